@@ -4,13 +4,14 @@ Aplicação Flask - FParcerias (Ferramenta de Parcerias)
 Arquivo principal que inicializa a aplicação e registra os blueprints.
 """
 
-from flask import Flask, request, session, g, current_app, jsonify
+from flask import Flask, request, session, g, jsonify
 from config import SECRET_KEY, DEBUG
-from db import close_db, get_db, DatabaseUnavailable
+from db import close_db, DatabaseUnavailable
 from utils import format_sei
 import time
 import json
-from threading import Thread
+from core.log_writer import enfileirar_log
+from core import perfil_requisicoes
 
 # Importar blueprints
 from routes.main import main_bp
@@ -164,68 +165,6 @@ def mapear_acao_tipo(metodo, endpoint):
     return 'outros'
 
 
-def salvar_log_atividade(dados, app_instance):
-    """
-    Salva log de atividade no banco de dados.
-    Executa em thread separada para não afetar performance.
-    
-    PROTEÇÕES DE PERFORMANCE:
-    1. Executa em thread daemon (não bloqueia shutdown)
-    2. Usa conexão independente (não afeta transações principais)
-    3. Try-catch abrangente (nunca quebra aplicação)
-    4. Timeout implícito (thread morre se demorar muito)
-    5. Commit isolado (não interfere em outras operações)
-    """
-    conn = None
-    cur = None
-    
-    try:
-        # CRÍTICO: Thread precisa de contexto Flask para acessar get_db()
-        with app_instance.app_context():
-            conn = get_db()
-            cur = conn.cursor()
-            
-            # INSERT com timeout implícito do PostgreSQL
-            cur.execute("""
-                INSERT INTO gestao_pessoas.log_atividades (
-                    usuario_nome, usuario_email, tipo_usuario,
-                    acao_tipo, acao_categoria, acao_endpoint, acao_metodo,
-                    recurso_tipo, recurso_id,
-                    status_codigo, sucesso, ip_address, user_agent, duracao_ms,
-                    detalhes, created_at
-                ) VALUES (
-                    %(usuario_nome)s, %(usuario_email)s, %(tipo_usuario)s,
-                    %(acao_tipo)s, %(acao_categoria)s, %(acao_endpoint)s, %(acao_metodo)s,
-                    %(recurso_tipo)s, %(recurso_id)s,
-                    %(status_codigo)s, %(sucesso)s, %(ip_address)s, %(user_agent)s, %(duracao_ms)s,
-                    %(detalhes)s, NOW()
-                )
-            """, dados)
-            
-            # Commit isolado - não afeta outras transações
-            conn.commit()
-        
-    except Exception as e:
-        # CRÍTICO: NUNCA deixar log quebrar a aplicação
-        # Silenciosamente falha e imprime aviso no console
-        print(f"[LOG_AVISO] Falha ao salvar log (não afeta aplicação): {e}")
-        
-        # Rollback se necessário
-        if conn:
-            try:
-                conn.rollback()
-            except:
-                pass
-    
-    finally:
-        # Garantir limpeza de recursos
-        if cur:
-            try:
-                cur.close()
-            except:
-                pass
-
-
 # ============================================================================
 # FIM DAS FUNÇÕES DE LOGGING
 # ============================================================================
@@ -338,6 +277,7 @@ def create_app():
         g.usuario_nome = session.get('d_usuario')  # Nome é o d_usuario (ex: d843702)
         g.usuario_email = session.get('email')      # Email vem do campo email
         g.tipo_usuario = session.get('tipo_usuario')
+        perfil_requisicoes.iniciar()
     
     @app.after_request
     def depois_da_requisicao(response):
@@ -345,8 +285,8 @@ def create_app():
         Intercepta TODAS as respostas APÓS execução.
         Salva log de atividade se a rota for relevante.
         
-        PERFORMANCE: Logging é assíncrono (thread separada) e não adiciona
-        latência à resposta do usuário. Resposta retorna IMEDIATAMENTE.
+        PERFORMANCE: o registro vai para a fila do log writer (core/log_writer),
+        que grava em lote num worker único. Resposta retorna IMEDIATAMENTE.
         """
         try:
             # Verificar se deve logar esta rota
@@ -372,22 +312,21 @@ def create_app():
                     'detalhes': json.dumps(g.get('log_detalhes'), ensure_ascii=False) if g.get('log_detalhes') else None
                 }
                 
-                # CRÍTICO: Salvar log em thread daemon separada
-                # - Thread daemon = não impede shutdown da aplicação
-                # - Start() retorna IMEDIATAMENTE (não espera thread terminar)
-                # - Se thread falhar, não afeta a resposta ao usuário
-                # - IMPORTANTE: Passar instância do app para ter contexto Flask
-                Thread(
-                    target=salvar_log_atividade, 
-                    args=(dados_log, current_app._get_current_object()), 
-                    daemon=True
-                ).start()
+                # Enfileira sem bloquear: fila limitada, gravação em lote.
+                # Fila cheia = registro descartado (contado), nunca erro na resposta.
+                enfileirar_log('log_atividades', dados_log)
         
         except Exception as e:
             # Se logging falhar, não quebrar resposta ao usuário
             print(f"[LOG_AVISO] Erro ao preparar log (ignorado): {e}")
             pass
         
+        # Server-Timing e janela de p50/p95 por endpoint (/admin/desempenho)
+        try:
+            response = perfil_requisicoes.finalizar(response)
+        except Exception as e:
+            print(f"[PERFIL] Erro ao registrar perfil da requisição (ignorado): {e}")
+        
         # SEMPRE retornar response (mesmo se log falhar)
         return response
     
@@ -0,0 +1,329 @@
+"""
+Busca aproximada (pg_trgm + unaccent) para OSCs, termos, indicadores e meios de aferição
+
+Autocompletes e buscas usavam ILIKE '%x%', que não usa índice btree (varredura
+completa a cada tecla) e não perdoa acento nem erro de digitação.
+
+- Banco: public.busca_normalizar(texto) (unaccent + lower + espaços) é
+  IMMUTABLE e indexada com GIN gin_trgm_ops em cada coluna de FONTES. filtro()
+  casa substring (LIKE, usa o índice) OU palavra parecida (<%, word
+  similarity); ordem() põe primeiro quem começa com o texto e depois a maior
+  similaridade
+- A estrutura é garantida uma vez por processo (DDL guard, mesmo script em
+  scripts/migration_busca_trgm.sql); sem pg_trgm/unaccent disponíveis as
+  funções caem para ILIKE, como antes
+- Memória: listas quentes (MEMORIA) ficam num IndiceTrigramas por TTL s; o
+  autocomplete responde sem ida ao banco, com os trigramas e a similaridade
+  calculados como no pg_trgm (trigramas(), similaridade())
+- A fusão de indicadores/meios sugere destinos pela mesma busca (buscar()
+  ordenado por similaridade), como o alerta de similares ao cadastrar
+
+Uso:
+    sql, params = busca.filtro('p.osc', texto)
+    ordem, params_ordem = busca.ordem('p.osc', texto)
+    linhas = busca.buscar(cur, 'indicadores', texto, limite=10)
+    oscs = busca.indice('oscs').buscar(texto, limite=20)
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+
+LIMIAR_SIMILARIDADE = 0.3     # mesmo default de pg_trgm.similarity_threshold
+LIMIAR_PALAVRA = 0.6          # idem pg_trgm.word_similarity_threshold (operador <%)
+TTL_MEMORIA = 300
+
+# nome → tabela e coluna pesquisável (índice GIN trigram em busca_normalizar(coluna))
+FONTES = {
+    'oscs': {'tabela': 'public.parcerias', 'coluna': 'osc'},
+    'oscs_cents': {'tabela': 'celebracao.gestao_cents', 'coluna': 'osc'},
+    'oscs_celebracao': {'tabela': 'celebracao.celebracao_parcerias', 'coluna': 'osc'},
+    'termos': {'tabela': 'public.parcerias', 'coluna': 'numero_termo'},
+    'indicadores': {'tabela': 'categoricas.c_dgp_indicadores', 'coluna': 'indicador'},
+    'meios_afericao': {'tabela': 'categoricas.c_dgp_meios_afericao', 'coluna': 'meios_afericao'},
+}
+
+# Listas quentes mantidas em memória: sql (texto na 1ª coluna, demais colunas vão no item)
+MEMORIA = {
+    'oscs': """
+        SELECT osc, MAX(NULLIF(TRIM(cnpj), '')) AS cnpj
+        FROM public.parcerias
+        WHERE osc IS NOT NULL AND TRIM(osc) NOT IN ('', '#N/D')
+        GROUP BY osc
+    """,
+}
+
+
+# ── Normalização e similaridade (espelho do pg_trgm) ─────────────────────────
+
+def normalizar(texto):
+    """Sem acentos, minúsculo e com espaços simples — igual a public.busca_normalizar."""
+    if texto is None:
+        return ''
+    sem_acento = ''.join(
+        c for c in unicodedata.normalize('NFKD', str(texto)) if not unicodedata.combining(c)
+    )
+    return ' '.join(sem_acento.lower().split())
+
+
+_PALAVRA = re.compile(r'[^\W_]+')
+
+
+def trigramas(texto):
+    """Conjunto de trigramas como o pg_trgm: por palavra, com '  ' antes e ' ' depois."""
+    saida = set()
+    for palavra in _PALAVRA.findall(normalizar(texto)):
+        p = f'  {palavra} '
+        saida.update(p[i:i + 3] for i in range(len(p) - 2))
+    return saida
+
+
+def similaridade(a, b):
+    """similarity() do pg_trgm: trigramas em comum / trigramas na união."""
+    ta, tb = trigramas(a), trigramas(b)
+    if not ta or not tb:
+        return 0.0
+    comuns = len(ta & tb)
+    return comuns / (len(ta) + len(tb) - comuns)
+
+
+def _padrao_like(texto_normalizado, inicio=False):
+    escapado = re.sub(r'([\\%_])', r'\\\1', texto_normalizado)
+    return f'{escapado}%' if inicio else f'%{escapado}%'
+
+
+# ── Estrutura no banco ───────────────────────────────────────────────────────
+
+_estrutura_ok = None          # None = ainda não verificado
+_estrutura_lock = threading.Lock()
+
+
+def _nome_indice(fonte):
+    tabela = fonte['tabela'].split('.')[-1]
+    return f"idx_busca_trgm_{tabela}_{fonte['coluna']}"
+
+
+def garantir_estrutura(cur):
+    """DDL guard: extensões, função de normalização e índices GIN das FONTES."""
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cur.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    # Supabase instala extensões no schema `extensions`: qualificar pelo schema real
+    cur.execute("""
+        SELECT n.nspname
+        FROM pg_extension e
+        JOIN pg_namespace n ON n.oid = e.extnamespace
+        WHERE e.extname = 'unaccent'
+    """)
+    row = cur.fetchone()
+    schema_unaccent = row[0] if not isinstance(row, dict) else row['nspname']
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION public.busca_normalizar(texto text)
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$
+            SELECT btrim(regexp_replace(
+                lower({schema_unaccent}.unaccent('{schema_unaccent}.unaccent'::regdictionary, texto)),
+                '\\s+', ' ', 'g'
+            ))
+        $$
+    """)
+    for fonte in FONTES.values():
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {_nome_indice(fonte)}
+            ON {fonte['tabela']}
+            USING gin (public.busca_normalizar({fonte['coluna']}) gin_trgm_ops)
+        """)
+
+
+def disponivel():
+    """True se pg_trgm, unaccent e os índices estão prontos (verifica uma vez por processo)."""
+    global _estrutura_ok
+    if _estrutura_ok is not None:
+        return _estrutura_ok
+    with _estrutura_lock:
+        if _estrutura_ok is None:
+            from db import pooled_connection
+            try:
+                with pooled_connection() as conn:
+                    with conn.cursor() as cur:
+                        garantir_estrutura(cur)
+                    conn.commit()
+                _estrutura_ok = True
+            except Exception as e:
+                print(f"[BUSCA] pg_trgm/unaccent indisponível; usando ILIKE: {e}")
+                _estrutura_ok = False
+    return _estrutura_ok
+
+
+# ── Trechos SQL ──────────────────────────────────────────────────────────────
+
+def expressao(coluna):
+    return f"public.busca_normalizar({coluna})"
+
+
+def filtro(coluna, texto):
+    """
+    (sql, params) do WHERE: `coluna` contém o texto (sem acento/caixa) ou tem
+    palavra parecida com ele. Usa o índice GIN trigram da coluna.
+    """
+    norm = normalizar(texto)
+    if not disponivel():
+        return f"{coluna} ILIKE %s", [f'%{texto}%']
+    expr = expressao(coluna)
+    return f"({expr} LIKE %s OR %s <%% {expr})", [_padrao_like(norm), norm]
+
+
+def ordem(coluna, texto):
+    """(sql, params) do ORDER BY: começa com o texto, depois maior similaridade."""
+    norm = normalizar(texto)
+    if not disponivel():
+        return f"{coluna}", []
+    expr = expressao(coluna)
+    return (
+        f"({expr} LIKE %s) DESC, word_similarity(%s, {expr}) DESC, similarity(%s, {expr}) DESC, {coluna}",
+        [_padrao_like(norm, inicio=True), norm, norm],
+    )
+
+
+def buscar(cur, fonte, texto, limite=20, colunas=('id',), excluir_ids=(), excluir_igual=False):
+    """
+    Linhas de FONTES[fonte] que casam com `texto`, da mais parecida para a
+    menos, com a coluna pesquisável, `colunas` e 'similaridade' (0–1).
+
+    Args:
+        excluir_ids: ids a omitir (ex.: o próprio item na fusão).
+        excluir_igual: omite o texto idêntico (sem acento/caixa).
+    """
+    config = FONTES[fonte]
+    coluna = config['coluna']
+    onde, params = filtro(coluna, texto)
+    ordenar, params_ordem = ordem(coluna, texto)
+    condicoes = [onde]
+    if excluir_ids:
+        condicoes.append("id <> ALL(%s)")
+        params.append(list(excluir_ids))
+    if excluir_igual:
+        if disponivel():
+            condicoes.append(f"{expressao(coluna)} <> %s")
+            params.append(normalizar(texto))
+        else:
+            condicoes.append(f"LOWER({coluna}) <> LOWER(%s)")
+            params.append(texto)
+    pontuacao = f"similarity(%s, {expressao(coluna)})" if disponivel() else "NULL::real"
+    params_pontuacao = [normalizar(texto)] if disponivel() else []
+
+    cur.execute(f"""
+        SELECT {', '.join(colunas + (coluna,))}, {pontuacao} AS similaridade
+        FROM {config['tabela']}
+        WHERE {coluna} IS NOT NULL AND {' AND '.join(condicoes)}
+        ORDER BY {ordenar}
+        LIMIT %s
+    """, params_pontuacao + params + params_ordem + [limite])
+    return cur.fetchall()
+
+
+def melhor(cur, fonte, texto, colunas=(), minimo=LIMIAR_SIMILARIDADE):
+    """A linha mais parecida com `texto` (substring ou similaridade >= minimo), ou None."""
+    for linha in buscar(cur, fonte, texto, limite=5, colunas=tuple(colunas)):
+        coluna = FONTES[fonte]['coluna']
+        if normalizar(texto) in normalizar(linha[coluna]) or similaridade(texto, linha[coluna]) >= minimo:
+            return linha
+    return None
+
+
+# ── Índice em memória ────────────────────────────────────────────────────────
+
+class IndiceTrigramas:
+    """
+    Índice invertido trigrama → itens, para autocomplete sem ida ao banco.
+
+    Mesma regra de filtro() (substring sem acento ou palavra parecida) e de
+    ordem() (prefixo, depois similaridade). A semelhança de palavra é
+    aproximada pela fração dos trigramas da consulta presentes no item.
+    """
+
+    def __init__(self, itens, chave):
+        """
+        Args:
+            itens: lista de dicts.
+            chave: campo de texto pesquisável de cada item.
+        """
+        self.itens = itens
+        self._textos = [normalizar(item[chave]) for item in itens]
+        self._tamanhos = []
+        self._postings = {}
+        for i, item in enumerate(itens):
+            tri = trigramas(item[chave])
+            self._tamanhos.append(len(tri))
+            for t in tri:
+                self._postings.setdefault(t, []).append(i)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def buscar(self, texto, limite=20):
+        norm = normalizar(texto)
+        if not norm:
+            return []
+        consulta = trigramas(norm)
+        comuns = Counter()
+        for t in consulta:
+            comuns.update(self._postings.get(t, ()))
+        candidatos = set(comuns)
+        if len(norm) < 3 or not consulta:
+            # Consultas curtas: substring não garante trigrama em comum
+            candidatos.update(i for i, t in enumerate(self._textos) if norm in t)
+
+        ranqueados = []
+        for i in candidatos:
+            n = comuns.get(i, 0)
+            uniao = len(consulta) + self._tamanhos[i] - n
+            sim = n / uniao if uniao else 0.0
+            palavra = n / len(consulta) if consulta else 0.0
+            contem = norm in self._textos[i]
+            if contem or palavra >= LIMIAR_PALAVRA:
+                ranqueados.append((not self._textos[i].startswith(norm), not contem, -palavra, -sim, self._textos[i], i))
+        ranqueados.sort()
+        return [dict(self.itens[r[-1]], similaridade=round(-r[3], 3)) for r in ranqueados[:limite]]
+
+
+class _IndicesMemoria:
+
+    def __init__(self, ttl=TTL_MEMORIA):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indices = {}      # nome → (expira_em, IndiceTrigramas)
+
+    def obter(self, nome, cur=None):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._indices.get(nome)
+            if item and item[0] > agora:
+                return item[1]
+
+        if cur is None:
+            from db import get_cursor
+            cur = get_cursor()
+        cur.execute(MEMORIA[nome])
+        linhas = [dict(r) for r in cur.fetchall()]
+        chave = next(iter(linhas[0])) if linhas else 'texto'
+        indice = IndiceTrigramas(linhas, chave)
+        with self._lock:
+            self._indices[nome] = (agora + self.ttl, indice)
+        return indice
+
+    def invalidar(self, nome=None):
+        with self._lock:
+            if nome is None:
+                self._indices.clear()
+            else:
+                self._indices.pop(nome, None)
+
+
+_memoria = _IndicesMemoria()
+
+indice = _memoria.obter
+invalidar_indice = _memoria.invalidar
@@ -0,0 +1,195 @@
+"""
+Cache persistente de texto extraído por página de PDF
+
+O mesmo extrato costuma passar por ocr_testes, conc_classificacao e pelo
+upload de manifestações; cada passagem repetia pdfplumber e tesseract do zero.
+
+- Chave: hash SHA-256 do conteúdo da página (streams de conteúdo, imagens e
+  formulários referenciados, fontes — Encoding, ToUnicode e FontFile* —,
+  MediaBox e rotação) + método de extração
+  ('pdfplumber' ou 'tesseract@<dpi>'). A mesma página reaparece com o mesmo
+  hash mesmo dentro de outro arquivo (ex.: partes de dividir_e_classificar)
+- O hash usa os bytes brutos dos streams — nada é descomprimido nem
+  interpretado, então uma página em cache custa só o hash
+- Armazenado em public.cache_extracao_paginas; se o banco estiver
+  indisponível, a extração segue normalmente sem cache
+
+Uso (feito por core/ocr.py):
+    hashes = cache_paginas.hashes_documento(pdf)        # pdfplumber aberto
+    em_cache = cache_paginas.buscar(hashes, ['pdfplumber', 'tesseract@200'])
+    cache_paginas.gravar([(hash, metodo, texto), ...])
+"""
+
+import hashlib
+
+
+PROFUNDIDADE_MAX_FORMULARIOS = 4
+PROFUNDIDADE_MAX_FONTES = 8
+
+
+def _bytes_stream(stream):
+    # rawdata vira None depois que o pdfminer decodifica o stream
+    dados = stream.rawdata if stream.rawdata is not None else stream.get_data()
+    return dados or b''
+
+
+def _atualizar_objeto(h, obj, profundidade, vistos):
+    """Serializa um objeto PDF (dict/lista/nome/stream) de forma estável."""
+    from pdfminer.pdftypes import PDFStream, resolve1
+
+    obj = resolve1(obj)
+    if isinstance(obj, PDFStream):
+        h.update(b'S')
+        if id(obj) not in vistos:
+            vistos.add(id(obj))
+            h.update(_bytes_stream(obj))
+    elif isinstance(obj, dict):
+        h.update(b'D')
+        if profundidade >= PROFUNDIDADE_MAX_FONTES or id(obj) in vistos:
+            return
+        vistos.add(id(obj))
+        for chave in sorted(obj, key=str):
+            h.update(str(chave).encode())
+            _atualizar_objeto(h, obj[chave], profundidade + 1, vistos)
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'L')
+        if profundidade >= PROFUNDIDADE_MAX_FONTES:
+            return
+        for item in obj:
+            _atualizar_objeto(h, item, profundidade + 1, vistos)
+    else:
+        # nomes (PSLiteral), números, strings e None têm repr estável
+        h.update(repr(obj).encode())
+
+
+def _atualizar_fontes(h, recursos, vistos):
+    # Mesmo stream de conteúdo com Encoding/ToUnicode diferentes extrai outro
+    # texto, então o dicionário de cada fonte entra inteiro no hash
+    # (FontDescriptor/FontFile*, DescendantFonts, CharProcs de Type3...)
+    from pdfminer.pdftypes import resolve1
+
+    fontes = resolve1(recursos.get('Font')) or {}
+    if not isinstance(fontes, dict):
+        return
+    for nome in sorted(fontes, key=str):
+        h.update(str(nome).encode())
+        _atualizar_objeto(h, fontes[nome], 0, vistos)
+
+
+def _atualizar_recursos(h, recursos, profundidade, vistos):
+    from pdfminer.pdftypes import PDFStream, resolve1
+
+    recursos = resolve1(recursos) or {}
+    if not isinstance(recursos, dict):
+        return
+    _atualizar_fontes(h, recursos, vistos)
+    xobjetos = resolve1(recursos.get('XObject')) or {}
+    if not isinstance(xobjetos, dict):
+        return
+    for nome in sorted(xobjetos, key=str):
+        xobj = resolve1(xobjetos[nome])
+        if not isinstance(xobj, PDFStream):
+            continue
+        h.update(str(nome).encode())
+        if id(xobj) in vistos:
+            continue
+        vistos.add(id(xobj))
+        h.update(_bytes_stream(xobj))
+        subtipo = resolve1(xobj.attrs.get('Subtype'))
+        if getattr(subtipo, 'name', None) == 'Form' and profundidade < PROFUNDIDADE_MAX_FORMULARIOS:
+            _atualizar_recursos(h, xobj.attrs.get('Resources'), profundidade + 1, vistos)
+
+
+def hash_pagina(pagina):
+    """SHA-256 (hex) do conteúdo de uma página pdfplumber."""
+    from pdfminer.pdftypes import PDFStream, resolve1
+
+    obj = pagina.page_obj
+    h = hashlib.sha256()
+    h.update(repr((list(obj.mediabox), obj.rotate)).encode())
+    for conteudo in obj.contents:
+        conteudo = resolve1(conteudo)
+        if isinstance(conteudo, PDFStream):
+            h.update(_bytes_stream(conteudo))
+    _atualizar_recursos(h, obj.resources, 0, set())
+    return h.hexdigest()
+
+
+def hashes_documento(pdf):
+    """
+    Hash de todas as páginas de um documento pdfplumber aberto.
+
+    Deve ser chamado antes de extrair texto: a extração decodifica streams
+    compartilhados entre páginas e o hash passaria a usar outros bytes.
+    """
+    return [hash_pagina(p) for p in pdf.pages]
+
+
+# ── Persistência ─────────────────────────────────────────────────────────────
+
+_tabela_ok = False
+
+
+def _garantir_tabela(cur):
+    global _tabela_ok
+    if _tabela_ok:
+        return
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS public.cache_extracao_paginas (
+            hash_pagina  CHAR(64)    NOT NULL,
+            metodo       VARCHAR(30) NOT NULL,
+            texto        TEXT        NOT NULL,
+            criado_em    TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (hash_pagina, metodo)
+        )
+    """)
+    _tabela_ok = True
+
+
+def buscar(hashes, metodos):
+    """
+    Textos em cache para `hashes` × `metodos`.
+
+    Returns:
+        dict {(hash, metodo): texto}; vazio se o cache estiver indisponível.
+    """
+    hashes = sorted(set(hashes))
+    if not hashes:
+        return {}
+    try:
+        from db import pooled_connection
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                _garantir_tabela(cur)
+                cur.execute("""
+                    SELECT hash_pagina, metodo, texto
+                    FROM public.cache_extracao_paginas
+                    WHERE hash_pagina = ANY(%s) AND metodo = ANY(%s)
+                """, (hashes, list(metodos)))
+                linhas = cur.fetchall()
+            conn.commit()
+    except Exception as e:
+        print(f"[CACHE PAGINAS] Falha na consulta: {e}")
+        return {}
+    return {(h, m): t for h, m, t in linhas}
+
+
+def gravar(entradas):
+    """Grava [(hash, metodo, texto)]; entradas já existentes são mantidas."""
+    entradas = list({(h, m): (h, m, t) for h, m, t in entradas}.values())
+    if not entradas:
+        return
+    try:
+        from psycopg2.extras import execute_values
+        from db import pooled_connection
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                _garantir_tabela(cur)
+                execute_values(cur, """
+                    INSERT INTO public.cache_extracao_paginas (hash_pagina, metodo, texto)
+                    VALUES %s
+                    ON CONFLICT (hash_pagina, metodo) DO NOTHING
+                """, entradas, page_size=200)
+            conn.commit()
+    except Exception as e:
+        print(f"[CACHE PAGINAS] Falha ao gravar {len(entradas)} página(s): {e}")
@@ -0,0 +1,169 @@
+"""
+Calendário de dias úteis (fins de semana + calendario.data_feriados)
+
+Prazos em dias úteis eram calculados avançando um dia por vez e ignoravam
+os feriados (analises.adicionar_dias_uteis); notificações somavam dias
+corridos sem olhar o calendário.
+
+- Os feriados ativos vêm de core/referencia ('feriados'): lidos uma vez por
+  processo e recarregados quando datas_importantes edita a tabela (inclusive
+  nos demais workers, via cache_referencia_versoes)
+- Os feriados que caem de segunda a sexta ficam num vetor ordenado de
+  ordinais; o número de dias úteis até uma data sai de aritmética sobre a
+  semana menos um bisect no vetor, então contar, somar N dias úteis e achar
+  o próximo dia útil custam O(log n), sem laço por dia
+- Sem acesso ao banco, vale só a regra de fim de semana
+
+Uso:
+    prazo = calendario.adicionar_dias_uteis(vigencia_final, 5)
+    prazos = calendario.adicionar_dias_uteis_lote(datas, 5)     # uma busca por data distinta
+    dias = calendario.contar_dias_uteis(inicio, fim)
+    vencimento = calendario.proximo_dia_util(data_prazo)
+"""
+
+import threading
+from bisect import bisect_right
+from datetime import date, datetime
+
+from core import referencia
+
+
+class _Calendario:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origem = None         # tupla de feriados da última carga
+        self._ordinais = []         # feriados em dia de semana, ordenados
+        self._conjunto = frozenset()
+
+    # ── Carga ────────────────────────────────────────────────────────────
+
+    def _indice(self, cur=None):
+        try:
+            feriados = tuple(referencia.obter('feriados', cur))
+        except Exception as e:
+            print(f"[CALENDARIO] Falha ao carregar feriados; usando só fins de semana: {e}")
+            if cur is not None:
+                cur.connection.rollback()
+            with self._lock:
+                return self._ordinais, self._conjunto
+
+        with self._lock:
+            if feriados != self._origem:
+                ordinais = sorted({_data(f).toordinal() for f in feriados if _data(f).weekday() < 5})
+                self._origem = feriados
+                self._ordinais = ordinais
+                self._conjunto = frozenset(ordinais)
+            return self._ordinais, self._conjunto
+
+    # ── API ──────────────────────────────────────────────────────────────
+
+    def eh_dia_util(self, dia, cur=None):
+        dia = _data(dia)
+        if dia.weekday() >= 5:
+            return False
+        _, conjunto = self._indice(cur)
+        return dia.toordinal() not in conjunto
+
+    def feriados_entre(self, inicio, fim, cur=None):
+        """Feriados em dia de semana no intervalo [inicio, fim]."""
+        ordinais, _ = self._indice(cur)
+        inicio, fim = _data(inicio).toordinal(), _data(fim).toordinal()
+        i = bisect_right(ordinais, inicio - 1)
+        j = bisect_right(ordinais, fim)
+        return [date.fromordinal(o) for o in ordinais[i:j]]
+
+    def contar_dias_uteis(self, inicio, fim, cur=None):
+        """
+        Dias úteis no intervalo (inicio, fim] — o dia inicial não conta, como
+        na contagem de prazos. Negativo se fim < inicio.
+        """
+        ordinais, _ = self._indice(cur)
+        return _uteis_ate(_data(fim).toordinal(), ordinais) - _uteis_ate(_data(inicio).toordinal(), ordinais)
+
+    def adicionar_dias_uteis(self, dia, dias, cur=None):
+        """
+        Data `dias` dias úteis após `dia` (antes, se negativo). Com dias=0
+        devolve o próprio dia.
+        """
+        ordinais, _ = self._indice(cur)
+        return _somar(_data(dia).toordinal(), dias, ordinais)
+
+    def adicionar_dias_uteis_lote(self, datas, dias, cur=None):
+        """
+        adicionar_dias_uteis para uma sequência de datas (None é mantido),
+        com uma única carga do calendário e uma busca por data distinta.
+        """
+        ordinais, _ = self._indice(cur)
+        resultados = {}
+        saida = []
+        for dia in datas:
+            if dia is None:
+                saida.append(None)
+                continue
+            dia = _data(dia)
+            if dia not in resultados:
+                resultados[dia] = _somar(dia.toordinal(), dias, ordinais)
+            saida.append(resultados[dia])
+        return saida
+
+    def proximo_dia_util(self, dia, incluir=True, cur=None):
+        """
+        Primeiro dia útil a partir de `dia` (o próprio dia, se for útil e
+        incluir=True; senão o seguinte).
+        """
+        ordinais, _ = self._indice(cur)
+        o = _data(dia).toordinal()
+        alvo = _uteis_ate(o - 1 if incluir else o, ordinais) + 1
+        return date.fromordinal(_menor_com(alvo, o - 1, ordinais))
+
+
+# ── Aritmética ───────────────────────────────────────────────────────────────
+# date.fromordinal(1) é segunda-feira: os ordinais 7q+1..7q+5 são dias de semana
+
+def _data(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+def _uteis_ate(o, ordinais):
+    """Quantidade de dias úteis com ordinal <= o."""
+    q, r = divmod(o, 7)
+    return 5 * q + min(r, 5) - bisect_right(ordinais, o)
+
+
+def _menor_com(alvo, abaixo, ordinais):
+    """Menor ordinal > `abaixo` cuja contagem de dias úteis chega a `alvo`."""
+    lo, hi = abaixo, abaixo + 1
+    while _uteis_ate(hi, ordinais) < alvo:
+        hi += 2 * (alvo - _uteis_ate(hi, ordinais)) + 7
+    while _uteis_ate(lo, ordinais) >= alvo:
+        lo -= 2 * (_uteis_ate(lo, ordinais) - alvo + 1) + 7
+    # invariante: contagem(lo) < alvo <= contagem(hi)
+    while hi - lo > 1:
+        meio = (lo + hi) // 2
+        if _uteis_ate(meio, ordinais) >= alvo:
+            hi = meio
+        else:
+            lo = meio
+    return hi
+
+
+def _somar(o, dias, ordinais):
+    if dias == 0:
+        return date.fromordinal(o)
+    if dias > 0:
+        alvo = _uteis_ate(o, ordinais) + dias
+        return date.fromordinal(_menor_com(alvo, o, ordinais))
+    # Para trás: o |dias|-ésimo dia útil antes de `o`
+    alvo = _uteis_ate(o - 1, ordinais) + dias + 1
+    return date.fromordinal(_menor_com(alvo, o - 2 * abs(dias) - 30, ordinais))
+
+
+_calendario = _Calendario()
+
+eh_dia_util = _calendario.eh_dia_util
+feriados_entre = _calendario.feriados_entre
+contar_dias_uteis = _calendario.contar_dias_uteis
+adicionar_dias_uteis = _calendario.adicionar_dias_uteis
+adicionar_dias_uteis_lote = _calendario.adicionar_dias_uteis_lote
+proximo_dia_util = _calendario.proximo_dia_util
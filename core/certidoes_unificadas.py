@@ -0,0 +1,384 @@
+"""
+PDF unificado de certidões por OSC
+
+Usado por certidoes.juntar_pdfs, juntar_pdfs_selecionados e pelo lote
+(vários OSCs numa tarefa em background).
+
+- Pasta da OSC resolvida pela coluna gerada public.certidoes.certidao_pasta
+  (primeiro segmento de certidao_path, com \\ → /) e índice — antes eram até
+  quatro LIKE sobre REPLACE(certidao_path, ...)
+- Certidões baixadas em paralelo (utils_storage.download_files)
+- PDF unificado em cache no disco, com chave = hash dos pares (caminho,
+  versão do arquivo no storage). Reenviar uma certidão muda a versão e,
+  portanto, a chave; um pacote inalterado sai direto do cache
+
+Uso:
+    osc, certidoes = certidoes_unificadas.certidoes_da_pasta(cur, nome_pasta)
+    certidoes_unificadas.validar(certidoes)
+    caminho_pdf = certidoes_unificadas.juntar(certidoes)
+    resposta = send_file(caminho_pdf, ...)
+    resposta.call_on_close(lambda: certidoes_unificadas.descartar(caminho_pdf))
+"""
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import date
+
+import utils_storage as storage
+
+
+CACHE_DIR = os.environ.get('CERTIDOES_CACHE_DIR') or os.path.join(
+    tempfile.gettempdir(), 'certidoes_unificadas'
+)
+MAX_ARQUIVOS_CACHE = 200
+DOWNLOADS_PARALELOS = 8
+
+ORDEM_CERTIDOES_SQL = """
+    CASE certidao_nome
+        WHEN 'CNPJ' THEN 1
+        WHEN 'CND' THEN 2
+        WHEN 'CNDT' THEN 3
+        WHEN 'CRF' THEN 4
+        WHEN 'CADIN Municipal' THEN 5
+        WHEN 'CTM' THEN 6
+        WHEN 'CENTS' THEN 7
+        ELSE 8
+    END
+"""
+
+_EXPR_PASTA = "split_part(REPLACE(certidao_path, chr(92), '/'), '/', 1)"
+
+
+class ErroCertidoes(Exception):
+    """Pacote não pode ser gerado; `status` é o código HTTP sugerido."""
+
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+# ── Estrutura ────────────────────────────────────────────────────────────────
+
+_estrutura_ok = False
+_estrutura_lock = threading.Lock()
+
+
+def garantir_estrutura():
+    """
+    DDL guard (uma vez por processo): coluna gerada certidao_pasta + índice.
+
+    Returns:
+        bool: True se a coluna está disponível.
+    """
+    global _estrutura_ok
+    if _estrutura_ok:
+        return True
+    from db import pooled_connection
+
+    with _estrutura_lock:
+        if _estrutura_ok:
+            return True
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT EXISTS (
+                            SELECT FROM information_schema.columns
+                            WHERE table_schema = 'public' AND table_name = 'certidoes'
+                              AND column_name = 'certidao_pasta'
+                        )
+                    """)
+                    if not cur.fetchone()[0]:
+                        cur.execute(f"""
+                            ALTER TABLE public.certidoes
+                            ADD COLUMN certidao_pasta TEXT
+                            GENERATED ALWAYS AS ({_EXPR_PASTA}) STORED
+                        """)
+                    cur.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_certidoes_pasta
+                            ON public.certidoes (certidao_pasta)
+                    """)
+                conn.commit()
+            _estrutura_ok = True
+        except Exception as e:
+            print(f"[CERTIDOES] Falha ao criar coluna certidao_pasta: {e}")
+        return _estrutura_ok
+
+
+def coluna_pasta():
+    # Sem a coluna (ex.: usuário sem ALTER) a mesma expressão vale, sem índice
+    return 'certidao_pasta' if garantir_estrutura() else _EXPR_PASTA
+
+
+# ── Resolução da OSC ─────────────────────────────────────────────────────────
+
+def certidoes_da_pasta(cur, nome_pasta):
+    """
+    Localiza a OSC da pasta e suas certidões, na ordem do PDF unificado.
+
+    Tenta, em ordem: pasta das certidões (índice), nome da OSC em certidoes,
+    nome da OSC em parcerias e, por fim, os arquivos soltos no storage.
+
+    Returns:
+        (osc_data {'osc', 'cnpj'}, [certidões {'certidao_nome', 'certidao_path',
+        'certidao_vencimento', 'certidao_status'}])
+
+    Raises:
+        ErroCertidoes(404): OSC não encontrada e pasta vazia.
+    """
+    cur.execute(f"""
+        SELECT osc, cnpj, certidao_nome, certidao_path,
+               certidao_vencimento, certidao_status
+        FROM public.certidoes
+        WHERE {coluna_pasta()} = %s
+        ORDER BY {ORDEM_CERTIDOES_SQL}
+    """, [nome_pasta])
+    certidoes = cur.fetchall()
+    if certidoes:
+        return {'osc': certidoes[0]['osc'], 'cnpj': certidoes[0]['cnpj']}, certidoes
+
+    # Fallbacks para registros antigos cujo path não segue a pasta da OSC
+    nome_busca = nome_pasta.replace('_', ' ').lower()
+    palavras = nome_busca.split()
+    cur.execute("""
+        SELECT DISTINCT osc, cnpj
+        FROM public.certidoes
+        WHERE LOWER(osc) LIKE %s
+        LIMIT 1
+    """, [f'%{" ".join(palavras)}%'])
+    osc_data = cur.fetchone()
+
+    if not osc_data and len(palavras) >= 3:
+        cur.execute("""
+            SELECT DISTINCT osc, cnpj
+            FROM public.parcerias
+            WHERE LOWER(osc) LIKE %s
+            LIMIT 1
+        """, [f'%{" ".join(palavras[:3])}%'])
+        osc_data = cur.fetchone()
+
+    if not osc_data and len(palavras) >= 2:
+        cur.execute("""
+            SELECT DISTINCT osc, cnpj
+            FROM public.parcerias
+            WHERE LOWER(osc) LIKE %s AND LOWER(osc) LIKE %s
+            LIMIT 1
+        """, [f'%{palavras[0]}%', f'%{palavras[:3][-1]}%'])
+        osc_data = cur.fetchone()
+
+    certidoes = []
+    if osc_data:
+        cur.execute(f"""
+            SELECT certidao_nome, certidao_path, certidao_vencimento, certidao_status
+            FROM public.certidoes
+            WHERE osc = %s
+            ORDER BY {ORDEM_CERTIDOES_SQL}
+        """, [osc_data['osc']])
+        certidoes = cur.fetchall()
+
+    if not certidoes:
+        arquivos_pdf = sorted(
+            f for f in storage.list_files(f'Certidoes/{nome_pasta}') if f.lower().endswith('.pdf')
+        )
+        if not osc_data and not arquivos_pdf:
+            raise ErroCertidoes('OSC não encontrada no banco de dados e sem arquivos no storage', 404)
+        if not osc_data:
+            osc_data = {'osc': nome_pasta.replace('_', ' ').title(), 'cnpj': 'Não cadastrado'}
+        certidoes = [{
+            'certidao_nome': arquivo.replace('.pdf', '').replace('_', ' '),
+            'certidao_path': f'{nome_pasta}/{arquivo}',
+            'certidao_vencimento': None,  # Sem validação de vencimento
+            'certidao_status': 'física',
+        } for arquivo in arquivos_pdf]
+
+    return dict(osc_data), certidoes
+
+
+def validar(certidoes, minimo=2):
+    """Exige `minimo` certidões e nenhuma vencida. Raises ErroCertidoes(400)."""
+    if len(certidoes) < minimo:
+        raise ErroCertidoes(
+            f'Apenas {len(certidoes)} certidão cadastrada. É necessário ter pelo menos '
+            f'{minimo} certidões para gerar o PDF unificado.'
+        )
+    hoje = date.today()
+    vencidas = [
+        c['certidao_nome'] for c in certidoes
+        if c['certidao_vencimento'] is not None and c['certidao_vencimento'] < hoje
+    ]
+    if vencidas:
+        raise ErroCertidoes(
+            f'Existem certidões vencidas: {", ".join(vencidas)}. '
+            f'Atualize-as antes de gerar o PDF unificado.'
+        )
+
+
+# ── PDF unificado ────────────────────────────────────────────────────────────
+
+def _caminho_storage(certidao_path):
+    return f"Certidoes/{certidao_path.replace(chr(92), '/').lstrip('/')}"
+
+
+def _chave(caminhos):
+    """Hash de (caminho, versão) de cada arquivo; None se alguma versão faltar."""
+    versoes_por_pasta = {}
+    entradas = []
+    for caminho in caminhos:
+        pasta, _, nome = caminho.rpartition('/')
+        if pasta not in versoes_por_pasta:
+            versoes_por_pasta[pasta] = storage.file_versions(pasta)
+        versao = versoes_por_pasta[pasta].get(nome)
+        if not versao:
+            return None
+        entradas.append((caminho, versao))
+    return hashlib.sha256(json.dumps(entradas).encode()).hexdigest()
+
+
+def _podar_cache():
+    try:
+        arquivos = [
+            os.path.join(CACHE_DIR, f) for f in os.listdir(CACHE_DIR) if f.endswith('.pdf')
+        ]
+        if len(arquivos) <= MAX_ARQUIVOS_CACHE:
+            return
+        arquivos.sort(key=os.path.getmtime)
+        for caminho in arquivos[:len(arquivos) - MAX_ARQUIVOS_CACHE]:
+            os.unlink(caminho)
+    except OSError as e:
+        print(f"[CERTIDOES] Falha ao podar cache de PDFs unificados: {e}")
+
+
+def juntar(certidoes):
+    """
+    Caminho de um PDF com as certidões na ordem recebida (do cache, se o
+    conjunto de arquivos não mudou).
+
+    Raises:
+        ErroCertidoes(404): arquivo ausente no storage.
+        ErroCertidoes(400): arquivo que não é PDF válido.
+    """
+    from PyPDF2 import PdfMerger
+
+    caminhos = [_caminho_storage(c['certidao_path']) for c in certidoes]
+    chave = _chave(caminhos)
+    destino = os.path.join(CACHE_DIR, f'{chave}.pdf') if chave else None
+    if destino and os.path.isfile(destino):
+        try:
+            os.utime(destino)   # LRU por mtime
+            return destino
+        except OSError:
+            pass
+
+    nomes = dict(zip(caminhos, (c['certidao_nome'] for c in certidoes)))
+    try:
+        arquivos = storage.download_files(caminhos, max_workers=DOWNLOADS_PARALELOS)
+    except FileNotFoundError as e:
+        raise ErroCertidoes(f'Arquivo não encontrado: {nomes.get(e.filename, e.filename)}', 404)
+
+    merger = PdfMerger()
+    try:
+        for caminho in caminhos:
+            try:
+                merger.append(io.BytesIO(arquivos[caminho]))
+            except Exception as e:
+                raise ErroCertidoes(
+                    f'Erro ao processar {nomes[caminho]}: {str(e)}. Certifique-se de que é um PDF válido.'
+                )
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(suffix='.pdf', dir=CACHE_DIR, prefix='.tmp_')
+        with os.fdopen(fd, 'wb') as fh:
+            merger.write(fh)
+    finally:
+        merger.close()
+
+    if not destino:
+        # Sem versão confiável: arquivo avulso, não reaproveitado (ver descartar)
+        return temporario
+    os.replace(temporario, destino)
+    _podar_cache()
+    return destino
+
+
+def descartar(caminho):
+    """
+    Remove o PDF devolvido por juntar() se ele for avulso (.tmp_*, sem versão
+    confiável para o cache); PDFs do cache ficam. Chamar depois de enviá-lo.
+    """
+    if not caminho or not os.path.basename(caminho).startswith('.tmp_'):
+        return
+    try:
+        os.unlink(caminho)
+    except OSError:
+        pass
+
+
+# ── Lote (várias OSCs) ───────────────────────────────────────────────────────
+
+RETENCAO_LOTES = 24 * 3600
+
+
+def caminho_lote(task_id):
+    """ZIP gerado pela tarefa `task_id` (uuid validado pelo chamador)."""
+    return os.path.join(CACHE_DIR, f'lote_{task_id}.zip')
+
+
+def _podar_lotes():
+    import time
+
+    limite = time.time() - RETENCAO_LOTES
+    try:
+        for f in os.listdir(CACHE_DIR):
+            caminho = os.path.join(CACHE_DIR, f)
+            if f.startswith(('lote_', '.tmp_')) and os.path.getmtime(caminho) < limite:
+                os.unlink(caminho)
+    except OSError as e:
+        print(f"[CERTIDOES] Falha ao podar lotes antigos: {e}")
+
+
+def gerar_lote(cur, pastas, destino, progresso=None):
+    """
+    Gera o PDF unificado de cada pasta e grava todos num ZIP em `destino`.
+    Pastas com problema (vencidas, faltando arquivo...) entram em `erros`.
+
+    Args:
+        progresso: callback(feitas, total, nome_pasta).
+
+    Returns:
+        {'gerados': int, 'erros': [{'pasta', 'erro'}]}
+    """
+    import zipfile
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _podar_lotes()
+    gerados, erros = 0, []
+    fd, temporario = tempfile.mkstemp(suffix='.zip', dir=CACHE_DIR, prefix='.tmp_')
+    os.close(fd)
+    try:
+        # PDFs já são comprimidos: ZIP_STORED evita recompressão inútil
+        with zipfile.ZipFile(temporario, 'w', zipfile.ZIP_STORED) as zf:
+            for i, nome_pasta in enumerate(pastas, start=1):
+                if progresso:
+                    progresso(i - 1, len(pastas), nome_pasta)
+                try:
+                    _, certidoes = certidoes_da_pasta(cur, nome_pasta)
+                    validar(certidoes)
+                    caminho_pdf = juntar(certidoes)
+                    try:
+                        zf.write(caminho_pdf, f'Certidoes_{nome_pasta}.pdf')
+                    finally:
+                        descartar(caminho_pdf)
+                    gerados += 1
+                except ErroCertidoes as e:
+                    erros.append({'pasta': nome_pasta, 'erro': str(e)})
+        os.replace(temporario, destino)
+    except BaseException:
+        try:
+            os.unlink(temporario)
+        except OSError:
+            pass
+        raise
+    return {'gerados': gerados, 'erros': erros}
@@ -0,0 +1,306 @@
+"""
+Dados do relatório de conciliação (conc_relatorio.dados_relatorio)
+
+O relatório fazia de 10 a 30 consultas em sequência por acesso: análises
+(responsabilidade), parceria, rendimentos, contrapartida (duas vezes),
+extrato agrupado, glosas, taxas, restituições, conc_banco, o recorte do
+demonstrativo (mais duas) e, no modo misto, legislação, categorias de
+provisão, orçamento e duas consultas por categoria de provisão do extrato.
+
+- Uma única consulta (CTEs) devolve numa linha todos os agregados do termo;
+  as listas (extrato por categoria, orçamento mensal, categorias de
+  provisão) vêm como json_agg. As fórmulas continuam na rota
+- O resultado fica em cache por termo por TTL s. As rotas que escrevem em
+  conc_extrato, conc_rendimentos, conc_contrapartida e conc_banco chamam
+  invalidar(numero_termo, tabela) após o commit: o termo sai do cache deste
+  processo e a versão da tabela sobe em cache_referencia_versoes
+  (core/referencia), o que descarta nos demais workers os relatórios
+  lidos antes da escrita
+- Orçamento (parcerias_despesas), análises e legislação não têm
+  invalidação: a mudança aparece ao fim do TTL
+
+Uso:
+    dados = conciliacao_relatorio.carregar(cur, numero_termo)
+    ...
+    conn.commit()
+    conciliacao_relatorio.invalidar(numero_termo, 'analises_pc.conc_extrato')
+"""
+
+import threading
+import time
+
+from core import referencia
+
+
+TTL = 120
+MAX_ITENS = 500
+
+# Escritas nestas tabelas invalidam o cache (versões em core/referencia)
+TABELAS = (
+    'analises_pc.conc_extrato',
+    'analises_pc.conc_rendimentos',
+    'analises_pc.conc_contrapartida',
+    'analises_pc.conc_banco',
+)
+
+# Data de corte do modo misto quando a portaria do termo não tem término
+CORTE_PADRAO = '2023-02-28'
+
+# Categorias que entram no executado do demonstrativo mesmo fora do orçamento
+# (taxas bancárias ficam ocultas, como no demonstrativo padrão)
+CATEGORIAS_EXTRAS_DEMONSTRATIVO = [
+    'débitos indevidos',
+    'juros e/ou multas',
+    'débitos não identificados',
+]
+
+_SQL_DADOS = """
+    WITH parceria AS (
+        SELECT numero_termo, total_previsto, total_pago, inicio, portaria
+        FROM public.parcerias
+        WHERE numero_termo = %(termo)s
+        LIMIT 1
+    ),
+    analises AS (
+        SELECT
+            COUNT(*) FILTER (WHERE responsabilidade_analise = 2) > 0 AS tem_mista,
+            COUNT(*) > 0 AS tem_analise,
+            (SELECT responsabilidade_analise
+             FROM public.parcerias_analises
+             WHERE numero_termo = %(termo)s
+             LIMIT 1) AS responsabilidade_primeira
+        FROM public.parcerias_analises
+        WHERE numero_termo = %(termo)s
+    ),
+    legislacao AS (
+        SELECT (
+            SELECT l.termino
+            FROM categoricas.c_geral_legislacao l
+            JOIN parceria p ON p.portaria = l.lei
+            LIMIT 1
+        ) AS termino_portaria
+    ),
+    corte AS (
+        SELECT COALESCE(termino_portaria, %(corte_padrao)s) AS data_corte
+        FROM legislacao
+    ),
+    despesas AS (
+        SELECT categoria_despesa, mes, valor
+        FROM public.parcerias_despesas
+        WHERE numero_termo = %(termo)s
+    ),
+    categorias_previstas AS (
+        SELECT DISTINCT LOWER(categoria_despesa) AS categoria
+        FROM despesas
+        WHERE categoria_despesa IS NOT NULL
+    ),
+    janela AS (
+        -- Recorte do demonstrativo: [mês de início, mês de início + MAX(mes))
+        SELECT
+            DATE_TRUNC('month', (SELECT inicio FROM parceria)::timestamp) AS inicio,
+            DATE_TRUNC('month', (SELECT inicio FROM parceria)::timestamp)
+                + MAKE_INTERVAL(months => (SELECT MAX(mes) FROM despesas)::int) AS fim
+    ),
+    extrato AS (
+        SELECT
+            ce.cat_transacao,
+            ce.cat_avaliacao,
+            ce.discriminacao,
+            ce.competencia,
+            LOWER(ce.cat_transacao) AS transacao,
+            cp.categoria IS NOT NULL AS prevista
+        FROM analises_pc.conc_extrato ce
+        LEFT JOIN categorias_previstas cp ON cp.categoria = LOWER(ce.cat_transacao)
+        WHERE ce.numero_termo = %(termo)s
+          AND ce.discriminacao IS NOT NULL
+    ),
+    extrato_totais AS (
+        SELECT
+            COALESCE(SUM(ABS(discriminacao)) FILTER (
+                WHERE cat_avaliacao = 'Avaliado' AND prevista
+            ), 0) AS executado_aprovado,
+            COALESCE(SUM(ABS(discriminacao)) FILTER (
+                WHERE cat_avaliacao = 'Glosar' AND transacao != 'taxas bancárias'
+            ), 0) AS glosas,
+            COALESCE(SUM(ABS(discriminacao)) FILTER (
+                WHERE transacao = 'taxas bancárias'
+            ), 0) AS taxas,
+            COALESCE(SUM(ABS(discriminacao)) FILTER (
+                WHERE transacao = 'devolução de taxas bancárias'
+            ), 0) AS devolucao_taxas,
+            COALESCE(SUM(ABS(discriminacao)) FILTER (
+                WHERE transacao IN ('restituição de verba', 'devolução de taxas bancárias')
+            ), 0) AS restituicao,
+            COALESCE(SUM(ABS(discriminacao)) FILTER (
+                WHERE cat_transacao IS NOT NULL
+                  AND cat_avaliacao IS NOT NULL
+                  AND cat_avaliacao != 'Pessoa Gestora'
+                  AND competencia IS NOT NULL
+                  AND DATE_TRUNC('month', competencia) >= j.inicio
+                  AND DATE_TRUNC('month', competencia) < j.fim
+                  AND (prevista OR transacao = ANY(%(extras_demonstrativo)s))
+            ), 0) AS executado_demonstrativo
+        FROM extrato
+        CROSS JOIN janela j
+    ),
+    extrato_categorias AS (
+        SELECT
+            cat_transacao,
+            cat_avaliacao,
+            COUNT(*) AS qtd_linhas,
+            SUM(ABS(discriminacao)) AS total_valor,
+            SUM(discriminacao) AS total_projeto,
+            COALESCE(SUM(discriminacao) FILTER (WHERE competencia <= c.data_corte), 0) AS total_ate_corte
+        FROM extrato
+        CROSS JOIN corte c
+        GROUP BY cat_transacao, cat_avaliacao
+    ),
+    rendimentos AS (
+        SELECT
+            COALESCE(SUM(rendimento_bruto), 0) AS total_bruto,
+            COALESCE(SUM(rendimento_ir), 0) AS total_ir,
+            COALESCE(SUM(rendimento_iof), 0) AS total_iof
+        FROM analises_pc.conc_rendimentos
+        WHERE numero_termo = %(termo)s
+    ),
+    contrapartida AS (
+        SELECT
+            COALESCE(SUM(valor_previsto), 0) AS total_contrapartida,
+            COALESCE(SUM(valor_executado), 0) AS total_contrapartida_executada,
+            COALESCE(SUM(GREATEST(valor_previsto - valor_executado, 0)), 0) AS desconto_previsto_executado,
+            COALESCE(SUM(GREATEST(valor_executado - valor_considerado, 0)), 0) AS desconto_executado_considerado
+        FROM analises_pc.conc_contrapartida
+        WHERE numero_termo = %(termo)s
+    )
+    SELECT
+        p.numero_termo IS NOT NULL AS encontrada,
+        p.total_previsto,
+        p.total_pago,
+        p.inicio,
+        p.portaria,
+        a.tem_mista,
+        a.tem_analise,
+        a.responsabilidade_primeira,
+        r.total_bruto,
+        r.total_ir,
+        r.total_iof,
+        cp.total_contrapartida,
+        cp.total_contrapartida_executada,
+        cp.desconto_previsto_executado,
+        cp.desconto_executado_considerado,
+        et.executado_aprovado,
+        et.glosas,
+        et.taxas,
+        et.devolucao_taxas,
+        et.restituicao,
+        et.executado_demonstrativo,
+        (SELECT descontos_realizados
+         FROM analises_pc.conc_banco
+         WHERE numero_termo = %(termo)s
+         LIMIT 1) AS descontos_realizados,
+        lg.termino_portaria,
+        c.data_corte,
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'cat_transacao', cat_transacao,
+                    'cat_avaliacao', cat_avaliacao,
+                    'qtd_linhas', qtd_linhas,
+                    'total_valor', total_valor,
+                    'total_projeto', total_projeto,
+                    'total_ate_corte', total_ate_corte
+                ) ORDER BY cat_transacao, cat_avaliacao), '[]'::json)
+         FROM extrato_categorias) AS extrato_categorias,
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'categoria_despesa', categoria_despesa,
+                    'mes', mes,
+                    'valor', valor
+                ) ORDER BY categoria_despesa, mes), '[]'::json)
+         FROM despesas) AS despesas,
+        (SELECT COALESCE(json_agg(status), '[]'::json)
+         FROM categoricas.c_geral_status
+         WHERE schema_table_coluna_r = 'gestao_financeira.despesas.categoria_provisao'
+           AND ativo = TRUE) AS categorias_provisao
+    FROM analises a
+    LEFT JOIN parceria p ON TRUE
+    CROSS JOIN rendimentos r
+    CROSS JOIN contrapartida cp
+    CROSS JOIN extrato_totais et
+    CROSS JOIN legislacao lg
+    CROSS JOIN corte c
+"""
+
+_LISTAS = ('extrato_categorias', 'despesas', 'categorias_provisao')
+
+
+class _CacheRelatorio:
+
+    def __init__(self, ttl=TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._itens = {}        # numero_termo → (expira_em, versões das TABELAS, dados)
+
+    def obter(self, numero_termo, versoes):
+        with self._lock:
+            item = self._itens.get(numero_termo)
+            if item and item[0] > time.monotonic() and item[1] == versoes:
+                return item[2]
+        return None
+
+    def gravar(self, numero_termo, versoes, dados):
+        agora = time.monotonic()
+        with self._lock:
+            if len(self._itens) >= MAX_ITENS:
+                self._itens = {k: v for k, v in self._itens.items() if v[0] > agora}
+            self._itens[numero_termo] = (agora + self.ttl, versoes, dados)
+
+    def descartar(self, numero_termo=None):
+        with self._lock:
+            if numero_termo is None:
+                self._itens.clear()
+            else:
+                self._itens.pop(numero_termo, None)
+
+
+_cache = _CacheRelatorio()
+
+
+def _copiar(dados):
+    copia = dict(dados)
+    for chave in _LISTAS:
+        copia[chave] = [dict(v) if isinstance(v, dict) else v for v in dados[chave]]
+    return copia
+
+
+def carregar(cur, numero_termo):
+    """
+    Agregados do termo para o relatório de conciliação, numa ida ao banco
+    (ou nenhuma, com o cache válido).
+
+    Returns:
+        dict com os campos da parceria (encontrada=False se o termo não
+        existe), responsabilidade, rendimentos, contrapartida, totais do
+        extrato, descontos_realizados, data_corte e as listas
+        extrato_categorias, despesas e categorias_provisao
+    """
+    versoes = referencia.versoes(*TABELAS)
+    dados = _cache.obter(numero_termo, versoes)
+    if dados is not None:
+        return _copiar(dados)
+
+    cur.execute(_SQL_DADOS, {
+        'termo': numero_termo,
+        'corte_padrao': CORTE_PADRAO,
+        'extras_demonstrativo': CATEGORIAS_EXTRAS_DEMONSTRATIVO,
+    })
+    dados = dict(cur.fetchone())
+    if dados['encontrada']:
+        _cache.gravar(numero_termo, versoes, dados)
+    return _copiar(dados)
+
+
+def invalidar(numero_termo=None, *tabelas):
+    """
+    Descarta o relatório em cache do termo (todos, se None) e avisa os demais
+    workers da escrita em `tabelas`. Chamar após o commit.
+    """
+    _cache.descartar(numero_termo)
+    referencia.invalidar(*tabelas)
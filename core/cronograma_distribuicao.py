@@ -0,0 +1,377 @@
+"""
+Distribuição mensal materializada do cronograma (gestao_orcamentaria)
+
+Os painéis do orçamento detalhado (cronograma pago, comprometido, suas
+versões detalhadas, cronograma detalhado e mensal programado/projetado)
+releram ultra_liquidacoes e ultra_liquidacoes_cronograma inteiras a cada
+requisição, com filtros EXTRACT(YEAR FROM ...) que não usam índice, e a
+distribuição fill-from-start era refeita em Python parcela a parcela.
+
+- gestao_financeira.cronograma_distribuicao guarda o resultado por
+  (ano, serie, numero_termo, parcela, mes); os endpoints só somam as linhas
+  de um (ano, serie) pela chave primária
+- Séries (SERIES):
+    pago / comprometido         valor no mês de vigencia_inicial da parcela
+    pago_distribuido /          valor da parcela distribuído do início do
+    comprometido_distribuido    cronograma até esgotar (destacado = excesso
+                                lançado no último mês)
+    programada / projetada      valor_previsto no mês de vigencia_inicial
+    cronograma                  valor_mes de ultra_liquidacoes_cronograma
+- Triggers em ultra_liquidacoes e ultra_liquidacoes_cronograma marcam o termo
+  em cronograma_distribuicao_pendentes; sincronizar() recalcula só os termos
+  marcados antes da leitura
+- Recarga completa agendada: scripts/atualizar_cronograma_distribuicao.py
+
+Migração equivalente em scripts/migration_cronograma_distribuicao.sql.
+"""
+
+import threading
+
+
+STATUS_PAGO = 'Pago'
+STATUS_ENCAMINHADO = 'Encaminhado para Pagamento'
+
+SERIES = (
+    'pago', 'comprometido',
+    'pago_distribuido', 'comprometido_distribuido',
+    'programada', 'projetada',
+    'cronograma',
+)
+
+TABELAS_ORIGEM = (
+    'gestao_financeira.ultra_liquidacoes',
+    'gestao_financeira.ultra_liquidacoes_cronograma',
+)
+
+_estrutura_ok = False
+_estrutura_lock = threading.Lock()
+
+
+def _existe(cur, nome):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (nome,))
+    row = cur.fetchone()
+    return bool(row[0] if not isinstance(row, dict) else list(row.values())[0])
+
+
+def garantir_estrutura(cur):
+    """
+    DDL guard: tabela materializada, fila de pendentes, função e triggers.
+    Na criação da tabela faz a carga completa.
+
+    Returns:
+        bool: True se a tabela foi criada agora.
+    """
+    criou = not _existe(cur, 'gestao_financeira.cronograma_distribuicao')
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS gestao_financeira.cronograma_distribuicao (
+            ano          SMALLINT         NOT NULL,
+            serie        VARCHAR(30)      NOT NULL,
+            numero_termo VARCHAR(100)     NOT NULL,
+            parcela      TEXT             NOT NULL DEFAULT '',
+            mes          SMALLINT         NOT NULL,
+            valor        DOUBLE PRECISION NOT NULL DEFAULT 0,
+            destacado    BOOLEAN          NOT NULL DEFAULT FALSE,
+            PRIMARY KEY (ano, serie, numero_termo, parcela, mes)
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cronograma_distribuicao_termo
+            ON gestao_financeira.cronograma_distribuicao (numero_termo)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS gestao_financeira.cronograma_distribuicao_pendentes (
+            numero_termo VARCHAR(100) PRIMARY KEY,
+            marcado_em   TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION gestao_financeira.fn_cronograma_distribuicao_marcar()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                IF NEW.numero_termo IS NOT NULL THEN
+                    INSERT INTO gestao_financeira.cronograma_distribuicao_pendentes (numero_termo)
+                    VALUES (NEW.numero_termo)
+                    ON CONFLICT (numero_termo) DO NOTHING;
+                END IF;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                IF OLD.numero_termo IS NOT NULL THEN
+                    INSERT INTO gestao_financeira.cronograma_distribuicao_pendentes (numero_termo)
+                    VALUES (OLD.numero_termo)
+                    ON CONFLICT (numero_termo) DO NOTHING;
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$
+    """)
+    for tabela in TABELAS_ORIGEM:
+        cur.execute(f"""
+            CREATE OR REPLACE TRIGGER trg_cronograma_distribuicao_marcar
+            AFTER INSERT OR UPDATE OR DELETE ON {tabela}
+            FOR EACH ROW EXECUTE FUNCTION gestao_financeira.fn_cronograma_distribuicao_marcar()
+        """)
+
+    if criou:
+        atualizar(cur)
+    return criou
+
+
+# ── Cálculo ──────────────────────────────────────────────────────────────────
+
+def _distribuir(valor_previsto, entradas):
+    """
+    Fill-from-start: preenche os meses do cronograma (ordenados) até esgotar
+    valor_previsto; o excesso vai para o último mês, que fica destacado.
+
+    Returns:
+        [(mes, valor, destacado)]
+    """
+    restante = valor_previsto
+    saida = []
+    for i, (mes, valor_cronograma) in enumerate(entradas):
+        ultimo = i == len(entradas) - 1
+        destacado = False
+        if restante <= 0:
+            valor_mes = 0.0
+        elif ultimo:
+            # Último mês: recebe todo o restante (pode ser > valor_cronograma)
+            valor_mes = restante
+            destacado = restante > valor_cronograma
+            restante = 0.0
+        elif restante >= valor_cronograma:
+            valor_mes = valor_cronograma
+            restante -= valor_cronograma
+        else:
+            # Mês parcial
+            valor_mes = restante
+            restante = 0.0
+        saida.append((mes, valor_mes, destacado))
+    return saida
+
+
+def _carregar_origem(cur, filtro, params):
+    cur.execute(f"""
+        SELECT numero_termo, parcela_numero, parcela_status, parcela_tipo,
+               vigencia_inicial, valor_previsto::float AS valor_previsto,
+               valor_pago::float AS valor_pago
+        FROM gestao_financeira.ultra_liquidacoes
+        WHERE vigencia_inicial IS NOT NULL
+          AND numero_termo IS NOT NULL
+          {filtro}
+    """, params)
+    parcelas = cur.fetchall()
+
+    cur.execute(f"""
+        SELECT numero_termo, parcela_numero, nome_mes, valor_mes::float AS valor_mes
+        FROM gestao_financeira.ultra_liquidacoes_cronograma
+        WHERE nome_mes IS NOT NULL
+          AND numero_termo IS NOT NULL
+          {filtro}
+        ORDER BY numero_termo, parcela_numero, nome_mes
+    """, params)
+    return parcelas, cur.fetchall()
+
+
+def calcular(cur, termos=None):
+    """
+    Linhas de cronograma_distribuicao para `termos` (None = todos).
+
+    Returns:
+        [(ano, serie, numero_termo, parcela, mes, valor, destacado)]
+    """
+    from psycopg2.extras import RealDictCursor
+
+    filtro = "AND numero_termo = ANY(%s)" if termos is not None else ""
+    params = (termos,) if termos is not None else ()
+
+    # sincronizar() e o script de recarga usam cursor comum (tuplas)
+    with cur.connection.cursor(cursor_factory=RealDictCursor) as dcur:
+        parcelas, cronograma = _carregar_origem(dcur, filtro, params)
+
+    linhas = {}     # (ano, serie, termo, parcela, mes) → [valor, destacado]
+
+    def _somar(ano, serie, termo, parcela, mes, valor, destacado=False):
+        item = linhas.setdefault((ano, serie, termo, parcela, mes), [0.0, False])
+        item[0] += valor
+        item[1] = item[1] or destacado
+
+    # Valor da parcela por status, para a distribuição (mesma chave do cronograma)
+    valor_pago = {}          # (ano, termo, parcela_numero) → valor
+    valor_comprometido = {}
+
+    for p in parcelas:
+        termo, numero = p['numero_termo'], p['parcela_numero']
+        parcela = '' if numero is None else str(numero)
+        ano, mes = p['vigencia_inicial'].year, p['vigencia_inicial'].month
+        previsto = p['valor_previsto'] or 0.0
+
+        serie_mensal = 'programada' if p['parcela_tipo'] == 'Programada' else 'projetada'
+        _somar(ano, serie_mensal, termo, parcela, mes, previsto)
+
+        # Pago inclui o valor parcial de parcelas encaminhadas com valor_pago > 0
+        pago = None
+        if p['parcela_status'] == STATUS_PAGO:
+            pago = previsto
+        elif p['parcela_status'] == STATUS_ENCAMINHADO and (p['valor_pago'] or 0) > 0:
+            pago = p['valor_pago']
+        if pago is not None:
+            _somar(ano, 'pago', termo, parcela, mes, pago)
+            valor_pago[(ano, termo, numero)] = valor_pago.get((ano, termo, numero), 0.0) + pago
+
+        if p['parcela_status'] == STATUS_ENCAMINHADO:
+            _somar(ano, 'comprometido', termo, parcela, mes, previsto)
+            chave = (ano, termo, numero)
+            valor_comprometido[chave] = valor_comprometido.get(chave, 0.0) + previsto
+
+    entradas = {}            # (ano, termo, parcela_numero) → [(mes, valor_mes)] em ordem
+    for c in cronograma:
+        termo, numero = c['numero_termo'], c['parcela_numero']
+        ano, mes = c['nome_mes'].year, c['nome_mes'].month
+        valor = c['valor_mes'] or 0.0
+        entradas.setdefault((ano, termo, numero), []).append((mes, valor))
+        _somar(ano, 'cronograma', termo, '' if numero is None else str(numero), mes, valor)
+
+    for serie, valores in (('pago_distribuido', valor_pago),
+                           ('comprometido_distribuido', valor_comprometido)):
+        for (ano, termo, numero), valor in valores.items():
+            meses = sorted(entradas.get((ano, termo, numero), []), key=lambda x: x[0])
+            parcela = '' if numero is None else str(numero)
+            for mes, valor_mes, destacado in _distribuir(valor, meses):
+                _somar(ano, serie, termo, parcela, mes, valor_mes, destacado)
+
+    return [chave + (v[0], v[1]) for chave, v in linhas.items()]
+
+
+def atualizar(cur, termos=None):
+    """
+    Recalcula cronograma_distribuicao.
+
+    Args:
+        termos: numero_termo a recalcular; None = recarga completa.
+
+    Returns:
+        int: linhas gravadas.
+    """
+    from psycopg2.extras import execute_values
+
+    if termos is not None:
+        termos = sorted({t for t in termos if t})
+        if not termos:
+            return 0
+        linhas = calcular(cur, termos)
+        cur.execute("DELETE FROM gestao_financeira.cronograma_distribuicao WHERE numero_termo = ANY(%s)",
+                    (termos,))
+    else:
+        linhas = calcular(cur)
+        cur.execute("DELETE FROM gestao_financeira.cronograma_distribuicao")
+        # Tudo recalculado: marcações anteriores à carga já estão refletidas
+        cur.execute("DELETE FROM gestao_financeira.cronograma_distribuicao_pendentes")
+
+    if linhas:
+        execute_values(cur, """
+            INSERT INTO gestao_financeira.cronograma_distribuicao
+                (ano, serie, numero_termo, parcela, mes, valor, destacado)
+            VALUES %s
+        """, linhas, page_size=1000)
+    return len(linhas)
+
+
+def sincronizar():
+    """
+    Garante a estrutura (uma vez por processo) e recalcula os termos pendentes,
+    numa conexão própria do pool. Termos que outra requisição já está
+    recalculando são pulados (SKIP LOCKED).
+
+    Returns:
+        int: termos recalculados.
+    """
+    global _estrutura_ok
+    from db import pooled_connection
+
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                if not _estrutura_ok:
+                    with _estrutura_lock:
+                        if not _estrutura_ok:
+                            if garantir_estrutura(cur):
+                                print("[CRONOGRAMA_DISTRIBUICAO] Tabela criada e carregada")
+                            conn.commit()
+                            _estrutura_ok = True
+
+                cur.execute("""
+                    DELETE FROM gestao_financeira.cronograma_distribuicao_pendentes
+                    WHERE numero_termo IN (
+                        SELECT numero_termo FROM gestao_financeira.cronograma_distribuicao_pendentes
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING numero_termo
+                """)
+                termos = [r[0] for r in cur.fetchall()]
+                if termos:
+                    atualizar(cur, termos)
+            conn.commit()
+    except Exception as e:
+        # Leitura segue com a tabela como está; os termos continuam pendentes
+        print(f"[CRONOGRAMA_DISTRIBUICAO] Falha ao sincronizar pendentes: {e}")
+        return 0
+    return len(termos)
+
+
+# ── Leitura ──────────────────────────────────────────────────────────────────
+
+def por_mes(cur, ano, serie):
+    """{numero_termo: {mes: valor}} da série no ano."""
+    cur.execute("""
+        SELECT numero_termo, mes, SUM(valor) AS valor
+        FROM gestao_financeira.cronograma_distribuicao
+        WHERE ano = %s AND serie = %s
+        GROUP BY numero_termo, mes
+        ORDER BY numero_termo, mes
+    """, (ano, serie))
+    dados = {}
+    for row in cur.fetchall():
+        dados.setdefault(row['numero_termo'], {})[int(row['mes'])] = float(row['valor'] or 0)
+    return dados
+
+
+def distribuicao(cur, ano, serie):
+    """{numero_termo: {'meses': {mes: valor}, 'highlighted': [mes]}} da série distribuída."""
+    cur.execute("""
+        SELECT numero_termo, mes, SUM(valor) AS valor, BOOL_OR(destacado) AS destacado
+        FROM gestao_financeira.cronograma_distribuicao
+        WHERE ano = %s AND serie = %s
+        GROUP BY numero_termo, mes
+        ORDER BY numero_termo, mes
+    """, (ano, serie))
+    dados = {}
+    for row in cur.fetchall():
+        termo = dados.setdefault(row['numero_termo'], {'meses': {}, 'highlighted': []})
+        mes = int(row['mes'])
+        termo['meses'][mes] = float(row['valor'] or 0)
+        if row['destacado']:
+            termo['highlighted'].append(mes)
+    return dados
+
+
+def cronograma_detalhado(cur, ano):
+    """{numero_termo: {mes: {'valor', 'parcelas'}}} de ultra_liquidacoes_cronograma no ano."""
+    cur.execute("""
+        SELECT numero_termo, mes, SUM(valor) AS valor,
+               ARRAY_AGG(parcela ORDER BY parcela) AS parcelas
+        FROM gestao_financeira.cronograma_distribuicao
+        WHERE ano = %s AND serie = 'cronograma'
+        GROUP BY numero_termo, mes
+        ORDER BY numero_termo, mes
+    """, (ano,))
+    dados = {}
+    for row in cur.fetchall():
+        dados.setdefault(row['numero_termo'], {})[int(row['mes'])] = {
+            'valor': float(row['valor'] or 0),
+            'parcelas': [p or None for p in row['parcelas']],
+        }
+    return dados
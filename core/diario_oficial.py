@@ -0,0 +1,535 @@
+"""
+Ingestão de nomeações CDA do Diário Oficial (gestao_pessoas.buscar_do)
+
+Cada busca baixava e parseava (html.parser) a página de pesquisa inteira do
+D.O. e depois cada Título de Nomeação do período, um após o outro — mesmo
+os já lidos em buscas anteriores com períodos sobrepostos.
+
+- A listagem de pesquisa (sempre a mesma URL; o período é filtrado aqui)
+  fica gravada em gestao_pessoas.do_listagem com ETag/Last-Modified: por
+  FRESCOR_LISTAGEM s é servida do banco e depois revalidada com requisição
+  condicional (304 = nada novo). Se o D.O. não responder, vale a última
+  gravada
+- Documentos já parseados ficam em gestao_pessoas.do_documentos (número,
+  data, nomeações em JSONB). Só os números ainda não vistos são baixados,
+  em paralelo (MAX_WORKERS) numa requests.Session com pool de conexões e
+  novas tentativas para falhas transitórias
+- Parser lxml quando instalado (html.parser como alternativa); a listagem
+  só monta a árvore dos blocos div.dadosDocumento
+- Mudou o parsing? Aumentar VERSAO_PARSER: documentos gravados com versão
+  anterior são baixados e parseados de novo na próxima busca que os cobrir
+- O banco é usado em transações curtas numa conexão própria do pool
+  (lê, commit; rede; grava, commit): nenhuma transação fica aberta durante
+  os downloads. Sem banco (conexao=None) a busca funciona como antes, sem
+  memória
+- Texto decodificado como UTF-8 quando válido, senão pela detecção do
+  conteúdo (o charset do Content-Type nem sempre é o real)
+
+As funções parse_* são puras (HTML → dados) e ClienteDO aceita qualquer
+sessão com .get(): testes/test_diario_oficial.py roda a busca sobre HTML
+salvo em testes/fixtures/diario_oficial, sem rede e sem banco.
+
+Uso:
+    from db import pooled_connection
+    resultado = diario_oficial.buscar(pooled_connection, data_inicio, data_fim)
+"""
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import lxml  # noqa: F401
+    PARSER_HTML = 'lxml'
+except ImportError:
+    PARSER_HTML = 'html.parser'
+
+
+DO_BASE_URL = 'https://diariooficial.prefeitura.sp.gov.br/'
+DO_SEARCH_URL = DO_BASE_URL + 'md_epubli_controlador.php'
+DO_SEARCH_TERM = '"Secretaria Municipal de Direitos Humanos e Cidadania, vaga"'
+DO_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'pt-BR,pt;q=0.9',
+    'Referer': DO_BASE_URL,
+}
+
+VERSAO_PARSER = 1
+FRESCOR_LISTAGEM = int(os.environ.get('DO_FRESCOR_LISTAGEM', '300'))
+MAX_WORKERS = 4
+TIMEOUT = 15
+
+
+# ── Parsing (puro) ───────────────────────────────────────────────────────────
+
+def parse_int(value):
+    """Extrai apenas dígitos de uma string e retorna como int, ou None."""
+    if not value:
+        return None
+    digits = re.sub(r'\D', '', str(value))
+    return int(digits) if digits else None
+
+
+def parse_data(date_str):
+    """Converte 'DD/MM/YYYY' para objeto date, ou None."""
+    if not date_str:
+        return None
+    try:
+        return datetime.strptime(date_str.strip(), '%d/%m/%Y').date()
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_nomeacoes_texto(text, data_publicacao='', num_doc=''):
+    """
+    Extrai nomeações de cargo CDA a partir de texto plano do D.O.
+    Retorna lista de dicts com: cda, numero_vaga, nome_servidor, numero_rf,
+    data_publicacao, numero_documento, unidade, observacoes
+    """
+    results = []
+    lines = text.split('\n')
+
+    # Agrupa linhas em chunks: uma nomeação pode estar dividida em várias linhas.
+    # Um novo chunk começa ao encontrar linha numerada ("1. NOME" / "1- NOME")
+    # ou ao encontrar uma linha em branco. Linhas de continuação são concatenadas.
+    chunks = []
+    current = []
+    for raw in lines:
+        stripped = raw.strip()
+        # Linha em branco = fim de bloco
+        if not stripped:
+            if current:
+                chunks.append(' '.join(current))
+                current = []
+            continue
+        # Nova entrada numerada ("1. NOME" ou "1- NOME") = novo bloco
+        if re.match(r'^\d+[.\-]\s+[A-ZÁÉÍÓÚÀÂÊÎÔÛÃÕ]', stripped):
+            if current:
+                chunks.append(' '.join(current))
+            current = [stripped]
+        else:
+            current.append(stripped)
+    if current:
+        chunks.append(' '.join(current))
+
+    for chunk in chunks:
+        upper = chunk.upper()
+        if 'CDA' not in upper:
+            continue
+
+        # Nome: tudo antes de ", RG", ", RF" ou ", CPF"
+        name_match = re.match(r'^(.+?),\s*(?:\w+/)?(?:RG|RF|CPF)(?:/\w+)?\s+', chunk, re.IGNORECASE)
+        name = name_match.group(1).strip() if name_match else ''
+        # Remove prefixos comuns
+        name = re.sub(
+            r'^Nomear\s+(?:o\s+senhor(?:a)?|a\s+senhora|o\s+servidor|a\s+servidora'
+            r'|o\s+sr\.?|a\s+sr[aª]\.?)\s+',
+            '', name, flags=re.IGNORECASE
+        ).strip()
+        name = re.sub(r'^Nomear\s+', '', name, flags=re.IGNORECASE).strip()
+        # Remove prefixos de lista numerada: "1- ", "2- ", "1. ", etc.
+        name = re.sub(r'^\d+[-\u2013.]\s*', '', name).strip()
+
+        # RF
+        rf_match = re.search(r'\bRF\s+([\d.]+(?:-\d)?)', chunk, re.IGNORECASE)
+        numero_rf = parse_int(rf_match.group(1)) if rf_match else None
+
+        # CDA
+        cda_match = re.search(r'\bCDA-?(\d+)', chunk, re.IGNORECASE)
+        cda = int(cda_match.group(1)) if cda_match else None
+
+        # Vaga (explícita: "vaga 21989"; ou implícita: número isolado entre vírgulas)
+        vaga_match = re.search(r'\bvaga\s+(\d+)', chunk, re.IGNORECASE)
+        if not vaga_match:
+            vaga_match = re.search(r',\s*(\d{4,6})\s*[,.]', chunk)
+        numero_vaga = int(vaga_match.group(1)) if vaga_match else None
+
+        if cda and numero_vaga:
+            results.append({
+                'cda': cda,
+                'numero_vaga': numero_vaga,
+                'nome_servidor': name,
+                'numero_rf': numero_rf,
+                'data_publicacao': data_publicacao,
+                'unidade': '',
+                'numero_documento': parse_int(num_doc),
+                'observacoes': '',
+            })
+    return results
+
+
+def parse_documento(html, doc_number=''):
+    """Parseia a página (texto) de um documento do D.O. e extrai nomeações."""
+    soup = BeautifulSoup(html, PARSER_HTML)
+    full_text = soup.get_text('\n')
+
+    # Data de publicação
+    data_pub = ''
+    span_pub = soup.select_one('.info__publicacao, [class*="publicacao"]')
+    if span_pub:
+        m = re.search(r'Publica(?:ç|c)(?:ã|a)o:\s*(\d{2}/\d{2}/\d{4})', span_pub.get_text(), re.IGNORECASE)
+        if m:
+            data_pub = m.group(1)
+    if not data_pub:
+        m = re.search(r'Publica(?:ç|c)(?:ã|a)o:\s*(\d{2}/\d{2}/\d{4})', full_text, re.IGNORECASE)
+        if m:
+            data_pub = m.group(1)
+
+    # Número do documento (tentativa automática)
+    if not doc_number:
+        # 1. Prioridade: <title>ARQUIP | DOSP - XXXXXXXX - ...</title>
+        title_tag = soup.find('title')
+        if title_tag:
+            m = re.search(r'DOSP\s*-\s*(\d+)', title_tag.get_text())
+            if m:
+                doc_number = m.group(1)
+    if not doc_number:
+        # 2. SEI nº XXXXXXXX (rodapé)
+        m = re.search(r'SEI\s+n[°º.]\s*(\d+)', full_text, re.IGNORECASE)
+        if m:
+            doc_number = m.group(1)
+    if not doc_number:
+        # 3. Fallback: "o seguinte documento ... integra este ato XXXXXXXX"
+        m = re.search(r'O seguinte documento\b[\w\s]*\bintegra este ato\s+(\d+)', full_text, re.IGNORECASE)
+        if m:
+            doc_number = m.group(1)
+
+    return parse_nomeacoes_texto(full_text, data_pub, doc_number)
+
+
+_SO_DOCUMENTOS = SoupStrainer('div', class_='dadosDocumento')
+
+
+def parse_listagem(html):
+    """
+    Títulos de Nomeação da página de pesquisa do D.O., de qualquer data.
+
+    Returns:
+        lista de {url, numero, data ('DD/MM/YYYY'), tipo}, na ordem da página
+    """
+    soup = BeautifulSoup(html, PARSER_HTML, parse_only=_SO_DOCUMENTOS)
+    documentos = []
+
+    for div in soup.find_all('div', class_='dadosDocumento'):
+        # Tipo: verificar se é Título de Nomeação
+        link = div.select_one('a.nroSei')
+        if not link:
+            continue
+
+        tipo_span = link.find_next_sibling('span')
+        tipo = tipo_span.get_text(strip=True) if tipo_span else ''
+        if 'Título de Nomeação' not in tipo and 'titulo de nomeacao' not in tipo.lower():
+            continue
+
+        # Data de publicação
+        data_span = div.select_one('span.dataPublicacao')
+        data_pub_text = data_span.get_text(strip=True) if data_span else ''
+        m = re.search(r'(\d{2}/\d{2}/\d{4})', data_pub_text)
+        if not m or not parse_data(m.group(1)):
+            continue
+
+        doc_url = link.get('href', '')
+        doc_numero = link.get_text(strip=True)
+
+        # Normaliza URL
+        if doc_url and not doc_url.startswith('http'):
+            doc_url = DO_BASE_URL + doc_url.lstrip('/')
+
+        documentos.append({
+            'url': doc_url,
+            'numero': doc_numero,
+            'data': m.group(1),
+            'tipo': tipo.lstrip(' -').strip(),
+        })
+
+    return documentos
+
+
+# ── HTTP ─────────────────────────────────────────────────────────────────────
+
+def texto_resposta(resposta):
+    """
+    Corpo da resposta como texto. O D.O. nem sempre declara o charset certo
+    no Content-Type: UTF-8 válido é aceito direto; senão vale a detecção pelo
+    conteúdo (apparent_encoding), como no scraping original.
+    """
+    try:
+        return resposta.content.decode('utf-8')
+    except UnicodeDecodeError:
+        resposta.encoding = resposta.apparent_encoding or 'utf-8'
+        return resposta.text
+
+
+class ClienteDO:
+    """GETs no D.O. numa sessão com pool de conexões (recriada após fork)."""
+
+    def __init__(self, sessao=None, max_workers=MAX_WORKERS, timeout=TIMEOUT):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._fixa = sessao
+        self._lock = threading.Lock()
+        self._sessao_atual = None
+        self._pid = None
+
+    def _sessao(self):
+        if self._fixa is not None:
+            return self._fixa
+        with self._lock:
+            if self._sessao_atual is None or self._pid != os.getpid():
+                sessao = requests.Session()
+                sessao.headers.update(DO_HEADERS)
+                adaptador = HTTPAdapter(
+                    pool_connections=2,
+                    pool_maxsize=self.max_workers * 2,
+                    max_retries=Retry(total=2, backoff_factor=0.5,
+                                      status_forcelist=(429, 500, 502, 503, 504),
+                                      allowed_methods=('GET',)),
+                )
+                sessao.mount('https://', adaptador)
+                sessao.mount('http://', adaptador)
+                self._sessao_atual = sessao
+                self._pid = os.getpid()
+            return self._sessao_atual
+
+    def get(self, url, params=None, headers=None):
+        return self._sessao().get(url, params=params, headers={**DO_HEADERS, **(headers or {})},
+                                  timeout=self.timeout)
+
+
+# ── Pipeline ─────────────────────────────────────────────────────────────────
+
+class IngestaoDO:
+    """
+    Busca com memória no banco. `conexao` (em buscar) é uma fábrica de
+    conexões no formato de db.pooled_connection; cada etapa de banco abre uma
+    transação curta e faz commit antes de qualquer acesso à rede.
+    """
+
+    def __init__(self, cliente=None):
+        self.cliente = cliente or ClienteDO()
+        self._estrutura_ok = False
+        self._lock = threading.Lock()
+
+    # ── Banco ────────────────────────────────────────────────────────────
+
+    def garantir_estrutura(self, conn):
+        """DDL guard das tabelas de memória da ingestão (uma vez por processo, com commit)."""
+        if self._estrutura_ok:
+            return
+        with self._lock:
+            if self._estrutura_ok:
+                return
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS gestao_pessoas.do_listagem (
+                        termo          TEXT PRIMARY KEY,
+                        etag           TEXT,
+                        last_modified  TEXT,
+                        documentos     JSONB NOT NULL DEFAULT '[]'::jsonb,
+                        verificado_em  TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+                    )
+                """)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS gestao_pessoas.do_documentos (
+                        numero           TEXT PRIMARY KEY,
+                        url              TEXT,
+                        tipo             TEXT,
+                        data_publicacao  DATE,
+                        versao_parser    SMALLINT NOT NULL,
+                        nomeacoes        JSONB NOT NULL DEFAULT '[]'::jsonb,
+                        processado_em    TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+                    )
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_do_documentos_data_publicacao
+                        ON gestao_pessoas.do_documentos (data_publicacao)
+                """)
+            conn.commit()
+            # Só depois do commit: DDL desfeito por rollback não marca a estrutura como pronta
+            self._estrutura_ok = True
+
+    def _no_banco(self, conexao, etapa, *args):
+        """
+        etapa(cur, *args) numa transação curta com commit. None sem banco ou
+        se ele falhar (a busca segue sem memória).
+        """
+        if conexao is None:
+            return None
+        try:
+            with conexao() as conn:
+                self.garantir_estrutura(conn)
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    resultado = etapa(cur, *args)
+                conn.commit()
+            return resultado
+        except Exception as e:
+            print(f'[gestao_pessoas] Memória da ingestão do D.O. indisponível: {e}')
+            return None
+
+    @staticmethod
+    def _listagem_salva(cur):
+        cur.execute("""
+            SELECT etag, last_modified, documentos,
+                   EXTRACT(EPOCH FROM (NOW() - verificado_em)) AS idade
+            FROM gestao_pessoas.do_listagem
+            WHERE termo = %s
+        """, (DO_SEARCH_TERM,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _documentos_salvos(cur, numeros):
+        if not numeros:
+            return {}
+        cur.execute("""
+            SELECT numero, nomeacoes
+            FROM gestao_pessoas.do_documentos
+            WHERE numero = ANY(%s)
+              AND versao_parser >= %s
+        """, (sorted(numeros), VERSAO_PARSER))
+        return {r['numero']: r['nomeacoes'] for r in cur.fetchall()}
+
+    @staticmethod
+    def _gravar(cur, listagem, validadores, documentos, nomeacoes):
+        if validadores is not None:
+            cur.execute("""
+                INSERT INTO gestao_pessoas.do_listagem (termo, etag, last_modified, documentos, verificado_em)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (termo) DO UPDATE
+                SET etag = EXCLUDED.etag,
+                    last_modified = EXCLUDED.last_modified,
+                    documentos = EXCLUDED.documentos,
+                    verificado_em = NOW()
+            """, (DO_SEARCH_TERM, *validadores, Json(listagem)))
+        if documentos:
+            execute_values(cur, """
+                INSERT INTO gestao_pessoas.do_documentos
+                    (numero, url, tipo, data_publicacao, versao_parser, nomeacoes)
+                VALUES %s
+                ON CONFLICT (numero) DO UPDATE
+                SET url = EXCLUDED.url,
+                    tipo = EXCLUDED.tipo,
+                    data_publicacao = EXCLUDED.data_publicacao,
+                    versao_parser = EXCLUDED.versao_parser,
+                    nomeacoes = EXCLUDED.nomeacoes,
+                    processado_em = NOW()
+            """, [
+                (d['numero'], d['url'], d['tipo'], parse_data(d['data']), VERSAO_PARSER,
+                 Json(nomeacoes[d['numero']]))
+                for d in documentos
+            ], page_size=len(documentos))
+
+    # ── Rede ─────────────────────────────────────────────────────────────
+
+    def _listagem(self, salva):
+        """
+        (documentos, erro, validadores) a partir da listagem gravada `salva`:
+        ela mesma enquanto fresca, senão revalidada no D.O. validadores =
+        (etag, last_modified) a gravar, ou None se nada mudou no banco.
+        """
+        if salva and salva['idade'] < FRESCOR_LISTAGEM:
+            return salva['documentos'], None, None
+
+        condicionais = {}
+        if salva and salva['etag']:
+            condicionais['If-None-Match'] = salva['etag']
+        if salva and salva['last_modified']:
+            condicionais['If-Modified-Since'] = salva['last_modified']
+        try:
+            resp = self.cliente.get(DO_SEARCH_URL, params={
+                'acao': 'materias_pesquisar',
+                'textTermoPesquisa': DO_SEARCH_TERM,
+            }, headers=condicionais)
+            if resp.status_code == 304 and salva:
+                documentos = salva['documentos']
+                etag, last_modified = salva['etag'], salva['last_modified']
+            else:
+                resp.raise_for_status()
+                documentos = parse_listagem(texto_resposta(resp))
+                etag, last_modified = resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+        except requests.RequestException as e:
+            if salva:
+                print(f'[gestao_pessoas] D.O. indisponível; usando a listagem gravada: {e}')
+                return salva['documentos'], None, None
+            return [], f'Erro ao acessar o D.O.: {e}', None
+
+        return documentos, None, (etag, last_modified)
+
+    def _baixar(self, doc):
+        """Nomeações de um documento, ou None se o download falhar (tenta de novo na próxima busca)."""
+        try:
+            resp = self.cliente.get(doc['url'])
+            resp.raise_for_status()
+            return parse_documento(texto_resposta(resp), doc['numero'])
+        except requests.RequestException as e:
+            print(f"[gestao_pessoas] Erro ao buscar doc {doc['numero']}: {e}")
+            return None
+
+    # ── API ──────────────────────────────────────────────────────────────
+
+    def buscar(self, conexao, data_inicio_str, data_fim_str):
+        """
+        Títulos de Nomeação da SMDHC publicados no período e suas nomeações.
+
+        Args:
+            conexao: fábrica de conexões (db.pooled_connection) ou None para
+                     buscar sem memória
+            data_inicio_str / data_fim_str: 'DD/MM/YYYY'
+
+        Returns:
+            dict com 'documentos' ({url, numero, data, tipo}), 'nomeacoes'
+            (com _doc_numero/_doc_url) e 'erro' (str|None)
+        """
+        data_inicio = parse_data(data_inicio_str)
+        data_fim = parse_data(data_fim_str)
+        if not data_inicio or not data_fim:
+            return {'documentos': [], 'nomeacoes': [], 'erro': 'Datas inválidas.'}
+
+        salva = self._no_banco(conexao, self._listagem_salva)
+        listagem, erro, validadores = self._listagem(salva)
+        if erro:
+            return {'documentos': [], 'nomeacoes': [], 'erro': erro}
+
+        documentos = [d for d in listagem if data_inicio <= parse_data(d['data']) <= data_fim]
+        com_url = [d for d in documentos if d['url']]
+
+        numeros = {d['numero'] for d in com_url}
+        nomeacoes_por_doc = self._no_banco(conexao, self._documentos_salvos, numeros) or {}
+        em_memoria = len(nomeacoes_por_doc)
+        novos = list({d['numero']: d for d in com_url if d['numero'] not in nomeacoes_por_doc}.values())
+        ok = []
+        if novos:
+            with ThreadPoolExecutor(max_workers=min(self.cliente.max_workers, len(novos))) as executor:
+                baixados = list(executor.map(self._baixar, novos))
+            for doc, noms in zip(novos, baixados):
+                if noms is not None:
+                    ok.append(doc)
+                    nomeacoes_por_doc[doc['numero']] = noms
+        print(f'[gestao_pessoas] D.O.: {len(documentos)} documento(s) no período, '
+              f'{em_memoria} da memória, {len(ok)}/{len(novos)} baixado(s)')
+
+        if validadores is not None or ok:
+            self._no_banco(conexao, self._gravar, listagem, validadores, ok, nomeacoes_por_doc)
+
+        # Enriquecer com info do documento
+        todas_nomeacoes = []
+        for doc in com_url:
+            for n in nomeacoes_por_doc.get(doc['numero']) or []:
+                todas_nomeacoes.append({**n, '_doc_numero': doc['numero'], '_doc_url': doc['url']})
+
+        return {'documentos': documentos, 'nomeacoes': todas_nomeacoes, 'erro': None}
+
+
+_ingestao = IngestaoDO()
+
+buscar = _ingestao.buscar
+garantir_estrutura = _ingestao.garantir_estrutura
@@ -0,0 +1,228 @@
+"""
+Colunas normalizadas e saldos materializados de empenhos (back_empenhos)
+
+O SOF entrega os valores como texto ("1234,56") e o processo formatado de
+formas diferentes em parcerias.sei_celeb ("6074.2023/0004039-2") e em
+back_empenhos.cod_nro_pcss_sof. Para que a listagem de Ultra Liquidações não
+precise converter texto e casar via REGEXP_REPLACE a cada requisição:
+
+- back_empenhos ganha colunas numéricas (*_num) e a chave cod_pcss_norm,
+  preenchidas na importação (gestao_financeira.api_importar_empenhos)
+- parcerias ganha sei_celeb_norm (coluna gerada, indexada)
+- back_empenhos_saldos guarda os totais por (cod_sof, ano, elemento) e é
+  recalculada apenas para os processos tocados pela importação
+
+Migração equivalente em scripts/migration_back_empenhos_saldos.sql.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+
+
+# Colunas de valor do SOF (texto) → coluna numérica normalizada
+COLUNAS_VALOR = {
+    'VAL_TOT_EPH': 'val_tot_eph_num',
+    'VAL_TOT_CANC_EPH': 'val_tot_canc_eph_num',
+    'VAL_TOT_LQDC_EPH': 'val_tot_lqdc_eph_num',
+    'VAL_TOT_PAGO_EPH': 'val_tot_pago_eph_num',
+}
+
+
+def normalizar_processo_sof(processo):
+    """'6074.2023/0004039-2' → '6074202300040392' (None se vazio)."""
+    if not processo:
+        return None
+    return re.sub(r'[.\-/\s]', '', str(processo)) or None
+
+
+def valor_sof_decimal(valor):
+    """
+    Converte valor do SOF para Decimal.
+    Aceita '1234,56', '1234.56' e '1.234,56'; retorna None se não for número.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, Decimal):
+        return valor
+    s = str(valor).strip()
+    if not s:
+        return None
+    if ',' in s and '.' in s:
+        s = s.replace('.', '').replace(',', '.')
+    elif ',' in s:
+        s = s.replace(',', '.')
+    try:
+        return Decimal(s)
+    except InvalidOperation:
+        return None
+
+
+def _existe(cur, sql, params):
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    if not row:
+        return False
+    return bool(row['existe'] if isinstance(row, dict) else row[0])
+
+
+def _coluna_existe(cur, schema, tabela, coluna):
+    return _existe(cur, """
+        SELECT EXISTS (
+            SELECT FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s AND column_name = %s
+        ) AS existe
+    """, (schema, tabela, coluna))
+
+
+def estrutura_disponivel(cur):
+    """True se colunas normalizadas e tabela de saldos já foram criadas."""
+    return _existe(cur, """
+        SELECT (
+            EXISTS (SELECT FROM information_schema.tables
+                    WHERE table_schema = 'gestao_financeira'
+                      AND table_name = 'back_empenhos_saldos')
+            AND EXISTS (SELECT FROM information_schema.columns
+                        WHERE table_schema = 'public' AND table_name = 'parcerias'
+                          AND column_name = 'sei_celeb_norm')
+            AND EXISTS (SELECT FROM information_schema.columns
+                        WHERE table_schema = 'gestao_financeira'
+                          AND table_name = 'back_empenhos'
+                          AND column_name = 'cod_pcss_norm')
+        ) AS existe
+    """, ())
+
+
+def garantir_estrutura(cur):
+    """
+    DDL guard: cria colunas normalizadas, índices e tabela de saldos se faltarem.
+    Na primeira execução faz o backfill das linhas existentes e a carga
+    completa dos saldos.
+
+    Returns:
+        bool: True se a estrutura foi criada agora (saldos já recalculados).
+    """
+    criou = False
+
+    for coluna in COLUNAS_VALOR.values():
+        if not _coluna_existe(cur, 'gestao_financeira', 'back_empenhos', coluna):
+            cur.execute(f"""
+                ALTER TABLE gestao_financeira.back_empenhos
+                ADD COLUMN {coluna} NUMERIC(15,2)
+            """)
+            criou = True
+
+    if not _coluna_existe(cur, 'gestao_financeira', 'back_empenhos', 'cod_pcss_norm'):
+        cur.execute("""
+            ALTER TABLE gestao_financeira.back_empenhos
+            ADD COLUMN cod_pcss_norm VARCHAR(30)
+        """)
+        criou = True
+
+    if not _coluna_existe(cur, 'public', 'parcerias', 'sei_celeb_norm'):
+        # Coluna gerada: acompanha qualquer edição de sei_celeb sem tocar nas rotas de parcerias
+        cur.execute("""
+            ALTER TABLE public.parcerias
+            ADD COLUMN sei_celeb_norm VARCHAR(30)
+            GENERATED ALWAYS AS (
+                NULLIF(REGEXP_REPLACE(sei_celeb, '[-./[:space:]]', '', 'g'), '')
+            ) STORED
+        """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_parcerias_sei_celeb_norm
+            ON public.parcerias (sei_celeb_norm)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_back_empenhos_pcss_norm
+            ON gestao_financeira.back_empenhos (cod_pcss_norm, dt_eph)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS gestao_financeira.back_empenhos_saldos (
+            cod_sof            VARCHAR(30) NOT NULL,
+            ano                INTEGER     NOT NULL,
+            elemento           INTEGER     NOT NULL,
+            val_tot_eph        NUMERIC(15,2) NOT NULL DEFAULT 0,
+            val_tot_canc_eph   NUMERIC(15,2) NOT NULL DEFAULT 0,
+            val_tot_lqdc_eph   NUMERIC(15,2) NOT NULL DEFAULT 0,
+            val_tot_pago_eph   NUMERIC(15,2) NOT NULL DEFAULT 0,
+            disponivel         NUMERIC(15,2) NOT NULL DEFAULT 0,
+            qtd_empenhos       INTEGER     NOT NULL DEFAULT 0,
+            atualizado_em      TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (cod_sof, ano, elemento)
+        )
+    """)
+
+    if criou:
+        backfill_colunas_normalizadas(cur)
+        atualizar_saldos(cur)
+    return criou
+
+
+def _sql_valor_sof(coluna):
+    """Mesma conversão de valor_sof_decimal em SQL (NULL se não for número)."""
+    v = f"BTRIM({coluna})"
+    # '1.234,56' → '1234.56'; '1234,56' → '1234.56'; '1234.56' fica como está
+    norm = (f"CASE WHEN STRPOS({v}, ',') > 0 AND STRPOS({v}, '.') > 0 "
+            f"THEN REPLACE(REPLACE({v}, '.', ''), ',', '.') ELSE REPLACE({v}, ',', '.') END")
+    return f"CASE WHEN ({norm}) ~ '^[+-]?([0-9]+\\.?[0-9]*|\\.[0-9]+)$' THEN ({norm})::numeric END"
+
+
+def backfill_colunas_normalizadas(cur):
+    """Preenche *_num e cod_pcss_norm das linhas gravadas antes da migração."""
+    sets = ',\n                '.join(
+        f"{num} = {_sql_valor_sof(txt)}" for txt, num in COLUNAS_VALOR.items()
+    )
+    cur.execute(f"""
+        UPDATE gestao_financeira.back_empenhos
+        SET {sets},
+            cod_pcss_norm = NULLIF(REGEXP_REPLACE(cod_nro_pcss_sof, '[-./[:space:]]', '', 'g'), '')
+    """)
+    return cur.rowcount
+
+
+def atualizar_saldos(cur, processos=None):
+    """
+    Recalcula back_empenhos_saldos.
+
+    Args:
+        processos: chaves normalizadas a recalcular; None = recarga completa.
+
+    Disponível = Total - Cancelado - Pago (liquidado não entra, igual à listagem).
+    """
+    filtro = ''
+    params = ()
+    if processos is not None:
+        processos = [p for p in processos if p]
+        if not processos:
+            return 0
+        filtro = 'WHERE cod_sof = ANY(%s)'
+        params = (processos,)
+
+    cur.execute(f"DELETE FROM gestao_financeira.back_empenhos_saldos {filtro}", params)
+    cur.execute(f"""
+        INSERT INTO gestao_financeira.back_empenhos_saldos (
+            cod_sof, ano, elemento,
+            val_tot_eph, val_tot_canc_eph, val_tot_lqdc_eph, val_tot_pago_eph,
+            disponivel, qtd_empenhos, atualizado_em
+        )
+        SELECT
+            cod_pcss_norm,
+            EXTRACT(YEAR FROM dt_eph)::integer,
+            cod_item_desp_sof,
+            COALESCE(SUM(val_tot_eph_num), 0),
+            COALESCE(SUM(val_tot_canc_eph_num), 0),
+            COALESCE(SUM(val_tot_lqdc_eph_num), 0),
+            COALESCE(SUM(val_tot_pago_eph_num), 0),
+            COALESCE(SUM(val_tot_eph_num), 0)
+              - COALESCE(SUM(val_tot_canc_eph_num), 0)
+              - COALESCE(SUM(val_tot_pago_eph_num), 0),
+            COUNT(*),
+            NOW()
+        FROM gestao_financeira.back_empenhos
+        WHERE cod_pcss_norm IS NOT NULL
+          AND dt_eph IS NOT NULL
+          AND cod_item_desp_sof IS NOT NULL
+          {'AND cod_pcss_norm = ANY(%s)' if processos is not None else ''}
+        GROUP BY cod_pcss_norm, EXTRACT(YEAR FROM dt_eph), cod_item_desp_sof
+    """, params)
+    return cur.rowcount
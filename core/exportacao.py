@@ -0,0 +1,315 @@
+"""
+Exportação em streaming (CSV / XLSX / ZIP)
+
+As exportações (parcerias, ultra liquidações, conciliação, relatórios SOF)
+faziam fetchall() do resultado inteiro e montavam o arquivo completo em
+memória antes de responder. Aqui:
+
+- consultar(): cursor nomeado (server-side) numa conexão própria do pool; o
+  Postgres entrega TAMANHO_LOTE linhas por vez. A consulta é declarada e o
+  primeiro lote lido já na rota, então erros de SQL ainda viram 500 normal
+- resposta_csv(): gera o CSV em blocos de ~TAMANHO_BLOCO bytes conforme as
+  linhas chegam — o download começa logo e a memória fica constante
+- gerar_xlsx(): openpyxl em modo write-only (linhas vão direto para disco);
+  o arquivo é gravado num temporário e enviado em blocos por resposta_xlsx().
+  O formato .xlsx (zip) só fica completo no fim, então aqui o ganho é de
+  memória, não de tempo até o primeiro byte
+- gerar_zip(): ZIP escrito entrada a entrada num destino sem seek (tamanhos
+  e CRC vão no data descriptor após cada arquivo), com ZIP64 quando
+  preciso. Cada entrada é um iterável de blocos — inclusive outro
+  gerar_zip(), para ZIPs aninhados — e os bytes saem assim que escritos.
+  Formatos já comprimidos (jpg, mp4, pdf, docx...) vão sem recompressão
+
+Uso:
+    consulta = exportacao.consultar(sql, params)
+    return exportacao.resposta_csv('arquivo.csv', cabecalho,
+                                   (formatar(r) for r in consulta), consulta)
+"""
+
+import csv
+import io
+import os
+import tempfile
+import time
+import unicodedata
+import uuid
+import zipfile
+from contextlib import ExitStack
+from urllib.parse import quote
+
+from flask import Response, send_file
+from psycopg2.extras import RealDictCursor
+
+
+TAMANHO_LOTE = 2000
+TAMANHO_BLOCO = 64 * 1024
+
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Deflate nesses formatos gasta CPU para ganhar ~0%: vão com ZIP_STORED
+EXTENSOES_COMPRIMIDAS = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.webp',
+    '.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v', '.mp3',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods',
+    '.zip', '.rar', '.7z', '.gz',
+})
+
+
+class ConsultaEmLotes:
+    """
+    Iterador de linhas (dict) sobre um cursor nomeado.
+
+    A conexão sai do pool no construtor e volta em fechar() — chamado ao fim
+    da iteração, na saída do `with` ou quando a resposta HTTP é encerrada.
+    """
+
+    def __init__(self, sql, params=None, lote=TAMANHO_LOTE):
+        from db import pooled_connection
+
+        self.lote = lote
+        self.total_linhas = 0
+        self._inicio = time.monotonic()
+        self._pilha = ExitStack()
+        try:
+            conn = self._pilha.enter_context(pooled_connection())
+            self._cur = self._pilha.enter_context(conn.cursor(
+                name=f'exportacao_{uuid.uuid4().hex[:12]}',
+                cursor_factory=RealDictCursor,
+            ))
+            self._cur.itersize = lote
+            self._cur.execute(sql, params)
+            self._primeiro = self._cur.fetchmany(lote)
+            self.colunas = [d[0] for d in self._cur.description or ()]
+        except BaseException:
+            self._pilha.close()
+            raise
+
+    @property
+    def vazia(self):
+        return not self._primeiro and self.total_linhas == 0
+
+    def __iter__(self):
+        try:
+            bloco, self._primeiro = self._primeiro, []
+            while bloco:
+                self.total_linhas += len(bloco)
+                yield from bloco
+                bloco = self._cur.fetchmany(self.lote)
+        finally:
+            self.fechar()
+
+    def fechar(self):
+        self._pilha.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def duracao(self):
+        return time.monotonic() - self._inicio
+
+
+def consultar(sql, params=None, lote=TAMANHO_LOTE):
+    """Executa `sql` num cursor nomeado; ver ConsultaEmLotes."""
+    return ConsultaEmLotes(sql, params, lote)
+
+
+def gerar_csv(cabecalho, linhas, delimitador=';', bom=True, **opcoes_csv):
+    """
+    Gerador de blocos de texto CSV.
+
+    Args:
+        cabecalho: lista de títulos (None = sem cabeçalho).
+        linhas: iterável de listas já formatadas.
+        bom: prefixa BOM UTF-8 (Excel reconhece o encoding).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimitador, **opcoes_csv)
+    if bom:
+        buffer.write('\ufeff')
+    if cabecalho:
+        writer.writerow(cabecalho)
+    for linha in linhas:
+        writer.writerow(linha)
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def resposta_csv(nome_arquivo, cabecalho, linhas, consulta=None, **opcoes):
+    """
+    Response em streaming com o CSV.
+
+    Args:
+        consulta: ConsultaEmLotes de origem — liberada quando a resposta for
+            encerrada, mesmo se o cliente desistir do download no meio.
+        opcoes: repassadas a gerar_csv (delimitador, bom, quoting...).
+    """
+    def _gerar():
+        try:
+            yield from gerar_csv(cabecalho, linhas, **opcoes)
+        except Exception as e:
+            print(f"[EXPORTACAO] Falha durante o envio de {nome_arquivo}: {e}")
+            raise
+        if consulta is not None:
+            print(f"[EXPORTACAO] {nome_arquivo}: {consulta.total_linhas} linhas em {consulta.duracao():.2f}s")
+
+    resposta = Response(
+        _gerar(),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename="{nome_arquivo}"',
+            'Content-Type': 'text/csv; charset=utf-8',
+        },
+    )
+    if consulta is not None:
+        resposta.call_on_close(consulta.fechar)
+    return resposta
+
+
+def gerar_xlsx(abas, estilo_cabecalho=None, congelar_cabecalho=True):
+    """
+    Grava um XLSX (openpyxl write-only) num arquivo temporário.
+
+    Args:
+        abas: iterável de (titulo, cabecalho, linhas). `linhas` pode ser um
+            gerador — é consumido aqui, uma aba por vez.
+        estilo_cabecalho: dict com font/fill/alignment para as células do cabeçalho.
+
+    Returns:
+        arquivo temporário binário posicionado no início (fechar após o envio).
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    wb = Workbook(write_only=True)
+    for titulo, cabecalho, linhas in abas:
+        ws = wb.create_sheet(title=titulo)
+        if cabecalho:
+            if congelar_cabecalho:
+                ws.freeze_panes = 'A2'
+            celulas = []
+            for valor in cabecalho:
+                celula = WriteOnlyCell(ws, value=valor)
+                for atributo, estilo in (estilo_cabecalho or {}).items():
+                    setattr(celula, atributo, estilo)
+                celulas.append(celula)
+            ws.append(celulas)
+        for linha in linhas:
+            ws.append(linha)
+
+    arquivo = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        wb.save(arquivo)
+        arquivo.seek(0)
+    except BaseException:
+        arquivo.close()
+        raise
+    return arquivo
+
+
+def resposta_xlsx(nome_arquivo, arquivo):
+    """Envia o arquivo de gerar_xlsx em blocos e o descarta ao final."""
+    return send_file(
+        arquivo,
+        mimetype=MIMETYPE_XLSX,
+        as_attachment=True,
+        download_name=nome_arquivo,
+        max_age=0,
+    )
+
+
+class _DestinoZip:
+    """Destino write-only do ZipFile: guarda os bytes até serem repassados."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def drenar(self):
+        if self._partes:
+            dados = b''.join(self._partes)
+            self._partes.clear()
+            yield dados
+
+
+def gerar_zip(entradas):
+    """
+    Gerador de blocos de bytes de um arquivo ZIP.
+
+    Args:
+        entradas: iterável de (arcname, blocos, tamanho). `blocos` é um
+            iterável de bytes consumido uma vez; `tamanho` (bytes, ou None se
+            desconhecido) só decide o uso de ZIP64.
+    """
+    destino = _DestinoZip()
+    with zipfile.ZipFile(destino, 'w', allowZip64=True) as zf:
+        for arcname, blocos, tamanho in entradas:
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+            info.external_attr = 0o644 << 16
+            if os.path.splitext(arcname)[1].lower() in EXTENSOES_COMPRIMIDAS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            if tamanho is not None:
+                info.file_size = tamanho
+            with zf.open(info, 'w', force_zip64=tamanho is None) as arquivo:
+                for bloco in blocos:
+                    arquivo.write(bloco)
+                    yield from destino.drenar()
+            yield from destino.drenar()
+    yield from destino.drenar()
+
+
+def _content_disposition(nome_arquivo):
+    try:
+        nome_arquivo.encode('ascii')
+        return f'attachment; filename="{nome_arquivo}"'
+    except UnicodeEncodeError:
+        simples = unicodedata.normalize('NFKD', nome_arquivo).encode('ascii', 'ignore').decode('ascii')
+        return f"attachment; filename=\"{simples}\"; filename*=UTF-8''{quote(nome_arquivo)}"
+
+
+def resposta_zip(nome_arquivo, entradas, ao_fechar=None):
+    """
+    Response em streaming com o ZIP de gerar_zip(entradas).
+
+    Args:
+        ao_fechar: chamado quando a resposta for encerrada (inclusive se o
+            cliente desistir do download no meio) — para liberar recursos
+            das entradas ainda não consumidas.
+    """
+    def _gerar():
+        inicio = time.monotonic()
+        total = 0
+        try:
+            for bloco in gerar_zip(entradas):
+                total += len(bloco)
+                yield bloco
+        except Exception as e:
+            print(f"[EXPORTACAO] Falha durante o envio de {nome_arquivo}: {e}")
+            raise
+        print(f"[EXPORTACAO] {nome_arquivo}: {total / 1024 / 1024:.1f} MB em {time.monotonic() - inicio:.2f}s")
+
+    resposta = Response(
+        _gerar(),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': _content_disposition(nome_arquivo),
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+    if ao_fechar is not None:
+        resposta.call_on_close(ao_fechar)
+    return resposta
@@ -0,0 +1,340 @@
+"""
+Tarefas em background com estado persistido no Postgres
+
+Substitui os dicts em memória (conc_classificacao._tarefas,
+analises_pc._analises_ia) e tira do ciclo HTTP o trabalho pesado de
+gestao_financeira (importação SOF e sincronização de empenhos).
+
+- Estado em public.tarefas_background: qualquer worker do gunicorn responde
+  ao polling, não só o que iniciou a tarefa
+- Execução em ThreadPoolExecutors limitados por processo: importações e
+  sincronizações (TIPOS_DADOS) têm pool próprio (JOBS_MAX_WORKERS_DADOS) e
+  não esperam na fila atrás das análises de IA (JOBS_MAX_WORKERS)
+- chave_exclusiva + índice único parcial: no máximo uma tarefa ativa por chave
+  (ex.: 'sincronizar_empenhos'); tarefa sem atualização há TTL_HEARTBEAT é
+  considerada órfã (worker reiniciado) e liberada. Enquanto o processo vive,
+  uma thread renova atualizada_em das suas tarefas (na fila ou rodando) a cada
+  INTERVALO_HEARTBEAT s
+- A passagem para 'running' só acontece se a tarefa ainda está 'queued'; se
+  ela foi liberada como órfã nesse meio tempo, a função não é executada
+- Atualizações de progresso são agrupadas (no máximo uma escrita por
+  INTERVALO_ESCRITA s); mudanças de status são gravadas na hora
+
+Uso:
+    tid = jobs.criar('classificacao_processual', usuario=email)
+    jobs.iniciar(tid, funcao, arg1, arg2)      # funcao chama jobs.atualizar(tid, ...)
+    jobs.obter(tid)  # → {status, pct, label, resultado, erro, ...}
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+import psycopg2
+import psycopg2.extras
+
+
+MAX_WORKERS = int(os.environ.get('JOBS_MAX_WORKERS', '2'))
+MAX_WORKERS_DADOS = int(os.environ.get('JOBS_MAX_WORKERS_DADOS', '2'))
+INTERVALO_ESCRITA = 1.0
+INTERVALO_HEARTBEAT = 60.0
+TTL_HEARTBEAT = '15 minutes'
+RETENCAO = '1 day'
+
+_CAMPOS = ('status', 'pct', 'label', 'resultado', 'erro')
+
+# Importações/sincronizações: pool separado das tarefas longas de IA/OCR
+TIPOS_DADOS = frozenset({
+    'importar_sof',
+    'sincronizar_empenhos',
+    'relatorio_sincronizacao_empenhos',
+})
+
+
+class TarefaEmAndamento(Exception):
+    """Já existe tarefa ativa com a mesma chave_exclusiva."""
+
+    def __init__(self, task_id):
+        super().__init__(f'Já existe uma tarefa em andamento ({task_id})')
+        self.task_id = task_id
+
+
+def _json_default(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, (set, tuple)):
+        return list(valor)
+    return str(valor)
+
+
+class _GerenciadorTarefas:
+
+    def __init__(self, max_workers=MAX_WORKERS, max_workers_dados=MAX_WORKERS_DADOS):
+        self.limites = {'geral': max_workers, 'dados': max_workers_dados}
+        self._lock = threading.Lock()
+        self._executores = {}
+        self._pid = None
+        self._tabela_ok = False
+        # task_id → (campos pendentes, instante da última escrita)
+        self._pendentes = {}
+        # task_id → fila, entre criar() e iniciar() no mesmo processo
+        self._filas = {}
+        # Tarefas deste processo (na fila ou rodando) cujo heartbeat é renovado
+        self._ativas = set()
+
+    # ── Infra ────────────────────────────────────────────────────────────
+
+    def _pool(self, fila='geral'):
+        # Após fork (gunicorn) executores e heartbeat do processo pai não servem no filho
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executores = {}
+                self._ativas = set()
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._heartbeat, name='tarefa-heartbeat', daemon=True
+                ).start()
+            if fila not in self._executores:
+                self._executores[fila] = ThreadPoolExecutor(
+                    max_workers=self.limites[fila], thread_name_prefix=f'tarefa-{fila}'
+                )
+            return self._executores[fila]
+
+    def _heartbeat(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(INTERVALO_HEARTBEAT)
+            with self._lock:
+                ativas = sorted(self._ativas)
+            if not ativas:
+                continue
+            try:
+                with self._conexao() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("""
+                            UPDATE public.tarefas_background
+                            SET atualizada_em = NOW()
+                            WHERE id = ANY(%s) AND status IN ('queued', 'running')
+                        """, (ativas,))
+                    conn.commit()
+            except Exception as e:
+                print(f"[TAREFA] Falha ao renovar heartbeat: {e}")
+
+    def _conexao(self):
+        from db import pooled_connection
+        return pooled_connection()
+
+    def _garantir_tabela(self, cur):
+        if self._tabela_ok:
+            return
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS public.tarefas_background (
+                id              VARCHAR(36) PRIMARY KEY,
+                tipo            VARCHAR(60) NOT NULL,
+                status          VARCHAR(20) NOT NULL DEFAULT 'queued',
+                pct             INTEGER     NOT NULL DEFAULT 0,
+                label           TEXT,
+                resultado       JSONB,
+                erro            TEXT,
+                usuario         VARCHAR(255),
+                chave_exclusiva VARCHAR(120),
+                worker          VARCHAR(60),
+                criada_em       TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                iniciada_em     TIMESTAMP WITHOUT TIME ZONE,
+                atualizada_em   TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                concluida_em    TIMESTAMP WITHOUT TIME ZONE
+            )
+        """)
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_tarefas_background_exclusiva_ativa
+                ON public.tarefas_background (chave_exclusiva)
+                WHERE chave_exclusiva IS NOT NULL AND status IN ('queued', 'running')
+        """)
+        self._tabela_ok = True
+
+    # ── API ──────────────────────────────────────────────────────────────
+
+    def criar(self, tipo, usuario=None, chave_exclusiva=None, label='Na fila...'):
+        """
+        Registra uma tarefa nova (status 'queued') e devolve o task_id.
+
+        Raises:
+            TarefaEmAndamento: se chave_exclusiva já tem tarefa ativa.
+        """
+        tid = str(uuid.uuid4())
+        with self._conexao() as conn:
+            with conn.cursor() as cur:
+                self._garantir_tabela(cur)
+                # Limpeza: concluídas antigas e órfãs (processo morreu no meio)
+                cur.execute(f"""
+                    DELETE FROM public.tarefas_background
+                    WHERE concluida_em < NOW() - INTERVAL '{RETENCAO}'
+                """)
+                cur.execute(f"""
+                    UPDATE public.tarefas_background
+                    SET status = 'error', erro = 'Tarefa interrompida (worker reiniciado)',
+                        concluida_em = NOW(), atualizada_em = NOW()
+                    WHERE status IN ('queued', 'running')
+                      AND atualizada_em < NOW() - INTERVAL '{TTL_HEARTBEAT}'
+                """)
+                conn.commit()
+                try:
+                    cur.execute("""
+                        INSERT INTO public.tarefas_background
+                            (id, tipo, status, label, usuario, chave_exclusiva)
+                        VALUES (%s, %s, 'queued', %s, %s, %s)
+                    """, (tid, tipo, label, usuario, chave_exclusiva))
+                    conn.commit()
+                except psycopg2.errors.UniqueViolation:
+                    conn.rollback()
+                    cur.execute("""
+                        SELECT id FROM public.tarefas_background
+                        WHERE chave_exclusiva = %s AND status IN ('queued', 'running')
+                    """, (chave_exclusiva,))
+                    row = cur.fetchone()
+                    raise TarefaEmAndamento(row[0] if row else None)
+        with self._lock:
+            self._filas[tid] = 'dados' if tipo in TIPOS_DADOS else 'geral'
+        return tid
+
+    def iniciar(self, tid, funcao, *args, **kwargs):
+        """Agenda `funcao(*args, **kwargs)` no pool; exceções viram status 'error'."""
+        with self._lock:
+            fila = self._filas.pop(tid, 'geral')
+        executor = self._pool(fila)
+        with self._lock:
+            self._ativas.add(tid)
+        executor.submit(self._rodar, tid, funcao, args, kwargs)
+        return tid
+
+    def submeter(self, tipo, funcao, *args, usuario=None, chave_exclusiva=None, **kwargs):
+        """criar + iniciar. `funcao` recebe o task_id como primeiro argumento."""
+        tid = self.criar(tipo, usuario=usuario, chave_exclusiva=chave_exclusiva)
+        return self.iniciar(tid, funcao, tid, *args, **kwargs)
+
+    def atualizar(self, tid, **campos):
+        """
+        Atualiza status/pct/label/resultado/erro.
+        Progresso é agrupado; mudança de status grava imediatamente.
+        """
+        campos = {k: v for k, v in campos.items() if k in _CAMPOS}
+        agora = time.monotonic()
+        with self._lock:
+            pendentes, ultima = self._pendentes.get(tid, ({}, 0.0))
+            pendentes.update(campos)
+            gravar = 'status' in pendentes or agora - ultima >= INTERVALO_ESCRITA
+            if gravar:
+                self._pendentes[tid] = ({}, agora)
+            else:
+                self._pendentes[tid] = (pendentes, ultima)
+        if gravar:
+            self._gravar(tid, pendentes)
+
+    def obter(self, tid):
+        """Estado atual da tarefa (dict) ou None se não existir."""
+        with self._conexao() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                self._garantir_tabela(cur)
+                cur.execute("""
+                    SELECT id AS task_id, tipo, status, pct, label, resultado, erro,
+                           usuario, criada_em, iniciada_em, atualizada_em, concluida_em
+                    FROM public.tarefas_background
+                    WHERE id = %s
+                """, (tid,))
+                row = cur.fetchone()
+                conn.commit()
+        if not row:
+            return None
+        tarefa = dict(row)
+        for campo in ('criada_em', 'iniciada_em', 'atualizada_em', 'concluida_em'):
+            if tarefa[campo]:
+                tarefa[campo] = tarefa[campo].isoformat()
+        return tarefa
+
+    # ── Execução ─────────────────────────────────────────────────────────
+
+    def _rodar(self, tid, funcao, args, kwargs):
+        # Só roda quem ainda está na fila: tarefa liberada como órfã (e talvez
+        # já substituída por outra com a mesma chave_exclusiva) não executa
+        if not self._gravar(tid, {'status': 'running'}, iniciando=True):
+            with self._lock:
+                self._ativas.discard(tid)
+            print(f"[TAREFA] [{tid[:8]}] não está mais na fila; execução descartada")
+            return
+        try:
+            retorno = funcao(*args, **kwargs)
+        except Exception as exc:
+            print(f"[TAREFA ERRO] [{tid[:8]}] {type(exc).__name__}: {exc}")
+            traceback.print_exc()
+            self.atualizar(tid, status='error', erro=f'{type(exc).__name__}: {exc}')
+            return
+        finally:
+            # Garante a escrita de progresso que ficou pendente
+            with self._lock:
+                pendentes, _ = self._pendentes.pop(tid, ({}, 0.0))
+                self._ativas.discard(tid)
+            if pendentes:
+                self._gravar(tid, pendentes)
+        # Função que não marcou o fim explicitamente: retorno vira resultado
+        self._gravar(tid, {'status': 'done', 'pct': 100, 'label': 'Concluído!',
+                           'resultado': retorno}, so_se_ativa=True)
+
+    def _gravar(self, tid, campos, iniciando=False, so_se_ativa=False):
+        """
+        UPDATE da tarefa. Com iniciando=True a transição é condicional a
+        status = 'queued'. Retorna True se uma linha foi alterada.
+        """
+        if not campos:
+            return False
+        sets, params = [], []
+        for campo, valor in campos.items():
+            if campo == 'resultado':
+                valor = json.dumps(valor, default=_json_default) if valor is not None else None
+                sets.append('resultado = %s::jsonb')
+            else:
+                sets.append(f'{campo} = %s')
+            params.append(valor)
+        sets.append('atualizada_em = NOW()')
+        if iniciando:
+            sets.append('iniciada_em = NOW()')
+            sets.append('worker = %s')
+            params.append(f'{os.uname().nodename}:{os.getpid()}' if hasattr(os, 'uname') else str(os.getpid()))
+        if campos.get('status') not in (None, 'queued', 'running'):
+            sets.append('concluida_em = NOW()')
+        if iniciando:
+            filtro = " AND status = 'queued'"
+        elif so_se_ativa:
+            filtro = " AND status IN ('queued', 'running')"
+        else:
+            filtro = ''
+        try:
+            with self._conexao() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"UPDATE public.tarefas_background SET {', '.join(sets)} WHERE id = %s{filtro}",
+                        params + [tid],
+                    )
+                    alteradas = cur.rowcount
+                conn.commit()
+            return alteradas > 0
+        except Exception as e:
+            # Falha ao registrar progresso não pode derrubar a tarefa
+            print(f"[TAREFA] Falha ao gravar estado de {tid[:8]}: {e}")
+            return False
+
+
+_gerenciador = _GerenciadorTarefas()
+
+criar = _gerenciador.criar
+iniciar = _gerenciador.iniciar
+submeter = _gerenciador.submeter
+atualizar = _gerenciador.atualizar
+obter = _gerenciador.obter
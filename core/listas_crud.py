@@ -0,0 +1,259 @@
+"""
+Leitura e gravação em lote das listas categóricas (routes/listas, TABELAS_CONFIG)
+
+obter_dados fazia uma COUNT por linha para as colunas calculadas (uma em
+c_dac_glosas, duas em c_geral_pessoa_gestora), checava IDs duplicados com
+ids.count() (O(n²)) e convertia célula a célula relendo a config;
+salvar_lote e mover_item faziam um UPDATE e um commit por linha.
+
+- listar(): uma consulta só; as colunas calculadas ('contagens' na config)
+  entram como LEFT JOIN em subconsultas agregadas
+- serializador(): a conversão de cada coluna (status → 'Ativo'/'Inativo',
+  datas → DD/MM/AAAA) é decidida uma vez por tabela e reaproveitada
+- atualizar_lote() / renumerar(): um único UPDATE … FROM (VALUES …) via
+  execute_values, numa ida ao banco e numa transação. Os casts usam os
+  tipos das colunas lidos do catálogo (cache por processo; reiniciar após
+  ALTER COLUMN … TYPE)
+
+Uso:
+    dados = listas_crud.listar(cur, tabela, config)
+    atualizados, nao_encontrados = listas_crud.atualizar_lote(cur, tabela, config, registros)
+"""
+
+import threading
+from collections import Counter
+from datetime import date, datetime
+
+from psycopg2.extras import execute_values
+
+
+# ── Conversão de valores ─────────────────────────────────────────────────────
+
+def converter_valor_para_db(valor, campo, config):
+    """
+    Converte valores do frontend para o formato do banco de dados
+    """
+    # Strings vazias viram NULL no banco (campos opcionais não preenchidos)
+    if isinstance(valor, str) and valor.strip() == '':
+        return None
+
+    # Se a tabela marca explicitamente que o campo é boolean no DB, converter
+    if isinstance(valor, str) and campo in (config or {}).get('colunas_boolean', []):
+        return valor.lower() in ['ativo', 'true', '1', 'sim']
+
+    # Se o campo for 'status' e valor for string, converter para boolean
+    # EXCETO se a tabela tem opções explícitas (coluna TEXT, não BOOLEAN)
+    if campo == 'status' and isinstance(valor, str):
+        tipos = config.get('tipos_campo', {}) if config else {}
+        if f'opcoes_{campo}' in tipos:
+            # Coluna TEXT com opções configuradas — manter string como está
+            return valor
+        # Coluna BOOLEAN sem opções explícitas
+        return valor.lower() in ['ativo', 'true', '1', 'sim']
+
+    # Se o campo for 'status_pg' e valor for string, manter string
+    if campo == 'status_pg':
+        return valor
+
+    # Se o campo for 'status_c' e valor for string, manter string
+    if campo == 'status_c':
+        return valor
+
+    return valor
+
+
+def converter_valor_para_frontend(valor, campo):
+    """
+    Converte valores do banco de dados para o formato do frontend
+    """
+    # Se o campo for 'status' e valor for boolean, converter para string
+    if campo == 'status' and isinstance(valor, bool):
+        return 'Ativo' if valor else 'Inativo'
+    # Corrigir registros corrompidos: 'false'/'true' armazenados como texto
+    if campo == 'status' and valor in ('false', 'f'):
+        return 'Inativo'
+    if campo == 'status' and valor in ('true', 't'):
+        return 'Ativo'
+
+    return valor
+
+
+_COLUNAS_DATA = ('legislatura_inicio', 'legislatura_fim')
+
+
+def _converter_status(valor):
+    return converter_valor_para_frontend(valor, 'status')
+
+
+def _converter_data(valor):
+    if valor and isinstance(valor, (date, datetime)):
+        return valor.strftime('%d/%m/%Y')
+    return valor
+
+
+def _compilar(config):
+    tipos_campo = config.get('tipos_campo', {})
+    conversores = []
+    for col in config['colunas_editaveis']:
+        if col in _COLUNAS_DATA or tipos_campo.get(col) == 'date':
+            conversores.append((col, _converter_data))
+        elif col == 'status':
+            conversores.append((col, _converter_status))
+        else:
+            conversores.append((col, None))
+    calculadas = tuple(config.get('contagens', {}))
+
+    def serializar(row):
+        item = {'id': row['id']}
+        for col, converter in conversores:
+            valor = row[col]
+            item[col] = converter(valor) if converter else valor
+        for col in calculadas:
+            item[col] = row[col]
+        return item
+
+    return serializar
+
+
+_serializadores = {}
+
+
+def serializador(tabela, config):
+    """Função row → dict do frontend da tabela (compilada uma vez)."""
+    funcao = _serializadores.get(tabela)
+    if funcao is None:
+        funcao = _serializadores[tabela] = _compilar(config)
+    return funcao
+
+
+# ── Leitura ──────────────────────────────────────────────────────────────────
+
+def _sql_listagem(tabela, config):
+    colunas = [f"t.{col}" for col in ['id'] + config['colunas_editaveis']]
+    juncoes = []
+    for i, (col, contagem) in enumerate(config.get('contagens', {}).items()):
+        juncoes.append(
+            f"LEFT JOIN ({contagem['sql']}) AS c{i} ON c{i}.chave = t.{contagem['coluna']}"
+        )
+        colunas.append(f"COALESCE(c{i}.total, 0) AS {col}")
+    return f"""
+        SELECT {', '.join(colunas)}
+        FROM {config['schema']}.{tabela} AS t
+        {' '.join(juncoes)}
+        ORDER BY {config['ordem']}
+    """
+
+
+def listar(cur, tabela, config):
+    """Linhas da tabela já no formato do frontend, com as colunas calculadas."""
+    cur.execute(_sql_listagem(tabela, config))
+    dados = cur.fetchall()
+
+    repetidos = [i for i, n in Counter(row['id'] for row in dados).items() if n > 1]
+    if repetidos:
+        print(f"[ALERTA] DUPLICAÇÃO DETECTADA em {tabela}! IDs: {repetidos}")
+
+    serializar = serializador(tabela, config)
+    return [serializar(row) for row in dados]
+
+
+# ── Gravação em lote ─────────────────────────────────────────────────────────
+
+_tipos_lock = threading.Lock()
+_tipos = {}     # 'schema.tabela' → {coluna: tipo SQL}
+
+
+def _tipos_colunas(cur, schema, tabela):
+    nome = f"{schema}.{tabela}"
+    with _tipos_lock:
+        tipos = _tipos.get(nome)
+    if tipos is None:
+        cur.execute("""
+            SELECT attname AS coluna, format_type(atttypid, atttypmod) AS tipo
+            FROM pg_attribute
+            WHERE attrelid = %s::regclass
+              AND attnum > 0
+              AND NOT attisdropped
+        """, (nome,))
+        tipos = {r['coluna']: r['tipo'] for r in cur.fetchall()}
+        with _tipos_lock:
+            _tipos[nome] = tipos
+    return tipos
+
+
+def atualizar_lote(cur, tabela, config, registros):
+    """
+    Aplica [{'id', 'campos': {coluna: valor}}] num único UPDATE. Cada linha
+    só altera as colunas que enviou; colunas fora de colunas_editaveis são
+    ignoradas. Não faz commit.
+
+    Returns:
+        (ids atualizados, ids não encontrados)
+    """
+    editaveis = set(config['colunas_editaveis'])
+    linhas = {}
+    for registro in registros:
+        reg_id = registro.get('id')
+        campos = registro.get('campos') or {}
+        validos = {
+            col: converter_valor_para_db(valor, col, config)
+            for col, valor in campos.items() if col in editaveis
+        }
+        if reg_id and validos:
+            linhas.setdefault(int(reg_id), {}).update(validos)
+    if not linhas:
+        return [], []
+
+    schema = config['schema']
+    colunas = [col for col in config['colunas_editaveis'] if any(col in l for l in linhas.values())]
+    tipos = _tipos_colunas(cur, schema, tabela)
+
+    template = '(' + ', '.join(
+        [f"%s::{tipos['id']}"] + [f"%s::{tipos[col]}, %s::boolean" for col in colunas]
+    ) + ')'
+    nomes = ['id'] + [nome for col in colunas for nome in (col, f'_tem_{col}')]
+    sets = ', '.join(
+        f"{col} = CASE WHEN v._tem_{col} THEN v.{col} ELSE t.{col} END" for col in colunas
+    )
+    valores = [
+        (reg_id, *[x for col in colunas for x in (campos.get(col), col in campos)])
+        for reg_id, campos in linhas.items()
+    ]
+    atualizados = execute_values(cur, f"""
+        UPDATE {schema}.{tabela} AS t
+        SET {sets}
+        FROM (VALUES %s) AS v({', '.join(nomes)})
+        WHERE t.id = v.id
+        RETURNING t.id
+    """, valores, template=template, page_size=len(valores), fetch=True)
+
+    ids = {r['id'] for r in atualizados}
+    return sorted(ids), [reg_id for reg_id in linhas if reg_id not in ids]
+
+
+def renumerar(cur, tabela, config, registros, passo=10):
+    """
+    Grava ordem = passo, 2·passo, … seguindo a sequência de `registros`
+    ([{'id', 'ordem'}]) num único UPDATE, só nas linhas que mudaram. Não faz
+    commit.
+
+    Returns:
+        quantidade de linhas alteradas
+    """
+    mudancas = [
+        (reg['id'], (idx + 1) * passo)
+        for idx, reg in enumerate(registros)
+        if reg['ordem'] != (idx + 1) * passo
+    ]
+    if not mudancas:
+        return 0
+
+    schema = config['schema']
+    tipos = _tipos_colunas(cur, schema, tabela)
+    execute_values(cur, f"""
+        UPDATE {schema}.{tabela} AS t
+        SET ordem = v.ordem
+        FROM (VALUES %s) AS v(id, ordem)
+        WHERE t.id = v.id
+    """, mudancas, template=f"(%s::{tipos['id']}, %s::{tipos['ordem']})", page_size=len(mudancas))
+    return len(mudancas)
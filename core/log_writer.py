@@ -0,0 +1,193 @@
+"""
+Serviço de gravação em lote dos logs da aplicação
+
+Substitui a thread-por-requisição dos logs de atividade (app.py) e de erros
+(decorators.registrar_erro). Um único worker por processo consome uma fila em
+memória limitada e grava em lotes (INSERT multi-linha via execute_values),
+usando uma conexão emprestada do pool apenas durante o flush.
+
+- Flush por tamanho (LOTE_MAXIMO registros) ou por tempo (INTERVALO_FLUSH s)
+- Fila cheia → o registro é descartado e contado em `descartados`
+- Flush final no encerramento do processo (atexit)
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+
+TAMANHO_FILA = 10000
+LOTE_MAXIMO = 200
+INTERVALO_FLUSH = 2.0
+
+# Destinos suportados: tabela + colunas gravadas (created_at vem do enfileiramento)
+_DESTINOS = {
+    'log_atividades': (
+        'gestao_pessoas.log_atividades',
+        [
+            'usuario_nome', 'usuario_email', 'tipo_usuario',
+            'acao_tipo', 'acao_categoria', 'acao_endpoint', 'acao_metodo',
+            'recurso_tipo', 'recurso_id',
+            'status_codigo', 'sucesso', 'ip_address', 'user_agent', 'duracao_ms',
+            'detalhes', 'created_at',
+        ],
+    ),
+    'log_erros': (
+        'gestao_pessoas.log_erros',
+        [
+            'tipo_erro', 'endpoint', 'metodo', 'status_codigo', 'usuario_email',
+            'ip_address', 'duracao_ms', 'query_preview', 'api_nome', 'api_endpoint',
+            'mensagem', 'detalhes', 'created_at',
+        ],
+    ),
+}
+
+
+class LogWriter:
+    """Fila limitada + worker único que grava logs em lote."""
+
+    def __init__(self, tamanho_fila=TAMANHO_FILA, lote_maximo=LOTE_MAXIMO,
+                 intervalo_flush=INTERVALO_FLUSH):
+        self.lote_maximo = lote_maximo
+        self.intervalo_flush = intervalo_flush
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.descartados = 0
+        self.gravados = 0
+        self.falhas = 0
+
+    # ── API pública ──────────────────────────────────────────────────────
+
+    def enfileirar(self, destino, dados):
+        """
+        Coloca um registro na fila sem bloquear a requisição.
+
+        Returns:
+            bool: False se a fila estava cheia (registro descartado).
+        """
+        if destino not in _DESTINOS:
+            raise ValueError(f"Destino de log desconhecido: {destino}")
+        self._garantir_worker()
+        registro = dict(dados)
+        registro.setdefault('created_at', datetime.now(timezone.utc))
+        try:
+            self._fila.put_nowait((destino, registro))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.descartados += 1
+                descartados = self.descartados
+            if descartados == 1 or descartados % 1000 == 0:
+                print(f"[LOG_WRITER] Fila cheia — {descartados} registros descartados até agora")
+            return False
+
+    def flush(self):
+        """Grava imediatamente tudo o que está na fila (chamado no shutdown)."""
+        pendentes = []
+        while True:
+            try:
+                pendentes.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        if pendentes:
+            self._gravar(pendentes)
+
+    def parar(self, timeout=5.0):
+        """Sinaliza o worker, espera o último lote e grava o que sobrou."""
+        self._parar.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+        self.flush()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'pendentes': self._fila.qsize(),
+                'gravados': self.gravados,
+                'descartados': self.descartados,
+                'falhas': self.falhas,
+            }
+
+    # ── Worker ───────────────────────────────────────────────────────────
+
+    def _garantir_worker(self):
+        # Após fork (gunicorn) a thread do processo pai não existe no filho
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._parar.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name='log-writer', daemon=True
+            )
+            self._thread.start()
+
+    def _loop(self):
+        lote = []
+        prazo = time.monotonic() + self.intervalo_flush
+        while not self._parar.is_set():
+            try:
+                lote.append(self._fila.get(timeout=max(prazo - time.monotonic(), 0.05)))
+            except queue.Empty:
+                pass
+            agora = time.monotonic()
+            if len(lote) >= self.lote_maximo or agora >= prazo:
+                if lote:
+                    self._gravar(lote)
+                    lote = []
+                prazo = agora + self.intervalo_flush
+        if lote:
+            self._gravar(lote)
+
+    def _gravar(self, registros):
+        """Agrupa por destino e grava cada grupo com um INSERT multi-linha."""
+        from db import pooled_connection
+
+        por_destino = {}
+        for destino, dados in registros:
+            por_destino.setdefault(destino, []).append(dados)
+
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    for destino, itens in por_destino.items():
+                        tabela, colunas = _DESTINOS[destino]
+                        execute_values(
+                            cur,
+                            f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES %s",
+                            [tuple(item.get(c) for c in colunas) for item in itens],
+                            page_size=self.lote_maximo,
+                        )
+                conn.commit()
+            with self._lock:
+                self.gravados += len(registros)
+        except Exception as e:
+            # NUNCA deixar log quebrar a aplicação: o lote é perdido e contado
+            with self._lock:
+                self.falhas += len(registros)
+            print(f"[LOG_WRITER] Falha ao gravar lote de {len(registros)} logs (ignorado): {e}")
+
+
+_writer = LogWriter()
+atexit.register(_writer.parar)
+
+
+def enfileirar_log(destino, dados):
+    """Atalho para o writer do processo: enfileira um registro de log."""
+    return _writer.enfileirar(destino, dados)
+
+
+def estatisticas_log_writer():
+    """Contadores do writer do processo (pendentes, gravados, descartados, falhas)."""
+    return _writer.estatisticas()
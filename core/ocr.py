@@ -0,0 +1,296 @@
+"""
+Extração de texto de PDFs com OCR paralelo por página
+
+Antes, analises_pc (manifestações) e conc_classificacao processavam as
+páginas em série e, para cada página sem texto, chamavam
+pdf2image.convert_from_bytes com o arquivo inteiro — o documento era
+reinterpretado pelo poppler uma vez por página.
+
+- Camada de texto (pdfplumber) lida uma única vez, no processo chamador
+- Páginas com menos de MIN_CHARS_PAGINA caracteres vão para OCR: o PDF é
+  gravado uma vez num arquivo temporário e trechos contíguos de até
+  PAGINAS_POR_TAREFA páginas são enviados a um ProcessPoolExecutor limitado
+  (OCR_MAX_WORKERS), que rasteriza só aquele trecho e roda o tesseract
+- Resultados saem em lotes (iterar_lotes) à medida que ficam prontos, para
+  gravação incremental; extrair_paginas() devolve a lista ordenada
+- Antes de extrair, cada página é consultada em core/cache_paginas pelo hash
+  do conteúdo: reenvio ou reclassificação do mesmo documento não repete
+  pdfplumber nem tesseract
+
+Uso:
+    for lote in ocr.iterar_lotes(pdf_bytes, ao_abrir=definir_total):
+        gravar(lote)                 # [{'pagina', 'texto', 'metodo'}, ...]
+
+    paginas = ocr.extrair_paginas(pdf_bytes, progresso=lambda feitas, total: ...)
+"""
+
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from core import cache_paginas
+
+# ── OCR opcional ──────────────────────────────────────────────────────────────
+try:
+    import pytesseract
+    import pdf2image  # noqa: F401 — usado nos processos do pool
+    OCR_DISPONIVEL = True
+except ImportError:
+    OCR_DISPONIVEL = False
+
+
+MIN_CHARS_PAGINA = 50
+DPI = int(os.environ.get('OCR_DPI', '200'))
+MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', str(min(4, os.cpu_count() or 1))))
+PAGINAS_POR_TAREFA = 4
+TAMANHO_LOTE = 10
+
+TESSERACT_CMD = os.environ.get('TESSERACT_CMD', '')
+POPPLER_PATH = os.environ.get('POPPLER_PATH', '') or None
+
+# Chaves do cache: mudar o DPI muda o texto reconhecido
+METODO_TEXTO = 'pdfplumber'
+METODO_OCR = f'tesseract@{DPI}'
+
+
+# ── Processos do pool ────────────────────────────────────────────────────────
+
+_idioma_worker = None
+
+
+def _iniciar_worker(tesseract_cmd):
+    # Um tesseract por núcleo: sem OpenMP interno disputando os mesmos núcleos
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _idioma():
+    global _idioma_worker
+    if _idioma_worker is None:
+        try:
+            _idioma_worker = 'por+eng' if 'por' in pytesseract.get_languages() else 'eng'
+        except Exception:
+            _idioma_worker = 'por'
+    return _idioma_worker
+
+
+def _ocr_intervalo(caminho, primeira, ultima, dpi, poppler_path):
+    """Rasteriza as páginas primeira..ultima de `caminho` e aplica o tesseract."""
+    from pdf2image import convert_from_path
+
+    imagens = convert_from_path(
+        caminho, first_page=primeira, last_page=ultima, dpi=dpi, poppler_path=poppler_path,
+    )
+    idioma = _idioma()
+    resultado = []
+    for deslocamento, imagem in enumerate(imagens):
+        texto = pytesseract.image_to_string(imagem, lang=idioma) or ''
+        resultado.append((primeira + deslocamento, texto.strip()))
+        imagem.close()
+    return resultado
+
+
+# ── Pool ─────────────────────────────────────────────────────────────────────
+
+class _PoolOCR:
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def executor(self):
+        # spawn: o processo web tem threads (pool do banco, jobs) — fork não é seguro
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_iniciar_worker,
+                    initargs=(TESSERACT_CMD,),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def descartar(self):
+        """Após BrokenProcessPool: o próximo uso cria um pool novo."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = _PoolOCR()
+
+
+# ── API ──────────────────────────────────────────────────────────────────────
+
+def _pagina(numero, texto, metodo):
+    return {'pagina': numero, 'texto': texto, 'metodo': metodo}
+
+
+def iterar_lotes(conteudo, ocr=True, min_chars=MIN_CHARS_PAGINA,
+                 tamanho_lote=TAMANHO_LOTE, ao_abrir=None, usar_cache=True):
+    """
+    Gerador de lotes de páginas [{'pagina', 'texto', 'metodo'}], na ordem em
+    que ficam prontos (páginas com camada de texto primeiro).
+
+    Args:
+        conteudo: bytes do PDF.
+        ocr: False = só camada de texto.
+        ao_abrir: callback(total_paginas), chamado assim que o PDF é aberto.
+        usar_cache: consulta/grava core/cache_paginas.
+
+    Página cujo OCR falhar ou vier vazio fica com o texto do pdfplumber.
+    """
+    import pdfplumber
+
+    usar_ocr = ocr and OCR_DISPONIVEL
+    caminho = None
+    futuros = {}        # future → {pagina: texto do pdfplumber}
+    trecho = {}         # páginas contíguas aguardando envio ao pool
+    hashes = []
+    novas = []          # (hash, metodo, texto) a gravar no cache
+    reaproveitadas = 0
+
+    def _enviar():
+        nonlocal caminho
+        if not trecho:
+            return
+        if caminho is None:
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+                tmp.write(conteudo)
+                caminho = tmp.name
+        paginas = dict(trecho)
+        trecho.clear()
+        try:
+            futuro = _pool.executor().submit(
+                _ocr_intervalo, caminho, min(paginas), max(paginas), DPI, POPPLER_PATH,
+            )
+        except (BrokenProcessPool, RuntimeError) as e:
+            print(f"[OCR] Pool indisponível ({e}); OCR em série para págs {min(paginas)}-{max(paginas)}")
+            _pool.descartar()
+            futuro = Future()
+            try:
+                futuro.set_result(_ocr_intervalo(caminho, min(paginas), max(paginas), DPI, POPPLER_PATH))
+            except Exception as erro:
+                futuro.set_exception(erro)
+        futuros[futuro] = paginas
+
+    try:
+        lote = []
+        with pdfplumber.open(io.BytesIO(conteudo)) as pdf:
+            if ao_abrir:
+                ao_abrir(len(pdf.pages))
+            em_cache = {}
+            if usar_cache:
+                try:
+                    hashes = cache_paginas.hashes_documento(pdf)
+                except Exception as e:
+                    print(f"[OCR] Falha ao calcular hash das páginas; seguindo sem cache: {e}")
+                    hashes = []
+                metodos = [METODO_TEXTO, METODO_OCR] if usar_ocr else [METODO_TEXTO]
+                em_cache = cache_paginas.buscar(hashes, metodos)
+
+            for numero, pagina in enumerate(pdf.pages, start=1):
+                chave = hashes[numero - 1] if hashes else None
+                texto_ocr = em_cache.get((chave, METODO_OCR)) if usar_ocr else None
+                texto = em_cache.get((chave, METODO_TEXTO))
+                if texto_ocr or texto is not None:
+                    reaproveitadas += 1
+                if texto_ocr:
+                    pagina.close()
+                    lote.append(_pagina(numero, texto_ocr, 'tesseract'))
+                    if len(lote) >= tamanho_lote:
+                        yield lote
+                        lote = []
+                    continue
+                if texto is None:
+                    texto = (pagina.extract_text() or '').strip()
+                    if chave:
+                        novas.append((chave, METODO_TEXTO, texto))
+                pagina.close()
+                if usar_ocr and len(texto) < min_chars:
+                    if trecho and (numero - 1 not in trecho or len(trecho) >= PAGINAS_POR_TAREFA):
+                        _enviar()
+                    trecho[numero] = texto
+                    continue
+                lote.append(_pagina(numero, texto, 'pdfplumber'))
+                if len(lote) >= tamanho_lote:
+                    yield lote
+                    lote = []
+        _enviar()
+        if reaproveitadas:
+            print(f"[OCR] {reaproveitadas}/{len(hashes)} página(s) reaproveitadas do cache")
+        cache_paginas.gravar(novas)
+        novas = []
+        if lote:
+            yield lote
+            lote = []
+
+        for futuro in as_completed(futuros):
+            paginas = futuros[futuro]
+            try:
+                reconhecidas = dict(futuro.result())
+            except Exception as e:
+                print(f"[OCR] Falha págs {min(paginas)}-{max(paginas)}: {type(e).__name__}: {e}")
+                if isinstance(e, BrokenProcessPool):
+                    _pool.descartar()
+                reconhecidas = {}
+            for numero in sorted(paginas):
+                texto_ocr = reconhecidas.get(numero)
+                if texto_ocr:
+                    lote.append(_pagina(numero, texto_ocr, 'tesseract'))
+                    if hashes:
+                        novas.append((hashes[numero - 1], METODO_OCR, texto_ocr))
+                else:
+                    lote.append(_pagina(numero, paginas[numero], 'pdfplumber'))
+            if len(lote) >= tamanho_lote:
+                cache_paginas.gravar(novas)
+                novas = []
+                yield lote
+                lote = []
+        cache_paginas.gravar(novas)
+        if lote:
+            yield lote
+    finally:
+        for futuro in futuros:
+            futuro.cancel()
+        if caminho:
+            try:
+                os.unlink(caminho)
+            except OSError:
+                pass
+
+
+def extrair_paginas(conteudo, ocr=True, min_chars=MIN_CHARS_PAGINA, progresso=None):
+    """
+    Lista de páginas [{'pagina', 'texto', 'metodo'}] ordenada por número.
+
+    Args:
+        progresso: callback(paginas_prontas, total_paginas) a cada lote.
+    """
+    total = [0]
+    paginas = []
+
+    def _abrir(n):
+        total[0] = n
+
+    for lote in iterar_lotes(conteudo, ocr=ocr, min_chars=min_chars, ao_abrir=_abrir):
+        paginas.extend(lote)
+        if progresso:
+            progresso(len(paginas), total[0])
+    paginas.sort(key=lambda p: p['pagina'])
+    return paginas
+
+
+def extrair_texto(conteudo, ocr=True, separador='\n'):
+    """Texto do documento inteiro (páginas sem texto são omitidas)."""
+    return separador.join(p['texto'] for p in extrair_paginas(conteudo, ocr=ocr) if p['texto'])
+
@@ -0,0 +1,184 @@
+"""
+Dados da tela inicial (main.index)
+
+A tela inicial fazia até 7 consultas em sequência a cada acesso: usuário,
+usuarios_infos (duas vezes), datas_importantes, datas_eventos e
+escala_teletrabalho. Aqui:
+
+- Uma única consulta (CTEs) devolve o usuário e os widgets: lembretes de
+  hoje/amanhã e o alerta de escala de teletrabalho de sexta-feira
+- Os widgets ficam em cache por usuário/dia por TTL s; com o cache válido
+  a tela faz só a leitura do usuário (acessos sempre atualizados)
+- datas_importantes e escalas chamam invalidar() após gravar eventos ou
+  escalas; nos demais workers do gunicorn a mudança aparece ao fim do TTL
+
+Uso:
+    user, widgets = painel_inicial.carregar(cur, session['user_id'], session.get('email'))
+"""
+
+import threading
+import time
+from datetime import date, timedelta
+
+
+TTL = 60
+MAX_ITENS = 1000
+
+_PERFIS_GERENTE = ('Agente Público', 'admin')
+
+_SQL_USUARIO = """
+    SELECT id, email, tipo_usuario, data_criacao, acessos
+    FROM gestao_pessoas.usuarios
+    WHERE id = %(user_id)s
+"""
+
+# Uma linha por lembrete (ou uma linha com lembrete nulo), com o usuário repetido
+_SQL_PAINEL = f"""
+    WITH u AS (
+        {_SQL_USUARIO}
+    ),
+    infos AS (
+        SELECT visualizar_todos_eventos, usuario_escala_permissao
+        FROM gestao_pessoas.usuarios_infos
+        WHERE usuario_email = %(email)s
+        LIMIT 1
+    ),
+    f AS (
+        SELECT u.*,
+               (u.tipo_usuario IN %(perfis_gerente)s
+                OR COALESCE((SELECT visualizar_todos_eventos FROM infos), FALSE)) AS eh_gerente,
+               (u.tipo_usuario IN %(perfis_gerente)s
+                OR COALESCE((SELECT usuario_escala_permissao FROM infos), FALSE)) AS pode_tt
+        FROM u
+    ),
+    lembretes AS (
+        SELECT 0 AS ordem, 'pessoal' AS tipo, di.nome_data AS titulo, di.data_inicio,
+               di.horario_inicio AS horario, ui.usuario_nome
+        FROM calendario.datas_importantes di
+        LEFT JOIN gestao_pessoas.usuarios_infos ui ON ui.usuario_email = di.usuario_email
+        CROSS JOIN f
+        WHERE di.data_inicio IN (%(hoje)s, %(amanha)s)
+          AND (f.eh_gerente OR di.tipo_usuario = f.tipo_usuario)
+        UNION ALL
+        SELECT 1, 'evento', de.nome_atividade, de.data_inicio, NULL, ui.usuario_nome
+        FROM calendario.datas_eventos de
+        LEFT JOIN gestao_pessoas.usuarios_infos ui ON ui.usuario_email = de.usuario_email
+        CROSS JOIN f
+        WHERE de.data_inicio IN (%(hoje)s, %(amanha)s)
+          AND (f.eh_gerente OR de.tipo_usuario = f.tipo_usuario)
+    )
+    SELECT f.id, f.email, f.tipo_usuario, f.data_criacao, f.acessos,
+           (%(sexta)s AND f.pode_tt AND NOT EXISTS (
+                SELECT 1 FROM calendario.escala_teletrabalho
+                WHERE semana_inicio = %(proxima_segunda)s
+           )) AS alerta_escala_tt,
+           l.tipo, l.titulo, l.data_inicio, l.horario, l.usuario_nome
+    FROM f
+    LEFT JOIN lembretes l ON TRUE
+    ORDER BY l.data_inicio, l.ordem, l.horario NULLS LAST
+"""
+
+_CAMPOS_USUARIO = ('id', 'email', 'tipo_usuario', 'data_criacao', 'acessos')
+_CAMPOS_LEMBRETE = ('tipo', 'titulo', 'data_inicio', 'horario', 'usuario_nome')
+
+
+def _widgets_vazios():
+    return {'lembretes_hoje': [], 'lembretes_amanha': [],
+            'alerta_escala_tt': False, 'next_monday_iso': ''}
+
+
+class _CachePainel:
+
+    def __init__(self, ttl=TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._itens = {}        # (user_id, dia) → (expira_em, widgets)
+
+    def obter(self, user_id, dia):
+        with self._lock:
+            item = self._itens.get((user_id, dia))
+            if item and item[0] > time.monotonic():
+                return item[1]
+        return None
+
+    def gravar(self, user_id, dia, widgets):
+        agora = time.monotonic()
+        with self._lock:
+            if len(self._itens) >= MAX_ITENS:
+                self._itens = {k: v for k, v in self._itens.items() if v[0] > agora}
+            self._itens[(user_id, dia)] = (agora + self.ttl, widgets)
+
+    def invalidar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+_cache = _CachePainel()
+
+
+def _copiar(widgets):
+    return {
+        'lembretes_hoje': [dict(r) for r in widgets['lembretes_hoje']],
+        'lembretes_amanha': [dict(r) for r in widgets['lembretes_amanha']],
+        'alerta_escala_tt': widgets['alerta_escala_tt'],
+        'next_monday_iso': widgets['next_monday_iso'],
+    }
+
+
+def carregar(cur, user_id, email):
+    """
+    Usuário e widgets da tela inicial.
+
+    Returns:
+        (user dict ou None se não existir, widgets {'lembretes_hoje',
+        'lembretes_amanha', 'alerta_escala_tt', 'next_monday_iso'})
+    """
+    hoje = date.today()
+    widgets = _cache.obter(user_id, hoje)
+    if widgets is not None:
+        cur.execute(_SQL_USUARIO, {'user_id': user_id})
+        return cur.fetchone(), _copiar(widgets)
+
+    amanha = hoje + timedelta(days=1)
+    proxima_segunda = hoje + timedelta(days=3)
+    sexta = hoje.weekday() == 4  # Sexta-feira = 4
+    try:
+        cur.execute(_SQL_PAINEL, {
+            'user_id': user_id,
+            'email': email,
+            'perfis_gerente': _PERFIS_GERENTE,
+            'hoje': hoje,
+            'amanha': amanha,
+            'sexta': sexta,
+            'proxima_segunda': proxima_segunda,
+        })
+        linhas = cur.fetchall()
+    except Exception as e:
+        # Widgets são opcionais: sem eles a tela abre só com o usuário
+        print(f"[PAINEL] Falha ao carregar widgets da tela inicial: {e}")
+        cur.connection.rollback()
+        cur.execute(_SQL_USUARIO, {'user_id': user_id})
+        return cur.fetchone(), _widgets_vazios()
+
+    if not linhas:
+        return None, _widgets_vazios()
+
+    user = {c: linhas[0][c] for c in _CAMPOS_USUARIO}
+    widgets = _widgets_vazios()
+    if linhas[0]['alerta_escala_tt']:
+        widgets['alerta_escala_tt'] = True
+        widgets['next_monday_iso'] = proxima_segunda.isoformat()
+    for linha in linhas:
+        if linha['tipo'] is None:
+            continue
+        lembrete = {c: linha[c] for c in _CAMPOS_LEMBRETE}
+        destino = 'lembretes_hoje' if lembrete['data_inicio'] == hoje else 'lembretes_amanha'
+        widgets[destino].append(lembrete)
+
+    _cache.gravar(user_id, hoje, widgets)
+    return user, _copiar(widgets)
+
+
+def invalidar():
+    """Descarta os widgets em cache (chamar após gravar eventos ou escalas)."""
+    _cache.invalidar()
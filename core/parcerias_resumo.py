@@ -0,0 +1,336 @@
+"""
+Read model public.parcerias_resumo (listagem e exportação de parcerias)
+
+parcerias.listar e parcerias.exportar_csv montavam, a cada requisição, uma CTE
+sobre todos os termos: DISTINCT ON em parcerias_pg, SUMs em ultra_liquidacoes
+e no cronograma, STRING_AGG de endereços e um LATERAL com regex em
+back_empenhos. Esses agregados agora ficam numa linha por termo:
+
+- parcerias_resumo guarda só os campos derivados; os campos de
+  public.parcerias continuam vindo da própria tabela (JOIN pela PK)
+- Triggers nas tabelas de origem marcam o termo em parcerias_resumo_pendentes;
+  sincronizar() recalcula apenas os termos marcados antes da leitura
+- back_empenhos (cargas de dezenas de milhares de linhas) não tem trigger: a
+  importação de empenhos chama marcar_por_processos() com os processos tocados
+- Recarga completa agendada: scripts/atualizar_parcerias_resumo.py
+
+O SELECT dos agregados existe só aqui: scripts/migration_parcerias_resumo.sql
+cria a fila de pendentes e os triggers; a tabela, os índices e a carga inicial
+vêm de garantir_estrutura() (primeiro acesso ou scripts/atualizar_parcerias_resumo.py).
+"""
+
+import threading
+
+from core import empenhos_saldos
+
+
+# Agregados por termo. {filtro} restringe a p.numero_termo = ANY(%s) na carga incremental.
+_SELECT_RESUMO = """
+    SELECT
+        p.numero_termo,
+        lpg.pessoa_gestora,
+        lpg.status_pg,
+        lpg.solicitacao,
+        (lpg.tem_pg IS NOT NULL)                 AS tem_pg,
+        COALESCE(tp.total_pago, 0)               AS total_pago,
+        asg.data_assinatura_termo,
+        end_.endereco_completo,
+        COALESCE(end_.qtd_enderecos, 0)          AS qtd_enderecos,
+        COALESCE(end_.tem_logradouro, false)     AS tem_endereco,
+        COALESCE(cro.valor_mes_detalhado, 0)     AS valor_mes_detalhado,
+        COALESCE(cro.valor_mes_23, 0)            AS valor_mes_23,
+        COALESCE(cro.valor_mes_24, 0)            AS valor_mes_24,
+        inf.abrangencia,
+        inf.data_suspensao,
+        inf.data_retomada,
+        inf.parceria_objeto,
+        COALESCE(abr.abrangencias, ARRAY[]::text[]) AS abrangencias,
+        d.dotacao_orcamentaria,
+        NOW()::timestamp                         AS atualizado_em
+    FROM public.parcerias p
+    LEFT JOIN LATERAL (
+        SELECT pg.nome_pg AS pessoa_gestora, pg.solicitacao, cpg.status_pg, 1 AS tem_pg
+        FROM public.parcerias_pg pg
+        LEFT JOIN categoricas.c_geral_pessoa_gestora cpg ON cpg.nome_pg = pg.nome_pg
+        WHERE pg.numero_termo = p.numero_termo
+        ORDER BY pg.data_de_criacao DESC
+        LIMIT 1
+    ) lpg ON true
+    LEFT JOIN LATERAL (
+        SELECT SUM(ul.valor_previsto) AS total_pago
+        FROM gestao_financeira.ultra_liquidacoes ul
+        WHERE ul.numero_termo = p.numero_termo
+          AND ul.parcela_status = 'Pago'
+    ) tp ON true
+    LEFT JOIN LATERAL (
+        SELECT ps.data_assinatura AS data_assinatura_termo
+        FROM public.parcerias_sei ps
+        WHERE ps.numero_termo = p.numero_termo
+          AND (ps.aditamento = '-' OR ps.aditamento IS NULL)
+          AND (ps.apostilamento = '-' OR ps.apostilamento IS NULL)
+          AND ps.termo_tipo_sei IS NULL
+        ORDER BY ps.id ASC
+        LIMIT 1
+    ) asg ON true
+    LEFT JOIN LATERAL (
+        SELECT
+            STRING_AGG(
+                COALESCE(pe.parceria_logradouro, '') ||
+                CASE WHEN pe.parceria_numero IS NOT NULL
+                     THEN ', ' || pe.parceria_numero::text
+                     ELSE ''
+                END,
+                ' | '
+            ) AS endereco_completo,
+            COUNT(*) AS qtd_enderecos,
+            BOOL_OR(pe.parceria_logradouro IS NOT NULL AND pe.parceria_logradouro != '') AS tem_logradouro
+        FROM public.parcerias_enderecos pe
+        WHERE pe.numero_termo = p.numero_termo
+    ) end_ ON true
+    LEFT JOIN LATERAL (
+        SELECT
+            SUM(ulc.valor_mes)    AS valor_mes_detalhado,
+            SUM(ulc.valor_mes_23) AS valor_mes_23,
+            SUM(ulc.valor_mes_24) AS valor_mes_24
+        FROM gestao_financeira.ultra_liquidacoes_cronograma ulc
+        WHERE ulc.numero_termo = p.numero_termo
+    ) cro ON true
+    LEFT JOIN LATERAL (
+        SELECT
+            pia.parceria_abrangencia_projeto AS abrangencia,
+            pia.parceria_data_suspensao      AS data_suspensao,
+            pia.parceria_data_retomada       AS data_retomada,
+            pia.parceria_objeto
+        FROM public.parcerias_infos_adicionais pia
+        WHERE pia.numero_termo = p.numero_termo
+        ORDER BY pia.id DESC
+        LIMIT 1
+    ) inf ON true
+    LEFT JOIN LATERAL (
+        SELECT ARRAY_AGG(DISTINCT pia.parceria_abrangencia_projeto::text) AS abrangencias
+        FROM public.parcerias_infos_adicionais pia
+        WHERE pia.numero_termo = p.numero_termo
+          AND pia.parceria_abrangencia_projeto IS NOT NULL
+    ) abr ON true
+    LEFT JOIN LATERAL (
+        SELECT STRING_AGG(DISTINCT be.txt_dotacao_fmt, ' | ') AS dotacao_orcamentaria
+        FROM gestao_financeira.back_empenhos be
+        WHERE be.cod_pcss_norm = p.sei_celeb_norm
+          AND be.txt_dotacao_fmt IS NOT NULL
+    ) d ON true
+    {filtro}
+"""
+
+# Tabelas de origem com coluna numero_termo (trigger por linha)
+TABELAS_ORIGEM = (
+    'public.parcerias',
+    'public.parcerias_pg',
+    'public.parcerias_sei',
+    'public.parcerias_enderecos',
+    'public.parcerias_infos_adicionais',
+    'gestao_financeira.ultra_liquidacoes',
+    'gestao_financeira.ultra_liquidacoes_cronograma',
+)
+
+_estrutura_ok = False
+_estrutura_lock = threading.Lock()
+
+
+def _existe(cur, nome):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (nome,))
+    row = cur.fetchone()
+    return bool(row[0] if not isinstance(row, dict) else list(row.values())[0])
+
+
+def garantir_estrutura(cur):
+    """
+    DDL guard: tabela de resumo, fila de pendentes, função e triggers.
+    Na criação da tabela faz a carga completa.
+
+    Returns:
+        bool: True se a tabela foi criada agora.
+    """
+    # Dotação casa parcerias.sei_celeb_norm com back_empenhos.cod_pcss_norm (indexadas)
+    empenhos_saldos.garantir_estrutura(cur)
+
+    criou = False
+    if not _existe(cur, 'public.parcerias_resumo'):
+        # Tipos das colunas herdados das tabelas de origem
+        cur.execute(
+            "CREATE TABLE public.parcerias_resumo AS "
+            + _SELECT_RESUMO.format(filtro='')
+            + " WITH NO DATA"
+        )
+        cur.execute("ALTER TABLE public.parcerias_resumo ADD PRIMARY KEY (numero_termo)")
+        criou = True
+
+    for coluna in ('pessoa_gestora', 'status_pg', 'data_assinatura_termo', 'data_suspensao'):
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_parcerias_resumo_{coluna}
+                ON public.parcerias_resumo ({coluna})
+        """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_parcerias_resumo_abrangencias
+            ON public.parcerias_resumo USING GIN (abrangencias)
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS public.parcerias_resumo_pendentes (
+            numero_termo VARCHAR(100) PRIMARY KEY,
+            marcado_em   TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION public.fn_parcerias_resumo_marcar()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                IF NEW.numero_termo IS NOT NULL THEN
+                    INSERT INTO public.parcerias_resumo_pendentes (numero_termo)
+                    VALUES (NEW.numero_termo)
+                    ON CONFLICT (numero_termo) DO NOTHING;
+                END IF;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                IF OLD.numero_termo IS NOT NULL THEN
+                    INSERT INTO public.parcerias_resumo_pendentes (numero_termo)
+                    VALUES (OLD.numero_termo)
+                    ON CONFLICT (numero_termo) DO NOTHING;
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION public.fn_parcerias_resumo_marcar_gestora()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            nomes TEXT[];
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                nomes := ARRAY[NEW.nome_pg::text];
+            ELSIF TG_OP = 'DELETE' THEN
+                nomes := ARRAY[OLD.nome_pg::text];
+            ELSE
+                nomes := ARRAY[NEW.nome_pg::text, OLD.nome_pg::text];
+            END IF;
+            INSERT INTO public.parcerias_resumo_pendentes (numero_termo)
+            SELECT DISTINCT pg.numero_termo
+            FROM public.parcerias_pg pg
+            WHERE pg.nome_pg::text = ANY(nomes)
+              AND pg.numero_termo IS NOT NULL
+            ON CONFLICT (numero_termo) DO NOTHING;
+            RETURN NULL;
+        END;
+        $$
+    """)
+    for tabela in TABELAS_ORIGEM:
+        cur.execute(f"""
+            CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+            AFTER INSERT OR UPDATE OR DELETE ON {tabela}
+            FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar()
+        """)
+    cur.execute("""
+        CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+        AFTER INSERT OR UPDATE OR DELETE ON categoricas.c_geral_pessoa_gestora
+        FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar_gestora()
+    """)
+
+    if criou:
+        atualizar(cur)
+    return criou
+
+
+def atualizar(cur, termos=None):
+    """
+    Recalcula parcerias_resumo.
+
+    Args:
+        termos: numero_termo a recalcular; None = recarga completa.
+
+    Returns:
+        int: linhas gravadas.
+    """
+    if termos is not None:
+        termos = sorted({t for t in termos if t})
+        if not termos:
+            return 0
+        cur.execute("DELETE FROM public.parcerias_resumo WHERE numero_termo = ANY(%s)", (termos,))
+        cur.execute(
+            "INSERT INTO public.parcerias_resumo "
+            + _SELECT_RESUMO.format(filtro='WHERE p.numero_termo = ANY(%s)'),
+            (termos,),
+        )
+        return cur.rowcount
+
+    cur.execute("DELETE FROM public.parcerias_resumo")
+    cur.execute("INSERT INTO public.parcerias_resumo " + _SELECT_RESUMO.format(filtro=''))
+    total = cur.rowcount
+    # Tudo recalculado: marcações anteriores à carga já estão refletidas
+    cur.execute("DELETE FROM public.parcerias_resumo_pendentes")
+    return total
+
+
+def marcar_por_processos(cur, processos):
+    """
+    Marca como pendentes os termos cujo sei_celeb corresponde aos processos SOF
+    (chaves normalizadas de back_empenhos) — usado após importar empenhos.
+    """
+    processos = [p for p in (processos or []) if p]
+    if not processos or not _existe(cur, 'public.parcerias_resumo_pendentes'):
+        return 0
+    cur.execute("""
+        INSERT INTO public.parcerias_resumo_pendentes (numero_termo)
+        SELECT p.numero_termo
+        FROM public.parcerias p
+        WHERE p.sei_celeb_norm = ANY(%s)
+        ON CONFLICT (numero_termo) DO NOTHING
+    """, (processos,))
+    return cur.rowcount
+
+
+def sincronizar():
+    """
+    Garante a estrutura (uma vez por processo) e recalcula os termos pendentes,
+    numa conexão própria do pool (a transação da requisição fica só de leitura).
+    Termos que outra requisição já está recalculando são pulados (SKIP LOCKED).
+
+    Returns:
+        int: termos recalculados.
+    """
+    global _estrutura_ok
+    from db import pooled_connection
+
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                if not _estrutura_ok:
+                    with _estrutura_lock:
+                        if not _estrutura_ok:
+                            if garantir_estrutura(cur):
+                                print("[PARCERIAS_RESUMO] Tabela criada e carregada")
+                            conn.commit()
+                            _estrutura_ok = True
+
+                cur.execute("""
+                    DELETE FROM public.parcerias_resumo_pendentes
+                    WHERE numero_termo IN (
+                        SELECT numero_termo FROM public.parcerias_resumo_pendentes
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING numero_termo
+                """)
+                termos = [r[0] for r in cur.fetchall()]
+                if termos:
+                    atualizar(cur, termos)
+            conn.commit()
+    except Exception as e:
+        # Leitura segue com o resumo como está; os termos continuam pendentes
+        print(f"[PARCERIAS_RESUMO] Falha ao sincronizar pendentes: {e}")
+        return 0
+    return len(termos)
@@ -0,0 +1,183 @@
+"""
+Perfil de banco por requisição (queries, tempo, linhas, N+1)
+
+db.TimedCursor só registrava queries individuais acima de 1 s. Endpoints
+lentos por volume — dezenas de queries rápidas, a mesma consulta repetida
+por linha (N+1) — não apareciam em lugar nenhum.
+
+- before_request cria o perfil da requisição em g; o TimedCursor soma em
+  cada execute/executemany a duração, e em cada fetch as linhas lidas
+- Consultas idênticas (mesmo SQL, parâmetros à parte) são contadas; a partir
+  de LIMITE_REPETICOES execuções na mesma requisição o endpoint é marcado
+  como suspeito de N+1 e o SQL é logado uma vez
+- after_request anexa o cabeçalho Server-Timing (db, app e contagens — visível
+  na aba Rede do navegador) e guarda a amostra numa janela por endpoint
+  (últimas JANELA requisições) para p50/p95 em /admin/desempenho
+- As janelas são por processo: com vários workers do gunicorn cada um vê a
+  sua parte do tráfego, amostra suficiente para os percentis
+
+Desligar com PERFIL_REQUISICOES=0.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, request
+
+
+ATIVO = os.environ.get('PERFIL_REQUISICOES', '1') != '0'
+JANELA = int(os.environ.get('PERFIL_REQUISICOES_JANELA', '200'))
+LIMITE_REPETICOES = 5
+MAX_ENDPOINTS = 500
+
+
+class PerfilRequisicao:
+    """Contadores de banco de uma requisição (preenchidos pelo TimedCursor)."""
+
+    __slots__ = ('inicio', 'queries', 'db_s', 'linhas', 'repeticoes')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.queries = 0
+        self.db_s = 0.0
+        self.linhas = 0
+        self.repeticoes = {}        # sql → execuções
+
+    def registrar_query(self, query, duracao):
+        self.queries += 1
+        self.db_s += duracao
+        chave = query if isinstance(query, str) else str(query)
+        self.repeticoes[chave] = self.repeticoes.get(chave, 0) + 1
+
+    def registrar_linhas(self, quantidade):
+        self.linhas += quantidade
+
+    def mais_repetida(self):
+        """(sql, execuções) da consulta mais repetida, ou (None, 0)."""
+        if not self.repeticoes:
+            return None, 0
+        sql = max(self.repeticoes, key=self.repeticoes.get)
+        return sql, self.repeticoes[sql]
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    # nearest-rank
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+class _Agregador:
+
+    def __init__(self, janela=JANELA):
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._amostras = {}         # (metodo, rota) → deque[(total_ms, db_ms, queries, linhas, repeticoes)]
+        self._totais = {}           # (metodo, rota) → requisições desde o início/limpeza
+        self._n_mais_um = {}        # (metodo, rota) → (sql, execuções) da última ocorrência
+        self._desde = time.time()
+
+    def registrar(self, chave, amostra, repetida):
+        with self._lock:
+            fila = self._amostras.get(chave)
+            if fila is None:
+                if len(self._amostras) >= MAX_ENDPOINTS:
+                    return
+                fila = self._amostras[chave] = deque(maxlen=self.janela)
+            fila.append(amostra)
+            self._totais[chave] = self._totais.get(chave, 0) + 1
+            novo_n_mais_um = repetida[1] >= LIMITE_REPETICOES and chave not in self._n_mais_um
+            if repetida[1] >= LIMITE_REPETICOES:
+                self._n_mais_um[chave] = repetida
+        return novo_n_mais_um
+
+    def relatorio(self, ordenar='db_p95'):
+        """Uma linha por endpoint com p50/p95 de tempo total e de banco."""
+        with self._lock:
+            copia = {k: list(v) for k, v in self._amostras.items()}
+            totais = dict(self._totais)
+            n_mais_um = dict(self._n_mais_um)
+
+        linhas = []
+        for (metodo, rota), amostras in copia.items():
+            total_ms = [a[0] for a in amostras]
+            db_ms = [a[1] for a in amostras]
+            queries = [a[2] for a in amostras]
+            sql, repeticoes = n_mais_um.get((metodo, rota), (None, 0))
+            linhas.append({
+                'metodo': metodo,
+                'rota': rota,
+                'requisicoes': totais.get((metodo, rota), len(amostras)),
+                'amostras': len(amostras),
+                'total_p50': _percentil(total_ms, 50),
+                'total_p95': _percentil(total_ms, 95),
+                'db_p50': _percentil(db_ms, 50),
+                'db_p95': _percentil(db_ms, 95),
+                'queries_p50': _percentil(queries, 50),
+                'queries_p95': _percentil(queries, 95),
+                'linhas_p95': _percentil([a[3] for a in amostras], 95),
+                'repeticoes_max': max(a[4] for a in amostras),
+                'n_mais_um_sql': sql,
+                'n_mais_um_execucoes': repeticoes,
+            })
+        linhas.sort(key=lambda r: r.get(ordenar, 0), reverse=True)
+        return linhas
+
+    def limpar(self):
+        with self._lock:
+            self._amostras.clear()
+            self._totais.clear()
+            self._n_mais_um.clear()
+            self._desde = time.time()
+
+    def desde(self):
+        return self._desde
+
+
+_agregador = _Agregador()
+
+
+# ── Hooks (app.py) ───────────────────────────────────────────────────────────
+
+def iniciar():
+    """before_request: abre o perfil da requisição."""
+    if ATIVO:
+        g.perfil_db = PerfilRequisicao()
+
+
+def finalizar(response):
+    """after_request: Server-Timing + amostra na janela do endpoint."""
+    perfil = g.pop('perfil_db', None)
+    if perfil is None or request.endpoint in (None, 'static'):
+        return response
+
+    total_ms = (time.perf_counter() - perfil.inicio) * 1000
+    db_ms = perfil.db_s * 1000
+    sql, repeticoes = perfil.mais_repetida()
+
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={db_ms:.1f};desc="{perfil.queries} queries, {perfil.linhas} linhas", '
+        f'app;dur={max(total_ms - db_ms, 0):.1f}, '
+        f'repeticoes;desc="{repeticoes}x mesma query"'
+    )
+
+    chave = (request.method, request.url_rule.rule if request.url_rule else request.path)
+    novo = _agregador.registrar(
+        chave,
+        (total_ms, db_ms, perfil.queries, perfil.linhas, repeticoes),
+        (sql, repeticoes),
+    )
+    if novo:
+        print(f"[PERFIL N+1] {chave[0]} {chave[1]}: {repeticoes}x a mesma query — {' '.join(sql.split())[:200]}")
+    return response
+
+
+relatorio = _agregador.relatorio
+limpar = _agregador.limpar
+desde = _agregador.desde
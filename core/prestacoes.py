@@ -0,0 +1,577 @@
+"""
+Prestações de contas: cronograma esperado e reconciliação em lote
+
+Regras de geração (gerar_prestacoes, determinar_responsabilidade_por_vigencia)
+usadas por analises (cadastro, cálculo e atualização de prestações).
+
+analises.atualizar_prestacoes comparava e regravava parcerias_analises um
+termo por POST (a tela disparava um POST por termo em "Recalcular Todos"),
+apagando e reinserindo todas as prestações do termo. reconciliar():
+
+- Carrega os termos e todas as prestações cadastradas em duas consultas
+- Calcula o cronograma esperado de cada termo e compara por tipo+número:
+  prestações que continuam existindo mantêm o id e os dados preenchidos e só
+  têm a vigência corrigida; as que sobram são removidas (com parcerias_monit
+  e parcerias_monit_adicional); as que faltam são inseridas
+- Dry-run (aplicar=False) devolve o relatório sem gravar; aplicar=True grava
+  tudo numa única transação
+
+Uso:
+    relatorio = prestacoes.reconciliar(cur, modo_exato=False)            # dry-run
+    relatorio = prestacoes.reconciliar(cur, termos=['TFM/001/2024'], aplicar=True)
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+
+def determinar_responsabilidade_por_vigencia(portaria, vigencia_final):
+    """
+    Determina a responsabilidade da análise baseada na portaria do termo 
+    e na data de término da vigência da prestação.
+    
+    Regras baseadas em períodos de transição:
+    
+    - Portaria 021 (TFM/TCL sem FUMCAD): 
+      - Se vigencia_final >= 01/03/2023 → Pessoa Gestora (3)
+      - Se vigencia_final < 01/03/2023 → Compartilhada (2) [era Portaria 121]
+    
+    - Portaria 090 (TFM/TCL com FUMCAD/FMID):
+      - Se vigencia_final >= 01/01/2024 → Pessoa Gestora (3)
+      - Se vigencia_final < 01/01/2024 → Compartilhada (2) [era Portaria 140]
+    
+    - Portaria 121 ou 140 diretamente → Compartilhada (2)
+    - Outras portarias antigas (TCV, etc) → DP (1)
+    
+    Exemplo: Termo TFM/XXX/2023 com Portaria 090
+    - Prestação 01/12/2023 a 28/02/2024 → Termina antes de 01/01/2024 = Compartilhada (2)
+    - Prestação 01/03/2024 a 31/05/2024 → Termina depois de 01/01/2024 = Pessoa Gestora (3)
+    
+    Args:
+        portaria (str): Nome da portaria (ex: 'Portaria nº 021/SMDHC/2023')
+        vigencia_final (date/str): Data de término da vigência da prestação
+    
+    Returns:
+        int: 1 (DP), 2 (Compartilhada) ou 3 (Pessoa Gestora)
+    """
+    if not portaria:
+        return 1  # Default: DP
+    
+    # Converter vigencia_final para date se for string
+    if isinstance(vigencia_final, str):
+        try:
+            vigencia_final = datetime.strptime(vigencia_final, '%Y-%m-%d').date()
+        except:
+            pass  # Se falhar, continua com o valor original
+    
+    # Datas de transição das portarias
+    DATA_TRANSICAO_021 = datetime(2023, 3, 1).date()   # 01/03/2023 - Portaria 021 assume
+    DATA_TRANSICAO_090 = datetime(2024, 1, 1).date()   # 01/01/2024 - Portaria 090 assume
+    
+    portaria_upper = portaria.upper()
+    
+    # Portaria 021 (TFM/TCL sem fundos) - verifica data de transição
+    if '021/SMDHC/2023' in portaria_upper or '021' in portaria_upper and '2023' in portaria_upper:
+        if vigencia_final and vigencia_final >= DATA_TRANSICAO_021:
+            return 3  # Pessoa Gestora (prestação termina após 01/03/2023)
+        else:
+            return 2  # Compartilhada (prestação termina antes, ainda era Portaria 121)
+    
+    # Portaria 090 (TFM/TCL com FUMCAD/FMID) - verifica data de transição
+    if '090/SMDHC/2023' in portaria_upper or '090' in portaria_upper and '2023' in portaria_upper:
+        if vigencia_final and vigencia_final >= DATA_TRANSICAO_090:
+            return 3  # Pessoa Gestora (prestação termina após 01/01/2024)
+        else:
+            return 2  # Compartilhada (prestação termina antes, ainda era Portaria 140)
+    
+    # Portarias 121 e 140 diretamente (período de transição 2017-2023)
+    if '121/SMDHC/2019' in portaria_upper or '140/SMDHC/2019' in portaria_upper:
+        return 2  # Compartilhada
+    
+    # Outras portarias antigas (TCV, Portarias 006, 072, 009, Decreto 6.170)
+    return 1  # DP
+
+
+def gerar_prestacoes(numero_termo, data_inicio, data_termino, portaria):
+    """
+    Gera as prestações de contas baseado na portaria e período de vigência
+    Usa lógica de dias para cálculos precisos
+    
+    IMPORTANTE: Considera transição de portarias:
+    - Portaria 121 → 021 em 01/03/2023
+    - Portaria 140 → 090 em 01/01/2024
+    
+    Após transição, trimestrais PARAM de ser geradas (só semestral + final)
+    """
+    from dateutil.relativedelta import relativedelta
+    from datetime import date
+    
+    prestacoes = []
+    
+    # Definir tipo de prestações baseado na portaria
+    portarias_semestral = ['Portaria nº 021/SMDHC/2023', 'Portaria nº 090/SMDHC/2023']
+    portarias_trimestral_semestral = ['Portaria nº 121/SMDHC/2019', 'Portaria nº 140/SMDHC/2019']
+    
+    # Datas de transição de portarias
+    DATA_TRANSICAO_121_PARA_021 = date(2023, 3, 1)  # 01/03/2023
+    DATA_TRANSICAO_140_PARA_090 = date(2024, 1, 1)  # 01/01/2024
+    
+    # Determinar se há transição durante a vigência do termo
+    data_transicao = None
+    if portaria == 'Portaria nº 121/SMDHC/2019':
+        if data_inicio < DATA_TRANSICAO_121_PARA_021 <= data_termino:
+            data_transicao = DATA_TRANSICAO_121_PARA_021
+    elif portaria == 'Portaria nº 140/SMDHC/2019':
+        if data_inicio < DATA_TRANSICAO_140_PARA_090 <= data_termino:
+            data_transicao = DATA_TRANSICAO_140_PARA_090
+    
+    # Calcular duração em meses
+    duracao_meses = (data_termino.year - data_inicio.year) * 12 + (data_termino.month - data_inicio.month) + 1
+    
+    if portaria in portarias_semestral:
+        # Portarias 021 e 090: Semestral + Final
+        # REGRA: Só gerar semestral se houver MAIS de 6 meses de vigência
+        # Se vigência <= 6 meses, gerar APENAS Final
+        numero_prestacao = 1
+        data_atual = data_inicio
+        
+        while data_atual < data_termino:
+            # Calcular fim do semestre (6 meses)
+            data_fim_semestre = data_atual + relativedelta(months=6) - relativedelta(days=1)
+            
+            # Se passou do término OU atingiu exatamente o término, NÃO gerar semestral
+            # Nestes casos, a prestação Final já cobre todo o período
+            if data_fim_semestre >= data_termino:
+                # Esta seria a única semestral OU uma semestral parcial - NÃO gerar
+                # A prestação Final já cobre todo o período
+                break
+            
+            prestacoes.append({
+                'tipo_prestacao': 'Semestral',
+                'numero_prestacao': numero_prestacao,
+                'vigencia_inicial': data_atual.strftime('%Y-%m-%d'),
+                'vigencia_final': data_fim_semestre.strftime('%Y-%m-%d')
+            })
+            
+            numero_prestacao += 1
+            data_atual = data_fim_semestre + relativedelta(days=1)
+            
+            if data_atual > data_termino:
+                break
+        
+        # Adicionar prestação final
+        prestacoes.append({
+            'tipo_prestacao': 'Final',
+            'numero_prestacao': 1,
+            'vigencia_inicial': data_inicio.strftime('%Y-%m-%d'),
+            'vigencia_final': data_termino.strftime('%Y-%m-%d')
+        })
+        
+    elif portaria in portarias_trimestral_semestral:
+        # Portarias 121 e 140: Trimestral + Semestral + Final
+        # COM TRANSIÇÃO: após data_transicao, NÃO gerar mais trimestrais
+        
+        # === TRIMESTRAIS ===
+        # Só gera até a data de transição (se houver)
+        data_limite_trimestral = data_transicao - relativedelta(days=1) if data_transicao else data_termino
+        
+        numero_prestacao = 1
+        data_atual = data_inicio
+        
+        while data_atual < data_limite_trimestral:
+            # Calcular fim do trimestre (3 meses)
+            data_fim_trimestre = data_atual + relativedelta(months=3) - relativedelta(days=1)
+            
+            # Se passou do limite trimestral, ajustar para parar antes da transição
+            if data_fim_trimestre > data_limite_trimestral:
+                data_fim_trimestre = data_limite_trimestral
+            
+            prestacoes.append({
+                'tipo_prestacao': 'Trimestral',
+                'numero_prestacao': numero_prestacao,
+                'vigencia_inicial': data_atual.strftime('%Y-%m-%d'),
+                'vigencia_final': data_fim_trimestre.strftime('%Y-%m-%d')
+            })
+            
+            numero_prestacao += 1
+            data_atual = data_fim_trimestre + relativedelta(days=1)
+            
+            if data_atual >= data_limite_trimestral:
+                break
+        
+        # === SEMESTRAIS ===
+        # Gera para TODO o período (antes E depois da transição)
+        # REGRA: Não gerar semestral parcial no final (menor que 6 meses)
+        numero_semestral = 1
+        data_atual = data_inicio
+        
+        while data_atual < data_termino:
+            # Calcular fim do semestre (6 meses)
+            data_fim_semestre = data_atual + relativedelta(months=6) - relativedelta(days=1)
+            
+            # Se passou do término, verificar se é semestre completo
+            if data_fim_semestre > data_termino:
+                # Esta seria uma semestral parcial - NÃO gerar
+                # A prestação Final já cobre todo o período
+                break
+            
+            prestacoes.append({
+                'tipo_prestacao': 'Semestral',
+                'numero_prestacao': numero_semestral,
+                'vigencia_inicial': data_atual.strftime('%Y-%m-%d'),
+                'vigencia_final': data_fim_semestre.strftime('%Y-%m-%d')
+            })
+            
+            numero_semestral += 1
+            data_atual = data_fim_semestre + relativedelta(days=1)
+            
+            if data_atual > data_termino:
+                break
+        
+        # Adicionar prestação final
+        prestacoes.append({
+            'tipo_prestacao': 'Final',
+            'numero_prestacao': 1,
+            'vigencia_inicial': data_inicio.strftime('%Y-%m-%d'),
+            'vigencia_final': data_termino.strftime('%Y-%m-%d')
+        })
+        
+    else:
+        # Outras portarias: Trimestral + Final
+        
+        # Gerar prestações trimestrais
+        numero_prestacao = 1
+        data_atual = data_inicio
+        
+        while data_atual < data_termino:
+            # Calcular fim do trimestre (3 meses)
+            data_fim_trimestre = data_atual + relativedelta(months=3) - relativedelta(days=1)
+            
+            # Se passou do término, ajustar
+            if data_fim_trimestre > data_termino:
+                data_fim_trimestre = data_termino
+            
+            prestacoes.append({
+                'tipo_prestacao': 'Trimestral',
+                'numero_prestacao': numero_prestacao,
+                'vigencia_inicial': data_atual.strftime('%Y-%m-%d'),
+                'vigencia_final': data_fim_trimestre.strftime('%Y-%m-%d')
+            })
+            
+            numero_prestacao += 1
+            data_atual = data_fim_trimestre + relativedelta(days=1)
+            
+            if data_atual > data_termino:
+                break
+        
+        # Adicionar prestação final
+        prestacoes.append({
+            'tipo_prestacao': 'Final',
+            'numero_prestacao': 1,
+            'vigencia_inicial': data_inicio.strftime('%Y-%m-%d'),
+            'vigencia_final': data_termino.strftime('%Y-%m-%d')
+        })
+    
+    return prestacoes
+
+
+# ── Reconciliação em lote ────────────────────────────────────────────────────
+
+ORDEM_TIPO = {'Trimestral': 1, 'Semestral': 2, 'Final': 3}
+
+# Execução mínima (dias entre início e rescisão) para haver prestação de contas
+DIAS_EXECUCAO_MINIMA = 5
+
+_SQL_TERMOS = """
+    SELECT p.numero_termo, p.sei_celeb, p.inicio, p.final, p.portaria,
+           tr.data_rescisao, p.total_pago
+    FROM Parcerias p
+    LEFT JOIN public.termos_rescisao tr ON p.numero_termo = tr.numero_termo
+    WHERE {filtro}
+    ORDER BY p.numero_termo DESC
+"""
+
+_SQL_CADASTRADAS = """
+    SELECT id, numero_termo, tipo_prestacao, numero_prestacao,
+           vigencia_inicial, vigencia_final, responsabilidade_analise, entregue
+    FROM parcerias_analises
+    WHERE numero_termo = ANY(%s)
+    ORDER BY numero_termo, id
+"""
+
+
+def _como_data(valor):
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor
+
+
+def _chave(prestacao):
+    return (prestacao['tipo_prestacao'], int(prestacao['numero_prestacao']))
+
+
+def _ordenar(prestacoes):
+    return sorted(prestacoes, key=lambda x: (ORDEM_TIPO.get(x['tipo_prestacao'], 4), x['numero_prestacao']))
+
+
+def _final_diverge(cadastradas, data_inicio, data_termino, modo_exato):
+    """Mesma regra da tela: compara só a prestação Final com a vigência do termo."""
+    final = next((p for p in cadastradas if p['tipo_prestacao'] == 'Final'), None)
+    if not final or not final['vigencia_inicial'] or not final['vigencia_final']:
+        return True
+    if modo_exato:
+        return not (final['vigencia_inicial'] == data_inicio and final['vigencia_final'] == data_termino)
+    return not (
+        (final['vigencia_inicial'].year, final['vigencia_inicial'].month) == (data_inicio.year, data_inicio.month)
+        and (final['vigencia_final'].year, final['vigencia_final'].month) == (data_termino.year, data_termino.month)
+    )
+
+
+def _planejar_termo(termo, cadastradas):
+    """
+    Plano de um termo: o que inserir, atualizar e remover em parcerias_analises.
+    Prestações existentes com mesmo tipo+número são mantidas (mesmo id, dados
+    preenchidos preservados) e só têm a vigência corrigida.
+    """
+    data_inicio = termo['inicio']
+    data_rescisao = termo.get('data_rescisao')
+    data_termino = data_rescisao or termo['final']
+    portaria = termo['portaria']
+    total_pago = termo.get('total_pago') or 0
+
+    plano = {
+        'numero_termo': termo['numero_termo'],
+        'sei_celeb': termo.get('sei_celeb'),
+        'portaria': portaria,
+        'data_inicio_termo': data_inicio,
+        'data_final_termo': data_termino,
+        'data_final_original': termo['final'],
+        'data_rescisao': data_rescisao,
+        'rescindido': data_rescisao is not None,
+        'total_pago': total_pago,
+        'acao': 'recalcular',
+        'motivo': '',
+        'prestacoes_cadastradas': [
+            {c: p[c] for c in ('id', 'tipo_prestacao', 'numero_prestacao', 'vigencia_inicial', 'vigencia_final')}
+            for p in _ordenar(cadastradas)
+        ],
+        'prestacoes_corretas': [],
+        'inserir': [],
+        'atualizar': [],
+        'remover': [],
+        'mantidas': 0,
+    }
+
+    if not data_inicio or not data_termino:
+        plano.update(acao='ignorar', motivo='Termo sem data de início ou término')
+        return plano
+
+    if data_rescisao:
+        dias_execucao = (data_rescisao - data_inicio).days
+        plano['dias_execucao'] = dias_execucao
+        if dias_execucao <= DIAS_EXECUCAO_MINIMA:
+            plano.update(
+                acao='ignorar',
+                motivo=f'Termo foi rescindido em {data_rescisao.strftime("%d/%m/%Y")}, apenas '
+                       f'{dias_execucao} dia(s) após o início. Não há prestações de contas '
+                       f'(execução mínima não atingida).',
+            )
+            return plano
+        if total_pago == 0:
+            # Rescindido sem recursos repassados: nenhuma prestação deve existir
+            plano.update(
+                acao='remover_sem_recursos',
+                motivo=f'Termo rescindido sem recursos (R$ 0,00). Vigência: {dias_execucao} dia(s).',
+                remover=list(cadastradas),
+            )
+            return plano
+
+    corretas = _ordenar(gerar_prestacoes(termo['numero_termo'], data_inicio, data_termino, portaria))
+    plano['prestacoes_corretas'] = corretas
+
+    existentes = {}
+    for p in cadastradas:
+        chave = _chave(p)
+        if chave in existentes:
+            plano['remover'].append(p)          # duplicada: fica a de menor id
+        else:
+            existentes[chave] = p
+
+    for nova in corretas:
+        vig_ini = _como_data(nova['vigencia_inicial'])
+        vig_fim = _como_data(nova['vigencia_final'])
+        responsabilidade = determinar_responsabilidade_por_vigencia(portaria, vig_fim)
+        antiga = existentes.pop(_chave(nova), None)
+        if antiga is None:
+            plano['inserir'].append({
+                'tipo_prestacao': nova['tipo_prestacao'],
+                'numero_prestacao': nova['numero_prestacao'],
+                'vigencia_inicial': vig_ini,
+                'vigencia_final': vig_fim,
+                'responsabilidade_analise': responsabilidade,
+            })
+            continue
+        responsabilidade = antiga['responsabilidade_analise'] or responsabilidade
+        if (antiga['vigencia_inicial'], antiga['vigencia_final'], antiga['responsabilidade_analise']) \
+                == (vig_ini, vig_fim, responsabilidade):
+            plano['mantidas'] += 1
+            continue
+        plano['atualizar'].append({
+            'id': antiga['id'],
+            'tipo_prestacao': nova['tipo_prestacao'],
+            'numero_prestacao': nova['numero_prestacao'],
+            'vigencia_inicial': vig_ini,
+            'vigencia_final': vig_fim,
+            'responsabilidade_analise': responsabilidade,
+            'vigencia_anterior': (antiga['vigencia_inicial'], antiga['vigencia_final']),
+        })
+
+    # O que sobrou não existe no cronograma recalculado
+    plano['remover'].extend(existentes.values())
+    return plano
+
+
+def _aplicar(cur, planos):
+    """Grava todos os planos (inserts, updates e deletes em lote)."""
+    from psycopg2.extras import execute_values
+
+    inserir = [
+        (pl['numero_termo'], p['tipo_prestacao'], p['numero_prestacao'],
+         p['vigencia_inicial'], p['vigencia_final'], p['responsabilidade_analise'],
+         False, False, False, False, False, False)
+        for pl in planos for p in pl['inserir']
+    ]
+    atualizar = [
+        (p['id'], p['vigencia_inicial'], p['vigencia_final'], p['responsabilidade_analise'])
+        for pl in planos for p in pl['atualizar']
+    ]
+    remover = [p for pl in planos for p in pl['remover']]
+    sem_recursos = [pl['numero_termo'] for pl in planos if pl['acao'] == 'remover_sem_recursos']
+
+    if sem_recursos:
+        cur.execute("DELETE FROM public.parcerias_monit WHERE numero_termo = ANY(%s)", (sem_recursos,))
+        cur.execute("DELETE FROM public.parcerias_monit_adicional WHERE numero_termo = ANY(%s)", (sem_recursos,))
+
+    if remover:
+        # Monitoramento das prestações que deixam de existir (sem órfãos)
+        chaves = {(p['numero_termo'], p['tipo_prestacao'], int(p['numero_prestacao'])) for p in remover}
+        permanecem = {
+            (pl['numero_termo'],) + _chave(p)
+            for pl in planos for p in pl['prestacoes_corretas']
+        }
+        chaves -= permanecem
+        if chaves:
+            termos, tipos, numeros = (list(c) for c in zip(*sorted(chaves)))
+            for tabela in ('public.parcerias_monit', 'public.parcerias_monit_adicional'):
+                cur.execute(f"""
+                    DELETE FROM {tabela} m
+                    USING UNNEST(%s::text[], %s::text[], %s::int[]) AS k(numero_termo, tipo_prestacao, numero_prestacao)
+                    WHERE m.numero_termo = k.numero_termo
+                      AND m.tipo_prestacao = k.tipo_prestacao
+                      AND m.numero_prestacao = k.numero_prestacao
+                """, (termos, tipos, numeros))
+        cur.execute("DELETE FROM parcerias_analises WHERE id = ANY(%s)", ([p['id'] for p in remover],))
+
+    if atualizar:
+        execute_values(cur, """
+            UPDATE parcerias_analises pa
+            SET vigencia_inicial = v.vigencia_inicial,
+                vigencia_final = v.vigencia_final,
+                responsabilidade_analise = v.responsabilidade_analise
+            FROM (VALUES %s) AS v(id, vigencia_inicial, vigencia_final, responsabilidade_analise)
+            WHERE pa.id = v.id
+        """, atualizar, template='(%s, %s::date, %s::date, %s::int)', page_size=500)
+
+    if inserir:
+        execute_values(cur, """
+            INSERT INTO parcerias_analises (
+                numero_termo, tipo_prestacao, numero_prestacao,
+                vigencia_inicial, vigencia_final,
+                responsabilidade_analise,
+                entregue, cobrado, e_notificacao, e_parecer,
+                e_fase_recursal, e_encerramento
+            ) VALUES %s
+        """, inserir, page_size=500)
+
+
+def reconciliar(cur, termos=None, modo_exato=False, aplicar=False):
+    """
+    Recalcula as prestações de contas de vários termos de uma vez.
+
+    Args:
+        cur: cursor da requisição (o commit/rollback é feito aqui se aplicar=True).
+        termos: lista de numero_termo a recalcular (todos, mesmo sem divergência);
+            None = todos os termos com prestações cuja Final diverge da vigência.
+        modo_exato: compara dia/mês/ano da Final (senão só mês/ano).
+        aplicar: False = dry-run, só devolve o relatório.
+
+    Returns:
+        dict {'termos': [plano por termo], 'totais': {...}, 'aplicado': bool}.
+        Cada plano traz acao ('recalcular', 'remover_sem_recursos' ou 'ignorar'),
+        motivo, prestacoes_cadastradas, prestacoes_corretas e as listas
+        inserir/atualizar/remover.
+    """
+    if termos is None:
+        filtro = ("p.inicio IS NOT NULL AND p.final IS NOT NULL "
+                  "AND EXISTS (SELECT 1 FROM parcerias_analises pa WHERE pa.numero_termo = p.numero_termo)")
+        cur.execute(_SQL_TERMOS.format(filtro=filtro))
+    else:
+        cur.execute(_SQL_TERMOS.format(filtro="p.numero_termo = ANY(%s)"), (list(termos),))
+    linhas_termos = cur.fetchall()
+
+    numeros = [t['numero_termo'] for t in linhas_termos]
+    sql_cadastradas = _SQL_CADASTRADAS + (" FOR UPDATE" if aplicar else "")
+    cur.execute(sql_cadastradas, (numeros,))
+    por_termo = {}
+    for p in cur.fetchall():
+        por_termo.setdefault(p['numero_termo'], []).append(p)
+
+    planos = []
+    for termo in linhas_termos:
+        cadastradas = por_termo.get(termo['numero_termo'], [])
+        if termos is None and not _final_diverge(
+                cadastradas, termo['inicio'], termo['data_rescisao'] or termo['final'], modo_exato):
+            continue
+        planos.append(_planejar_termo(termo, cadastradas))
+
+    encontrados = set(numeros)
+    nao_encontrados = [t for t in (termos or []) if t not in encontrados]
+
+    if aplicar:
+        try:
+            _aplicar(cur, planos)
+            cur.connection.commit()
+        except Exception:
+            cur.connection.rollback()
+            raise
+
+    return {
+        'termos': planos,
+        'nao_encontrados': nao_encontrados,
+        'totais': {
+            'termos': len(planos),
+            'ignorados': sum(1 for pl in planos if pl['acao'] == 'ignorar'),
+            'inserir': sum(len(pl['inserir']) for pl in planos),
+            'atualizar': sum(len(pl['atualizar']) for pl in planos),
+            'remover': sum(len(pl['remover']) for pl in planos),
+            'remover_entregues': sum(1 for pl in planos for p in pl['remover'] if p['entregue']),
+        },
+        'aplicado': aplicar,
+    }
+
+
+def serializar(relatorio):
+    """Relatório de reconciliar() em tipos JSON (datas ISO, sem linhas do banco)."""
+    def _valor(v):
+        if isinstance(v, (date, datetime)):
+            return v.isoformat()
+        if isinstance(v, (list, tuple)):
+            return [_valor(x) for x in v]
+        if isinstance(v, dict):
+            return {k: _valor(x) for k, x in v.items()}
+        if isinstance(v, Decimal):
+            return float(v)
+        return v
+    return _valor(relatorio)
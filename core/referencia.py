@@ -0,0 +1,266 @@
+"""
+Cache de dados de referência (dropdowns e listas categóricas)
+
+Listas como tipos de contrato, pessoas gestoras, legislação e editais mudam
+raramente, mas eram relidas do banco a cada renderização de página
+(parcerias.listar/nova/editar fazem 4+ consultas só para os selects).
+
+- Cache por processo, com TTL por consulta (CONSULTAS)
+- Invalidação explícita: as telas que escrevem nas tabelas (listas, portarias,
+  editais, parcerias) chamam invalidar('schema.tabela') após o commit
+- Os demais workers do gunicorn ficam sabendo pela tabela
+  public.cache_referencia_versoes, consultada no máximo a cada
+  INTERVALO_VERSOES s; se ela estiver indisponível, vale só o TTL
+
+Uso:
+    tipos = referencia.obter('tipos_contrato', cur)
+    ...
+    conn.commit()
+    referencia.invalidar('categoricas.c_geral_tipo_contrato')
+"""
+
+import threading
+import time
+
+
+INTERVALO_VERSOES = 10.0
+
+# nome → sql, tabelas de origem, TTL (s) e coluna (lista simples) ou None (linhas como dict)
+CONSULTAS = {
+    'tipos_contrato': {
+        'sql': "SELECT informacao FROM categoricas.c_geral_tipo_contrato ORDER BY informacao",
+        'tabelas': ('categoricas.c_geral_tipo_contrato',),
+        'ttl': 3600,
+        'coluna': 'informacao',
+    },
+    'tipos_contrato_siglas': {
+        'sql': "SELECT id, informacao, sigla FROM categoricas.c_geral_tipo_contrato ORDER BY sigla",
+        'tabelas': ('categoricas.c_geral_tipo_contrato',),
+        'ttl': 3600,
+        'coluna': None,
+    },
+    'legislacoes': {
+        'sql': "SELECT lei FROM categoricas.c_geral_legislacao ORDER BY lei",
+        'tabelas': ('categoricas.c_geral_legislacao',),
+        'ttl': 3600,
+        'coluna': 'lei',
+    },
+    'leis_opcoes': {
+        'sql': """
+            SELECT lei
+            FROM categoricas.c_geral_legislacao
+            WHERE lei IS NOT NULL
+              AND TRIM(lei) != ''
+            ORDER BY lei
+        """,
+        'tabelas': ('categoricas.c_geral_legislacao',),
+        'ttl': 3600,
+        'coluna': 'lei',
+    },
+    'pessoas_gestoras': {
+        'sql': "SELECT nome_pg, numero_rf, status_pg FROM categoricas.c_geral_pessoa_gestora ORDER BY nome_pg",
+        'tabelas': ('categoricas.c_geral_pessoa_gestora',),
+        'ttl': 1800,
+        'coluna': None,
+    },
+    'pessoas_gestoras_nomes': {
+        'sql': "SELECT DISTINCT nome_pg FROM categoricas.c_geral_pessoa_gestora ORDER BY nome_pg",
+        'tabelas': ('categoricas.c_geral_pessoa_gestora',),
+        'ttl': 1800,
+        'coluna': 'nome_pg',
+    },
+    'editais_cadastrados': {
+        'sql': """
+            SELECT DISTINCT edital_nome
+            FROM public.parcerias_edital
+            WHERE edital_nome IS NOT NULL
+            ORDER BY edital_nome
+        """,
+        'tabelas': ('public.parcerias_edital',),
+        'ttl': 1800,
+        'coluna': 'edital_nome',
+    },
+    # public.parcerias é escrita por muitas rotas (importações, alterações):
+    # TTL curto + invalidação nas telas de cadastro
+    'editais_em_parcerias': {
+        'sql': """
+            SELECT DISTINCT edital_nome
+            FROM public.parcerias
+            WHERE edital_nome IS NOT NULL
+            ORDER BY edital_nome
+        """,
+        'tabelas': ('public.parcerias',),
+        'ttl': 300,
+        'coluna': 'edital_nome',
+    },
+    # Base de core/calendario (dias úteis); datas_importantes invalida ao editar feriados
+    'feriados': {
+        'sql': """
+            SELECT data_feriado
+            FROM calendario.data_feriados
+            WHERE ativo = TRUE
+              AND data_feriado IS NOT NULL
+            ORDER BY data_feriado
+        """,
+        'tabelas': ('calendario.data_feriados',),
+        'ttl': 3600,
+        'coluna': 'data_feriado',
+    },
+}
+
+
+def _copiar(valor):
+    # Quem chama pode alterar a lista/linhas (ex.: dict(parceria)); o cache não
+    return [dict(v) if isinstance(v, dict) else v for v in valor]
+
+
+class _CacheReferencia:
+
+    def __init__(self, consultas):
+        self.consultas = consultas
+        self._lock = threading.Lock()
+        self._valores = {}          # nome → (expira_em, valor)
+        self._versoes = {}          # tabela → versão conhecida
+        self._proxima_verificacao = 0.0
+        self._tabela_ok = False
+        self.acertos = 0
+        self.faltas = 0
+
+    # ── API ──────────────────────────────────────────────────────────────
+
+    def obter(self, nome, cur=None):
+        """
+        Retorna a lista de referência `nome` (cópia), lendo do banco se o
+        cache expirou ou foi invalidado.
+
+        Args:
+            cur: cursor da requisição para a carga (default: db.get_cursor()).
+        """
+        consulta = self.consultas[nome]
+        self._sincronizar_versoes()
+
+        agora = time.monotonic()
+        with self._lock:
+            item = self._valores.get(nome)
+            if item and item[0] > agora:
+                self.acertos += 1
+                return _copiar(item[1])
+            self.faltas += 1
+
+        if cur is None:
+            from db import get_cursor
+            cur = get_cursor()
+        cur.execute(consulta['sql'])
+        linhas = cur.fetchall()
+        coluna = consulta['coluna']
+        valor = [r[coluna] for r in linhas] if coluna else [dict(r) for r in linhas]
+
+        with self._lock:
+            self._valores[nome] = (agora + consulta['ttl'], valor)
+        return _copiar(valor)
+
+    def invalidar(self, *tabelas):
+        """
+        Descarta as consultas que dependem de `tabelas` ('schema.tabela') neste
+        processo e avisa os demais workers. Chamar após o commit da escrita.
+        """
+        tabelas = {t.lower() for t in tabelas if t}
+        if not tabelas:
+            return
+        self._descartar(tabelas)
+        try:
+            from db import pooled_connection
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    self._garantir_tabela(cur)
+                    cur.execute("""
+                        INSERT INTO public.cache_referencia_versoes (tabela, versao, atualizado_em)
+                        SELECT t, 1, NOW() FROM UNNEST(%s::text[]) AS t
+                        ON CONFLICT (tabela) DO UPDATE
+                        SET versao = cache_referencia_versoes.versao + 1,
+                            atualizado_em = NOW()
+                        RETURNING tabela, versao
+                    """, (sorted(tabelas),))
+                    novas = dict(cur.fetchall())
+                conn.commit()
+            with self._lock:
+                self._versoes.update(novas)
+        except Exception as e:
+            # Sem a tabela de versões os outros workers expiram pelo TTL
+            print(f"[REFERENCIA] Falha ao propagar invalidação de {sorted(tabelas)}: {e}")
+
+    def versoes(self, *tabelas):
+        """
+        Versões conhecidas de `tabelas` (None = nunca invalidada). Caches de
+        fora de CONSULTAS guardam a tupla junto com o valor e o descartam
+        quando ela muda, aproveitando a mesma sincronização entre workers.
+        """
+        self._sincronizar_versoes()
+        with self._lock:
+            return tuple(self._versoes.get(t.lower()) for t in tabelas)
+
+    def limpar(self):
+        """Esvazia o cache deste processo."""
+        with self._lock:
+            self._valores.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'itens': len(self._valores),
+                'acertos': self.acertos,
+                'faltas': self.faltas,
+            }
+
+    # ── Interno ──────────────────────────────────────────────────────────
+
+    def _descartar(self, tabelas):
+        with self._lock:
+            for nome, consulta in self.consultas.items():
+                if tabelas.intersection(consulta['tabelas']):
+                    self._valores.pop(nome, None)
+
+    def _garantir_tabela(self, cur):
+        if self._tabela_ok:
+            return
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS public.cache_referencia_versoes (
+                tabela        VARCHAR(120) PRIMARY KEY,
+                versao        BIGINT NOT NULL DEFAULT 1,
+                atualizado_em TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+            )
+        """)
+        self._tabela_ok = True
+
+    def _sincronizar_versoes(self):
+        agora = time.monotonic()
+        with self._lock:
+            if agora < self._proxima_verificacao:
+                return
+            self._proxima_verificacao = agora + INTERVALO_VERSOES
+        try:
+            from db import pooled_connection
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    self._garantir_tabela(cur)
+                    cur.execute("SELECT tabela, versao FROM public.cache_referencia_versoes")
+                    remotas = dict(cur.fetchall())
+                conn.commit()
+        except Exception as e:
+            print(f"[REFERENCIA] Falha ao consultar versões: {e}")
+            return
+
+        with self._lock:
+            mudaram = {t for t, v in remotas.items() if self._versoes.get(t) != v}
+            self._versoes = remotas
+        if mudaram:
+            self._descartar(mudaram)
+
+
+_cache = _CacheReferencia(CONSULTAS)
+
+obter = _cache.obter
+invalidar = _cache.invalidar
+versoes = _cache.versoes
+limpar = _cache.limpar
+estatisticas = _cache.estatisticas
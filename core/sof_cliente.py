@@ -0,0 +1,364 @@
+"""
+Cliente da API SOF (gateway da Prefeitura de São Paulo)
+
+Antes, routes/sof_api fazia requests.get/post avulsos: conexão TLS nova a
+cada chamada, nenhuma nova tentativa em falha transitória e nenhuma
+reutilização de consultas idênticas. O cache do token era um dict global
+sem lock, disputado pelas threads do gunicorn (gthread).
+
+- requests.Session com pool de conexões (recriada após fork)
+- Token com renovação single-flight: uma thread renova, as demais esperam
+  e reaproveitam; 401 invalida o token e repete a chamada uma vez
+- Novas tentativas com backoff exponencial + jitter para erros de conexão,
+  timeout, 429 e 5xx (respeita Retry-After)
+- Cache de respostas por TTL_RESPOSTAS s, com chave = recurso + filtros
+  normalizados (sem vazios, valores como texto, ordem irrelevante)
+- Fan-out: filtros com lista de valores (ex.: anoContrato=[2023, 2024])
+  viram uma consulta por combinação, executadas em paralelo, e as listas
+  de resultado são concatenadas
+
+URLs configuráveis por SOF_TOKEN_URL / SOF_BASE_URL (ex.: servidor local de
+teste).
+
+Uso:
+    from core.sof_cliente import cliente_sof
+    dados = cliente_sof.contratos({'anoContrato': [2023, 2024], 'codOrgao': '34'})
+"""
+
+import copy
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+SOF_TOKEN_URL = os.environ.get('SOF_TOKEN_URL', 'https://gateway.apilib.prefeitura.sp.gov.br/token')
+SOF_BASE_URL = os.environ.get('SOF_BASE_URL', 'https://gateway.apilib.prefeitura.sp.gov.br/sf/sof/v4')
+
+TTL_RESPOSTAS = 300
+MAX_ITENS_CACHE = 500
+MAX_TENTATIVAS = 3
+BACKOFF_BASE = 0.5
+MAX_WORKERS = 4
+MAX_CONSULTAS_FANOUT = 60
+TIMEOUT_TOKEN = 10
+TIMEOUT_CONSULTA = 30
+MARGEM_TOKEN = 300
+
+_STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+# recurso → (chave da lista no retorno, filtros que aceitam vários valores)
+RECURSOS = {
+    'contratos': ('lstContratos', ('anoContrato', 'numProcesso', 'codContrato')),
+    'empenhos': ('lstEmpenhos', ('anoEmpenho', 'mesEmpenho', 'codContrato', 'numCpfCnpj')),
+}
+
+
+class ErroSOF(Exception):
+    """Falha definitiva numa chamada ao SOF (após as novas tentativas)."""
+
+    def __init__(self, mensagem, status=None, detalhes=None, url=None):
+        super().__init__(mensagem)
+        self.status = status
+        self.detalhes = detalhes
+        self.url = url
+
+
+def _registrar(url, mensagem, status=None, detalhes=None):
+    from decorators import registrar_erro
+    registrar_erro(
+        tipo_erro='api_externa',
+        api_nome='SOF',
+        api_endpoint=url,
+        status_codigo=status,
+        mensagem=mensagem,
+        detalhes=detalhes,
+    )
+
+
+def normalizar_filtros(filtros):
+    """Remove vazios e converte valores em texto (listas viram tuplas de texto)."""
+    normalizados = {}
+    for chave, valor in (filtros or {}).items():
+        if isinstance(valor, (list, tuple, set)):
+            valores = tuple(dict.fromkeys(str(v).strip() for v in valor if v is not None and str(v).strip()))
+            if len(valores) == 1:
+                normalizados[chave] = valores[0]
+            elif valores:
+                normalizados[chave] = valores
+            continue
+        if valor is None:
+            continue
+        texto = str(valor).strip()
+        if texto:
+            normalizados[chave] = texto
+    return normalizados
+
+
+def expandir_filtros(filtros, campos_multiplos):
+    """
+    Produto cartesiano dos campos com vários valores (lista ou 'a,b,c').
+
+    Returns:
+        lista de dicts de filtros simples.
+    """
+    filtros = dict(filtros)
+    eixos = []
+    for campo in campos_multiplos:
+        valor = filtros.get(campo)
+        if isinstance(valor, str) and ',' in valor:
+            valor = tuple(dict.fromkeys(v.strip() for v in valor.split(',') if v.strip()))
+        if isinstance(valor, tuple):
+            eixos.append((campo, valor))
+            filtros.pop(campo)
+    if not eixos:
+        return [filtros]
+    combinacoes = []
+    for valores in itertools.product(*(v for _, v in eixos)):
+        combinacao = dict(filtros)
+        combinacao.update(zip((c for c, _ in eixos), valores))
+        combinacoes.append(combinacao)
+    return combinacoes
+
+
+class ClienteSOF:
+
+    def __init__(self, token_url=SOF_TOKEN_URL, base_url=SOF_BASE_URL, auth_base64=None,
+                 ttl_respostas=TTL_RESPOSTAS, max_tentativas=MAX_TENTATIVAS,
+                 backoff_base=BACKOFF_BASE, max_workers=MAX_WORKERS):
+        self.token_url = token_url
+        self.base_url = base_url.rstrip('/')
+        self._auth_base64 = auth_base64
+        self.ttl_respostas = ttl_respostas
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._sessao_atual = None
+        self._pid = None
+
+        self._lock_token = threading.Lock()
+        self._token = None
+        self._token_expira = 0.0
+
+        self._lock_cache = threading.Lock()
+        self._cache = {}            # chave → (expira_em, dados)
+        self.acertos = 0
+        self.faltas = 0
+
+    # ── Infra ────────────────────────────────────────────────────────────
+
+    def _sessao(self):
+        with self._lock:
+            if self._sessao_atual is None or self._pid != os.getpid():
+                sessao = requests.Session()
+                adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers * 2)
+                sessao.mount('https://', adaptador)
+                sessao.mount('http://', adaptador)
+                self._sessao_atual = sessao
+                self._pid = os.getpid()
+            return self._sessao_atual
+
+    def _credencial(self):
+        if self._auth_base64 is None:
+            from config import SOF_AUTH_BASE64
+            return SOF_AUTH_BASE64
+        return self._auth_base64
+
+    def _espera(self, tentativa, resposta=None):
+        if resposta is not None:
+            retry_after = resposta.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), 30.0)
+        return self.backoff_base * (2 ** tentativa) * random.uniform(0.5, 1.5)
+
+    def _requisitar(self, metodo, url, **kwargs):
+        """HTTP com novas tentativas para falhas transitórias."""
+        ultima_falha = None
+        for tentativa in range(self.max_tentativas):
+            resposta = None
+            try:
+                resposta = self._sessao().request(metodo, url, **kwargs)
+                if resposta.status_code not in _STATUS_TRANSITORIOS:
+                    return resposta
+                ultima_falha = f'HTTP {resposta.status_code}'
+            except (requests.ConnectionError, requests.Timeout) as e:
+                ultima_falha = f'{type(e).__name__}: {e}'
+            if tentativa + 1 < self.max_tentativas:
+                espera = self._espera(tentativa, resposta)
+                print(f"[SOF_API] {ultima_falha} em {url}; nova tentativa em {espera:.1f}s")
+                time.sleep(espera)
+        if resposta is not None:
+            return resposta
+        raise ErroSOF(f'Falha de conexão após {self.max_tentativas} tentativas: {ultima_falha}', url=url)
+
+    # ── Token ────────────────────────────────────────────────────────────
+
+    def token(self, forcar=False):
+        """
+        Token Bearer válido; renova se expirado (uma thread por vez).
+
+        Returns:
+            str ou None se a autenticação falhar.
+        """
+        if not forcar and self._token and time.monotonic() < self._token_expira:
+            return self._token
+        with self._lock_token:
+            # Outra thread pode ter renovado enquanto esta esperava
+            if not forcar and self._token and time.monotonic() < self._token_expira:
+                return self._token
+            print("[SOF_API] Token expirado ou inexistente. Solicitando novo token...")
+            try:
+                resposta = self._requisitar(
+                    'POST', self.token_url,
+                    headers={
+                        "Authorization": f"Basic {self._credencial()}",
+                        "Content-Type": "application/x-www-form-urlencoded",
+                    },
+                    # API SOF usa APENAS grant_type=client_credentials
+                    data={"grant_type": "client_credentials"},
+                    timeout=TIMEOUT_TOKEN,
+                )
+            except ErroSOF as e:
+                print(f"[SOF_API] EXCEÇÃO ao obter token: {e}")
+                _registrar(self.token_url, f'Exceção ao obter token: {e}')
+                return None
+
+            if resposta.status_code != 200:
+                print(f"[SOF_API] ERRO ao obter token: {resposta.status_code} - {resposta.text}")
+                _registrar(self.token_url, f'Falha ao obter token: HTTP {resposta.status_code}',
+                           resposta.status_code, {'resposta': resposta.text[:500]})
+                return None
+
+            dados = resposta.json()
+            expires_in = dados.get('expires_in', 3600)  # Default 1 hora
+            self._token = dados.get('access_token')
+            # Margem antes da expiração real
+            self._token_expira = time.monotonic() + max(expires_in - MARGEM_TOKEN, expires_in / 2)
+            print(f"[SOF_API] Token obtido com sucesso! Expira em {expires_in}s")
+            return self._token
+
+    def _invalidar_token(self, token):
+        with self._lock_token:
+            if self._token == token:
+                self._token = None
+
+    # ── Cache ────────────────────────────────────────────────────────────
+
+    def _cache_obter(self, chave):
+        with self._lock_cache:
+            item = self._cache.get(chave)
+            if item and item[0] > time.monotonic():
+                self.acertos += 1
+                return copy.deepcopy(item[1])
+            self.faltas += 1
+            return None
+
+    def _cache_gravar(self, chave, dados):
+        agora = time.monotonic()
+        with self._lock_cache:
+            if len(self._cache) >= MAX_ITENS_CACHE:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > agora}
+                if len(self._cache) >= MAX_ITENS_CACHE:
+                    self._cache.pop(min(self._cache, key=lambda k: self._cache[k][0]))
+            self._cache[chave] = (agora + self.ttl_respostas, copy.deepcopy(dados))
+
+    def limpar_cache(self):
+        with self._lock_cache:
+            self._cache.clear()
+
+    def estatisticas(self):
+        with self._lock_cache:
+            return {'itens': len(self._cache), 'acertos': self.acertos, 'faltas': self.faltas}
+
+    # ── Consulta ─────────────────────────────────────────────────────────
+
+    def consultar(self, recurso, filtros, usar_cache=True):
+        """
+        GET {base_url}/{recurso} com filtros simples (sem listas).
+
+        Raises:
+            ErroSOF: autenticação, HTTP != 200 ou falha de conexão.
+        """
+        params = normalizar_filtros(filtros)
+        chave = (recurso, tuple(sorted(params.items())))
+        if usar_cache:
+            dados = self._cache_obter(chave)
+            if dados is not None:
+                print(f"[SOF_API] {recurso} em cache: {params}")
+                return dados
+
+        url = f"{self.base_url}/{recurso}"
+        for tentativa_auth in range(2):
+            token = self.token()
+            if not token:
+                raise ErroSOF('Falha ao obter token de autenticação', url=self.token_url)
+            print(f"[SOF_API] Consultando {recurso}: {url} {params}")
+            try:
+                resposta = self._requisitar(
+                    'GET', url, params=params, timeout=TIMEOUT_CONSULTA,
+                    headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+                )
+            except ErroSOF as e:
+                _registrar(url, f'Exceção na consulta de {recurso}: {e}', detalhes={'params': params})
+                raise
+            if resposta.status_code == 401 and tentativa_auth == 0:
+                # Token revogado/expirado antes do previsto
+                self._invalidar_token(token)
+                continue
+            break
+
+        if resposta.status_code != 200:
+            print(f"[SOF_API] ERRO na consulta: {resposta.status_code} - {resposta.text}")
+            _registrar(url, f'Erro na consulta de {recurso}: HTTP {resposta.status_code}',
+                       resposta.status_code, {'resposta': resposta.text[:500], 'params': params})
+            raise ErroSOF(f'Erro na API: {resposta.status_code}', resposta.status_code,
+                          resposta.text, url)
+
+        dados = resposta.json()
+        if usar_cache:
+            self._cache_gravar(chave, dados)
+        return dados
+
+    def consultar_multiplo(self, recurso, filtros, usar_cache=True):
+        """
+        Consulta com fan-out: campos de RECURSOS[recurso] com vários valores
+        geram uma chamada por combinação, em paralelo. A lista de resultados
+        é concatenada e `consultas` traz o metaDados de cada chamada.
+        """
+        chave_lista, multiplos = RECURSOS[recurso]
+        combinacoes = expandir_filtros(normalizar_filtros(filtros), multiplos)
+        if len(combinacoes) == 1:
+            return self.consultar(recurso, combinacoes[0], usar_cache)
+        if len(combinacoes) > MAX_CONSULTAS_FANOUT:
+            raise ErroSOF(f'Combinação de filtros gera {len(combinacoes)} consultas '
+                          f'(máximo {MAX_CONSULTAS_FANOUT})')
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(combinacoes)),
+                                thread_name_prefix='sof-api') as executor:
+            respostas = list(executor.map(
+                lambda f: self.consultar(recurso, f, usar_cache), combinacoes
+            ))
+
+        itens = []
+        consultas = []
+        for combinacao, dados in zip(combinacoes, respostas):
+            itens.extend(dados.get(chave_lista) or [])
+            consultas.append({'filtros': combinacao, 'metaDados': dados.get('metaDados', {}),
+                              'total': len(dados.get(chave_lista) or [])})
+        return {chave_lista: itens, 'metaDados': {'consultas': consultas}}
+
+    def contratos(self, filtros, usar_cache=True):
+        return self.consultar_multiplo('contratos', filtros, usar_cache)
+
+    def empenhos(self, filtros, usar_cache=True):
+        return self.consultar_multiplo('empenhos', filtros, usar_cache)
+
+
+cliente_sof = ClienteSOF()
@@ -0,0 +1,330 @@
+"""
+Importação em streaming dos relatórios CSV do SOF (dotação, reservas, empenhos, liquidação)
+
+Substitui o padrão "ler o arquivo inteiro → decodificar até 4 vezes → dict com
+todas as linhas → execute_batch/INSERT linha a linha" das rotas de
+gestao_financeira. O fluxo agora é:
+
+1. Encoding detectado numa amostra do início do arquivo (UTF-8 ou Latin-1)
+2. Linhas lidas incrementalmente do upload (csv.reader sobre o stream)
+3. COPY ... FROM STDIN para uma tabela temporária (não gera WAL)
+4. Deduplicação (DISTINCT ON) + um único INSERT ... ON CONFLICT no destino
+
+A memória usada não depende do tamanho do arquivo. O progresso é impresso a
+cada INTERVALO_PROGRESSO linhas e repassado ao callback `progresso`, se
+informado; o retorno traz as contagens de linhas lidas, descartadas,
+inseridas e atualizadas.
+"""
+
+import codecs
+import csv
+import io
+import time
+
+
+TAMANHO_AMOSTRA = 64 * 1024
+INTERVALO_PROGRESSO = 20000
+
+
+def _fallback_latin1(erro):
+    # Arquivo "quase UTF-8": bytes inválidos viram o caractere Latin-1 equivalente
+    return erro.object[erro.start:erro.end].decode('latin-1'), erro.end
+
+
+codecs.register_error('sof_latin1', _fallback_latin1)
+
+
+def detectar_encoding(amostra):
+    """
+    Decide o encoding pelo início do arquivo.
+
+    Returns:
+        tuple: (encoding, errors) para io.TextIOWrapper.
+    """
+    try:
+        # final=False: a amostra pode terminar no meio de um caractere multibyte
+        codecs.getincrementaldecoder('utf-8-sig')().decode(amostra, final=False)
+        return 'utf-8-sig', 'sof_latin1'
+    except UnicodeDecodeError:
+        return 'latin-1', 'strict'
+
+
+def limpar_valor(valor):
+    """Remove espaços e o invólucro ="..." do Excel; vazio vira None."""
+    if valor is None:
+        return None
+    v = valor.strip()
+    if v.startswith('="') and v.endswith('"'):
+        v = v[2:-1].strip()
+    return v or None
+
+
+def _campo_copy(valor):
+    """Formata um valor para o formato text do COPY."""
+    if valor is None:
+        return '\\N'
+    return (str(valor)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+class _FonteCopy:
+    """Objeto file-like (read) que alimenta o COPY a partir de um gerador de linhas."""
+
+    def __init__(self, linhas):
+        self._linhas = linhas
+        self._buffer = ''
+
+    def read(self, tamanho=-1):
+        if tamanho is None or tamanho < 0:
+            tamanho = 1 << 20
+        partes = [self._buffer]
+        total = len(self._buffer)
+        while total < tamanho:
+            linha = next(self._linhas, None)
+            if linha is None:
+                break
+            partes.append(linha)
+            total += len(linha)
+        dados = ''.join(partes)
+        self._buffer = dados[tamanho:]
+        return dados[:tamanho]
+
+    readline = read
+
+
+class ArquivoSOF:
+    """
+    Um arquivo enviado para importação.
+
+    Args:
+        nome: nome do campo do formulário (usado nas mensagens e contagens)
+        arquivo: FileStorage do Flask (lido via .stream, sem .read() completo)
+        prioridade: menor vence na deduplicação (ex.: 'Sem Executor' = 0, 'Executor' = 1)
+        fixos: colunas com valor constante para todas as linhas (ex.: fonte_relatorio)
+    """
+
+    def __init__(self, nome, arquivo, prioridade=0, fixos=None):
+        self.nome = nome
+        self.arquivo = arquivo
+        self.prioridade = prioridade
+        self.fixos = fixos or {}
+
+
+def arquivos_enviados(files, campos, prioridade=0, fixos=None):
+    """Lista de ArquivoSOF para os campos de request.files efetivamente preenchidos."""
+    enviados = []
+    for campo in campos:
+        arq = files.get(campo)
+        if arq and arq.filename:
+            enviados.append(ArquivoSOF(campo, arq, prioridade, fixos))
+    return enviados
+
+
+class ImportacaoSOF:
+    """
+    Definição de uma importação SOF → tabela de destino.
+
+    Args:
+        tabela: tabela de destino (schema.tabela)
+        colunas: lista de colunas do CSV; a coluna no banco é o nome em minúsculas,
+                 salvo mapeamento explícito em `renomear` (ex.: ':B3' → 'b3')
+        chave: colunas de deduplicação/ON CONFLICT (nomes do banco)
+        vence: 'primeiro' ou 'ultimo' — qual ocorrência da chave prevalece
+               dentro da mesma prioridade
+        obrigatorias: colunas que precisam estar no cabeçalho do CSV
+        colunas_update: colunas atualizadas no conflito (None = todas as importadas)
+        set_extra: trecho SQL adicional no DO UPDATE SET (ex.: "atualizado_em = NOW()")
+        colunas_fixas: colunas preenchidas por ArquivoSOF.fixos
+        derivadas: (nomes, funcao(valores) -> tuple) para colunas calculadas por linha
+    """
+
+    def __init__(self, tabela, colunas, chave, vence='primeiro', obrigatorias=None,
+                 renomear=None, colunas_update=None, set_extra=None,
+                 colunas_fixas=None, derivadas=None):
+        self.tabela = tabela
+        renomear = renomear or {}
+        self.colunas = [(c, renomear.get(c, c.lower())) for c in colunas]
+        self.chave = chave
+        self.vence = vence
+        self.obrigatorias = list(obrigatorias or [])
+        self.obrigatorias += [c for c, db in self.colunas if db in chave and c not in self.obrigatorias]
+        self.colunas_update = colunas_update
+        self.set_extra = set_extra
+        self.colunas_fixas = colunas_fixas or []
+        self.derivadas_nomes, self.derivadas_func = derivadas or ([], None)
+
+    @property
+    def staging(self):
+        return '_stg_sof_' + self.tabela.split('.')[-1]
+
+    def colunas_destino(self):
+        return [db for _, db in self.colunas] + self.colunas_fixas + list(self.derivadas_nomes)
+
+    # ── Execução ─────────────────────────────────────────────────────────
+
+    def executar(self, conn, arquivos, progresso=None, antes_de_mesclar=None):
+        """
+        Importa os arquivos na transação corrente de `conn` (sem commit).
+
+        Args:
+            conn: conexão psycopg2
+            arquivos: lista de ArquivoSOF, na ordem de leitura
+            progresso: callback opcional progresso(etapa, dados)
+            antes_de_mesclar: callback opcional (cur, staging) chamado antes do
+                              INSERT ... ON CONFLICT (ex.: capturar chaves antigas)
+
+        Returns:
+            dict com contagens (lidas, sem_chave, duplicadas, inseridas,
+            atualizadas, total_importados, arquivos, segundos)
+        """
+        inicio = time.perf_counter()
+        notificar = progresso or (lambda etapa, dados: None)
+        colunas_stg = self.colunas_destino()
+        stats = {'lidas': 0, 'sem_chave': 0, 'arquivos': {}}
+
+        cur = conn.cursor()
+        try:
+            cur.execute("SET LOCAL datestyle TO 'ISO, DMY'")
+            cur.execute("SET LOCAL statement_timeout = 0")
+            cur.execute(f"DROP TABLE IF EXISTS {self.staging}")
+            cur.execute(f"""
+                CREATE TEMP TABLE {self.staging} (
+                    {', '.join(f'{c} TEXT' for c in colunas_stg)},
+                    _prioridade INTEGER,
+                    _ordem BIGINT
+                ) ON COMMIT DROP
+            """)
+
+            ordem = 0
+            for arq in arquivos:
+                linhas_arquivo = [0]
+                geradas = self._linhas_copy(arq, ordem, stats, linhas_arquivo, notificar)
+                cur.copy_expert(
+                    f"COPY {self.staging} ({', '.join(colunas_stg)}, _prioridade, _ordem) FROM STDIN",
+                    _FonteCopy(geradas),
+                )
+                ordem += linhas_arquivo[0]
+                stats['arquivos'][arq.nome] = linhas_arquivo[0]
+                print(f"[SOF_IMPORT] {self.tabela} ← {arq.nome}: {linhas_arquivo[0]} linhas")
+                notificar('arquivo_carregado', {'arquivo': arq.nome, 'linhas': linhas_arquivo[0]})
+
+            notificar('mesclando', {'linhas': stats['lidas']})
+            if antes_de_mesclar:
+                antes_de_mesclar(cur, self.staging)
+
+            inseridas, atualizadas, unicas = self._mesclar(cur)
+            stats['inseridas'] = inseridas
+            stats['atualizadas'] = atualizadas
+            stats['total_importados'] = inseridas + atualizadas
+            stats['duplicadas'] = stats['lidas'] - stats['sem_chave'] - unicas
+            stats['segundos'] = round(time.perf_counter() - inicio, 2)
+            print(f"[SOF_IMPORT] {self.tabela}: {stats['lidas']} lidas, "
+                  f"{stats['duplicadas']} duplicadas, {stats['sem_chave']} sem chave, "
+                  f"{inseridas} inseridas, {atualizadas} atualizadas em {stats['segundos']}s")
+            notificar('concluido', stats)
+            return stats
+        finally:
+            cur.close()
+
+    def _abrir(self, arq):
+        stream = arq.arquivo.stream
+        stream.seek(0)
+        amostra = stream.read(TAMANHO_AMOSTRA)
+        stream.seek(0)
+        encoding, errors = detectar_encoding(amostra)
+        return io.TextIOWrapper(stream, encoding=encoding, errors=errors, newline='')
+
+    def _linhas_copy(self, arq, ordem_inicial, stats, contador, notificar):
+        """
+        Valida o cabeçalho (ValueError antes de abrir o COPY) e devolve o
+        gerador das linhas no formato do COPY.
+        """
+        texto = self._abrir(arq)
+        reader = csv.reader(texto, delimiter=';')
+        cabecalho = [c.strip() for c in next(reader, None) or []]
+        faltando = [c for c in self.obrigatorias if c not in cabecalho]
+        if cabecalho and faltando:
+            texto.detach()
+            raise ValueError(f'Arquivo "{arq.nome}" sem colunas: {", ".join(faltando[:5])}')
+
+        posicoes = {c: i for i, c in enumerate(cabecalho)}
+        indices = [(posicoes.get(csv_col), db) for csv_col, db in self.colunas]
+        indices_chave = [i for i, (_, db) in enumerate(self.colunas) if db in self.chave]
+        fixos = [arq.fixos.get(c) for c in self.colunas_fixas]
+        return self._gerar(texto, reader, arq, indices, indices_chave, fixos,
+                           ordem_inicial, stats, contador, notificar)
+
+    def _gerar(self, texto, reader, arq, indices, indices_chave, fixos,
+               ordem_inicial, stats, contador, notificar):
+        sufixo = f"\t{arq.prioridade}\t"
+        nomes = [db for _, db in self.colunas]
+        try:
+            for linha in reader:
+                if not linha:
+                    continue
+                stats['lidas'] += 1
+                valores = [
+                    limpar_valor(linha[i]) if i is not None and i < len(linha) else None
+                    for i, _ in indices
+                ]
+                if any(valores[i] is None for i in indices_chave):
+                    stats['sem_chave'] += 1
+                    continue
+                extras = fixos
+                if self.derivadas_func:
+                    extras = fixos + list(self.derivadas_func(dict(zip(nomes, valores))))
+                contador[0] += 1
+                yield '\t'.join(_campo_copy(v) for v in valores + extras) + sufixo + \
+                    f"{ordem_inicial + contador[0]}\n"
+                if stats['lidas'] % INTERVALO_PROGRESSO == 0:
+                    print(f"[SOF_IMPORT] {arq.nome}: {stats['lidas']} linhas lidas...")
+                    notificar('lendo', {'arquivo': arq.nome, 'linhas': stats['lidas']})
+        finally:
+            # Não deixa o TextIOWrapper fechar o stream do upload ao ser coletado
+            texto.detach()
+
+    def _tipos_destino(self, cur):
+        """{coluna: tipo SQL} das colunas não textuais do destino (precisam de cast)."""
+        cur.execute("""
+            SELECT a.attname, format_type(a.atttypid, a.atttypmod), t.typcategory
+            FROM pg_attribute a
+            JOIN pg_type t ON t.oid = a.atttypid
+            WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        """, (self.tabela,))
+        return {nome: tipo for nome, tipo, categoria in cur.fetchall() if categoria != 'S'}
+
+    def _mesclar(self, cur):
+        colunas = self.colunas_destino()
+        tipos = self._tipos_destino(cur)
+        selecao = ', '.join(f"{c}::{tipos[c]}" if c in tipos else c for c in colunas)
+        chave = ', '.join(self.chave)
+        direcao = 'DESC' if self.vence == 'ultimo' else 'ASC'
+        atualizar = self.colunas_update
+        if atualizar is None:
+            atualizar = [c for c in colunas if c not in self.chave]
+        sets = [f"{c} = EXCLUDED.{c}" for c in atualizar]
+        if self.set_extra:
+            sets.append(self.set_extra)
+
+        cur.execute(f"""
+            WITH unicas AS (
+                SELECT DISTINCT ON ({chave}) *
+                FROM {self.staging}
+                ORDER BY {chave}, _prioridade, _ordem {direcao}
+            ), gravadas AS (
+                INSERT INTO {self.tabela} ({', '.join(colunas)})
+                SELECT {selecao} FROM unicas
+                ON CONFLICT ({chave}) DO UPDATE SET
+                    {', '.join(sets)}
+                RETURNING (xmax = 0) AS inserida
+            )
+            SELECT COUNT(*) FILTER (WHERE inserida),
+                   COUNT(*) FILTER (WHERE NOT inserida),
+                   COUNT(*)
+            FROM gravadas
+        """)
+        inseridas, atualizadas, unicas = cur.fetchone()
+        return inseridas, atualizadas, unicas
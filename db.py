@@ -3,6 +3,7 @@ Modulo de gerenciamento de conexao com o banco de dados PostgreSQL.
 """
 
 import time
+from contextlib import contextmanager
 
 import psycopg2
 from config import DB_CONFIG
@@ -65,6 +66,33 @@ def _return_connection(db, close=False):
             pass
 
 
+@contextmanager
+def pooled_connection():
+    """
+    Empresta uma conexao do pool fora do contexto de requisicao.
+
+    Para servicos em background (log writer, jobs): a conexao nao fica em
+    `g`, e devolvida ao pool na saida do bloco e descartada se tiver caido.
+    """
+    conn = _get_pool().getconn()
+    close = False
+    try:
+        conn.autocommit = False
+        with conn.cursor() as cur:
+            cur.execute("SET timezone = 'America/Sao_Paulo'")
+        conn.commit()
+        yield conn
+    except Exception as e:
+        close = _is_connection_error(e) or bool(conn.closed)
+        try:
+            conn.rollback()
+        except Exception:
+            close = True
+        raise
+    finally:
+        _return_connection(conn, close=close or bool(conn.closed))
+
+
 def get_cursor():
     """
     Retorna um cursor instrumentado que loga queries lentas.
@@ -75,6 +103,8 @@ def get_cursor():
     """
     db = get_db()
     raw_cursor = db.cursor(cursor_factory=RealDictCursor)
+    # Contadores da requisição (core/perfil_requisicoes); None fora de requisição
+    perfil = g.get("perfil_db")
 
     class TimedCursor:
         def __init__(self, cursor):
@@ -92,6 +122,8 @@ def get_cursor():
                     ) from e
                 raise
             elapsed = time.time() - t0
+            if perfil is not None:
+                perfil.registrar_query(query, elapsed)
             if elapsed >= SLOW_QUERY_THRESHOLD:
                 query_text = str(query)
                 is_advisory_lock = 'pg_advisory_xact_lock' in query_text
@@ -134,14 +166,41 @@ def get_cursor():
                     ) from e
                 raise
             elapsed = time.time() - t0
+            if perfil is not None:
+                perfil.registrar_query(query, elapsed)
             if elapsed >= SLOW_QUERY_THRESHOLD:
                 print(f"[SLOW QUERY BATCH {elapsed:.2f}s] {str(query)[:200]}")
 
+        def fetchone(self):
+            row = self._cur.fetchone()
+            if perfil is not None and row is not None:
+                perfil.registrar_linhas(1)
+            return row
+
+        def fetchmany(self, size=None):
+            rows = self._cur.fetchmany(size) if size is not None else self._cur.fetchmany()
+            if perfil is not None:
+                perfil.registrar_linhas(len(rows))
+            return rows
+
+        def fetchall(self):
+            rows = self._cur.fetchall()
+            if perfil is not None:
+                perfil.registrar_linhas(len(rows))
+            return rows
+
         def __getattr__(self, name):
             return getattr(self._cur, name)
 
         def __iter__(self):
-            return iter(self._cur)
+            if perfil is None:
+                return iter(self._cur)
+            return self._iterar()
+
+        def _iterar(self):
+            for row in self._cur:
+                perfil.registrar_linhas(1)
+                yield row
 
     return TimedCursor(raw_cursor)
 
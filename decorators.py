@@ -25,10 +25,9 @@ Todos os agentes internos (DAC, DGP, DP, Externo, Agente Público) passam sem ve
 ════════════════════════════════════════════════════════════════════
 """
 from functools import wraps
-from threading import Thread
 import json
 import traceback as _traceback
-from flask import session, redirect, url_for, flash, request, current_app, jsonify
+from flask import session, redirect, url_for, flash, request, jsonify
 from config import ACESSOS_BASICOS, TIPOS_USUARIO
 
 ACCESS_INHERITANCE = {
@@ -101,40 +100,20 @@ def get_module_access_status(user_acessos, modulo):
 # LOGGING DE ERROS ASSÍNCRONO
 # =============================================================================
 
-def _salvar_erro_async(dados, app_instance):
-    """Grava um registro em gestao_pessoas.log_erros em thread daemon."""
-    conn = None
+def _salvar_erro_async(dados):
+    """Enfileira um registro para gestao_pessoas.log_erros no log writer."""
     try:
-        with app_instance.app_context():
-            from db import get_db
-            conn = get_db()
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO gestao_pessoas.log_erros (
-                    tipo_erro, endpoint, metodo, status_codigo, usuario_email,
-                    ip_address, duracao_ms, query_preview, api_nome, api_endpoint,
-                    mensagem, detalhes
-                ) VALUES (
-                    %(tipo_erro)s, %(endpoint)s, %(metodo)s, %(status_codigo)s,
-                    %(usuario_email)s, %(ip_address)s, %(duracao_ms)s,
-                    %(query_preview)s, %(api_nome)s, %(api_endpoint)s,
-                    %(mensagem)s, %(detalhes)s
-                )
-            """, dados)
-            conn.commit()
+        from core.log_writer import enfileirar_log
+        enfileirar_log('log_erros', dados)
     except Exception as e:
-        print(f"[LOG_ERROS_AVISO] Falha ao salvar erro (não afeta aplicação): {e}")
-        if conn:
-            try:
-                conn.rollback()
-            except Exception:
-                pass
+        print(f"[LOG_ERROS_AVISO] Falha ao enfileirar erro (não afeta aplicação): {e}")
 
 
 def registrar_erro(tipo_erro, **kwargs):
     """
     Registra um erro de forma assíncrona em gestao_pessoas.log_erros.
-    Pode ser chamado de qualquer lugar com contexto Flask ativo.
+    A gravação é feita em lote pelo log writer (core/log_writer); pode ser
+    chamado de qualquer lugar, com ou sem contexto Flask.
 
     Args:
         tipo_erro (str): 'http_erro', 'query_lenta' ou 'api_externa'
@@ -158,15 +137,7 @@ def registrar_erro(tipo_erro, **kwargs):
         'detalhes':      json.dumps(detalhes_raw, ensure_ascii=False)
                          if detalhes_raw is not None else None,
     }
-    try:
-        app = current_app._get_current_object()
-        Thread(
-            target=_salvar_erro_async,
-            args=(dados, app),
-            daemon=True
-        ).start()
-    except Exception as e:
-        print(f"[LOG_ERROS_AVISO] Não foi possível disparar thread de erro: {e}")
+    _salvar_erro_async(dados)
 
 
 def capture_errors(f):
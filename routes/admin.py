@@ -1,11 +1,13 @@
 ﻿"""
-Blueprint do painel administrativo — erros do sistema e testes de regressão.
+Blueprint do painel administrativo — erros do sistema, desempenho por endpoint
+e testes de regressão.
 Acesso restrito a usuários do tipo 'Agente Público'.
 """
 
 from flask import Blueprint, render_template, jsonify, request, session, redirect, url_for, Response
 from utils import login_required
 from db import get_cursor, get_db
+from core import perfil_requisicoes
 import subprocess
 import sys
 import json
@@ -240,6 +242,55 @@ def exportar_erros(formato):
         )
 
 
+# =============================================================================
+# DESEMPENHO POR ENDPOINT (core/perfil_requisicoes)
+# =============================================================================
+
+_ORDENACOES_DESEMPENHO = (
+    'db_p95', 'total_p95', 'queries_p95', 'repeticoes_max', 'requisicoes', 'linhas_p95',
+)
+
+
+@admin_bp.route('/desempenho')
+@login_required
+def painel_desempenho():
+    """p50/p95 de tempo total, tempo de banco e queries por endpoint (janela deste worker)."""
+    if not _apenas_admin():
+        return redirect(url_for('main.index'))
+
+    ordenar = request.args.get('ordenar', 'db_p95')
+    if ordenar not in _ORDENACOES_DESEMPENHO:
+        ordenar = 'db_p95'
+    endpoints = perfil_requisicoes.relatorio(ordenar=ordenar)
+
+    if request.args.get('formato') == 'json':
+        return jsonify({
+            'pid': os.getpid(),
+            'desde': datetime.fromtimestamp(perfil_requisicoes.desde()).isoformat(),
+            'endpoints': endpoints,
+        })
+
+    return render_template(
+        'admin/painel_desempenho.html',
+        endpoints=endpoints,
+        ordenar=ordenar,
+        ativo=perfil_requisicoes.ATIVO,
+        janela=perfil_requisicoes.JANELA,
+        limite_repeticoes=perfil_requisicoes.LIMITE_REPETICOES,
+        pid=os.getpid(),
+        desde=datetime.fromtimestamp(perfil_requisicoes.desde()),
+    )
+
+
+@admin_bp.route('/desempenho/limpar', methods=['POST'])
+@login_required
+def limpar_desempenho():
+    if not _apenas_admin():
+        return jsonify({'success': False, 'erro': 'Acesso negado'}), 403
+    perfil_requisicoes.limpar()
+    return jsonify({'success': True})
+
+
 # =============================================================================
 # TESTES DE REGRESSÃO
 # =============================================================================
@@ -6,93 +6,22 @@ from flask import Blueprint, render_template, request, jsonify, make_response
 from db import get_cursor, execute_query
 from utils import login_required
 from decorators import requires_access, requires_write_access
+from core import calendario, prestacoes
+from core.prestacoes import gerar_prestacoes, determinar_responsabilidade_por_vigencia
 from datetime import datetime, timedelta
 import io
 import re
 
 
-def determinar_responsabilidade_por_vigencia(portaria, vigencia_final):
+def adicionar_dias_uteis(data_inicial, dias):
     """
-    Determina a responsabilidade da análise baseada na portaria do termo 
-    e na data de término da vigência da prestação.
-    
-    Regras baseadas em períodos de transição:
-    
-    - Portaria 021 (TFM/TCL sem FUMCAD): 
-      - Se vigencia_final >= 01/03/2023 → Pessoa Gestora (3)
-      - Se vigencia_final < 01/03/2023 → Compartilhada (2) [era Portaria 121]
-    
-    - Portaria 090 (TFM/TCL com FUMCAD/FMID):
-      - Se vigencia_final >= 01/01/2024 → Pessoa Gestora (3)
-      - Se vigencia_final < 01/01/2024 → Compartilhada (2) [era Portaria 140]
-    
-    - Portaria 121 ou 140 diretamente → Compartilhada (2)
-    - Outras portarias antigas (TCV, etc) → DP (1)
-    
-    Exemplo: Termo TFM/XXX/2023 com Portaria 090
-    - Prestação 01/12/2023 a 28/02/2024 → Termina antes de 01/01/2024 = Compartilhada (2)
-    - Prestação 01/03/2024 a 31/05/2024 → Termina depois de 01/01/2024 = Pessoa Gestora (3)
-    
-    Args:
-        portaria (str): Nome da portaria (ex: 'Portaria nº 021/SMDHC/2023')
-        vigencia_final (date/str): Data de término da vigência da prestação
-    
-    Returns:
-        int: 1 (DP), 2 (Compartilhada) ou 3 (Pessoa Gestora)
+    Adiciona dias úteis a uma data (pula sábados, domingos e feriados
+    cadastrados — ver core/calendario)
     """
-    if not portaria:
-        return 1  # Default: DP
-    
-    # Converter vigencia_final para date se for string
-    if isinstance(vigencia_final, str):
-        try:
-            vigencia_final = datetime.strptime(vigencia_final, '%Y-%m-%d').date()
-        except:
-            pass  # Se falhar, continua com o valor original
-    
-    # Datas de transição das portarias
-    DATA_TRANSICAO_021 = datetime(2023, 3, 1).date()   # 01/03/2023 - Portaria 021 assume
-    DATA_TRANSICAO_090 = datetime(2024, 1, 1).date()   # 01/01/2024 - Portaria 090 assume
-    
-    portaria_upper = portaria.upper()
-    
-    # Portaria 021 (TFM/TCL sem fundos) - verifica data de transição
-    if '021/SMDHC/2023' in portaria_upper or '021' in portaria_upper and '2023' in portaria_upper:
-        if vigencia_final and vigencia_final >= DATA_TRANSICAO_021:
-            return 3  # Pessoa Gestora (prestação termina após 01/03/2023)
-        else:
-            return 2  # Compartilhada (prestação termina antes, ainda era Portaria 121)
-    
-    # Portaria 090 (TFM/TCL com FUMCAD/FMID) - verifica data de transição
-    if '090/SMDHC/2023' in portaria_upper or '090' in portaria_upper and '2023' in portaria_upper:
-        if vigencia_final and vigencia_final >= DATA_TRANSICAO_090:
-            return 3  # Pessoa Gestora (prestação termina após 01/01/2024)
-        else:
-            return 2  # Compartilhada (prestação termina antes, ainda era Portaria 140)
-    
-    # Portarias 121 e 140 diretamente (período de transição 2017-2023)
-    if '121/SMDHC/2019' in portaria_upper or '140/SMDHC/2019' in portaria_upper:
-        return 2  # Compartilhada
-    
-    # Outras portarias antigas (TCV, Portarias 006, 072, 009, Decreto 6.170)
-    return 1  # DP
+    return calendario.adicionar_dias_uteis(data_inicial, dias)
 
 
-
-def adicionar_dias_uteis(data_inicial, dias):
-    """
-    Adiciona dias úteis a uma data (não conta sábados e domingos)
-    """
-    data_atual = data_inicial
-    dias_adicionados = 0
-    
-    while dias_adicionados < dias:
-        data_atual += timedelta(days=1)
-        # 0=Segunda, 6=Domingo
-        if data_atual.weekday() < 5:  # Segunda a Sexta
-            dias_adicionados += 1
-    
-    return data_atual
+PORTARIAS_PRAZO = ('Portaria nº 021/SMDHC/2023', 'Portaria nº 090/SMDHC/2023')
 
 
 def calcular_prazo(vigencia_final, tipo_prestacao, portaria):
@@ -103,33 +32,45 @@ def calcular_prazo(vigencia_final, tipo_prestacao, portaria):
     - Final: vigência final + 45 dias corridos
     Retorna: (data_prazo, status_prazo)
     """
-    if not vigencia_final:
-        return None, ''
-    
-    # Verificar se é portaria 021 ou 090
-    portarias_especiais = ['Portaria nº 021/SMDHC/2023', 'Portaria nº 090/SMDHC/2023']
-    
-    if portaria not in portarias_especiais:
-        return None, ''
-    
+    return calcular_prazos([{
+        'vigencia_final': vigencia_final,
+        'tipo_prestacao': tipo_prestacao,
+        'portaria': portaria,
+    }])[0]
+
+
+def calcular_prazos(linhas, cur=None):
+    """
+    calcular_prazo para todas as linhas de uma vez (vigencia_final,
+    tipo_prestacao e portaria): uma carga do calendário, uma data de
+    referência e um cálculo de dias úteis por vigência distinta.
+    Retorna lista de (data_prazo, status_prazo) na ordem das linhas.
+    """
     hoje = datetime.now().date()
-    
-    if tipo_prestacao == 'Semestral':
-        # Somar 5 dias úteis
-        data_prazo = adicionar_dias_uteis(vigencia_final, 5)
-    elif tipo_prestacao == 'Final':
-        # Somar 45 dias corridos
-        data_prazo = vigencia_final + timedelta(days=45)
-    else:
-        return None, ''
-    
-    # Verificar status
-    if data_prazo < hoje:
-        status = 'atrasado'  # Amarelo
-    else:
-        status = 'em_dia'  # Verde
-    
-    return data_prazo, status
+    prazos = [None] * len(linhas)
+    semestrais = []
+
+    for i, row in enumerate(linhas):
+        if not row['vigencia_final'] or row['portaria'] not in PORTARIAS_PRAZO:
+            continue
+        if row['tipo_prestacao'] == 'Semestral':
+            # Somar 5 dias úteis (em lote, abaixo)
+            semestrais.append(i)
+        elif row['tipo_prestacao'] == 'Final':
+            # Somar 45 dias corridos
+            prazos[i] = row['vigencia_final'] + timedelta(days=45)
+
+    if semestrais:
+        datas = calendario.adicionar_dias_uteis_lote(
+            [linhas[i]['vigencia_final'] for i in semestrais], 5, cur=cur)
+        for i, data_prazo in zip(semestrais, datas):
+            prazos[i] = data_prazo
+
+    # Verificar status: atrasado = amarelo, em_dia = verde
+    return [
+        (data_prazo, 'atrasado' if data_prazo < hoje else 'em_dia') if data_prazo else (None, '')
+        for data_prazo in prazos
+    ]
 
 
 def obter_data_rescisao(numero_termo):
@@ -434,11 +375,14 @@ def obter_dados():
         
         cur.execute(query, params)
         resultados = cur.fetchall()
+
+        # Prazos de todo o resultado de uma vez
+        prazos = calcular_prazos(resultados, cur=cur)
         cur.close()
         
         # Processar dados
         dados = []
-        for row in resultados:
+        for row, (prazo_data, prazo_status) in zip(resultados, prazos):
             # Calcular regularidade
             regularidade = calcular_regularidade(
                 row['vigencia_final'],
@@ -451,12 +395,6 @@ def obter_dados():
                 if regularidade.lower() != filtro_regularidade.lower():
                     continue
             
-            # Calcular prazo
-            prazo_data, prazo_status = calcular_prazo(
-                row['vigencia_final'],
-                row['tipo_prestacao'],
-                row['portaria']
-            )
             prazo_formatado = prazo_data.strftime('%d/%m/%Y') if prazo_data else ''
             
             # Converter responsabilidade_analise
@@ -1171,189 +1109,6 @@ def calcular_prestacoes():
         return jsonify({'erro': str(e)}), 500
 
 
-def gerar_prestacoes(numero_termo, data_inicio, data_termino, portaria):
-    """
-    Gera as prestações de contas baseado na portaria e período de vigência
-    Usa lógica de dias para cálculos precisos
-    
-    IMPORTANTE: Considera transição de portarias:
-    - Portaria 121 → 021 em 01/03/2023
-    - Portaria 140 → 090 em 01/01/2024
-    
-    Após transição, trimestrais PARAM de ser geradas (só semestral + final)
-    """
-    from dateutil.relativedelta import relativedelta
-    from datetime import date
-    
-    prestacoes = []
-    
-    # Definir tipo de prestações baseado na portaria
-    portarias_semestral = ['Portaria nº 021/SMDHC/2023', 'Portaria nº 090/SMDHC/2023']
-    portarias_trimestral_semestral = ['Portaria nº 121/SMDHC/2019', 'Portaria nº 140/SMDHC/2019']
-    
-    # Datas de transição de portarias
-    DATA_TRANSICAO_121_PARA_021 = date(2023, 3, 1)  # 01/03/2023
-    DATA_TRANSICAO_140_PARA_090 = date(2024, 1, 1)  # 01/01/2024
-    
-    # Determinar se há transição durante a vigência do termo
-    data_transicao = None
-    if portaria == 'Portaria nº 121/SMDHC/2019':
-        if data_inicio < DATA_TRANSICAO_121_PARA_021 <= data_termino:
-            data_transicao = DATA_TRANSICAO_121_PARA_021
-    elif portaria == 'Portaria nº 140/SMDHC/2019':
-        if data_inicio < DATA_TRANSICAO_140_PARA_090 <= data_termino:
-            data_transicao = DATA_TRANSICAO_140_PARA_090
-    
-    # Calcular duração em meses
-    duracao_meses = (data_termino.year - data_inicio.year) * 12 + (data_termino.month - data_inicio.month) + 1
-    
-    if portaria in portarias_semestral:
-        # Portarias 021 e 090: Semestral + Final
-        # REGRA: Só gerar semestral se houver MAIS de 6 meses de vigência
-        # Se vigência <= 6 meses, gerar APENAS Final
-        numero_prestacao = 1
-        data_atual = data_inicio
-        
-        while data_atual < data_termino:
-            # Calcular fim do semestre (6 meses)
-            data_fim_semestre = data_atual + relativedelta(months=6) - relativedelta(days=1)
-            
-            # Se passou do término OU atingiu exatamente o término, NÃO gerar semestral
-            # Nestes casos, a prestação Final já cobre todo o período
-            if data_fim_semestre >= data_termino:
-                # Esta seria a única semestral OU uma semestral parcial - NÃO gerar
-                # A prestação Final já cobre todo o período
-                break
-            
-            prestacoes.append({
-                'tipo_prestacao': 'Semestral',
-                'numero_prestacao': numero_prestacao,
-                'vigencia_inicial': data_atual.strftime('%Y-%m-%d'),
-                'vigencia_final': data_fim_semestre.strftime('%Y-%m-%d')
-            })
-            
-            numero_prestacao += 1
-            data_atual = data_fim_semestre + relativedelta(days=1)
-            
-            if data_atual > data_termino:
-                break
-        
-        # Adicionar prestação final
-        prestacoes.append({
-            'tipo_prestacao': 'Final',
-            'numero_prestacao': 1,
-            'vigencia_inicial': data_inicio.strftime('%Y-%m-%d'),
-            'vigencia_final': data_termino.strftime('%Y-%m-%d')
-        })
-        
-    elif portaria in portarias_trimestral_semestral:
-        # Portarias 121 e 140: Trimestral + Semestral + Final
-        # COM TRANSIÇÃO: após data_transicao, NÃO gerar mais trimestrais
-        
-        # === TRIMESTRAIS ===
-        # Só gera até a data de transição (se houver)
-        data_limite_trimestral = data_transicao - relativedelta(days=1) if data_transicao else data_termino
-        
-        numero_prestacao = 1
-        data_atual = data_inicio
-        
-        while data_atual < data_limite_trimestral:
-            # Calcular fim do trimestre (3 meses)
-            data_fim_trimestre = data_atual + relativedelta(months=3) - relativedelta(days=1)
-            
-            # Se passou do limite trimestral, ajustar para parar antes da transição
-            if data_fim_trimestre > data_limite_trimestral:
-                data_fim_trimestre = data_limite_trimestral
-            
-            prestacoes.append({
-                'tipo_prestacao': 'Trimestral',
-                'numero_prestacao': numero_prestacao,
-                'vigencia_inicial': data_atual.strftime('%Y-%m-%d'),
-                'vigencia_final': data_fim_trimestre.strftime('%Y-%m-%d')
-            })
-            
-            numero_prestacao += 1
-            data_atual = data_fim_trimestre + relativedelta(days=1)
-            
-            if data_atual >= data_limite_trimestral:
-                break
-        
-        # === SEMESTRAIS ===
-        # Gera para TODO o período (antes E depois da transição)
-        # REGRA: Não gerar semestral parcial no final (menor que 6 meses)
-        numero_semestral = 1
-        data_atual = data_inicio
-        
-        while data_atual < data_termino:
-            # Calcular fim do semestre (6 meses)
-            data_fim_semestre = data_atual + relativedelta(months=6) - relativedelta(days=1)
-            
-            # Se passou do término, verificar se é semestre completo
-            if data_fim_semestre > data_termino:
-                # Esta seria uma semestral parcial - NÃO gerar
-                # A prestação Final já cobre todo o período
-                break
-            
-            prestacoes.append({
-                'tipo_prestacao': 'Semestral',
-                'numero_prestacao': numero_semestral,
-                'vigencia_inicial': data_atual.strftime('%Y-%m-%d'),
-                'vigencia_final': data_fim_semestre.strftime('%Y-%m-%d')
-            })
-            
-            numero_semestral += 1
-            data_atual = data_fim_semestre + relativedelta(days=1)
-            
-            if data_atual > data_termino:
-                break
-        
-        # Adicionar prestação final
-        prestacoes.append({
-            'tipo_prestacao': 'Final',
-            'numero_prestacao': 1,
-            'vigencia_inicial': data_inicio.strftime('%Y-%m-%d'),
-            'vigencia_final': data_termino.strftime('%Y-%m-%d')
-        })
-        
-    else:
-        # Outras portarias: Trimestral + Final
-        
-        # Gerar prestações trimestrais
-        numero_prestacao = 1
-        data_atual = data_inicio
-        
-        while data_atual < data_termino:
-            # Calcular fim do trimestre (3 meses)
-            data_fim_trimestre = data_atual + relativedelta(months=3) - relativedelta(days=1)
-            
-            # Se passou do término, ajustar
-            if data_fim_trimestre > data_termino:
-                data_fim_trimestre = data_termino
-            
-            prestacoes.append({
-                'tipo_prestacao': 'Trimestral',
-                'numero_prestacao': numero_prestacao,
-                'vigencia_inicial': data_atual.strftime('%Y-%m-%d'),
-                'vigencia_final': data_fim_trimestre.strftime('%Y-%m-%d')
-            })
-            
-            numero_prestacao += 1
-            data_atual = data_fim_trimestre + relativedelta(days=1)
-            
-            if data_atual > data_termino:
-                break
-        
-        # Adicionar prestação final
-        prestacoes.append({
-            'tipo_prestacao': 'Final',
-            'numero_prestacao': 1,
-            'vigencia_inicial': data_inicio.strftime('%Y-%m-%d'),
-            'vigencia_final': data_termino.strftime('%Y-%m-%d')
-        })
-    
-    return prestacoes
-
-
 @analises_bp.route('/atualizar-prestacoes', methods=['GET', 'POST'])
 @login_required
 @requires_access('analises')
@@ -1364,8 +1119,6 @@ def atualizar_prestacoes():
     Compara datas de vigência da tabela Parcerias com parcerias_analises
     Considera data de rescisão se o termo foi rescindido
     """
-    from db import get_db
-    
     if request.method == 'POST':
         try:
             data = request.get_json()
@@ -1375,212 +1128,60 @@ def atualizar_prestacoes():
                 return jsonify({'erro': 'Termo não informado'}), 400
             
             cur = get_cursor()
+            try:
+                relatorio = prestacoes.reconciliar(cur, termos=[numero_termo], aplicar=True)
+            finally:
+                cur.close()
             
-            # Buscar dados do termo (datas corretas, portaria, rescisão e total_pago)
-            cur.execute("""
-                SELECT p.inicio, p.final, p.portaria,
-                       tr.data_rescisao, p.total_pago
-                FROM Parcerias p
-                LEFT JOIN public.termos_rescisao tr ON p.numero_termo = tr.numero_termo
-                WHERE p.numero_termo = %s
-            """, (numero_termo,))
-            termo = cur.fetchone()
-            
-            if not termo:
+            if not relatorio['termos']:
                 return jsonify({'erro': 'Termo não encontrado'}), 404
             
-            data_inicio = termo['inicio']
-            data_termino_original = termo['final']
-            data_rescisao = termo.get('data_rescisao')
-            portaria = termo['portaria']
-            total_pago = termo.get('total_pago') or 0
-            
-            # Se foi rescindido, validar execução
-            if data_rescisao:
-                dias_execucao = (data_rescisao - data_inicio).days
-                
-                # Validação 1: Rescindido em até 5 dias (execução mínima)
-                if dias_execucao <= 5:
-                    return jsonify({
-                        'erro': f'Termo foi rescindido em {data_rescisao.strftime("%d/%m/%Y")}, apenas {dias_execucao} dia(s) após o início. Não há prestações de contas (execução mínima não atingida).',
-                        'data_rescisao': data_rescisao.strftime('%d/%m/%Y'),
-                        'dias_execucao': dias_execucao
-                    }), 400
-                
-                # Validação 2: Rescindido com total_pago = 0 (não recebeu recursos)
-                # Neste caso, DELETAR todas as prestações existentes
-                if total_pago == 0:
-                    # Contar prestações antes de deletar para informar ao usuário
-                    cur.execute("""
-                        SELECT COUNT(*) as total,
-                               COUNT(CASE WHEN entregue = true THEN 1 END) as entregues
-                        FROM parcerias_analises
-                        WHERE numero_termo = %s
-                    """, (numero_termo,))
-                    
-                    contagem = cur.fetchone()
-                    total_prestacoes = contagem['total'] if contagem else 0
-                    prestacoes_entregues = contagem['entregues'] if contagem else 0
-                    
-                    # Deletar monit + adicional antes das análises
-                    cur.execute("DELETE FROM public.parcerias_monit WHERE numero_termo = %s", (numero_termo,))
-                    cur.execute("DELETE FROM public.parcerias_monit_adicional WHERE numero_termo = %s", (numero_termo,))
-
-                    # Deletar todas as prestações
-                    cur.execute("DELETE FROM parcerias_analises WHERE numero_termo = %s", (numero_termo,))
-                    get_db().commit()
-                    cur.close()
-                    
-                    mensagem = f'Termo {numero_termo} rescindido sem recursos (R$ 0,00). '
-                    mensagem += f'{total_prestacoes} prestação(ões) removida(s)'
-                    if prestacoes_entregues > 0:
-                        mensagem += f' (incluindo {prestacoes_entregues} marcada(s) como entregue)'
-                    mensagem += f'. Vigência: {dias_execucao} dia(s).'
-                    
-                    return jsonify({
-                        'mensagem': mensagem,
-                        'prestacoes_removidas': total_prestacoes,
-                        'prestacoes_entregues': prestacoes_entregues,
-                        'sem_recursos': True
-                    }), 200
-            
-            # Usar data de rescisão como término se existir
-            data_termino = data_rescisao if data_rescisao else data_termino_original
+            plano = relatorio['termos'][0]
             
-            # Recalcular todas as prestações baseado na portaria e novas datas
-            prestacoes_novas = gerar_prestacoes(numero_termo, data_inicio, data_termino, portaria)
+            # Rescindido antes da execução mínima: nada a gerar
+            if plano['acao'] == 'ignorar':
+                resposta = {'erro': plano['motivo']}
+                if plano['data_rescisao']:
+                    resposta['data_rescisao'] = plano['data_rescisao'].strftime('%d/%m/%Y')
+                    resposta['dias_execucao'] = plano.get('dias_execucao')
+                return jsonify(resposta), 400
             
-            # Buscar prestações antigas para preservar dados preenchidos
-            cur.execute("""
-                SELECT id, tipo_prestacao, numero_prestacao, 
-                       entregue, cobrado, e_notificacao, e_parecer,
-                       e_fase_recursal, e_encerramento, data_parecer_dp,
-                       valor_devolucao, valor_devolvido, responsavel_dp,
-                       data_parecer_pg, responsavel_pg, observacoes,
-                       vigencia_final
-                FROM parcerias_analises
-                WHERE numero_termo = %s
-                ORDER BY tipo_prestacao, numero_prestacao
-            """, (numero_termo,))
-            prestacoes_antigas = cur.fetchall()
-            
-            # Criar mapa das prestações antigas (chave: tipo+numero)
-            mapa_antigas = {}
-            prestacoes_deletadas = []
-
-            # Chaves novas (para identificar orphans de monit)
-            chaves_novas = {
-                (numero_termo, p['tipo_prestacao'], p['numero_prestacao'])
-                for p in prestacoes_novas
-            }
-
-            for p in prestacoes_antigas:
-                chave = f"{p['tipo_prestacao']}_{p['numero_prestacao']}"
-                mapa_antigas[chave] = p
-
-                # Se foi rescindido e a prestação tinha vigência_final posterior à rescisão
-                if data_rescisao and p['vigencia_final'] and p['vigencia_final'] > data_rescisao:
-                    # Marcar para logging
-                    obs_antiga = f"(vigência até {p['vigencia_final'].strftime('%d/%m/%Y')}"
-                    if p['entregue']:
-                        obs_antiga += ", estava marcada como entregue"
-                    obs_antiga += ")"
-                    prestacoes_deletadas.append(f"{p['tipo_prestacao']} {p['numero_prestacao']} {obs_antiga}")
-
-            # Deletar orphans de monit (chaves que existem agora mas não existirão após recálculo)
-            # Isso garante que dados de monitoramento de prestações removidas não fiquem órfãos
-            for p in prestacoes_antigas:
-                chave_tuple = (numero_termo, p['tipo_prestacao'], int(p['numero_prestacao']))
-                if chave_tuple not in chaves_novas:
-                    cur.execute("""
-                        DELETE FROM public.parcerias_monit
-                         WHERE numero_termo = %s AND tipo_prestacao = %s AND numero_prestacao = %s
-                    """, chave_tuple)
-                    cur.execute("""
-                        DELETE FROM public.parcerias_monit_adicional
-                         WHERE numero_termo = %s AND tipo_prestacao = %s AND numero_prestacao = %s
-                    """, chave_tuple)
-
-            # Deletar todas as prestações antigas
-            cur.execute("DELETE FROM parcerias_analises WHERE numero_termo = %s", (numero_termo,))
-            
-            # Inserir prestações novas, preservando dados se existiam antes
-            for prestacao_nova in prestacoes_novas:
-                chave = f"{prestacao_nova['tipo_prestacao']}_{prestacao_nova['numero_prestacao']}"
-                antiga = mapa_antigas.get(chave)
-                
-                # Determinar responsabilidade baseada na vigência final de CADA prestação
-                vigencia_final = prestacao_nova['vigencia_final']
-                responsabilidade_auto = determinar_responsabilidade_por_vigencia(portaria, vigencia_final)
+            # Rescindido sem recursos: todas as prestações removidas
+            if plano['acao'] == 'remover_sem_recursos':
+                total_prestacoes = len(plano['remover'])
+                prestacoes_entregues = sum(1 for p in plano['remover'] if p['entregue'])
                 
-                # Se existia prestação com mesmo tipo+número, preservar dados
-                if antiga:
-                    query = """
-                        INSERT INTO parcerias_analises (
-                            numero_termo, tipo_prestacao, numero_prestacao,
-                            vigencia_inicial, vigencia_final,
-                            responsabilidade_analise,
-                            entregue, cobrado, e_notificacao, e_parecer,
-                            e_fase_recursal, e_encerramento, data_parecer_dp,
-                            valor_devolucao, valor_devolvido, responsavel_dp,
-                            data_parecer_pg, responsavel_pg, observacoes
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    params = (
-                        numero_termo,
-                        prestacao_nova['tipo_prestacao'],
-                        prestacao_nova['numero_prestacao'],
-                        prestacao_nova['vigencia_inicial'],
-                        prestacao_nova['vigencia_final'],
-                        antiga.get('responsabilidade_analise') or responsabilidade_auto,  # ← Preservar se existe, senão usar auto
-                        antiga['entregue'],
-                        antiga['cobrado'],
-                        antiga['e_notificacao'],
-                        antiga['e_parecer'],
-                        antiga['e_fase_recursal'],
-                        antiga['e_encerramento'],
-                        antiga['data_parecer_dp'],
-                        antiga['valor_devolucao'],
-                        antiga['valor_devolvido'],
-                        antiga['responsavel_dp'],
-                        antiga['data_parecer_pg'],
-                        antiga['responsavel_pg'],
-                        antiga['observacoes']
-                    )
-                else:
-                    # Prestação nova (não existia antes), inserir vazia com responsabilidade automática
-                    query = """
-                        INSERT INTO parcerias_analises (
-                            numero_termo, tipo_prestacao, numero_prestacao,
-                            vigencia_inicial, vigencia_final,
-                            responsabilidade_analise,
-                            entregue, cobrado, e_notificacao, e_parecer,
-                            e_fase_recursal, e_encerramento
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    params = (
-                        numero_termo,
-                        prestacao_nova['tipo_prestacao'],
-                        prestacao_nova['numero_prestacao'],
-                        prestacao_nova['vigencia_inicial'],
-                        prestacao_nova['vigencia_final'],
-                        responsabilidade_auto,  # ← RESPONSABILIDADE AUTOMÁTICA
-                        False, False, False, False, False, False
-                    )
+                mensagem = f'Termo {numero_termo} rescindido sem recursos (R$ 0,00). '
+                mensagem += f'{total_prestacoes} prestação(ões) removida(s)'
+                if prestacoes_entregues > 0:
+                    mensagem += f' (incluindo {prestacoes_entregues} marcada(s) como entregue)'
+                mensagem += f'. Vigência: {plano["dias_execucao"]} dia(s).'
                 
-                cur.execute(query, params)
-            
-            get_db().commit()
-            cur.close()
+                return jsonify({
+                    'mensagem': mensagem,
+                    'prestacoes_removidas': total_prestacoes,
+                    'prestacoes_entregues': prestacoes_entregues,
+                    'sem_recursos': True
+                }), 200
             
             # Montar mensagem de sucesso
-            mensagem = f'Prestações recalculadas com sucesso! Total: {len(prestacoes_novas)}'
+            mensagem = f'Prestações recalculadas com sucesso! Total: {len(plano["prestacoes_corretas"])}'
             
+            data_rescisao = plano['data_rescisao']
             if data_rescisao:
                 mensagem += f'\n⚠️ Termo rescindido em {data_rescisao.strftime("%d/%m/%Y")}.'
                 
-            if prestacoes_deletadas:
-                mensagem += f'\n📋 Prestações removidas (vigência posterior à rescisão): {", ".join(prestacoes_deletadas)}'
+                # Prestações removidas com vigência posterior à rescisão
+                prestacoes_deletadas = []
+                for p in plano['remover']:
+                    if p['vigencia_final'] and p['vigencia_final'] > data_rescisao:
+                        obs_antiga = f"(vigência até {p['vigencia_final'].strftime('%d/%m/%Y')}"
+                        if p['entregue']:
+                            obs_antiga += ", estava marcada como entregue"
+                        obs_antiga += ")"
+                        prestacoes_deletadas.append(f"{p['tipo_prestacao']} {p['numero_prestacao']} {obs_antiga}")
+                if prestacoes_deletadas:
+                    mensagem += f'\n📋 Prestações removidas (vigência posterior à rescisão): {", ".join(prestacoes_deletadas)}'
             
             return jsonify({'mensagem': mensagem}), 200
             
@@ -1590,141 +1191,58 @@ def atualizar_prestacoes():
             traceback.print_exc()
             return jsonify({'erro': str(e)}), 500
     
-    # GET - Buscar termos com divergências
-    cur = get_cursor()
-    
+    # GET - Buscar termos com divergências (dry-run, sem gravar)
     # Verificar se deve usar comparação exata (parâmetro da URL)
     modo_exato = request.args.get('exato', '0') == '1'
     
-    # Buscar TODOS os termos que têm prestações cadastradas
-    # Incluir informação sobre rescisão e total_pago
-    # NÃO FILTRAR termos com total_pago = 0, pois precisam aparecer para validação humana
-    query_termos = """
-        SELECT DISTINCT 
-            p.numero_termo,
-            p.sei_celeb,
-            p.inicio,
-            p.final,
-            p.portaria,
-            tr.data_rescisao,
-            p.total_pago,
-            CASE 
-                WHEN tr.data_rescisao IS NOT NULL THEN tr.data_rescisao
-                ELSE p.final
-            END as vigencia_efetiva
-        FROM Parcerias p
-        INNER JOIN parcerias_analises pa ON p.numero_termo = pa.numero_termo
-        LEFT JOIN public.termos_rescisao tr ON p.numero_termo = tr.numero_termo
-        WHERE p.inicio IS NOT NULL 
-        AND p.final IS NOT NULL
-        ORDER BY p.numero_termo DESC
-    """
-    
-    cur.execute(query_termos)
-    termos = cur.fetchall()
+    cur = get_cursor()
+    try:
+        relatorio = prestacoes.reconciliar(cur, modo_exato=modo_exato)
+    finally:
+        cur.close()
     
-    termos_divergentes = {}
+    return render_template('atualizar_prestacoes.html', 
+                         termos_divergentes=relatorio['termos'])
+
+
+@analises_bp.route('/api/reconciliar-prestacoes', methods=['POST'])
+@login_required
+@requires_access('analises')
+@requires_write_access('analises')
+def reconciliar_prestacoes():
+    """
+    Recalcula as prestações de todos os termos divergentes numa única chamada.
     
-    for termo in termos:
-        numero_termo = termo['numero_termo']
-        data_inicio = termo['inicio']
-        data_termino_original = termo['final']
-        data_rescisao = termo.get('data_rescisao')
-        portaria = termo['portaria']
+    Body JSON (todos opcionais):
+        termos: lista de numero_termo (default: todos os divergentes)
+        exato: compara dia/mês/ano da Final (default: só mês/ano)
+        aplicar: true grava tudo numa transação; default false = dry-run
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        termos = data.get('termos')
+        if termos is not None and (not isinstance(termos, list) or not all(isinstance(t, str) for t in termos)):
+            return jsonify({'erro': 'termos deve ser uma lista de números de termo'}), 400
         
-        # Usar data de rescisão como término se existir
-        data_termino = data_rescisao if data_rescisao else data_termino_original
+        cur = get_cursor()
+        try:
+            relatorio = prestacoes.reconciliar(
+                cur,
+                termos=termos,
+                modo_exato=bool(data.get('exato')),
+                aplicar=bool(data.get('aplicar')),
+            )
+        finally:
+            cur.close()
         
-        # Buscar APENAS a prestação Final cadastrada
-        cur.execute("""
-            SELECT id, tipo_prestacao, numero_prestacao, 
-                   vigencia_inicial, vigencia_final
-            FROM parcerias_analises
-            WHERE numero_termo = %s
-            AND tipo_prestacao = 'Final'
-            LIMIT 1
-        """, (numero_termo,))
-        prestacao_final_cadastrada = cur.fetchone()
+        print(f"[PRESTACOES] Reconciliação {'aplicada' if relatorio['aplicado'] else 'simulada'}: {relatorio['totais']}")
+        return jsonify(prestacoes.serializar(relatorio)), 200
         
-        # Se não existe Final cadastrada, tem divergência
-        if not prestacao_final_cadastrada:
-            tem_divergencia = True
-        else:
-            # Comparar mês/ano da Final com o termo
-            if modo_exato:
-                # Modo exato: compara dia/mês/ano
-                inicial_bate = (prestacao_final_cadastrada['vigencia_inicial'] == data_inicio)
-                final_bate = (prestacao_final_cadastrada['vigencia_final'] == data_termino)
-            else:
-                # Modo mês/ano: compara apenas mês e ano
-                inicial_bate = (
-                    prestacao_final_cadastrada['vigencia_inicial'].month == data_inicio.month and
-                    prestacao_final_cadastrada['vigencia_inicial'].year == data_inicio.year
-                )
-                final_bate = (
-                    prestacao_final_cadastrada['vigencia_final'].month == data_termino.month and
-                    prestacao_final_cadastrada['vigencia_final'].year == data_termino.year
-                )
-            
-            # Se a Final não bate com o termo, tem divergência
-            tem_divergencia = not (inicial_bate and final_bate)
-        
-        # Se tem divergência, calcular todas as prestações corretas e cadastradas para mostrar no front
-        if tem_divergencia:
-            # Calcular prestações corretas baseado na portaria
-            prestacoes_corretas = gerar_prestacoes(numero_termo, data_inicio, data_termino, portaria)
-            
-            # Ordenar prestações corretas
-            ordem_tipo = {'Trimestral': 1, 'Semestral': 2, 'Final': 3}
-            prestacoes_corretas_ordenadas = sorted(
-                prestacoes_corretas, 
-                key=lambda x: (ordem_tipo.get(x['tipo_prestacao'], 4), x['numero_prestacao'])
-            )
-            
-            # Buscar TODAS as prestações cadastradas
-            cur.execute("""
-                SELECT id, tipo_prestacao, numero_prestacao, 
-                       vigencia_inicial, vigencia_final
-                FROM parcerias_analises
-                WHERE numero_termo = %s
-                ORDER BY 
-                    CASE 
-                        WHEN tipo_prestacao = 'Trimestral' THEN 1
-                        WHEN tipo_prestacao = 'Semestral' THEN 2
-                        WHEN tipo_prestacao = 'Final' THEN 3
-                        ELSE 4
-                    END,
-                    numero_prestacao
-            """, (numero_termo,))
-            prestacoes_cadastradas = cur.fetchall()
-            
-            # Adicionar à lista de divergentes
-            termos_divergentes[numero_termo] = {
-                'numero_termo': numero_termo,
-                'sei_celeb': termo['sei_celeb'],
-                'data_inicio_termo': data_inicio,
-                'data_final_termo': data_termino,
-                'data_final_original': data_termino_original,  # Data original da tabela parcerias
-                'data_rescisao': data_rescisao,  # Data de rescisão se houver
-                'rescindido': data_rescisao is not None,  # Boolean para template
-                'total_pago': termo.get('total_pago') or 0,  # Total pago (recursos repassados)
-                'portaria': portaria,
-                'prestacoes_cadastradas': [
-                    {
-                        'id': p['id'],
-                        'tipo_prestacao': p['tipo_prestacao'],
-                        'numero_prestacao': p['numero_prestacao'],
-                        'vigencia_inicial': p['vigencia_inicial'],
-                        'vigencia_final': p['vigencia_final']
-                    } for p in prestacoes_cadastradas
-                ],
-                'prestacoes_corretas': prestacoes_corretas_ordenadas
-            }
-    
-    cur.close()
-    
-    return render_template('atualizar_prestacoes.html', 
-                         termos_divergentes=list(termos_divergentes.values()))
+    except Exception as e:
+        print(f"[ERRO] Erro ao reconciliar prestações: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'erro': str(e)}), 500
 
 
 @analises_bp.route('/api/limpar-prestacoes-sem-recursos', methods=['POST'])
@@ -0,0 +1,592 @@
+"""
+Motor de regras das inconsistências da conciliação bancária
+
+Carrega de uma vez os dados de um ou mais termos (extrato + análise, parceria,
+conta de execução, despesas previstas e ratificações) e avalia todos os cards
+de inconsistência em memória, numa única passada pelas linhas do extrato.
+
+O número de queries é fixo (6), independente da quantidade de cards ou de
+termos — usado tanto por /api/identificar-inconsistencias/<termo> quanto pelo
+modo em lote /api/identificar-inconsistencias-lote.
+
+Cada regra reproduz o filtro SQL que existia por card (ILIKE → contém sem
+diferenciar maiúsculas; comparações com NULL → falso; ORDER BY data, indice
+com NULLs por último).
+"""
+
+import math
+from bisect import bisect_right
+from datetime import timedelta
+from decimal import Decimal
+
+
+# IDs de categoricas.c_dac_modelo_textos_inconsistencias avaliados pelo motor
+IDS_MODELOS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 25, 26)
+
+# Tabelas de ratificação, em ordem de prioridade para o status exibido no card
+TABELAS_RATIFICACAO = (
+    'lista_inconsistencias',
+    'lista_inconsistencias_agregadas',
+    'lista_inconsistencias_globais',
+)
+
+_CAMPOS_TRANSACAO = (
+    'id', 'indice', 'data', 'credito', 'debito',
+    'discriminacao', 'cat_transacao', 'competencia', 'origem_destino',
+)
+_CAMPOS_APLICACAO = ('id', 'indice', 'data', 'discriminacao', 'cat_transacao')
+
+
+# =============================================================================
+# CARGA
+# =============================================================================
+
+def carregar_dados(cur, termos):
+    """
+    Carrega tudo o que os cards precisam para os termos informados.
+
+    Returns:
+        tuple: (modelos, dados_por_termo) — dados_por_termo[termo] é o dict
+        consumido por avaliar_termo().
+    """
+    termos = list(dict.fromkeys(t for t in termos if t))
+    dados = {
+        t: {
+            'extrato': [], 'parceria': None, 'conta_execucao': None,
+            'despesas': [], 'ratificacoes': [],
+        }
+        for t in termos
+    }
+
+    cur.execute("""
+        SELECT id, nome_item, modelo_texto, solucao, ordem
+        FROM categoricas.c_dac_modelo_textos_inconsistencias
+        WHERE id = ANY(%s)
+        ORDER BY ordem
+    """, (list(IDS_MODELOS),))
+    modelos = {row['id']: row for row in cur.fetchall()}
+
+    if not termos:
+        return modelos, dados
+
+    cur.execute("""
+        SELECT numero_termo, conta, total_pago, contrapartida, inicio, final
+        FROM public.parcerias
+        WHERE numero_termo = ANY(%s)
+    """, (termos,))
+    for row in cur.fetchall():
+        if dados[row['numero_termo']]['parceria'] is None:
+            dados[row['numero_termo']]['parceria'] = row
+
+    cur.execute("""
+        SELECT DISTINCT ON (numero_termo) numero_termo, conta_execucao
+        FROM analises_pc.conc_banco
+        WHERE numero_termo = ANY(%s)
+        ORDER BY numero_termo
+    """, (termos,))
+    for row in cur.fetchall():
+        dados[row['numero_termo']]['conta_execucao'] = row['conta_execucao']
+
+    cur.execute("""
+        SELECT numero_termo, categoria_despesa, rubrica, mes, valor
+        FROM public.parcerias_despesas
+        WHERE numero_termo = ANY(%s)
+    """, (termos,))
+    for row in cur.fetchall():
+        dados[row['numero_termo']]['despesas'].append(row)
+
+    # Extrato + análise numa query só: uma linha por par (extrato, análise),
+    # extratos sem análise aparecem uma vez com as colunas de análise nulas.
+    cur.execute("""
+        SELECT
+            ce.numero_termo, ce.id, ce.indice, ce.data, ce.credito, ce.debito,
+            ce.discriminacao, ce.cat_transacao, ce.competencia, ce.origem_destino,
+            ce.cat_avaliacao, ce.avaliacao_analista,
+            ca.conc_extrato_id AS analise_extrato_id,
+            ca.avaliacao_guia, ca.avaliacao_comprovante,
+            ca.avaliacao_contratos, ca.avaliacao_fora_municipio
+        FROM analises_pc.conc_extrato ce
+        LEFT JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
+        WHERE ce.numero_termo = ANY(%s)
+        ORDER BY ce.numero_termo, ce.data, ce.indice, ce.id
+    """, (termos,))
+    ultimo = {}
+    for row in cur.fetchall():
+        termo = row['numero_termo']
+        linha = ultimo.get(termo)
+        if linha is None or linha['id'] != row['id']:
+            linha = {k: row[k] for k in (
+                'id', 'indice', 'data', 'credito', 'debito', 'discriminacao',
+                'cat_transacao', 'competencia', 'origem_destino',
+                'cat_avaliacao', 'avaliacao_analista',
+            )}
+            linha['analises'] = []
+            dados[termo]['extrato'].append(linha)
+            ultimo[termo] = linha
+        if row['analise_extrato_id'] is not None:
+            linha['analises'].append({k: row[k] for k in (
+                'avaliacao_guia', 'avaliacao_comprovante',
+                'avaliacao_contratos', 'avaliacao_fora_municipio',
+            )})
+
+    cur.execute("""
+        SELECT 0 AS prioridade, numero_termo, nome_item, status
+        FROM analises_pc.lista_inconsistencias WHERE numero_termo = ANY(%s)
+        UNION ALL
+        SELECT 1, numero_termo, nome_item, status
+        FROM analises_pc.lista_inconsistencias_agregadas WHERE numero_termo = ANY(%s)
+        UNION ALL
+        SELECT 2, numero_termo, nome_item, status
+        FROM analises_pc.lista_inconsistencias_globais WHERE numero_termo = ANY(%s)
+    """, (termos, termos, termos))
+    for row in cur.fetchall():
+        dados[row['numero_termo']]['ratificacoes'].append(row)
+
+    return modelos, dados
+
+
+# =============================================================================
+# AVALIAÇÃO
+# =============================================================================
+
+def _contem(valor, trecho):
+    """Equivalente a `valor ILIKE '%trecho%'` (NULL → False)."""
+    return valor is not None and trecho.lower() in valor.lower()
+
+
+def _transacao(linha, campos=_CAMPOS_TRANSACAO, **extras):
+    item = {campo: linha[campo] for campo in campos}
+    item.update(extras)
+    return item
+
+
+def _formatar_brl(valor):
+    return f"R$ {valor:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+
+
+def _mes_vigencia(competencia, inicio):
+    """Mês relativo ao início da vigência (1 = mês de início), como no SQL."""
+    if competencia is None or inicio is None:
+        return None
+    return (competencia.year - inicio.year) * 12 + (competencia.month - inicio.month) + 1
+
+
+def _ordenar_nulos_ultimo(valor):
+    return (valor is None, valor if valor is not None else 0)
+
+
+def avaliar_termo(modelos, dados):
+    """
+    Avalia todos os cards para um termo a partir dos dados já carregados.
+
+    Returns:
+        list: inconsistências identificadas, na ordem de avaliação dos cards
+        (o chamador ordena por 'ordem').
+    """
+    extrato = dados['extrato']
+    parceria = dados['parceria']
+    despesas = dados['despesas']
+    inicio = parceria['inicio'] if parceria else None
+    final = parceria['final'] if parceria else None
+
+    categorias_previstas = {d['categoria_despesa'] for d in despesas}
+    categorias_previstas_lower = {
+        d['categoria_despesa'].lower() for d in despesas if d['categoria_despesa'] is not None
+    }
+    rubrica_por_categoria = {}
+    previsto_por_categoria_mes = {}
+    for d in despesas:
+        rubrica_por_categoria.setdefault(d['categoria_despesa'], d['rubrica'])
+        previsto_por_categoria_mes.setdefault((d['categoria_despesa'], d['mes']), []).append(d)
+
+    # ── Acumuladores da passada única ─────────────────────────────────────
+    guias_preenchidas = guias_nao_apresentadas = 0
+    contratos_nao_apresentados = 0
+    t_guias, t_contratos = [], []
+    tem_taxas, t_juros = False, []
+    t_creditos, t_debitos_indevidos = [], []
+    t_especie, t_cartao, t_cheque = [], [], []
+    t_reembolso, t_duplicidade, t_outro_favorecido, t_vinculo = [], [], [], []
+    t_vigencia, t_fora_municipio, t_especificar = [], [], []
+    parcelas, aplicacoes_datas, t_aplicacao_divergente = [], [], []
+    total_aplicacoes = 0
+    total_taxas = total_dev_taxas = total_juros = total_dev_juros = 0.0
+    rendimentos = 0.0
+    exec_aprovado = glosas = taxas_abs = dev_taxas_abs = 0.0
+    executado_rubrica = {}
+    sem_previsao = {}
+
+    for linha in extrato:
+        cat = linha['cat_transacao']
+        cat_lower = cat.lower() if cat is not None else None
+        disc = linha['discriminacao']
+        analista = linha['avaliacao_analista']
+        origem = linha['origem_destino']
+        analises = linha['analises']
+
+        # Cards 2 e 3 (e 5: taxas não devolvidas)
+        if cat in ('Taxas Bancárias', 'Devolução de Taxas Bancárias'):
+            tem_taxas = True
+            if cat == 'Taxas Bancárias':
+                total_taxas += float(disc or 0)
+            else:
+                total_dev_taxas += float(disc or 0)
+        if cat in ('Juros e/ou Multas', 'Devolução de Juros e/ou Multas'):
+            t_juros.append(_transacao(linha))
+            if cat == 'Juros e/ou Multas':
+                total_juros += float(disc or 0)
+            else:
+                total_dev_juros += float(disc or 0)
+
+        # Card 5: restituição final
+        if cat == 'Rendimentos' and disc is not None:
+            rendimentos += float(disc)
+        if disc is not None:
+            if (linha['cat_avaliacao'] == 'Avaliado' and cat_lower is not None
+                    and cat_lower in categorias_previstas_lower):
+                exec_aprovado += abs(float(disc))
+            if (linha['cat_avaliacao'] == 'Glosar' and cat_lower is not None
+                    and cat_lower != 'taxas bancárias'):
+                glosas += abs(float(disc))
+            if cat_lower == 'taxas bancárias':
+                taxas_abs += abs(float(disc))
+            elif cat_lower == 'devolução de taxas bancárias':
+                dev_taxas_abs += abs(float(disc))
+
+        # Card 7: créditos não justificados
+        if linha['credito'] is not None and linha['credito'] > 0 and linha['cat_avaliacao'] != 'Avaliado':
+            t_creditos.append(_transacao(linha))
+
+        # Card 8: despesas não previstas
+        if cat == 'Débitos Indevidos':
+            t_debitos_indevidos.append(_transacao(linha))
+
+        # Cards 1, 6, 9, 10-16, 25: dependem de conc_analise (uma vez por análise)
+        for analise in analises:
+            guia = analise['avaliacao_guia']
+            if guia:
+                guias_preenchidas += 1
+                if guia == 'Não apresentada':
+                    guias_nao_apresentadas += 1
+            if guia == 'Não apresentada':
+                t_guias.append(_transacao(linha))
+            if analise['avaliacao_contratos'] == 'Não apresentado':
+                contratos_nao_apresentados += 1
+                t_contratos.append(_transacao(linha))
+
+            comprovante = analise['avaliacao_comprovante']
+            if comprovante == 'Pago em Espécie':
+                t_especie.append(_transacao(linha))
+            elif comprovante == 'Cartão de Crédito':
+                t_cartao.append(_transacao(linha))
+            elif comprovante == 'Pago em Cheque':
+                t_cheque.append(_transacao(linha))
+
+            if ((_contem(origem, 'Reembolso') or _contem(analista, 'Reembolso'))
+                    and comprovante is not None and comprovante != 'Apresentado corretamente'):
+                t_reembolso.append(_transacao(
+                    linha, avaliacao_analista=analista, avaliacao_comprovante=comprovante
+                ))
+            if _contem(origem, 'Duplicidade') or _contem(analista, 'Duplicidade'):
+                t_duplicidade.append(_transacao(linha, avaliacao_analista=analista))
+            if _contem(origem, 'Outro favorecido') or _contem(analista, 'Outro favorecido'):
+                t_outro_favorecido.append(_transacao(linha, avaliacao_analista=analista))
+            if any(_contem(v, t) for v in (origem, analista)
+                   for t in ('Alteração do vínculo', 'Alteração de vínculo')):
+                t_vinculo.append(_transacao(linha, avaliacao_analista=analista))
+            if _contem(analise['avaliacao_fora_municipio'], 'Fora do município'):
+                t_fora_municipio.append(_transacao(linha))
+
+        # Cards 17 e 18: execução por rubrica/mês (exige parceria)
+        if parceria is not None and cat is not None and cat in categorias_previstas:
+            mes = _mes_vigencia(linha['competencia'], inicio)
+            trimestre = math.ceil(mes / 3) if mes is not None else None
+            chave_rubrica = (rubrica_por_categoria[cat], trimestre)
+            if disc is not None:
+                executado_rubrica[chave_rubrica] = executado_rubrica.get(chave_rubrica, Decimal(0)) + disc
+            else:
+                executado_rubrica.setdefault(chave_rubrica, None)
+
+            previstas_mes = previsto_por_categoria_mes.get((cat, mes), []) if mes is not None else []
+            repeticoes = 1 if not previstas_mes else sum(
+                1 for d in previstas_mes if d['valor'] is None or d['valor'] == 0
+            )
+            if repeticoes:
+                chave = (cat, linha['competencia'])
+                grupo = sem_previsao.setdefault(chave, {
+                    'categoria_despesa': cat,
+                    'mes': Decimal(mes) if mes is not None else None,
+                    'valor_executado': None,
+                })
+                if disc is not None:
+                    grupo['valor_executado'] = (grupo['valor_executado'] or Decimal(0)) + disc * repeticoes
+
+        # Card 19: vigência extemporânea (exige parceria)
+        if parceria is not None:
+            comp = linha['competencia']
+            fora_vigencia = comp is not None and (
+                (inicio is not None and comp < inicio) or (final is not None and comp > final)
+            )
+            if fora_vigencia or _contem(analista, 'Vigência extemporânea') or _contem(analista, 'Vigencia extemporanea'):
+                t_vigencia.append(_transacao(linha, avaliacao_analista=analista))
+
+        # Cards 20, 21, 22: aplicações e parcelas
+        if _contem(cat, 'Aplica'):
+            total_aplicacoes += 1
+            if linha['data'] is not None:
+                aplicacoes_datas.append(linha['data'])
+            if not _contem(cat, 'Poupan'):
+                t_aplicacao_divergente.append(_transacao(linha, _CAMPOS_APLICACAO))
+        if _contem(cat, 'Parcela'):
+            parcelas.append(linha)
+
+        # Card 26: especificar categoria de despesa
+        if _contem(analista, 'especificar'):
+            t_especificar.append({
+                'id_conc_extrato': linha['id'],
+                **_transacao(linha, _CAMPOS_TRANSACAO[1:]),
+                'avaliacao_analista': analista,
+            })
+
+    # ── Montagem dos cards ────────────────────────────────────────────────
+    inconsistencias = []
+
+    def adicionar(id_modelo, transacoes, texto=None, **extras):
+        modelo = modelos.get(id_modelo)
+        if not modelo:
+            return
+        item = {
+            'id': modelo['id'],
+            'nome_item': modelo['nome_item'],
+            'modelo_texto': texto if texto is not None else modelo['modelo_texto'],
+            'solucao': modelo['solucao'],
+            'transacoes': transacoes,
+        }
+        item.update(extras)
+        item.setdefault('ordem', modelo.get('ordem', 999))
+        inconsistencias.append(item)
+
+    # 1. Apresentação de todas as guias
+    if guias_preenchidas > 0 and guias_preenchidas == guias_nao_apresentadas:
+        adicionar(8, t_guias)
+
+    # 2. Taxas bancárias
+    saldo_taxas = total_taxas - total_dev_taxas
+    if tem_taxas and saldo_taxas > 0 and modelos.get(1):
+        adicionar(
+            1, [],
+            texto=modelos[1]['modelo_texto'].replace('valor_taxa_usuario', _formatar_brl(saldo_taxas)),
+            valor_calculado=saldo_taxas,
+            mostrar_tabela=False,
+        )
+
+    # 3. Juros e multas
+    saldo_juros = total_juros - total_dev_juros
+    if t_juros and saldo_juros > 0 and modelos.get(2):
+        adicionar(
+            2, t_juros,
+            texto=modelos[2]['modelo_texto'].replace('valor_juros_usuario', _formatar_brl(saldo_juros)),
+            valor_calculado=saldo_juros,
+        )
+
+    # 4. Não uso da conta específica
+    conta_execucao = dados['conta_execucao']
+    if parceria and parceria['conta'] and conta_execucao and modelos.get(3):
+        conta_prevista = parceria['conta'].strip()
+        conta_executada = conta_execucao.strip()
+        if conta_prevista != conta_executada:
+            texto = modelos[3]['modelo_texto']
+            texto = texto.replace('conta_prevista', conta_prevista)
+            texto = texto.replace('conta_executada', conta_executada)
+            adicionar(
+                3, [], texto=texto,
+                conta_prevista=conta_prevista,
+                conta_executada=conta_executada,
+            )
+
+    # 5. Restituição final
+    if parceria:
+        valor_total_projeto = (
+            float(parceria['total_pago'] or 0) + rendimentos + float(parceria['contrapartida'] or 0)
+        )
+        saldos_remanescentes = valor_total_projeto - exec_aprovado - glosas - (taxas_abs - dev_taxas_abs)
+        if saldos_remanescentes > 0 and modelos.get(4):
+            adicionar(
+                4, [],
+                texto=modelos[4]['modelo_texto'].replace(
+                    'valor_residual_usuario', _formatar_brl(saldos_remanescentes)
+                ),
+                valor_calculado=saldos_remanescentes,
+            )
+
+    # 6. Apresentar todos os contratos
+    if contratos_nao_apresentados > 0:
+        adicionar(5, t_contratos)
+
+    # 7-8. Créditos não justificados / despesas não previstas
+    if t_creditos:
+        adicionar(6, t_creditos)
+    if t_debitos_indevidos:
+        adicionar(7, t_debitos_indevidos)
+
+    # 9. Despesa sem guia (algumas, não todas)
+    if 0 < guias_nao_apresentadas < guias_preenchidas:
+        adicionar(9, t_guias)
+
+    # 10-16. Comprovantes e marcações do analista
+    for id_modelo, transacoes in (
+        (10, t_especie), (11, t_cartao), (12, t_cheque), (13, t_reembolso),
+        (14, t_duplicidade), (15, t_outro_favorecido), (16, t_vinculo),
+    ):
+        if transacoes:
+            adicionar(id_modelo, transacoes)
+
+    # 17. Execução de rubrica superior ao previsto (por trimestre)
+    previsto_rubrica = {}
+    for d in despesas:
+        trimestre = Decimal(math.ceil(d['mes'] / 3)) if d['mes'] is not None else None
+        chave = (d['rubrica'], trimestre)
+        if d['valor'] is not None:
+            previsto_rubrica[chave] = (previsto_rubrica.get(chave) or Decimal(0)) + d['valor']
+        else:
+            previsto_rubrica.setdefault(chave, None)
+    divergencias_rubrica = []
+    for (rubrica, trimestre), valor_previsto in previsto_rubrica.items():
+        executado = None
+        if rubrica is not None and trimestre is not None:
+            executado = executado_rubrica.get((rubrica, int(trimestre)))
+        valor_executado = executado if executado is not None else Decimal(0)
+        if valor_previsto is None:
+            continue
+        diferenca = valor_previsto - valor_executado
+        if diferenca < 0:
+            divergencias_rubrica.append({
+                'rubrica': rubrica,
+                'trimestre': trimestre,
+                'valor_previsto': valor_previsto,
+                'valor_executado': valor_executado,
+                'diferenca': diferenca,
+            })
+    divergencias_rubrica.sort(key=lambda d: (
+        _ordenar_nulos_ultimo(d['rubrica']), _ordenar_nulos_ultimo(d['trimestre'])
+    ))
+    if divergencias_rubrica:
+        adicionar(17, divergencias_rubrica, mostrar_tabela=True, tipo_tabela='rubrica_trimestral')
+
+    # 18. Despesa sem previsão no período
+    despesas_sem_previsao = sorted(sem_previsao.values(), key=lambda d: (
+        _ordenar_nulos_ultimo(d['categoria_despesa']), _ordenar_nulos_ultimo(d['mes'])
+    ))
+    if despesas_sem_previsao:
+        adicionar(18, despesas_sem_previsao, mostrar_tabela=True, tipo_tabela='despesa_sem_previsao')
+
+    # 19. Vigência extemporânea
+    if t_vigencia:
+        adicionar(19, t_vigencia)
+
+    # 20. Ausência de aplicação total
+    if total_aplicacoes == 0:
+        adicionar(20, [], mostrar_tabela=False)
+
+    # 21. Ausência de aplicação em 48h (busca binária nas datas de aplicação)
+    aplicacoes_datas.sort()
+    parcelas_sem_aplicacao = []
+    for parcela in parcelas:
+        data_parcela = parcela['data']
+        if data_parcela is None:
+            continue
+        pos = bisect_right(aplicacoes_datas, data_parcela)
+        limite = data_parcela + timedelta(days=2)  # 48 horas = 2 dias
+        if pos >= len(aplicacoes_datas) or aplicacoes_datas[pos] > limite:
+            parcelas_sem_aplicacao.append(_transacao(parcela, _CAMPOS_APLICACAO))
+    if parcelas_sem_aplicacao:
+        adicionar(21, parcelas_sem_aplicacao, tipo_tabela='aplicacao_48h')
+
+    # 22. Aplicação divergente (não poupança)
+    if t_aplicacao_divergente:
+        adicionar(22, t_aplicacao_divergente, tipo_tabela='aplicacao_divergente')
+
+    # 25-26. Fora do município / especificar categoria
+    if t_fora_municipio:
+        adicionar(25, t_fora_municipio)
+    if t_especificar:
+        adicionar(26, t_especificar)
+
+    return inconsistencias
+
+
+def aplicar_ratificacoes(inconsistencias, ratificacoes):
+    """
+    Marca cada inconsistência com ratificada/status e retorna, por tabela, os
+    nome_item ratificados (não atendidos) que deixaram de ser identificados.
+
+    Returns:
+        dict: {tabela: set(nome_item)} a atualizar para 'Atendida'.
+    """
+    status_por_item = {}
+    pendentes = {tabela: set() for tabela in TABELAS_RATIFICACAO}
+    for row in sorted(ratificacoes, key=lambda r: r['prioridade']):
+        status_por_item.setdefault(row['nome_item'], row['status'])
+        if row['status'] is not None and row['status'] != 'Atendida':
+            pendentes[TABELAS_RATIFICACAO[row['prioridade']]].add(row['nome_item'])
+
+    for inc in inconsistencias:
+        ratificada = inc['nome_item'] in status_por_item
+        inc['ratificada'] = ratificada
+        inc['status'] = status_por_item.get(inc['nome_item']) if ratificada else None
+
+    identificados = {inc['nome_item'] for inc in inconsistencias}
+    return {tabela: nomes - identificados for tabela, nomes in pendentes.items() if nomes - identificados}
+
+
+def marcar_atendidas(cur, corrigidas_por_termo):
+    """
+    Atualiza para 'Atendida' as ratificações corrigidas — um UPDATE por tabela
+    para todos os termos.
+
+    Args:
+        corrigidas_por_termo: {numero_termo: {tabela: set(nome_item)}}
+
+    Returns:
+        int: total de pares (termo, nome_item) atualizados.
+    """
+    total = 0
+    for tabela in TABELAS_RATIFICACAO:
+        pares = [
+            (termo, nome)
+            for termo, por_tabela in corrigidas_por_termo.items()
+            for nome in por_tabela.get(tabela, ())
+        ]
+        if not pares:
+            continue
+        cur.execute(f"""
+            UPDATE analises_pc.{tabela} AS li
+            SET status = 'Atendida'
+            FROM UNNEST(%s::text[], %s::text[]) AS c(numero_termo, nome_item)
+            WHERE li.numero_termo = c.numero_termo
+              AND li.nome_item = c.nome_item
+              AND li.status != 'Atendida'
+        """, ([p[0] for p in pares], [p[1] for p in pares]))
+        total += len(pares)
+    return total
+
+
+def identificar_inconsistencias_termos(cur, termos):
+    """
+    Identifica as inconsistências de vários termos de uma vez.
+
+    Returns:
+        tuple: (resultados, corrigidas_por_termo) — resultados[termo] é a lista
+        de inconsistências já ordenada por 'ordem', com ratificada/status.
+    """
+    modelos, dados = carregar_dados(cur, termos)
+    resultados = {}
+    corrigidas_por_termo = {}
+    for termo, dados_termo in dados.items():
+        inconsistencias = avaliar_termo(modelos, dados_termo)
+        corrigidas = aplicar_ratificacoes(inconsistencias, dados_termo['ratificacoes'])
+        if corrigidas:
+            corrigidas_por_termo[termo] = corrigidas
+        inconsistencias.sort(key=lambda x: x.get('ordem', 999))
+        resultados[termo] = inconsistencias
+    return resultados, corrigidas_por_termo
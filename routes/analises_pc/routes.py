@@ -9,6 +9,8 @@ import requests
 from psycopg2.extras import execute_values
 import traceback
 import core.audit_log as audit_log  # Módulo de auditoria
+from core import jobs
+from . import inconsistencias as motor_inconsistencias
 import os
 from werkzeug.utils import secure_filename
 import re
@@ -1432,17 +1434,24 @@ import threading
 
 def _processar_pdf_manifestacao(doc_id: int, file_bytes: bytes):
     """Extrai texto de cada página do PDF e armazena em analises_pc_manifestacoes.paginas.
-    Executado em thread separada; abre sua própria conexão DB via DB_CONFIG."""
+    Executado em thread separada; abre sua própria conexão DB via DB_CONFIG.
+    Páginas escaneadas passam pelo OCR paralelo de core.ocr e são gravadas em lotes."""
     import psycopg2
     import psycopg2.extras
-    import pdfplumber
     from config import DB_CONFIG
-    from io import BytesIO
+    from core import ocr
 
     conn = psycopg2.connect(**DB_CONFIG)
     conn.autocommit = False
     cur = conn.cursor()
 
+    def _definir_total(total):
+        cur.execute(
+            "UPDATE analises_pc_manifestacoes.documentos SET total_paginas=%s WHERE id=%s",
+            (total, doc_id)
+        )
+        conn.commit()
+
     try:
         cur.execute(
             "UPDATE analises_pc_manifestacoes.documentos SET status='processando' WHERE id=%s",
@@ -1450,44 +1459,17 @@ def _processar_pdf_manifestacao(doc_id: int, file_bytes: bytes):
         )
         conn.commit()
 
-        with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-            total = len(pdf.pages)
-            cur.execute(
-                "UPDATE analises_pc_manifestacoes.documentos SET total_paginas=%s WHERE id=%s",
-                (total, doc_id)
-            )
+        for lote in ocr.iterar_lotes(file_bytes, ao_abrir=_definir_total):
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO analises_pc_manifestacoes.paginas
+                    (documento_id, numero_pagina, texto_extraido, metodo_extracao)
+                VALUES %s
+                ON CONFLICT (documento_id, numero_pagina) DO UPDATE
+                    SET texto_extraido = EXCLUDED.texto_extraido,
+                        metodo_extracao = EXCLUDED.metodo_extracao
+            """, [(doc_id, p['pagina'], p['texto'], p['metodo']) for p in lote])
             conn.commit()
 
-            for i, page in enumerate(pdf.pages, start=1):
-                texto = page.extract_text() or ''
-                metodo = 'pdfplumber'
-
-                if len(texto.strip()) < 50:
-                    try:
-                        import pdf2image
-                        import pytesseract
-                        imgs = pdf2image.convert_from_bytes(
-                            file_bytes, first_page=i, last_page=i, dpi=200
-                        )
-                        if imgs:
-                            texto = pytesseract.image_to_string(imgs[0], lang='por') or ''
-                            metodo = 'tesseract'
-                    except Exception:
-                        pass
-
-                cur.execute("""
-                    INSERT INTO analises_pc_manifestacoes.paginas
-                        (documento_id, numero_pagina, texto_extraido, metodo_extracao)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (documento_id, numero_pagina) DO UPDATE
-                        SET texto_extraido = EXCLUDED.texto_extraido,
-                            metodo_extracao = EXCLUDED.metodo_extracao
-                """, (doc_id, i, texto, metodo))
-
-                if i % 5 == 0:
-                    conn.commit()
-
-        conn.commit()
         cur.execute(
             "UPDATE analises_pc_manifestacoes.documentos SET status='concluido' WHERE id=%s",
             (doc_id,)
@@ -1689,33 +1671,16 @@ def deletar_manifestacao(doc_id):
 # ANÁLISE IA — Deepseek cross-referência manifestação × conciliação bancária
 # ─────────────────────────────────────────────────────────────────────────────
 
-import uuid
-import time as _time
 import json as _json
 
-_analises_ia: dict = {}
-_analises_ia_lock = threading.Lock()
-_ANALISE_TTL_S = 3600  # 1h
-
+# Estado em public.tarefas_background (core.jobs): polling responde em qualquer worker
 
 def _nova_analise_task() -> str:
-    tid = str(uuid.uuid4())
-    agora = _time.time()
-    with _analises_ia_lock:
-        expiradas = [k for k, v in _analises_ia.items()
-                     if agora - v.get('ts', agora) > _ANALISE_TTL_S]
-        for k in expiradas:
-            del _analises_ia[k]
-        _analises_ia[tid] = {'status': 'running', 'pct': 0,
-                             'label': 'Iniciando…', 'resultado': None,
-                             'erro': None, 'ts': agora}
-    return tid
+    return jobs.criar('analise_manifestacao_ia', usuario=session.get('email'),
+                      label='Iniciando…')
 
 
-def _upd_analise(tid: str, **kw):
-    with _analises_ia_lock:
-        if tid in _analises_ia:
-            _analises_ia[tid].update(kw)
+_upd_analise = jobs.atualizar
 
 
 def _carregar_prompt_sistema() -> str:
@@ -2703,11 +2668,7 @@ def analisar_manifestacao():
         return jsonify({'error': 'Número do termo não informado'}), 400
 
     tid = _nova_analise_task()
-    threading.Thread(
-        target=_executar_analise_ia,
-        args=(tid, numero_termo, meses_analisados, doc_ids, foco),
-        daemon=True
-    ).start()
+    jobs.iniciar(tid, _executar_analise_ia, tid, numero_termo, meses_analisados, doc_ids, foco)
 
     return jsonify({'task_id': tid})
 
@@ -2775,10 +2736,12 @@ def excluir_analise_ia(analise_id):
 @login_required
 def status_analise_ia(task_id):
     """Retorna estado atual de uma tarefa de análise IA."""
-    with _analises_ia_lock:
-        tarefa = dict(_analises_ia.get(task_id, {}))
+    tarefa = jobs.obter(task_id)
     if not tarefa:
         return jsonify({'error': 'Tarefa não encontrada ou expirada'}), 404
+    if tarefa['status'] == 'error':
+        # Falha fora do try de _executar_analise_ia: o front espera 'erro'
+        tarefa['status'] = 'erro'
     return jsonify(tarefa)
 
 
@@ -2947,37 +2910,6 @@ def listar_arquivos_disponiveis():
         return jsonify({'error': str(e)}), 500
 
 
-def verificar_ratificacao(cursor, numero_termo, nome_item):
-    """
-    Verifica se uma inconsistência já foi ratificada em qualquer das 3 tabelas.
-    Retorna um dicionário com: {'ratificada': bool, 'status': str}
-    OTIMIZADO: Uma única query com UNION ALL em vez de 3 queries sequenciais.
-    """
-    cursor.execute("""
-        SELECT status FROM analises_pc.lista_inconsistencias
-        WHERE numero_termo = %s AND nome_item = %s
-        
-        UNION ALL
-        
-        SELECT status FROM analises_pc.lista_inconsistencias_agregadas
-        WHERE numero_termo = %s AND nome_item = %s
-        
-        UNION ALL
-        
-        SELECT status FROM analises_pc.lista_inconsistencias_globais
-        WHERE numero_termo = %s AND nome_item = %s
-        
-        LIMIT 1
-    """, (numero_termo, nome_item, numero_termo, nome_item, numero_termo, nome_item))
-    
-    resultado = cursor.fetchone()
-    if resultado:
-        return {'ratificada': True, 'status': resultado['status']}
-    
-    # Não encontrado em nenhuma tabela
-    return {'ratificada': False, 'status': None}
-
-
 def agrupar_cards_compostos(inconsistencias):
     """
     DESABILITADO: Retorna lista de inconsistências sem agrupamento.
@@ -3037,6 +2969,9 @@ def identificar_inconsistencias(numero_termo):
     Identifica inconsistências automaticamente para um termo específico.
     Retorna lista de inconsistências com transações identificadas.
     
+    Os dados do termo são carregados uma única vez e todos os cards são
+    avaliados em memória (ver routes/analises_pc/inconsistencias.py).
+    
     Nota: Usa <path:numero_termo> para aceitar barras (/) no número do termo.
     """
     print(f"[DEBUG] ===== INÍCIO identificar_inconsistencias =====")
@@ -3046,1278 +2981,32 @@ def identificar_inconsistencias(numero_termo):
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     try:
-        inconsistencias_identificadas = []
-        
-        # ========================================
-        # OTIMIZAÇÃO: Buscar TODOS os modelos de texto de uma vez (1 query em vez de 26)
-        # ========================================
-        print("[DEBUG] Buscando modelos de texto (otimizado)...")
-        cur.execute("""
-            SELECT id, nome_item, modelo_texto, solucao, ordem
-            FROM categoricas.c_dac_modelo_textos_inconsistencias
-            WHERE id IN (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 25, 26)
-            ORDER BY ordem
-        """)
-        modelos_cache = {row['id']: row for row in cur.fetchall()}
-        print(f"[DEBUG] {len(modelos_cache)} modelos carregados em cache")
-        
-        # ========================================
-        # 1. APRESENTAÇÃO DE TODAS AS GUIAS
-        # ========================================
-        print("[DEBUG] Card 1: Iniciando verificação - Apresentação de todas as guias")
-        # Verifica se TODOS os registros PREENCHIDOS (desconsiderando vazios/null) têm avaliacao_guia = 'Não apresentada'
-        cur.execute("""
-            SELECT 
-                COUNT(*) as total_preenchidos,
-                COALESCE(SUM(CASE WHEN avaliacao_guia = 'Não apresentada' THEN 1 ELSE 0 END), 0) as nao_apresentadas
-            FROM analises_pc.conc_analise ca
-            INNER JOIN analises_pc.conc_extrato ce ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND ca.avaliacao_guia IS NOT NULL
-              AND ca.avaliacao_guia != ''
-        """, (numero_termo,))
-        
-        resultado_guias = cur.fetchone()
-        
-        # Só identifica inconsistência se:
-        # 1. Há registros preenchidos (total_preenchidos > 0)
-        # 2. TODOS os preenchidos são "Não apresentada"
-        if resultado_guias and resultado_guias['total_preenchidos'] > 0:
-            if resultado_guias['total_preenchidos'] == resultado_guias['nao_apresentadas']:
-                # TODOS os registros preenchidos são "Não apresentada" - inconsistência identificada!
-                
-                # Buscar modelo de texto do cache (otimizado)
-                modelo = modelos_cache.get(8)
-                
-                if modelo:
-                    # Buscar transações relacionadas
-                    cur.execute("""
-                        SELECT 
-                            ce.id,
-                            ce.indice,
-                            ce.data,
-                            ce.credito,
-                            ce.debito,
-                            ce.discriminacao,
-                            ce.cat_transacao,
-                            ce.competencia,
-                            ce.origem_destino
-                        FROM analises_pc.conc_extrato ce
-                        INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-                        WHERE ce.numero_termo = %s
-                          AND ca.avaliacao_guia = 'Não apresentada'
-                        ORDER BY ce.data, ce.indice
-                    """, (numero_termo,))
-                    
-                    transacoes = cur.fetchall()
-                    
-                    inconsistencias_identificadas.append({
-                        'id': modelo['id'],
-                        'nome_item': modelo['nome_item'],
-                        'modelo_texto': modelo['modelo_texto'],
-                        'solucao': modelo['solucao'],
-                        'transacoes': transacoes,
-                        'ordem': modelo.get('ordem', 999)
-                    })
-        
-        # ========================================
-        # 2. TAXAS BANCÁRIAS
-        # ========================================
-        print("[DEBUG] Card 2: Iniciando verificação - Taxas Bancárias")
-        # Verifica se (Soma de Taxas Bancárias) - (Soma de Devoluções) > 0
-        cur.execute("""
-            SELECT 
-                ce.id,
-                ce.indice,
-                ce.data,
-                ce.credito,
-                ce.debito,
-                ce.discriminacao,
-                ce.cat_transacao,
-                ce.competencia,
-                ce.origem_destino
-            FROM analises_pc.conc_extrato ce
-            WHERE ce.numero_termo = %s
-              AND ce.cat_transacao IN ('Taxas Bancárias', 'Devolução de Taxas Bancárias')
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo,))
-        
-        transacoes_taxas = cur.fetchall()
-        
-        if transacoes_taxas:
-            # Calcular saldo líquido: Taxas - Devoluções
-            total_taxas = sum(
-                float(t['discriminacao'] or 0) 
-                for t in transacoes_taxas 
-                if t['cat_transacao'] == 'Taxas Bancárias'
-            )
-            total_devolucoes = sum(
-                float(t['discriminacao'] or 0) 
-                for t in transacoes_taxas 
-                if t['cat_transacao'] == 'Devolução de Taxas Bancárias'
-            )
-            
-            saldo_taxas = total_taxas - total_devolucoes
-            
-            # Se saldo > 0, há inconsistência
-            if saldo_taxas > 0:
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_taxas = modelos_cache.get(1)
-                
-                if modelo_taxas:
-                    # Formatar valor para moeda brasileira
-                    valor_formatado = f"R$ {saldo_taxas:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    
-                    # Substituir valor_taxa_usuario no modelo
-                    texto_formatado = modelo_taxas['modelo_texto'].replace('valor_taxa_usuario', valor_formatado)
-                    
-                    inconsistencias_identificadas.append({
-                        'id': modelo_taxas['id'],
-                        'nome_item': modelo_taxas['nome_item'],
-                        'modelo_texto': texto_formatado,
-                        'solucao': modelo_taxas['solucao'],
-                        'transacoes': [],  # Taxas Bancárias não mostra tabela de transações
-                        'valor_calculado': saldo_taxas,
-                        'ordem': modelo_taxas.get('ordem', 999),
-                        'mostrar_tabela': False  # Flag para ocultar tabela no frontend
-                    })
-        
-        # ========================================
-        # 3. JUROS E MULTAS
-        # ========================================
-        print("[DEBUG] Card 3: Iniciando verificação - Juros e Multas")
-        # Verifica se (Soma de Juros e/ou Multas) - (Soma de Devoluções) > 0
-        cur.execute("""
-            SELECT 
-                ce.id,
-                ce.indice,
-                ce.data,
-                ce.credito,
-                ce.debito,
-                ce.discriminacao,
-                ce.cat_transacao,
-                ce.competencia,
-                ce.origem_destino
-            FROM analises_pc.conc_extrato ce
-            WHERE ce.numero_termo = %s
-              AND ce.cat_transacao IN ('Juros e/ou Multas', 'Devolução de Juros e/ou Multas')
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo,))
-        
-        transacoes_juros = cur.fetchall()
-        
-        if transacoes_juros:
-            # Calcular saldo líquido: Juros - Devoluções
-            total_juros = sum(
-                float(t['discriminacao'] or 0) 
-                for t in transacoes_juros 
-                if t['cat_transacao'] == 'Juros e/ou Multas'
-            )
-            total_devolucoes_juros = sum(
-                float(t['discriminacao'] or 0) 
-                for t in transacoes_juros 
-                if t['cat_transacao'] == 'Devolução de Juros e/ou Multas'
-            )
-            
-            saldo_juros = total_juros - total_devolucoes_juros
-            
-            # Se saldo > 0, há inconsistência
-            if saldo_juros > 0:
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_juros = modelos_cache.get(2)
-                
-                if modelo_juros:
-                    # Formatar valor para moeda brasileira
-                    valor_formatado = f"R$ {saldo_juros:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    
-                    # Substituir valor_juros_usuario no modelo
-                    texto_formatado = modelo_juros['modelo_texto'].replace('valor_juros_usuario', valor_formatado)
-                    
-                    inconsistencias_identificadas.append({
-                        'id': modelo_juros['id'],
-                        'nome_item': modelo_juros['nome_item'],
-                        'modelo_texto': texto_formatado,
-                        'solucao': modelo_juros['solucao'],
-                        'transacoes': transacoes_juros,
-                        'valor_calculado': saldo_juros,
-                        'ordem': modelo_juros.get('ordem', 999)
-                    })
-        
-        # ========================================
-        # 4. NÃO USO DA CONTA ESPECÍFICA
-        # ========================================
-        print("[DEBUG] Card 4: Iniciando verificação - Não uso da conta específica")
-        # Verifica se a conta de execução difere da conta prevista no termo
-        # Buscar conta prevista em public.parcerias
-        cur.execute("""
-            SELECT conta
-            FROM public.parcerias
-            WHERE numero_termo = %s
-            LIMIT 1
-        """, (numero_termo,))
-        
-        parceria = cur.fetchone()
-        
-        if parceria and parceria['conta']:
-            conta_prevista = parceria['conta'].strip()
-            
-            # Buscar conta de execução em analises_pc.conc_banco
-            cur.execute("""
-                SELECT conta_execucao
-                FROM analises_pc.conc_banco
-                WHERE numero_termo = %s
-                LIMIT 1
-            """, (numero_termo,))
-            
-            conc_banco = cur.fetchone()
-            
-            if conc_banco and conc_banco['conta_execucao']:
-                conta_executada = conc_banco['conta_execucao'].strip()
-                
-                # Se as contas forem divergentes, há inconsistência
-                if conta_prevista != conta_executada:
-                    # Buscar modelo de texto do cache (otimizado)
-                    modelo_conta = modelos_cache.get(3)
-                    
-                    if modelo_conta:
-                        # Substituir placeholders
-                        texto_formatado = modelo_conta['modelo_texto']
-                        texto_formatado = texto_formatado.replace('conta_prevista', conta_prevista)
-                        texto_formatado = texto_formatado.replace('conta_executada', conta_executada)
-                        
-                        # Não buscar transações - apenas descrição
-                        inconsistencias_identificadas.append({
-                            'id': modelo_conta['id'],
-                            'nome_item': modelo_conta['nome_item'],
-                            'modelo_texto': texto_formatado,
-                            'solucao': modelo_conta['solucao'],
-                            'transacoes': [],  # Vazio - não mostrar tabela
-                            'conta_prevista': conta_prevista,
-                            'conta_executada': conta_executada,
-                            'ordem': modelo_conta.get('ordem', 999)
-                        })
-        
-        # ========================================
-        # 5. RESTITUIÇÃO FINAL
-        # ========================================
-        print("[DEBUG] Card 5: Iniciando verificação - Restituição Final")
-        # Calcular valor residual (Saldos não Utilizados Remanescentes)
-        # Fórmula: Valor Total Projeto - Executado Aprovado - Despesas Glosa
-        
-        # Buscar dados necessários para o cálculo
-        cur.execute("""
-            SELECT total_pago, contrapartida
-            FROM public.parcerias
-            WHERE numero_termo = %s
-            LIMIT 1
-        """, (numero_termo,))
-        parceria_rest = cur.fetchone()
-        
-        if parceria_rest:
-            # Calcular rendimentos (bruto por padrão)
-            cur.execute("""
-                SELECT SUM(discriminacao) as total
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s
-                  AND cat_transacao = 'Rendimentos'
-            """, (numero_termo,))
-            rendimentos_rest = cur.fetchone()
-            total_rendimentos = float(rendimentos_rest['total'] or 0) if rendimentos_rest else 0
-            
-            # Valor executado e aprovado - MESMA LÓGICA DO CONC_RELATORIO
-            # Usar ABS() e verificar se categoria existe em parcerias_despesas
-            cur.execute("""
-                SELECT COALESCE(SUM(ABS(ce.discriminacao)), 0) as total
-                FROM analises_pc.conc_extrato ce
-                WHERE ce.numero_termo = %s 
-                    AND ce.cat_avaliacao = 'Avaliado'
-                    AND ce.discriminacao IS NOT NULL
-                    AND EXISTS (
-                        SELECT 1 
-                        FROM public.parcerias_despesas pd
-                        WHERE LOWER(pd.categoria_despesa) = LOWER(ce.cat_transacao)
-                            AND pd.numero_termo = ce.numero_termo
-                    )
-            """, (numero_termo,))
-            exec_aprovado = cur.fetchone()
-            valor_exec_aprovado = float(exec_aprovado['total'] or 0) if exec_aprovado else 0
-            
-            # Despesas passíveis de glosa - USAR ABS() para consistência
-            cur.execute("""
-                SELECT COALESCE(SUM(ABS(discriminacao)), 0) as total
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s 
-                    AND cat_avaliacao = 'Glosar'
-                    AND LOWER(cat_transacao) != 'taxas bancárias'
-                    AND discriminacao IS NOT NULL
-            """, (numero_termo,))
-            glosas_rest = cur.fetchone()
-            despesas_glosa = float(glosas_rest['total'] or 0) if glosas_rest else 0
-            
-            # Taxas Bancárias não Devolvidas
-            cur.execute("""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN LOWER(cat_transacao) = 'taxas bancárias' THEN ABS(discriminacao) ELSE 0 END), 0) as total_taxas,
-                    COALESCE(SUM(CASE WHEN LOWER(cat_transacao) = 'devolução de taxas bancárias' THEN ABS(discriminacao) ELSE 0 END), 0) as total_devolucao
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s AND discriminacao IS NOT NULL
-            """, (numero_termo,))
-            taxas_data_rest = cur.fetchone()
-            taxas_bancarias_rest = float(taxas_data_rest['total_taxas'] or 0) if taxas_data_rest else 0
-            devolucao_taxas_rest = float(taxas_data_rest['total_devolucao'] or 0) if taxas_data_rest else 0
-            taxas_nao_devolvidas_rest = taxas_bancarias_rest - devolucao_taxas_rest
-            
-            # Calcular Valor Total do Projeto
-            contrapartida_rest = float(parceria_rest['contrapartida'] or 0)
-            valor_total_projeto_rest = float(parceria_rest['total_pago']) + total_rendimentos + contrapartida_rest
-            
-            # Saldos não Utilizados Remanescentes = Valor Total - Executado - Glosas - Taxas não Devolvidas
-            saldos_remanescentes = valor_total_projeto_rest - valor_exec_aprovado - despesas_glosa - taxas_nao_devolvidas_rest
-            
-            # Se houver saldo positivo, identificar inconsistência
-            if saldos_remanescentes > 0:
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_rest = modelos_cache.get(4)
-                
-                if modelo_rest:
-                    # Formatar valor para moeda brasileira
-                    valor_formatado = f"R$ {saldos_remanescentes:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    
-                    # Substituir placeholder
-                    texto_formatado = modelo_rest['modelo_texto'].replace('valor_residual_usuario', valor_formatado)
-                    
-                    inconsistencias_identificadas.append({
-                        'id': modelo_rest['id'],
-                        'nome_item': modelo_rest['nome_item'],
-                        'modelo_texto': texto_formatado,
-                        'solucao': modelo_rest['solucao'],
-                        'transacoes': [],  # Sem tabela de transações
-                        'valor_calculado': saldos_remanescentes,
-                        'ordem': modelo_rest.get('ordem', 999)
-                    })
-        
-        # ========================================
-        # 6. APRESENTAR TODOS OS CONTRATOS
-        # ========================================
-        print("[DEBUG] Card 6: Iniciando verificação - Apresentar todos os Contratos")
-        # Verifica se há transações com contratos não apresentados
-        # Condição: avaliacao_contratos = 'Não apresentado'
-        
-        cur.execute("""
-            SELECT 
-                COUNT(*) as total_preenchidos,
-                COALESCE(SUM(CASE WHEN ca.avaliacao_contratos = 'Não apresentado' THEN 1 ELSE 0 END), 0) as nao_apresentados
-            FROM analises_pc.conc_analise ca
-            INNER JOIN analises_pc.conc_extrato ce ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND ca.avaliacao_contratos IS NOT NULL
-              AND ca.avaliacao_contratos != ''
-        """, (numero_termo,))
-        
-        resultado_contratos = cur.fetchone()
-        
-        # Só identifica inconsistência se há registros com "Não apresentado"
-        if resultado_contratos and resultado_contratos['nao_apresentados'] > 0:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_contratos = modelos_cache.get(5)
-            
-            if modelo_contratos:
-                # Buscar transações relacionadas
-                cur.execute("""
-                    SELECT 
-                        ce.id,
-                        ce.indice,
-                        ce.data,
-                        ce.credito,
-                        ce.debito,
-                        ce.discriminacao,
-                        ce.cat_transacao,
-                        ce.competencia,
-                        ce.origem_destino
-                    FROM analises_pc.conc_extrato ce
-                    INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-                    WHERE ce.numero_termo = %s
-                      AND ca.avaliacao_contratos = 'Não apresentado'
-                    ORDER BY ce.data, ce.indice
-                """, (numero_termo,))
-                
-                transacoes_contratos = cur.fetchall()
-                
-                inconsistencias_identificadas.append({
-                    'id': modelo_contratos['id'],
-                    'nome_item': modelo_contratos['nome_item'],
-                    'modelo_texto': modelo_contratos['modelo_texto'],
-                    'solucao': modelo_contratos['solucao'],
-                    'transacoes': transacoes_contratos,
-                    'ordem': modelo_contratos.get('ordem', 999)
-                })
-        
-        # ========================================
-        # 7. CRÉDITOS NÃO JUSTIFICADOS
-        # ========================================
-        print("[DEBUG] Card 7: Iniciando verificação - Créditos não justificados")
-        # Verifica transações com crédito > 0 e cat_avaliacao != 'Avaliado'
-        cur.execute("""
-            SELECT 
-                ce.id,
-                ce.indice,
-                ce.data,
-                ce.credito,
-                ce.debito,
-                ce.discriminacao,
-                ce.cat_transacao,
-                ce.competencia,
-                ce.origem_destino
-            FROM analises_pc.conc_extrato ce
-            WHERE ce.numero_termo = %s
-              AND ce.credito > 0
-              AND (ce.cat_avaliacao IS NULL OR ce.cat_avaliacao != 'Avaliado')
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo,))
-        
-        transacoes_creditos = cur.fetchall()
-        
-        if transacoes_creditos:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_creditos = modelos_cache.get(6)
-            
-            if modelo_creditos:
-                inconsistencias_identificadas.append({
-                    'id': modelo_creditos['id'],
-                    'nome_item': modelo_creditos['nome_item'],
-                    'modelo_texto': modelo_creditos['modelo_texto'],
-                    'solucao': modelo_creditos['solucao'],
-                    'transacoes': transacoes_creditos,
-                    'ordem': modelo_creditos.get('ordem', 999)
-                })
-        
-        # ========================================
-        # 8. DESPESAS NÃO PREVISTAS
-        # ========================================
-        print("[DEBUG] Card 8: Iniciando verificação - Despesas não previstas")
-        # Verifica transações categorizadas como "Débitos Indevidos"
-        cur.execute("""
-            SELECT 
-                ce.id,
-                ce.indice,
-                ce.data,
-                ce.credito,
-                ce.debito,
-                ce.discriminacao,
-                ce.cat_transacao,
-                ce.competencia,
-                ce.origem_destino
-            FROM analises_pc.conc_extrato ce
-            WHERE ce.numero_termo = %s
-              AND ce.cat_transacao = 'Débitos Indevidos'
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo,))
-        
-        transacoes_debitos_indevidos = cur.fetchall()
-        
-        if transacoes_debitos_indevidos:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_debitos = modelos_cache.get(7)
-            
-            if modelo_debitos:
-                inconsistencias_identificadas.append({
-                    'id': modelo_debitos['id'],
-                    'nome_item': modelo_debitos['nome_item'],
-                    'modelo_texto': modelo_debitos['modelo_texto'],
-                    'solucao': modelo_debitos['solucao'],
-                    'transacoes': transacoes_debitos_indevidos,
-                    'ordem': modelo_debitos.get('ordem', 999)
-                })
-        
-        # ========================================
-        # 9. DESPESA SEM GUIA (ALGUMAS, NÃO TODAS)
-        # ========================================
-        print("[DEBUG] Card 9: Iniciando verificação - Despesa sem guia")
-        # Verifica se ALGUMAS (mas não todas) guias não foram apresentadas
-        # Este card é excludente com Card 1 (que verifica se TODAS não foram apresentadas)
-        
-        # Verificar se há registros com "Não apresentada" mas não é o caso de TODOS
-        cur.execute("""
-            SELECT 
-                COUNT(*) as total_preenchidos,
-                COALESCE(SUM(CASE WHEN avaliacao_guia = 'Não apresentada' THEN 1 ELSE 0 END), 0) as nao_apresentadas
-            FROM analises_pc.conc_analise ca
-            INNER JOIN analises_pc.conc_extrato ce ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND ca.avaliacao_guia IS NOT NULL
-              AND ca.avaliacao_guia != ''
-        """, (numero_termo,))
-        
-        resultado_guias_parcial = cur.fetchone()
-        
-        # Só identifica se:
-        # 1. Há registros com "Não apresentada" (nao_apresentadas > 0)
-        # 2. MAS não são TODOS (nao_apresentadas < total_preenchidos)
-        if resultado_guias_parcial and resultado_guias_parcial['nao_apresentadas'] > 0:
-            if resultado_guias_parcial['nao_apresentadas'] < resultado_guias_parcial['total_preenchidos']:
-                # ALGUMAS guias não foram apresentadas (mas não todas)
-                
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_guias_parcial = modelos_cache.get(9)
-                
-                if modelo_guias_parcial:
-                    # Buscar transações relacionadas (apenas as não apresentadas)
-                    cur.execute("""
-                        SELECT 
-                            ce.id,
-                            ce.indice,
-                            ce.data,
-                            ce.credito,
-                            ce.debito,
-                            ce.discriminacao,
-                            ce.cat_transacao,
-                            ce.competencia,
-                            ce.origem_destino
-                        FROM analises_pc.conc_extrato ce
-                        INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-                        WHERE ce.numero_termo = %s
-                          AND ca.avaliacao_guia = 'Não apresentada'
-                        ORDER BY ce.data, ce.indice
-                    """, (numero_termo,))
-                    
-                    transacoes_guias_parcial = cur.fetchall()
-                    
-                    inconsistencias_identificadas.append({
-                        'id': modelo_guias_parcial['id'],
-                        'nome_item': modelo_guias_parcial['nome_item'],
-                        'modelo_texto': modelo_guias_parcial['modelo_texto'],
-                        'solucao': modelo_guias_parcial['solucao'],
-                        'transacoes': transacoes_guias_parcial,
-                        'ordem': modelo_guias_parcial.get('ordem', 999)
-                    })
-        
-        # ========================================
-        # 10. PAGO EM ESPÉCIE
-        # ========================================
-        print("[DEBUG] Card 10: Iniciando verificação - Pago em espécie")
-        # Verifica transações com comprovante "Pago em Espécie"
-        cur.execute("""
-            SELECT 
-                ce.id,
-                ce.indice,
-                ce.data,
-                ce.credito,
-                ce.debito,
-                ce.discriminacao,
-                ce.cat_transacao,
-                ce.competencia,
-                ce.origem_destino
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND ca.avaliacao_comprovante = 'Pago em Espécie'
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo,))
-        
-        transacoes_especie = cur.fetchall()
-        
-        if transacoes_especie:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_especie = modelos_cache.get(10)
-            
-            if modelo_especie:
-                inconsistencias_identificadas.append({
-                    'id': modelo_especie['id'],
-                    'nome_item': modelo_especie['nome_item'],
-                    'modelo_texto': modelo_especie['modelo_texto'],
-                    'solucao': modelo_especie['solucao'],
-                    'transacoes': transacoes_especie,
-                    'ordem': modelo_especie.get('ordem', 999)
-                })
-        
-        # ========================================
-        # 11. PAGO EM CARTÃO DE CRÉDITO
-        # ========================================
-        print("[DEBUG] Card 11: Iniciando verificação - Pago em cartão de crédito")
-        # Verifica transações com comprovante "Cartão de Crédito"
-        cur.execute("""
-            SELECT 
-                ce.id,
-                ce.indice,
-                ce.data,
-                ce.credito,
-                ce.debito,
-                ce.discriminacao,
-                ce.cat_transacao,
-                ce.competencia,
-                ce.origem_destino
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND ca.avaliacao_comprovante = 'Cartão de Crédito'
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo,))
-        
-        transacoes_cartao = cur.fetchall()
-        
-        if transacoes_cartao:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_cartao = modelos_cache.get(11)
-            
-            if modelo_cartao:
-                inconsistencias_identificadas.append({
-                    'id': modelo_cartao['id'],
-                    'nome_item': modelo_cartao['nome_item'],
-                    'modelo_texto': modelo_cartao['modelo_texto'],
-                    'solucao': modelo_cartao['solucao'],
-                    'transacoes': transacoes_cartao,
-                    'ordem': modelo_cartao.get('ordem', 999)
-                })
-        
-        # ========================================
-        # 12. PAGO EM CHEQUE
-        # ========================================
-        print("[DEBUG] Card 12: Iniciando verificação - Pago em cheque")
-        # Verifica transações com comprovante "Pago em Cheque"
-        cur.execute("""
-            SELECT 
-                ce.id,
-                ce.indice,
-                ce.data,
-                ce.credito,
-                ce.debito,
-                ce.discriminacao,
-                ce.cat_transacao,
-                ce.competencia,
-                ce.origem_destino
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND ca.avaliacao_comprovante = 'Pago em Cheque'
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo,))
-        
-        transacoes_cheque = cur.fetchall()
-        
-        if transacoes_cheque:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_cheque = modelos_cache.get(12)
-            
-            if modelo_cheque:
-                inconsistencias_identificadas.append({
-                    'id': modelo_cheque['id'],
-                    'nome_item': modelo_cheque['nome_item'],
-                    'modelo_texto': modelo_cheque['modelo_texto'],
-                    'solucao': modelo_cheque['solucao'],
-                    'transacoes': transacoes_cheque,
-                    'ordem': modelo_cheque.get('ordem', 999)
-                })
-        
-        # ========================================
-        # CARD 13: Reembolsos sem comprovação
-        # ========================================
-        print(f"[DEBUG] Verificando Card 13: Reembolsos sem comprovação...")
-        cur.execute("""
-            SELECT ce.id, ce.indice, ce.data, ce.credito, ce.debito,
-                   ce.discriminacao, ce.cat_transacao, ce.competencia, ce.origem_destino,
-                   ce.avaliacao_analista, ca.avaliacao_comprovante
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND (ce.origem_destino ILIKE %s OR ce.avaliacao_analista ILIKE %s)
-              AND ca.avaliacao_comprovante != 'Apresentado corretamente'
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo, '%Reembolso%', '%Reembolso%'))
-        
-        transacoes_reembolso_sem_comp = cur.fetchall()
-        
-        if transacoes_reembolso_sem_comp:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_reembolso = modelos_cache.get(13)
-            
-            if modelo_reembolso:
-                inconsistencias_identificadas.append({
-                    'id': modelo_reembolso['id'],
-                    'nome_item': modelo_reembolso['nome_item'],
-                    'modelo_texto': modelo_reembolso['modelo_texto'],
-                    'solucao': modelo_reembolso['solucao'],
-                    'transacoes': transacoes_reembolso_sem_comp,
-                    'ordem': modelo_reembolso.get('ordem', 999)
-                })
-        
-        # ========================================
-        # CARD 14: Pagamento em duplicidade
-        # ========================================
-        print(f"[DEBUG] Verificando Card 14: Pagamento em duplicidade...")
-        cur.execute("""
-            SELECT ce.id, ce.indice, ce.data, ce.credito, ce.debito,
-                   ce.discriminacao, ce.cat_transacao, ce.competencia, ce.origem_destino,
-                   ce.avaliacao_analista
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND (ce.origem_destino ILIKE %s OR ce.avaliacao_analista ILIKE %s)
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo, '%Duplicidade%', '%Duplicidade%'))
-        
-        transacoes_duplicidade = cur.fetchall()
-        
-        if transacoes_duplicidade:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_duplicidade = modelos_cache.get(14)
-            
-            if modelo_duplicidade:
-                inconsistencias_identificadas.append({
-                    'id': modelo_duplicidade['id'],
-                    'nome_item': modelo_duplicidade['nome_item'],
-                    'modelo_texto': modelo_duplicidade['modelo_texto'],
-                    'solucao': modelo_duplicidade['solucao'],
-                    'transacoes': transacoes_duplicidade,
-                    'ordem': modelo_duplicidade.get('ordem', 999)
-                })
-        
-        # ========================================
-        # CARD 15: Pagamento para outro Favorecido
-        # ========================================
-        print(f"[DEBUG] Verificando Card 15: Pagamento para outro Favorecido...")
-        cur.execute("""
-            SELECT ce.id, ce.indice, ce.data, ce.credito, ce.debito,
-                   ce.discriminacao, ce.cat_transacao, ce.competencia, ce.origem_destino,
-                   ce.avaliacao_analista
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND (ce.origem_destino ILIKE %s OR ce.avaliacao_analista ILIKE %s)
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo, '%Outro favorecido%', '%Outro favorecido%'))
-        
-        transacoes_outro_favorecido = cur.fetchall()
-        
-        if transacoes_outro_favorecido:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_outro_favorecido = modelos_cache.get(15)
-            
-            if modelo_outro_favorecido:
-                inconsistencias_identificadas.append({
-                    'id': modelo_outro_favorecido['id'],
-                    'nome_item': modelo_outro_favorecido['nome_item'],
-                    'modelo_texto': modelo_outro_favorecido['modelo_texto'],
-                    'solucao': modelo_outro_favorecido['solucao'],
-                    'transacoes': transacoes_outro_favorecido,
-                    'ordem': modelo_outro_favorecido.get('ordem', 999)
-                })
-        
-        # ========================================
-        # CARD 16: Alteração do vínculo de contratado
-        # ========================================
-        print(f"[DEBUG] Verificando Card 16: Alteração do vínculo de contratado...")
-        cur.execute("""
-            SELECT ce.id, ce.indice, ce.data, ce.credito, ce.debito,
-                   ce.discriminacao, ce.cat_transacao, ce.competencia, ce.origem_destino,
-                   ce.avaliacao_analista
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-            WHERE ce.numero_termo = %s
-              AND (ce.origem_destino ILIKE %s 
-                   OR ce.origem_destino ILIKE %s
-                   OR ce.avaliacao_analista ILIKE %s
-                   OR ce.avaliacao_analista ILIKE %s)
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo, '%Alteração do vínculo%', '%Alteração de vínculo%', '%Alteração do vínculo%', '%Alteração de vínculo%'))
-        
-        transacoes_alteracao_vinculo = cur.fetchall()
-        
-        if transacoes_alteracao_vinculo:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_alteracao_vinculo = modelos_cache.get(16)
-            
-            if modelo_alteracao_vinculo:
-                inconsistencias_identificadas.append({
-                    'id': modelo_alteracao_vinculo['id'],
-                    'nome_item': modelo_alteracao_vinculo['nome_item'],
-                    'modelo_texto': modelo_alteracao_vinculo['modelo_texto'],
-                    'solucao': modelo_alteracao_vinculo['solucao'],
-                    'transacoes': transacoes_alteracao_vinculo,
-                    'ordem': modelo_alteracao_vinculo.get('ordem', 999)
-                })
-        
-        # ========================================
-        # CARD 17: Execução de rubrica superior ao previsto
-        # ========================================
-        print(f"[DEBUG] Verificando Card 17: Execução de rubrica superior ao previsto...")
-        cur.execute("""
-            WITH previsto AS (
-                SELECT 
-                    pd.rubrica,
-                    CEIL(pd.mes / 3.0) as trimestre,
-                    SUM(pd.valor) as valor_previsto
-                FROM public.parcerias_despesas pd
-                WHERE pd.numero_termo = %s
-                GROUP BY pd.rubrica, trimestre
-            ),
-            executado AS (
-                SELECT 
-                    pd.rubrica,
-                    CEIL(
-                        ((EXTRACT(YEAR FROM ce.competencia) - EXTRACT(YEAR FROM p.inicio)) * 12 +
-                         (EXTRACT(MONTH FROM ce.competencia) - EXTRACT(MONTH FROM p.inicio)) + 1) / 3.0
-                    ) as trimestre,
-                    SUM(ce.discriminacao) as valor_executado
-                FROM analises_pc.conc_extrato ce
-                INNER JOIN public.parcerias p ON p.numero_termo = ce.numero_termo
-                INNER JOIN (
-                    SELECT DISTINCT ON (categoria_despesa, numero_termo) 
-                        rubrica, categoria_despesa, numero_termo
-                    FROM public.parcerias_despesas
-                ) pd ON pd.numero_termo = ce.numero_termo 
-                    AND pd.categoria_despesa = ce.cat_transacao
-                WHERE ce.numero_termo = %s
-                GROUP BY pd.rubrica, trimestre
-            )
-            SELECT 
-                p.rubrica,
-                p.trimestre,
-                p.valor_previsto,
-                COALESCE(e.valor_executado, 0) as valor_executado,
-                p.valor_previsto - COALESCE(e.valor_executado, 0) as diferenca
-            FROM previsto p
-            LEFT JOIN executado e ON p.rubrica = e.rubrica AND p.trimestre = e.trimestre
-            WHERE p.valor_previsto - COALESCE(e.valor_executado, 0) < 0
-            ORDER BY p.rubrica, p.trimestre
-        """, (numero_termo, numero_termo))
-        
-        divergencias_rubrica = cur.fetchall()
-        
-        if divergencias_rubrica:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_rubrica = modelos_cache.get(17)
-            
-            if modelo_rubrica:
-                inconsistencias_identificadas.append({
-                    'id': modelo_rubrica['id'],
-                    'nome_item': modelo_rubrica['nome_item'],
-                    'modelo_texto': modelo_rubrica['modelo_texto'],
-                    'solucao': modelo_rubrica['solucao'],
-                    'transacoes': divergencias_rubrica,
-                    'ordem': modelo_rubrica.get('ordem', 999),
-                    'mostrar_tabela': True,
-                    'tipo_tabela': 'rubrica_trimestral'  # Indicador para renderização customizada
-                })
-        
-        # ========================================
-        # CARD 18: Despesa sem previsão no período
-        # ========================================
-        print(f"[DEBUG] Verificando Card 18: Despesa sem previsão no período...")
-        cur.execute("""
-            SELECT 
-                ce.cat_transacao as categoria_despesa,
-                ((EXTRACT(YEAR FROM ce.competencia) - EXTRACT(YEAR FROM p.inicio)) * 12 +
-                 (EXTRACT(MONTH FROM ce.competencia) - EXTRACT(MONTH FROM p.inicio)) + 1) as mes,
-                SUM(ce.discriminacao) as valor_executado
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN public.parcerias p ON p.numero_termo = ce.numero_termo
-            INNER JOIN (
-                SELECT DISTINCT categoria_despesa, numero_termo
-                FROM public.parcerias_despesas
-            ) categorias_validas ON categorias_validas.numero_termo = ce.numero_termo 
-                AND categorias_validas.categoria_despesa = ce.cat_transacao
-            LEFT JOIN public.parcerias_despesas pd 
-                ON pd.numero_termo = ce.numero_termo
-                AND pd.categoria_despesa = ce.cat_transacao
-                AND pd.mes = ((EXTRACT(YEAR FROM ce.competencia) - EXTRACT(YEAR FROM p.inicio)) * 12 +
-                             (EXTRACT(MONTH FROM ce.competencia) - EXTRACT(MONTH FROM p.inicio)) + 1)
-            WHERE ce.numero_termo = %s
-              AND ce.cat_transacao IS NOT NULL
-              AND (pd.mes IS NULL OR pd.valor = 0 OR pd.valor IS NULL)
-            GROUP BY ce.cat_transacao, p.inicio, ce.competencia
-            ORDER BY ce.cat_transacao, mes
-        """, (numero_termo,))
-        
-        despesas_sem_previsao = cur.fetchall()
-        
-        if despesas_sem_previsao:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_despesa_sem_previsao = modelos_cache.get(18)
-            
-            if modelo_despesa_sem_previsao:
-                inconsistencias_identificadas.append({
-                    'id': modelo_despesa_sem_previsao['id'],
-                    'nome_item': modelo_despesa_sem_previsao['nome_item'],
-                    'modelo_texto': modelo_despesa_sem_previsao['modelo_texto'],
-                    'solucao': modelo_despesa_sem_previsao['solucao'],
-                    'transacoes': despesas_sem_previsao,
-                    'ordem': modelo_despesa_sem_previsao.get('ordem', 999),
-                    'mostrar_tabela': True,
-                    'tipo_tabela': 'despesa_sem_previsao'  # Indicador para renderização customizada
-                })
-        
-        # ========================================
-        # CARD 19: Vigência extemporânea
-        # ========================================
-        print(f"[DEBUG] Verificando Card 19: Vigência extemporânea...")
-        cur.execute("""
-            SELECT 
-                ce.id, ce.indice, ce.data, ce.credito, ce.debito,
-                ce.discriminacao, ce.cat_transacao, ce.competencia, ce.origem_destino,
-                ce.avaliacao_analista
-            FROM analises_pc.conc_extrato ce
-            INNER JOIN public.parcerias p ON p.numero_termo = ce.numero_termo
-            WHERE ce.numero_termo = %s
-              AND (
-                  -- Competência fora do período de vigência
-                  (ce.competencia < p.inicio OR ce.competencia > p.final)
-                  -- Ou marcado pelo analista
-                  OR ce.avaliacao_analista ILIKE %s
-                  OR ce.avaliacao_analista ILIKE %s
-              )
-            ORDER BY ce.data, ce.indice
-        """, (numero_termo, '%Vigência extemporânea%', '%Vigencia extemporanea%'))
-        
-        transacoes_vigencia_extemporanea = cur.fetchall()
-        
-        if transacoes_vigencia_extemporanea:
-            # Buscar modelo de texto do cache (otimizado)
-            modelo_vigencia = modelos_cache.get(19)
-            
-            if modelo_vigencia:
-                inconsistencias_identificadas.append({
-                    'id': modelo_vigencia['id'],
-                    'nome_item': modelo_vigencia['nome_item'],
-                    'modelo_texto': modelo_vigencia['modelo_texto'],
-                    'solucao': modelo_vigencia['solucao'],
-                    'transacoes': transacoes_vigencia_extemporanea,
-                    'ordem': modelo_vigencia.get('ordem', 999)
-                })
-        
-        # ========================================
-        # CARD 20: Ausência de aplicação total
-        # ========================================
-        print(f"[DEBUG] Verificando Card 20: Ausência de aplicação total...")
-        try:
-            cur.execute("""
-                SELECT COUNT(*) as total_aplicacoes
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s
-                  AND cat_transacao ILIKE %s
-            """, (numero_termo, '%Aplica%'))
-            
-            resultado_aplicacao = cur.fetchone()
-            total_aplicacoes = resultado_aplicacao['total_aplicacoes'] if resultado_aplicacao else 0
-            print(f"[DEBUG] Card 20 - Total de aplicações encontradas: {total_aplicacoes}")
-            
-            # Se não há nenhuma aplicação no termo, adicionar inconsistência SEM tabela
-            if total_aplicacoes == 0:
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_ausencia_aplicacao = modelos_cache.get(20)
-                
-                if modelo_ausencia_aplicacao:
-                    inconsistencias_identificadas.append({
-                        'id': modelo_ausencia_aplicacao['id'],
-                        'nome_item': modelo_ausencia_aplicacao['nome_item'],
-                        'modelo_texto': modelo_ausencia_aplicacao['modelo_texto'],
-                        'solucao': modelo_ausencia_aplicacao['solucao'],
-                        'transacoes': [],  # SEM transações
-                        'mostrar_tabela': False,  # Flag para não mostrar tabela
-                        'ordem': modelo_ausencia_aplicacao.get('ordem', 999)
-                    })
-                    print(f"[DEBUG] Card 20 - Inconsistência adicionada")
-        except Exception as e:
-            conn.rollback()  # Resetar transação após erro
-            print(f"[ERRO] Card 20 falhou: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        # ========================================
-        # CARD 21: Ausência de aplicação em 48h
-        # ========================================
-        print(f"[DEBUG] Verificando Card 21: Ausência de aplicação em 48h...")
-        try:
-            # Buscar todas as transações com "Parcela" em cat_transacao
-            print(f"[DEBUG] Card 21 - Buscando parcelas para termo: {numero_termo}")
-            cur.execute("""
-                SELECT id, indice, data, discriminacao, cat_transacao
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s
-                  AND cat_transacao ILIKE %s
-                ORDER BY data
-            """, (numero_termo, '%Parcela%'))
-            
-            transacoes_parcelas = cur.fetchall()
-            print(f"[DEBUG] Card 21 - Total de parcelas encontradas: {len(transacoes_parcelas)}")
-            parcelas_sem_aplicacao = []
-            
-            # Para cada parcela, verificar se há aplicação nos próximos 2 dias
-            for idx, parcela in enumerate(transacoes_parcelas):
-                data_parcela = parcela['data']
-                data_limite = data_parcela + timedelta(days=2)  # 48 horas = 2 dias
-                print(f"[DEBUG] Card 21 - Verificando parcela {idx+1}/{len(transacoes_parcelas)}: data={data_parcela}, limite={data_limite}")
-                
-                # Buscar se existe aplicação entre data_parcela e data_limite
-                cur.execute("""
-                    SELECT COUNT(*) as total_aplicacoes
-                    FROM analises_pc.conc_extrato
-                    WHERE numero_termo = %s
-                      AND cat_transacao ILIKE %s
-                      AND data > %s
-                      AND data <= %s
-                """, (numero_termo, '%Aplica%', data_parcela, data_limite))
-                
-                resultado = cur.fetchone()
-                total_aplicacoes_periodo = resultado['total_aplicacoes'] if resultado else 0
-                print(f"[DEBUG] Card 21 - Aplicações encontradas no período: {total_aplicacoes_periodo}")
-                
-                # Se não há aplicação nos próximos 2 dias, adicionar à lista
-                if total_aplicacoes_periodo == 0:
-                    parcelas_sem_aplicacao.append(parcela)
-            
-            print(f"[DEBUG] Card 21 - Total de parcelas sem aplicação em 48h: {len(parcelas_sem_aplicacao)}")
-            
-            if parcelas_sem_aplicacao:
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_aplicacao_48h = modelos_cache.get(21)
-                
-                if modelo_aplicacao_48h:
-                    inconsistencias_identificadas.append({
-                        'id': modelo_aplicacao_48h['id'],
-                        'nome_item': modelo_aplicacao_48h['nome_item'],
-                        'modelo_texto': modelo_aplicacao_48h['modelo_texto'],
-                        'solucao': modelo_aplicacao_48h['solucao'],
-                        'transacoes': parcelas_sem_aplicacao,
-                        'tipo_tabela': 'aplicacao_48h',  # Tipo especial para tabela reduzida
-                        'ordem': modelo_aplicacao_48h.get('ordem', 999)
-                    })
-                    print(f"[DEBUG] Card 21 - Inconsistência adicionada")
-        except Exception as e:
-            conn.rollback()  # Resetar transação após erro
-            print(f"[ERRO] Card 21 falhou: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        # ========================================
-        # CARD 22: Aplicação Divergente
-        # ========================================
-        print(f"[DEBUG] Verificando Card 22: Aplicação Divergente...")
-        try:
-            # Buscar aplicações que NÃO sejam Poupança
-            cur.execute("""
-                SELECT id, indice, data, discriminacao, cat_transacao
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s
-                  AND cat_transacao ILIKE %s
-                  AND cat_transacao NOT ILIKE %s
-                ORDER BY data
-            """, (numero_termo, '%Aplica%', '%Poupan%'))
-            
-            transacoes_aplicacao_divergente = cur.fetchall()
-            print(f"[DEBUG] Card 22 - Aplicações divergentes encontradas: {len(transacoes_aplicacao_divergente)}")
-            
-            if transacoes_aplicacao_divergente:
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_aplicacao_divergente = modelos_cache.get(22)
-                
-                if modelo_aplicacao_divergente:
-                    inconsistencias_identificadas.append({
-                        'id': modelo_aplicacao_divergente['id'],
-                        'nome_item': modelo_aplicacao_divergente['nome_item'],
-                        'modelo_texto': modelo_aplicacao_divergente['modelo_texto'],
-                        'solucao': modelo_aplicacao_divergente['solucao'],
-                        'transacoes': transacoes_aplicacao_divergente,
-                        'tipo_tabela': 'aplicacao_divergente',  # Tipo especial para tabela reduzida
-                        'ordem': modelo_aplicacao_divergente.get('ordem', 999)
-                    })
-                    print(f"[DEBUG] Card 22 - Inconsistência adicionada")
-        except Exception as e:
-            conn.rollback()  # Resetar transação após erro
-            print(f"[ERRO] Card 22 falhou: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        # ========================================
-        # CARD 25: Fora do Município
-        # ========================================
-        print(f"[DEBUG] Verificando Card 25: Fora do Município...")
-        try:
-            # Buscar transações marcadas como "Fora do município"
-            cur.execute("""
-                SELECT 
-                    ce.id, ce.indice, ce.data, ce.credito, ce.debito,
-                    ce.discriminacao, ce.cat_transacao, ce.competencia, ce.origem_destino
-                FROM analises_pc.conc_extrato ce
-                INNER JOIN analises_pc.conc_analise ca ON ca.conc_extrato_id = ce.id
-                WHERE ce.numero_termo = %s
-                  AND ca.avaliacao_fora_municipio ILIKE %s
-                ORDER BY ce.data, ce.indice
-            """, (numero_termo, '%Fora do município%'))
-            
-            transacoes_fora_municipio = cur.fetchall()
-            print(f"[DEBUG] Card 25 - Transações fora do município: {len(transacoes_fora_municipio)}")
-            
-            if transacoes_fora_municipio:
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_fora_municipio = modelos_cache.get(25)
-                
-                if modelo_fora_municipio:
-                    inconsistencias_identificadas.append({
-                        'id': modelo_fora_municipio['id'],
-                        'nome_item': modelo_fora_municipio['nome_item'],
-                        'modelo_texto': modelo_fora_municipio['modelo_texto'],
-                        'solucao': modelo_fora_municipio['solucao'],
-                        'transacoes': transacoes_fora_municipio,
-                        'ordem': modelo_fora_municipio.get('ordem', 999)
-                    })
-                    print(f"[DEBUG] Card 25 - Inconsistência adicionada")
-        except Exception as e:
-            conn.rollback()  # Resetar transação após erro
-            print(f"[ERRO] Card 25 falhou: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        # ========================================
-        # CARD 26: Especificar categoria de despesa
-        # ========================================
-        print(f"[DEBUG] Verificando Card 26: Especificar categoria de despesa...")
-        try:
-            # Buscar transações onde avaliacao_analista contém "especificar"
-            # Busca em ce.avaliacao_analista (coluna do extrato)
-            cur.execute("""
-                SELECT 
-                    ce.id AS id_conc_extrato, ce.indice, ce.data, ce.credito, ce.debito,
-                    ce.discriminacao, ce.cat_transacao, ce.competencia, ce.origem_destino,
-                    ce.avaliacao_analista
-                FROM analises_pc.conc_extrato ce
-                WHERE ce.numero_termo = %s
-                  AND ce.avaliacao_analista ILIKE %s
-                ORDER BY ce.data, ce.indice
-            """, (numero_termo, '%especificar%'))
-            
-            transacoes_especificar = cur.fetchall()
-            print(f"[DEBUG] Card 26 - Transações para especificar categoria: {len(transacoes_especificar)}")
-            
-            if transacoes_especificar:
-                # Buscar modelo de texto do cache (otimizado)
-                modelo_especificar = modelos_cache.get(26)
-                
-                if modelo_especificar:
-                    inconsistencias_identificadas.append({
-                        'id': modelo_especificar['id'],
-                        'nome_item': modelo_especificar['nome_item'],
-                        'modelo_texto': modelo_especificar['modelo_texto'],
-                        'solucao': modelo_especificar['solucao'],
-                        'transacoes': transacoes_especificar,
-                        'ordem': modelo_especificar.get('ordem', 999)
-                    })
-                    print(f"[DEBUG] Card 26 - Inconsistência adicionada")
-        except Exception as e:
-            conn.rollback()  # Resetar transação após erro
-            print(f"[ERRO] Card 26 falhou: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        # ========================================
-        # ADICIONAR MAIS INCONSISTÊNCIAS AQUI NO FUTURO
-        # ========================================
-        
-        # ========================================
-        # AGRUPAR INCONSISTÊNCIAS EM CARDS COMPOSTOS
-        # ========================================
-        print(f"[DEBUG] Total de inconsistências identificadas: {len(inconsistencias_identificadas)}")
-        # Identificar transações que aparecem em múltiplas inconsistências
-        inconsistencias_agrupadas = agrupar_cards_compostos(inconsistencias_identificadas)
-        print(f"[DEBUG] Total após agrupamento: {len(inconsistencias_agrupadas)}")
-        
-        # Verificar quais inconsistências já foram ratificadas e buscar status
-        for inc in inconsistencias_agrupadas:
-            resultado = verificar_ratificacao(cur, numero_termo, inc['nome_item'])
-            inc['ratificada'] = resultado['ratificada']
-            inc['status'] = resultado['status']  # Adicionar status ao retorno
-        
-        # ========================================
-        # ATUALIZAÇÃO AUTOMÁTICA DE STATUS
-        # ========================================
-        # Comparar inconsistências identificadas vs ratificadas
-        # Se uma inconsistência foi ratificada mas não aparece mais na lista atual,
-        # significa que foi corrigida → atualizar status para 'Atendida'
-        
-        nomes_identificados = {inc['nome_item'] for inc in inconsistencias_agrupadas}
-        print(f"[DEBUG] Inconsistências identificadas atualmente: {len(nomes_identificados)}")
-        
-        # Buscar TODAS as inconsistências ratificadas para este termo em todas as tabelas
-        # Tabela 1: lista_inconsistencias (transações individuais)
-        cur.execute("""
-            SELECT DISTINCT nome_item
-            FROM analises_pc.lista_inconsistencias
-            WHERE numero_termo = %s AND status != 'Atendida'
-        """, (numero_termo,))
-        ratificadas_transacoes = {row['nome_item'] for row in cur.fetchall()}
-        
-        # Tabela 2: lista_inconsistencias_agregadas
-        cur.execute("""
-            SELECT DISTINCT nome_item
-            FROM analises_pc.lista_inconsistencias_agregadas
-            WHERE numero_termo = %s AND status != 'Atendida'
-        """, (numero_termo,))
-        ratificadas_agregadas = {row['nome_item'] for row in cur.fetchall()}
-        
-        # Tabela 3: lista_inconsistencias_globais
-        cur.execute("""
-            SELECT DISTINCT nome_item
-            FROM analises_pc.lista_inconsistencias_globais
-            WHERE numero_termo = %s AND status != 'Atendida'
-        """, (numero_termo,))
-        ratificadas_globais = {row['nome_item'] for row in cur.fetchall()}
-        
-        # Combinar todas as ratificações
-        todas_ratificadas = ratificadas_transacoes | ratificadas_agregadas | ratificadas_globais
-        print(f"[DEBUG] Inconsistências ratificadas (não atendidas): {len(todas_ratificadas)}")
-        
-        # Identificar quais foram corrigidas (ratificadas mas não mais identificadas)
-        corrigidas = todas_ratificadas - nomes_identificados
-        
-        if corrigidas:
-            print(f"[DEBUG] Inconsistências corrigidas detectadas: {corrigidas}")
-            
-            # Atualizar status para 'Atendida' em todas as tabelas
-            for nome_item in corrigidas:
-                # Determinar em qual tabela está
-                if nome_item in ratificadas_transacoes:
-                    cur.execute("""
-                        UPDATE analises_pc.lista_inconsistencias
-                        SET status = 'Atendida'
-                        WHERE numero_termo = %s AND nome_item = %s AND status != 'Atendida'
-                    """, (numero_termo, nome_item))
-                    print(f"[DEBUG] ✅ Atualizado em lista_inconsistencias: {nome_item}")
-                
-                if nome_item in ratificadas_agregadas:
-                    cur.execute("""
-                        UPDATE analises_pc.lista_inconsistencias_agregadas
-                        SET status = 'Atendida'
-                        WHERE numero_termo = %s AND nome_item = %s AND status != 'Atendida'
-                    """, (numero_termo, nome_item))
-                    print(f"[DEBUG] ✅ Atualizado em lista_inconsistencias_agregadas: {nome_item}")
-                
-                if nome_item in ratificadas_globais:
-                    cur.execute("""
-                        UPDATE analises_pc.lista_inconsistencias_globais
-                        SET status = 'Atendida'
-                        WHERE numero_termo = %s AND nome_item = %s AND status != 'Atendida'
-                    """, (numero_termo, nome_item))
-                    print(f"[DEBUG] ✅ Atualizado em lista_inconsistencias_globais: {nome_item}")
-            
+        resultados, corrigidas_por_termo = motor_inconsistencias.identificar_inconsistencias_termos(
+            cur, [numero_termo]
+        )
+        inconsistencias = agrupar_cards_compostos(resultados.get(numero_termo, []))
+        print(f"[DEBUG] Total de inconsistências identificadas: {len(inconsistencias)}")
+        
+        # ATUALIZAÇÃO AUTOMÁTICA DE STATUS: ratificadas que não aparecem mais
+        # na lista atual foram corrigidas → status 'Atendida'
+        if corrigidas_por_termo:
+            print(f"[DEBUG] Inconsistências corrigidas detectadas: {corrigidas_por_termo[numero_termo]}")
+            motor_inconsistencias.marcar_atendidas(cur, corrigidas_por_termo)
             conn.commit()
-            print(f"[DEBUG] Status automático atualizado para {len(corrigidas)} inconsistência(s)")
-        else:
-            print("[DEBUG] Nenhuma inconsistência corrigida detectada")
         
         cur.close()
         
-        # Ordenar inconsistências pela coluna 'ordem'
-        inconsistencias_agrupadas.sort(key=lambda x: x.get('ordem', 999))
-        
         print(f"[DEBUG] ===== FIM identificar_inconsistencias - SUCESSO =====")
-        print(f"[DEBUG] Retornando {len(inconsistencias_agrupadas)} inconsistências")
+        print(f"[DEBUG] Retornando {len(inconsistencias)} inconsistências")
         
         return jsonify({
             'sucesso': True,
             'numero_termo': numero_termo,
-            'inconsistencias': inconsistencias_agrupadas
+            'inconsistencias': inconsistencias
         })
     
     except Exception as e:
+        conn.rollback()
         cur.close()
         print(f"[ERRO] identificar_inconsistencias: {str(e)}")
         import traceback
@@ -4325,6 +3014,50 @@ def identificar_inconsistencias(numero_termo):
         return jsonify({'erro': str(e)}), 500
 
 
+@analises_pc_bp.route('/api/identificar-inconsistencias-lote', methods=['POST'])
+@login_required
+@requires_access('analises')
+def identificar_inconsistencias_lote():
+    """
+    Identifica inconsistências de vários termos (carteira) em uma única chamada.
+    Body JSON: {"numeros_termo": ["TFM/001/2023/SMDHC/FUMCAD", ...]}
+    
+    O custo em queries é o mesmo de um único termo; o status 'Atendida' das
+    ratificações corrigidas é atualizado para todos os termos na mesma transação.
+    """
+    dados = request.get_json(silent=True) or {}
+    termos = [str(t).strip() for t in (dados.get('numeros_termo') or []) if str(t).strip()]
+    if not termos:
+        return jsonify({'erro': 'Informe numeros_termo (lista de termos)'}), 400
+    
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    
+    try:
+        resultados, corrigidas_por_termo = motor_inconsistencias.identificar_inconsistencias_termos(cur, termos)
+        if corrigidas_por_termo:
+            motor_inconsistencias.marcar_atendidas(cur, corrigidas_por_termo)
+            conn.commit()
+        cur.close()
+        
+        print(f"[DEBUG] identificar_inconsistencias_lote: {len(resultados)} termos avaliados")
+        return jsonify({
+            'sucesso': True,
+            'total_termos': len(resultados),
+            'resultados': {
+                termo: agrupar_cards_compostos(inconsistencias)
+                for termo, inconsistencias in resultados.items()
+            },
+        })
+    
+    except Exception as e:
+        conn.rollback()
+        cur.close()
+        print(f"[ERRO] identificar_inconsistencias_lote: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'erro': str(e)}), 500
+
+
 @analises_pc_bp.route('/api/ratificar-inconsistencia', methods=['POST'])
 def ratificar_inconsistencia():
     """
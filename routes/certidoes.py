@@ -9,10 +9,11 @@ from utils import login_required
 from decorators import requires_access, requires_write_access
 from werkzeug.utils import secure_filename
 import os
-from datetime import datetime, date
-from PyPDF2 import PdfMerger
+from datetime import datetime
 import io
+import uuid
 import utils_storage as storage
+from core import busca, certidoes_unificadas, jobs
 
 certidoes_bp = Blueprint('certidoes', __name__, url_prefix='/certidoes')
 
@@ -53,9 +54,8 @@ def _listar_pastas_certidoes_existentes(cur=None, nomes_pasta_candidatos=None):
     """
     pastas = set(storage.list_folders('Certidoes'))
     cursor = cur or get_cursor()
-    cursor.execute("""
-        SELECT DISTINCT
-            split_part(REPLACE(certidao_path, chr(92), '/'), '/', 1) AS nome_pasta
+    cursor.execute(f"""
+        SELECT DISTINCT {certidoes_unificadas.coluna_pasta()} AS nome_pasta
         FROM public.certidoes
         WHERE certidao_path IS NOT NULL
           AND certidao_path <> ''
@@ -85,7 +85,7 @@ def index():
     Exibe grid de OSCs com pastas criadas
     """
     import time
-    from datetime import datetime, date
+    from datetime import datetime
     from dateutil.relativedelta import relativedelta
     
     start_total = time.time()
@@ -151,8 +151,9 @@ def index():
     busca_params = []
 
     if filtro_busca:
-        busca_sql = " AND unaccent(LOWER(p.osc)) LIKE unaccent(%s)"
-        busca_params.append(f'%{filtro_busca}%')
+        filtro_sql, filtro_params = busca.filtro('p.osc', filtro_busca)
+        busca_sql = f" AND {filtro_sql}"
+        busca_params.extend(filtro_params)
 
     if filtro_data_parcela:
         data_ref = datetime.strptime(filtro_data_parcela, '%Y-%m-%d').date()
@@ -231,8 +232,9 @@ def index():
     busca_params_celebracao = []
 
     if filtro_busca:
-        busca_sql_celebracao = " AND unaccent(LOWER(osc)) LIKE unaccent(%s)"
-        busca_params_celebracao.append(f'%{filtro_busca}%')
+        filtro_sql, filtro_params = busca.filtro('osc', filtro_busca)
+        busca_sql_celebracao = f" AND {filtro_sql}"
+        busca_params_celebracao.extend(filtro_params)
 
     cur.execute(f"""
         SELECT DISTINCT osc, cnpj
@@ -312,7 +314,6 @@ def gestao_osc(nome_pasta):
     # Buscar dados da OSC
     osc_nome_direto = request.args.get('osc_nome', '').strip()
     nome_busca = nome_pasta.replace('_', ' ').lower()
-    palavras = nome_busca.split()[:3]
     osc_data = None
 
     # Tentativa 0: Usar nome direto do banco (passado via query param pelo front-end)
@@ -335,49 +336,20 @@ def gestao_osc(nome_pasta):
             """, [osc_nome_direto])
             osc_data = cur.fetchone()
 
-    # Tentativa 1: Reconstrução pelo nome da pasta com 3 palavras (fallback)
+    # Tentativa 1: match por secure_filename (cobre @ e outros chars especiais),
+    # sobre a lista de OSCs em memória
     if not osc_data:
-        cur.execute("""
-            SELECT osc, cnpj
-            FROM public.parcerias
-            WHERE unaccent(LOWER(osc)) LIKE unaccent(%s)
-            LIMIT 1
-        """, [f'%{" ".join(palavras)}%'])
-        osc_data = cur.fetchone()
-
-    # Tentativa 2: Nome completo com LIKE inicial
-    if not osc_data:
-        cur.execute("""
-            SELECT osc, cnpj 
-            FROM public.parcerias 
-            WHERE unaccent(LOWER(osc)) LIKE unaccent(%s)
-            ORDER BY LENGTH(osc) ASC
-            LIMIT 1
-        """, [f'{nome_busca}%'])
-        osc_data = cur.fetchone()
-
-    # Tentativa 3: Apenas primeira palavra
-    if not osc_data and palavras:
-        cur.execute("""
-            SELECT osc, cnpj 
-            FROM public.parcerias 
-            WHERE unaccent(LOWER(osc)) LIKE unaccent(%s)
-            ORDER BY LENGTH(osc) ASC
-            LIMIT 1
-        """, [f'{palavras[0]}%'])
-        osc_data = cur.fetchone()
-
-    # Tentativa 4: match por secure_filename (cobre @ e outros chars especiais)
-    if not osc_data:
-        cur.execute("SELECT DISTINCT osc, cnpj FROM public.parcerias")
-        todas_parcerias = cur.fetchall()
         pasta_lower = nome_pasta.lower()
-        for row in todas_parcerias:
+        for row in busca.indice('oscs', cur).itens:
             computed = secure_filename(row['osc'].replace(' ', '_')).lower()
             if computed == pasta_lower:
-                osc_data = row
+                osc_data = dict(row)
                 break
 
+    # Tentativa 2: OSC mais parecida com o nome da pasta (sem acento/caixa, trigramas)
+    if not osc_data:
+        osc_data = busca.melhor(cur, 'oscs', nome_busca, colunas=('cnpj',))
+
     if not osc_data:
         flash(f'OSC não encontrada: {nome_busca}. Verifique se o nome está correto na tabela parcerias.', 'error')
         return redirect(url_for('certidoes.index'))
@@ -1139,229 +1111,33 @@ def excluir_certidao(certidao_id):
 def juntar_pdfs(nome_pasta):
     """
     API: Junta todas as certidões válidas em um único PDF
-    Só permite se todas as 7 certidões obrigatórias estiverem presentes e válidas
+    Só permite se houver ao menos 2 certidões e nenhuma vencida.
+    Pacote inalterado é servido do cache (core.certidoes_unificadas).
     """
     try:
         cur = get_cursor()
-        
-        # Buscar dados da OSC
-        nome_busca = nome_pasta.replace('_', ' ').lower()
-        print(f"[DEBUG PDF] Buscando OSC: {nome_busca}")
-        print(f"[DEBUG PDF] Nome da pasta recebido: {nome_pasta}")
-        
-        osc_data = None
-        certidoes_por_path = None
-        
-        # OPÇÃO 0: Buscar pelo certidao_path normalizado (suporta / e \)
-        # REPLACE(certidao_path, chr(92), '/') converte barras invertidas antes do LIKE
-        print(f"[DEBUG PDF] OPÇÃO 0: Buscando em certidoes pelo path da pasta...")
-        cur.execute("""
-            SELECT DISTINCT osc, cnpj 
-            FROM public.certidoes 
-            WHERE REPLACE(certidao_path, chr(92), '/') LIKE %s
-            LIMIT 1
-        """, [f'{nome_pasta}/%'])
-        
-        osc_data = cur.fetchone()
-        print(f"[DEBUG PDF] OPÇÃO 0 - Resultado: {osc_data is not None}")
-        
-        if osc_data:
-            cur.execute("""
-                SELECT 
-                    certidao_nome,
-                    certidao_path,
-                    certidao_vencimento,
-                    certidao_status
-                FROM public.certidoes
-                WHERE REPLACE(certidao_path, chr(92), '/') LIKE %s
-                ORDER BY 
-                    CASE certidao_nome
-                        WHEN 'CNPJ' THEN 1
-                        WHEN 'CND' THEN 2
-                        WHEN 'CNDT' THEN 3
-                        WHEN 'CRF' THEN 4
-                        WHEN 'CADIN Municipal' THEN 5
-                        WHEN 'CTM' THEN 6
-                        WHEN 'CENTS' THEN 7
-                        ELSE 8
-                    END
-            """, [f'{nome_pasta}/%'])
-            certidoes_por_path = cur.fetchall()
-            print(f"[DEBUG PDF] OPÇÃO 0 - Certidões por path: {len(certidoes_por_path)} - {[c['certidao_nome'] for c in certidoes_por_path]}")
-        
-        # ========================================
-        # OPÇÃO 2: Buscar diretamente na tabela certidoes pelo OSC (fallback)
-        # ========================================
-        if not osc_data:
-            print(f"[DEBUG PDF] OPÇÃO 2: Buscando em certidoes pelo OSC...")
-            
-            palavras_busca = nome_busca.split()
-            
-            cur.execute("""
-                SELECT DISTINCT osc, cnpj 
-                FROM public.certidoes 
-                WHERE LOWER(osc) LIKE %s
-                LIMIT 1
-            """, [f'%{" ".join(palavras_busca)}%'])
-            
-            osc_data = cur.fetchone()
-            print(f"[DEBUG PDF] OPÇÃO 2 - Resultado: {osc_data is not None}")
-        
-        # ========================================
-        # OPÇÃO 1: Se não encontrou, buscar em parcerias (fallback)
-        # ========================================
-        if not osc_data:
-            print(f"[DEBUG PDF] OPÇÃO 1: Buscando em parcerias...")
-            palavras = nome_busca.split()[:3]
-            
-            # Busca 1: primeiras 3 palavras
-            if len(palavras) >= 3:
-                cur.execute("""
-                    SELECT DISTINCT osc, cnpj 
-                    FROM public.parcerias 
-                    WHERE LOWER(osc) LIKE %s
-                    LIMIT 1
-                """, [f'%{" ".join(palavras)}%'])
-                
-                osc_data = cur.fetchone()
-                print(f"[DEBUG PDF] OPÇÃO 1.1 (3 palavras) - Resultado: {osc_data is not None}")
-            
-            # Busca 2: Se não encontrou, tentar com todas as palavras (sem fallback para 1ª palavra)
-            if not osc_data and len(palavras) >= 2:
-                cur.execute("""
-                    SELECT DISTINCT osc, cnpj 
-                    FROM public.parcerias 
-                    WHERE LOWER(osc) LIKE %s AND LOWER(osc) LIKE %s
-                    LIMIT 1
-                """, [f'%{palavras[0]}%', f'%{palavras[-1]}%'])
-                osc_data = cur.fetchone()
-                print(f"[DEBUG PDF] OPÇÃO 1.2 (1ª e última palavra) - Resultado: {osc_data is not None}")
-        
-        # ========================================
-        # OPÇÃO 3: Se não encontrou no banco, tentar ler arquivos físicos da pasta
-        # ========================================
-        if not osc_data:
-            print(f"[DEBUG PDF] OPÇÃO 3: OSC não encontrada no banco. Tentando ler arquivos no storage...")
-            
-            arquivos_pdf = [f for f in storage.list_files(f'Certidoes/{nome_pasta}') if f.lower().endswith('.pdf')]
-            print(f"[DEBUG PDF] OPÇÃO 3 - Arquivos no storage: {arquivos_pdf}")
-            
-            if len(arquivos_pdf) > 0:
-                osc_data = {
-                    'osc': nome_pasta.replace('_', ' ').title(),
-                    'cnpj': 'Não cadastrado'
-                }
-                print(f"[DEBUG PDF] OPÇÃO 3 - Usando storage para OSC: {osc_data['osc']}")
-            else:
-                print(f"[DEBUG PDF] OSC não encontrada no banco e sem arquivos no storage: {nome_busca}")
-                return jsonify({'success': False, 'erro': 'OSC não encontrada no banco de dados e sem arquivos no storage'}), 404
-        
-        print(f"[DEBUG PDF] OSC identificada: {osc_data['osc']}")
-        
-        # Se já temos certidões por path (OPÇÃO 0), usar diretamente
-        if certidoes_por_path is not None:
-            certidoes = certidoes_por_path
-        else:
-            # Buscar todas as certidões da OSC no banco pelo nome da OSC
-            cur.execute("""
-                SELECT 
-                    certidao_nome,
-                    certidao_path,
-                    certidao_vencimento,
-                    certidao_status
-                FROM public.certidoes
-                WHERE osc = %s
-                ORDER BY 
-                    CASE certidao_nome
-                        WHEN 'CNPJ' THEN 1
-                        WHEN 'CND' THEN 2
-                        WHEN 'CNDT' THEN 3
-                        WHEN 'CRF' THEN 4
-                        WHEN 'CADIN Municipal' THEN 5
-                        WHEN 'CTM' THEN 6
-                        WHEN 'CENTS' THEN 7
-                        ELSE 8
-                    END
-            """, [osc_data['osc']])
-            
-            certidoes = cur.fetchall()
-        
-        # Se não encontrou no banco, usar arquivos físicos
-        if len(certidoes) == 0:
-            print(f"[DEBUG PDF] Nenhuma certidão no banco. Usando arquivos do storage...")
-            arquivos_pdf = sorted([f for f in storage.list_files(f'Certidoes/{nome_pasta}') if f.lower().endswith('.pdf')])
-            
-            certidoes = []
-            for arquivo in arquivos_pdf:
-                certidoes.append({
-                    'certidao_nome': arquivo.replace('.pdf', '').replace('_', ' '),
-                    'certidao_path': f'{nome_pasta}/{arquivo}',
-                    'certidao_vencimento': None,  # Sem validação de vencimento
-                    'certidao_status': 'física'
-                })
-            
-            print(f"[DEBUG PDF] Arquivos do storage carregados: {len(certidoes)} - {[c['certidao_nome'] for c in certidoes]}")
-        else:
-            print(f"[DEBUG PDF] Certidões encontradas no banco: {len(certidoes)} - {[c['certidao_nome'] for c in certidoes]}")
-        
-        # Validar se tem pelo menos 2 certidões
-        if len(certidoes) < 2:
-            return jsonify({
-                'success': False, 
-                'erro': f'Apenas {len(certidoes)} certidão cadastrada. É necessário ter pelo menos 2 certidões para gerar o PDF unificado.'
-            }), 400
-        
-        # Validar se todas estão válidas (não vencidas) - apenas para certidões cadastradas
-        hoje = date.today()
-        certidoes_vencidas = []
-        
-        for cert in certidoes:
-            # Pular validação se for arquivo físico sem data de vencimento
-            if cert['certidao_vencimento'] is not None and cert['certidao_vencimento'] < hoje:
-                certidoes_vencidas.append(cert['certidao_nome'])
-        
-        if certidoes_vencidas:
-            return jsonify({
-                'success': False,
-                'erro': f'Existem certidões vencidas: {", ".join(certidoes_vencidas)}. Atualize-as antes de gerar o PDF unificado.'
-            }), 400
-        
-        # Juntar PDFs
-        merger = PdfMerger()
-        
-        for cert in certidoes:
-            try:
-                cert_bytes = storage.download_file(f"Certidoes/{cert['certidao_path']}")
-            except FileNotFoundError:
-                return jsonify({
-                    'success': False,
-                    'erro': f'Arquivo não encontrado: {cert["certidao_nome"]}'
-                }), 404
-            
-            try:
-                merger.append(io.BytesIO(cert_bytes))
-            except Exception as e:
-                return jsonify({
-                    'success': False,
-                    'erro': f'Erro ao processar {cert["certidao_nome"]}: {str(e)}. Certifique-se de que é um PDF válido.'
-                }), 400
-        
-        # Criar PDF em memória
-        output = io.BytesIO()
-        merger.write(output)
-        merger.close()
-        output.seek(0)
-        
+        osc_data, certidoes = certidoes_unificadas.certidoes_da_pasta(cur, nome_pasta)
+        print(f"[DEBUG PDF] OSC identificada: {osc_data['osc']} - "
+              f"{len(certidoes)} certidões: {[c['certidao_nome'] for c in certidoes]}")
+
+        certidoes_unificadas.validar(certidoes)
+        caminho_pdf = certidoes_unificadas.juntar(certidoes)
+
         # Nome do arquivo unificado
         nome_arquivo = f"Certidoes_{nome_pasta}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        
-        return send_file(
-            output,
+
+        resposta = send_file(
+            caminho_pdf,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=nome_arquivo
+            download_name=nome_arquivo,
+            max_age=0
         )
-        
+        resposta.call_on_close(lambda: certidoes_unificadas.descartar(caminho_pdf))
+        return resposta
+
+    except certidoes_unificadas.ErroCertidoes as e:
+        return jsonify({'success': False, 'erro': str(e)}), e.status
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1386,51 +1162,113 @@ def juntar_pdfs_selecionados():
             return jsonify({'success': False, 'erro': 'Nenhuma certidão selecionada.'}), 400
 
         cur = get_cursor()
-        placeholders = ','.join(['%s'] * len(ids))
         cur.execute(f"""
             SELECT certidao_nome, certidao_path, certidao_vencimento
             FROM public.certidoes
-            WHERE id IN ({placeholders})
-            ORDER BY
-                CASE certidao_nome
-                    WHEN 'CNPJ' THEN 1
-                    WHEN 'CND' THEN 2
-                    WHEN 'CNDT' THEN 3
-                    WHEN 'CRF' THEN 4
-                    WHEN 'CADIN Municipal' THEN 5
-                    WHEN 'CTM' THEN 6
-                    WHEN 'CENTS' THEN 7
-                    ELSE 8
-                END
-        """, ids)
+            WHERE id = ANY(%s)
+            ORDER BY {certidoes_unificadas.ORDEM_CERTIDOES_SQL}
+        """, [[int(i) for i in ids]])
         certidoes = cur.fetchall()
 
         if not certidoes:
             return jsonify({'success': False, 'erro': 'Nenhuma certidão encontrada para os IDs fornecidos.'}), 404
 
-        merger = PdfMerger()
-        for cert in certidoes:
-            try:
-                cert_bytes = storage.download_file(f"Certidoes/{cert['certidao_path']}")
-            except FileNotFoundError:
-                return jsonify({'success': False, 'erro': f'Arquivo não encontrado: {cert["certidao_nome"]}'}), 404
-            try:
-                merger.append(io.BytesIO(cert_bytes))
-            except Exception as e:
-                return jsonify({'success': False, 'erro': f'Erro ao processar {cert["certidao_nome"]}: {str(e)}'}), 400
-
-        output = io.BytesIO()
-        merger.write(output)
-        merger.close()
-        output.seek(0)
+        caminho_pdf = certidoes_unificadas.juntar(certidoes)
 
         nome_arquivo = f"Certidoes_{nome_pasta}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        return send_file(output, mimetype='application/pdf', as_attachment=True, download_name=nome_arquivo)
+        resposta = send_file(caminho_pdf, mimetype='application/pdf', as_attachment=True,
+                             download_name=nome_arquivo, max_age=0)
+        resposta.call_on_close(lambda: certidoes_unificadas.descartar(caminho_pdf))
+        return resposta
 
+    except certidoes_unificadas.ErroCertidoes as e:
+        return jsonify({'success': False, 'erro': str(e)}), e.status
     except Exception as e:
         return jsonify({'success': False, 'erro': f'Erro ao juntar PDFs: {str(e)}'}), 500
 
 
+# ── PDF unificado em lote (tarefa em background) ─────────────────────────────
+
+@certidoes_bp.route("/api/juntar-pdfs-lote", methods=["POST"])
+@login_required
+@requires_access('certidoes')
+def juntar_pdfs_lote():
+    """
+    API: Gera o PDF unificado de várias OSCs num ZIP, em background.
+    Recebe JSON: { "pastas": ["OSC_A", "OSC_B", ...] }
+    Retorna task_id; acompanhar em GET /api/juntar-pdfs-lote/<task_id>.
+    """
+    data = request.get_json(silent=True) or {}
+    pastas = [p for p in dict.fromkeys(data.get('pastas') or []) if isinstance(p, str) and p.strip()]
+    if not pastas:
+        return jsonify({'success': False, 'erro': 'Nenhuma pasta informada.'}), 400
+
+    task_id = jobs.criar('certidoes_lote', usuario=session.get('email'),
+                         label=f'{len(pastas)} OSC(s) na fila...')
+    jobs.iniciar(task_id, _executar_lote, task_id, pastas)
+    return jsonify({'success': True, 'task_id': task_id}), 202
+
+
+def _executar_lote(task_id, pastas):
+    from psycopg2.extras import RealDictCursor
+    from db import pooled_connection
+
+    def _progresso(feitas, total, nome_pasta):
+        jobs.atualizar(task_id, pct=round(feitas / total * 100),
+                       label=f'OSC {feitas + 1}/{total}: {nome_pasta}')
+
+    with pooled_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            resultado = certidoes_unificadas.gerar_lote(
+                cur, pastas, certidoes_unificadas.caminho_lote(task_id), progresso=_progresso
+            )
+        conn.rollback()
+    print(f"[CERTIDOES LOTE] [{task_id[:8]}] {resultado['gerados']}/{len(pastas)} PDFs gerados")
+    return resultado
+
+
+def _tarefa_lote(task_id):
+    """Tarefa de lote de certidões do usuário da sessão, ou None."""
+    tarefa = jobs.obter(task_id)
+    if not tarefa or tarefa['tipo'] != 'certidoes_lote':
+        return None
+    if tarefa['usuario'] != session.get('email'):
+        return None
+    return tarefa
+
+
+@certidoes_bp.route("/api/juntar-pdfs-lote/<task_id>", methods=["GET"])
+@login_required
+@requires_access('certidoes')
+def status_juntar_pdfs_lote(task_id):
+    """API: Estado da tarefa de lote (status, pct, resultado com erros por OSC)."""
+    tarefa = _tarefa_lote(task_id)
+    if not tarefa:
+        return jsonify({'success': False, 'erro': 'Tarefa não encontrada ou expirada'}), 404
+    return jsonify(tarefa)
+
+
+@certidoes_bp.route("/api/juntar-pdfs-lote/<task_id>/download", methods=["GET"])
+@login_required
+@requires_access('certidoes')
+def download_juntar_pdfs_lote(task_id):
+    """Download do ZIP gerado pela tarefa de lote."""
+    try:
+        task_id = str(uuid.UUID(task_id))
+    except ValueError:
+        return jsonify({'success': False, 'erro': 'Tarefa inválida'}), 400
+    if not _tarefa_lote(task_id):
+        return jsonify({'success': False, 'erro': 'Tarefa não encontrada ou expirada'}), 404
+
+    caminho = certidoes_unificadas.caminho_lote(task_id)
+    if not os.path.isfile(caminho):
+        return jsonify({'success': False, 'erro': 'Arquivo do lote não encontrado ou ainda em geração'}), 404
+
+    nome_arquivo = f"Certidoes_lote_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return send_file(caminho, mimetype='application/zip', as_attachment=True,
+                     download_name=nome_arquivo, max_age=0)
+
+
 @certidoes_bp.route("/api/debug/oscs", methods=["GET"])
 @login_required
 @requires_access('certidoes')
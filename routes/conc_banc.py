@@ -9,10 +9,10 @@ from functools import wraps
 from datetime import datetime, date
 from decorators import requires_access, requires_write_access
 from routes.conc_termo_permissions import ensure_can_edit_termo, get_termo_permission
+from core import conciliacao_relatorio
 import os
 import uuid
-import boto3
-from botocore.client import Config
+import utils_storage as storage
 from werkzeug.utils import secure_filename
 
 bp = Blueprint('conc_banc', __name__, url_prefix='/conc_banc')
@@ -61,6 +61,237 @@ def _request_numero_termo():
         or ''
     ).strip()
 
+# Colunas gravadas pelo save do extrato, na ordem usada pelos INSERT/UPDATE,
+# com o tipo SQL de destino (usado para validar o staging antes do apply).
+_EXTRATO_COLUNAS = [
+    ('indice', 'integer'),
+    ('data', 'date'),
+    ('credito', 'numeric(18,2)'),
+    ('debito', 'numeric(18,2)'),
+    ('discriminacao', 'numeric(18,2)'),
+    ('cat_transacao', 'text'),
+    ('competencia', 'date'),
+    ('origem_destino', 'text'),
+    ('cat_avaliacao', 'varchar(30)'),
+    ('avaliacao_analista', 'text'),
+    ('mesclado_com', 'integer[]'),
+]
+
+
+def _valores_linha_extrato(linha):
+    """Normaliza os campos de uma linha do extrato (vazio -> None)."""
+    return (
+        linha.get('indice'), linha.get('data') or None,
+        linha.get('credito') or None, linha.get('debito') or None,
+        linha.get('discriminacao') or None, linha.get('cat_transacao') or None,
+        linha.get('competencia') or None, linha.get('origem_destino') or None,
+        linha.get('cat_avaliacao') or None, linha.get('avaliacao_analista') or None,
+        linha.get('mesclado_com') or None,
+    )
+
+
+def _texto_staging(valor):
+    """Converte um valor do JSON para o texto gravado na tabela de staging."""
+    if valor is None:
+        return None
+    if isinstance(valor, (list, tuple)):
+        return '{' + ','.join('NULL' if v is None else str(v) for v in valor) + '}'
+    return str(valor)
+
+
+def _upsert_extrato_bulk(cur, numero_termo, linhas):
+    """
+    Salva as linhas do extrato de forma set-based, em número fixo de round trips.
+
+    1. Validação semântica em Python (crédito + débito na mesma linha)
+    2. Staging de todas as linhas em tabela temporária via execute_values
+    3. Validação de tipos no staging com pg_input_is_valid (erro por linha)
+    4. UPDATE ... FROM staging e INSERT ... SELECT staging RETURNING id
+
+    Qualquer erro de banco no apply propaga para o chamador, que reverte o
+    savepoint e refaz o save linha a linha.
+
+    Returns:
+        tuple: (ids_processados, ids_inseridos, ids_inseridos_map, erros_linhas)
+    """
+    from psycopg2.extras import execute_values
+
+    erros_linhas = []
+    staging = []
+    for ordem, linha in enumerate(linhas):
+        if not linha.get('indice'):
+            continue
+        if linha.get('credito') and linha.get('debito'):
+            erros_linhas.append({
+                'indice': linha.get('indice'),
+                'id': linha.get('id'),
+                'mensagem': 'Linha com crédito e débito ao mesmo tempo'
+            })
+            continue
+        staging.append(
+            (ordem, _texto_staging(linha.get('id') or None))
+            + tuple(_texto_staging(v) for v in _valores_linha_extrato(linha))
+        )
+
+    if not staging:
+        return [], [], [], erros_linhas
+
+    colunas = [nome for nome, _ in _EXTRATO_COLUNAS]
+    cur.execute(f"""
+        CREATE TEMP TABLE _stg_conc_extrato (
+            ordem integer PRIMARY KEY,
+            id text,
+            {', '.join(f'{nome} text' for nome in colunas)}
+        ) ON COMMIT DROP
+    """)
+    execute_values(
+        cur,
+        f"INSERT INTO _stg_conc_extrato (ordem, id, {', '.join(colunas)}) VALUES %s",
+        staging,
+        page_size=len(staging)
+    )
+
+    # Validação de tipos: linhas inválidas saem do staging e viram erro por linha
+    checagens = ["CASE WHEN s.id IS NOT NULL AND NOT pg_input_is_valid(s.id, 'integer') THEN 'id' END"]
+    checagens += [
+        f"CASE WHEN s.{nome} IS NOT NULL AND NOT pg_input_is_valid(s.{nome}, '{tipo}') THEN '{nome}' END"
+        for nome, tipo in _EXTRATO_COLUNAS if tipo != 'text'
+    ]
+    cur.execute(f"""
+        WITH invalidas AS (
+            SELECT s.ordem, ARRAY_REMOVE(ARRAY[{', '.join(checagens)}], NULL) AS colunas
+            FROM _stg_conc_extrato s
+        )
+        DELETE FROM _stg_conc_extrato s
+        USING invalidas i
+        WHERE s.ordem = i.ordem AND CARDINALITY(i.colunas) > 0
+        RETURNING s.ordem, i.colunas
+    """)
+    ordens_invalidas = set()
+    for row in sorted(cur.fetchall(), key=lambda r: r['ordem']):
+        ordens_invalidas.add(row['ordem'])
+        linha = linhas[row['ordem']]
+        erros_linhas.append({
+            'indice': linha.get('indice'),
+            'id': linha.get('id'),
+            'mensagem': f"Valor inválido em: {', '.join(row['colunas'])}"
+        })
+
+    conversoes = ', '.join(f's.{nome}::{tipo}' for nome, tipo in _EXTRATO_COLUNAS)
+    processados = []
+
+    cur.execute(f"""
+        UPDATE analises_pc.conc_extrato AS e SET
+            {', '.join(f'{nome} = s.{nome}::{tipo}' for nome, tipo in _EXTRATO_COLUNAS)}
+        FROM _stg_conc_extrato s
+        WHERE s.id IS NOT NULL
+          AND e.id = s.id::integer
+          AND e.numero_termo = %s
+        RETURNING e.id, s.ordem
+    """, (numero_termo,))
+    processados.extend((row['ordem'], row['id']) for row in cur.fetchall())
+
+    # IDs seriais saem em ordem crescente seguindo o ORDER BY do SELECT,
+    # então o i-ésimo id gerado corresponde à i-ésima linha nova do staging.
+    cur.execute(f"""
+        INSERT INTO analises_pc.conc_extrato ({', '.join(colunas)}, numero_termo)
+        SELECT {conversoes}, %s
+        FROM _stg_conc_extrato s
+        WHERE s.id IS NULL
+        ORDER BY s.ordem
+        RETURNING id
+    """, (numero_termo,))
+    novos_ids = sorted(row['id'] for row in cur.fetchall())
+    ordens_novas = [
+        ordem for ordem, linha_id, *_ in staging
+        if linha_id is None and ordem not in ordens_invalidas
+    ]
+
+    ids_inseridos_map = []
+    for ordem, novo_id in zip(ordens_novas, novos_ids):
+        processados.append((ordem, novo_id))
+        ids_inseridos_map.append({'indice': linhas[ordem].get('indice'), 'id': novo_id})
+
+    ids_processados = [linha_id for _, linha_id in sorted(processados)]
+    ids_inseridos = [item['id'] for item in ids_inseridos_map]
+    return ids_processados, ids_inseridos, ids_inseridos_map, erros_linhas
+
+
+def _upsert_extrato_linha_a_linha(cur, numero_termo, linhas):
+    """
+    Salva as linhas do extrato uma a uma, com savepoint por linha.
+
+    Caminho de fallback do save em lote: isola o erro de banco na linha que o
+    causou, sem cancelar as demais.
+
+    Returns:
+        tuple: (ids_processados, ids_inseridos, ids_inseridos_map, erros_linhas)
+    """
+    ids_processados = []
+    ids_inseridos = []   # apenas INSERTs
+    ids_inseridos_map = []
+    erros_linhas = []    # linhas que falharam: [{indice, id, mensagem}]
+
+    for i, linha in enumerate(linhas):
+        if not linha.get('indice'):
+            continue
+
+        linha_id = linha.get('id')
+        valores = _valores_linha_extrato(linha)
+        sp = f'sp_{i}'
+
+        cur.execute(f'SAVEPOINT {sp}')
+        try:
+            # Validação semântica (antes de ir ao banco)
+            if linha.get('credito') and linha.get('debito'):
+                raise ValueError('Linha com crédito e débito ao mesmo tempo')
+
+            if linha_id:
+                cur.execute("""
+                    UPDATE analises_pc.conc_extrato SET
+                        indice = %s, data = %s, credito = %s, debito = %s,
+                        discriminacao = %s, cat_transacao = %s, competencia = %s,
+                        origem_destino = %s, cat_avaliacao = %s,
+                        avaliacao_analista = %s, mesclado_com = %s
+                    WHERE id = %s AND numero_termo = %s
+                    RETURNING id
+                """, valores + (linha_id, numero_termo))
+                result = cur.fetchone()
+                if result:
+                    ids_processados.append(result['id'])
+            else:
+                cur.execute("""
+                    INSERT INTO analises_pc.conc_extrato (
+                        indice, data, credito, debito, discriminacao,
+                        cat_transacao, competencia, origem_destino,
+                        cat_avaliacao, avaliacao_analista, mesclado_com, numero_termo
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                """, valores + (numero_termo,))
+                novo_id = cur.fetchone()['id']
+                ids_processados.append(novo_id)
+                ids_inseridos.append(novo_id)
+                ids_inseridos_map.append({
+                    'indice': linha.get('indice'),
+                    'id': novo_id
+                })
+
+            cur.execute(f'RELEASE SAVEPOINT {sp}')
+
+        except DatabaseUnavailable:
+            raise
+        except Exception as linha_err:
+            cur.execute(f'ROLLBACK TO SAVEPOINT {sp}')
+            erros_linhas.append({
+                'indice': linha.get('indice'),
+                'id': linha_id,
+                'mensagem': str(linha_err)
+            })
+            print(f'[SAVE] Linha {linha.get("indice")} falhou (savepoint revertido): {linha_err}')
+
+    return ids_processados, ids_inseridos, ids_inseridos_map, erros_linhas
+
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -246,84 +477,22 @@ def api_salvar_extrato():
                 cur.execute("DELETE FROM analises_pc.conc_extrato WHERE numero_termo = %s", (numero_termo,))
         timings['delete_ausentes_ms'] = (time.time() - t_delete) * 1000
 
-        # UPSERT com savepoints: cada linha é isolada — erro em 1 não cancela as demais
+        # UPSERT em lote (staging + UPDATE/INSERT set-based). Se o apply falhar
+        # no banco, reverte o lote e refaz linha a linha para isolar o erro.
         t_upsert = time.time()
-        ids_processados = []
-        ids_inseridos = []   # apenas INSERTs
-        ids_inseridos_map = []
-        erros_linhas = []    # linhas que falharam: [{indice, id, mensagem}]
-
-        for i, linha in enumerate(linhas):
-            if not linha.get('indice'):
-                continue
-
-            credito = linha.get('credito')
-            debito  = linha.get('debito')
-            linha_id = linha.get('id')
-            sp = f'sp_{i}'
-
-            cur.execute(f'SAVEPOINT {sp}')
-            try:
-                # Validação semântica (antes de ir ao banco)
-                if credito and debito:
-                    raise ValueError('Linha com crédito e débito ao mesmo tempo')
-
-                if linha_id:
-                    cur.execute("""
-                        UPDATE analises_pc.conc_extrato SET
-                            indice = %s, data = %s, credito = %s, debito = %s,
-                            discriminacao = %s, cat_transacao = %s, competencia = %s,
-                            origem_destino = %s, cat_avaliacao = %s,
-                            avaliacao_analista = %s, mesclado_com = %s
-                        WHERE id = %s AND numero_termo = %s
-                        RETURNING id
-                    """, (
-                        linha.get('indice'), linha.get('data') or None,
-                        credito or None, debito or None,
-                        linha.get('discriminacao') or None, linha.get('cat_transacao') or None,
-                        linha.get('competencia') or None, linha.get('origem_destino') or None,
-                        linha.get('cat_avaliacao') or None, linha.get('avaliacao_analista') or None,
-                        linha.get('mesclado_com') or None, linha_id, numero_termo
-                    ))
-                    result = cur.fetchone()
-                    if result:
-                        ids_processados.append(result['id'])
-                else:
-                    cur.execute("""
-                        INSERT INTO analises_pc.conc_extrato (
-                            indice, data, credito, debito, discriminacao,
-                            cat_transacao, competencia, origem_destino,
-                            cat_avaliacao, avaliacao_analista, mesclado_com, numero_termo
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                    """, (
-                        linha.get('indice'), linha.get('data') or None,
-                        credito or None, debito or None,
-                        linha.get('discriminacao') or None, linha.get('cat_transacao') or None,
-                        linha.get('competencia') or None, linha.get('origem_destino') or None,
-                        linha.get('cat_avaliacao') or None, linha.get('avaliacao_analista') or None,
-                        linha.get('mesclado_com') or None, numero_termo
-                    ))
-                    novo_id = cur.fetchone()['id']
-                    ids_processados.append(novo_id)
-                    ids_inseridos.append(novo_id)
-                    ids_inseridos_map.append({
-                        'indice': linha.get('indice'),
-                        'id': novo_id
-                    })
-
-                cur.execute(f'RELEASE SAVEPOINT {sp}')
-
-            except DatabaseUnavailable:
-                raise
-            except Exception as linha_err:
-                cur.execute(f'ROLLBACK TO SAVEPOINT {sp}')
-                erros_linhas.append({
-                    'indice': linha.get('indice'),
-                    'id': linha_id,
-                    'mensagem': str(linha_err)
-                })
-                print(f'[SAVE] Linha {linha.get("indice")} falhou (savepoint revertido): {linha_err}')
+        cur.execute('SAVEPOINT sp_extrato_bulk')
+        try:
+            resultado_upsert = _upsert_extrato_bulk(cur, numero_termo, linhas)
+            cur.execute('RELEASE SAVEPOINT sp_extrato_bulk')
+            modo_upsert = 'bulk'
+        except DatabaseUnavailable:
+            raise
+        except Exception as bulk_err:
+            cur.execute('ROLLBACK TO SAVEPOINT sp_extrato_bulk')
+            print(f'[SAVE] Save em lote falhou, refazendo linha a linha: {bulk_err}')
+            resultado_upsert = _upsert_extrato_linha_a_linha(cur, numero_termo, linhas)
+            modo_upsert = 'linha_a_linha'
+        ids_processados, ids_inseridos, ids_inseridos_map, erros_linhas = resultado_upsert
 
         timings['upsert_linhas_ms'] = (time.time() - t_upsert) * 1000
         t_auto = time.time()
@@ -486,6 +655,7 @@ def api_salvar_extrato():
         t_commit = time.time()
         db.commit()
         timings['commit_ms'] = (time.time() - t_commit) * 1000
+        conciliacao_relatorio.invalidar(numero_termo, 'analises_pc.conc_extrato')
 
         tempo_total = (time.time() - inicio) * 1000
         timings['total_ms'] = tempo_total
@@ -494,7 +664,7 @@ def api_salvar_extrato():
             f"Permissao: {timings['permissao_ms']:.2f}ms | "
             f"Lock wait: {timings['lock_wait_ms']:.2f}ms | "
             f"Delete: {timings['delete_ausentes_ms']:.2f}ms | "
-            f"Upsert: {timings['upsert_linhas_ms']:.2f}ms | "
+            f"Upsert ({modo_upsert}): {timings['upsert_linhas_ms']:.2f}ms | "
             f"Automacoes: {timings['automacoes_ms']:.2f}ms | "
             f"Commit: {timings['commit_ms']:.2f}ms"
         )
@@ -544,6 +714,7 @@ def api_excluir_extrato(extrato_id):
             db.rollback()
             return jsonify({'erro': 'Linha nao encontrada neste termo'}), 404
         db.commit()
+        conciliacao_relatorio.invalidar(numero_termo, 'analises_pc.conc_extrato')
 
         return jsonify({'mensagem': 'Linha excluída com sucesso'}), 200
 
@@ -592,6 +763,7 @@ def api_excluir_extrato_bulk():
         )
         deletados = cur.rowcount
         db.commit()
+        conciliacao_relatorio.invalidar(numero_termo, 'analises_pc.conc_extrato')
 
         print(f"[BULK DELETE] {deletados} linhas excluídas: {ids_int}")
         return jsonify({'mensagem': f'{deletados} linhas excluídas com sucesso', 'deletados': deletados}), 200
@@ -1399,6 +1571,12 @@ def api_limpar_termo():
         cur.execute("DELETE FROM analises_pc.conc_extrato WHERE numero_termo = %s", (numero_termo,))
 
         db.commit()
+        conciliacao_relatorio.invalidar(
+            numero_termo,
+            'analises_pc.conc_extrato',
+            'analises_pc.conc_rendimentos',
+            'analises_pc.conc_contrapartida',
+        )
 
         print(f"[LIMPAR TERMO] Termo: {numero_termo}")
         print(f"  - Extrato: {total_extrato} registros deletados")
@@ -1777,17 +1955,14 @@ _R2_PRESTACAO_PUBLIC_BASE = 'https://pub-1fa0a2c3969349d89c2adfd82134cf95.r2.dev
 
 
 def _r2_prestacao_client():
-    """Cria cliente boto3 para o bucket prestacao-bucket no Cloudflare R2."""
-    return boto3.client(
-        's3',
-        endpoint_url=os.environ.get(
+    """Cliente boto3 (compartilhado) para o bucket prestacao-bucket no Cloudflare R2."""
+    return storage.s3_client(
+        os.environ.get(
             'R2_PRESTACAO_ENDPOINT',
             'https://1229204919913a51f4090b769f8f0548.r2.cloudflarestorage.com'
         ),
-        aws_access_key_id=os.environ.get('R2_PRESTACAO_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.environ.get('R2_PRESTACAO_SECRET_ACCESS_KEY'),
-        config=Config(signature_version='s3v4'),
-        region_name='auto',
+        os.environ.get('R2_PRESTACAO_ACCESS_KEY_ID'),
+        os.environ.get('R2_PRESTACAO_SECRET_ACCESS_KEY'),
     )
 
 
@@ -5,8 +5,8 @@ cada página (ou bloco coerente) por tipo de documento.
 Arquitetura de concorrência
 ───────────────────────────
 • Triagem de PDF     → SSE streaming  (só leitura de PDF, rápido, sem API externa)
-• Classificação IA   → background thread + polling
-• Dividir+Classificar→ background thread + polling
+• Classificação IA   → tarefa em background (core.jobs) + polling
+• Dividir+Classificar→ tarefa em background (core.jobs) + polling
 
 O padrão de polling evita ERR_CONNECTION_RESET do Werkzeug dev-server no Windows,
 que ocorre quando a resposta fica muito tempo sem enviar bytes (DeepSeek leva 60-120 s).
@@ -17,71 +17,32 @@ import os
 import json
 import time as _time
 import traceback as _tb
-import uuid
 import zipfile
-import threading
 import requests
-import pdfplumber
 from flask import Blueprint, request, jsonify, session, send_file, Response, stream_with_context
 from functools import wraps
 from decorators import requires_access
+from core import jobs, ocr
 from PyPDF2 import PdfReader, PdfWriter
 
-# ── OCR opcional ──────────────────────────────────────────────────────────────
-try:
-    import pytesseract
-    from pdf2image import convert_from_bytes
-
-    _tesseract_cmd = os.environ.get('TESSERACT_CMD', '')
-    if _tesseract_cmd:
-        pytesseract.pytesseract.tesseract_cmd = _tesseract_cmd
-
-    _POPPLER_PATH = os.environ.get('POPPLER_PATH', '') or None
-    _OCR_DISPONIVEL = True
-except ImportError:
-    _OCR_DISPONIVEL = False
-    _POPPLER_PATH   = None
-
 bp = Blueprint('conc_classificacao', __name__, url_prefix='/conc_banc')
 
 _DEEPSEEK_URL    = 'https://api.deepseek.com/v1/chat/completions'
 _DEEPSEEK_MODEL  = 'deepseek-chat'
-_MIN_CHARS_PAGINA = 50
+_MIN_CHARS_PAGINA = ocr.MIN_CHARS_PAGINA
 _MAX_CHARS_PROMPT = 120_000
 _MAX_PAGINAS_DIRETO = 80   # acima disso, sugere usar Triagem para dividir primeiro
 
-# ── Armazenamento de tarefas em memória ──────────────────────────────────────
-# Formato: {task_id: {status, pct, label, resultado, erro, criada_em}}
-_tarefas: dict = {}
-_tarefas_lock   = threading.Lock()
-_TAREFA_TTL_S   = 1800   # 30 min — limpa tarefas antigas
-
+# ── Tarefas em background ────────────────────────────────────────────────────
+# Estado persistido em public.tarefas_background (core.jobs): o polling pode
+# cair em qualquer worker do gunicorn.
 
 def _nova_tarefa() -> str:
-    tid = str(uuid.uuid4())
-    with _tarefas_lock:
-        # Limpa tarefas velhas ao criar uma nova (evita vazamento de memória)
-        agora = _time.time()
-        expiradas = [k for k, v in _tarefas.items()
-                     if agora - v.get('criada_em', agora) > _TAREFA_TTL_S]
-        for k in expiradas:
-            del _tarefas[k]
-
-        _tarefas[tid] = {
-            'status':    'running',
-            'pct':       0,
-            'label':     'Iniciando...',
-            'resultado': None,
-            'erro':      None,
-            'criada_em': agora,
-        }
-    return tid
+    return jobs.criar('classificacao_processual', usuario=session.get('email'),
+                      label='Iniciando...')
 
 
-def _atualizar(tid: str, **kwargs):
-    with _tarefas_lock:
-        if tid in _tarefas:
-            _tarefas[tid].update(kwargs)
+_atualizar = jobs.atualizar
 
 
 # ── Autenticação ──────────────────────────────────────────────────────────────
@@ -95,34 +56,6 @@ def login_required(f):
     return decorated_function
 
 
-# ── Extração de texto ─────────────────────────────────────────────────────────
-
-def _extrair_texto_pagina(pagina_plumber, pagina_bytes=None, num_pagina=0):
-    """pdfplumber primeiro; pytesseract/pdf2image como fallback."""
-    texto = (pagina_plumber.extract_text() or '').strip()
-    if len(texto) >= _MIN_CHARS_PAGINA:
-        return texto
-
-    if _OCR_DISPONIVEL and pagina_bytes:
-        try:
-            imagens = convert_from_bytes(
-                pagina_bytes,
-                first_page=num_pagina,
-                last_page=num_pagina,
-                dpi=200,
-                poppler_path=_POPPLER_PATH,
-            )
-            if imagens:
-                langs_disp = pytesseract.get_languages()
-                lang = 'por+eng' if 'por' in langs_disp else 'eng'
-                ocr_texto = pytesseract.image_to_string(imagens[0], lang=lang).strip()
-                return ocr_texto or texto
-        except Exception as ocr_err:
-            print(f'[CLASSIF OCR] Falha pág {num_pagina}: {ocr_err}')
-
-    return texto
-
-
 # ── Triagem (detecção de quebras sem IA) ─────────────────────────────────────
 
 _PALAVRAS_CABECALHO = [
@@ -254,8 +187,7 @@ def _criar_subpdf(reader, inicio_0, fim_0):
 @login_required
 def api_task_status(task_id):
     """Retorna o estado atual de uma tarefa de classificação."""
-    with _tarefas_lock:
-        tarefa = _tarefas.get(task_id)
+    tarefa = jobs.obter(task_id)
     if not tarefa:
         return jsonify({'erro': 'Tarefa não encontrada ou expirada'}), 404
     return jsonify(tarefa)
@@ -314,18 +246,14 @@ def api_classificacao_processual():
                     erros.append({'arquivo': nome, 'mensagem': 'Arquivo vazio'})
                     continue
 
-                # Extração página a página
-                paginas = []
-                with pdfplumber.open(io.BytesIO(conteudo)) as pdf:
-                    total_pags = len(pdf.pages)
-                    print(f'[CLASSIF] [{tid[:8]}] PDF aberto: {total_pags} págs')
-                    for i, pg in enumerate(pdf.pages, start=1):
-                        texto = _extrair_texto_pagina(pg, conteudo, i)
-                        paginas.append({'pagina': i, 'texto': texto})
-                        pct   = pct_base + round((i / total_pags) * (50 / n))
-                        label = (f'Extraindo pág {i}/{total_pags} — {nome}'
-                                 if n == 1 else f'Arquivo {idx}/{n} · pág {i}/{total_pags}')
-                        _atualizar(tid, pct=pct, label=label)
+                # Extração: camada de texto + OCR paralelo das páginas escaneadas
+                def _progresso(feitas, total_pags):
+                    pct   = pct_base + round((feitas / total_pags) * (50 / n))
+                    label = (f'Extraindo pág {feitas}/{total_pags} — {nome}'
+                             if n == 1 else f'Arquivo {idx}/{n} · pág {feitas}/{total_pags}')
+                    _atualizar(tid, pct=pct, label=label)
+
+                paginas = ocr.extrair_paginas(conteudo, progresso=_progresso)
 
                 chars_total = sum(len(p['texto']) for p in paginas)
                 print(f'[CLASSIF] [{tid[:8]}] Extração: {len(paginas)} págs, {chars_total} chars')
@@ -350,7 +278,7 @@ def api_classificacao_processual():
                     'arquivo':       nome,
                     'total_paginas': len(paginas),
                     'itens':         itens,
-                    'ocr_usado':     (_OCR_DISPONIVEL and
+                    'ocr_usado':     (ocr.OCR_DISPONIVEL and
                                       chars_total < (_MIN_CHARS_PAGINA * len(paginas))),
                 })
 
@@ -366,12 +294,12 @@ def api_classificacao_processual():
         resultado_final = {
             'resultados':    resultados,
             'erros':         erros,
-            'ocr_disponivel': _OCR_DISPONIVEL,
+            'ocr_disponivel': ocr.OCR_DISPONIVEL,
         }
         print(f'[CLASSIF] [{tid[:8]}] Concluído: {len(resultados)} ok, {len(erros)} erros')
         _atualizar(tid, status='done', pct=100, label='Concluído!', resultado=resultado_final)
 
-    threading.Thread(target=_executar, daemon=True).start()
+    jobs.iniciar(tid, _executar)
     return jsonify({'task_id': tid, 'avisos': avisos})
 
 
@@ -425,15 +353,12 @@ def api_dividir_e_classificar():
             try:
                 pdf_bytes = _criar_subpdf(reader, ini - 1, fim - 1)
 
-                paginas = []
-                with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-                    total_p = len(pdf.pages)
-                    for i, pg in enumerate(pdf.pages, start=1):
-                        texto = _extrair_texto_pagina(pg, pdf_bytes, i)
-                        paginas.append({'pagina': i, 'texto': texto})
-                        pct   = pct_base + round((i / total_p) * (50 / n))
-                        label = f'Parte {idx}/{n} · extraindo pág {i}/{total_p}'
-                        _atualizar(tid, pct=pct, label=label)
+                def _progresso(feitas, total_p):
+                    pct   = pct_base + round((feitas / total_p) * (50 / n))
+                    label = f'Parte {idx}/{n} · extraindo pág {feitas}/{total_p}'
+                    _atualizar(tid, pct=pct, label=label)
+
+                paginas = ocr.extrair_paginas(pdf_bytes, progresso=_progresso)
 
                 if not paginas:
                     erros.append({'arquivo': nome_parte, 'mensagem': 'Sem páginas extraídas'})
@@ -454,7 +379,7 @@ def api_dividir_e_classificar():
                     'paginas_originais': f'{ini}-{fim}',
                     'total_paginas':     len(paginas),
                     'itens':             itens,
-                    'ocr_usado':         (_OCR_DISPONIVEL and
+                    'ocr_usado':         (ocr.OCR_DISPONIVEL and
                                           chars_total < (_MIN_CHARS_PAGINA * len(paginas))),
                 })
 
@@ -470,12 +395,12 @@ def api_dividir_e_classificar():
         resultado_final = {
             'resultados':    resultados,
             'erros':         erros,
-            'ocr_disponivel': _OCR_DISPONIVEL,
+            'ocr_disponivel': ocr.OCR_DISPONIVEL,
         }
         print(f'[DIV+CLASSIF] [{tid[:8]}] Concluído: {len(resultados)} ok, {len(erros)} erros')
         _atualizar(tid, status='done', pct=100, label='Concluído!', resultado=resultado_final)
 
-    threading.Thread(target=_executar, daemon=True).start()
+    jobs.iniciar(tid, _executar)
     return jsonify({'task_id': tid})
 
 
@@ -500,26 +425,32 @@ def api_triagem_pdf():
 
     def _gerar():
         try:
-            with pdfplumber.open(io.BytesIO(conteudo)) as pdf:
-                total = len(pdf.pages)
-                if total == 0:
-                    yield f"data: {json.dumps({'tipo': 'erro', 'mensagem': 'PDF sem páginas'})}\n\n"
-                    return
-
-                paginas_info = []
-                for i, pg in enumerate(pdf.pages, start=1):
-                    texto   = _extrair_texto_pagina(pg, conteudo, i)
+            total = [0]
+
+            def _abrir(n_pags):
+                total[0] = n_pags
+
+            # Lotes chegam fora de ordem (OCR paralelo); ordena no fim
+            paginas_info = []
+            for lote in ocr.iterar_lotes(conteudo, ao_abrir=_abrir):
+                for p in lote:
+                    texto   = p['texto']
                     chars   = len(texto)
-                    tipo_kw = _detectar_tipo_cabecalho(texto)
                     paginas_info.append({
-                        'pagina':         i,
+                        'pagina':         p['pagina'],
                         'chars':          chars,
                         'cor':            _cor_barra(chars),
                         'preview':        texto[:90].replace('\n', ' ').strip(),
-                        'tipo_detectado': tipo_kw,
+                        'tipo_detectado': _detectar_tipo_cabecalho(texto),
                     })
-                    pct = round(i / total * 100)
-                    yield f"data: {json.dumps({'tipo': 'progresso', 'pagina': i, 'total': total, 'pct': pct})}\n\n"
+                feitas = len(paginas_info)
+                pct = round(feitas / total[0] * 100)
+                yield f"data: {json.dumps({'tipo': 'progresso', 'pagina': feitas, 'total': total[0], 'pct': pct})}\n\n"
+
+            if not total[0]:
+                yield f"data: {json.dumps({'tipo': 'erro', 'mensagem': 'PDF sem páginas'})}\n\n"
+                return
+            paginas_info.sort(key=lambda p: p['pagina'])
 
             n, quebras = len(paginas_info), []
             for i, p in enumerate(paginas_info):
@@ -537,7 +468,7 @@ def api_triagem_pdf():
                     vistos.add(q); quebras_unicas.append(q)
 
             print(f'[TRIAGEM] {nome}: {n} págs | {len(quebras_unicas)} quebras sugeridas')
-            yield f"data: {json.dumps({'tipo': 'resultado', 'arquivo': nome, 'total_paginas': n, 'paginas': paginas_info, 'quebras_sugeridas': quebras_unicas, 'ocr_disponivel': _OCR_DISPONIVEL})}\n\n"
+            yield f"data: {json.dumps({'tipo': 'resultado', 'arquivo': nome, 'total_paginas': n, 'paginas': paginas_info, 'quebras_sugeridas': quebras_unicas, 'ocr_disponivel': ocr.OCR_DISPONIVEL})}\n\n"
 
         except Exception as e:
             print(f'[TRIAGEM ERRO] {e}')
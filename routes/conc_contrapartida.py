@@ -4,6 +4,7 @@ from functools import wraps
 from decorators import requires_access, requires_write_access
 from db import get_cursor, get_db
 from routes.conc_termo_permissions import ensure_can_edit_termo
+from core import conciliacao_relatorio
 
 bp = Blueprint('conc_contrapartida', __name__, url_prefix='/conc_contrapartida')
 
@@ -190,6 +191,7 @@ def salvar_contrapartidas():
         
         get_db().commit()
         cur.close()
+        conciliacao_relatorio.invalidar(numero_termo, 'analises_pc.conc_contrapartida')
         
         return jsonify({
             'mensagem': f'{len(ids_salvos)} contrapartida(s) salva(s) com sucesso!',
@@ -238,6 +240,7 @@ def excluir_contrapartida(id):
         
         get_db().commit()
         cur.close()
+        conciliacao_relatorio.invalidar(numero_termo, 'analises_pc.conc_contrapartida')
         
         return jsonify({'mensagem': 'Contrapartida excluída com sucesso!'}), 200
         
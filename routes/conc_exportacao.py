@@ -6,6 +6,7 @@ from flask import Blueprint, request, jsonify, session, Response
 from db import get_cursor
 from functools import wraps
 from decorators import requires_access
+from core import exportacao
 import csv
 import io
 from datetime import datetime
@@ -32,10 +33,8 @@ def exportar_csv():
         if not numero_termo:
             return jsonify({'erro': 'Número do termo é obrigatório'}), 400
         
-        cur = get_cursor()
-        
-        # Buscar dados do extrato
-        cur.execute("""
+        # Buscar dados do extrato (cursor no servidor, enviado em lotes)
+        consulta = exportacao.consultar("""
             SELECT 
                 indice,
                 data,
@@ -52,14 +51,7 @@ def exportar_csv():
             ORDER BY indice ASC
         """, (numero_termo,))
         
-        dados = cur.fetchall()
-        
-        # Criar CSV em memória
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        
-        # Cabeçalho
-        writer.writerow([
+        cabecalho = [
             'Índice',
             'Data',
             'Crédito (R$)',
@@ -70,10 +62,12 @@ def exportar_csv():
             'Origem ou Destino',
             'Avaliação',
             'Observações'
-        ])
+        ]
         
-        # Dados
-        for row in dados:
+        meses = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 
+                 'jul', 'ago', 'set', 'out', 'nov', 'dez']
+        
+        def _linha(row):
             # Formatar data
             data_formatada = ''
             if row['data']:
@@ -82,8 +76,6 @@ def exportar_csv():
             # Formatar competência
             competencia_formatada = ''
             if row['competencia']:
-                meses = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 
-                        'jul', 'ago', 'set', 'out', 'nov', 'dez']
                 competencia_formatada = f"{meses[row['competencia'].month - 1]}/{row['competencia'].year}"
             
             # Formatar valores monetários
@@ -99,7 +91,7 @@ def exportar_csv():
             if row['discriminacao']:
                 discriminacao = f"{float(row['discriminacao']):.2f}".replace('.', ',')
             
-            writer.writerow([
+            return [
                 row['indice'] or '',
                 data_formatada,
                 credito,
@@ -110,23 +102,16 @@ def exportar_csv():
                 row['origem_destino'] or '',
                 row['cat_avaliacao'] or '',
                 row['avaliacao_analista'] or ''
-            ])
-        
-        # Preparar resposta com BOM UTF-8 para Excel
-        output.seek(0)
-        csv_content = '\ufeff' + output.getvalue()  # BOM UTF-8
+            ]
         
         # Nome do arquivo com data
         data_atual = datetime.now().strftime('%Y%m%d_%H%M%S')
         nome_arquivo = f"conciliacao_{numero_termo.replace('/', '_')}_{data_atual}.csv"
         
-        return Response(
-            csv_content.encode('utf-8'),
-            mimetype='text/csv; charset=utf-8',
-            headers={
-                'Content-Disposition': f'attachment; filename="{nome_arquivo}"',
-                'Content-Type': 'text/csv; charset=utf-8-sig'
-            }
+        # BOM UTF-8 para Excel (gerar_csv)
+        return exportacao.resposta_csv(
+            nome_arquivo, cabecalho, (_linha(r) for r in consulta), consulta,
+            quotechar='"', quoting=csv.QUOTE_MINIMAL
         )
         
     except Exception as e:
@@ -8,6 +8,7 @@ from db import get_cursor, get_db
 from functools import wraps
 from decorators import requires_access, requires_write_access
 from routes.conc_termo_permissions import ensure_can_edit_termo
+from core import conciliacao_relatorio
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import csv
@@ -25,67 +26,6 @@ def login_required(f):
     return decorated_function
 
 
-def _obter_total_executado_demonstrativo(cursor, numero_termo, data_inicio, ocultar_taxas=True, excluir_pg=True):
-    """
-    Replica o recorte-base do demonstrativo para obter o executado total.
-    """
-    if not data_inicio:
-        return 0.0
-
-    cursor.execute("""
-        SELECT MAX(mes) AS total_meses
-        FROM public.parcerias_despesas
-        WHERE numero_termo = %s
-    """, (numero_termo,))
-
-    total_meses_row = cursor.fetchone()
-    total_meses = int(total_meses_row['total_meses'] or 0) if total_meses_row else 0
-    if total_meses <= 0:
-        return 0.0
-
-    inicio_comp = datetime.strptime(str(data_inicio), '%Y-%m-%d').replace(day=1)
-    fim_comp_exclusivo = inicio_comp + relativedelta(months=total_meses)
-
-    categorias_extras = [
-        'débitos indevidos',
-        'juros e/ou multas',
-        'débitos não identificados',
-    ]
-    if not ocultar_taxas:
-        categorias_extras.append('taxas bancárias')
-
-    cursor.execute("""
-        SELECT COALESCE(SUM(ABS(ce.discriminacao)), 0) AS total_executado
-        FROM analises_pc.conc_extrato ce
-        WHERE ce.numero_termo = %s
-          AND ce.discriminacao IS NOT NULL
-          AND ce.cat_transacao IS NOT NULL
-          AND ce.cat_avaliacao IS NOT NULL
-          AND (NOT %s OR ce.cat_avaliacao != 'Pessoa Gestora')
-          AND ce.competencia IS NOT NULL
-          AND DATE_TRUNC('month', ce.competencia) >= %s
-          AND DATE_TRUNC('month', ce.competencia) < %s
-          AND (
-                EXISTS (
-                    SELECT 1
-                    FROM public.parcerias_despesas pd
-                    WHERE pd.numero_termo = ce.numero_termo
-                      AND LOWER(pd.categoria_despesa) = LOWER(ce.cat_transacao)
-                )
-                OR LOWER(ce.cat_transacao) = ANY(%s)
-          )
-    """, (
-        numero_termo,
-        excluir_pg,
-        inicio_comp,
-        fim_comp_exclusivo,
-        categorias_extras,
-    ))
-
-    total_row = cursor.fetchone()
-    return float(total_row['total_executado'] or 0) if total_row else 0.0
-
-
 @bp.route('/')
 @login_required
 @requires_access('conc_relatorio')
@@ -107,7 +47,6 @@ def test():
 @requires_access('conc_relatorio')
 def dados_relatorio():
     """Retorna dados do relatório conforme o tipo de responsabilidade"""
-    conn = None
     try:
         numero_termo = request.args.get('numero_termo')
         considerar_liquido = request.args.get('considerar_liquido', 'false').lower() == 'true'
@@ -120,54 +59,23 @@ def dados_relatorio():
         if not numero_termo:
             return jsonify({'erro': 'Número do termo não informado'}), 400
         
-        print(f"[DEBUG RELATORIO] Conectando ao banco...")
-        conn = get_db()
-        cursor = get_cursor()
+        # Todos os agregados do termo numa consulta só (cache por termo)
+        dados = conciliacao_relatorio.carregar(get_cursor(), numero_termo)
         
-        print(f"[DEBUG RELATORIO] Executando query de parceria...")
+        if not dados['encontrada']:
+            return jsonify({'erro': 'Termo não encontrado'}), 404
         
-        # Verificar se existe prestação com responsabilidade mista (2)
-        cursor.execute("""
-            SELECT COUNT(*) as total_mista
-            FROM public.parcerias_analises
-            WHERE numero_termo = %s
-              AND responsabilidade_analise = 2
-        """, (numero_termo,))
-        tem_mista = cursor.fetchone()['total_mista'] > 0
-
-        # Se tiver mista, usar responsabilidade 2 (Misto)
+        parceria = dados
+        
+        # Se tiver prestação mista (2), usar responsabilidade 2 (Misto)
         # Senão, pegar a responsabilidade da primeira análise
-        if tem_mista:
+        if dados['tem_mista']:
             responsabilidade_usar = 2
             print(f"[DEBUG RELATORIO] Detectada prestação MISTA - usando responsabilidade 2")
         else:
-            cursor.execute("""
-                SELECT responsabilidade_analise
-                FROM public.parcerias_analises
-                WHERE numero_termo = %s
-                LIMIT 1
-            """, (numero_termo,))
-            result = cursor.fetchone()
-            responsabilidade_usar = result['responsabilidade_analise'] if result else 1
+            responsabilidade_usar = dados['responsabilidade_primeira'] if dados['tem_analise'] else 1
             print(f"[DEBUG RELATORIO] Responsabilidade detectada: {responsabilidade_usar}")
         
-        # Buscar informações da parceria
-        cursor.execute("""
-            SELECT 
-                p.numero_termo,
-                p.total_previsto,
-                p.total_pago,
-                p.inicio
-            FROM public.parcerias p
-            WHERE p.numero_termo = %s
-        """, (numero_termo,))
-        
-        parceria = cursor.fetchone()
-        
-        if not parceria:
-            conn.close()
-            return jsonify({'erro': 'Termo não encontrado'}), 404
-        
         # Usar responsabilidade detectada
         responsabilidade = responsabilidade_usar
         
@@ -179,9 +87,7 @@ def dados_relatorio():
             responsabilidade = 3
             print(f"[DEBUG RELATORIO] MODO FORÇADO: PG (original: {responsabilidade_usar})")
         
-        # DEBUG: Verificar valor real
         print(f"[DEBUG RELATORIO] Termo: {numero_termo}")
-        print(f"[DEBUG RELATORIO] Parceria completa: {parceria}")
         print(f"[DEBUG RELATORIO] Responsabilidade FINAL: {responsabilidade} (tipo: {type(responsabilidade)})")
         print(f"[DEBUG RELATORIO] Total previsto: {parceria['total_previsto']}")
         print(f"[DEBUG RELATORIO] Total pago: {parceria['total_pago']}")
@@ -189,189 +95,62 @@ def dados_relatorio():
         # Valores: DP=1, Misto=2, PG=3
         print(f"[DEBUG RELATORIO] Tipo de relatório detectado: {'DP' if responsabilidade == 1 else 'Misto' if responsabilidade == 2 else 'PG' if responsabilidade == 3 else 'Desconhecido'}")
         
-        # Buscar rendimentos
-        cursor.execute("""
-            SELECT 
-                COALESCE(SUM(rendimento_bruto), 0) as total_bruto,
-                COALESCE(SUM(rendimento_ir), 0) as total_ir,
-                COALESCE(SUM(rendimento_iof), 0) as total_iof
-            FROM analises_pc.conc_rendimentos
-            WHERE numero_termo = %s
-        """, (numero_termo,))
-        
-        rendimentos_data = cursor.fetchone()
-        print(f"[DEBUG RELATORIO] Rendimentos raw: {rendimentos_data}")
-        total_bruto = float(rendimentos_data['total_bruto']) if rendimentos_data and rendimentos_data['total_bruto'] else 0
-        total_ir = float(rendimentos_data['total_ir']) if rendimentos_data and rendimentos_data['total_ir'] else 0
-        total_iof = float(rendimentos_data['total_iof']) if rendimentos_data and rendimentos_data['total_iof'] else 0
+        # Rendimentos
+        total_bruto = float(dados['total_bruto']) if dados['total_bruto'] else 0
+        total_ir = float(dados['total_ir']) if dados['total_ir'] else 0
+        total_iof = float(dados['total_iof']) if dados['total_iof'] else 0
         total_liquido = total_bruto - total_ir - total_iof
         
-        # Buscar contrapartida
-        cursor.execute("""
-            SELECT
-                COALESCE(SUM(valor_previsto), 0) as total_contrapartida,
-                COALESCE(SUM(valor_executado), 0) as total_contrapartida_executada
-            FROM analises_pc.conc_contrapartida
-            WHERE numero_termo = %s
-        """, (numero_termo,))
-
-        contrapartida_data = cursor.fetchone()
-        print(f"[DEBUG RELATORIO] Contrapartida raw: {contrapartida_data}")
-        total_contrapartida = float(contrapartida_data['total_contrapartida']) if contrapartida_data and contrapartida_data['total_contrapartida'] else 0
-        total_contrapartida_executada = float(contrapartida_data['total_contrapartida_executada']) if contrapartida_data and contrapartida_data['total_contrapartida_executada'] else 0
+        # Contrapartida
+        total_contrapartida = float(dados['total_contrapartida']) if dados['total_contrapartida'] else 0
+        total_contrapartida_executada = float(dados['total_contrapartida_executada']) if dados['total_contrapartida_executada'] else 0
         
-        # Buscar categorias de transação do extrato
-        cursor.execute("""
-            SELECT 
-                cat_transacao,
-                cat_avaliacao,
-                COALESCE(SUM(ABS(discriminacao)), 0) as total_valor
-            FROM analises_pc.conc_extrato
-            WHERE numero_termo = %s AND discriminacao IS NOT NULL
-            GROUP BY cat_transacao, cat_avaliacao
-        """, (numero_termo,))
-        
-        extrato_categorias = cursor.fetchall()
-        print(f"[DEBUG RELATORIO] Categorias extrato: {extrato_categorias}")
+        # Categorias de transação do extrato (soma de ABS(discriminacao) por transação/avaliação)
+        extrato_categorias = dados['extrato_categorias']
+        print(f"[DEBUG RELATORIO] Categorias extrato: {len(extrato_categorias)}")
         
         # Definir rendimento_usado (usado em ambos DP e PG)
         rendimento_usado = total_liquido if considerar_liquido else total_bruto
         
         # ==== CÁLCULOS ESPECÍFICOS PARA DEPARTAMENTO DE PARCERIAS (DP) ====
         if responsabilidade == 1:
-            # 1. Valor executado e Aprovado (JOIN entre cat_transacao e categoria_despesa)
-            print(f"[DEBUG DP] ===== INICIANDO CÁLCULO VALOR EXECUTADO E APROVADO =====")
-            
-            # Primeiro, ver quais categorias de despesa estão previstas
-            cursor.execute("""
-                SELECT categoria_despesa, COUNT(*) as qtd_linhas
-                FROM public.parcerias_despesas
-                WHERE numero_termo = %s
-                GROUP BY categoria_despesa
-                ORDER BY categoria_despesa
-            """, (numero_termo,))
-            categorias_previstas = cursor.fetchall()
-            print(f"[DEBUG DP] Categorias de despesa previstas:")
-            for cat in categorias_previstas:
-                print(f"  - '{cat['categoria_despesa']}': {cat['qtd_linhas']} linha(s) na tabela parcerias_despesas")
-            
-            # Agora ver o que tem no extrato com detalhes
-            cursor.execute("""
-                SELECT 
-                    ce.cat_transacao,
-                    ce.cat_avaliacao,
-                    COUNT(*) as qtd_linhas,
-                    SUM(ABS(ce.discriminacao)) as total_categoria
-                FROM analises_pc.conc_extrato ce
-                WHERE ce.numero_termo = %s 
-                    AND ce.discriminacao IS NOT NULL
-                GROUP BY ce.cat_transacao, ce.cat_avaliacao
-                ORDER BY ce.cat_transacao, ce.cat_avaliacao
-            """, (numero_termo,))
-            extrato_resumo = cursor.fetchall()
+            # 1. Valor executado e Aprovado: 'Avaliado' com cat_transacao entre as
+            #    categorias de despesa previstas (case insensitive)
             print(f"[DEBUG DP] === Resumo do Extrato ===")
-            for linha in extrato_resumo:
-                print(f"  - cat_transacao: '{linha['cat_transacao']}' | cat_avaliacao: '{linha['cat_avaliacao']}' | qtd: {linha['qtd_linhas']} | total: R$ {linha['total_categoria']:.2f}")
+            for linha in extrato_categorias:
+                print(f"  - cat_transacao: '{linha['cat_transacao']}' | cat_avaliacao: '{linha['cat_avaliacao']}' | qtd: {linha['qtd_linhas']} | total: R$ {linha['total_valor']:.2f}")
             
-            # Query CORRIGIDA: usar EXISTS ao invés de JOIN para evitar duplicação
-            cursor.execute("""
-                SELECT COALESCE(SUM(ABS(ce.discriminacao)), 0) as total_executado_aprovado
-                FROM analises_pc.conc_extrato ce
-                WHERE ce.numero_termo = %s 
-                    AND ce.cat_avaliacao = 'Avaliado'
-                    AND ce.discriminacao IS NOT NULL
-                    AND EXISTS (
-                        SELECT 1 
-                        FROM public.parcerias_despesas pd
-                        WHERE LOWER(pd.categoria_despesa) = LOWER(ce.cat_transacao)
-                            AND pd.numero_termo = ce.numero_termo
-                    )
-            """, (numero_termo,))
-            
-            executado_aprovado_data = cursor.fetchone()
-            valor_executado_aprovado = float(executado_aprovado_data['total_executado_aprovado']) if executado_aprovado_data else 0
+            valor_executado_aprovado = float(dados['executado_aprovado'])
             print(f"[DEBUG DP] Valor Executado e Aprovado FINAL: R$ {valor_executado_aprovado:.2f}")
-            print(f"[DEBUG DP] ===== FIM DO DEBUG =====\n")
             
             # 2. Descontos de Contrapartida
-            cursor.execute("""
-                SELECT 
-                    COALESCE(SUM(GREATEST(valor_previsto - valor_executado, 0)), 0) as desconto_previsto_executado,
-                    COALESCE(SUM(GREATEST(valor_executado - valor_considerado, 0)), 0) as desconto_executado_considerado
-                FROM analises_pc.conc_contrapartida
-                WHERE numero_termo = %s
-            """, (numero_termo,))
-            
-            contrapartida_descontos = cursor.fetchone()
-            desconto_contrapartida = 0
-            if contrapartida_descontos:
-                desconto_prev_exec = float(contrapartida_descontos['desconto_previsto_executado']) if contrapartida_descontos['desconto_previsto_executado'] else 0
-                desconto_exec_cons = float(contrapartida_descontos['desconto_executado_considerado']) if contrapartida_descontos['desconto_executado_considerado'] else 0
-                desconto_contrapartida = desconto_prev_exec + desconto_exec_cons
+            desconto_prev_exec = float(dados['desconto_previsto_executado']) if dados['desconto_previsto_executado'] else 0
+            desconto_exec_cons = float(dados['desconto_executado_considerado']) if dados['desconto_executado_considerado'] else 0
+            desconto_contrapartida = desconto_prev_exec + desconto_exec_cons
             print(f"[DEBUG RELATORIO DP] Descontos de Contrapartida: {desconto_contrapartida}")
             
             # 3. Despesas Passíveis de Glosa (cat_avaliacao='Glosar', exceto Taxas Bancárias)
-            cursor.execute("""
-                SELECT COALESCE(SUM(ABS(discriminacao)), 0) as total_glosas
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s 
-                    AND cat_avaliacao = 'Glosar'
-                    AND LOWER(cat_transacao) != 'taxas bancárias'
-                    AND discriminacao IS NOT NULL
-            """, (numero_termo,))
-            
-            glosas_data = cursor.fetchone()
-            despesas_glosa = float(glosas_data['total_glosas']) if glosas_data else 0
+            despesas_glosa = float(dados['glosas'])
             print(f"[DEBUG RELATORIO DP] Despesas Passíveis de Glosa: {despesas_glosa}")
             
             # 4. Taxas Bancárias não Devolvidas
-            cursor.execute("""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN LOWER(cat_transacao) = 'taxas bancárias' THEN ABS(discriminacao) ELSE 0 END), 0) as total_taxas,
-                    COALESCE(SUM(CASE WHEN LOWER(cat_transacao) = 'devolução de taxas bancárias' THEN ABS(discriminacao) ELSE 0 END), 0) as total_devolucao
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s AND discriminacao IS NOT NULL
-            """, (numero_termo,))
-            
-            taxas_data = cursor.fetchone()
-            taxas_bancarias = float(taxas_data['total_taxas']) if taxas_data else 0
-            devolucao_taxas = float(taxas_data['total_devolucao']) if taxas_data else 0
+            taxas_bancarias = float(dados['taxas'])
+            devolucao_taxas = float(dados['devolucao_taxas'])
             taxas_nao_devolvidas_dp = taxas_bancarias - devolucao_taxas
             print(f"[DEBUG RELATORIO DP] Taxas não Devolvidas: {taxas_nao_devolvidas_dp}")
             
             # 5. Valores já devolvidos (cat_transacao='Restituição de Verba' ou 'Devolução de Taxas Bancárias')
-            cursor.execute("""
-                SELECT COALESCE(SUM(ABS(discriminacao)), 0) as total_restituicao
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s 
-                    AND LOWER(cat_transacao) IN ('restituição de verba', 'devolução de taxas bancárias')
-                    AND discriminacao IS NOT NULL
-            """, (numero_termo,))
-            
-            restituicao_data = cursor.fetchone()
-            valores_devolvidos = float(restituicao_data['total_restituicao']) if restituicao_data else 0
+            valores_devolvidos = float(dados['restituicao'])
             print(f"[DEBUG RELATORIO DP] Valores já Devolvidos: {valores_devolvidos}")
             
-            # 6. Descontos já Realizados (buscar do conc_banco, default 0)
-            cursor.execute("""
-                SELECT descontos_realizados
-                FROM analises_pc.conc_banco
-                WHERE numero_termo = %s
-            """, (numero_termo,))
-            desc_result = cursor.fetchone()
-            descontos_realizados = float(desc_result['descontos_realizados']) if desc_result else 0
+            # 6. Descontos já Realizados (conc_banco, default 0)
+            descontos_realizados = float(dados['descontos_realizados'] or 0)
             print(f"[DEBUG RELATORIO DP] Descontos já Realizados: {descontos_realizados}")
             
             # 7. Valor Total do Projeto (igual PG)
-            rendimento_usado = total_liquido if considerar_liquido else total_bruto
             valor_total_projeto = float(parceria['total_pago']) + rendimento_usado + total_contrapartida
-            valor_executado_total = _obter_total_executado_demonstrativo(
-                cursor,
-                numero_termo,
-                parceria['inicio'],
-                ocultar_taxas=True,
-                excluir_pg=True,
-            )
+            # Recorte-base do demonstrativo (taxas ocultas, sem Pessoa Gestora)
+            valor_executado_total = float(dados['executado_demonstrativo'])
             print(f"[DEBUG RELATORIO DP] Executado Total (base demonstrativo): {valor_executado_total}")
             print(f"[DEBUG RELATORIO DP] Contrapartida Executada: {total_contrapartida_executada}")
             
@@ -402,46 +181,22 @@ def dados_relatorio():
             
             # ===== DETERMINAR DATA DE CORTE (TRANSIÇÃO ENTRE PORTARIAS) =====
             
-            # Buscar portaria e data de início do termo
-            cursor.execute("""
-                SELECT inicio, portaria
-                FROM public.parcerias
-                WHERE numero_termo = %s
-            """, (numero_termo,))
-            info_parceria = cursor.fetchone()
-            
-            data_inicio = info_parceria['inicio']
-            portaria = info_parceria['portaria']
+            data_inicio = parceria['inicio']
+            portaria = parceria['portaria']
             
             print(f"[DEBUG MISTO] Portaria: {portaria}")
             print(f"[DEBUG MISTO] Data início: {data_inicio}")
             
-            # Buscar data de término da portaria na tabela c_geral_legislacao
-            cursor.execute("""
-                SELECT termino
-                FROM categoricas.c_geral_legislacao
-                WHERE lei = %s
-            """, (portaria,))
-            legislacao = cursor.fetchone()
-            
-            if legislacao and legislacao['termino']:
-                data_corte = legislacao['termino']
+            # Término da portaria em c_geral_legislacao; sem ele, 28/02/2023
+            data_corte = dados['data_corte']
+            if dados['termino_portaria']:
                 print(f"[DEBUG MISTO] Data de corte (término da portaria): {data_corte}")
             else:
-                # Fallback: usar 28/02/2023 como padrão
-                data_corte = '2023-02-28'
                 print(f"[DEBUG MISTO] Data de corte (padrão): {data_corte}")
             
-            # ===== BUSCAR CATEGORIAS DE PROVISÃO DO BANCO =====
+            # ===== CATEGORIAS DE PROVISÃO DO BANCO =====
             
-            # Buscar lista oficial de categorias de provisão
-            cursor.execute("""
-                SELECT status AS despesa_provisao
-                FROM categoricas.c_geral_status
-                WHERE schema_table_coluna_r = 'gestao_financeira.despesas.categoria_provisao'
-                  AND ativo = TRUE
-            """)
-            categorias_provisao_db = [row['despesa_provisao'] for row in cursor.fetchall()]
+            categorias_provisao_db = dados['categorias_provisao']
             print(f"[DEBUG MISTO] Categorias de provisão (do banco): {categorias_provisao_db}")
             
             def is_provisao(categoria):
@@ -457,21 +212,8 @@ def dados_relatorio():
             
             # ===== CALCULAR ORÇAMENTO POR PERÍODO =====
             
-            # Buscar despesas previstas com valores mensais
-            cursor.execute("""
-                SELECT 
-                    categoria_despesa,
-                    mes,
-                    valor
-                FROM public.parcerias_despesas
-                WHERE numero_termo = %s
-                ORDER BY categoria_despesa, mes
-            """, (numero_termo,))
-            despesas_previstas = cursor.fetchall()
-            
-            # Calcular meses do período DP (antes do corte)
-            from datetime import datetime
-            from dateutil.relativedelta import relativedelta
+            # Despesas previstas com valores mensais
+            despesas_previstas = dados['despesas']
             
             data_inicio_dt = datetime.strptime(str(data_inicio), '%Y-%m-%d')
             data_corte_dt = datetime.strptime(str(data_corte), '%Y-%m-%d')
@@ -531,18 +273,8 @@ def dados_relatorio():
                 
                 # Provisões executadas = cat_avaliacao='Avaliado' + cat_transacao em provisões
                 if cat_avaliacao == 'Avaliado' and is_provisao(cat_transacao):
-                    # Verificar se a competência está no período DP
-                    cursor.execute("""
-                        SELECT COALESCE(SUM(discriminacao), 0) as total_dp
-                        FROM analises_pc.conc_extrato
-                        WHERE numero_termo = %s
-                          AND cat_transacao = %s
-                          AND cat_avaliacao = %s
-                          AND competencia <= %s
-                    """, (numero_termo, cat_transacao, cat_avaliacao, data_corte))
-                    
-                    result = cursor.fetchone()
-                    valor_dp = float(result['total_dp']) if result else 0
+                    # Soma com competência no período DP (competencia <= data_corte)
+                    valor_dp = float(cat['total_ate_corte']) if cat['total_ate_corte'] else 0
                     
                     provisoes_executadas_dp += valor_dp
                     print(f"[DEBUG MISTO]    + Provisão executada DP '{cat_transacao}': R$ {valor_dp:.2f}")
@@ -571,16 +303,7 @@ def dados_relatorio():
                 
                 if cat_avaliacao == 'Avaliado' and is_provisao(cat_transacao):
                     # Sem filtro de competencia - todo o projeto
-                    cursor.execute("""
-                        SELECT COALESCE(SUM(discriminacao), 0) as total_projeto
-                        FROM analises_pc.conc_extrato
-                        WHERE numero_termo = %s
-                          AND cat_transacao = %s
-                          AND cat_avaliacao = %s
-                    """, (numero_termo, cat_transacao, cat_avaliacao))
-                    
-                    result = cursor.fetchone()
-                    valor_total = float(result['total_projeto']) if result else 0
+                    valor_total = float(cat['total_projeto']) if cat['total_projeto'] else 0
                     
                     provisoes_executadas_total += valor_total
                     print(f"[DEBUG MISTO]    + Provisão executada TOTAL '{cat_transacao}': R$ {valor_total:.2f}")
@@ -626,32 +349,9 @@ def dados_relatorio():
             print(f"[DEBUG MISTO] 5. Valor Total do Projeto (DAC): R$ {valor_total_projeto_dac:.2f}")
             print(f"[DEBUG MISTO]    = Valor Repassado ({valor_repassado_dac:.2f}) + Rendimentos ({rendimentos_dac}) + Contrapartida ({contrapartida_dac}) + Provisões Executadas ({provisoes_executadas:.2f})")
             
-            # Buscar categorias previstas
-            cursor.execute("""
-                SELECT DISTINCT categoria_despesa
-                FROM public.parcerias_despesas
-                WHERE numero_termo = %s
-                ORDER BY categoria_despesa
-            """, (numero_termo,))
-            categorias_previstas = [row['categoria_despesa'] for row in cursor.fetchall()]
-            
             # 6. Valor Executado e Aprovado = Soma de discriminacao onde cat_avaliacao = 'Avaliado'
             #    E cat_transacao está nas categorias previstas (case insensitive)
-            if categorias_previstas:
-                # Converter categorias previstas para lowercase para comparação
-                cursor.execute("""
-                    SELECT COALESCE(SUM(ABS(discriminacao)), 0) as total_considerado
-                    FROM analises_pc.conc_extrato
-                    WHERE numero_termo = %s
-                      AND discriminacao IS NOT NULL
-                      AND cat_avaliacao = 'Avaliado'
-                      AND LOWER(cat_transacao) = ANY(SELECT LOWER(unnest(%s::text[])))
-                """, (numero_termo, categorias_previstas))
-                
-                resultado_considerado = cursor.fetchone()
-                valor_executado_aprovado_dac = float(resultado_considerado['total_considerado']) if resultado_considerado else 0
-            else:
-                valor_executado_aprovado_dac = 0
+            valor_executado_aprovado_dac = float(dados['executado_aprovado'])
             
             print(f"[DEBUG MISTO] 6. Valor Executado e Aprovado (DAC): {valor_executado_aprovado_dac}")
             print(f"[DEBUG MISTO]    = Soma ABS(discriminacao) onde cat_avaliacao='Avaliado' E cat_transacao em categorias previstas")
@@ -660,14 +360,8 @@ def dados_relatorio():
             # Será calculado após itens 8, 9, 10, 11, 12, 13
             # NOTA: Saldos não Utilizados será calculado APÓS item 11 (Despesas Glosa)
             
-            # 9. Descontos já realizados (buscar do conc_banco, default 0)
-            cursor.execute("""
-                SELECT descontos_realizados
-                FROM analises_pc.conc_banco
-                WHERE numero_termo = %s
-            """, (numero_termo,))
-            desc_dac_result = cursor.fetchone()
-            descontos_realizados_dac = float(desc_dac_result['descontos_realizados']) if desc_dac_result else 0
+            # 9. Descontos já realizados (conc_banco, default 0)
+            descontos_realizados_dac = float(dados['descontos_realizados'] or 0)
             print(f"[DEBUG MISTO] 9. Descontos já Realizados (DAC): {descontos_realizados_dac}")
             
             # 10. Descontos de Contrapartida
@@ -687,16 +381,7 @@ def dados_relatorio():
             print(f"[DEBUG MISTO]    = Valor Total Projeto ({valor_total_projeto_dac:.2f}) - Valor Executado Aprovado ({valor_executado_aprovado_dac:.2f}) - Despesas Glosa ({despesas_glosa_dac:.2f})")
             
             # 12. Valores já Devolvidos (cat_transacao='Restituição de Verba' ou 'Devolução de Taxas Bancárias')
-            cursor.execute("""
-                SELECT COALESCE(SUM(ABS(discriminacao)), 0) as total_restituicao
-                FROM analises_pc.conc_extrato
-                WHERE numero_termo = %s 
-                    AND LOWER(cat_transacao) IN ('restituição de verba', 'devolução de taxas bancárias')
-                    AND discriminacao IS NOT NULL
-            """, (numero_termo,))
-            
-            restituicao_dac_data = cursor.fetchone()
-            valores_devolvidos_dac = float(restituicao_dac_data['total_restituicao']) if restituicao_dac_data else 0
+            valores_devolvidos_dac = float(dados['restituicao'])
             print(f"[DEBUG MISTO] 12. Valores já Devolvidos (DAC): {valores_devolvidos_dac}")
             
             # 7. Total de Descontos = Saldos Remanescentes + Descontos já Realizados + Descontos Contrapartida + Despesas Glosa
@@ -775,9 +460,6 @@ def dados_relatorio():
                 valor_dest_identificado - valor_dest_nao_identificado - taxas_nao_devolvidas
             )
         
-        if conn:
-            conn.close()
-        
         # Preparar resposta baseada no tipo de responsabilidade
         if responsabilidade == 1:  # Departamento de Parcerias
             resultado = {
@@ -887,9 +569,6 @@ def dados_relatorio():
         import traceback
         traceback.print_exc()
         
-        if conn:
-            conn.close()
-        
         return jsonify({'erro': str(e)}), 500
 
 
@@ -1213,6 +892,7 @@ def save_descontos_realizados():
             """, (numero_termo, valor))
         
         conn.commit()
+        conciliacao_relatorio.invalidar(numero_termo, 'analises_pc.conc_banco')
         
         return jsonify({'success': True, 'valor': float(valor)})
         
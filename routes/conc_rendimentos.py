@@ -6,6 +6,7 @@ from flask import Blueprint, render_template, request, jsonify, session, make_re
 from db import get_cursor, get_db
 from functools import wraps
 from decorators import requires_access, requires_write_access
+from core import conciliacao_relatorio
 from datetime import datetime, date
 import calendar
 
@@ -305,6 +306,7 @@ def api_salvar_rendimentos():
                 ids_processados.append(novo_id)
         
         db.commit()
+        conciliacao_relatorio.invalidar(numero_termo, 'analises_pc.conc_rendimentos')
         
         return jsonify({
             'mensagem': f'{len(ids_processados)} rendimentos salvos com sucesso',
@@ -7,9 +7,11 @@ import re
 import os
 import io
 import uuid
-import zipfile
-import boto3
-from botocore.client import Config
+import utils_storage as storage
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from core import exportacao, painel_inicial, referencia
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_file
 from db import get_cursor, get_db
 from utils import login_required
@@ -38,13 +40,10 @@ _R2_ALLOWED_EXTS = {
 
 
 def _r2_client():
-    return boto3.client(
-        's3',
-        endpoint_url=os.environ.get('R2_ENDPOINT_URL'),
-        aws_access_key_id=os.environ.get('R2_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.environ.get('R2_SECRET_ACCESS_KEY'),
-        config=Config(signature_version='s3v4'),
-        region_name='auto',
+    return storage.s3_client(
+        os.environ.get('R2_ENDPOINT_URL'),
+        os.environ.get('R2_ACCESS_KEY_ID'),
+        os.environ.get('R2_SECRET_ACCESS_KEY'),
     )
 
 
@@ -87,6 +86,15 @@ def _delete_r2(url):
 datas_importantes_bp = Blueprint('datas_importantes', __name__, url_prefix='/datas-importantes')
 
 
+@datas_importantes_bp.after_request
+def _invalidar_painel_apos_escrita(response):
+    # Lembretes/alerta da tela inicial ficam em cache (core.painel_inicial)
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        painel_inicial.invalidar()
+    return response
+
+
+
 def _get_user_info():
     """Retorna tupla (d_usuario, email, tipo_usuario) da sessão."""
     return (
@@ -1089,6 +1097,8 @@ def exportar_pdf_evento(id):
 # ─────────────────────────────────────────────────────── Download ZIP ───────
 
 _ZIP_MAX_BYTES = 50 * 1024 * 1024  # 50 MB por parte
+_ZIP_JANELA = 4                    # get_object em andamento à frente da escrita
+_ZIP_BLOCO = 256 * 1024            # leitura do corpo dos objetos
 
 
 def _pasta_por_tipo(nome_doc):
@@ -1119,14 +1129,123 @@ def _nome_unico_zip(nome, pasta, vistos):
         i += 1
 
 
-def _construir_zip(itens):
-    """Recebe lista de {'arcname': str, 'content': bytes}. Retorna BytesIO do ZIP."""
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for item in itens:
-            zf.writestr(item['arcname'], item['content'])
-    buf.seek(0)
-    return buf
+def _tamanhos_r2(r2, bucket, prefixo, keys):
+    """
+    Tamanho (bytes) de cada key acessível: uma listagem do prefixo do evento
+    e head_object em paralelo só para as keys de fora dele.
+    """
+    tamanhos = {}
+    try:
+        paginas = r2.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefixo)
+        for pagina in paginas:
+            for obj in pagina.get('Contents', ()):
+                tamanhos[obj['Key']] = obj['Size']
+    except Exception as e:
+        print(f"[ZIP EVENTO] Falha ao listar {prefixo}: {e}")
+
+    def _head(key):
+        try:
+            return key, r2.head_object(Bucket=bucket, Key=key)['ContentLength']
+        except Exception:
+            return key, None  # arquivo inacessível — pula
+
+    restantes = [k for k in dict.fromkeys(keys) if k not in tamanhos]
+    if restantes:
+        with ThreadPoolExecutor(max_workers=_ZIP_JANELA) as executor:
+            for key, tamanho in executor.map(_head, restantes):
+                if tamanho is not None:
+                    tamanhos[key] = tamanho
+    return tamanhos
+
+
+def _blocos_r2(r2, bucket, key, corpo):
+    """
+    Lê o corpo de um get_object em blocos de _ZIP_BLOCO. Se a conexão cair no
+    meio, retoma uma vez a partir do byte já lido (Range).
+    """
+    lidos = 0
+    retomado = False
+    try:
+        while True:
+            try:
+                for bloco in corpo.iter_chunks(_ZIP_BLOCO):
+                    lidos += len(bloco)
+                    yield bloco
+                return
+            except Exception as e:
+                if retomado:
+                    raise
+                print(f"[ZIP EVENTO] Retomando {key} a partir de {lidos} bytes: {e}")
+                retomado = True
+                corpo.close()
+                corpo = r2.get_object(Bucket=bucket, Key=key, Range=f'bytes={lidos}-')['Body']
+    finally:
+        corpo.close()
+
+
+class _PrefetchR2:
+    """
+    Abre os objetos do R2 em ordem, com até _ZIP_JANELA get_object em
+    andamento à frente do que está sendo escrito no ZIP. Só os cabeçalhos são
+    lidos antecipadamente; o corpo é consumido em blocos por quem escreve,
+    então a memória não depende do tamanho dos arquivos.
+
+    Itera (item, blocos); blocos é None quando o objeto não pôde ser aberto.
+    """
+
+    def __init__(self, r2, bucket, itens, janela=_ZIP_JANELA):
+        self.r2 = r2
+        self.bucket = bucket
+        self._itens = iter(itens)
+        self._janela = janela
+        self._executor = ThreadPoolExecutor(max_workers=janela, thread_name_prefix='zip-r2')
+        self._pendentes = deque()
+
+    def _abrir(self, item):
+        return self.r2.get_object(Bucket=self.bucket, Key=item['key'])['Body']
+
+    def _agendar(self):
+        item = next(self._itens, None)
+        if item is not None:
+            self._pendentes.append((item, self._executor.submit(self._abrir, item)))
+
+    def __iter__(self):
+        try:
+            for _ in range(self._janela):
+                self._agendar()
+            while self._pendentes:
+                item, futuro = self._pendentes.popleft()
+                self._agendar()
+                try:
+                    corpo = futuro.result()
+                except Exception as e:
+                    print(f"[ZIP EVENTO] {item['key']} inacessível — pulando: {e}")
+                    yield item, None
+                    continue
+                yield item, _blocos_r2(self.r2, self.bucket, item['key'], corpo)
+        finally:
+            self.fechar()
+
+    def fechar(self):
+        while self._pendentes:
+            _, futuro = self._pendentes.popleft()
+            if not futuro.cancel():
+                futuro.add_done_callback(_fechar_corpo)
+        self._executor.shutdown(wait=False)
+
+
+def _fechar_corpo(futuro):
+    try:
+        futuro.result().close()
+    except Exception:
+        pass
+
+
+def _entradas_zip(origem, quantidade):
+    """(arcname, blocos, tamanho) dos próximos `quantidade` itens de `origem`."""
+    for item, blocos in islice(origem, quantidade):
+        if blocos is not None:
+            yield item['arcname'], blocos, item['tamanho']
 
 
 @datas_importantes_bp.route("/eventos/<int:id>/download-zip", methods=["GET"])
@@ -1134,7 +1253,7 @@ def _construir_zip(itens):
 @requires_access('ferias')
 def download_zip_evento(id):
     """
-    Baixa todos os arquivos R2 de um evento como ZIP.
+    Baixa todos os arquivos R2 de um evento como ZIP, em streaming.
     - ≤ 50 MB  → NomeEvento.zip
     - > 50 MB  → NomeEvento_partes.zip (contém parte1.zip, parte2.zip …)
     """
@@ -1173,41 +1292,40 @@ def download_zip_evento(id):
         flash('Este evento não possui documentos para download.', 'warning')
         return redirect(url_for('datas_importantes.index'))
 
-    # ── Baixar arquivos do R2 ──────────────────────────────────────────────
+    # ── Planejar partes (só metadados; nada é baixado aqui) ────────────────
     r2     = _r2_client()
     base   = os.environ.get('R2_PUBLIC_BASE_URL', '').rstrip('/')
     bucket = os.environ.get('R2_BUCKET_NAME', 'eventos')
 
-    partes   = []          # lista de partes; cada parte é lista de {arcname, content}
-    parte_atual = []
-    tamanho_atual = 0
-
+    arquivos = []
     for doc in docs:
-        nome = doc['nome_doc'] or 'arquivo'
-        url  = doc['nome_doc_link'] or ''
-
+        url = doc['nome_doc_link'] or ''
         # Somente arquivos R2
         if not (url and base and url.startswith(base)):
             continue
-        key = url[len(base):].lstrip('/')
-        try:
-            resp    = r2.get_object(Bucket=bucket, Key=key)
-            content = resp['Body'].read()
-        except Exception:
-            continue  # arquivo inacessível — pula
+        arquivos.append((doc['nome_doc'] or 'arquivo', url[len(base):].lstrip('/')))
 
-        pasta   = _pasta_por_tipo(nome)
-        tamanho = len(content)
+    tamanhos = _tamanhos_r2(r2, bucket, f"{id}/", [key for _, key in arquivos]) if arquivos else {}
+
+    partes   = []          # lista de partes; cada parte é lista de {arcname, key, tamanho}
+    parte_atual = []
+    tamanho_atual = 0
+    vistos_nesta_parte = set()
+
+    for nome, key in arquivos:
+        tamanho = tamanhos.get(key)
+        if tamanho is None:
+            continue  # arquivo inacessível — pula
 
         # Nova parte se ultrapassar o limite (e já houver algo na parte atual)
         if parte_atual and (tamanho_atual + tamanho) > _ZIP_MAX_BYTES:
             partes.append(parte_atual)
             parte_atual   = []
             tamanho_atual = 0
+            vistos_nesta_parte = set()
 
-        vistos_nesta_parte = {item['arcname'] for item in parte_atual}
-        arcname = _nome_unico_zip(nome, pasta, vistos_nesta_parte)
-        parte_atual.append({'arcname': arcname, 'content': content})
+        arcname = _nome_unico_zip(nome, _pasta_por_tipo(nome), vistos_nesta_parte)
+        parte_atual.append({'arcname': arcname, 'key': key, 'tamanho': tamanho})
         tamanho_atual += tamanho
 
     if parte_atual:
@@ -1218,30 +1336,23 @@ def download_zip_evento(id):
         return redirect(url_for('datas_importantes.index'))
 
     nome_base = sanitizar_nome_doc(nome_atividade)
+    origem = _PrefetchR2(r2, bucket, [item for parte in partes for item in parte])
+    iterador = iter(origem)
 
     # ── Gerar resposta ─────────────────────────────────────────────────────
     if len(partes) == 1:
-        buf = _construir_zip(partes[0])
-        return send_file(
-            buf,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"{nome_base}.zip",
+        return exportacao.resposta_zip(
+            f"{nome_base}.zip",
+            _entradas_zip(iterador, len(partes[0])),
+            ao_fechar=iterador.close,
         )
 
-    # Múltiplas partes → ZIP externo contendo os ZIPs internos
-    outer_buf = io.BytesIO()
-    with zipfile.ZipFile(outer_buf, 'w', zipfile.ZIP_STORED) as outer_zf:
-        for i, parte in enumerate(partes, 1):
-            inner_buf = _construir_zip(parte)
-            outer_zf.writestr(f"{nome_base}_parte{i}.zip", inner_buf.read())
-    outer_buf.seek(0)
-    return send_file(
-        outer_buf,
-        mimetype='application/zip',
-        as_attachment=True,
-        download_name=f"{nome_base}_partes.zip",
+    # Múltiplas partes → ZIP externo contendo os ZIPs internos (também em streaming)
+    externas = (
+        (f"{nome_base}_parte{i}.zip", exportacao.gerar_zip(_entradas_zip(iterador, len(parte))), None)
+        for i, parte in enumerate(partes, 1)
     )
+    return exportacao.resposta_zip(f"{nome_base}_partes.zip", externas, ao_fechar=iterador.close)
 
 
 # ─────────────────────────────────────────────────────────── Feriados ──────
@@ -1272,6 +1383,7 @@ def feriados_criar():
             VALUES (%s, %s, %s, %s)
         """, (data, nome, tipo, ativo))
         get_db().commit()
+        referencia.invalidar('calendario.data_feriados')
         flash('Feriado criado com sucesso.', 'success')
     except Exception as e:
         get_db().rollback()
@@ -1308,6 +1420,7 @@ def feriados_editar(id):
             WHERE id = %s
         """, (data, nome, tipo, ativo, id))
         get_db().commit()
+        referencia.invalidar('calendario.data_feriados')
         flash('Feriado atualizado.', 'success')
     except Exception as e:
         get_db().rollback()
@@ -1331,6 +1444,7 @@ def feriados_deletar(id):
     try:
         cur.execute("DELETE FROM calendario.data_feriados WHERE id = %s", (id,))
         get_db().commit()
+        referencia.invalidar('calendario.data_feriados')
         flash('Feriado removido.', 'success')
     except Exception as e:
         get_db().rollback()
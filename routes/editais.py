@@ -6,6 +6,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from db import get_cursor, get_db
 from utils import login_required
 from decorators import requires_access, requires_write_access
+from core import referencia
 import csv
 from io import StringIO
 from datetime import datetime
@@ -318,6 +319,7 @@ def criar():
               status))
         
         get_db().commit()
+        referencia.invalidar('public.parcerias_edital')
         cur.close()
         
         flash(f'Edital "{edital_nome}" cadastrado com sucesso!', 'success')
@@ -381,6 +383,7 @@ def editar(id):
             flash('Edital não encontrado!', 'danger')
         else:
             get_db().commit()
+            referencia.invalidar('public.parcerias_edital')
             flash(f'Edital "{edital_nome}" atualizado com sucesso!', 'success')
         
         cur.close()
@@ -420,6 +423,7 @@ def deletar(id):
         # Deletar
         cur.execute("DELETE FROM public.parcerias_edital WHERE id = %s", (id,))
         get_db().commit()
+        referencia.invalidar('public.parcerias_edital')
         cur.close()
         
         flash(f'Edital "{nome}" excluído com sucesso!', 'success')
@@ -8,9 +8,19 @@ from db import get_cursor, get_db
 from utils import login_required
 from decorators import requires_access
 from datetime import date, timedelta, datetime
+from core import calendario, painel_inicial
 
 escalas_bp = Blueprint('escalas', __name__, url_prefix='/escalas')
 
+
+@escalas_bp.after_request
+def _invalidar_painel_apos_escrita(response):
+    # Lembretes/alerta da tela inicial ficam em cache (core.painel_inicial)
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        painel_inicial.invalidar()
+    return response
+
+
 # Mapeamento tipo_usuario → unidade alocada (auto-preenchimento)
 UNIDADE_POR_TIPO = {
     'Agente DAC': 'Divisão de Análise de Contas',
@@ -50,11 +60,14 @@ def _monday_of_week(d: date) -> date:
 
 def _check_conflitos(usuario_email: str, data_tt: date) -> dict | None:
     """
-    Verifica se data_tt conflita com férias ou folga do servidor.
+    Verifica se data_tt conflita com feriado, férias ou folga do servidor.
     Retorna dict com detalhes do conflito, ou None se não houver.
     """
     cur = get_cursor()
     try:
+        if data_tt.weekday() < 5 and not calendario.eh_dia_util(data_tt, cur=cur):
+            return {'tipo': 'Feriado', 'inicio': data_tt, 'fim': data_tt}
+
         # Verificar férias
         cur.execute("""
             SELECT ferias_inicio, ferias_fim
@@ -180,6 +193,11 @@ def teletrabalho():
                     if row['data_inicio'] <= dia <= row['data_fim']:
                         conflitos[row['usuario_email']][dia.isoformat()] = row['nome_data']
 
+            # Feriados da semana bloqueiam o dia para todos
+            for dia in calendario.feriados_entre(semana_inicio, semana_fim, cur=cur):
+                for conflitos_srv in conflitos.values():
+                    conflitos_srv.setdefault(dia.isoformat(), 'Feriado')
+
     finally:
         cur.close()
 
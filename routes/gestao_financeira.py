@@ -3,10 +3,15 @@ Blueprint de Gestão Financeira
 Acompanhamento de Reservas, Empenhos e Controles Financeiros
 """
 
+import os
+
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
-from db import get_cursor, get_db
+from db import get_cursor, get_db, pooled_connection
+from psycopg2.extras import RealDictCursor
 from utils import login_required
 from decorators import requires_access, requires_write_access
+import psycopg2
+from core import empenhos_saldos, exportacao, jobs, parcerias_resumo, sof_import
 
 gestao_financeira_bp = Blueprint('gestao_financeira', __name__, url_prefix='/gestao_financeira')
 
@@ -1455,391 +1460,223 @@ def api_fumcad_exportar_csv():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@gestao_financeira_bp.route('/api/importar-dotacao', methods=['POST'])
-@login_required
-@requires_access('gestao_financeira')
-@requires_write_access('gestao_financeira')
-def api_importar_dotacao():
-    """
-    API para importar arquivos CSV de dotação orçamentária
-    """
-    import csv
-    from io import StringIO
-    
+IMPORTACAO_DOTACAO = sof_import.ImportacaoSOF(
+    tabela='gestao_financeira.back_dotacao',
+    colunas=[
+        'COD_IDT_DOTA', 'COD_ORG_EMP', 'TXT_ORG_EMP', 'COD_UNID_ORCM_SOF', 'TXT_UNID_ORCM',
+        'COD_FCAO_GOVR', 'TXT_FCAO_GOVR', 'COD_SUB_FCAO_GOVR', 'TXT_SUB_FCAO_GOVR',
+        'COD_PGM_GOVR', 'TXT_PGM_GOVR', 'COD_PROJ_ATVD_SOF', 'TXT_PROJ_ATVD',
+        'COD_CTA_DESP', 'TXT_CTA_DESP', 'COD_FONT_REC', 'TXT_FONT_REC',
+        'COD_EX_FONT_REC', 'COD_DSTN_REC', 'COD_VINC_REC_PMSP', 'COD_TIP_CRED_ORCM',
+        'IND_ACTC_REDC', 'IND_CNTR_COTA_PESL', 'IND_COTA_PESL', 'IND_DOTA_LQDD_PAGO',
+        'DT_CRIA_DOTA', 'VAL_DOTA_AUTR', 'VAL_TOT_CRED_SPLM', 'VAL_TOT_CRED_ESPC',
+        'VAL_TOT_CRED_EXT', 'VAL_TOT_REDC', 'ORCADO_ATUAL', 'VAL_TOT_CNGL',
+        'VAL_TOT_BLOQ_DECR', 'ORCADO_DISPONIVEL', 'VAL_SLDO_RESV_DOTA', 'SALDO_DOTACAO',
+        'VAL_TOT_EPH', 'VAL_TOT_CANC_EPH', 'SALDO_EMPENHADO', 'SALDO_RESERVADO',
+        'VAL_TOT_LQDC_EPH', 'VAL_TOT_PGTO_DOTA', 'IND_EMND_ORCM', 'DOTACAO_FORMATADA',
+        'IND_DVDA_PUBC', 'IND_LANC_RCTA'
+    ],
+    chave=['cod_idt_dota'],
+    vence='ultimo',  # mesmo efeito do upsert linha a linha: a última ocorrência prevalece
+    obrigatorias=['COD_IDT_DOTA', 'COD_ORG_EMP', 'TXT_ORG_EMP'],
+    set_extra='criado_em = NOW()',
+)
+
+
+def _data_ultima_carga(conn, sql, formato='%d/%m/%Y'):
+    cur = conn.cursor()
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SET datestyle TO 'ISO, DMY'")
-        total_importados = 0
-        
-        # Processar cada arquivo enviado
-        arquivos = ['dotacao_3410', 'dotacao_3420', 'dotacao_0810', 'dotacao_9010', 'dotacao_7810']
-        
-        for arquivo_key in arquivos:
-            if arquivo_key not in request.files:
-                continue
-                
-            arquivo = request.files[arquivo_key]
-            if arquivo.filename == '':
-                continue
-            
-            # Ler conteúdo do CSV com encoding robusto
-            conteudo_bytes = arquivo.read()
-            for encoding in ['utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']:
-                try:
-                    conteudo = conteudo_bytes.decode(encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                return jsonify({'success': False, 'error': f'Não foi possível decodificar o arquivo {arquivo.filename}'}), 400
-            
-            csv_reader = csv.DictReader(StringIO(conteudo), delimiter=';')
-            
-            # Inserir registros
-            for linha in csv_reader:
-                try:
-                    cur.execute("""
-                        INSERT INTO gestao_financeira.back_dotacao (
-                            COD_IDT_DOTA, COD_ORG_EMP, TXT_ORG_EMP, COD_UNID_ORCM_SOF, TXT_UNID_ORCM,
-                            COD_FCAO_GOVR, TXT_FCAO_GOVR, COD_SUB_FCAO_GOVR, TXT_SUB_FCAO_GOVR,
-                            COD_PGM_GOVR, TXT_PGM_GOVR, COD_PROJ_ATVD_SOF, TXT_PROJ_ATVD,
-                            COD_CTA_DESP, TXT_CTA_DESP, COD_FONT_REC, TXT_FONT_REC,
-                            COD_EX_FONT_REC, COD_DSTN_REC, COD_VINC_REC_PMSP, COD_TIP_CRED_ORCM,
-                            IND_ACTC_REDC, IND_CNTR_COTA_PESL, IND_COTA_PESL, IND_DOTA_LQDD_PAGO,
-                            DT_CRIA_DOTA, VAL_DOTA_AUTR, VAL_TOT_CRED_SPLM, VAL_TOT_CRED_ESPC,
-                            VAL_TOT_CRED_EXT, VAL_TOT_REDC, ORCADO_ATUAL, VAL_TOT_CNGL,
-                            VAL_TOT_BLOQ_DECR, ORCADO_DISPONIVEL, VAL_SLDO_RESV_DOTA, SALDO_DOTACAO,
-                            VAL_TOT_EPH, VAL_TOT_CANC_EPH, SALDO_EMPENHADO, SALDO_RESERVADO,
-                            VAL_TOT_LQDC_EPH, VAL_TOT_PGTO_DOTA, IND_EMND_ORCM, DOTACAO_FORMATADA,
-                            IND_DVDA_PUBC, IND_LANC_RCTA
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                                  %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                                  %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (COD_IDT_DOTA) DO UPDATE SET
-                            COD_ORG_EMP             = EXCLUDED.COD_ORG_EMP,
-                            TXT_ORG_EMP             = EXCLUDED.TXT_ORG_EMP,
-                            COD_UNID_ORCM_SOF       = EXCLUDED.COD_UNID_ORCM_SOF,
-                            TXT_UNID_ORCM           = EXCLUDED.TXT_UNID_ORCM,
-                            COD_FCAO_GOVR           = EXCLUDED.COD_FCAO_GOVR,
-                            TXT_FCAO_GOVR           = EXCLUDED.TXT_FCAO_GOVR,
-                            COD_SUB_FCAO_GOVR       = EXCLUDED.COD_SUB_FCAO_GOVR,
-                            TXT_SUB_FCAO_GOVR       = EXCLUDED.TXT_SUB_FCAO_GOVR,
-                            COD_PGM_GOVR            = EXCLUDED.COD_PGM_GOVR,
-                            TXT_PGM_GOVR            = EXCLUDED.TXT_PGM_GOVR,
-                            COD_PROJ_ATVD_SOF       = EXCLUDED.COD_PROJ_ATVD_SOF,
-                            TXT_PROJ_ATVD           = EXCLUDED.TXT_PROJ_ATVD,
-                            COD_CTA_DESP            = EXCLUDED.COD_CTA_DESP,
-                            TXT_CTA_DESP            = EXCLUDED.TXT_CTA_DESP,
-                            COD_FONT_REC            = EXCLUDED.COD_FONT_REC,
-                            TXT_FONT_REC            = EXCLUDED.TXT_FONT_REC,
-                            COD_EX_FONT_REC         = EXCLUDED.COD_EX_FONT_REC,
-                            COD_DSTN_REC            = EXCLUDED.COD_DSTN_REC,
-                            COD_VINC_REC_PMSP       = EXCLUDED.COD_VINC_REC_PMSP,
-                            COD_TIP_CRED_ORCM       = EXCLUDED.COD_TIP_CRED_ORCM,
-                            IND_ACTC_REDC           = EXCLUDED.IND_ACTC_REDC,
-                            IND_CNTR_COTA_PESL      = EXCLUDED.IND_CNTR_COTA_PESL,
-                            IND_COTA_PESL           = EXCLUDED.IND_COTA_PESL,
-                            IND_DOTA_LQDD_PAGO      = EXCLUDED.IND_DOTA_LQDD_PAGO,
-                            DT_CRIA_DOTA            = EXCLUDED.DT_CRIA_DOTA,
-                            VAL_DOTA_AUTR           = EXCLUDED.VAL_DOTA_AUTR,
-                            VAL_TOT_CRED_SPLM       = EXCLUDED.VAL_TOT_CRED_SPLM,
-                            VAL_TOT_CRED_ESPC       = EXCLUDED.VAL_TOT_CRED_ESPC,
-                            VAL_TOT_CRED_EXT        = EXCLUDED.VAL_TOT_CRED_EXT,
-                            VAL_TOT_REDC            = EXCLUDED.VAL_TOT_REDC,
-                            ORCADO_ATUAL            = EXCLUDED.ORCADO_ATUAL,
-                            VAL_TOT_CNGL            = EXCLUDED.VAL_TOT_CNGL,
-                            VAL_TOT_BLOQ_DECR       = EXCLUDED.VAL_TOT_BLOQ_DECR,
-                            ORCADO_DISPONIVEL       = EXCLUDED.ORCADO_DISPONIVEL,
-                            VAL_SLDO_RESV_DOTA      = EXCLUDED.VAL_SLDO_RESV_DOTA,
-                            SALDO_DOTACAO           = EXCLUDED.SALDO_DOTACAO,
-                            VAL_TOT_EPH             = EXCLUDED.VAL_TOT_EPH,
-                            VAL_TOT_CANC_EPH        = EXCLUDED.VAL_TOT_CANC_EPH,
-                            SALDO_EMPENHADO         = EXCLUDED.SALDO_EMPENHADO,
-                            SALDO_RESERVADO         = EXCLUDED.SALDO_RESERVADO,
-                            VAL_TOT_LQDC_EPH        = EXCLUDED.VAL_TOT_LQDC_EPH,
-                            VAL_TOT_PGTO_DOTA       = EXCLUDED.VAL_TOT_PGTO_DOTA,
-                            IND_EMND_ORCM           = EXCLUDED.IND_EMND_ORCM,
-                            DOTACAO_FORMATADA       = EXCLUDED.DOTACAO_FORMATADA,
-                            IND_DVDA_PUBC           = EXCLUDED.IND_DVDA_PUBC,
-                            IND_LANC_RCTA           = EXCLUDED.IND_LANC_RCTA,
-                            criado_em               = NOW()
-                    """, (
-                        linha.get('COD_IDT_DOTA'), linha.get('COD_ORG_EMP'), linha.get('TXT_ORG_EMP'),
-                        linha.get('COD_UNID_ORCM_SOF'), linha.get('TXT_UNID_ORCM'), linha.get('COD_FCAO_GOVR'),
-                        linha.get('TXT_FCAO_GOVR'), linha.get('COD_SUB_FCAO_GOVR'), linha.get('TXT_SUB_FCAO_GOVR'),
-                        linha.get('COD_PGM_GOVR'), linha.get('TXT_PGM_GOVR'), linha.get('COD_PROJ_ATVD_SOF'),
-                        linha.get('TXT_PROJ_ATVD'), linha.get('COD_CTA_DESP'), linha.get('TXT_CTA_DESP'),
-                        linha.get('COD_FONT_REC'), linha.get('TXT_FONT_REC'), linha.get('COD_EX_FONT_REC'),
-                        linha.get('COD_DSTN_REC'), linha.get('COD_VINC_REC_PMSP'), linha.get('COD_TIP_CRED_ORCM'),
-                        linha.get('IND_ACTC_REDC'), linha.get('IND_CNTR_COTA_PESL'), linha.get('IND_COTA_PESL'),
-                        linha.get('IND_DOTA_LQDD_PAGO'), linha.get('DT_CRIA_DOTA'), linha.get('VAL_DOTA_AUTR'),
-                        linha.get('VAL_TOT_CRED_SPLM'), linha.get('VAL_TOT_CRED_ESPC'), linha.get('VAL_TOT_CRED_EXT'),
-                        linha.get('VAL_TOT_REDC'), linha.get('ORCADO_ATUAL'), linha.get('VAL_TOT_CNGL'),
-                        linha.get('VAL_TOT_BLOQ_DECR'), linha.get('ORCADO_DISPONIVEL'), linha.get('VAL_SLDO_RESV_DOTA'),
-                        linha.get('SALDO_DOTACAO'), linha.get('VAL_TOT_EPH'), linha.get('VAL_TOT_CANC_EPH'),
-                        linha.get('SALDO_EMPENHADO'), linha.get('SALDO_RESERVADO'), linha.get('VAL_TOT_LQDC_EPH'),
-                        linha.get('VAL_TOT_PGTO_DOTA'), linha.get('IND_EMND_ORCM'), linha.get('DOTACAO_FORMATADA'),
-                        linha.get('IND_DVDA_PUBC'), linha.get('IND_LANC_RCTA')
-                    ))
-                    total_importados += 1
-                except Exception as e:
-                    conn.rollback()
-                    colunas_faltando = [col for col in ['COD_IDT_DOTA', 'COD_ORG_EMP', 'TXT_ORG_EMP'] if col not in linha]
-                    return jsonify({
-                        'success': False,
-                        'error': f'Erro na linha: {str(e)}',
-                        'detalhes': f'Verifique se o CSV tem as colunas corretas. Colunas obrigatórias ausentes: {colunas_faltando if colunas_faltando else "Erro de dados"}'
-                    }), 400
-        
-        conn.commit()
-        
-        # Buscar data atualizada
-        cur.execute("SELECT MAX(criado_em) as ultima FROM gestao_financeira.back_dotacao")
+        cur.execute(sql)
         result = cur.fetchone()
-        data_atual = result[0] if result and result[0] else None
+    finally:
         cur.close()
-        
-        from datetime import datetime
-        data_fmt = data_atual.strftime('%d/%m/%Y') if data_atual else None
-        
+    return result[0].strftime(formato) if result and result[0] else None
+
+
+def _responder_importacao(importar, msg_sem_arquivo, nome_api, *args):
+    """Executa um importador SOF na conexão da requisição e monta a resposta JSON."""
+    conn = get_db()
+    try:
+        resultado = importar(conn, request.files, None, *args)
+        if resultado is None:
+            return jsonify({'success': False, 'error': msg_sem_arquivo}), 400
+        return jsonify(resultado)
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except psycopg2.DataError as e:
+        conn.rollback()
         return jsonify({
-            'success': True,
-            'message': 'Dotação importada com sucesso!',
-            'total_importados': total_importados,
-            'data_atualizacao': data_fmt
-        })
-        
+            'success': False,
+            'error': f'Erro nos dados: {str(e)}',
+            'detalhes': 'Verifique o formato do arquivo CSV e tente novamente.'
+        }), 400
     except Exception as e:
-        print(f"[ERRO] api_importar_dotacao: {str(e)}")
+        conn.rollback()
+        print(f"[ERRO] {nome_api}: {str(e)}")
         import traceback
         traceback.print_exc()
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'detalhes': 'Verifique o formato do arquivo CSV e tente novamente.'
-        }), 500
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@gestao_financeira_bp.route('/api/importar-reservas', methods=['POST'])
+def _importar_dotacao(conn, files, progresso=None):
+    """Importa os CSVs de dotação presentes em `files`. None se nenhum foi enviado."""
+    arquivos = sof_import.arquivos_enviados(
+        files, ['dotacao_3410', 'dotacao_3420', 'dotacao_0810', 'dotacao_9010', 'dotacao_7810']
+    )
+    if not arquivos:
+        return None
+
+    stats = IMPORTACAO_DOTACAO.executar(conn, arquivos, progresso)
+    conn.commit()
+
+    return {
+        'success': True,
+        'message': 'Dotação importada com sucesso!',
+        'total_importados': stats['total_importados'],
+        'estatisticas': stats,
+        'data_atualizacao': _data_ultima_carga(
+            conn, "SELECT MAX(criado_em) as ultima FROM gestao_financeira.back_dotacao"
+        )
+    }
+
+
+@gestao_financeira_bp.route('/api/importar-dotacao', methods=['POST'])
 @login_required
 @requires_access('gestao_financeira')
 @requires_write_access('gestao_financeira')
-def api_importar_reservas():
+def api_importar_dotacao():
     """
-    API para importar arquivos CSV de reservas (sem executor e como executor).
-    Deduplica por (COD_RESV_DOTA_SOF, ANO_RESV).
+    API para importar arquivos CSV de dotação orçamentária
+    """
+    return _responder_importacao(
+        _importar_dotacao, 'Nenhum arquivo de dotação enviado', 'api_importar_dotacao'
+    )
+
+
+_COLUNAS_RESERVAS = [
+    'COD_RESV_DOTA_SOF', 'DT_EFET_RESV', 'ANO_RESV', 'DOTACAO_FORMATADA', 'COD_NRO_PCSS_SOF',
+    'HIST_RESV', 'VL_RESV', 'VL_TRANSF_RESV', 'VL_CANC_RESV', 'VL_EPH', 'VL_SALDO_RESV',
+    'COD_ORG_EMP', 'COD_UNID_ORCM_SOF', 'ORGDESC', 'TXT_UNID_ORCM', 'COD_ORG_EMP_EXEC',
+    'COD_UNID_ORCM_SOF_EXEC', 'TXT_ORG_EMP_EXECT', 'TXT_UNID_ORCM_EXECT',
+    'COD_CATG_ECMC', 'COD_GRUP_DESP', 'COD_MODL_APLC', 'COD_ELEM_DESP', 'COD_SUB_ELEM_CONTA_DESP',
+    'COD_FCAO_GOVR', 'TXT_FCAO_GOVR', 'COD_SUB_FCAO_GOVR', 'TXT_SUB_FCAO_GOVR',
+    'COD_PGM_GOVR', 'TXT_PGM_GOVR', 'COD_PROJ_ATVD_SOF', 'COD_CTA_DESP', 'COD_FONT_REC'
+]
+
+IMPORTACAO_RESERVAS = sof_import.ImportacaoSOF(
+    tabela='gestao_financeira.back_reservas',
+    colunas=_COLUNAS_RESERVAS,
+    obrigatorias=_COLUNAS_RESERVAS,
+    chave=['cod_resv_dota_sof'],
+    set_extra='criado_em = NOW()',
+    colunas_fixas=['fonte_relatorio'],
+)
+
+
+def _importar_reservas(conn, files, progresso=None):
+    """
+    Importa os CSVs de reservas (sem executor e como executor). None se nenhum foi enviado.
+    Deduplica por COD_RESV_DOTA_SOF.
     fonte_relatorio = 'Executor' se a reserva só aparece no arquivo executor;
                     = 'Sem Executor' se aparece em qualquer arquivo sem executor.
     """
-    import csv
-    from io import StringIO
-
-    try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SET datestyle TO 'ISO, DMY'")
-
-        colunas_esperadas = [
-            'COD_RESV_DOTA_SOF', 'DT_EFET_RESV', 'ANO_RESV', 'DOTACAO_FORMATADA', 'COD_NRO_PCSS_SOF',
-            'HIST_RESV', 'VL_RESV', 'VL_TRANSF_RESV', 'VL_CANC_RESV', 'VL_EPH', 'VL_SALDO_RESV',
-            'COD_ORG_EMP', 'COD_UNID_ORCM_SOF', 'ORGDESC', 'TXT_UNID_ORCM', 'COD_ORG_EMP_EXEC',
-            'COD_UNID_ORCM_SOF_EXEC', 'TXT_ORG_EMP_EXECT', 'TXT_UNID_ORCM_EXECT',
-            'COD_CATG_ECMC', 'COD_GRUP_DESP', 'COD_MODL_APLC', 'COD_ELEM_DESP', 'COD_SUB_ELEM_CONTA_DESP',
-            'COD_FCAO_GOVR', 'TXT_FCAO_GOVR', 'COD_SUB_FCAO_GOVR', 'TXT_SUB_FCAO_GOVR',
-            'COD_PGM_GOVR', 'TXT_PGM_GOVR', 'COD_PROJ_ATVD_SOF', 'COD_CTA_DESP', 'COD_FONT_REC'
-        ]
-
-        def ler_csv(nome_campo):
-            """Lê e parseia um arquivo CSV do request. Retorna lista de dicts ou None."""
-            if nome_campo not in request.files:
-                return None
-            arq = request.files[nome_campo]
-            if not arq or arq.filename == '':
-                return None
-            conteudo_bytes = arq.read()
-            for encoding in ['utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']:
-                try:
-                    conteudo = conteudo_bytes.decode(encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError(f'Não foi possível decodificar o arquivo "{nome_campo}"')
-            reader = csv.DictReader(StringIO(conteudo), delimiter=';')
-            linhas = list(reader)
-            if linhas:
-                colunas_csv = list(linhas[0].keys())
-                faltando = [c for c in colunas_esperadas if c not in colunas_csv]
-                if faltando:
-                    raise ValueError(f'Arquivo "{nome_campo}" está faltando colunas: {", ".join(faltando[:5])}')
-            return linhas
-
-        # --- Leitura dos arquivos ---
-        campos_sem_exec = ['reservas_3410', 'reservas_3420', 'reservas_0810', 'reservas_9010', 'reservas_7810']
-        campos_exec     = ['reservas_3410_exec']
-
-        dados_sem_exec = {c: ler_csv(c) for c in campos_sem_exec}
-        dados_exec     = {c: ler_csv(c) for c in campos_exec}
-
-        # Verificar se pelo menos um arquivo foi enviado
-        todos_arquivos = list(dados_sem_exec.values()) + list(dados_exec.values())
-        if not any(v for v in todos_arquivos):
-            return jsonify({'success': False, 'error': 'Nenhum arquivo enviado'}), 400
-
-        # --- Deduplicação por (COD_RESV_DOTA_SOF, ANO_RESV) ---
-        # Executor tem prioridade MENOR: carregado primeiro.
-        # Sem executor tem prioridade MAIOR: sobrescreve exec linha a linha.
-        registros = {}        # chave -> linha dict
-        chaves_sem_exec = set()
-
-        # Primeiro: executor (prioridade menor — será sobrescrito pelo sem_exec)
-        for linhas in dados_exec.values():
-            if not linhas:
-                continue
-            for linha in linhas:
-                cod = (linha.get('COD_RESV_DOTA_SOF') or '').strip()
-                ano = (linha.get('ANO_RESV') or '').strip()
-                chave = (cod, ano)
-                if chave not in registros:
-                    registros[chave] = linha
-
-        # Depois: sem executor (prioridade maior — sobrescreve TODOS os dados do exec se a chave coincidir)
-        for linhas in dados_sem_exec.values():
-            if not linhas:
-                continue
-            for linha in linhas:
-                cod = (linha.get('COD_RESV_DOTA_SOF') or '').strip()
-                ano = (linha.get('ANO_RESV') or '').strip()
-                chave = (cod, ano)
-                if chave not in chaves_sem_exec:   # primeiro arquivo sem_exec com esta chave vence
-                    registros[chave] = linha       # sobrescreve exec se necessário
-                chaves_sem_exec.add(chave)
-
-        # --- Inserção no banco ---
-        total_importados = 0
-        for chave, linha in registros.items():
-            fonte = 'Sem Executor' if chave in chaves_sem_exec else 'Executor'
-            try:
-                cur.execute("""
-                    INSERT INTO gestao_financeira.back_reservas (
-                        COD_RESV_DOTA_SOF, DT_EFET_RESV, ANO_RESV, DOTACAO_FORMATADA, COD_NRO_PCSS_SOF,
-                        HIST_RESV, VL_RESV, VL_TRANSF_RESV, VL_CANC_RESV, VL_EPH, VL_SALDO_RESV,
-                        COD_ORG_EMP, COD_UNID_ORCM_SOF, ORGDESC, TXT_UNID_ORCM, COD_ORG_EMP_EXEC,
-                        COD_UNID_ORCM_SOF_EXEC, TXT_ORG_EMP_EXECT, TXT_UNID_ORCM_EXECT,
-                        COD_CATG_ECMC, COD_GRUP_DESP, COD_MODL_APLC, COD_ELEM_DESP, COD_SUB_ELEM_CONTA_DESP,
-                        COD_FCAO_GOVR, TXT_FCAO_GOVR, COD_SUB_FCAO_GOVR, TXT_SUB_FCAO_GOVR,
-                        COD_PGM_GOVR, TXT_PGM_GOVR, COD_PROJ_ATVD_SOF, COD_CTA_DESP, COD_FONT_REC,
-                        fonte_relatorio
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                    ON CONFLICT (COD_RESV_DOTA_SOF) DO UPDATE SET
-                        DT_EFET_RESV            = EXCLUDED.DT_EFET_RESV,
-                        ANO_RESV                = EXCLUDED.ANO_RESV,
-                        DOTACAO_FORMATADA       = EXCLUDED.DOTACAO_FORMATADA,
-                        COD_NRO_PCSS_SOF        = EXCLUDED.COD_NRO_PCSS_SOF,
-                        HIST_RESV               = EXCLUDED.HIST_RESV,
-                        VL_RESV                 = EXCLUDED.VL_RESV,
-                        VL_TRANSF_RESV          = EXCLUDED.VL_TRANSF_RESV,
-                        VL_CANC_RESV            = EXCLUDED.VL_CANC_RESV,
-                        VL_EPH                  = EXCLUDED.VL_EPH,
-                        VL_SALDO_RESV           = EXCLUDED.VL_SALDO_RESV,
-                        COD_ORG_EMP             = EXCLUDED.COD_ORG_EMP,
-                        COD_UNID_ORCM_SOF       = EXCLUDED.COD_UNID_ORCM_SOF,
-                        ORGDESC                 = EXCLUDED.ORGDESC,
-                        TXT_UNID_ORCM           = EXCLUDED.TXT_UNID_ORCM,
-                        COD_ORG_EMP_EXEC        = EXCLUDED.COD_ORG_EMP_EXEC,
-                        COD_UNID_ORCM_SOF_EXEC  = EXCLUDED.COD_UNID_ORCM_SOF_EXEC,
-                        TXT_ORG_EMP_EXECT       = EXCLUDED.TXT_ORG_EMP_EXECT,
-                        TXT_UNID_ORCM_EXECT     = EXCLUDED.TXT_UNID_ORCM_EXECT,
-                        COD_CATG_ECMC           = EXCLUDED.COD_CATG_ECMC,
-                        COD_GRUP_DESP           = EXCLUDED.COD_GRUP_DESP,
-                        COD_MODL_APLC           = EXCLUDED.COD_MODL_APLC,
-                        COD_ELEM_DESP           = EXCLUDED.COD_ELEM_DESP,
-                        COD_SUB_ELEM_CONTA_DESP = EXCLUDED.COD_SUB_ELEM_CONTA_DESP,
-                        COD_FCAO_GOVR           = EXCLUDED.COD_FCAO_GOVR,
-                        TXT_FCAO_GOVR           = EXCLUDED.TXT_FCAO_GOVR,
-                        COD_SUB_FCAO_GOVR       = EXCLUDED.COD_SUB_FCAO_GOVR,
-                        TXT_SUB_FCAO_GOVR       = EXCLUDED.TXT_SUB_FCAO_GOVR,
-                        COD_PGM_GOVR            = EXCLUDED.COD_PGM_GOVR,
-                        TXT_PGM_GOVR            = EXCLUDED.TXT_PGM_GOVR,
-                        COD_PROJ_ATVD_SOF       = EXCLUDED.COD_PROJ_ATVD_SOF,
-                        COD_CTA_DESP            = EXCLUDED.COD_CTA_DESP,
-                        COD_FONT_REC            = EXCLUDED.COD_FONT_REC,
-                        fonte_relatorio         = EXCLUDED.fonte_relatorio,
-                        criado_em               = NOW()
-                """, (
-                    linha.get('COD_RESV_DOTA_SOF'), linha.get('DT_EFET_RESV'), linha.get('ANO_RESV'),
-                    linha.get('DOTACAO_FORMATADA'), linha.get('COD_NRO_PCSS_SOF'), linha.get('HIST_RESV'),
-                    linha.get('VL_RESV'), linha.get('VL_TRANSF_RESV'), linha.get('VL_CANC_RESV'),
-                    linha.get('VL_EPH'), linha.get('VL_SALDO_RESV'), linha.get('COD_ORG_EMP'),
-                    linha.get('COD_UNID_ORCM_SOF'), linha.get('ORGDESC'), linha.get('TXT_UNID_ORCM'),
-                    linha.get('COD_ORG_EMP_EXEC'), linha.get('COD_UNID_ORCM_SOF_EXEC'),
-                    linha.get('TXT_ORG_EMP_EXECT'), linha.get('TXT_UNID_ORCM_EXECT'),
-                    linha.get('COD_CATG_ECMC'), linha.get('COD_GRUP_DESP'), linha.get('COD_MODL_APLC'),
-                    linha.get('COD_ELEM_DESP'), linha.get('COD_SUB_ELEM_CONTA_DESP'),
-                    linha.get('COD_FCAO_GOVR'), linha.get('TXT_FCAO_GOVR'), linha.get('COD_SUB_FCAO_GOVR'),
-                    linha.get('TXT_SUB_FCAO_GOVR'), linha.get('COD_PGM_GOVR'), linha.get('TXT_PGM_GOVR'),
-                    linha.get('COD_PROJ_ATVD_SOF'), linha.get('COD_CTA_DESP'), linha.get('COD_FONT_REC'),
-                    fonte
-                ))
-                total_importados += 1
-            except Exception as e:
-                conn.rollback()
-                return jsonify({
-                    'success': False,
-                    'error': f'Erro ao inserir linha: {str(e)}',
-                    'detalhes': 'Verifique se o CSV tem todas as colunas necessárias.'
-                }), 400
-
-        conn.commit()
-
-        cur.execute("SELECT MAX(criado_em) as ultima FROM gestao_financeira.back_reservas")
-        result = cur.fetchone()
-        data_atual = result[0] if result and result[0] else None
-        cur.close()
-
-        from datetime import datetime
-        data_fmt = data_atual.strftime('%d/%m/%Y') if data_atual else None
-
-        return jsonify({
-            'success': True,
-            'message': 'Reservas importadas com sucesso!',
-            'total_importados': total_importados,
-            'data_atualizacao': data_fmt
-        })
-
-    except ValueError as e:
-        return jsonify({'success': False, 'error': str(e)}), 400
-    except Exception as e:
-        print(f"[ERRO] api_importar_reservas: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': str(e)}), 500
+    # Sem executor tem prioridade MAIOR (0): sobrescreve o executor quando a chave coincidir;
+    # entre arquivos da mesma prioridade, o primeiro vence.
+    arquivos = sof_import.arquivos_enviados(
+        files,
+        ['reservas_3410', 'reservas_3420', 'reservas_0810', 'reservas_9010', 'reservas_7810'],
+        prioridade=0, fixos={'fonte_relatorio': 'Sem Executor'}
+    ) + sof_import.arquivos_enviados(
+        files, ['reservas_3410_exec'],
+        prioridade=1, fixos={'fonte_relatorio': 'Executor'}
+    )
+    if not arquivos:
+        return None
+
+    stats = IMPORTACAO_RESERVAS.executar(conn, arquivos, progresso)
+    conn.commit()
+
+    return {
+        'success': True,
+        'message': 'Reservas importadas com sucesso!',
+        'total_importados': stats['total_importados'],
+        'estatisticas': stats,
+        'data_atualizacao': _data_ultima_carga(
+            conn, "SELECT MAX(criado_em) as ultima FROM gestao_financeira.back_reservas"
+        )
+    }
 
 
-@gestao_financeira_bp.route('/api/importar-empenhos', methods=['POST'])
+@gestao_financeira_bp.route('/api/importar-reservas', methods=['POST'])
 @login_required
 @requires_access('gestao_financeira')
 @requires_write_access('gestao_financeira')
-def api_importar_empenhos():
+def api_importar_reservas():
     """
-    Importa CSVs de Empenhos (5 sem executor + 1 como executor).
+    API para importar arquivos CSV de reservas (sem executor e como executor).
+    """
+    return _responder_importacao(
+        _importar_reservas, 'Nenhum arquivo enviado', 'api_importar_reservas'
+    )
+
+
+def _normalizados_empenho(valores):
+    """Colunas derivadas gravadas na importação (ver core.empenhos_saldos)."""
+    return tuple(
+        empenhos_saldos.valor_sof_decimal(valores[c.lower()])
+        for c in empenhos_saldos.COLUNAS_VALOR
+    ) + (empenhos_saldos.normalizar_processo_sof(valores['cod_nro_pcss_sof']),)
+
+
+IMPORTACAO_EMPENHOS = sof_import.ImportacaoSOF(
+    tabela='gestao_financeira.back_empenhos',
+    colunas=[
+        'COD_IDT_EPH', 'DT_EPH', 'COD_EPH', 'ANO_EPH', 'COD_TIP_EPH_SOF', 'COD_NRO_PCSS_SOF',
+        'COD_TIP_DOC', 'COD_IDT_MODL_LICI', 'TXT_OBS_EPH', 'VAL_TOT_EPH', 'VAL_TOT_CANC_EPH',
+        'VAL_TOT_LQDC_EPH', 'VAL_TOT_PAGO_EPH', 'VAL_TOT_A_LIQ_EPH', 'VAL_TOT_A_PAG_EPH',
+        'COD_IDT_CRDR_SOF', 'NOM_RZAO_SOCI_SOF', 'COD_NAT_CRDR', 'COD_CPF_CNPJ_SOF',
+        'COD_IDT_ITEM_DESP', 'COD_ITEM_DESP_SOF', 'TXT_ITEM_DESP', 'COD_IDT_SUB_ELEM',
+        'COD_SUB_ELEM_DESP', 'TXT_SUB_ELEM', 'COD_IDT_CTA_DESP', 'IND_CTA_SINT_ANLT',
+        'COD_CATG_ECMC', 'COD_GRUP_DESP', 'COD_MODL_APLC', 'COD_ELEM_DESP',
+        'COD_SUB_ELEM_CONTA_DESP', 'COD_IDT_FCAO_GOVR', 'COD_IDT_SUB_FCAO',
+        'COD_IDT_PGM_GOVR', 'COD_IDT_PROJ_ATVD', 'COD_ORG_EMP_EXECT', 'TXT_ORG_EMP_EXECT',
+        'COD_UNID_ORCM_SOF_EXECT', 'TXT_UNID_ORCM_EXECT', 'TXT_DOTACAO_FMT',
+        'COD_FCAO_GOVR', 'TXT_FCAO_GOVR', 'COD_PGM_GOVR', 'TXT_PGM_GOVR',
+        'COD_SUB_FCAO_GOVR', 'TXT_SUB_FCAO_GOVR', 'COD_PROJ_ATVD_SOF_P', 'TXT_PROJ_ATVD_P',
+        'COD_MODL_LICI_SOF', 'TXT_MODL_LICI', 'COD_EMP_PMSP', 'NOM_EMP_SOF',
+        'COD_IDT_FONT_REC', 'COD_IDT_DOTA', 'COD_IDT_CTA_DESP1', 'COD_CTA_DESP',
+        'TXT_CTA_DESP', 'COD_FONT_REC', 'TXT_FONT_REC', 'COD_FONT_REC_EXEC',
+        'TXT_FONT_REC_EXEC', 'COD_CAR', 'DESC_CAR'
+    ],
+    chave=['cod_idt_eph'],
+    set_extra='atualizado_em = NOW()',
+    colunas_fixas=['fonte_relatorio'],
+    derivadas=(list(empenhos_saldos.COLUNAS_VALOR.values()) + ['cod_pcss_norm'], _normalizados_empenho),
+)
+
+
+def _importar_empenhos(conn, files, progresso=None):
+    """
+    Importa CSVs de Empenhos (5 sem executor + 1 como executor). None se nenhum foi enviado.
     Deduplica por COD_IDT_EPH (PK do SOF a nível de item).
     fonte_relatorio = 'Sem Executor' ou 'Executor'.
     """
-    import csv
-    from io import StringIO
-    from datetime import datetime
-    import psycopg2.extras
+    # Sem executor sobrescreve executor quando a chave coincidir; primeiro arquivo sem_exec vence.
+    arquivos = sof_import.arquivos_enviados(
+        files,
+        ['empenhos_3410', 'empenhos_3420', 'empenhos_0810', 'empenhos_9010', 'empenhos_7810'],
+        prioridade=0, fixos={'fonte_relatorio': 'Sem Executor'}
+    ) + sof_import.arquivos_enviados(
+        files, ['empenhos_3410_exec'],
+        prioridade=1, fixos={'fonte_relatorio': 'Executor'}
+    )
+    if not arquivos:
+        return None
 
-    conn = get_db()
     cur = conn.cursor()
     try:
-        cur.execute("SET statement_timeout = 0")
-        cur.execute("SET datestyle TO 'ISO, DMY'")
+        cur.execute("SET LOCAL statement_timeout = 0")
 
         # DDL guard: fonte_relatorio
         cur.execute("""
@@ -1871,218 +1708,76 @@ def api_importar_empenhos():
                 ADD COLUMN atualizado_em TIMESTAMP WITHOUT TIME ZONE
             """)
 
-        colunas_insert = [
-            'COD_IDT_EPH', 'DT_EPH', 'COD_EPH', 'ANO_EPH', 'COD_TIP_EPH_SOF', 'COD_NRO_PCSS_SOF',
-            'COD_TIP_DOC', 'COD_IDT_MODL_LICI', 'TXT_OBS_EPH', 'VAL_TOT_EPH', 'VAL_TOT_CANC_EPH',
-            'VAL_TOT_LQDC_EPH', 'VAL_TOT_PAGO_EPH', 'VAL_TOT_A_LIQ_EPH', 'VAL_TOT_A_PAG_EPH',
-            'COD_IDT_CRDR_SOF', 'NOM_RZAO_SOCI_SOF', 'COD_NAT_CRDR', 'COD_CPF_CNPJ_SOF',
-            'COD_IDT_ITEM_DESP', 'COD_ITEM_DESP_SOF', 'TXT_ITEM_DESP', 'COD_IDT_SUB_ELEM',
-            'COD_SUB_ELEM_DESP', 'TXT_SUB_ELEM', 'COD_IDT_CTA_DESP', 'IND_CTA_SINT_ANLT',
-            'COD_CATG_ECMC', 'COD_GRUP_DESP', 'COD_MODL_APLC', 'COD_ELEM_DESP',
-            'COD_SUB_ELEM_CONTA_DESP', 'COD_IDT_FCAO_GOVR', 'COD_IDT_SUB_FCAO',
-            'COD_IDT_PGM_GOVR', 'COD_IDT_PROJ_ATVD', 'COD_ORG_EMP_EXECT', 'TXT_ORG_EMP_EXECT',
-            'COD_UNID_ORCM_SOF_EXECT', 'TXT_UNID_ORCM_EXECT', 'TXT_DOTACAO_FMT',
-            'COD_FCAO_GOVR', 'TXT_FCAO_GOVR', 'COD_PGM_GOVR', 'TXT_PGM_GOVR',
-            'COD_SUB_FCAO_GOVR', 'TXT_SUB_FCAO_GOVR', 'COD_PROJ_ATVD_SOF_P', 'TXT_PROJ_ATVD_P',
-            'COD_MODL_LICI_SOF', 'TXT_MODL_LICI', 'COD_EMP_PMSP', 'NOM_EMP_SOF',
-            'COD_IDT_FONT_REC', 'COD_IDT_DOTA', 'COD_IDT_CTA_DESP1', 'COD_CTA_DESP',
-            'TXT_CTA_DESP', 'COD_FONT_REC', 'TXT_FONT_REC', 'COD_FONT_REC_EXEC',
-            'TXT_FONT_REC_EXEC', 'COD_CAR', 'DESC_CAR'
-        ]
-        colunas_integer = {
-            'COD_IDT_EPH', 'COD_EPH', 'ANO_EPH', 'COD_IDT_MODL_LICI', 'COD_IDT_CRDR_SOF',
-            'COD_IDT_ITEM_DESP', 'COD_ITEM_DESP_SOF', 'COD_IDT_SUB_ELEM', 'COD_SUB_ELEM_DESP',
-            'COD_IDT_CTA_DESP', 'COD_CATG_ECMC', 'COD_GRUP_DESP', 'COD_MODL_APLC', 'COD_ELEM_DESP',
-            'COD_SUB_ELEM_CONTA_DESP', 'COD_IDT_FCAO_GOVR', 'COD_IDT_SUB_FCAO', 'COD_IDT_PGM_GOVR',
-            'COD_IDT_PROJ_ATVD', 'COD_ORG_EMP_EXECT', 'COD_UNID_ORCM_SOF_EXECT', 'COD_FCAO_GOVR',
-            'COD_PGM_GOVR', 'COD_SUB_FCAO_GOVR', 'COD_PROJ_ATVD_SOF_P', 'COD_MODL_LICI_SOF',
-            'COD_EMP_PMSP', 'COD_IDT_FONT_REC', 'COD_IDT_DOTA', 'COD_IDT_CTA_DESP1', 'COD_CAR'
-        }
-
-        def ler_csv_emp(nome_campo):
-            if nome_campo not in request.files:
-                return None
-            arq = request.files[nome_campo]
-            if not arq or arq.filename == '':
-                return None
-            b = arq.read()
-            for enc in ['utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']:
-                try:
-                    conteudo = b.decode(enc)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError(f'Não foi possível decodificar "{nome_campo}"')
-            reader = csv.DictReader(StringIO(conteudo), delimiter=';')
-            return list(reader)
-
-        campos_sem_exec = ['empenhos_3410', 'empenhos_3420', 'empenhos_0810', 'empenhos_9010', 'empenhos_7810']
-        campos_exec     = ['empenhos_3410_exec']
-
-        dados_sem_exec = {c: ler_csv_emp(c) for c in campos_sem_exec}
-        dados_exec     = {c: ler_csv_emp(c) for c in campos_exec}
-
-        if not any(v for v in list(dados_sem_exec.values()) + list(dados_exec.values())):
-            return jsonify({'success': False, 'error': 'Nenhum arquivo de empenhos enviado'}), 400
-
-        # Dedup por COD_IDT_EPH (PK do banco = identificador de item do SOF).
-        # Executor tem prioridade MENOR: carregado primeiro.
-        # Sem executor sobrescreve executor quando a chave coincidir; primeiro arquivo sem_exec vence.
-        registros = {}  # cod_idt_eph -> (linha, fonte)
-
-        for linhas in dados_exec.values():
-            if not linhas:
-                continue
-            for linha in linhas:
-                idt = (linha.get('COD_IDT_EPH') or '').strip()
-                if idt and idt not in registros:
-                    registros[idt] = (linha, 'Executor')
+        # DDL guard: valores numéricos, chave de processo normalizada e tabela de saldos
+        empenhos_saldos.garantir_estrutura(cur)
+
+        # Processos afetados = chaves novas + chaves antigas dos mesmos empenhos
+        # (um COD_IDT_EPH pode ter mudado de processo no SOF)
+        processos_afetados = set()
+
+        def capturar_processos(cur_stg, staging):
+            cur_stg.execute(f"""
+                SELECT cod_pcss_norm FROM {staging}
+                WHERE cod_pcss_norm IS NOT NULL
+                UNION
+                SELECT e.cod_pcss_norm
+                FROM gestao_financeira.back_empenhos e
+                JOIN {staging} s ON e.cod_idt_eph = s.cod_idt_eph::bigint
+                WHERE e.cod_pcss_norm IS NOT NULL
+            """)
+            processos_afetados.update(r[0] for r in cur_stg.fetchall())
 
-        for linhas in dados_sem_exec.values():
-            if not linhas:
-                continue
-            for linha in linhas:
-                idt = (linha.get('COD_IDT_EPH') or '').strip()
-                if idt:
-                    if idt not in registros or registros[idt][1] == 'Executor':
-                        registros[idt] = (linha, 'Sem Executor')
-
-        def val(linha, col):
-            v = (linha.get(col) or '').strip()
-            if v.startswith('="') and v.endswith('"'):
-                v = v[2:-1]
-            if not v and col in colunas_integer:
-                return None
-            return v or None
-
-        sql_upsert = """
-            INSERT INTO gestao_financeira.back_empenhos (
-                COD_IDT_EPH, DT_EPH, COD_EPH, ANO_EPH, COD_TIP_EPH_SOF, COD_NRO_PCSS_SOF,
-                COD_TIP_DOC, COD_IDT_MODL_LICI, TXT_OBS_EPH, VAL_TOT_EPH, VAL_TOT_CANC_EPH,
-                VAL_TOT_LQDC_EPH, VAL_TOT_PAGO_EPH, VAL_TOT_A_LIQ_EPH, VAL_TOT_A_PAG_EPH,
-                COD_IDT_CRDR_SOF, NOM_RZAO_SOCI_SOF, COD_NAT_CRDR, COD_CPF_CNPJ_SOF,
-                COD_IDT_ITEM_DESP, COD_ITEM_DESP_SOF, TXT_ITEM_DESP, COD_IDT_SUB_ELEM,
-                COD_SUB_ELEM_DESP, TXT_SUB_ELEM, COD_IDT_CTA_DESP, IND_CTA_SINT_ANLT,
-                COD_CATG_ECMC, COD_GRUP_DESP, COD_MODL_APLC, COD_ELEM_DESP,
-                COD_SUB_ELEM_CONTA_DESP, COD_IDT_FCAO_GOVR, COD_IDT_SUB_FCAO,
-                COD_IDT_PGM_GOVR, COD_IDT_PROJ_ATVD, COD_ORG_EMP_EXECT, TXT_ORG_EMP_EXECT,
-                COD_UNID_ORCM_SOF_EXECT, TXT_UNID_ORCM_EXECT, TXT_DOTACAO_FMT,
-                COD_FCAO_GOVR, TXT_FCAO_GOVR, COD_PGM_GOVR, TXT_PGM_GOVR,
-                COD_SUB_FCAO_GOVR, TXT_SUB_FCAO_GOVR, COD_PROJ_ATVD_SOF_P, TXT_PROJ_ATVD_P,
-                COD_MODL_LICI_SOF, TXT_MODL_LICI, COD_EMP_PMSP, NOM_EMP_SOF,
-                COD_IDT_FONT_REC, COD_IDT_DOTA, COD_IDT_CTA_DESP1, COD_CTA_DESP,
-                TXT_CTA_DESP, COD_FONT_REC, TXT_FONT_REC, COD_FONT_REC_EXEC,
-                TXT_FONT_REC_EXEC, COD_CAR, DESC_CAR, fonte_relatorio
-            ) VALUES (
-                %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,
-                %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,
-                %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s
-            )
-            ON CONFLICT (COD_IDT_EPH) DO UPDATE SET
-                DT_EPH                  = EXCLUDED.DT_EPH,
-                COD_EPH                 = EXCLUDED.COD_EPH,
-                ANO_EPH                 = EXCLUDED.ANO_EPH,
-                COD_TIP_EPH_SOF         = EXCLUDED.COD_TIP_EPH_SOF,
-                COD_NRO_PCSS_SOF        = EXCLUDED.COD_NRO_PCSS_SOF,
-                COD_TIP_DOC             = EXCLUDED.COD_TIP_DOC,
-                COD_IDT_MODL_LICI       = EXCLUDED.COD_IDT_MODL_LICI,
-                TXT_OBS_EPH             = EXCLUDED.TXT_OBS_EPH,
-                VAL_TOT_EPH             = EXCLUDED.VAL_TOT_EPH,
-                VAL_TOT_CANC_EPH        = EXCLUDED.VAL_TOT_CANC_EPH,
-                VAL_TOT_LQDC_EPH        = EXCLUDED.VAL_TOT_LQDC_EPH,
-                VAL_TOT_PAGO_EPH        = EXCLUDED.VAL_TOT_PAGO_EPH,
-                VAL_TOT_A_LIQ_EPH       = EXCLUDED.VAL_TOT_A_LIQ_EPH,
-                VAL_TOT_A_PAG_EPH       = EXCLUDED.VAL_TOT_A_PAG_EPH,
-                COD_IDT_CRDR_SOF        = EXCLUDED.COD_IDT_CRDR_SOF,
-                NOM_RZAO_SOCI_SOF       = EXCLUDED.NOM_RZAO_SOCI_SOF,
-                COD_NAT_CRDR            = EXCLUDED.COD_NAT_CRDR,
-                COD_CPF_CNPJ_SOF        = EXCLUDED.COD_CPF_CNPJ_SOF,
-                COD_IDT_ITEM_DESP       = EXCLUDED.COD_IDT_ITEM_DESP,
-                COD_ITEM_DESP_SOF       = EXCLUDED.COD_ITEM_DESP_SOF,
-                TXT_ITEM_DESP           = EXCLUDED.TXT_ITEM_DESP,
-                COD_IDT_SUB_ELEM        = EXCLUDED.COD_IDT_SUB_ELEM,
-                COD_SUB_ELEM_DESP       = EXCLUDED.COD_SUB_ELEM_DESP,
-                TXT_SUB_ELEM            = EXCLUDED.TXT_SUB_ELEM,
-                COD_IDT_CTA_DESP        = EXCLUDED.COD_IDT_CTA_DESP,
-                IND_CTA_SINT_ANLT       = EXCLUDED.IND_CTA_SINT_ANLT,
-                COD_CATG_ECMC           = EXCLUDED.COD_CATG_ECMC,
-                COD_GRUP_DESP           = EXCLUDED.COD_GRUP_DESP,
-                COD_MODL_APLC           = EXCLUDED.COD_MODL_APLC,
-                COD_ELEM_DESP           = EXCLUDED.COD_ELEM_DESP,
-                COD_SUB_ELEM_CONTA_DESP = EXCLUDED.COD_SUB_ELEM_CONTA_DESP,
-                COD_IDT_FCAO_GOVR       = EXCLUDED.COD_IDT_FCAO_GOVR,
-                COD_IDT_SUB_FCAO        = EXCLUDED.COD_IDT_SUB_FCAO,
-                COD_IDT_PGM_GOVR        = EXCLUDED.COD_IDT_PGM_GOVR,
-                COD_IDT_PROJ_ATVD       = EXCLUDED.COD_IDT_PROJ_ATVD,
-                COD_ORG_EMP_EXECT       = EXCLUDED.COD_ORG_EMP_EXECT,
-                TXT_ORG_EMP_EXECT       = EXCLUDED.TXT_ORG_EMP_EXECT,
-                COD_UNID_ORCM_SOF_EXECT = EXCLUDED.COD_UNID_ORCM_SOF_EXECT,
-                TXT_UNID_ORCM_EXECT     = EXCLUDED.TXT_UNID_ORCM_EXECT,
-                TXT_DOTACAO_FMT         = EXCLUDED.TXT_DOTACAO_FMT,
-                COD_FCAO_GOVR           = EXCLUDED.COD_FCAO_GOVR,
-                TXT_FCAO_GOVR           = EXCLUDED.TXT_FCAO_GOVR,
-                COD_PGM_GOVR            = EXCLUDED.COD_PGM_GOVR,
-                TXT_PGM_GOVR            = EXCLUDED.TXT_PGM_GOVR,
-                COD_SUB_FCAO_GOVR       = EXCLUDED.COD_SUB_FCAO_GOVR,
-                TXT_SUB_FCAO_GOVR       = EXCLUDED.TXT_SUB_FCAO_GOVR,
-                COD_PROJ_ATVD_SOF_P     = EXCLUDED.COD_PROJ_ATVD_SOF_P,
-                TXT_PROJ_ATVD_P         = EXCLUDED.TXT_PROJ_ATVD_P,
-                COD_MODL_LICI_SOF       = EXCLUDED.COD_MODL_LICI_SOF,
-                TXT_MODL_LICI           = EXCLUDED.TXT_MODL_LICI,
-                COD_EMP_PMSP            = EXCLUDED.COD_EMP_PMSP,
-                NOM_EMP_SOF             = EXCLUDED.NOM_EMP_SOF,
-                COD_IDT_FONT_REC        = EXCLUDED.COD_IDT_FONT_REC,
-                COD_IDT_DOTA            = EXCLUDED.COD_IDT_DOTA,
-                COD_IDT_CTA_DESP1       = EXCLUDED.COD_IDT_CTA_DESP1,
-                COD_CTA_DESP            = EXCLUDED.COD_CTA_DESP,
-                TXT_CTA_DESP            = EXCLUDED.TXT_CTA_DESP,
-                COD_FONT_REC            = EXCLUDED.COD_FONT_REC,
-                TXT_FONT_REC            = EXCLUDED.TXT_FONT_REC,
-                COD_FONT_REC_EXEC       = EXCLUDED.COD_FONT_REC_EXEC,
-                TXT_FONT_REC_EXEC       = EXCLUDED.TXT_FONT_REC_EXEC,
-                COD_CAR                 = EXCLUDED.COD_CAR,
-                DESC_CAR                = EXCLUDED.DESC_CAR,
-                fonte_relatorio         = EXCLUDED.fonte_relatorio,
-                atualizado_em           = NOW()
-        """
+        stats = IMPORTACAO_EMPENHOS.executar(
+            conn, arquivos, progresso, antes_de_mesclar=capturar_processos
+        )
+        saldos_recalculados = empenhos_saldos.atualizar_saldos(cur, processos_afetados)
+        # Dotação orçamentária exibida na listagem de parcerias
+        parcerias_resumo.marcar_por_processos(cur, processos_afetados)
+        conn.commit()
+    finally:
+        cur.close()
 
-        batch = [
-            tuple(val(linha, c) for c in colunas_insert) + (fonte,)
-            for linha, fonte in registros.values()
-        ]
+    return {
+        'success': True,
+        'message': 'Empenhos importados com sucesso!',
+        'total_importados': stats['total_importados'],
+        'estatisticas': stats,
+        'saldos_recalculados': saldos_recalculados,
+        'data_atualizacao': _data_ultima_carga(
+            conn,
+            "SELECT MAX(COALESCE(atualizado_em, criado_em)) as ultima FROM gestao_financeira.back_empenhos"
+        )
+    }
 
-        psycopg2.extras.execute_batch(cur, sql_upsert, batch, page_size=500)
-        conn.commit()
 
-        cur.execute("SELECT MAX(COALESCE(atualizado_em, criado_em)) as ultima FROM gestao_financeira.back_empenhos")
-        result = cur.fetchone()
-        data_atual = result[0] if result and result[0] else None
+@gestao_financeira_bp.route('/api/importar-empenhos', methods=['POST'])
+@login_required
+@requires_access('gestao_financeira')
+@requires_write_access('gestao_financeira')
+def api_importar_empenhos():
+    """
+    Importa CSVs de Empenhos (5 sem executor + 1 como executor).
+    """
+    return _responder_importacao(
+        _importar_empenhos, 'Nenhum arquivo de empenhos enviado', 'api_importar_empenhos'
+    )
 
-        data_fmt = data_atual.strftime('%d/%m/%Y') if data_atual else None
 
-        return jsonify({
-            'success': True,
-            'message': 'Empenhos importados com sucesso!',
-            'total_importados': len(batch),
-            'data_atualizacao': data_fmt
-        })
+# Ordem da importação geral: (chave no resultado, importador, precisa do usuário)
+_IMPORTADORES_SOF = [
+    ('dotacao', '_importar_dotacao', False),
+    ('reservas', '_importar_reservas', False),
+    ('empenhos', '_importar_empenhos', False),
+    ('liquidacao', '_importar_liquidacao', True),
+]
 
-    except ValueError as e:
-        conn.rollback()
-        return jsonify({'success': False, 'error': str(e)}), 400
-    except Exception as e:
-        conn.rollback()
-        print(f"[ERRO] api_importar_empenhos: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        try:
-            cur.execute("RESET statement_timeout")
-        except Exception:
-            pass
-        cur.close()
+_PCT_ETAPA_SOF = {'lendo': 5, 'arquivo_carregado': 10, 'mesclando': 15, 'concluido': 24}
+_ROTULO_ETAPA_SOF = {
+    'lendo': 'lendo arquivos',
+    'arquivo_carregado': 'arquivo carregado',
+    'mesclando': 'gravando no banco',
+    'concluido': 'concluído',
+}
 
 
 @gestao_financeira_bp.route('/api/importar-todos', methods=['POST'])
@@ -2091,88 +1786,46 @@ def api_importar_empenhos():
 @requires_write_access('gestao_financeira')
 def api_importar_todos():
     """
-    API para importar todos os arquivos CSV de uma vez
+    API para importar todos os arquivos CSV de uma vez.
+
+    Os uploads são gravados em disco e a importação roda em background
+    (core.jobs). Retorna 202 + task_id para polling em /api/tarefa/<task_id>;
+    409 se já houver importação em andamento.
     """
+    import shutil
+    import tempfile
+    from werkzeug.utils import secure_filename
+
+    pasta = tempfile.mkdtemp(prefix='sof_import_')
     try:
-        resultados = {
-            'dotacao_importados': 0,
-            'reservas_importados': 0,
-            'empenhos_importados': 0,
-            'liquidacao_importados': 0,
-            'datas': {}
-        }
-        
-        # Importar Dotação
-        arquivos_dotacao = ['dotacao_3410', 'dotacao_3420', 'dotacao_0810', 'dotacao_9010', 'dotacao_7810']
-        tem_dotacao = any(key in request.files and request.files[key].filename != '' for key in arquivos_dotacao)
-        
-        if tem_dotacao:
-            resp = api_importar_dotacao()
-            data = resp.get_json() if hasattr(resp, 'get_json') else {}
-            if data.get('success'):
-                resultados['dotacao_importados'] = data.get('total_importados', 0)
-                resultados['datas']['dotacao'] = data.get('data_atualizacao')
-            else:
-                try: get_db().rollback()
-                except: pass
-        
-        # Importar Reservas
-        arquivos_reservas = ['reservas_3410', 'reservas_3420', 'reservas_0810', 'reservas_9010', 'reservas_7810', 'reservas_3410_exec']
-        tem_reservas = any(key in request.files and request.files[key].filename != '' for key in arquivos_reservas)
-
-        if tem_reservas:
-            resp = api_importar_reservas()
-            data = resp.get_json() if hasattr(resp, 'get_json') else {}
-            if data.get('success'):
-                resultados['reservas_importados'] = data.get('total_importados', 0)
-                resultados['datas']['reservas'] = data.get('data_atualizacao')
-            else:
-                try: get_db().rollback()
-                except: pass
-        
-        # Importar Empenhos
-        arquivos_empenhos = ['empenhos_3410', 'empenhos_3420', 'empenhos_0810', 'empenhos_9010', 'empenhos_7810', 'empenhos_3410_exec']
-        tem_empenhos = any(key in request.files and request.files[key].filename != '' for key in arquivos_empenhos)
-        
-        if tem_empenhos:
-            resp = api_importar_empenhos()
-            data = resp.get_json() if hasattr(resp, 'get_json') else {}
-            if data.get('success'):
-                resultados['empenhos_importados'] = data.get('total_importados', 0)
-                resultados['datas']['empenhos'] = data.get('data_atualizacao')
-            else:
-                try: get_db().rollback()
-                except: pass
-
-        # Importar Liquidação
-        arquivos_liquidacao = ['liquidacao_3410', 'liquidacao_3420', 'liquidacao_0810', 'liquidacao_9010', 'liquidacao_7810']
-        tem_liquidacao = any(key in request.files and request.files[key].filename != '' for key in arquivos_liquidacao)
-
-        if tem_liquidacao:
-            resp = api_importar_liquidacao()
-            data = resp.get_json() if hasattr(resp, 'get_json') else {}
-            if data.get('success'):
-                resultados['liquidacao_importados'] = data.get('total_importados', 0)
-                resultados['datas']['liquidacao'] = data.get('data_atualizacao')
-            else:
-                try: get_db().rollback()
-                except: pass
-        
-        total_geral = sum([
-            resultados['dotacao_importados'],
-            resultados['reservas_importados'],
-            resultados['empenhos_importados'],
-            resultados['liquidacao_importados'],
-        ])
-        
+        salvos = {}
+        for campo, arquivo in request.files.items():
+            if not arquivo or not arquivo.filename:
+                continue
+            caminho = os.path.join(pasta, secure_filename(campo))
+            arquivo.save(caminho)
+            salvos[campo] = (caminho, arquivo.filename)
+
+        if not salvos:
+            shutil.rmtree(pasta, ignore_errors=True)
+            return jsonify({'success': False, 'error': 'Nenhum arquivo enviado'}), 400
+
+        task_id = jobs.submeter(
+            'importar_sof', _job_importar_todos, pasta, salvos,
+            session.get('username', 'Sistema'),
+            usuario=session.get('email'), chave_exclusiva='importar_sof',
+        )
+        return jsonify({'success': True, 'task_id': task_id}), 202
+
+    except jobs.TarefaEmAndamento as e:
+        shutil.rmtree(pasta, ignore_errors=True)
         return jsonify({
-            'success': True,
-            'message': 'Importação geral concluída!',
-            'total_importados': total_geral,
-            **resultados
-        })
-        
+            'success': False,
+            'error': 'Já existe uma importação em andamento',
+            'task_id': e.task_id
+        }), 409
     except Exception as e:
+        shutil.rmtree(pasta, ignore_errors=True)
         print(f"[ERRO] api_importar_todos: {str(e)}")
         import traceback
         traceback.print_exc()
@@ -2182,157 +1835,155 @@ def api_importar_todos():
         }), 500
 
 
-@gestao_financeira_bp.route('/api/importar-liquidacao', methods=['POST'])
-@login_required
-@requires_access('gestao_financeira')
-@requires_write_access('gestao_financeira')
-def api_importar_liquidacao():
+def _job_importar_todos(task_id, pasta, salvos, usuario_nome):
+    """Importação geral em background: cada tipo commita separadamente, como antes."""
+    import shutil
+    from werkzeug.datastructures import FileStorage
+
+    resultados = {
+        'dotacao_importados': 0,
+        'reservas_importados': 0,
+        'empenhos_importados': 0,
+        'liquidacao_importados': 0,
+        'datas': {},
+        'estatisticas': {},
+        'erros': {}
+    }
+    abertos = []
+    try:
+        files = {}
+        for campo, (caminho, nome_original) in salvos.items():
+            stream = open(caminho, 'rb')
+            abertos.append(stream)
+            files[campo] = FileStorage(stream=stream, filename=nome_original, name=campo)
+
+        with pooled_connection() as conn:
+            for i, (tipo, nome_funcao, usa_usuario) in enumerate(_IMPORTADORES_SOF):
+                pct_base = i * 25
+                jobs.atualizar(task_id, pct=pct_base, label=f'Importando {tipo}...')
+
+                def progresso(etapa, dados, tipo=tipo, pct_base=pct_base):
+                    linhas = dados.get('linhas', dados.get('lidas'))
+                    detalhe = f' ({linhas} linhas)' if linhas is not None else ''
+                    jobs.atualizar(task_id, pct=pct_base + _PCT_ETAPA_SOF.get(etapa, 5),
+                                   label=f'{tipo.capitalize()}: {_ROTULO_ETAPA_SOF.get(etapa, etapa)}{detalhe}')
+
+                importar = globals()[nome_funcao]
+                args = (usuario_nome,) if usa_usuario else ()
+                try:
+                    data = importar(conn, files, progresso, *args)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"[ERRO] importar-todos ({tipo}): {str(e)}")
+                    resultados['erros'][tipo] = str(e)
+                    continue
+                if data is None:
+                    continue
+                resultados[f'{tipo}_importados'] = data.get('total_importados', 0)
+                resultados['datas'][tipo] = data.get('data_atualizacao')
+                resultados['estatisticas'][tipo] = data.get('estatisticas')
+    finally:
+        for stream in abertos:
+            stream.close()
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    total_geral = sum([
+        resultados['dotacao_importados'],
+        resultados['reservas_importados'],
+        resultados['empenhos_importados'],
+        resultados['liquidacao_importados'],
+    ])
+
+    return {
+        'success': True,
+        'message': 'Importação geral concluída!',
+        'total_importados': total_geral,
+        **resultados
+    }
+
+
+_COLUNAS_LIQUIDACAO = [
+    'COD_IDT_EMP_SOF', 'COD_IDT_EPH_MVTO', 'DT_MVTO_EPH', 'COD_NLP',
+    'COD_NRO_PCSS_SOF', 'COD_CPF_CNPJ_SOF', 'NOM_RZAO_SOCI_SOF', 'COD_EPH', 'ANO_EPH',
+    'COD_NRO_PCSS_SOF_NE', 'ORGAOUNIDADE', 'ORGUNEXECUTORA',
+    'DT_INIC_RLZC_LQDC', 'DT_FIM_RLZC_LQDC', 'COD_REC_SOF', 'VAL_MVTO_EPH',
+    'DT_PREV_PGTO', 'DT_PGTO', 'VAL_ESTN_MVTO', 'COD_NLP_CANC', 'TXT_DCR_DOC_LQDD',
+    ':B3', ':B2', 'VL_INSS', 'VL_IRRF', 'VL_ISS', 'VL_OUTROS',
+    'VL_LIQUIDO', 'VL_LIQUIDO_CANC', 'VALOR_BRUTO_CANC',
+    'CODIGO_RETENCAO_IR', 'DESCRICAO_RETENCAO_IR', 'NUMERO_LANCAMENTO_IR',
+    'ANO_LANCAMENTO_IR', 'NUMERO_GUIA_IR', 'ANO_GUIA_IR',
+    'CODIGO_MOTIVO_ISENCAO_IR', 'TEXTO_MOTIVO_ISENCAO_IR',
+    'COD_CTA_DESP', 'COD_SUB_ELEM_DESP', 'COD_IDT_OPEA'
+]
+
+IMPORTACAO_LIQUIDACAO = sof_import.ImportacaoSOF(
+    tabela='gestao_financeira.back_liquidacao',
+    colunas=_COLUNAS_LIQUIDACAO,
+    obrigatorias=_COLUNAS_LIQUIDACAO,
+    renomear={':B3': 'b3', ':B2': 'b2'},
+    chave=['cod_idt_eph_mvto'],
+    colunas_update=['val_mvto_eph', 'vl_liquido', 'dt_pgto', 'atualizado_por', 'atualizado_em'],
+    colunas_fixas=['atualizado_por', 'atualizado_em'],
+)
+
+
+def _importar_liquidacao(conn, files, progresso=None, usuario_nome='Sistema'):
     """
-    Importa CSVs de Liquidação (5 dotações sem executor).
+    Importa CSVs de Liquidação (5 dotações sem executor). None se nenhum foi enviado.
     Deduplica por COD_IDT_EPH_MVTO (PK da tabela).
     Registra atualizado_por e atualizado_em.
     """
-    import csv
-    from io import StringIO
     from datetime import datetime
 
-    try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SET datestyle TO 'ISO, DMY'")
-
-        colunas_csv = [
-            'COD_IDT_EMP_SOF', 'COD_IDT_EPH_MVTO', 'DT_MVTO_EPH', 'COD_NLP',
-            'COD_NRO_PCSS_SOF', 'COD_CPF_CNPJ_SOF', 'NOM_RZAO_SOCI_SOF', 'COD_EPH', 'ANO_EPH',
-            'COD_NRO_PCSS_SOF_NE', 'ORGAOUNIDADE', 'ORGUNEXECUTORA',
-            'DT_INIC_RLZC_LQDC', 'DT_FIM_RLZC_LQDC', 'COD_REC_SOF', 'VAL_MVTO_EPH',
-            'DT_PREV_PGTO', 'DT_PGTO', 'VAL_ESTN_MVTO', 'COD_NLP_CANC', 'TXT_DCR_DOC_LQDD',
-            ':B3', ':B2', 'VL_INSS', 'VL_IRRF', 'VL_ISS', 'VL_OUTROS',
-            'VL_LIQUIDO', 'VL_LIQUIDO_CANC', 'VALOR_BRUTO_CANC',
-            'CODIGO_RETENCAO_IR', 'DESCRICAO_RETENCAO_IR', 'NUMERO_LANCAMENTO_IR',
-            'ANO_LANCAMENTO_IR', 'NUMERO_GUIA_IR', 'ANO_GUIA_IR',
-            'CODIGO_MOTIVO_ISENCAO_IR', 'TEXTO_MOTIVO_ISENCAO_IR',
-            'COD_CTA_DESP', 'COD_SUB_ELEM_DESP', 'COD_IDT_OPEA'
-        ]
-        colunas_data = {'DT_MVTO_EPH', 'DT_INIC_RLZC_LQDC', 'DT_FIM_RLZC_LQDC', 'DT_PREV_PGTO', 'DT_PGTO'}
-        usuario_atual = session.get('username', 'Sistema')
-
-        def ler_csv_liq(nome_campo):
-            if nome_campo not in request.files:
-                return None
-            arq = request.files[nome_campo]
-            if not arq or arq.filename == '':
-                return None
-            b = arq.read()
-            for enc in ['utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']:
-                try:
-                    conteudo = b.decode(enc)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError(f'Não foi possível decodificar "{nome_campo}"')
-            reader = csv.DictReader(StringIO(conteudo), delimiter=';')
-            linhas = list(reader)
-            if linhas:
-                faltando = [c for c in colunas_csv if c not in linhas[0]]
-                if faltando:
-                    raise ValueError(f'Arquivo "{nome_campo}" sem colunas: {", ".join(faltando[:5])}')
-            return linhas
-
-        campos = ['liquidacao_3410', 'liquidacao_3420', 'liquidacao_0810', 'liquidacao_9010', 'liquidacao_7810']
-        dados = {c: ler_csv_liq(c) for c in campos}
-
-        if not any(v for v in dados.values()):
-            return jsonify({'success': False, 'error': 'Nenhum arquivo de liquidação enviado'}), 400
-
-        # Deduplicação em memória por PK
-        registros = {}
-        for linhas in dados.values():
-            if not linhas:
-                continue
-            for linha in linhas:
-                pk = (linha.get('COD_IDT_EPH_MVTO') or '').strip()
-                if pk and pk not in registros:
-                    registros[pk] = linha
-
-        total_importados = 0
-        agora = datetime.now()
-
-        for pk, linha in registros.items():
-            def val(col):
-                v = (linha.get(col) or '').strip()
-                return v if v else None
-
-            try:
-                cur.execute("""
-                    INSERT INTO gestao_financeira.back_liquidacao (
-                        COD_IDT_EMP_SOF, COD_IDT_EPH_MVTO, DT_MVTO_EPH, COD_NLP,
-                        COD_NRO_PCSS_SOF, COD_CPF_CNPJ_SOF, NOM_RZAO_SOCI_SOF, COD_EPH, ANO_EPH,
-                        COD_NRO_PCSS_SOF_NE, ORGAOUNIDADE, ORGUNEXECUTORA,
-                        DT_INIC_RLZC_LQDC, DT_FIM_RLZC_LQDC, COD_REC_SOF, VAL_MVTO_EPH,
-                        DT_PREV_PGTO, DT_PGTO, VAL_ESTN_MVTO, COD_NLP_CANC, TXT_DCR_DOC_LQDD,
-                        B3, B2, VL_INSS, VL_IRRF, VL_ISS, VL_OUTROS,
-                        VL_LIQUIDO, VL_LIQUIDO_CANC, VALOR_BRUTO_CANC,
-                        CODIGO_RETENCAO_IR, DESCRICAO_RETENCAO_IR, NUMERO_LANCAMENTO_IR,
-                        ANO_LANCAMENTO_IR, NUMERO_GUIA_IR, ANO_GUIA_IR,
-                        CODIGO_MOTIVO_ISENCAO_IR, TEXTO_MOTIVO_ISENCAO_IR,
-                        COD_CTA_DESP, COD_SUB_ELEM_DESP, COD_IDT_OPEA,
-                        atualizado_por, atualizado_em
-                    ) VALUES (
-                        %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,
-                        %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s
-                    )
-                    ON CONFLICT (COD_IDT_EPH_MVTO) DO UPDATE SET
-                        VAL_MVTO_EPH   = EXCLUDED.VAL_MVTO_EPH,
-                        VL_LIQUIDO     = EXCLUDED.VL_LIQUIDO,
-                        DT_PGTO        = EXCLUDED.DT_PGTO,
-                        atualizado_por = EXCLUDED.atualizado_por,
-                        atualizado_em  = EXCLUDED.atualizado_em
-                """, (
-                    val('COD_IDT_EMP_SOF'), val('COD_IDT_EPH_MVTO'), val('DT_MVTO_EPH'), val('COD_NLP'),
-                    val('COD_NRO_PCSS_SOF'), val('COD_CPF_CNPJ_SOF'), val('NOM_RZAO_SOCI_SOF'),
-                    val('COD_EPH'), val('ANO_EPH'), val('COD_NRO_PCSS_SOF_NE'),
-                    val('ORGAOUNIDADE'), val('ORGUNEXECUTORA'),
-                    val('DT_INIC_RLZC_LQDC'), val('DT_FIM_RLZC_LQDC'), val('COD_REC_SOF'),
-                    val('VAL_MVTO_EPH'), val('DT_PREV_PGTO'), val('DT_PGTO'),
-                    val('VAL_ESTN_MVTO'), val('COD_NLP_CANC'), val('TXT_DCR_DOC_LQDD'),
-                    val(':B3'), val(':B2'), val('VL_INSS'), val('VL_IRRF'), val('VL_ISS'), val('VL_OUTROS'),
-                    val('VL_LIQUIDO'), val('VL_LIQUIDO_CANC'), val('VALOR_BRUTO_CANC'),
-                    val('CODIGO_RETENCAO_IR'), val('DESCRICAO_RETENCAO_IR'), val('NUMERO_LANCAMENTO_IR'),
-                    val('ANO_LANCAMENTO_IR'), val('NUMERO_GUIA_IR'), val('ANO_GUIA_IR'),
-                    val('CODIGO_MOTIVO_ISENCAO_IR'), val('TEXTO_MOTIVO_ISENCAO_IR'),
-                    val('COD_CTA_DESP'), val('COD_SUB_ELEM_DESP'), val('COD_IDT_OPEA'),
-                    usuario_atual, agora
-                ))
-                total_importados += 1
-            except Exception as e:
-                conn.rollback()
-                return jsonify({'success': False, 'error': f'Erro linha (PK={pk}): {str(e)}'}), 400
-
-        conn.commit()
+    arquivos = sof_import.arquivos_enviados(
+        files,
+        ['liquidacao_3410', 'liquidacao_3420', 'liquidacao_0810', 'liquidacao_9010', 'liquidacao_7810'],
+        fixos={
+            'atualizado_por': usuario_nome,
+            'atualizado_em': datetime.now().isoformat(sep=' '),
+        }
+    )
+    if not arquivos:
+        return None
+
+    stats = IMPORTACAO_LIQUIDACAO.executar(conn, arquivos, progresso)
+    conn.commit()
+
+    return {
+        'success': True,
+        'message': 'Liquidações importadas com sucesso!',
+        'total_importados': stats['total_importados'],
+        'estatisticas': stats,
+        'data_atualizacao': _data_ultima_carga(
+            conn, "SELECT MAX(atualizado_em) FROM gestao_financeira.back_liquidacao",
+            '%d/%m/%Y %H:%M'
+        )
+    }
 
-        cur.execute("SELECT MAX(atualizado_em) FROM gestao_financeira.back_liquidacao")
-        result = cur.fetchone()
-        data_atual = result[0] if result and result[0] else None
-        cur.close()
 
-        data_fmt = data_atual.strftime('%d/%m/%Y %H:%M') if data_atual else None
+@gestao_financeira_bp.route('/api/importar-liquidacao', methods=['POST'])
+@login_required
+@requires_access('gestao_financeira')
+@requires_write_access('gestao_financeira')
+def api_importar_liquidacao():
+    """
+    Importa CSVs de Liquidação (5 dotações sem executor).
+    """
+    return _responder_importacao(
+        _importar_liquidacao, 'Nenhum arquivo de liquidação enviado', 'api_importar_liquidacao',
+        session.get('username', 'Sistema')
+    )
 
-        return jsonify({
-            'success': True,
-            'message': 'Liquidações importadas com sucesso!',
-            'total_importados': total_importados,
-            'data_atualizacao': data_fmt
-        })
 
-    except ValueError as e:
-        return jsonify({'success': False, 'error': str(e)}), 400
-    except Exception as e:
-        print(f"[ERRO] api_importar_liquidacao: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': str(e)}), 500
+@gestao_financeira_bp.route('/api/tarefa/<task_id>', methods=['GET'])
+@login_required
+@requires_access('gestao_financeira')
+def api_status_tarefa(task_id):
+    """Polling das tarefas em background (importação geral e sincronização)."""
+    tarefa = jobs.obter(task_id)
+    if not tarefa:
+        return jsonify({'success': False, 'error': 'Tarefa não encontrada ou expirada'}), 404
+    return jsonify(tarefa)
 
 
 @gestao_financeira_bp.route('/api/exportar-xlsx-completo')
@@ -2342,16 +1993,14 @@ def api_exportar_xlsx_completo():
     """
     Exporta XLSX com 4 abas: Dotação, Reservas, Empenhos, Liquidação.
     Todos os dados do banco, sem filtros. UTF-8 nativo via openpyxl.
+
+    Cada aba é lida em lotes (cursor nomeado) e gravada em modo write-only —
+    memória constante mesmo com o histórico completo de empenhos/liquidações.
     """
-    from flask import Response
-    from io import BytesIO
     from datetime import datetime
-    import openpyxl
     from openpyxl.styles import Font, PatternFill, Alignment
 
     try:
-        cur = get_cursor()
-
         def fmt_cell(val):
             if val is None:
                 return ''
@@ -2362,12 +2011,11 @@ def api_exportar_xlsx_completo():
                     return val.strftime('%d/%m/%Y')
             return val
 
-        def estilizar_header(ws):
-            for cell in ws[1]:
-                cell.font = Font(bold=True, color='FFFFFFFF')
-                cell.fill = PatternFill(start_color='FF667EEA', end_color='FF667EEA', fill_type='solid')
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-            ws.freeze_panes = 'A2'
+        estilo_header = {
+            'font': Font(bold=True, color='FFFFFFFF'),
+            'fill': PatternFill(start_color='FF667EEA', end_color='FF667EEA', fill_type='solid'),
+            'alignment': Alignment(horizontal='center', vertical='center'),
+        }
 
         tabelas = [
             ('Dotação',    'SELECT * FROM gestao_financeira.back_dotacao ORDER BY dotacao_formatada'),
@@ -2376,34 +2024,24 @@ def api_exportar_xlsx_completo():
             ('Liquidação', 'SELECT * FROM gestao_financeira.back_liquidacao ORDER BY dt_mvto_eph DESC NULLS LAST, cod_idt_eph_mvto DESC'),
         ]
 
-        wb = openpyxl.Workbook()
-        wb.remove(wb.active)
-
-        for nome_aba, query in tabelas:
-            ws = wb.create_sheet(title=nome_aba)
-            cur.execute(query)
-            rows = cur.fetchall()
-            if not rows:
-                ws.append([f'Sem dados em {nome_aba}'])
-                continue
-            colunas = list(rows[0].keys())
-            ws.append([c.upper() for c in colunas])
-            estilizar_header(ws)
-            for row in rows:
-                ws.append([fmt_cell(row[c]) for c in colunas])
-
-        cur.close()
+        def abas():
+            # Uma consulta aberta por vez: a conexão volta ao pool ao fim de cada aba
+            for nome_aba, query in tabelas:
+                with exportacao.consultar(query) as consulta:
+                    if consulta.vazia:
+                        yield nome_aba, None, [[f'Sem dados em {nome_aba}']]
+                        continue
+                    colunas = consulta.colunas
+                    yield (
+                        nome_aba,
+                        [c.upper() for c in colunas],
+                        ([fmt_cell(row[c]) for c in colunas] for row in consulta),
+                    )
 
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        arquivo = exportacao.gerar_xlsx(abas(), estilo_cabecalho=estilo_header)
 
         filename = f'relatorios_sof_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        return Response(
-            output.getvalue(),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
-        )
+        return exportacao.resposta_xlsx(filename, arquivo)
 
     except Exception as e:
         print(f"[ERRO] api_exportar_xlsx_completo: {str(e)}")
@@ -2417,6 +2055,58 @@ def api_exportar_xlsx_completo():
 @requires_access('gestao_financeira')
 @requires_write_access('gestao_financeira')
 def api_sincronizar_empenhos():
+    """
+    Agenda a sincronização de empenhos do SOF (back_empenhos) com o
+    acompanhamento de parcelas (temp_acomp_empenhos) em background.
+    Ver _sincronizar_empenhos para a lógica.
+
+    Parâmetros:
+        apenas_relatorio (bool): Se True, gera relatório sem atualizar banco
+
+    Retorna 202 + task_id (polling em /api/tarefa/<task_id>); 409 se já houver
+    uma sincronização em andamento. Só uma sincronização efetiva roda por vez.
+    """
+    dados = request.get_json(silent=True) or {}
+    apenas_relatorio = bool(dados.get('apenas_relatorio', True))
+    try:
+        task_id = jobs.submeter(
+            'relatorio_sincronizacao_empenhos' if apenas_relatorio else 'sincronizar_empenhos',
+            _job_sincronizar_empenhos, apenas_relatorio,
+            usuario=session.get('email'),
+            chave_exclusiva=None if apenas_relatorio else 'sincronizar_empenhos',
+        )
+        return jsonify({'success': True, 'task_id': task_id}), 202
+    except jobs.TarefaEmAndamento as e:
+        return jsonify({
+            'success': False,
+            'error': 'Já existe uma sincronização em andamento',
+            'task_id': e.task_id
+        }), 409
+    except Exception as e:
+        print(f"[ERRO] api_sincronizar_empenhos: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+def _job_sincronizar_empenhos(task_id, apenas_relatorio):
+    """Executa _sincronizar_empenhos numa conexão própria (fora da requisição)."""
+    with pooled_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            return _sincronizar_empenhos(
+                conn, cur, apenas_relatorio,
+                progresso=lambda pct, label: jobs.atualizar(task_id, pct=pct, label=label)
+            )
+        finally:
+            cur.close()
+            conn.rollback()  # apenas_relatorio não grava nada; não devolver conexão com transação aberta
+
+
+def _sincronizar_empenhos(conn, cur, apenas_relatorio, progresso=None):
     """
     Sincroniza empenhos do SOF (back_empenhos) com acompanhamento de parcelas (temp_acomp_empenhos)
     
@@ -2426,430 +2116,416 @@ def api_sincronizar_empenhos():
     3. Vincula com temp_acomp_empenhos e temp_reservas_empenhos através do numero_termo
     4. Distribui valores empenhados nas parcelas programadas
     5. Atualiza status e valores em temp_acomp_empenhos
-    
-    Parâmetros:
-        apenas_relatorio (bool): Se True, gera relatório sem atualizar banco
     """
-    try:
-        dados = request.get_json() or {}
-        apenas_relatorio = dados.get('apenas_relatorio', True)
-        
-        cur = get_cursor()
-        conn = get_db()
-        
-        # Função auxiliar para normalizar processo (remove pontos, traços, barras)
-        def normalizar_processo(processo):
-            if not processo:
-                return ''
-            return str(processo).replace('.', '').replace('/', '').replace('-', '').strip()
+    progresso = progresso or (lambda pct, label: None)
+    progresso(2, 'Carregando empenhos do SOF...')
+    
+    # Função auxiliar para normalizar processo (remove pontos, traços, barras)
+    def normalizar_processo(processo):
+        if not processo:
+            return ''
+        return str(processo).replace('.', '').replace('/', '').replace('-', '').strip()
+    
+    # Função para determinar status baseado em valores previstos vs empenhados
+    def calcular_status(previsto, empenhado, status_anterior):
+        previsto = float(previsto or 0)
+        empenhado = float(empenhado or 0)
+        
+        if empenhado == 0:
+            # Nada empenhado
+            if status_anterior == 'DEOF: Enviado para empenho':
+                return 'Enviado, mas não empenhado'
+            return status_anterior
+        elif empenhado >= previsto:
+            return 'Empenhado'
+        else:
+            return 'Empenhado Parcialmente'
+    
+    # PASSO 1: Buscar empenhos do back_empenhos a partir de 2026
+    print("[DEBUG] Buscando empenhos do SOF (a partir de 2026)...")
+    cur.execute("""
+        SELECT 
+            cod_idt_eph,
+            cod_nro_pcss_sof,
+            cod_eph,
+            cod_item_desp_sof,
+            val_tot_eph,
+            val_tot_canc_eph,
+            dt_eph
+        FROM gestao_financeira.back_empenhos
+        WHERE cod_nro_pcss_sof IS NOT NULL
+          AND cod_cta_desp = '33503900'
+          AND dt_eph >= date_trunc('year', CURRENT_DATE)
+        ORDER BY cod_nro_pcss_sof, cod_item_desp_sof, cod_eph
+    """)
+    
+    empenhos_sof = cur.fetchall()
+    print(f"[DEBUG] Encontrados {len(empenhos_sof)} empenhos no SOF")
+    
+    # Debug: verificar tipo de retorno
+    if empenhos_sof:
+        print(f"[DEBUG] Tipo do primeiro elemento: {type(empenhos_sof[0])}")
+        print(f"[DEBUG] Primeiro elemento: {empenhos_sof[0]}")
+    
+    # Helper robusto: converte qualquer representação de número para float
+    # Suporta float/int/Decimal nativos e strings PT-BR ("1.234,56")
+    def _to_float(v):
+        if v is None:
+            return 0.0
+        if isinstance(v, (int, float)):
+            return float(v)
+        try:
+            from decimal import Decimal
+            if isinstance(v, Decimal):
+                return float(v)
+        except Exception:
+            pass
+        s = str(v).strip()
+        if ',' in s and '.' in s:
+            s = s.replace('.', '').replace(',', '.')
+        elif ',' in s:
+            s = s.replace(',', '.')
+        try:
+            return float(s)
+        except (ValueError, TypeError):
+            return 0.0
+
+    # Organizar empenhos por processo normalizado
+    empenhos_por_processo = {}
+    for emp in empenhos_sof:
+        # Acessar por nome de coluna (compatível com RealDictCursor)
+        try:
+            processo_norm = normalizar_processo(emp['cod_nro_pcss_sof'])
+            elemento = str(emp['cod_item_desp_sof'])  # normalizado como string '23' ou '24'
+            ne = emp['cod_eph']  # número da nota de empenho
+            val_total = emp['val_tot_eph']
+            val_canc = emp['val_tot_canc_eph']
+            dt_eph = emp['dt_eph']
+        except (KeyError, TypeError):
+            # Se falhar, tentar acesso por índice (tupla normal)
+            processo_norm = normalizar_processo(emp[1])
+            elemento = str(emp[3])
+            ne = emp[2]
+            val_total = emp[4]
+            val_canc = emp[5]
+            dt_eph = emp[6]
+        
+        # Calcular valor líquido (total - cancelado)
+        try:
+            valor_liquido = _to_float(val_total) - _to_float(val_canc)
+        except Exception:
+            print(f"[AVISO] Erro ao converter valores para empenho {ne}: total={val_total}, canc={val_canc}")
+            valor_liquido = 0
         
-        # Função para determinar status baseado em valores previstos vs empenhados
-        def calcular_status(previsto, empenhado, status_anterior):
-            previsto = float(previsto or 0)
-            empenhado = float(empenhado or 0)
-            
-            if empenhado == 0:
-                # Nada empenhado
-                if status_anterior == 'DEOF: Enviado para empenho':
-                    return 'Enviado, mas não empenhado'
-                return status_anterior
-            elif empenhado >= previsto:
-                return 'Empenhado'
-            else:
-                return 'Empenhado Parcialmente'
+        # ⚠️ IGNORAR empenhos totalmente cancelados (valor_liquido = 0)
+        if valor_liquido <= 0:
+            print(f"[INFO] Empenho {ne} ignorado (totalmente cancelado ou zerado): total={val_total}, canc={val_canc}")
+            continue
         
-        # PASSO 1: Buscar empenhos do back_empenhos a partir de 2026
-        print("[DEBUG] Buscando empenhos do SOF (a partir de 2026)...")
-        cur.execute("""
-            SELECT 
-                cod_idt_eph,
-                cod_nro_pcss_sof,
-                cod_eph,
-                cod_item_desp_sof,
-                val_tot_eph,
-                val_tot_canc_eph,
-                dt_eph
-            FROM gestao_financeira.back_empenhos
-            WHERE cod_nro_pcss_sof IS NOT NULL
-              AND cod_cta_desp = '33503900'
-              AND dt_eph >= date_trunc('year', CURRENT_DATE)
-            ORDER BY cod_nro_pcss_sof, cod_item_desp_sof, cod_eph
-        """)
+        if processo_norm not in empenhos_por_processo:
+            empenhos_por_processo[processo_norm] = {}
         
-        empenhos_sof = cur.fetchall()
-        print(f"[DEBUG] Encontrados {len(empenhos_sof)} empenhos no SOF")
+        if elemento not in empenhos_por_processo[processo_norm]:
+            empenhos_por_processo[processo_norm][elemento] = []
         
-        # Debug: verificar tipo de retorno
-        if empenhos_sof:
-            print(f"[DEBUG] Tipo do primeiro elemento: {type(empenhos_sof[0])}")
-            print(f"[DEBUG] Primeiro elemento: {empenhos_sof[0]}")
+        empenhos_por_processo[processo_norm][elemento].append({
+            'ne': ne,
+            'valor': valor_liquido,
+            'data': dt_eph
+        })
+    
+    # PASSO 2: Vincular com parcerias e buscar numero_termo
+    print("[DEBUG] Vinculando processos com parcerias...")
+    cur.execute("""
+        SELECT 
+            sei_celeb,
+            numero_termo
+        FROM public.parcerias
+        WHERE sei_celeb IS NOT NULL
+          AND numero_termo IS NOT NULL
+    """)
+    
+    parcerias = cur.fetchall()
+    
+    # Mapa processo -> numero_termo
+    processo_to_termo = {}
+    for parc in parcerias:
+        try:
+            sei_celeb_norm = normalizar_processo(parc['sei_celeb'])
+            numero_termo = parc['numero_termo']
+        except (KeyError, TypeError):
+            sei_celeb_norm = normalizar_processo(parc[0])
+            numero_termo = parc[1]
         
-        # Helper robusto: converte qualquer representação de número para float
-        # Suporta float/int/Decimal nativos e strings PT-BR ("1.234,56")
-        def _to_float(v):
-            if v is None:
-                return 0.0
-            if isinstance(v, (int, float)):
-                return float(v)
-            try:
-                from decimal import Decimal
-                if isinstance(v, Decimal):
-                    return float(v)
-            except Exception:
-                pass
-            s = str(v).strip()
-            if ',' in s and '.' in s:
-                s = s.replace('.', '').replace(',', '.')
-            elif ',' in s:
-                s = s.replace(',', '.')
-            try:
-                return float(s)
-            except (ValueError, TypeError):
-                return 0.0
-
-        # Organizar empenhos por processo normalizado
-        empenhos_por_processo = {}
-        for emp in empenhos_sof:
-            # Acessar por nome de coluna (compatível com RealDictCursor)
-            try:
-                processo_norm = normalizar_processo(emp['cod_nro_pcss_sof'])
-                elemento = str(emp['cod_item_desp_sof'])  # normalizado como string '23' ou '24'
-                ne = emp['cod_eph']  # número da nota de empenho
-                val_total = emp['val_tot_eph']
-                val_canc = emp['val_tot_canc_eph']
-                dt_eph = emp['dt_eph']
-            except (KeyError, TypeError):
-                # Se falhar, tentar acesso por índice (tupla normal)
-                processo_norm = normalizar_processo(emp[1])
-                elemento = str(emp[3])
-                ne = emp[2]
-                val_total = emp[4]
-                val_canc = emp[5]
-                dt_eph = emp[6]
-            
-            # Calcular valor líquido (total - cancelado)
-            try:
-                valor_liquido = _to_float(val_total) - _to_float(val_canc)
-            except Exception:
-                print(f"[AVISO] Erro ao converter valores para empenho {ne}: total={val_total}, canc={val_canc}")
-                valor_liquido = 0
-            
-            # ⚠️ IGNORAR empenhos totalmente cancelados (valor_liquido = 0)
-            if valor_liquido <= 0:
-                print(f"[INFO] Empenho {ne} ignorado (totalmente cancelado ou zerado): total={val_total}, canc={val_canc}")
+        processo_to_termo[sei_celeb_norm] = numero_termo
+    
+    print(f"[DEBUG] Mapeados {len(processo_to_termo)} processos para termos")
+    
+    # PASSO 3: Buscar parcelas programadas de ultra_liquidacoes (vigencia_inicial dentro do ano vigente)
+    print("[DEBUG] Buscando parcelas programadas com vigência dentro do ano vigente...")
+    cur.execute("""
+        SELECT 
+            id,
+            numero_termo,
+            parcela_numero,
+            valor_elemento_53_23,
+            valor_elemento_53_24,
+            valor_previsto
+        FROM gestao_financeira.ultra_liquidacoes
+        WHERE parcela_tipo = 'Programada'
+          AND vigencia_inicial >= date_trunc('year', CURRENT_DATE)
+          AND vigencia_inicial <= (date_trunc('year', CURRENT_DATE) + INTERVAL '1 year' - INTERVAL '1 day')
+        ORDER BY numero_termo, id
+    """)
+    
+    parcelas_programadas = cur.fetchall()
+    
+    # Buscar todos os termos que existem em ultra_liquidacoes (para distinguir encerrados de ausentes)
+    cur.execute("""
+        SELECT DISTINCT numero_termo
+        FROM gestao_financeira.ultra_liquidacoes
+        WHERE parcela_tipo = 'Programada'
+    """)
+    termos_em_ultra = set()
+    for row in cur.fetchall():
+        try:
+            termos_em_ultra.add(row['numero_termo'])
+        except (KeyError, TypeError):
+            termos_em_ultra.add(row[0])
+    
+    # Organizar por termo (lista ordenada por id)
+    parcelas_por_termo = {}
+    for parcela in parcelas_programadas:
+        try:
+            id_reserva = parcela['id']
+            termo = parcela['numero_termo']
+            num_parcela = parcela['parcela_numero']
+            elem_23 = parcela['valor_elemento_53_23']
+            elem_24 = parcela['valor_elemento_53_24']
+            total_prev = parcela['valor_previsto']
+        except (KeyError, TypeError):
+            id_reserva = parcela[0]
+            termo = parcela[1]
+            num_parcela = parcela[2]
+            elem_23 = parcela[3]
+            elem_24 = parcela[4]
+            total_prev = parcela[5]
+        
+        if termo not in parcelas_por_termo:
+            parcelas_por_termo[termo] = []
+        
+        # Converter VARCHAR para float
+        def converter_valor_sync(val):
+            return _to_float(val)
+        
+        parcelas_por_termo[termo].append({
+            'id_reserva': id_reserva,
+            'numero_parcela': num_parcela,
+            'previsto_23': converter_valor_sync(elem_23),
+            'previsto_24': converter_valor_sync(elem_24),
+            'previsto_total': converter_valor_sync(total_prev)
+        })
+    
+    # PASSO 3.5: Buscar parcelas de temp_acomp_empenhos (ordenadas por numero)
+    print("[DEBUG] Buscando parcelas de acompanhamento...")
+    cur.execute("""
+        SELECT 
+            id,
+            numero,
+            numero_termo,
+            status
+        FROM gestao_financeira.temp_acomp_empenhos
+        ORDER BY numero_termo, numero
+    """)
+    
+    parcelas_acomp = cur.fetchall()
+    
+    # Organizar por termo
+    acomp_por_termo = {}
+    for acomp in parcelas_acomp:
+        try:
+            id_acomp = acomp['id']
+            numero = acomp['numero']
+            termo = acomp['numero_termo']
+            status_atual = acomp['status']
+        except (KeyError, TypeError):
+            id_acomp = acomp[0]
+            numero = acomp[1]
+            termo = acomp[2]
+            status_atual = acomp[3] if len(acomp) > 3 else ''
+        
+        if termo not in acomp_por_termo:
+            acomp_por_termo[termo] = []
+        
+        acomp_por_termo[termo].append({
+            'id': id_acomp,
+            'numero': numero,
+            'status_atual': status_atual
+        })
+    
+    # PASSO 4: Processar cada termo e distribuir empenhos nas parcelas
+    relatorio = {
+        'total_termos': 0,
+        'total_parcelas': 0,
+        'total_empenhos': len(empenhos_sof),
+        'detalhes': [],
+        'alertas': []
+    }
+    
+    termos_atualizados = 0
+    parcelas_atualizadas = 0
+    
+    total_processos = len(empenhos_por_processo) or 1
+    for i_processo, (processo_norm, empenhos_elementos) in enumerate(empenhos_por_processo.items(), start=1):
+        progresso(10 + round(i_processo / total_processos * 85),
+                  f'Processando {i_processo}/{total_processos} processos...')
+        # Buscar termo correspondente
+        if processo_norm not in processo_to_termo:
+            relatorio['alertas'].append(f"⚠️ Processo {processo_norm} não encontrado em parcerias")
+            continue
+        
+        numero_termo = processo_to_termo[processo_norm]
+        
+        # Verificar se tem parcelas programadas com vigência a partir de 2026
+        if numero_termo not in parcelas_por_termo:
+            if numero_termo in termos_em_ultra:
+                # Termo existe mas todas as parcelas são anteriores a 2026 — encerrado, ignorar
                 continue
-            
-            if processo_norm not in empenhos_por_processo:
-                empenhos_por_processo[processo_norm] = {}
-            
-            if elemento not in empenhos_por_processo[processo_norm]:
-                empenhos_por_processo[processo_norm][elemento] = []
-            
-            empenhos_por_processo[processo_norm][elemento].append({
-                'ne': ne,
-                'valor': valor_liquido,
-                'data': dt_eph
-            })
+            relatorio['alertas'].append(f"⚠️ Termo {numero_termo} não tem parcelas Programadas em ultra_liquidacoes")
+            continue
         
-        # PASSO 2: Vincular com parcerias e buscar numero_termo
-        print("[DEBUG] Vinculando processos com parcerias...")
-        cur.execute("""
-            SELECT 
-                sei_celeb,
-                numero_termo
-            FROM public.parcerias
-            WHERE sei_celeb IS NOT NULL
-              AND numero_termo IS NOT NULL
-        """)
-        
-        parcerias = cur.fetchall()
+        if numero_termo not in acomp_por_termo:
+            relatorio['alertas'].append(f"⚠️ Termo {numero_termo} não tem parcelas em temp_acomp_empenhos")
+            continue
         
-        # Mapa processo -> numero_termo
-        processo_to_termo = {}
-        for parc in parcerias:
-            try:
-                sei_celeb_norm = normalizar_processo(parc['sei_celeb'])
-                numero_termo = parc['numero_termo']
-            except (KeyError, TypeError):
-                sei_celeb_norm = normalizar_processo(parc[0])
-                numero_termo = parc[1]
-            
-            processo_to_termo[sei_celeb_norm] = numero_termo
+        parcelas_reservas = parcelas_por_termo[numero_termo]
+        parcelas_enviadas = acomp_por_termo[numero_termo]
         
-        print(f"[DEBUG] Mapeados {len(processo_to_termo)} processos para termos")
-        
-        # PASSO 3: Buscar parcelas programadas de ultra_liquidacoes (vigencia_inicial dentro do ano vigente)
-        print("[DEBUG] Buscando parcelas programadas com vigência dentro do ano vigente...")
-        cur.execute("""
-            SELECT 
-                id,
-                numero_termo,
-                parcela_numero,
-                valor_elemento_53_23,
-                valor_elemento_53_24,
-                valor_previsto
-            FROM gestao_financeira.ultra_liquidacoes
-            WHERE parcela_tipo = 'Programada'
-              AND vigencia_inicial >= date_trunc('year', CURRENT_DATE)
-              AND vigencia_inicial <= (date_trunc('year', CURRENT_DATE) + INTERVAL '1 year' - INTERVAL '1 day')
-            ORDER BY numero_termo, id
-        """)
+        # Verificar se quantidade bate (posicional)
+        if len(parcelas_reservas) != len(parcelas_enviadas):
+            relatorio['alertas'].append(
+                f"⚠️ {numero_termo}: Quantidade de parcelas não bate - "
+                f"Reservas: {len(parcelas_reservas)}, Enviadas: {len(parcelas_enviadas)}"
+            )
+            # Usa o mínimo para evitar erro de índice
+            qtd_parcelas = min(len(parcelas_reservas), len(parcelas_enviadas))
+        else:
+            qtd_parcelas = len(parcelas_reservas)
         
-        parcelas_programadas = cur.fetchall()
+        relatorio['total_termos'] += 1
+        relatorio['total_parcelas'] += qtd_parcelas
         
-        # Buscar todos os termos que existem em ultra_liquidacoes (para distinguir encerrados de ausentes)
-        cur.execute("""
-            SELECT DISTINCT numero_termo
-            FROM gestao_financeira.ultra_liquidacoes
-            WHERE parcela_tipo = 'Programada'
-        """)
-        termos_em_ultra = set()
-        for row in cur.fetchall():
-            try:
-                termos_em_ultra.add(row['numero_termo'])
-            except (KeyError, TypeError):
-                termos_em_ultra.add(row[0])
+        # Somar totais empenhados por elemento
+        total_empenhado_23 = sum([e['valor'] for e in empenhos_elementos.get('23', [])])
+        total_empenhado_24 = sum([e['valor'] for e in empenhos_elementos.get('24', [])])
         
-        # Organizar por termo (lista ordenada por id)
-        parcelas_por_termo = {}
-        for parcela in parcelas_programadas:
-            try:
-                id_reserva = parcela['id']
-                termo = parcela['numero_termo']
-                num_parcela = parcela['parcela_numero']
-                elem_23 = parcela['valor_elemento_53_23']
-                elem_24 = parcela['valor_elemento_53_24']
-                total_prev = parcela['valor_previsto']
-            except (KeyError, TypeError):
-                id_reserva = parcela[0]
-                termo = parcela[1]
-                num_parcela = parcela[2]
-                elem_23 = parcela[3]
-                elem_24 = parcela[4]
-                total_prev = parcela[5]
-            
-            if termo not in parcelas_por_termo:
-                parcelas_por_termo[termo] = []
-            
-            # Converter VARCHAR para float
-            def converter_valor_sync(val):
-                return _to_float(val)
-            
-            parcelas_por_termo[termo].append({
-                'id_reserva': id_reserva,
-                'numero_parcela': num_parcela,
-                'previsto_23': converter_valor_sync(elem_23),
-                'previsto_24': converter_valor_sync(elem_24),
-                'previsto_total': converter_valor_sync(total_prev)
-            })
-        
-        # PASSO 3.5: Buscar parcelas de temp_acomp_empenhos (ordenadas por numero)
-        print("[DEBUG] Buscando parcelas de acompanhamento...")
-        cur.execute("""
-            SELECT 
-                id,
-                numero,
-                numero_termo,
-                status
-            FROM gestao_financeira.temp_acomp_empenhos
-            ORDER BY numero_termo, numero
-        """)
+        # Somar totais previstos por elemento
+        total_previsto_23 = sum([p['previsto_23'] for p in parcelas_reservas])
+        total_previsto_24 = sum([p['previsto_24'] for p in parcelas_reservas])
         
-        parcelas_acomp = cur.fetchall()
+        # Alertas de discrepância
+        if total_empenhado_23 > total_previsto_23 * 1.01:  # Tolerância de 1%
+            relatorio['alertas'].append(
+                f"⚠️ {numero_termo}: Empenhado no elemento 23 (R$ {total_empenhado_23:,.2f}) "
+                f"excede previsto (R$ {total_previsto_23:,.2f})"
+            )
         
-        # Organizar por termo
-        acomp_por_termo = {}
-        for acomp in parcelas_acomp:
-            try:
-                id_acomp = acomp['id']
-                numero = acomp['numero']
-                termo = acomp['numero_termo']
-                status_atual = acomp['status']
-            except (KeyError, TypeError):
-                id_acomp = acomp[0]
-                numero = acomp[1]
-                termo = acomp[2]
-                status_atual = acomp[3] if len(acomp) > 3 else ''
-            
-            if termo not in acomp_por_termo:
-                acomp_por_termo[termo] = []
-            
-            acomp_por_termo[termo].append({
-                'id': id_acomp,
-                'numero': numero,
-                'status_atual': status_atual
-            })
+        if total_empenhado_24 > total_previsto_24 * 1.01:
+            relatorio['alertas'].append(
+                f"⚠️ {numero_termo}: Empenhado no elemento 24 (R$ {total_empenhado_24:,.2f}) "
+                f"excede previsto (R$ {total_previsto_24:,.2f})"
+            )
         
-        # PASSO 4: Processar cada termo e distribuir empenhos nas parcelas
-        relatorio = {
-            'total_termos': 0,
-            'total_parcelas': 0,
-            'total_empenhos': len(empenhos_sof),
-            'detalhes': [],
-            'alertas': []
+        # Distribuir valores nas parcelas EM CASCATA
+        detalhes_termo = {
+            'numero_termo': numero_termo,
+            'processo_celebracao': processo_norm,
+            'parcelas': []
         }
         
-        termos_atualizados = 0
-        parcelas_atualizadas = 0
+        saldo_23 = total_empenhado_23
+        saldo_24 = total_empenhado_24
         
-        for processo_norm, empenhos_elementos in empenhos_por_processo.items():
-            # Buscar termo correspondente
-            if processo_norm not in processo_to_termo:
-                relatorio['alertas'].append(f"⚠️ Processo {processo_norm} não encontrado em parcerias")
-                continue
-            
-            numero_termo = processo_to_termo[processo_norm]
-            
-            # Verificar se tem parcelas programadas com vigência a partir de 2026
-            if numero_termo not in parcelas_por_termo:
-                if numero_termo in termos_em_ultra:
-                    # Termo existe mas todas as parcelas são anteriores a 2026 — encerrado, ignorar
-                    continue
-                relatorio['alertas'].append(f"⚠️ Termo {numero_termo} não tem parcelas Programadas em ultra_liquidacoes")
-                continue
-            
-            if numero_termo not in acomp_por_termo:
-                relatorio['alertas'].append(f"⚠️ Termo {numero_termo} não tem parcelas em temp_acomp_empenhos")
-                continue
-            
-            parcelas_reservas = parcelas_por_termo[numero_termo]
-            parcelas_enviadas = acomp_por_termo[numero_termo]
-            
-            # Verificar se quantidade bate (posicional)
-            if len(parcelas_reservas) != len(parcelas_enviadas):
-                relatorio['alertas'].append(
-                    f"⚠️ {numero_termo}: Quantidade de parcelas não bate - "
-                    f"Reservas: {len(parcelas_reservas)}, Enviadas: {len(parcelas_enviadas)}"
-                )
-                # Usa o mínimo para evitar erro de índice
-                qtd_parcelas = min(len(parcelas_reservas), len(parcelas_enviadas))
-            else:
-                qtd_parcelas = len(parcelas_reservas)
+        # Concatenar notas de empenho
+        nes_23 = ';'.join([str(e['ne']) for e in empenhos_elementos.get('23', [])])
+        nes_24 = ';'.join([str(e['ne']) for e in empenhos_elementos.get('24', [])])
+        
+        # DISTRIBUIÇÃO EM CASCATA (ordem sequencial)
+        for i in range(qtd_parcelas):
+            parcela_reserva = parcelas_reservas[i]
+            parcela_enviada = parcelas_enviadas[i]
             
-            relatorio['total_termos'] += 1
-            relatorio['total_parcelas'] += qtd_parcelas
+            # Alocar valores até esgotar saldo ou previsto (CASCATA)
+            empenhado_23 = min(saldo_23, parcela_reserva['previsto_23'])
+            empenhado_24 = min(saldo_24, parcela_reserva['previsto_24'])
             
-            # Somar totais empenhados por elemento
-            total_empenhado_23 = sum([e['valor'] for e in empenhos_elementos.get('23', [])])
-            total_empenhado_24 = sum([e['valor'] for e in empenhos_elementos.get('24', [])])
+            saldo_23 -= empenhado_23
+            saldo_24 -= empenhado_24
             
-            # Somar totais previstos por elemento
-            total_previsto_23 = sum([p['previsto_23'] for p in parcelas_reservas])
-            total_previsto_24 = sum([p['previsto_24'] for p in parcelas_reservas])
+            # Determinar status
+            previsto_total_parcela = parcela_reserva['previsto_23'] + parcela_reserva['previsto_24']
+            empenhado_total_parcela = empenhado_23 + empenhado_24
             
-            # Alertas de discrepância
-            if total_empenhado_23 > total_previsto_23 * 1.01:  # Tolerância de 1%
-                relatorio['alertas'].append(
-                    f"⚠️ {numero_termo}: Empenhado no elemento 23 (R$ {total_empenhado_23:,.2f}) "
-                    f"excede previsto (R$ {total_previsto_23:,.2f})"
-                )
+            status_anterior = parcela_enviada['status_atual']
+            status = calcular_status(previsto_total_parcela, empenhado_total_parcela, status_anterior)
             
-            if total_empenhado_24 > total_previsto_24 * 1.01:
-                relatorio['alertas'].append(
-                    f"⚠️ {numero_termo}: Empenhado no elemento 24 (R$ {total_empenhado_24:,.2f}) "
-                    f"excede previsto (R$ {total_previsto_24:,.2f})"
-                )
+            # Determinar quais NEs usar (só incluir se houver valor empenhado)
+            ne_23_parcela = nes_23 if empenhado_23 > 0 else ''
+            ne_24_parcela = nes_24 if empenhado_24 > 0 else ''
             
-            # Distribuir valores nas parcelas EM CASCATA
-            detalhes_termo = {
-                'numero_termo': numero_termo,
-                'processo_celebracao': processo_norm,
-                'parcelas': []
-            }
-            
-            saldo_23 = total_empenhado_23
-            saldo_24 = total_empenhado_24
-            
-            # Concatenar notas de empenho
-            nes_23 = ';'.join([str(e['ne']) for e in empenhos_elementos.get('23', [])])
-            nes_24 = ';'.join([str(e['ne']) for e in empenhos_elementos.get('24', [])])
+            detalhes_termo['parcelas'].append({
+                'numero': parcela_enviada['numero'],
+                'numero_parcela': parcela_reserva['numero_parcela'],
+                'previsto_23': parcela_reserva['previsto_23'],
+                'empenhado_23': empenhado_23,
+                'ne_23': ne_23_parcela,
+                'previsto_24': parcela_reserva['previsto_24'],
+                'empenhado_24': empenhado_24,
+                'ne_24': ne_24_parcela,
+                'status': status
+            })
             
-            # DISTRIBUIÇÃO EM CASCATA (ordem sequencial)
-            for i in range(qtd_parcelas):
-                parcela_reserva = parcelas_reservas[i]
-                parcela_enviada = parcelas_enviadas[i]
-                
-                # Alocar valores até esgotar saldo ou previsto (CASCATA)
-                empenhado_23 = min(saldo_23, parcela_reserva['previsto_23'])
-                empenhado_24 = min(saldo_24, parcela_reserva['previsto_24'])
-                
-                saldo_23 -= empenhado_23
-                saldo_24 -= empenhado_24
-                
-                # Determinar status
-                previsto_total_parcela = parcela_reserva['previsto_23'] + parcela_reserva['previsto_24']
-                empenhado_total_parcela = empenhado_23 + empenhado_24
-                
-                status_anterior = parcela_enviada['status_atual']
-                status = calcular_status(previsto_total_parcela, empenhado_total_parcela, status_anterior)
-                
-                # Determinar quais NEs usar (só incluir se houver valor empenhado)
-                ne_23_parcela = nes_23 if empenhado_23 > 0 else ''
-                ne_24_parcela = nes_24 if empenhado_24 > 0 else ''
-                
-                detalhes_termo['parcelas'].append({
-                    'numero': parcela_enviada['numero'],
-                    'numero_parcela': parcela_reserva['numero_parcela'],
-                    'previsto_23': parcela_reserva['previsto_23'],
-                    'empenhado_23': empenhado_23,
-                    'ne_23': ne_23_parcela,
-                    'previsto_24': parcela_reserva['previsto_24'],
-                    'empenhado_24': empenhado_24,
-                    'ne_24': ne_24_parcela,
-                    'status': status
-                })
+            # ATUALIZAR BANCO (se não for apenas relatório)
+            if not apenas_relatorio:
+                # UPDATE direto usando id de temp_acomp_empenhos
+                cur.execute("""
+                    UPDATE gestao_financeira.temp_acomp_empenhos
+                    SET 
+                        nota_empenho_23 = CASE WHEN %s > 0 THEN %s ELSE nota_empenho_23 END,
+                        nota_empenho_24 = CASE WHEN %s > 0 THEN %s ELSE nota_empenho_24 END,
+                        total_empenhado_23 = %s,
+                        total_empenhado_24 = %s,
+                        status = %s
+                    WHERE id = %s
+                """, (
+                    empenhado_23, ne_23_parcela if ne_23_parcela else None,
+                    empenhado_24, ne_24_parcela if ne_24_parcela else None,
+                    empenhado_23, empenhado_24, status,
+                    parcela_enviada['id']
+                ))
                 
-                # ATUALIZAR BANCO (se não for apenas relatório)
-                if not apenas_relatorio:
-                    # UPDATE direto usando id de temp_acomp_empenhos
-                    cur.execute("""
-                        UPDATE gestao_financeira.temp_acomp_empenhos
-                        SET 
-                            nota_empenho_23 = CASE WHEN %s > 0 THEN %s ELSE nota_empenho_23 END,
-                            nota_empenho_24 = CASE WHEN %s > 0 THEN %s ELSE nota_empenho_24 END,
-                            total_empenhado_23 = %s,
-                            total_empenhado_24 = %s,
-                            status = %s
-                        WHERE id = %s
-                    """, (
-                        empenhado_23, ne_23_parcela if ne_23_parcela else None,
-                        empenhado_24, ne_24_parcela if ne_24_parcela else None,
-                        empenhado_23, empenhado_24, status,
-                        parcela_enviada['id']
-                    ))
-                    
-                    parcelas_atualizadas += 1
-            
-            detalhes_termo['total_empenhado_23'] = total_empenhado_23
-            detalhes_termo['total_empenhado_24'] = total_empenhado_24
-            detalhes_termo['total_previsto_23'] = total_previsto_23
-            detalhes_termo['total_previsto_24'] = total_previsto_24
-            
-            relatorio['detalhes'].append(detalhes_termo)
-            termos_atualizados += 1
+                parcelas_atualizadas += 1
         
-        # Commit se não for apenas relatório
-        if not apenas_relatorio:
-            conn.commit()
-            print(f"[DEBUG] Sincronização concluída: {termos_atualizados} termos, {parcelas_atualizadas} parcelas")
+        detalhes_termo['total_empenhado_23'] = total_empenhado_23
+        detalhes_termo['total_empenhado_24'] = total_empenhado_24
+        detalhes_termo['total_previsto_23'] = total_previsto_23
+        detalhes_termo['total_previsto_24'] = total_previsto_24
         
-        return jsonify({
-            'success': True,
-            'relatorio': relatorio,
-            'termos_atualizados': termos_atualizados,
-            'parcelas_atualizadas': parcelas_atualizadas,
-            'alertas': relatorio['alertas']
-        })
-        
-    except Exception as e:
-        print(f"[ERRO] api_sincronizar_empenhos: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
-
+        relatorio['detalhes'].append(detalhes_termo)
+        termos_atualizados += 1
+    
+    # Commit se não for apenas relatório
+    if not apenas_relatorio:
+        conn.commit()
+        print(f"[DEBUG] Sincronização concluída: {termos_atualizados} termos, {parcelas_atualizadas} parcelas")
+    
+    return {
+        'success': True,
+        'relatorio': relatorio,
+        'termos_atualizados': termos_atualizados,
+        'parcelas_atualizadas': parcelas_atualizadas,
+        'alertas': relatorio['alertas']
+    }
 
 @gestao_financeira_bp.route("/api/adicionar-encaminhamento", methods=["POST"])
 @login_required
@@ -9,11 +9,14 @@ from db import get_db, get_cursor
 from psycopg2.extras import RealDictCursor
 from datetime import datetime, timedelta
 from utils import login_required
+from core import empenhos_saldos, exportacao
 from decimal import Decimal
-import csv
-import io
+import base64
 import calendar
+import json
 import re
+import threading
+import time
 
 ultra_liquidacoes_bp = Blueprint('ultra_liquidacoes', __name__, url_prefix='/gestao_financeira/ultra-liquidacoes')
 
@@ -94,97 +97,104 @@ def converter_sei_para_cod_sof(sei_celeb):
     IMPORTANTE: Não remove zeros à esquerda! O valor já está correto no SEI.
     Exemplo: 6074.2023/0004039-2 → 6074202300040392
     """
-    if not sei_celeb:
-        return None
-    # Remove apenas os separadores (pontos, barras, hífens)
-    return re.sub(r'[.\-/]', '', sei_celeb)
+    # Mesma normalização gravada em back_empenhos.cod_pcss_norm / parcerias.sei_celeb_norm
+    return empenhos_saldos.normalizar_processo_sof(sei_celeb)
 
 
-def calcular_empenhos_disponiveis(cur, hoje):
+def calcular_empenhos_disponiveis(cur, hoje, cod_sofs=None):
     """
     Retorna detalhes de empenhos disponíveis por termo/ano.
     Retorna: (empenhos_detalhados, pagos_por_elemento, avisos)
     empenhos_detalhados = {(cod_sof, ano): [lista de dicts com cod_eph, val_tot_eph, etc]}
     pagos_por_elemento = {(cod_sof, ano, elemento): total_pago}
+
+    Lê as colunas normalizadas gravadas na importação (core.empenhos_saldos):
+    JOIN por chave indexada (sei_celeb_norm = cod_pcss_norm) e totais por
+    elemento vindos de back_empenhos_saldos — sem conversão de texto nem regex.
+
+    Args:
+        cod_sofs: processos normalizados a carregar (ex.: só os termos da
+            página atual); None = todas as parcerias.
     """
     empenhos_por_termo_ano = {}
-    pagos_por_elemento = {}  # Novo: agregar valores pagos por elemento
+    pagos_por_elemento = {}
     avisos = []
     
+    filtro_empenhos = ''
+    filtro_saldos = ''
+    params = ()
+    if cod_sofs is not None:
+        cod_sofs = sorted({c for c in cod_sofs if c})
+        if not cod_sofs:
+            return {}, {}, avisos
+        filtro_empenhos = 'AND e.cod_pcss_norm = ANY(%s)'
+        filtro_saldos = 'AND s.cod_sof = ANY(%s)'
+        params = (cod_sofs,)
+    
     try:
-        # Verificar se tabela existe
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'gestao_financeira' 
-                AND table_name = 'back_empenhos'
-            ) as existe
-        """)
-        
-        resultado = cur.fetchone()
-        tabela_existe = resultado['existe'] if resultado else False
-        
-        if not tabela_existe:
+        if not empenhos_saldos.estrutura_disponivel(cur):
             avisos.append({
-                'tipo': 'tabela_inexistente',
-                'mensagem': 'Tabela gestao_financeira.back_empenhos não encontrada'
+                'tipo': 'estrutura_desatualizada',
+                'mensagem': 'Saldos de empenhos ainda não materializados: reimporte os empenhos '
+                            'ou execute scripts/migration_back_empenhos_saldos.sql'
             })
             return {}, {}, avisos
         
-        # Buscar TODOS os empenhos de uma vez via JOIN (evita N+1 queries por termo)
-        cur.execute("SET statement_timeout = 0")  # Query pesada — sem timeout
-        cur.execute("""
+        cur.execute(f"""
             SELECT
-                REGEXP_REPLACE(p.sei_celeb, '[-./]', '', 'g') AS cod_sof,
+                e.cod_pcss_norm AS cod_sof,
                 e.cod_eph,
                 EXTRACT(YEAR FROM e.dt_eph)::integer AS ano_eph,
-                COALESCE(NULLIF(REPLACE(e.val_tot_eph, ',', '.'), '')::numeric, 0) AS val_tot_eph,
-                COALESCE(NULLIF(REPLACE(e.val_tot_lqdc_eph, ',', '.'), '')::numeric, 0) AS val_tot_lqdc_eph,
-                COALESCE(NULLIF(REPLACE(e.val_tot_pago_eph, ',', '.'), '')::numeric, 0) AS val_tot_pago_eph,
-                COALESCE(NULLIF(REPLACE(e.val_tot_canc_eph, ',', '.'), '')::numeric, 0) AS val_tot_canc_eph,
+                COALESCE(e.val_tot_eph_num, 0) AS val_tot_eph,
+                COALESCE(e.val_tot_lqdc_eph_num, 0) AS val_tot_lqdc_eph,
+                COALESCE(e.val_tot_pago_eph_num, 0) AS val_tot_pago_eph,
+                COALESCE(e.val_tot_canc_eph_num, 0) AS val_tot_canc_eph,
                 e.cod_item_desp_sof
-            FROM public.parcerias p
+            FROM (
+                SELECT DISTINCT sei_celeb_norm
+                FROM public.parcerias
+                WHERE sei_celeb_norm IS NOT NULL
+            ) p
             JOIN gestao_financeira.back_empenhos e
-                ON e.cod_nro_pcss_sof = REGEXP_REPLACE(p.sei_celeb, '[-./]', '', 'g')
-            WHERE p.sei_celeb IS NOT NULL AND p.sei_celeb != ''
+                ON e.cod_pcss_norm = p.sei_celeb_norm
+            WHERE e.dt_eph IS NOT NULL
+              {filtro_empenhos}
             ORDER BY e.dt_eph, e.cod_eph
-        """)
+        """, params)
         todos_empenhos = cur.fetchall()
-        print(f"   Total de empenhos carregados (query única): {len(todos_empenhos)}")
+        print(f"   Total de empenhos carregados (chave normalizada): {len(todos_empenhos)}")
 
         # Agrupar por COD_SOF + ANO (não por termo!)
         for emp in todos_empenhos:
-            cod_sof = emp['cod_sof']
-            ano = int(emp['ano_eph'])
-            elemento = emp['cod_item_desp_sof']  # '23' ou '24'
-            chave = (cod_sof, ano)  # CHAVE: (cod_sof, ano) não (termo, ano)!
-            chave_elemento = (cod_sof, ano, elemento)  # CHAVE para pagos por elemento
-
-            if chave not in empenhos_por_termo_ano:
-                empenhos_por_termo_ano[chave] = []
-
+            chave = (emp['cod_sof'], int(emp['ano_eph']))
             # Cálculo do disponível: Total - Cancelado - Pago (NÃO considerar liquidado)
             disponivel = (
                 float(emp['val_tot_eph']) -
                 float(emp['val_tot_canc_eph']) -
                 float(emp['val_tot_pago_eph'])
             )
-
-            # Agregar valor pago por elemento
-            if chave_elemento not in pagos_por_elemento:
-                pagos_por_elemento[chave_elemento] = 0
-            pagos_por_elemento[chave_elemento] += float(emp['val_tot_pago_eph'])
-
-            empenhos_por_termo_ano[chave].append({
+            empenhos_por_termo_ano.setdefault(chave, []).append({
                 'cod_eph': emp['cod_eph'],
-                'ano_eph': ano,
+                'ano_eph': chave[1],
                 'val_tot_eph': float(emp['val_tot_eph']),
                 'val_tot_lqdc_eph': float(emp['val_tot_lqdc_eph']),
                 'val_tot_pago_eph': float(emp['val_tot_pago_eph']),
                 'val_tot_canc_eph': float(emp['val_tot_canc_eph']),
-                'cod_item_desp_sof': elemento,
+                'cod_item_desp_sof': emp['cod_item_desp_sof'],
                 'disponivel': disponivel
             })
+
+        # Valor pago por elemento: já agregado na tabela de saldos
+        cur.execute(f"""
+            SELECT s.cod_sof, s.ano, s.elemento, s.val_tot_pago_eph
+            FROM gestao_financeira.back_empenhos_saldos s
+            WHERE EXISTS (
+                SELECT 1 FROM public.parcerias p WHERE p.sei_celeb_norm = s.cod_sof
+            )
+              {filtro_saldos}
+        """, params)
+        for r in cur.fetchall():
+            pagos_por_elemento[(r['cod_sof'], r['ano'], r['elemento'])] = float(r['val_tot_pago_eph'])
         
     except Exception as e:
         import traceback
@@ -323,6 +333,257 @@ def api_filtros_dados():
         cur.close()
 
 
+# ── Listagem paginada (api_listar_parcelas) ──────────────────────────────
+#
+# Paginação por cursor (keyset): a ordenação da tela vira colunas de chave
+# (todas crescentes, sem NULL, desempate por id) e a página seguinte é
+# "chave > última chave da página anterior". Qualquer página custa o mesmo
+# que a primeira (sem OFFSET). O total é contado uma vez por combinação de
+# filtros e reaproveitado enquanto as tabelas não mudarem.
+#
+# "Ano corrente primeiro" depende de CURRENT_DATE e não pode entrar num
+# índice, então a listagem é feita em duas faixas consultadas em sequência:
+# faixa 0 = vigência no ano corrente, faixa 1 = demais (inclui sem vigência).
+# Dentro de cada faixa as chaves são expressões imutáveis sobre
+# ultra_liquidacoes, servidas pelos índices de _SQL_INDICES_ORDENACAO (mesmas
+# expressões, precedidas da seção). O cursor guarda a faixa + as chaves dela.
+
+POR_PAGINA_PARCELAS = 100
+
+# Seção da tela (nao_pago / encaminhado / pago) como expressão indexável
+_SQL_SECAO = """CASE
+                WHEN POSITION('nao pago' IN LOWER({t}parcela_status)) > 0
+                  OR POSITION('não pago' IN LOWER({t}parcela_status)) > 0 THEN 'nao_pago'
+                WHEN {t}parcela_status = 'Encaminhado para Pagamento' THEN 'encaminhado'
+                WHEN LOWER({t}parcela_status) = 'pago' THEN 'pago'
+            END"""
+SECOES_PARCELAS = ('nao_pago', 'encaminhado', 'pago')
+
+_SQL_ANO_VIGENCIA = "EXTRACT(YEAR FROM {t}vigencia_inicial)"
+
+# Expressões das chaves; {t} = prefixo da tabela ('b.' na consulta, '' no índice)
+_SQL_CHAVES = {
+    # Pendências primeiro (apenas Não Pago e Encaminhado)
+    '_k_pendencia': """CASE
+                WHEN {t}parcela_status IN ('Não Pago', 'Nao Pago', 'Encaminhado para Pagamento')
+                     AND (COALESCE({t}valor_elemento_53_23, 0) + COALESCE({t}valor_elemento_53_24, 0) != COALESCE({t}valor_previsto, 0))
+                THEN 0
+                ELSE 1
+            END""",
+    # Não Pago: status secundário null/- primeiro (só ordena na faixa do ano corrente)
+    '_k_secundario': """CASE
+                WHEN {t}parcela_status IN ('Não Pago', 'Nao Pago')
+                     AND ({t}parcela_status_secundario IS NULL OR {t}parcela_status_secundario = '-' OR {t}parcela_status_secundario = '')
+                THEN 0
+                ELSE 1
+            END""",
+    # Pago: data de pagamento DESC NULLS LAST, expressa como inteiro crescente
+    '_k_pagamento': """COALESCE(
+                CASE WHEN LOWER({t}parcela_status) = 'pago' THEN DATE '9999-12-31' - {t}data_pagamento END,
+                2147483647
+            )""",
+    '_k_vigencia': "COALESCE({t}vigencia_inicial, DATE '9999-12-31')",
+    '_k_termo': "COALESCE({t}numero_termo, '')",
+}
+
+# Tipo de cada chave, para o cast do valor vindo do cursor
+_TIPOS_CHAVE = {
+    '_k_pendencia': 'integer',
+    '_k_secundario': 'integer',
+    '_k_pagamento': 'integer',
+    '_k_vigencia': 'date',
+    '_k_termo': 'text',
+    'id': 'bigint',
+}
+
+# Chaves de ordenação de cada faixa (0 = ano corrente, 1 = demais)
+_CHAVES_FAIXA = (
+    ('_k_pendencia', '_k_secundario', '_k_pagamento', '_k_vigencia', '_k_termo', 'id'),
+    ('_k_pendencia', '_k_pagamento', '_k_vigencia', '_k_termo', 'id'),
+)
+
+_CONDICOES_FAIXA = (
+    f"{_SQL_ANO_VIGENCIA.format(t='b.')} = EXTRACT(YEAR FROM CURRENT_DATE)",
+    f"{_SQL_ANO_VIGENCIA.format(t='b.')} IS DISTINCT FROM EXTRACT(YEAR FROM CURRENT_DATE)",
+)
+
+
+def _sql_indices_ordenacao():
+    """CREATE INDEX das duas faixas (mesmo texto de scripts/migration_ultra_liquidacoes_keyset.sql)."""
+    def expr(chave):
+        return 'id' if chave == 'id' else f"({_SQL_CHAVES[chave].format(t='')})"
+
+    secao = f"({_SQL_SECAO.format(t='')})"
+    faixa_0 = [secao, f"({_SQL_ANO_VIGENCIA.format(t='')})"] + [expr(c) for c in _CHAVES_FAIXA[0]]
+    faixa_1 = [secao] + [expr(c) for c in _CHAVES_FAIXA[1]]
+    return [
+        f"CREATE INDEX IF NOT EXISTS {nome}\n    ON gestao_financeira.ultra_liquidacoes (\n        "
+        + ',\n        '.join(colunas) + "\n    )"
+        for nome, colunas in (
+            ('idx_ultra_liquidacoes_ordem_ano_corrente', faixa_0),
+            ('idx_ultra_liquidacoes_ordem_demais', faixa_1),
+        )
+    ]
+
+
+_indices_ok = False
+_indices_lock = threading.Lock()
+
+
+def _garantir_indices_ordenacao():
+    """DDL guard dos índices da listagem (uma vez por processo)."""
+    global _indices_ok
+    if _indices_ok:
+        return
+    with _indices_lock:
+        if _indices_ok:
+            return
+        from db import pooled_connection
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    for ddl in _sql_indices_ordenacao():
+                        cur.execute(ddl)
+                conn.commit()
+        except Exception as e:
+            # Sem os índices a listagem funciona, só ordena em memória
+            print(f"[ULTRA_LIQUIDACOES] Índices de ordenação indisponíveis: {e}")
+        _indices_ok = True
+
+# Colunas calculadas quando o filtro de cor (tipo_pendencia) está ativo
+_SQL_COLUNAS_PENDENCIA = """,
+                -- REGRA 1: elementos não batem com previsto / REGRA 2: soma das parcelas ≠ total do termo
+                CASE
+                    WHEN (
+                        (LOWER(ul.parcela_status) LIKE '%%nao pago%%' OR LOWER(ul.parcela_status) LIKE '%%não pago%%' OR LOWER(ul.parcela_status) = 'encaminhado para pagamento')
+                        AND ABS((COALESCE(ul.valor_elemento_53_23, 0) + COALESCE(ul.valor_elemento_53_24, 0)) - COALESCE(ul.valor_previsto, 0)) > 0.01
+                    ) OR validacao.tem_divergencia = true
+                    THEN true
+                    ELSE false
+                END AS tem_inconsistencia,
+                -- Prazo crítico (5 dias)
+                CASE
+                    WHEN (LOWER(ul.parcela_status) LIKE '%%nao pago%%' OR LOWER(ul.parcela_status) LIKE '%%não pago%%')
+                         AND ul.vigencia_inicial < (CURRENT_DATE - INTERVAL '5 days')
+                    THEN true
+                    ELSE false
+                END AS necessita_regularizacao,
+                -- Placeholder: cobertura por empenho é calculada em Python
+                false AS empenho_cobre"""
+
+_SQL_JOIN_VALIDACAO = """
+            LEFT JOIN (
+                -- Divergência entre soma das parcelas programadas e total do termo
+                SELECT
+                    ul2.numero_termo,
+                    ABS(SUM(COALESCE(ul2.valor_previsto, 0)) - COALESCE(MAX(p2.total_previsto), 0)) > 0.01 AS tem_divergencia
+                FROM gestao_financeira.ultra_liquidacoes ul2
+                LEFT JOIN public.parcerias p2 ON p2.numero_termo = ul2.numero_termo
+                WHERE ul2.parcela_tipo = 'Programada'
+                GROUP BY ul2.numero_termo
+            ) validacao ON validacao.numero_termo = ul.numero_termo"""
+
+_CONDICOES_PENDENCIA = {
+    'amarelo': "b.tem_inconsistencia = true",
+    'verde_claro': "b.tem_inconsistencia = false AND b.necessita_regularizacao = true",
+    'verde_escuro': "b.tem_inconsistencia = false AND b.necessita_regularizacao = false AND b.empenho_cobre = true",
+    'sem_cor': "b.tem_inconsistencia = false AND b.necessita_regularizacao = false AND b.empenho_cobre = false",
+}
+
+
+def _sql_chaves_ordenacao(com_pendencia):
+    """Colunas de chave da listagem (sobre a subquery `b`)."""
+    expressoes = {chave: sql.format(t='b.') for chave, sql in _SQL_CHAVES.items()}
+    if com_pendencia:
+        # Com filtro de cor: inconsistências, vigência, termo. O filtro depende
+        # do agregado por termo (validacao), então a ordem não vem de índice.
+        expressoes['_k_pendencia'] = "CASE WHEN b.tem_inconsistencia THEN 0 ELSE 1 END"
+        expressoes['_k_secundario'] = "0"
+        expressoes['_k_pagamento'] = "0"
+    return ','.join(f"\n            {sql} AS {chave}" for chave, sql in expressoes.items())
+
+
+def _codificar_cursor(faixa, linha):
+    """Faixa + chaves de ordenação da última linha da página → token opaco (base64)."""
+    valores = [faixa]
+    for coluna in _CHAVES_FAIXA[faixa]:
+        valor = linha[coluna]
+        valores.append(valor.isoformat() if hasattr(valor, 'isoformat') else valor)
+    return base64.urlsafe_b64encode(json.dumps(valores).encode('utf-8')).decode('ascii')
+
+
+def _decodificar_cursor(token):
+    """Token de _codificar_cursor → (faixa, valores das chaves); None se inválido."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except ValueError:
+        return None
+    if not isinstance(valores, list) or not valores or valores[0] not in (0, 1):
+        return None
+    faixa = valores[0]
+    if len(valores) != len(_CHAVES_FAIXA[faixa]) + 1:
+        return None
+    return faixa, valores[1:]
+
+
+class _CacheContagem:
+    """
+    Total de registros por combinação de filtros.
+
+    A entrada vale enquanto a "versão" das tabelas da listagem (soma de
+    n_tup_ins/upd/del em pg_stat_user_tables) não mudar e por no máximo TTL s.
+    As estatísticas chegam ao catálogo com alguns segundos de atraso, por isso
+    as escritas deste blueprint também limpam o cache local (after_request).
+    """
+
+    TTL = 300
+    MAX_ITENS = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {}      # chave → (versão, expira_em, total)
+
+    def obter(self, cur, chave, contar):
+        versao = self._versao(cur)
+        agora = time.monotonic()
+        with self._lock:
+            item = self._valores.get(chave)
+            if item and item[0] == versao and item[1] > agora:
+                return item[2], True
+        total = contar()
+        with self._lock:
+            if len(self._valores) >= self.MAX_ITENS:
+                self._valores.clear()
+            self._valores[chave] = (versao, agora + self.TTL, total)
+        return total, False
+
+    def limpar(self):
+        with self._lock:
+            self._valores.clear()
+
+    def _versao(self, cur):
+        cur.execute("""
+            SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0) AS versao
+            FROM pg_stat_user_tables
+            WHERE (schemaname, relname) IN (
+                ('gestao_financeira', 'ultra_liquidacoes'),
+                ('public', 'parcerias'),
+                ('public', 'parcerias_infos_adicionais')
+            )
+        """)
+        return cur.fetchone()['versao']
+
+
+_contagens = _CacheContagem()
+
+
+@ultra_liquidacoes_bp.after_request
+def _limpar_contagens_apos_escrita(response):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        _contagens.limpar()
+    return response
+
+
 @ultra_liquidacoes_bp.route('/api/parcelas')
 @login_required
 def api_listar_parcelas():
@@ -337,7 +598,16 @@ def api_listar_parcelas():
         # Parâmetros de filtro
         secao = request.args.get('secao', 'nao_pago')  # nao_pago, encaminhado, pago
         pagina = int(request.args.get('pagina', 1))
-        por_pagina = 100
+        por_pagina = POR_PAGINA_PARCELAS
+        
+        # Cursor da página (proximo_cursor da resposta anterior); vazio = primeira página
+        cursor_pagina = request.args.get('cursor', '')
+        faixa_cursor, valores_cursor = 0, None
+        if cursor_pagina:
+            decodificado = _decodificar_cursor(cursor_pagina)
+            if decodificado is None:
+                return jsonify({'success': False, 'error': 'Cursor de paginação inválido'}), 400
+            faixa_cursor, valores_cursor = decodificado
         
         # Filtros adicionais
         filtro_termo = request.args.get('numero_termo', '')
@@ -359,6 +629,8 @@ def api_listar_parcelas():
         filtro_tipo_termo = request.args.get('tipo_termo', '')
         filtro_tipo_pendencia = request.args.get('tipo_pendencia', '')  # sem_cor, amarelo, verde_claro, verde_escuro
         filtro_ano_termino_termo = request.args.get('ano_termino_termo', '')  # Ano de término da PARCERIA
+        if filtro_tipo_pendencia not in _CONDICOES_PENDENCIA:
+            filtro_tipo_pendencia = ''
         
         # DEBUG: Log do filtro de pendência
         print(f"\n🔍 DEBUG FILTRO PENDÊNCIA:")
@@ -400,17 +672,11 @@ def api_listar_parcelas():
         # Construir WHERE baseado na seção
         where_secao = []
         
-        if secao == 'nao_pago':
-            # Aceita variações: 'Nao Pago', 'Não Pago', 'NAO PAGO', etc
-            where_secao.append("(ul.parcela_status ILIKE %s OR ul.parcela_status ILIKE %s)")
-            params.extend(['%nao pago%', '%não pago%'])
-        elif secao == 'encaminhado':
-            where_secao.append("ul.parcela_status = %s")
-            params.append('Encaminhado para Pagamento')
-        elif secao == 'pago':
-            # Aceita variações: 'Pago', 'pago', 'PAGO'
-            where_secao.append("LOWER(ul.parcela_status) = %s")
-            params.append('pago')
+        if secao in SECOES_PARCELAS:
+            # Aceita variações: 'Nao Pago', 'Não Pago', 'NAO PAGO', 'pago', 'PAGO' etc.
+            # A expressão é a mesma que abre os índices de ordenação
+            where_secao.append(f"({_SQL_SECAO.format(t='ul.')}) = %s")
+            params.append(secao)
         
         # Construir WHERE adicional
         where_filtros = []
@@ -524,96 +790,10 @@ def api_listar_parcelas():
         # Combinar WHERE
         where_clause = ' AND '.join(where_secao + where_filtros)
         
-        # Query principal - usar subquery se filtro de pendência ativo
-        if filtro_tipo_pendencia:
-            # Subquery para incluir cálculo de pendências
-            query = f"""
-            SELECT * FROM (
-                SELECT 
-                    ul.id,
-                    ul.vigencia_inicial,
-                    ul.vigencia_final,
-                    ul.numero_termo,
-                    ul.parcela_tipo,
-                    ul.parcela_numero,
-                    ul.valor_elemento_53_23,
-                    ul.valor_elemento_53_24,
-                    ul.valor_previsto,
-                    ul.valor_subtraido,
-                    ul.valor_encaminhado,
-                    ul.valor_pago,
-                    ul.parcela_status,
-                    ul.parcela_status_secundario,
-                    ul.parcela_andamento,
-                    ul.data_pagamento,
-                    ul.observacoes,
-                    p.osc,
-                    p.cnpj,
-                    p.projeto,
-                    p.sei_celeb,
-                    p.sei_pc,
-                    pia.parceria_objeto,
-                    -- Calcular se tem inconsistência (REGRA 1: elementos vs previsto OU REGRA 2: soma parcelas vs total termo)
-                    CASE 
-                        WHEN (
-                            -- REGRA 1: Elementos não batem com previsto
-                            (LOWER(ul.parcela_status) LIKE '%%nao pago%%' OR LOWER(ul.parcela_status) LIKE '%%não pago%%' OR LOWER(ul.parcela_status) = 'encaminhado para pagamento')
-                            AND ABS((COALESCE(ul.valor_elemento_53_23, 0) + COALESCE(ul.valor_elemento_53_24, 0)) - COALESCE(ul.valor_previsto, 0)) > 0.01
-                        ) OR (
-                            -- REGRA 2: Soma das parcelas programadas do termo ≠ total previsto do termo
-                            validacao.tem_divergencia = true
-                        )
-                        THEN true
-                        ELSE false
-                    END as tem_inconsistencia,
-                    -- Calcular se necessita pagamento (prazo crítico - 5 dias)
-                    CASE 
-                        WHEN (LOWER(ul.parcela_status) LIKE '%%nao pago%%' OR LOWER(ul.parcela_status) LIKE '%%não pago%%')
-                             AND ul.vigencia_inicial < (CURRENT_DATE - INTERVAL '5 days')
-                        THEN true
-                        ELSE false
-                    END as necessita_regularizacao,
-                    -- Calcular se empenho cobre valor (placeholder - ajustar se tiver lógica real)
-                    false as empenho_cobre
-                FROM gestao_financeira.ultra_liquidacoes ul
-                LEFT JOIN public.parcerias p ON p.numero_termo = ul.numero_termo
-                LEFT JOIN (
-                    -- Subquery para calcular divergências por termo
-                    SELECT 
-                        ul2.numero_termo,
-                        CASE 
-                            WHEN ABS(SUM(COALESCE(ul2.valor_previsto, 0)) - COALESCE(MAX(p2.total_previsto), 0)) > 0.01
-                            THEN true
-                            ELSE false
-                        END as tem_divergencia
-                    FROM gestao_financeira.ultra_liquidacoes ul2
-                    LEFT JOIN public.parcerias p2 ON p2.numero_termo = ul2.numero_termo
-                    WHERE ul2.parcela_tipo = 'Programada'
-                    GROUP BY ul2.numero_termo
-                ) validacao ON validacao.numero_termo = ul.numero_termo
-                WHERE {where_clause}
-            ) subq
-            WHERE 
-                -- Se filtro vazio, mostrar todos; caso contrário, filtrar por cor
-                ('{filtro_tipo_pendencia}' = '' OR
-                 ('{filtro_tipo_pendencia}' = 'amarelo' AND subq.tem_inconsistencia = true) OR
-                 ('{filtro_tipo_pendencia}' = 'verde_claro' AND subq.tem_inconsistencia = false AND subq.necessita_regularizacao = true) OR
-                 ('{filtro_tipo_pendencia}' = 'verde_escuro' AND subq.tem_inconsistencia = false AND subq.necessita_regularizacao = false AND subq.empenho_cobre = true) OR
-                 ('{filtro_tipo_pendencia}' = 'sem_cor' AND subq.tem_inconsistencia = false AND subq.necessita_regularizacao = false AND subq.empenho_cobre = false))
-            ORDER BY 
-                -- Ano atual primeiro
-                CASE WHEN EXTRACT(YEAR FROM subq.vigencia_inicial) = EXTRACT(YEAR FROM CURRENT_DATE) THEN 0 ELSE 1 END ASC,
-                -- Pendências primeiro
-                CASE 
-                    WHEN subq.tem_inconsistencia = true THEN 0
-                    ELSE 1
-                END ASC,
-                -- Ordem padrão
-                subq.vigencia_inicial ASC, 
-                subq.numero_termo ASC
-            """
-        else:
-            query = f"""
+        # Base: parcelas filtradas (+ colunas de pendência se filtro de cor ativo).
+        # O valor do filtro de cor só escolhe uma condição fixa — nunca entra no SQL.
+        com_pendencia = bool(filtro_tipo_pendencia)
+        query_base = f"""
             SELECT 
                 ul.id,
                 ul.vigencia_inicial,
@@ -637,112 +817,79 @@ def api_listar_parcelas():
                 p.projeto,
                 p.sei_celeb,
                 p.sei_pc,
-                pia.parceria_objeto
+                pia.parceria_objeto{_SQL_COLUNAS_PENDENCIA if com_pendencia else ''}
             FROM gestao_financeira.ultra_liquidacoes ul
             LEFT JOIN public.parcerias p ON p.numero_termo = ul.numero_termo
-            LEFT JOIN public.parcerias_infos_adicionais pia ON pia.numero_termo = ul.numero_termo
+            LEFT JOIN public.parcerias_infos_adicionais pia ON pia.numero_termo = ul.numero_termo{_SQL_JOIN_VALIDACAO if com_pendencia else ''}
             WHERE {where_clause}
-            ORDER BY 
-                -- Ano atual primeiro
-                CASE WHEN EXTRACT(YEAR FROM ul.vigencia_inicial) = EXTRACT(YEAR FROM CURRENT_DATE) THEN 0 ELSE 1 END ASC,
-                -- Pendências primeiro (apenas para Não Pago e Encaminhado)
-                CASE 
-                    WHEN ul.parcela_status IN ('Não Pago', 'Nao Pago', 'Encaminhado para Pagamento')
-                         AND (COALESCE(ul.valor_elemento_53_23, 0) + COALESCE(ul.valor_elemento_53_24, 0) != COALESCE(ul.valor_previsto, 0))
-                    THEN 0
-                    ELSE 1
-                END ASC,
-                -- Para Não Pago: priorizar status secundário null/- do ano atual
-                CASE 
-                    WHEN ul.parcela_status IN ('Não Pago', 'Nao Pago')
-                         AND (ul.parcela_status_secundario IS NULL OR ul.parcela_status_secundario = '-' OR ul.parcela_status_secundario = '')
-                         AND EXTRACT(YEAR FROM ul.vigencia_inicial) = EXTRACT(YEAR FROM CURRENT_DATE)
-                    THEN 0
-                    ELSE 1
-                END ASC,
-                -- Para Pago: ordenar por data DESC
-                CASE WHEN LOWER(ul.parcela_status) = 'pago' THEN ul.data_pagamento END DESC NULLS LAST,
-                -- Ordem padrão
-                ul.vigencia_inicial ASC, 
-                ul.numero_termo ASC
+        """
+        condicoes_cor = [_CONDICOES_PENDENCIA[filtro_tipo_pendencia]] if com_pendencia else []
+        where_cor = f"WHERE {condicoes_cor[0]}" if condicoes_cor else ''
+        
+        def _sql_faixa(faixa):
+            condicoes = ' AND '.join(condicoes_cor + [_CONDICOES_FAIXA[faixa]])
+            return f"""
+            SELECT * FROM (
+                SELECT b.*, {_sql_chaves_ordenacao(com_pendencia)}
+                FROM ({query_base}) b
+                WHERE {condicoes}
+            ) k
             """
         
-        # Adicionar LIMIT e OFFSET
-        query += " LIMIT %s OFFSET %s"
-        params.extend([por_pagina, (pagina - 1) * por_pagina])
+        # Compatibilidade: cliente antigo pedindo página por número (OFFSET)
+        offset = (pagina - 1) * por_pagina if not valores_cursor and pagina > 1 else 0
         
+        _garantir_indices_ordenacao()
         print(f"\n🔄 EXECUTANDO QUERY...")
-        print(f"   Total de parâmetros: {len(params)}")
-        print(f"   Usando query COM filtro de cor? {bool(filtro_tipo_pendencia)}")
-        print(f"\n📝 QUERY SQL (primeiros 1000 chars):")
-        print(query[:1000])
-        print(f"\n📝 Parâmetros (primeiros 5): {params[:5]}")
-        cur.execute(query, params)
-        parcelas = cur.fetchall()
+        print(f"   Usando query COM filtro de cor? {com_pendencia}")
+        print(f"   Cursor: {'sim' if valores_cursor else 'não'}")
+        # (faixa, linha); uma linha a mais só para saber se existe próxima página
+        linhas = []
+        for faixa in range(faixa_cursor, len(_CHAVES_FAIXA)):
+            falta = por_pagina + 1 - len(linhas)
+            if falta <= 0:
+                break
+            chaves = _CHAVES_FAIXA[faixa]
+            colunas_chave = ', '.join(chaves)
+            query = _sql_faixa(faixa)
+            params_pagina = list(params)
+            if valores_cursor and faixa == faixa_cursor:
+                # Keyset: continua logo após a última linha da página anterior
+                query += f"""
+            WHERE ({colunas_chave}) > ({', '.join(f'%s::{_TIPOS_CHAVE[c]}' for c in chaves)})
+            """
+                params_pagina.extend(valores_cursor)
+            query += f" ORDER BY {colunas_chave} LIMIT %s"
+            params_pagina.append(falta)
+            if offset:
+                query += " OFFSET %s"
+                params_pagina.append(offset)
+            cur.execute(query, params_pagina)
+            encontradas = cur.fetchall()
+            if offset:
+                if encontradas:
+                    offset = 0
+                else:
+                    # OFFSET além desta faixa: desconta as linhas dela na próxima
+                    cur.execute(f"SELECT COUNT(*) AS total FROM ({_sql_faixa(faixa)}) f", params)
+                    offset = max(0, offset - cur.fetchone()['total'])
+            linhas.extend((faixa, linha) for linha in encontradas)
+        
+        tem_mais = len(linhas) > por_pagina
+        linhas = linhas[:por_pagina]
+        parcelas = [linha for _, linha in linhas]
+        proximo_cursor = _codificar_cursor(*linhas[-1]) if tem_mais else None
         print(f"\n✅ QUERY EXECUTADA")
-        print(f"   Resultados retornados: {len(parcelas)}")
+        print(f"   Resultados retornados: {len(parcelas)} (mais páginas: {tem_mais})")
         
-        # Contar total
-        if filtro_tipo_pendencia:
-            query_count = f"""
-            SELECT COUNT(*) as total FROM (
-                SELECT ul.id,
-                    CASE 
-                        WHEN (
-                            -- REGRA 1: Elementos não batem com previsto
-                            (LOWER(ul.parcela_status) LIKE '%%nao pago%%' OR LOWER(ul.parcela_status) LIKE '%%não pago%%' OR LOWER(ul.parcela_status) = 'encaminhado para pagamento')
-                            AND ABS((COALESCE(ul.valor_elemento_53_23, 0) + COALESCE(ul.valor_elemento_53_24, 0)) - COALESCE(ul.valor_previsto, 0)) > 0.01
-                        ) OR (
-                            -- REGRA 2: Soma das parcelas programadas do termo ≠ total previsto do termo
-                            validacao.tem_divergencia = true
-                        )
-                        THEN true
-                        ELSE false
-                    END as tem_inconsistencia,
-                    CASE 
-                        WHEN (LOWER(ul.parcela_status) LIKE '%%nao pago%%' OR LOWER(ul.parcela_status) LIKE '%%não pago%%')
-                             AND ul.vigencia_inicial < (CURRENT_DATE - INTERVAL '5 days')
-                        THEN true
-                        ELSE false
-                    END as necessita_regularizacao,
-                    false as empenho_cobre
-                FROM gestao_financeira.ultra_liquidacoes ul
-                LEFT JOIN public.parcerias p ON p.numero_termo = ul.numero_termo
-                LEFT JOIN (
-                    -- Subquery para calcular divergências por termo
-                    SELECT 
-                        ul2.numero_termo,
-                        CASE 
-                            WHEN ABS(SUM(COALESCE(ul2.valor_previsto, 0)) - COALESCE(MAX(p2.total_previsto), 0)) > 0.01
-                            THEN true
-                            ELSE false
-                        END as tem_divergencia
-                    FROM gestao_financeira.ultra_liquidacoes ul2
-                    LEFT JOIN public.parcerias p2 ON p2.numero_termo = ul2.numero_termo
-                    WHERE ul2.parcela_tipo = 'Programada'
-                    GROUP BY ul2.numero_termo
-                ) validacao ON validacao.numero_termo = ul.numero_termo
-                WHERE {where_clause}
-            ) subq
-            WHERE 
-                ('{filtro_tipo_pendencia}' = '' OR
-                 ('{filtro_tipo_pendencia}' = 'amarelo' AND subq.tem_inconsistencia = true) OR
-                 ('{filtro_tipo_pendencia}' = 'verde_claro' AND subq.tem_inconsistencia = false AND subq.necessita_regularizacao = true) OR
-                 ('{filtro_tipo_pendencia}' = 'verde_escuro' AND subq.tem_inconsistencia = false AND subq.necessita_regularizacao = false AND subq.empenho_cobre = true) OR
-                 ('{filtro_tipo_pendencia}' = 'sem_cor' AND subq.tem_inconsistencia = false AND subq.necessita_regularizacao = false AND subq.empenho_cobre = false))
-            """
-            cur.execute(query_count, params[:-2])  # Sem LIMIT/OFFSET
-        else:
-            # Query count SEM filtro de cor (query simples)
-            query_count = f"""
-                SELECT COUNT(*) as total
-                FROM gestao_financeira.ultra_liquidacoes ul
-                LEFT JOIN public.parcerias p ON p.numero_termo = ul.numero_termo
-                WHERE {where_clause}
-            """
-            cur.execute(query_count, params[:-2])  # Sem LIMIT/OFFSET
-        total = cur.fetchone()['total']
-        print(f"\n📈 TOTAL DE REGISTROS (query_count): {total}")
+        # Contar total (reaproveitado entre páginas e workers enquanto as tabelas não mudarem)
+        def _contar():
+            cur.execute(f"SELECT COUNT(*) AS total FROM ({query_base}) b {where_cor}", params)
+            return cur.fetchone()['total']
+        
+        chave_contagem = (secao, where_clause, filtro_tipo_pendencia, tuple(str(v) for v in params))
+        total, contagem_em_cache = _contagens.obter(cur, chave_contagem, _contar)
+        print(f"\n📈 TOTAL DE REGISTROS: {total} ({'cache' if contagem_em_cache else 'contado'})")
         
         # Formatar resultado
         resultado = []
@@ -751,6 +898,9 @@ def api_listar_parcelas():
         
         hoje = datetime.now().date()
         
+        # Termos da página: validação, empenhos e cascata só precisam deles
+        termos_pagina = sorted({p['numero_termo'] for p in parcelas if p['numero_termo']})
+        
         # Calcular soma de valores previstos por termo para validação
         # Apenas para parcelas Programadas (NÃO Projetadas)
         cur.execute("""
@@ -760,18 +910,29 @@ def api_listar_parcelas():
             FROM gestao_financeira.ultra_liquidacoes ul
             LEFT JOIN public.parcerias p ON p.numero_termo = ul.numero_termo
             WHERE ul.parcela_tipo = 'Programada'
+              AND ul.numero_termo = ANY(%s)
             GROUP BY ul.numero_termo, p.total_previsto
-        """)
+        """, (termos_pagina,))
         validacao_termos = {r['numero_termo']: {
             'soma_parcelas': float(r['soma_previsto_parcelas'] or 0),
             'total_termo': float(r['total_previsto'] or 0)
         } for r in cur.fetchall()}
         
-        # Calcular empenhos disponíveis por termo/ano
+        # Criar mapeamento termo → sei_celeb a partir dos dados já carregados
+        # (p.sei_celeb já está no SELECT principal — sem query adicional ao banco)
+        termo_para_sei = {
+            p['numero_termo']: p['sei_celeb']
+            for p in parcelas if p['sei_celeb']
+        }
+        
+        # Calcular empenhos disponíveis por termo/ano — apenas dos termos da página
         # USAR CURSOR SEPARADO para evitar quebrar a transação
         cur_empenhos = get_cursor()
         try:
-            empenhos_disponiveis, pagos_por_elemento, avisos_empenhos = calcular_empenhos_disponiveis(cur_empenhos, hoje)
+            empenhos_disponiveis, pagos_por_elemento, avisos_empenhos = calcular_empenhos_disponiveis(
+                cur_empenhos, hoje,
+                cod_sofs=[converter_sei_para_cod_sof(sei) for sei in termo_para_sei.values()]
+            )
         except Exception as e_emp:
             print(f"[AVISO] calcular_empenhos_disponiveis falhou: {e_emp} — continuando sem empenhos")
             try:
@@ -788,13 +949,6 @@ def api_listar_parcelas():
         # Salvar avisos no session para o relatório DEBUG (última execução)
         session['debug_avisos_empenhos'] = avisos_empenhos
         
-        # Criar mapeamento termo → sei_celeb a partir dos dados já carregados
-        # (p.sei_celeb já está no SELECT principal — sem query adicional ao banco)
-        termo_para_sei = {
-            p['numero_termo']: p['sei_celeb']
-            for p in parcelas if p['sei_celeb']
-        }
-        
         for p in parcelas:
             # Calcular pendências
             pendencias = []
@@ -907,7 +1061,7 @@ def api_listar_parcelas():
         valores_consumidos = defaultdict(float)
         
         # PASSO 2: Contabilizar consumo de parcelas com status "Pago"
-        # CRÍTICO: buscar TODAS as parcelas "Pago" do banco, não só as da página atual.
+        # CRÍTICO: buscar TODAS as parcelas "Pago" dos termos da página, não só as exibidas.
         # Se o usuário está na aba "Encaminhado", as parcelas "Pago" não estão em `resultado`,
         # então precisamos de uma query separada para evitar que o saldo seja redistribuído
         # para parcelas erradas.
@@ -919,7 +1073,8 @@ def api_listar_parcelas():
                        COALESCE(valor_elemento_53_24, 0) AS valor_24
                 FROM gestao_financeira.ultra_liquidacoes
                 WHERE LOWER(parcela_status) = 'pago'
-            """)
+                  AND numero_termo = ANY(%s)
+            """, (termos_pagina,))
             parcelas_pagas_banco = cur.fetchall()
             for pp in parcelas_pagas_banco:
                 vi = pp['vigencia_inicial']
@@ -1048,6 +1203,8 @@ def api_listar_parcelas():
             'pagina': pagina,
             'por_pagina': por_pagina,
             'total_paginas': (total + por_pagina - 1) // por_pagina,
+            'proximo_cursor': proximo_cursor,
+            'tem_mais': tem_mais,
             'total_pendencias': total_pendencias,
             'total_necessita_pagamento': total_necessita_pagamento,
             'total_empenho_cobre': total_empenho_cobre,
@@ -1455,10 +1612,7 @@ def api_deletar_historico_andamento(log_id):
 @ultra_liquidacoes_bp.route('/api/exportar-csv')
 @login_required
 def api_exportar_csv():
-    """API para exportar dados em CSV"""
-    conn = get_db()
-    cur = get_cursor()
-    
+    """API para exportar dados em CSV (streaming, ver core.exportacao)"""
     try:
         modo = request.args.get('modo', 'tudo')  # tudo, secao, filtrado
         secao = request.args.get('secao', 'nao_pago')
@@ -1569,26 +1723,19 @@ def api_exportar_csv():
             ORDER BY ul.vigencia_inicial ASC
         """
         
-        cur.execute(query, params)
-        parcelas = cur.fetchall()
+        consulta = exportacao.consultar(query, params)
         
-        # Criar CSV
-        output = io.StringIO()
-        writer = csv.writer(output, delimiter=';')
-        
-        # Cabeçalho
-        writer.writerow([
+        cabecalho = [
             'Vigência Inicial', 'Vigência Final', 'Número do Termo',
             'Tipo Parcela', 'Número Parcela', 
             'Valor Elemento 53/23', 'Valor Elemento 53/24', 'Valor Previsto',
             'Valor Subtraído', 'Valor Encaminhado', 'Valor Pago',
             'Status', 'Status Secundário', 'Andamento', 'Data Pagamento', 'Observações',
             'OSC', 'CNPJ', 'Projeto', 'Processo Celebração', 'Processo PGTO/PC', 'Objeto'
-        ])
+        ]
         
-        # Dados
-        for p in parcelas:
-            writer.writerow([
+        def _linha(p):
+            return [
                 formatar_data_br(p['vigencia_inicial']),
                 formatar_data_br(p['vigencia_final']),
                 p['numero_termo'],
@@ -1611,28 +1758,15 @@ def api_exportar_csv():
                 p['sei_celeb'] or '',
                 p['sei_pc'] or '',
                 p['parceria_objeto'] or ''
-            ])
+            ]
         
-        output.seek(0)
-        
-        # Adicionar BOM UTF-8 para Excel reconhecer encoding
-        csv_content = '\ufeff' + output.getvalue()
-        
-        from flask import Response
-        return Response(
-            csv_content.encode('utf-8'),
-            mimetype='text/csv; charset=utf-8',
-            headers={
-                'Content-Disposition': f'attachment; filename=ultra_liquidacoes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                'Content-Type': 'text/csv; charset=utf-8'
-            }
+        return exportacao.resposta_csv(
+            f'ultra_liquidacoes_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+            cabecalho, (_linha(p) for p in consulta), consulta
         )
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
-    
-    finally:
-        cur.close()
 
 
 @ultra_liquidacoes_bp.route('/api/termo-info/<path:numero_termo>')
@@ -8,6 +8,7 @@ from flask import Blueprint, render_template, request, jsonify, session
 from db import get_db, get_cursor
 from utils import login_required
 from decorators import requires_access, requires_write_access
+from core import cronograma_distribuicao
 import re
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
@@ -486,51 +487,28 @@ def api_orcamento_detalhado():
         cur.close()
 
 
+def _ano_referencia():
+    """ano_referencia da query string como int (None se ausente ou inválido)."""
+    try:
+        return int(request.args.get('ano_referencia', ''))
+    except ValueError:
+        return None
+
+
 @gestao_orcamentaria_bp.route('/api/cronograma-pago')
 @login_required
 @requires_access('gestao_orcamentaria')
 def api_cronograma_pago():
     """API para obter cronograma mensal de valores PAGOS por termo (ano de referência)"""
-    conn = get_db()
-    cur = get_cursor()
+    ano_referencia = _ano_referencia()
+    if not ano_referencia:
+        return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
     
+    # Parcelas pagas + valor parcial das encaminhadas com valor_pago > 0, no mês de vigencia_inicial
+    cronograma_distribuicao.sincronizar()
+    cur = get_cursor()
     try:
-        ano_referencia = request.args.get('ano_referencia')
-        if not ano_referencia:
-            return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
-        
-        cur.execute("""
-            SELECT
-                numero_termo,
-                EXTRACT(MONTH FROM vigencia_inicial)::int AS mes,
-                SUM(
-                    CASE
-                        WHEN parcela_status = 'Pago' THEN valor_previsto
-                        WHEN parcela_status = 'Encaminhado para Pagamento' AND valor_pago > 0 THEN valor_pago
-                        ELSE 0
-                    END
-                ) AS valor
-            FROM gestao_financeira.ultra_liquidacoes
-            WHERE (
-                parcela_status = 'Pago'
-                OR (parcela_status = 'Encaminhado para Pagamento' AND valor_pago > 0)
-            )
-              AND EXTRACT(YEAR FROM vigencia_inicial) = %s
-            GROUP BY numero_termo, EXTRACT(MONTH FROM vigencia_inicial)
-            ORDER BY numero_termo, mes
-        """, (ano_referencia,))
-        
-        rows = cur.fetchall()
-        
-        dados_pago = {}
-        for row in rows:
-            nt = row['numero_termo']
-            mes = int(row['mes'])
-            valor = float(row['valor'] or 0)
-            if nt not in dados_pago:
-                dados_pago[nt] = {}
-            dados_pago[nt][mes] = dados_pago[nt].get(mes, 0) + valor
-        
+        dados_pago = cronograma_distribuicao.por_mes(cur, ano_referencia, 'pago')
         return jsonify({'success': True, 'dados_pago': dados_pago})
     
     except Exception as e:
@@ -548,37 +526,14 @@ def api_cronograma_pago():
 @requires_access('gestao_orcamentaria')
 def api_cronograma_comprometido():
     """API para obter cronograma mensal de valores COMPROMETIDOS por termo (Encaminhado para Pagamento)"""
-    conn = get_db()
-    cur = get_cursor()
+    ano_referencia = _ano_referencia()
+    if not ano_referencia:
+        return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
     
+    cronograma_distribuicao.sincronizar()
+    cur = get_cursor()
     try:
-        ano_referencia = request.args.get('ano_referencia')
-        if not ano_referencia:
-            return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
-        
-        cur.execute("""
-            SELECT
-                numero_termo,
-                EXTRACT(MONTH FROM vigencia_inicial)::int AS mes,
-                SUM(valor_previsto) AS valor
-            FROM gestao_financeira.ultra_liquidacoes
-            WHERE parcela_status = 'Encaminhado para Pagamento'
-              AND EXTRACT(YEAR FROM vigencia_inicial) = %s
-            GROUP BY numero_termo, EXTRACT(MONTH FROM vigencia_inicial)
-            ORDER BY numero_termo, mes
-        """, (ano_referencia,))
-        
-        rows = cur.fetchall()
-        
-        dados_comprometido = {}
-        for row in rows:
-            nt = row['numero_termo']
-            mes = int(row['mes'])
-            valor = float(row['valor'] or 0)
-            if nt not in dados_comprometido:
-                dados_comprometido[nt] = {}
-            dados_comprometido[nt][mes] = dados_comprometido[nt].get(mes, 0) + valor
-        
+        dados_comprometido = cronograma_distribuicao.por_mes(cur, ano_referencia, 'comprometido')
         return jsonify({'success': True, 'dados_comprometido': dados_comprometido})
     
     except Exception as e:
@@ -593,122 +548,21 @@ def api_cronograma_comprometido():
 
 def _distribuir_cronograma_por_status(ano_referencia, parcela_status):
     """
-    Distribui valores de ultra_liquidacoes_cronograma pelos meses do ano,
-    respeitando o valor_previsto de cada parcela (fill-from-start).
+    Distribuição fill-from-start dos valores de ultra_liquidacoes_cronograma
+    pelos meses do ano, lida de gestao_financeira.cronograma_distribuicao
+    (ver core/cronograma_distribuicao).
 
-    Algoritmo:
-      - Para cada parcela (numero_termo, parcela_numero) com o status dado:
-          1. Obtém valor_previsto de ultra_liquidacoes.
-          2. Obtém entradas mensais de ultra_liquidacoes_cronograma para o ano.
-          3. Ordena meses ASC e preenche do início até esgotar valor_previsto.
-          4. Se valor_previsto > soma do cronograma, o excesso vai para o último mês
-             e este mês é marcado como "destacado" (fundo diferente no front).
+    Para 'Pago' inclui o valor parcial de parcelas 'Encaminhado para Pagamento'
+    com valor_pago > 0. Meses em que o valor da parcela excede o cronograma
+    vêm em "highlighted" (fundo diferente no front).
 
     Retorna dict: {numero_termo: {"meses": {1..12: float}, "highlighted": [int]}}
     """
-    conn = get_db()
+    serie = 'pago_distribuido' if parcela_status == 'Pago' else 'comprometido_distribuido'
+    cronograma_distribuicao.sincronizar()
     cur = get_cursor()
     try:
-        # 1. Parcelas com valor para o status/ano
-        # Para 'Pago': inclui também parcelas 'Encaminhado para Pagamento' com valor_pago > 0
-        # usando valor_pago (parcial) em vez de valor_previsto nesses casos.
-        if parcela_status == 'Pago':
-            cur.execute("""
-                SELECT
-                    numero_termo,
-                    parcela_numero,
-                    SUM(
-                        CASE
-                            WHEN parcela_status = 'Pago' THEN valor_previsto
-                            WHEN parcela_status = 'Encaminhado para Pagamento' AND valor_pago > 0 THEN valor_pago
-                            ELSE 0
-                        END
-                    )::float AS valor_previsto
-                FROM gestao_financeira.ultra_liquidacoes
-                WHERE (
-                    parcela_status = 'Pago'
-                    OR (parcela_status = 'Encaminhado para Pagamento' AND valor_pago > 0)
-                )
-                  AND EXTRACT(YEAR FROM vigencia_inicial) = %s
-                GROUP BY numero_termo, parcela_numero
-            """, (ano_referencia,))
-        else:
-            cur.execute("""
-                SELECT
-                    numero_termo,
-                    parcela_numero,
-                    SUM(valor_previsto)::float AS valor_previsto
-                FROM gestao_financeira.ultra_liquidacoes
-                WHERE parcela_status = %s
-                  AND EXTRACT(YEAR FROM vigencia_inicial) = %s
-                GROUP BY numero_termo, parcela_numero
-            """, (parcela_status, ano_referencia))
-        parcelas = {}
-        for r in cur.fetchall():
-            key = (r['numero_termo'], r['parcela_numero'])
-            parcelas[key] = float(r['valor_previsto'] or 0)
-
-        if not parcelas:
-            return {}
-
-        # 2. Cronograma mensal para o ano
-        termos_list = list({k[0] for k in parcelas})
-        cur.execute("""
-            SELECT
-                numero_termo,
-                parcela_numero,
-                EXTRACT(MONTH FROM nome_mes)::int AS mes,
-                valor_mes::float AS valor_mes
-            FROM gestao_financeira.ultra_liquidacoes_cronograma
-            WHERE EXTRACT(YEAR FROM nome_mes) = %s
-              AND numero_termo = ANY(%s)
-            ORDER BY numero_termo, parcela_numero, nome_mes
-        """, (ano_referencia, termos_list))
-
-        cronograma_raw = {}  # {(termo, parcela): [(mes, valor), ...]}
-        for r in cur.fetchall():
-            key = (r['numero_termo'], r['parcela_numero'])
-            cronograma_raw.setdefault(key, []).append(
-                (int(r['mes']), float(r['valor_mes'] or 0))
-            )
-
-        # 3. Aplicar algoritmo fill-from-start por parcela
-        resultado = {}  # {termo: {"meses": {mes: float}, "highlighted": [mes]}}
-
-        for (termo, parcela), valor_previsto in parcelas.items():
-            entries = sorted(cronograma_raw.get((termo, parcela), []), key=lambda x: x[0])
-            if not entries:
-                continue
-
-            if termo not in resultado:
-                resultado[termo] = {'meses': {}, 'highlighted': []}
-
-            remaining = valor_previsto
-
-            for i, (mes, cronograma_val) in enumerate(entries):
-                is_last = (i == len(entries) - 1)
-
-                if remaining <= 0:
-                    month_value = 0.0
-                elif is_last:
-                    # Último mês: recebe todo o restante (pode ser > cronograma_val)
-                    month_value = remaining
-                    if remaining > cronograma_val:
-                        resultado[termo]['highlighted'].append(mes)
-                    remaining = 0.0
-                elif remaining >= cronograma_val:
-                    month_value = cronograma_val
-                    remaining -= cronograma_val
-                else:
-                    # Mês parcial
-                    month_value = remaining
-                    remaining = 0.0
-
-                resultado[termo]['meses'][mes] = (
-                    resultado[termo]['meses'].get(mes, 0.0) + month_value
-                )
-
-        return resultado
+        return cronograma_distribuicao.distribuicao(cur, ano_referencia, serie)
     finally:
         cur.close()
 
@@ -718,7 +572,7 @@ def _distribuir_cronograma_por_status(ano_referencia, parcela_status):
 @requires_access('gestao_orcamentaria')
 def api_cronograma_pago_detalhado():
     """Cronograma detalhado de PAGOS (fill-from-start via ultra_liquidacoes_cronograma)"""
-    ano_referencia = request.args.get('ano_referencia')
+    ano_referencia = _ano_referencia()
     if not ano_referencia:
         return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
     try:
@@ -734,7 +588,7 @@ def api_cronograma_pago_detalhado():
 @requires_access('gestao_orcamentaria')
 def api_cronograma_comprometido_detalhado():
     """Cronograma detalhado de COMPROMETIDOS (fill-from-start via ultra_liquidacoes_cronograma)"""
-    ano_referencia = request.args.get('ano_referencia')
+    ano_referencia = _ano_referencia()
     if not ano_referencia:
         return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
     try:
@@ -750,62 +604,15 @@ def api_cronograma_comprometido_detalhado():
 @requires_access('gestao_orcamentaria')
 def api_cronograma_detalhado():
     """API para obter cronograma detalhado da tabela ultra_liquidacoes_cronograma"""
-    conn = get_db()
-    cur = get_cursor()
+    ano_referencia = _ano_referencia()
+    if not ano_referencia:
+        return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
     
+    # dados[numero_termo][mes] = {valor: soma de valor_mes, parcelas: [parcela_numero]}
+    cronograma_distribuicao.sincronizar()
+    cur = get_cursor()
     try:
-        ano_referencia = request.args.get('ano_referencia')
-        
-        if not ano_referencia:
-            return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
-        
-        print(f"[DEBUG CRONOGRAMA DETALHADO] Buscando cronograma detalhado para ano: {ano_referencia}")
-        
-        # Buscar dados da tabela ultra_liquidacoes_cronograma
-        # Filtrar apenas meses do ano de referência
-        cur.execute("""
-            SELECT 
-                numero_termo,
-                nome_mes,
-                valor_mes,
-                parcela_numero
-            FROM gestao_financeira.ultra_liquidacoes_cronograma
-            WHERE EXTRACT(YEAR FROM nome_mes) = %s
-            ORDER BY numero_termo, nome_mes
-        """, (ano_referencia,))
-        
-        resultados = cur.fetchall()
-        print(f"[DEBUG CRONOGRAMA DETALHADO] Registros encontrados: {len(resultados)}")
-        
-        # Organizar dados por termo e mês
-        # dados[numero_termo][mes] = {valor: valor_mes, parcela: parcela_numero}
-        dados = {}
-        
-        for row in resultados:
-            numero_termo = row['numero_termo']
-            nome_mes = row['nome_mes']  # DATE no formato YYYY-MM-01
-            valor_mes = float(row['valor_mes']) if row['valor_mes'] else 0
-            parcela_numero = row['parcela_numero']
-            
-            if numero_termo not in dados:
-                dados[numero_termo] = {}
-            
-            # Extrair mês (1-12)
-            mes = nome_mes.month
-            
-            # Acumular valor se já existe (caso haja múltiplas entradas para o mesmo mês)
-            if mes not in dados[numero_termo]:
-                dados[numero_termo][mes] = {
-                    'valor': 0,
-                    'parcelas': []
-                }
-            
-            dados[numero_termo][mes]['valor'] += valor_mes
-            if parcela_numero not in dados[numero_termo][mes]['parcelas']:
-                dados[numero_termo][mes]['parcelas'].append(parcela_numero)
-        
-        print(f"[DEBUG CRONOGRAMA DETALHADO] Termos processados: {len(dados)}")
-        
+        dados = cronograma_distribuicao.cronograma_detalhado(cur, ano_referencia)
         return jsonify({
             'success': True,
             'dados': dados
@@ -826,72 +633,19 @@ def api_cronograma_detalhado():
 @requires_access('gestao_orcamentaria')
 def api_cronograma_mensal():
     """API para obter dados do cronograma mensal dos termos baseado em vigência"""
-    conn = get_db()
-    cur = get_cursor()
+    ano_referencia = _ano_referencia()
+    if not ano_referencia:
+        return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
     
+    # ⚡ O valor integral de cada parcela aparece no mês de vigencia_inicial
+    # (Programada → dados_programados; demais tipos → dados_projetados)
+    cronograma_distribuicao.sincronizar()
+    cur = get_cursor()
     try:
-        ano_referencia = request.args.get('ano_referencia')
-        
-        if not ano_referencia:
-            return jsonify({'success': False, 'error': 'Ano de referência não fornecido'}), 400
-        
-        print(f"[DEBUG CRONOGRAMA] Buscando cronograma para ano: {ano_referencia}")
-        
-        # Buscar parcelas do ano com vigência que começa no ano de referência
-        # ⚡ IMPORTANTE: O valor integral da parcela aparece no mês de vigencia_inicial
-        # Não dividimos o valor pelos meses, cada parcela é um "pagamento esperado" naquele mês
-        cur.execute("""
-            SELECT 
-                ul.numero_termo,
-                ul.vigencia_inicial,
-                ul.vigencia_final,
-                ul.valor_previsto,
-                ul.parcela_tipo
-            FROM gestao_financeira.ultra_liquidacoes ul
-            WHERE EXTRACT(YEAR FROM ul.vigencia_inicial) = %s
-            ORDER BY ul.numero_termo, ul.vigencia_inicial
-        """, (ano_referencia,))
-        
-        parcelas = cur.fetchall()
-        print(f"[DEBUG CRONOGRAMA] Parcelas encontradas: {len(parcelas)}")
-        
-        # Organizar dados por termo, tipo e mês
-        # dados_programados[numero_termo][mes] = valor_total_do_mes
-        # dados_projetados[numero_termo][mes] = valor_total_do_mes
-        dados_programados = {}
-        dados_projetados = {}
-        
-        for parcela in parcelas:
-            numero_termo = parcela['numero_termo']
-            vig_inicial = parcela['vigencia_inicial']
-            valor_previsto = float(parcela['valor_previsto']) if parcela['valor_previsto'] else 0
-            parcela_tipo = parcela['parcela_tipo']
-            
-            if not vig_inicial:
-                continue
-            
-            # ⚡ LÓGICA CORRETA: Valor integral vai para o mês de vigencia_inicial
-            mes_pagamento = vig_inicial.month
-            
-            # Selecionar o dict correto baseado no tipo
-            dados_dict = dados_programados if parcela_tipo == 'Programada' else dados_projetados
-            
-            if numero_termo not in dados_dict:
-                dados_dict[numero_termo] = {}
-            
-            # Acumular valor no mês de pagamento (pode haver múltiplas parcelas no mesmo mês)
-            if mes_pagamento not in dados_dict[numero_termo]:
-                dados_dict[numero_termo][mes_pagamento] = 0
-            dados_dict[numero_termo][mes_pagamento] += valor_previsto
-            
-            print(f"[DEBUG] {numero_termo} | {parcela_tipo} | Mês {mes_pagamento} | R$ {valor_previsto:,.2f}")
-        
-        print(f"[DEBUG CRONOGRAMA] Termos programados: {len(dados_programados)}, Termos projetados: {len(dados_projetados)}")
-        
         return jsonify({
             'success': True,
-            'dados_programados': dados_programados,
-            'dados_projetados': dados_projetados
+            'dados_programados': cronograma_distribuicao.por_mes(cur, ano_referencia, 'programada'),
+            'dados_projetados': cronograma_distribuicao.por_mes(cur, ano_referencia, 'projetada')
         })
     
     except Exception as e:
@@ -4,12 +4,11 @@ Importação de nomeações CDA a partir do Diário Oficial
 """
 
 from flask import Blueprint, render_template, request, jsonify, session
-from db import execute_batch, get_cursor, get_db
+from db import execute_batch, get_cursor, get_db, pooled_connection
 from utils import login_required
 from decorators import requires_access
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
+from core import diario_oficial
+from core.diario_oficial import parse_int as _parse_int, parse_data as _parse_date
 import re
 
 gestao_pessoas_bp = Blueprint('gestao_pessoas', __name__, url_prefix='/gestao_pessoas')
@@ -56,244 +55,6 @@ def _recalcular_encerramento(vagas):
         except Exception:
             pass
 
-DO_SEARCH_URL = 'https://diariooficial.prefeitura.sp.gov.br/md_epubli_controlador.php'
-DO_SEARCH_TERM = '"Secretaria Municipal de Direitos Humanos e Cidadania, vaga"'
-DO_HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-    'Accept-Language': 'pt-BR,pt;q=0.9',
-    'Referer': 'https://diariooficial.prefeitura.sp.gov.br/',
-}
-
-
-# ---------------------------------------------------------------------------
-# Funções auxiliares de parsing
-# ---------------------------------------------------------------------------
-
-def _parse_int(value):
-    """Extrai apenas dígitos de uma string e retorna como int, ou None."""
-    if not value:
-        return None
-    digits = re.sub(r'\D', '', str(value))
-    return int(digits) if digits else None
-
-
-def _parse_date(date_str):
-    """Converte 'DD/MM/YYYY' para objeto date, ou None."""
-    if not date_str:
-        return None
-    try:
-        return datetime.strptime(date_str.strip(), '%d/%m/%Y').date()
-    except (ValueError, TypeError):
-        return None
-
-
-def _parse_nominations_from_text(text, data_publicacao='', num_doc=''):
-    """
-    Extrai nomeações de cargo CDA a partir de texto plano do D.O.
-    Retorna lista de dicts com: cda, numero_vaga, nome_servidor, numero_rf,
-    data_publicacao, numero_documento, unidade, observacoes
-    """
-    results = []
-    lines = text.split('\n')
-
-    # Agrupa linhas em chunks: uma nomeação pode estar dividida em várias linhas.
-    # Um novo chunk começa ao encontrar linha numerada ("1. NOME" / "1- NOME")
-    # ou ao encontrar uma linha em branco. Linhas de continuação são concatenadas.
-    chunks = []
-    current = []
-    for raw in lines:
-        stripped = raw.strip()
-        # Linha em branco = fim de bloco
-        if not stripped:
-            if current:
-                chunks.append(' '.join(current))
-                current = []
-            continue
-        # Nova entrada numerada ("1. NOME" ou "1- NOME") = novo bloco
-        if re.match(r'^\d+[.\-]\s+[A-ZÁÉÍÓÚÀÂÊÎÔÛÃÕ]', stripped):
-            if current:
-                chunks.append(' '.join(current))
-            current = [stripped]
-        else:
-            current.append(stripped)
-    if current:
-        chunks.append(' '.join(current))
-
-    for chunk in chunks:
-        upper = chunk.upper()
-        if 'CDA' not in upper:
-            continue
-
-        # Nome: tudo antes de ", RG", ", RF" ou ", CPF"
-        name_match = re.match(r'^(.+?),\s*(?:\w+/)?(?:RG|RF|CPF)(?:/\w+)?\s+', chunk, re.IGNORECASE)
-        name = name_match.group(1).strip() if name_match else ''
-        # Remove prefixos comuns
-        name = re.sub(
-            r'^Nomear\s+(?:o\s+senhor(?:a)?|a\s+senhora|o\s+servidor|a\s+servidora'
-            r'|o\s+sr\.?|a\s+sr[aª]\.?)\s+',
-            '', name, flags=re.IGNORECASE
-        ).strip()
-        name = re.sub(r'^Nomear\s+', '', name, flags=re.IGNORECASE).strip()
-        # Remove prefixos de lista numerada: "1- ", "2- ", "1. ", etc.
-        name = re.sub(r'^\d+[-\u2013.]\s*', '', name).strip()
-
-        # RF
-        rf_match = re.search(r'\bRF\s+([\d.]+(?:-\d)?)', chunk, re.IGNORECASE)
-        numero_rf = _parse_int(rf_match.group(1)) if rf_match else None
-
-        # CDA
-        cda_match = re.search(r'\bCDA-?(\d+)', chunk, re.IGNORECASE)
-        cda = int(cda_match.group(1)) if cda_match else None
-
-        # Vaga (explícita: "vaga 21989"; ou implícita: número isolado entre vírgulas)
-        vaga_match = re.search(r'\bvaga\s+(\d+)', chunk, re.IGNORECASE)
-        if not vaga_match:
-            vaga_match = re.search(r',\s*(\d{4,6})\s*[,.]', chunk)
-        numero_vaga = int(vaga_match.group(1)) if vaga_match else None
-
-        if cda and numero_vaga:
-            results.append({
-                'cda': cda,
-                'numero_vaga': numero_vaga,
-                'nome_servidor': name,
-                'numero_rf': numero_rf,
-                'data_publicacao': data_publicacao,
-                'unidade': '',
-                'numero_documento': _parse_int(num_doc),
-                'observacoes': '',
-            })
-    return results
-
-
-def _parse_doc_page(html, doc_number=''):
-    """
-    Parseia a página de um documento do D.O. e extrai nomeações.
-    """
-    soup = BeautifulSoup(html, 'html.parser')
-    full_text = soup.get_text('\n')
-
-    # Data de publicação
-    data_pub = ''
-    span_pub = soup.select_one('.info__publicacao, [class*="publicacao"]')
-    if span_pub:
-        m = re.search(r'Publica(?:ç|c)(?:ã|a)o:\s*(\d{2}/\d{2}/\d{4})', span_pub.get_text(), re.IGNORECASE)
-        if m:
-            data_pub = m.group(1)
-    if not data_pub:
-        m = re.search(r'Publica(?:ç|c)(?:ã|a)o:\s*(\d{2}/\d{2}/\d{4})', full_text, re.IGNORECASE)
-        if m:
-            data_pub = m.group(1)
-
-    # Número do documento (tentativa automática)
-    if not doc_number:
-        # 1. Prioridade: <title>ARQUIP | DOSP - XXXXXXXX - ...</title>
-        title_tag = soup.find('title')
-        if title_tag:
-            m = re.search(r'DOSP\s*-\s*(\d+)', title_tag.get_text())
-            if m:
-                doc_number = m.group(1)
-    if not doc_number:
-        # 2. SEI nº XXXXXXXX (rodapé)
-        m = re.search(r'SEI\s+n[°º.]\s*(\d+)', full_text, re.IGNORECASE)
-        if m:
-            doc_number = m.group(1)
-    if not doc_number:
-        # 3. Fallback: "o seguinte documento ... integra este ato XXXXXXXX"
-        m = re.search(r'O seguinte documento\b[\w\s]*\bintegra este ato\s+(\d+)', full_text, re.IGNORECASE)
-        if m:
-            doc_number = m.group(1)
-
-    return _parse_nominations_from_text(full_text, data_pub, doc_number)
-
-
-# ---------------------------------------------------------------------------
-# Scraping do Diário Oficial
-# ---------------------------------------------------------------------------
-
-def _scrape_do(data_inicio_str, data_fim_str, timeout_sec=15):
-    """
-    Busca Títulos de Nomeação da SMDHC no D.O. dentro do período informado.
-
-    Args:
-        data_inicio_str: 'DD/MM/YYYY'
-        data_fim_str:    'DD/MM/YYYY'
-        timeout_sec:     timeout por requisição HTTP
-
-    Returns:
-        dict com chaves 'documentos' (lista de {url, numero, data, tipo}) e 'erro' (str|None)
-    """
-    data_inicio = _parse_date(data_inicio_str)
-    data_fim = _parse_date(data_fim_str)
-    if not data_inicio or not data_fim:
-        return {'documentos': [], 'erro': 'Datas inválidas.'}
-
-    try:
-        params = {
-            'acao': 'materias_pesquisar',
-            'textTermoPesquisa': DO_SEARCH_TERM,
-        }
-        resp = requests.get(DO_SEARCH_URL, params=params, headers=DO_HEADERS, timeout=timeout_sec)
-        resp.raise_for_status()
-    except requests.RequestException as e:
-        return {'documentos': [], 'erro': f'Erro ao acessar o D.O.: {e}'}
-
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    documentos = []
-
-    for div in soup.select('div.dadosDocumento'):
-        # Tipo: verificar se é Título de Nomeação
-        link = div.select_one('a.nroSei')
-        if not link:
-            continue
-
-        tipo_span = link.find_next_sibling('span')
-        tipo = tipo_span.get_text(strip=True) if tipo_span else ''
-        if 'Título de Nomeação' not in tipo and 'titulo de nomeacao' not in tipo.lower():
-            continue
-
-        # Data de publicação
-        data_span = div.select_one('span.dataPublicacao')
-        data_pub_text = data_span.get_text(strip=True) if data_span else ''
-        m = re.search(r'(\d{2}/\d{2}/\d{4})', data_pub_text)
-        if not m:
-            continue
-        data_pub = _parse_date(m.group(1))
-        if not data_pub:
-            continue
-
-        # Filtro por data
-        if not (data_inicio <= data_pub <= data_fim):
-            continue
-
-        doc_url = link.get('href', '')
-        doc_numero = link.get_text(strip=True)
-
-        # Normaliza URL
-        if doc_url and not doc_url.startswith('http'):
-            doc_url = 'https://diariooficial.prefeitura.sp.gov.br/' + doc_url.lstrip('/')
-
-        documentos.append({
-            'url': doc_url,
-            'numero': doc_numero,
-            'data': m.group(1),
-            'tipo': tipo.lstrip(' -').strip(),
-        })
-
-    return {'documentos': documentos, 'erro': None}
-
-
-def _fetch_nominations_from_doc(doc_url, doc_numero, timeout_sec=15):
-    """Acessa a URL de um documento do D.O. e retorna lista de nomeações parseadas."""
-    try:
-        resp = requests.get(doc_url, headers=DO_HEADERS, timeout=timeout_sec)
-        resp.raise_for_status()
-        resp.encoding = resp.apparent_encoding or 'utf-8'
-        return _parse_doc_page(resp.text, doc_numero)
-    except requests.RequestException as e:
-        print(f'[gestao_pessoas] Erro ao buscar doc {doc_numero}: {e}')
-        return []
-
 
 # ---------------------------------------------------------------------------
 # Rotas
@@ -514,7 +275,10 @@ def buscar_do():
     data_inicio = body.get('data_inicio', '')
     data_fim = body.get('data_fim', '')
 
-    resultado = _scrape_do(data_inicio, data_fim)
+    # Documentos já lidos em buscas anteriores vêm de gestao_pessoas.do_documentos;
+    # só os novos são baixados (em paralelo). O banco é acessado em transações
+    # curtas numa conexão do pool, fora da transação da requisição.
+    resultado = diario_oficial.buscar(pooled_connection, data_inicio, data_fim)
     if resultado['erro']:
         return jsonify({'success': False, 'erro': resultado['erro']}), 422
 
@@ -523,21 +287,10 @@ def buscar_do():
         return jsonify({'success': True, 'documentos': [], 'nomeacoes': [],
                         'mensagem': 'Nenhum Título de Nomeação da SMDHC encontrado no período.'})
 
-    # Para cada documento, buscar e parsear as nomeações
-    todas_nomeacoes = []
-    for doc in documentos:
-        if doc['url']:
-            noms = _fetch_nominations_from_doc(doc['url'], doc['numero'])
-            # Enriquecer com info do documento
-            for n in noms:
-                n['_doc_numero'] = doc['numero']
-                n['_doc_url'] = doc['url']
-            todas_nomeacoes.extend(noms)
-
     return jsonify({
         'success': True,
         'documentos': documentos,
-        'nomeacoes': todas_nomeacoes,
+        'nomeacoes': resultado['nomeacoes'],
     })
 
 
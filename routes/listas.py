@@ -6,59 +6,12 @@ from flask import Blueprint, render_template, request, jsonify, session
 from db import get_cursor, execute_query, get_db
 from utils import login_required
 from decorators import requires_access, requires_write_access
+from core import listas_crud, referencia
+from core.listas_crud import converter_valor_para_db
 
 listas_bp = Blueprint('listas', __name__, url_prefix='/listas')
 
 
-def converter_valor_para_db(valor, campo, config):
-    """
-    Converte valores do frontend para o formato do banco de dados
-    """
-    # Strings vazias viram NULL no banco (campos opcionais não preenchidos)
-    if isinstance(valor, str) and valor.strip() == '':
-        return None
-
-    # Se a tabela marca explicitamente que o campo é boolean no DB, converter
-    if isinstance(valor, str) and campo in (config or {}).get('colunas_boolean', []):
-        return valor.lower() in ['ativo', 'true', '1', 'sim']
-
-    # Se o campo for 'status' e valor for string, converter para boolean
-    # EXCETO se a tabela tem opções explícitas (coluna TEXT, não BOOLEAN)
-    if campo == 'status' and isinstance(valor, str):
-        tipos = config.get('tipos_campo', {}) if config else {}
-        if f'opcoes_{campo}' in tipos:
-            # Coluna TEXT com opções configuradas — manter string como está
-            return valor
-        # Coluna BOOLEAN sem opções explícitas
-        return valor.lower() in ['ativo', 'true', '1', 'sim']
-    
-    # Se o campo for 'status_pg' e valor for string, manter string
-    if campo == 'status_pg':
-        return valor
-    
-    # Se o campo for 'status_c' e valor for string, manter string
-    if campo == 'status_c':
-        return valor
-    
-    return valor
-
-
-def converter_valor_para_frontend(valor, campo):
-    """
-    Converte valores do banco de dados para o formato do frontend
-    """
-    # Se o campo for 'status' e valor for boolean, converter para string
-    if campo == 'status' and isinstance(valor, bool):
-        return 'Ativo' if valor else 'Inativo'
-    # Corrigir registros corrompidos: 'false'/'true' armazenados como texto
-    if campo == 'status' and valor in ('false', 'f'):
-        return 'Inativo'
-    if campo == 'status' and valor in ('true', 't'):
-        return 'Ativo'
-    
-    return valor
-
-
 # Configuração das tabelas gerenciáveis (ordem alfabética por nome)
 TABELAS_CONFIG = {
     'c_dac_analistas': {
@@ -531,6 +484,31 @@ TABELAS_CONFIG = {
         'schema': 'categoricas',
         'colunas_editaveis': ['nome_pg', 'setor', 'numero_rf', 'status_pg', 'email_pg'],
         'colunas_calculadas': ['total_pareceres', 'total_parcerias'],
+        # Colunas calculadas: subconsulta (chave, total) unida por `coluna` (core/listas_crud)
+        'contagens': {
+            'total_pareceres': {
+                'coluna': 'nome_pg',
+                'sql': """
+                    SELECT responsavel_pg AS chave, COUNT(*) AS total
+                    FROM parcerias_analises
+                    GROUP BY responsavel_pg
+                """,
+            },
+            # Somente a última atribuição de cada termo
+            'total_parcerias': {
+                'coluna': 'nome_pg',
+                'sql': """
+                    SELECT nome_pg AS chave, COUNT(DISTINCT numero_termo) AS total
+                    FROM (
+                        SELECT nome_pg, numero_termo, data_de_criacao,
+                               MAX(data_de_criacao) OVER (PARTITION BY numero_termo) AS ultima
+                        FROM parcerias_pg
+                    ) pg
+                    WHERE data_de_criacao = ultima
+                    GROUP BY nome_pg
+                """,
+            },
+        },
         'labels': {
             'nome_pg': 'Nome', 
             'setor': 'Setor', 
@@ -1095,6 +1073,16 @@ TABELAS_CONFIG = {
         'colunas_editaveis': ['glosa_nome', 'glosa_texto', 'glosa_inconsistencia'],
         'colunas_obrigatorias': ['glosa_nome'],
         'colunas_calculadas': ['total_fundamentacoes'],
+        'contagens': {
+            'total_fundamentacoes': {
+                'coluna': 'id',
+                'sql': """
+                    SELECT glosa_id AS chave, COUNT(*) AS total
+                    FROM categoricas.c_dac_glosas_fundamento
+                    GROUP BY glosa_id
+                """,
+            },
+        },
         'labels': {
             'glosa_nome': 'Nome da Glosa',
             'glosa_texto': 'Modelo de Texto',
@@ -1149,125 +1137,31 @@ def obter_dados(tabela):
     
     try:
         config = TABELAS_CONFIG[tabela]
-        schema = config['schema']
-        colunas = ['id'] + config['colunas_editaveis']
-        ordem = config['ordem']
-        
+
         cur = get_cursor()
-        query = f"""
-            SELECT {', '.join(colunas)}
-            FROM {schema}.{tabela}
-            ORDER BY {ordem}
-        """
-        cur.execute(query)
-        dados = cur.fetchall()
-        cur.close()
-        
-        # DEBUG: Verificar duplicação
-        print(f"[DEBUG] Tabela {tabela}: {len(dados)} registros retornados")
-        ids = [row['id'] for row in dados]
-        print(f"[DEBUG] IDs únicos: {len(set(ids))}")
-        if len(ids) != len(set(ids)):
-            print(f"[ALERTA] DUPLICAÇÃO DETECTADA em {tabela}!")
-            print(f"[DEBUG] IDs duplicados: {[i for i in ids if ids.count(i) > 1]}")
-        
-        # Converter para lista de dicionários
-        resultado = []
-        for row in dados:
-            item = {'id': row['id']}
-            for col in config['colunas_editaveis']:
-                # Converter valores booleanos para formato frontend
-                valor = row[col]
-                item[col] = converter_valor_para_frontend(valor, col)
-                
-                # Formatar datas para formato brasileiro (DD/MM/YYYY)
-                tipos_campo = config.get('tipos_campo', {})
-                if valor and (col in ['legislatura_inicio', 'legislatura_fim'] or tipos_campo.get(col) == 'date'):
-                    from datetime import date, datetime
-                    if isinstance(valor, (date, datetime)):
-                        item[col] = valor.strftime('%d/%m/%Y')
-            resultado.append(item)
-        
-        # Se for c_dac_glosas, adicionar contagem de fundamentações
-        if tabela == 'c_dac_glosas':
-            cur2 = get_cursor()
-            for item in resultado:
-                cur2.execute("""
-                    SELECT COUNT(*) as total
-                    FROM categoricas.c_dac_glosas_fundamento
-                    WHERE glosa_id = %s
-                """, (item['id'],))
-                contagem = cur2.fetchone()
-                item['total_fundamentacoes'] = contagem['total'] if contagem else 0
-            cur2.close()
-
-        # Se for pessoa_gestora, adicionar contagem de pareceres e parcerias
-        if tabela == 'c_geral_pessoa_gestora':
-            cur = get_cursor()
-            for item in resultado:
-                # Contar pareceres
-                cur.execute("""
-                    SELECT COUNT(*) as total
-                    FROM parcerias_analises
-                    WHERE responsavel_pg = %s
-                """, (item['nome_pg'],))
-                contagem = cur.fetchone()
-                item['total_pareceres'] = contagem['total'] if contagem else 0
-                
-                # Contar parcerias (somente a última atribuição de cada termo)
-                cur.execute("""
-                    SELECT COUNT(DISTINCT numero_termo) as total
-                    FROM parcerias_pg pg1
-                    WHERE pg1.nome_pg = %s
-                    AND pg1.data_de_criacao = (
-                        SELECT MAX(pg2.data_de_criacao)
-                        FROM parcerias_pg pg2
-                        WHERE pg2.numero_termo = pg1.numero_termo
-                    )
-                """, (item['nome_pg'],))
-                contagem_parcerias = cur.fetchone()
-                item['total_parcerias'] = contagem_parcerias['total'] if contagem_parcerias else 0
-            cur.close()
-        
+        resultado = listas_crud.listar(cur, tabela, config)
+        print(f"[DEBUG] Tabela {tabela}: {len(resultado)} registros retornados")
+
         # Buscar opções dinâmicas para selects e checkboxes múltiplas
         import copy
         config_com_opcoes = copy.deepcopy(config)
+        config_com_opcoes.pop('contagens', None)
         if 'tipos_campo' in config_com_opcoes:
             # Criar lista de itens antes de iterar para evitar modificação durante iteração
             items_list = list(config_com_opcoes['tipos_campo'].items())
             for campo, tipo in items_list:
-                # Processar select_dinamico
-                if tipo == 'select_dinamico':
-                    query_key = f'query_{campo}'
-                    if query_key in config_com_opcoes['tipos_campo']:
-                        cur = get_cursor()
-                        cur.execute(config_com_opcoes['tipos_campo'][query_key])
-                        opcoes_raw = cur.fetchall()
-                        cur.close()
-                        
-                        # Extrair valores da primeira coluna
-                        opcoes = [list(row.values())[0] for row in opcoes_raw if list(row.values())[0]]
-                        config_com_opcoes['tipos_campo'][f'opcoes_{campo}'] = opcoes
-                
-                # Processar checkbox_multiple com query dinâmica
-                elif tipo == 'checkbox_multiple':
-                    query_key = f'query_{campo}'
-                    opcoes_key = f'opcoes_{campo}'
-                    
-                    # Se tem query dinâmica, buscar do banco
-                    if query_key in config_com_opcoes['tipos_campo']:
-                        cur = get_cursor()
-                        cur.execute(config_com_opcoes['tipos_campo'][query_key])
-                        opcoes_raw = cur.fetchall()
-                        cur.close()
-                        
-                        # Extrair valores da primeira coluna
-                        opcoes = [list(row.values())[0] for row in opcoes_raw if list(row.values())[0]]
-                        config_com_opcoes['tipos_campo'][f'opcoes_{campo}'] = opcoes
-                    
-                    # Se já tem opcoes_campo definidas (opções fixas), manter
-                    # (não precisa fazer nada, já está na config)
-        
+                # select_dinamico e checkbox_multiple com query dinâmica: buscar do banco
+                # (checkbox_multiple com opcoes_campo fixas já está na config)
+                query_key = f'query_{campo}'
+                if tipo in ('select_dinamico', 'checkbox_multiple') and query_key in config_com_opcoes['tipos_campo']:
+                    cur.execute(config_com_opcoes['tipos_campo'][query_key])
+                    opcoes_raw = cur.fetchall()
+
+                    # Extrair valores da primeira coluna
+                    opcoes = [list(row.values())[0] for row in opcoes_raw if list(row.values())[0]]
+                    config_com_opcoes['tipos_campo'][f'opcoes_{campo}'] = opcoes
+        cur.close()
+
         return jsonify({
             'dados': resultado,
             'config': config_com_opcoes
@@ -1428,6 +1322,7 @@ def criar_registro(tabela):
         """
         
         if execute_query(query, valores):
+            referencia.invalidar(f"{schema}.{tabela}")
             return jsonify({
                 'sucesso': True,
                 'mensagem': 'Registro criado com sucesso'
@@ -1616,6 +1511,7 @@ def atualizar_registro(tabela, id):
                     """, (substatus_antigo_valor, novo_substatus, substatus_antigo_valor))
                     print(f"[CASCATA] Substatus substituído: '{substatus_antigo_valor}' → '{novo_substatus}' em celebracao_parcerias")
 
+            referencia.invalidar(f"{schema}.{tabela}")
             return jsonify({
                 'sucesso': True,
                 'mensagem': 'Registro atualizado com sucesso'
@@ -1648,6 +1544,7 @@ def excluir_registro(tabela, id):
         """
         
         if execute_query(query, (id,)):
+            referencia.invalidar(f"{schema}.{tabela}")
             return jsonify({
                 'sucesso': True,
                 'mensagem': 'Registro excluído com sucesso'
@@ -1675,7 +1572,7 @@ def salvar_lote(tabela):
         registros = dados.get('registros', [])
         
         print(f"[DEBUG salvar_lote] Tabela: {tabela}")
-        print(f"[DEBUG salvar_lote] Registros recebidos: {registros}")
+        print(f"[DEBUG salvar_lote] Registros recebidos: {len(registros)}")
         
         if not registros:
             return jsonify({'erro': 'Nenhum registro para salvar'}), 400
@@ -1683,45 +1580,22 @@ def salvar_lote(tabela):
         config = TABELAS_CONFIG[tabela]
         schema = config['schema']
         
-        # Processar cada registro
-        erros = []
-        sucesso_count = 0
+        # Um único UPDATE … FROM (VALUES …) para todos os registros
+        cur = get_cursor()
+        try:
+            atualizados, nao_encontrados = listas_crud.atualizar_lote(cur, tabela, config, registros)
+            get_db().commit()
+        except Exception:
+            get_db().rollback()
+            raise
+        finally:
+            cur.close()
+
+        sucesso_count = len(atualizados)
+        erros = [f"Registro ID {reg_id} não encontrado" for reg_id in nao_encontrados]
         
-        for registro in registros:
-            reg_id = registro.get('id')
-            campos = registro.get('campos', {})
-            
-            print(f"[DEBUG salvar_lote] Processando ID {reg_id}, campos: {campos}")
-            
-            if not reg_id or not campos:
-                continue
-            
-            # Montar query de update
-            sets = []
-            valores = []
-            for campo, valor in campos.items():
-                if campo in config['colunas_editaveis']:
-                    sets.append(f"{campo} = %s")
-                    valores.append(valor)
-                    print(f"[DEBUG salvar_lote] Campo {campo} = {valor} (tipo: {type(valor)})")
-            
-            if not sets:
-                continue
-            
-            valores.append(reg_id)
-            query = f"""
-                UPDATE {schema}.{tabela}
-                SET {', '.join(sets)}
-                WHERE id = %s
-            """
-            
-            print(f"[DEBUG salvar_lote] Query: {query}")
-            print(f"[DEBUG salvar_lote] Valores: {tuple(valores)}")
-            
-            if execute_query(query, tuple(valores)):
-                sucesso_count += 1
-            else:
-                erros.append(f"Falha ao atualizar registro ID {reg_id}")
+        if sucesso_count:
+            referencia.invalidar(f"{schema}.{tabela}")
         
         if erros:
             return jsonify({
@@ -1804,16 +1678,17 @@ def mover_item(tabela, id):
         # Trocar posições
         registros[posicao_atual], registros[nova_posicao] = registros[nova_posicao], registros[posicao_atual]
         
-        # Renumerar todos os registros (ordem de 10 em 10 para facilitar inserções futuras)
-        for idx, reg in enumerate(registros):
-            nova_ordem = (idx + 1) * 10
-            execute_query(f"""
-                UPDATE {schema}.{tabela}
-                SET ordem = %s
-                WHERE id = %s
-            """, (nova_ordem, reg['id']))
+        # Renumerar (ordem de 10 em 10 para facilitar inserções futuras) num único UPDATE
+        try:
+            listas_crud.renumerar(cur, tabela, config, registros)
+            get_db().commit()
+        except Exception:
+            get_db().rollback()
+            cur.close()
+            raise
         
         cur.close()
+        referencia.invalidar(f"{schema}.{tabela}")
         
         return jsonify({
             'sucesso': True,
@@ -2062,16 +1937,8 @@ def glosas_leis_opcoes():
     """Retorna lista de leis/normas disponíveis em categoricas.c_geral_legislacao para datalist sugestivo"""
     try:
         cur = get_cursor()
-        cur.execute("""
-            SELECT lei
-            FROM categoricas.c_geral_legislacao
-            WHERE lei IS NOT NULL
-              AND TRIM(lei) != ''
-            ORDER BY lei
-        """)
-        rows = cur.fetchall()
+        leis = referencia.obter('leis_opcoes', cur)
         cur.close()
-        leis = [r['lei'] for r in rows]
         return jsonify({'leis': leis}), 200
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
@@ -2,11 +2,11 @@
 Blueprint principal (tela inicial, dashboard)
 """
 
-from datetime import date, timedelta
 from flask import Blueprint, render_template, session, request, redirect, url_for, flash, jsonify
 from db import get_cursor, get_db
 from utils import login_required
 from decorators import requires_access, requires_write_access
+from core import painel_inicial, referencia
 
 main_bp = Blueprint('main', __name__)
 
@@ -17,11 +17,8 @@ def index():
     """
     Tela inicial / Dashboard
     """
-    # Buscar dados do usuário para exibir nome / tipo
-    cur = get_cursor()
-    cur.execute("SELECT id, email, tipo_usuario, data_criacao, acessos FROM gestao_pessoas.usuarios WHERE id = %s", (session["user_id"],))
-    user = cur.fetchone()
-    cur.close()
+    # Usuário + lembretes + alerta de escala numa única consulta (widgets em cache)
+    user, widgets = painel_inicial.carregar(get_cursor(), session["user_id"], session.get('email'))
 
     # Sessão referencia usuário inexistente (deletado ou corrompido) — encerrar
     if user is None:
@@ -32,112 +29,8 @@ def index():
     is_admin = user['tipo_usuario'] == 'Agente Público'
     user_acessos = (user['acessos'] or '').split(';') if user['acessos'] else []
 
-    # Lembretes: eventos de hoje e amanhã
-    lembretes_hoje = []
-    lembretes_amanha = []
-    try:
-        hoje = date.today()
-        amanha = hoje + timedelta(days=1)
-        tipo_usuario_logado = user['tipo_usuario']
-        eh_gerente = tipo_usuario_logado in ['Agente Público', 'admin']
-
-        # Also check visualizar_todos_eventos flag in DB
-        if not eh_gerente:
-            cur_chk = get_cursor()
-            cur_chk.execute(
-                "SELECT visualizar_todos_eventos FROM gestao_pessoas.usuarios_infos WHERE usuario_email = %s",
-                (session.get('email'),)
-            )
-            row_chk = cur_chk.fetchone()
-            cur_chk.close()
-            if row_chk and row_chk['visualizar_todos_eventos']:
-                eh_gerente = True
-
-        cur2 = get_cursor()
-        # Datas importantes (pessoais)
-        if eh_gerente:
-            cur2.execute("""
-                SELECT 'pessoal' AS tipo, di.nome_data AS titulo, di.data_inicio,
-                       di.horario_inicio AS horario, ui.usuario_nome
-                FROM calendario.datas_importantes di
-                LEFT JOIN gestao_pessoas.usuarios_infos ui ON ui.usuario_email = di.usuario_email
-                WHERE di.data_inicio IN (%s, %s)
-                ORDER BY di.data_inicio, di.horario_inicio NULLS LAST
-            """, (hoje, amanha))
-        else:
-            cur2.execute("""
-                SELECT 'pessoal' AS tipo, di.nome_data AS titulo, di.data_inicio,
-                       di.horario_inicio AS horario, ui.usuario_nome
-                FROM calendario.datas_importantes di
-                LEFT JOIN gestao_pessoas.usuarios_infos ui ON ui.usuario_email = di.usuario_email
-                WHERE di.tipo_usuario = %s AND di.data_inicio IN (%s, %s)
-                ORDER BY di.data_inicio, di.horario_inicio NULLS LAST
-            """, (tipo_usuario_logado, hoje, amanha))
-        datas_imp = list(cur2.fetchall())
-
-        # Eventos institucionais
-        if eh_gerente:
-            cur2.execute("""
-                SELECT 'evento' AS tipo, de.nome_atividade AS titulo, de.data_inicio,
-                       NULL AS horario, ui.usuario_nome
-                FROM calendario.datas_eventos de
-                LEFT JOIN gestao_pessoas.usuarios_infos ui ON ui.usuario_email = de.usuario_email
-                WHERE de.data_inicio IN (%s, %s)
-                ORDER BY de.data_inicio
-            """, (hoje, amanha))
-        else:
-            cur2.execute("""
-                SELECT 'evento' AS tipo, de.nome_atividade AS titulo, de.data_inicio,
-                       NULL AS horario, ui.usuario_nome
-                FROM calendario.datas_eventos de
-                LEFT JOIN gestao_pessoas.usuarios_infos ui ON ui.usuario_email = de.usuario_email
-                WHERE de.tipo_usuario = %s AND de.data_inicio IN (%s, %s)
-                ORDER BY de.data_inicio
-            """, (tipo_usuario_logado, hoje, amanha))
-        datas_ev = list(cur2.fetchall())
-        cur2.close()
-
-        todos = datas_imp + datas_ev
-        lembretes_hoje = [r for r in todos if r['data_inicio'] == hoje]
-        lembretes_amanha = [r for r in todos if r['data_inicio'] == amanha]
-    except Exception:
-        pass
-
-    # Lembrete de sexta-feira: escala de teletrabalho pendente para próxima semana
-    alerta_escala_tt = False
-    next_monday_iso = ''
-    try:
-        if hoje.weekday() == 4:  # Sexta-feira = 4
-            _email = session.get('email', '')
-            _tipo = user['tipo_usuario']
-            _pode_tt = _tipo in ('Agente Público', 'admin')
-            if not _pode_tt:
-                cur_p = get_cursor()
-                cur_p.execute(
-                    "SELECT usuario_escala_permissao FROM gestao_pessoas.usuarios_infos WHERE usuario_email = %s",
-                    (_email,)
-                )
-                row_p = cur_p.fetchone()
-                cur_p.close()
-                _pode_tt = bool(row_p and row_p['usuario_escala_permissao'])
-            if _pode_tt:
-                _next_monday = hoje + timedelta(days=3)
-                cur_tt = get_cursor()
-                cur_tt.execute(
-                    "SELECT COUNT(*) AS cnt FROM calendario.escala_teletrabalho WHERE semana_inicio = %s",
-                    (_next_monday,)
-                )
-                row_tt = cur_tt.fetchone()
-                cur_tt.close()
-                if not (row_tt and row_tt['cnt'] > 0):
-                    alerta_escala_tt = True
-                    next_monday_iso = _next_monday.isoformat()
-    except Exception:
-        pass
-
     return render_template("tela_inicial.html", user=user, is_admin=is_admin, user_acessos=user_acessos,
-                           lembretes_hoje=lembretes_hoje, lembretes_amanha=lembretes_amanha,
-                           alerta_escala_tt=alerta_escala_tt, next_monday_iso=next_monday_iso)
+                           **widgets)
 
 
 
@@ -157,6 +50,7 @@ def gerenciar_portarias():
             try:
                 cur.execute("DELETE FROM categoricas.c_geral_legislacao WHERE id = %s", (lei_id,))
                 conn.commit()
+                referencia.invalidar('categoricas.c_geral_legislacao')
                 flash("Legislação excluída com sucesso.", "success")
             except Exception as e:
                 conn.rollback()
@@ -194,6 +88,7 @@ def gerenciar_portarias():
                 flash(f"Legislação '{lei}' criada com sucesso!", "success")
 
             conn.commit()
+            referencia.invalidar('categoricas.c_geral_legislacao')
         except Exception as e:
             conn.rollback()
             flash(f"Erro ao salvar legislação: {str(e)}", "danger")
@@ -6,6 +6,7 @@ from flask import Blueprint, render_template, request, jsonify, send_file, sessi
 from db import get_cursor, get_db
 from functools import wraps
 from decorators import requires_access
+from core import ocr
 import re
 import csv
 import io
@@ -179,18 +180,10 @@ def processar_pdf():
 
 def extrair_texto_pdf(arquivo_pdf):
     """
-    Extrai texto de PDF usando pdfplumber
+    Extrai texto de PDF (camada de texto + OCR paralelo das páginas escaneadas)
     Retorna string com todo o texto extraído
     """
-    texto_completo = []
-    
-    with pdfplumber.open(arquivo_pdf) as pdf:
-        for pagina in pdf.pages:
-            texto = pagina.extract_text()
-            if texto:
-                texto_completo.append(texto)
-    
-    return '\n'.join(texto_completo)
+    return ocr.extrair_texto(arquivo_pdf.read())
 
 
 def detectar_formato(texto):
@@ -6,6 +6,7 @@ from flask import Blueprint, render_template, request, Response, jsonify, sessio
 from db import get_cursor
 from utils import login_required
 from decorators import requires_access, requires_write_access
+from core import conciliacao_relatorio
 import csv
 from io import StringIO
 from datetime import datetime
@@ -341,6 +342,8 @@ def atualizar_categoria():
         success_conc = execute_query(query_conc, (categoria_nova.strip(), categoria_antiga))
         
         if success_pd and success_conc:
+            # Renomeação vale para todos os termos
+            conciliacao_relatorio.invalidar(None, 'analises_pc.conc_extrato')
             message = f"✅ Categoria atualizada com sucesso!\n\n"
             message += f"• Parcerias_Despesas: {pd_count} registro(s)\n"
             message += f"• Conc_Extrato: {conc_count} registro(s)\n"
@@ -855,17 +858,14 @@ def api_ocr_pdf():
             }), 200
 
         # Sem tabelas estruturadas — retornar texto bruto
-        partes_texto = []
-        with pdfplumber.open(_io.BytesIO(conteudo)) as pdf:
-            for pagina in pdf.pages:
-                t = pagina.extract_text()
-                if t:
-                    partes_texto.append(t)
+        # (PDF escaneado: páginas sem texto passam pelo OCR paralelo)
+        from core import ocr
+        texto = ocr.extrair_texto(conteudo)
 
         return jsonify({
             'rows': [],
             'columns': [],
-            'texto': '\n'.join(partes_texto),
+            'texto': texto,
             'message': 'Nenhuma tabela estruturada encontrada. Texto bruto retornado para análise manual.'
         }), 200
 
@@ -6,6 +6,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from db import get_cursor, get_db, execute_query
 from utils import login_required
 from decorators import requires_access, requires_write_access
+from core import busca, exportacao, parcerias_resumo, referencia
 import csv
 import time as _time
 from io import StringIO, BytesIO
@@ -25,6 +26,115 @@ _MARCADORES_CACHE = {'data': None, 'ts': 0}
 _MARCADORES_CACHE_TTL = 300  # 5 minutos
 
 
+def _filtros_parcerias(args, endereco_por_logradouro=True):
+    """
+    Monta as condições de filtro da listagem/exportação de parcerias sobre
+    public.parcerias (p) + public.parcerias_resumo (r).
+
+    Args:
+        endereco_por_logradouro: 'preenchido' exige logradouro não vazio
+            (listagem); False aceita qualquer endereço cadastrado (CSV).
+
+    Returns:
+        tuple: (trecho SQL iniciado por " AND ...", params)
+    """
+    sql = []
+    params = []
+
+    def texto(nome):
+        return args.get(nome, '').strip()
+
+    def em(coluna, valores):
+        sql.append(f" AND {coluna} IN ({','.join(['%s'] * len(valores))})")
+        params.extend(valores)
+
+    for nome, coluna in (('filtro_termo', 'p.numero_termo'), ('filtro_osc', 'p.osc'),
+                         ('filtro_projeto', 'p.projeto'), ('busca_sei_celeb', 'p.sei_celeb'),
+                         ('busca_sei_pc', 'p.sei_pc'), ('filtro_cnpj', 'p.cnpj'),
+                         ('filtro_portaria', 'p.portaria')):
+        if texto(nome):
+            sql.append(f" AND {coluna} ILIKE %s")
+            params.append(f"%{texto(nome)}%")
+
+    if args.getlist('filtro_tipo_termo'):
+        em('p.tipo_termo', args.getlist('filtro_tipo_termo'))
+    if args.getlist('filtro_edital'):
+        em('p.edital_nome', args.getlist('filtro_edital'))
+
+    # Pessoa gestora atual (último registro de parcerias_pg) + filtros especiais
+    filtro_pessoa_gestora = args.getlist('filtro_pessoa_gestora')
+    if filtro_pessoa_gestora:
+        condicoes_pg = []
+        nomes_pg = [pg for pg in filtro_pessoa_gestora if pg.lower() not in ('nenhuma', 'inativos')]
+        especiais = {pg.lower() for pg in filtro_pessoa_gestora} - {n.lower() for n in nomes_pg}
+        if 'nenhuma' in especiais:
+            condicoes_pg.append("NOT COALESCE(r.tem_pg, false)")
+        if 'inativos' in especiais:
+            condicoes_pg.append("r.status_pg != 'Ativo'")
+        if nomes_pg:
+            condicoes_pg.append(f"r.pessoa_gestora IN ({','.join(['%s'] * len(nomes_pg))})")
+            params.extend(nomes_pg)
+        sql.append(" AND (" + " OR ".join(condicoes_pg) + ")")
+
+    if args.getlist('filtro_abrangencia'):
+        sql.append(" AND r.abrangencias && %s::text[]")
+        params.append(args.getlist('filtro_abrangencia'))
+
+    filtro_contrapartida = texto('filtro_contrapartida')
+    if filtro_contrapartida == 'sim':
+        sql.append(" AND p.contrapartida = 1")
+    elif filtro_contrapartida == 'nao':
+        sql.append(" AND (p.contrapartida IS NULL OR p.contrapartida = 0)")
+
+    filtro_endereco = args.getlist('filtro_endereco')
+    if filtro_endereco:
+        tem_endereco = ("COALESCE(r.tem_endereco, false)" if endereco_por_logradouro
+                        else "COALESCE(r.qtd_enderecos, 0) > 0")
+        condicoes_endereco = []
+        if 'preenchido' in filtro_endereco:
+            condicoes_endereco.append(tem_endereco)
+        if 'nao_preenchido' in filtro_endereco:
+            condicoes_endereco.append(f"NOT {tem_endereco}")
+        if condicoes_endereco:
+            sql.append(" AND (" + " OR ".join(condicoes_endereco) + ")")
+
+    # Datas: assinatura do termo (resumo), início e término
+    for nome, condicao in (('data_assinatura_inicio', 'r.data_assinatura_termo >= %s'),
+                           ('data_assinatura_fim', 'r.data_assinatura_termo <= %s'),
+                           ('data_inicio_de', 'p.inicio >= %s'),
+                           ('data_inicio_ate', 'p.inicio <= %s'),
+                           ('data_termino_de', 'p.final >= %s'),
+                           ('data_termino_ate', 'p.final <= %s')):
+        if texto(nome):
+            sql.append(f" AND {condicao}")
+            params.append(texto(nome))
+
+    # Período de vigência (sobreposição): termo.inicio <= periodo_fim AND termo.final >= periodo_inicio
+    if texto('periodo_fim'):
+        sql.append(" AND p.inicio <= %s")
+        params.append(texto('periodo_fim'))
+    if texto('periodo_inicio'):
+        sql.append(" AND p.final >= %s")
+        params.append(texto('periodo_inicio'))
+
+    filtro_status = args.getlist('filtro_status')
+    if filtro_status:
+        suspenso = ("(r.data_suspensao IS NOT NULL AND "
+                    "(r.data_retomada IS NULL OR r.data_retomada > CURRENT_DATE))")
+        condicoes_status = {
+            'vigente': f"(p.inicio <= CURRENT_DATE AND p.final >= CURRENT_DATE AND NOT {suspenso})",
+            'encerrado': "(p.final < CURRENT_DATE)",
+            'nao_iniciado': "(p.inicio > CURRENT_DATE)",
+            'suspenso': suspenso,
+            'rescindido': "(1=0)",
+        }
+        condicoes = [condicoes_status[st] for st in filtro_status if st in condicoes_status]
+        if condicoes:
+            sql.append(" AND (" + " OR ".join(condicoes) + ")")
+
+    return ''.join(sql), params
+
+
 @parcerias_bp.route("/", methods=["GET"])
 @login_required
 @requires_access('parcerias')
@@ -68,23 +178,11 @@ def listar():
     
     cur = get_cursor()
     
-    # Buscar tipos de contrato para o dropdown de filtro
-    cur.execute("SELECT informacao FROM categoricas.c_geral_tipo_contrato ORDER BY informacao")
-    tipos_contrato_raw = cur.fetchall()
-    tipos_contrato = [row['informacao'] for row in tipos_contrato_raw]
-    
-    # Buscar pessoas gestoras para o dropdown de filtro (todas, incluindo inativas)
-    cur.execute("SELECT DISTINCT nome_pg FROM categoricas.c_geral_pessoa_gestora ORDER BY nome_pg")
-    pessoas_gestoras_filtro = [row['nome_pg'] for row in cur.fetchall()]
-    
-    # Buscar editais para o dropdown de filtro
-    cur.execute("""
-        SELECT DISTINCT edital_nome 
-        FROM public.parcerias 
-        WHERE edital_nome IS NOT NULL 
-        ORDER BY edital_nome
-    """)
-    editais_filtro = [row['edital_nome'] for row in cur.fetchall()]
+    # Dropdowns de filtro (cache de referência): tipos de contrato,
+    # pessoas gestoras (todas, incluindo inativas) e editais
+    tipos_contrato = referencia.obter('tipos_contrato', cur)
+    pessoas_gestoras_filtro = referencia.obter('pessoas_gestoras_nomes', cur)
+    editais_filtro = referencia.obter('editais_em_parcerias', cur)
 
     # Buscar opções de abrangência para o filtro
     cur.execute("""
@@ -102,70 +200,11 @@ def listar():
         print(f"[ALERTA] DUPLICAÃ‡ÃƒO DETECTADA em c_geral_tipo_contrato!")
         print(f"[DEBUG] Tipos com duplicação: {[t for t in tipos_contrato if tipos_contrato.count(t) > 1]}")
     
-    # Query principal - buscar parcerias com datas como texto para evitar erro de conversão
-    query = """
-        WITH
-        last_pg AS (
-            SELECT DISTINCT ON (pg.numero_termo)
-                pg.numero_termo,
-                pg.nome_pg    AS pessoa_gestora,
-                pg.solicitacao,
-                cpg.status_pg
-            FROM public.parcerias_pg pg
-            LEFT JOIN categoricas.c_geral_pessoa_gestora cpg
-                   ON cpg.nome_pg = pg.nome_pg
-            ORDER BY pg.numero_termo, pg.data_de_criacao DESC
-        ),
-        total_pago AS (
-            SELECT numero_termo,
-                   COALESCE(SUM(valor_previsto), 0) AS total_pago
-            FROM gestao_financeira.ultra_liquidacoes
-            WHERE parcela_status = 'Pago'
-            GROUP BY numero_termo
-        ),
-        assinatura AS (
-            SELECT DISTINCT ON (numero_termo)
-                numero_termo,
-                data_assinatura AS data_assinatura_termo
-            FROM public.parcerias_sei
-            WHERE (aditamento = '-' OR aditamento IS NULL)
-              AND (apostilamento = '-' OR apostilamento IS NULL)
-              AND termo_tipo_sei IS NULL
-            ORDER BY numero_termo, id ASC
-        ),
-        enderecos AS (
-            SELECT
-                numero_termo,
-                STRING_AGG(
-                    COALESCE(parceria_logradouro, '') ||
-                    CASE WHEN parceria_numero IS NOT NULL
-                         THEN ', ' || parceria_numero::text
-                         ELSE ''
-                    END,
-                    ' | '
-                ) AS endereco_completo
-            FROM public.parcerias_enderecos
-            GROUP BY numero_termo
-        ),
-        cronograma AS (
-            SELECT
-                numero_termo,
-                COALESCE(SUM(valor_mes),    0) AS valor_mes_detalhado,
-                COALESCE(SUM(valor_mes_23), 0) AS valor_mes_23,
-                COALESCE(SUM(valor_mes_24), 0) AS valor_mes_24
-            FROM gestao_financeira.ultra_liquidacoes_cronograma
-            GROUP BY numero_termo
-        ),
-        infos AS (
-            SELECT DISTINCT ON (numero_termo)
-                numero_termo,
-                parceria_abrangencia_projeto AS abrangencia,
-                parceria_data_suspensao      AS data_suspensao,
-                parceria_data_retomada       AS data_retomada,
-                parceria_objeto
-            FROM public.parcerias_infos_adicionais
-            ORDER BY numero_termo
-        )
+    # Agregados por termo (pessoa gestora, total pago, endereços, cronograma, dotação)
+    # vêm do read model parcerias_resumo; datas como texto para evitar erro de conversão
+    parcerias_resumo.sincronizar()
+    filtros_sql, params = _filtros_parcerias(request.args)
+    query = f"""
         SELECT
             p.numero_termo,
             p.osc,
@@ -178,242 +217,28 @@ def listar():
             p.final::text  AS final_str,
             p.meses,
             p.total_previsto,
-            COALESCE(tp.total_pago, 0)           AS total_pago,
+            COALESCE(r.total_pago, 0)           AS total_pago,
             p.sei_celeb,
             p.sei_pc,
             p.edital_nome,
-            lpg.pessoa_gestora,
-            lpg.status_pg,
-            lpg.solicitacao,
-            asg.data_assinatura_termo,
-            end_.endereco_completo,
-            COALESCE(cro.valor_mes_detalhado, 0) AS valor_mes_detalhado,
-            COALESCE(cro.valor_mes_23, 0)        AS valor_mes_23,
-            COALESCE(cro.valor_mes_24, 0)        AS valor_mes_24,
-            inf.abrangencia,
-            inf.data_suspensao,
-            inf.data_retomada,
-            inf.parceria_objeto,
-            d.dotacao_orcamentaria
-        FROM public.Parcerias p
-        LEFT JOIN last_pg   lpg  ON lpg.numero_termo  = p.numero_termo
-        LEFT JOIN total_pago tp  ON tp.numero_termo   = p.numero_termo
-        LEFT JOIN assinatura asg ON asg.numero_termo  = p.numero_termo
-        LEFT JOIN enderecos end_ ON end_.numero_termo = p.numero_termo
-        LEFT JOIN cronograma cro ON cro.numero_termo  = p.numero_termo
-        LEFT JOIN infos inf      ON inf.numero_termo  = p.numero_termo
-        LEFT JOIN LATERAL (
-            SELECT STRING_AGG(DISTINCT be.txt_dotacao_fmt, ' | ') AS dotacao_orcamentaria
-            FROM gestao_financeira.back_empenhos be
-            WHERE be.cod_nro_pcss_sof = REGEXP_REPLACE(p.sei_celeb, '[^0-9]', '', 'g')
-              AND be.txt_dotacao_fmt IS NOT NULL
-              AND be.cod_nro_pcss_sof IS NOT NULL
-        ) d ON true
-        WHERE 1=1
+            r.pessoa_gestora,
+            r.status_pg,
+            r.solicitacao,
+            r.data_assinatura_termo,
+            r.endereco_completo,
+            COALESCE(r.valor_mes_detalhado, 0) AS valor_mes_detalhado,
+            COALESCE(r.valor_mes_23, 0)        AS valor_mes_23,
+            COALESCE(r.valor_mes_24, 0)        AS valor_mes_24,
+            r.abrangencia,
+            r.data_suspensao,
+            r.data_retomada,
+            r.parceria_objeto,
+            r.dotacao_orcamentaria
+        FROM public.parcerias p
+        LEFT JOIN public.parcerias_resumo r ON r.numero_termo = p.numero_termo
+        WHERE 1=1{filtros_sql}
+        ORDER BY p.numero_termo
     """
-
-    params = []
-
-    # Adicionar filtros se fornecidos
-    if filtro_termo:
-        query += " AND p.numero_termo ILIKE %s"
-        params.append(f"%{filtro_termo}%")
-
-    if filtro_osc:
-        query += " AND osc ILIKE %s"
-        params.append(f"%{filtro_osc}%")
-
-    if filtro_projeto:
-        query += " AND projeto ILIKE %s"
-        params.append(f"%{filtro_projeto}%")
-    
-    if filtro_tipo_termo:
-        # Múltiplos tipos de termo
-        placeholders = ','.join(['%s'] * len(filtro_tipo_termo))
-        query += f" AND p.tipo_termo IN ({placeholders})"
-        params.extend(filtro_tipo_termo)
-    
-    if filtro_pessoa_gestora:
-        # Separar filtros especiais de nomes específicos
-        filtros_especiais = []
-        nomes_pg = []
-        
-        for pg in filtro_pessoa_gestora:
-            if pg.lower() == 'nenhuma':
-                filtros_especiais.append('nenhuma')
-            elif pg.lower() == 'inativos':
-                filtros_especiais.append('inativos')
-            else:
-                nomes_pg.append(pg)
-        
-        # Construir condições OR
-        condicoes_pg = []
-        
-        if 'nenhuma' in filtros_especiais:
-            condicoes_pg.append(""" NOT EXISTS (
-                SELECT 1 FROM parcerias_pg pg 
-                WHERE pg.numero_termo = p.numero_termo
-            )""")
-        
-        if 'inativos' in filtros_especiais:
-            condicoes_pg.append(""" EXISTS (
-                SELECT 1 FROM parcerias_pg pg 
-                LEFT JOIN categoricas.c_geral_pessoa_gestora cpg ON cpg.nome_pg = pg.nome_pg
-                WHERE pg.numero_termo = p.numero_termo 
-                AND cpg.status_pg != 'Ativo'
-                AND pg.data_de_criacao = (
-                    SELECT MAX(data_de_criacao) 
-                    FROM parcerias_pg 
-                    WHERE numero_termo = p.numero_termo
-                )
-            )""")
-        
-        if nomes_pg:
-            placeholders = ','.join(['%s'] * len(nomes_pg))
-            condicoes_pg.append(f""" EXISTS (
-                SELECT 1 FROM parcerias_pg pg 
-                WHERE pg.numero_termo = p.numero_termo 
-                AND pg.nome_pg IN ({placeholders})
-                AND pg.data_de_criacao = (
-                    SELECT MAX(data_de_criacao) 
-                    FROM parcerias_pg 
-                    WHERE numero_termo = p.numero_termo
-                )
-            )""")
-            params.extend(nomes_pg)
-        
-        if condicoes_pg:
-            query += " AND (" + " OR ".join(condicoes_pg) + ")"
-    
-    if busca_sei_celeb:
-        query += " AND sei_celeb ILIKE %s"
-        params.append(f"%{busca_sei_celeb}%")
-
-    if busca_sei_pc:
-        query += " AND sei_pc ILIKE %s"
-        params.append(f"%{busca_sei_pc}%")
-
-    if filtro_edital:
-        placeholders = ','.join(['%s'] * len(filtro_edital))
-        query += f" AND p.edital_nome IN ({placeholders})"
-        params.extend(filtro_edital)
-
-    if filtro_cnpj:
-        query += " AND p.cnpj ILIKE %s"
-        params.append(f"%{filtro_cnpj}%")
-
-    if filtro_portaria:
-        query += " AND p.portaria ILIKE %s"
-        params.append(f"%{filtro_portaria}%")
-
-    if filtro_abrangencia:
-        placeholders = ','.join(['%s'] * len(filtro_abrangencia))
-        query += f""" AND EXISTS (
-            SELECT 1 FROM public.parcerias_infos_adicionais pia
-            WHERE pia.numero_termo = p.numero_termo
-              AND pia.parceria_abrangencia_projeto IN ({placeholders})
-        )"""
-        params.extend(filtro_abrangencia)
-
-    if filtro_contrapartida == 'sim':
-        query += " AND p.contrapartida = 1"
-    elif filtro_contrapartida == 'nao':
-        query += " AND (p.contrapartida IS NULL OR p.contrapartida = 0)"
-    if filtro_endereco:
-        condicoes_endereco = []
-        if 'preenchido' in filtro_endereco:
-            condicoes_endereco.append("EXISTS (SELECT 1 FROM public.parcerias_enderecos pe WHERE pe.numero_termo = p.numero_termo AND (pe.parceria_logradouro IS NOT NULL AND pe.parceria_logradouro != ''))")
-        if 'nao_preenchido' in filtro_endereco:
-            condicoes_endereco.append("NOT EXISTS (SELECT 1 FROM public.parcerias_enderecos pe WHERE pe.numero_termo = p.numero_termo AND (pe.parceria_logradouro IS NOT NULL AND pe.parceria_logradouro != ''))")
-        if condicoes_endereco:
-            query += " AND (" + " OR ".join(condicoes_endereco) + ")"
-    
-    # Filtro por data de assinatura
-    if data_assinatura_inicio:
-        query += """ AND EXISTS (
-            SELECT 1 FROM public.parcerias_sei ps
-            WHERE ps.numero_termo = p.numero_termo
-              AND (ps.aditamento = '-' OR ps.aditamento IS NULL)
-              AND (ps.apostilamento = '-' OR ps.apostilamento IS NULL)
-              AND ps.termo_tipo_sei IS NULL
-              AND ps.data_assinatura >= %s
-        )"""
-        params.append(data_assinatura_inicio)
-    
-    if data_assinatura_fim:
-        query += """ AND EXISTS (
-            SELECT 1 FROM public.parcerias_sei ps
-            WHERE ps.numero_termo = p.numero_termo
-              AND (ps.aditamento = '-' OR ps.aditamento IS NULL)
-              AND (ps.apostilamento = '-' OR ps.apostilamento IS NULL)
-              AND ps.termo_tipo_sei IS NULL
-              AND ps.data_assinatura <= %s
-        )"""
-        params.append(data_assinatura_fim)
-    
-    # Filtro por data de início
-    if data_inicio_de:
-        query += " AND p.inicio >= %s"
-        params.append(data_inicio_de)
-    
-    if data_inicio_ate:
-        query += " AND p.inicio <= %s"
-        params.append(data_inicio_ate)
-    
-    # Filtro por data de término
-    if data_termino_de:
-        query += " AND p.final >= %s"
-        params.append(data_termino_de)
-    
-    if data_termino_ate:
-        query += " AND p.final <= %s"
-        params.append(data_termino_ate)
-
-    # Filtro por período de vigência (sobreposição): traz todos os termos que estiveram
-    # ativos em qualquer momento dentro do intervalo informado.
-    # Lógica: termo.inicio <= periodo_fim  AND  termo.final >= periodo_inicio
-    if periodo_inicio and periodo_fim:
-        query += " AND p.inicio <= %s AND p.final >= %s"
-        params.append(periodo_fim)
-        params.append(periodo_inicio)
-    elif periodo_inicio:
-        query += " AND p.final >= %s"
-        params.append(periodo_inicio)
-    elif periodo_fim:
-        query += " AND p.inicio <= %s"
-        params.append(periodo_fim)
-
-    # Filtro de status
-    if filtro_status:
-        condicoes_status = []
-        for status in filtro_status:
-            if status == 'vigente':
-                condicoes_status.append("""
-                    (p.inicio <= CURRENT_DATE AND p.final >= CURRENT_DATE
-                     AND NOT EXISTS (
-                         SELECT 1 FROM public.parcerias_infos_adicionais pia
-                         WHERE pia.numero_termo = p.numero_termo
-                           AND pia.parceria_data_suspensao IS NOT NULL
-                           AND (pia.parceria_data_retomada IS NULL OR pia.parceria_data_retomada > CURRENT_DATE)
-                     ))
-                """)
-            elif status == 'encerrado':
-                condicoes_status.append("(p.final < CURRENT_DATE)")
-            elif status == 'nao_iniciado':
-                condicoes_status.append("(p.inicio > CURRENT_DATE)")
-            elif status == 'suspenso':
-                condicoes_status.append("""EXISTS (
-                    SELECT 1 FROM public.parcerias_infos_adicionais pia
-                    WHERE pia.numero_termo = p.numero_termo
-                      AND pia.parceria_data_suspensao IS NOT NULL
-                      AND (pia.parceria_data_retomada IS NULL OR pia.parceria_data_retomada > CURRENT_DATE)
-                )""")
-            elif status == 'rescindido':
-                condicoes_status.append("(1=0)")
-        if condicoes_status:
-            query += " AND (" + " OR ".join(condicoes_status) + ")"
-    
-    query += " ORDER BY p.numero_termo"
     
     # Adicionar LIMIT se não for "todas"
     if limite_sql is not None:
@@ -883,6 +708,8 @@ def nova():
                     print(f"[DEBUG NOVA] Resultado INSERT parcerias_pg: {resultado}")
                 
                 print("[DEBUG NOVA] Enviando flash de sucesso e redirecionando...")
+                referencia.invalidar('public.parcerias')
+                busca.invalidar_indice('oscs')
                 flash("Parceria criada com sucesso!", "success")
                 
                 # Verificar se veio da página de conferência
@@ -905,23 +732,12 @@ def nova():
     # GET - retornar formulário vazio (ou com dados pré-preenchidos da conferência)
     # Buscar dados dos dropdowns
     cur = get_cursor()
-    cur.execute("SELECT informacao FROM categoricas.c_geral_tipo_contrato ORDER BY informacao")
-    tipos_contrato = [row['informacao'] for row in cur.fetchall()]
-    cur.execute("SELECT lei FROM categoricas.c_geral_legislacao ORDER BY lei")
-    legislacoes = [row['lei'] for row in cur.fetchall()]
+    tipos_contrato = referencia.obter('tipos_contrato', cur)
+    legislacoes = referencia.obter('legislacoes', cur)
     
-    # Buscar pessoas gestoras (todas, incluindo inativas)
-    cur.execute("SELECT nome_pg, numero_rf, status_pg FROM categoricas.c_geral_pessoa_gestora ORDER BY nome_pg")
-    pessoas_gestoras = cur.fetchall()
-    
-    # Buscar editais disponíveis
-    cur.execute("""
-        SELECT DISTINCT edital_nome 
-        FROM public.parcerias_edital 
-        WHERE edital_nome IS NOT NULL 
-        ORDER BY edital_nome
-    """)
-    editais = [row['edital_nome'] for row in cur.fetchall()]
+    # Pessoas gestoras (todas, incluindo inativas) e editais disponíveis
+    pessoas_gestoras = referencia.obter('pessoas_gestoras', cur)
+    editais = referencia.obter('editais_cadastrados', cur)
     
     cur.close()
     
@@ -1328,6 +1144,8 @@ def editar(numero_termo):
                     else:
                         print(f"[DEBUG EDITAR] Solicitacao NÃƒO mudou - nenhum registro criado")
                 
+                referencia.invalidar('public.parcerias')
+                busca.invalidar_indice('oscs')
                 flash("Parceria atualizada com sucesso!", "success")
                 return redirect(url_for('parcerias.listar'))
             else:
@@ -1387,23 +1205,12 @@ def editar(numero_termo):
         parceria['solicitacao'] = pg_result['solicitacao']
     
     # Buscar dados dos dropdowns
-    cur.execute("SELECT informacao FROM categoricas.c_geral_tipo_contrato ORDER BY informacao")
-    tipos_contrato = [row['informacao'] for row in cur.fetchall()]
-    cur.execute("SELECT lei FROM categoricas.c_geral_legislacao ORDER BY lei")
-    legislacoes = [row['lei'] for row in cur.fetchall()]
+    tipos_contrato = referencia.obter('tipos_contrato', cur)
+    legislacoes = referencia.obter('legislacoes', cur)
     
-    # Buscar pessoas gestoras (todas, incluindo inativas)
-    cur.execute("SELECT nome_pg, numero_rf, status_pg FROM categoricas.c_geral_pessoa_gestora ORDER BY nome_pg")
-    pessoas_gestoras = cur.fetchall()
-    
-    # Buscar editais disponíveis
-    cur.execute("""
-        SELECT DISTINCT edital_nome 
-        FROM public.parcerias_edital 
-        WHERE edital_nome IS NOT NULL 
-        ORDER BY edital_nome
-    """)
-    editais = [row['edital_nome'] for row in cur.fetchall()]
+    # Pessoas gestoras (todas, incluindo inativas) e editais disponíveis
+    pessoas_gestoras = referencia.obter('pessoas_gestoras', cur)
+    editais = referencia.obter('editais_cadastrados', cur)
     
     # Buscar RF da pessoa gestora atual se existir
     rf_pessoa_gestora = None
@@ -1511,9 +1318,18 @@ def editar(numero_termo):
 def api_oscs():
     """
     API para buscar lista de OSCs únicas para autocomplete
+
+    Com ?q= devolve só as OSCs mais parecidas (índice em memória, sem ida ao
+    banco a cada tecla), na mesma forma {osc: cnpj}.
     """
     from flask import jsonify
     
+    termo = request.args.get('q', '').strip()
+    if termo:
+        limite = min(request.args.get('limite', 20, type=int), 100)
+        encontradas = busca.indice('oscs').buscar(termo, limite)
+        return jsonify({item['osc']: item['cnpj'] or '' for item in encontradas})
+
     cur = get_cursor()
     cur.execute("""
         SELECT DISTINCT osc, cnpj 
@@ -1543,8 +1359,7 @@ def api_sigla_tipo_termo():
     from flask import jsonify
     
     cur = get_cursor()
-    cur.execute("SELECT id, informacao, sigla FROM categoricas.c_geral_tipo_contrato ORDER BY sigla")
-    tipos = cur.fetchall()
+    tipos = referencia.obter('tipos_contrato_siglas', cur)
     cur.close()
     
     # Criar mapeamento sigla -> tipo
@@ -1620,17 +1435,8 @@ def exportar_csv():
         filtro_tipo_termo = request.args.getlist('filtro_tipo_termo')  # Multi-seleção
         filtro_status = request.args.getlist('filtro_status')  # Multi-seleção
         filtro_pessoa_gestora = request.args.getlist('filtro_pessoa_gestora')  # Multi-seleção
-        filtro_edital = request.args.getlist('filtro_edital')  # Multi-seleção
         busca_sei_celeb = request.args.get('busca_sei_celeb', '').strip()
         busca_sei_pc = request.args.get('busca_sei_pc', '').strip()
-        data_assinatura_inicio = request.args.get('data_assinatura_inicio', '').strip()
-        data_assinatura_fim = request.args.get('data_assinatura_fim', '').strip()
-        data_inicio_de = request.args.get('data_inicio_de', '').strip()
-        data_inicio_ate = request.args.get('data_inicio_ate', '').strip()
-        data_termino_de = request.args.get('data_termino_de', '').strip()
-        data_termino_ate = request.args.get('data_termino_ate', '').strip()
-        periodo_inicio = request.args.get('periodo_inicio', '').strip()
-        periodo_fim = request.args.get('periodo_fim', '').strip()
         filtro_cnpj = request.args.get('filtro_cnpj', '').strip()
         filtro_portaria = request.args.get('filtro_portaria', '').strip()
         filtro_abrangencia = request.args.getlist('filtro_abrangencia')
@@ -1643,10 +1449,10 @@ def exportar_csv():
         incluir_dotacao = request.args.get('incluir_dotacao', 'false') == 'true'
         incluir_objeto = request.args.get('incluir_objeto', 'false') == 'true'
         
-        cur = get_cursor()
-        
-        # Construir query com filtros (mesma lógica da listagem)
-        query = """
+        # Mesmos filtros da listagem; agregados do read model parcerias_resumo
+        parcerias_resumo.sincronizar()
+        filtros_sql, params = _filtros_parcerias(request.args, endereco_por_logradouro=False)
+        query = f"""
             SELECT 
                 p.numero_termo,
                 p.tipo_termo,
@@ -1664,261 +1470,22 @@ def exportar_csv():
                 p.sei_orcamento,
                 p.transicao,
                 p.edital_nome,
-                (SELECT STRING_AGG(DISTINCT be.txt_dotacao_fmt, ' | ')
-                 FROM gestao_financeira.back_empenhos be
-                 WHERE be.cod_nro_pcss_sof = REGEXP_REPLACE(p.sei_celeb, '[^0-9]', '', 'g')
-                   AND be.txt_dotacao_fmt IS NOT NULL) AS dotacao_orcamentaria,
-                (SELECT pg.nome_pg 
-                 FROM parcerias_pg pg 
-                 WHERE pg.numero_termo = p.numero_termo 
-                 ORDER BY pg.data_de_criacao DESC 
-                 LIMIT 1) as pessoa_gestora,
-                (SELECT pg.solicitacao 
-                 FROM parcerias_pg pg 
-                 WHERE pg.numero_termo = p.numero_termo 
-                 ORDER BY pg.data_de_criacao DESC 
-                 LIMIT 1) as solicitacao,
-                (SELECT STRING_AGG(
-                    COALESCE(pe.parceria_logradouro, '') || 
-                    CASE WHEN pe.parceria_numero IS NOT NULL 
-                         THEN ', ' || pe.parceria_numero::text 
-                         ELSE '' 
-                    END, ' | ')
-                 FROM public.parcerias_enderecos pe
-                 WHERE pe.numero_termo = p.numero_termo
-                 LIMIT 1) as endereco_completo,
-            (SELECT COALESCE(SUM(ulc.valor_mes), 0)
-             FROM gestao_financeira.ultra_liquidacoes_cronograma ulc
-             WHERE ulc.numero_termo = p.numero_termo) AS valor_mes_detalhado,
-            (SELECT COALESCE(SUM(ulc.valor_mes_23), 0)
-             FROM gestao_financeira.ultra_liquidacoes_cronograma ulc
-             WHERE ulc.numero_termo = p.numero_termo) AS valor_mes_23,
-            (SELECT COALESCE(SUM(ulc.valor_mes_24), 0)
-             FROM gestao_financeira.ultra_liquidacoes_cronograma ulc
-             WHERE ulc.numero_termo = p.numero_termo) AS valor_mes_24,
-            (SELECT pia.parceria_objeto
-             FROM public.parcerias_infos_adicionais pia
-             WHERE pia.numero_termo = p.numero_termo
-             LIMIT 1) AS parceria_objeto
-            FROM Parcerias p
-            WHERE 1=1
+                r.dotacao_orcamentaria,
+                r.pessoa_gestora,
+                r.solicitacao,
+                r.endereco_completo,
+                COALESCE(r.valor_mes_detalhado, 0) AS valor_mes_detalhado,
+                COALESCE(r.valor_mes_23, 0)        AS valor_mes_23,
+                COALESCE(r.valor_mes_24, 0)        AS valor_mes_24,
+                r.parceria_objeto
+            FROM public.parcerias p
+            LEFT JOIN public.parcerias_resumo r ON r.numero_termo = p.numero_termo
+            WHERE 1=1{filtros_sql}
+            ORDER BY p.numero_termo
         """
         
-        params = []
-        
-        # Adicionar filtros se fornecidos
-        if filtro_termo:
-            query += " AND p.numero_termo ILIKE %s"
-            params.append(f"%{filtro_termo}%")
-        
-        if filtro_osc:
-            query += " AND p.osc ILIKE %s"
-            params.append(f"%{filtro_osc}%")
-        
-        if filtro_projeto:
-            query += " AND p.projeto ILIKE %s"
-            params.append(f"%{filtro_projeto}%")
-        
-        if filtro_tipo_termo:
-            # Múltiplos tipos de termo
-            placeholders = ','.join(['%s'] * len(filtro_tipo_termo))
-            query += f" AND p.tipo_termo IN ({placeholders})"
-            params.extend(filtro_tipo_termo)
-        
-        if filtro_pessoa_gestora:
-            # Separar filtros especiais de nomes específicos
-            filtros_especiais = []
-            nomes_pg = []
-            
-            for pg in filtro_pessoa_gestora:
-                if pg.lower() == 'nenhuma':
-                    filtros_especiais.append('nenhuma')
-                elif pg.lower() == 'inativos':
-                    filtros_especiais.append('inativos')
-                else:
-                    nomes_pg.append(pg)
-            
-            # Construir condições OR
-            condicoes_pg = []
-            
-            if 'nenhuma' in filtros_especiais:
-                condicoes_pg.append(""" NOT EXISTS (
-                    SELECT 1 FROM parcerias_pg pg 
-                    WHERE pg.numero_termo = p.numero_termo
-                )""")
-            
-            if 'inativos' in filtros_especiais:
-                condicoes_pg.append(""" EXISTS (
-                    SELECT 1 FROM parcerias_pg pg 
-                    LEFT JOIN categoricas.c_geral_pessoa_gestora cpg ON cpg.nome_pg = pg.nome_pg
-                    WHERE pg.numero_termo = p.numero_termo 
-                    AND cpg.status_pg != 'Ativo'
-                    AND pg.data_de_criacao = (
-                        SELECT MAX(data_de_criacao) 
-                        FROM parcerias_pg 
-                        WHERE numero_termo = p.numero_termo
-                    )
-                )""")
-            
-            if nomes_pg:
-                placeholders = ','.join(['%s'] * len(nomes_pg))
-                condicoes_pg.append(f""" EXISTS (
-                    SELECT 1 FROM parcerias_pg pg 
-                    WHERE pg.numero_termo = p.numero_termo 
-                    AND pg.nome_pg IN ({placeholders})
-                    AND pg.data_de_criacao = (
-                        SELECT MAX(data_de_criacao) 
-                        FROM parcerias_pg 
-                        WHERE numero_termo = p.numero_termo
-                    )
-                )""")
-                params.extend(nomes_pg)
-            
-            if condicoes_pg:
-                query += " AND (" + " OR ".join(condicoes_pg) + ")"
-        
-        if busca_sei_celeb:
-            query += " AND p.sei_celeb ILIKE %s"
-            params.append(f"%{busca_sei_celeb}%")
-        
-        if busca_sei_pc:
-            query += " AND p.sei_pc ILIKE %s"
-            params.append(f"%{busca_sei_pc}%")
-        
-        if filtro_edital:
-            # Múltiplos editais
-            placeholders = ','.join(['%s'] * len(filtro_edital))
-            query += f" AND p.edital_nome IN ({placeholders})"
-            params.extend(filtro_edital)
-        
-        # Filtro por data de assinatura
-        if data_assinatura_inicio:
-            query += """ AND EXISTS (
-                SELECT 1 FROM public.parcerias_sei ps
-                WHERE ps.numero_termo = p.numero_termo
-                  AND (ps.aditamento = '-' OR ps.aditamento IS NULL)
-                  AND (ps.apostilamento = '-' OR ps.apostilamento IS NULL)
-                  AND ps.termo_tipo_sei IS NULL
-                  AND ps.data_assinatura >= %s
-            )"""
-            params.append(data_assinatura_inicio)
-        
-        if data_assinatura_fim:
-            query += """ AND EXISTS (
-                SELECT 1 FROM public.parcerias_sei ps
-                WHERE ps.numero_termo = p.numero_termo
-                  AND (ps.aditamento = '-' OR ps.aditamento IS NULL)
-                  AND (ps.apostilamento = '-' OR ps.apostilamento IS NULL)
-                  AND ps.termo_tipo_sei IS NULL
-                  AND ps.data_assinatura <= %s
-            )"""
-            params.append(data_assinatura_fim)
-        
-        # Filtro por data de início
-        if data_inicio_de:
-            query += " AND p.inicio >= %s"
-            params.append(data_inicio_de)
-        
-        if data_inicio_ate:
-            query += " AND p.inicio <= %s"
-            params.append(data_inicio_ate)
-        
-        # Filtro por data de término
-        if data_termino_de:
-            query += " AND p.final >= %s"
-            params.append(data_termino_de)
-        
-        if data_termino_ate:
-            query += " AND p.final <= %s"
-            params.append(data_termino_ate)
-
-        # Filtro por período de vigência (sobreposição)
-        if periodo_inicio and periodo_fim:
-            query += " AND p.inicio <= %s AND p.final >= %s"
-            params.append(periodo_fim)
-            params.append(periodo_inicio)
-        elif periodo_inicio:
-            query += " AND p.final >= %s"
-            params.append(periodo_inicio)
-        elif periodo_fim:
-            query += " AND p.inicio <= %s"
-            params.append(periodo_fim)
-
-        if filtro_cnpj:
-            query += " AND p.cnpj ILIKE %s"
-            params.append(f"%{filtro_cnpj}%")
-
-        if filtro_portaria:
-            query += " AND p.portaria ILIKE %s"
-            params.append(f"%{filtro_portaria}%")
-
-        if filtro_abrangencia:
-            placeholders = ','.join(['%s'] * len(filtro_abrangencia))
-            query += f""" AND EXISTS (
-                SELECT 1 FROM public.parcerias_infos_adicionais pia
-                WHERE pia.numero_termo = p.numero_termo
-                  AND pia.parceria_abrangencia_projeto IN ({placeholders})
-            )"""
-            params.extend(filtro_abrangencia)
-
-        if filtro_contrapartida == 'sim':
-            query += " AND p.contrapartida = 1"
-        elif filtro_contrapartida == 'nao':
-            query += " AND (p.contrapartida IS NULL OR p.contrapartida = 0)"
-
-        if filtro_endereco:
-            for v in filtro_endereco:
-                if v == 'preenchido':
-                    query += """ AND EXISTS (
-                        SELECT 1 FROM public.parcerias_enderecos pe
-                        WHERE pe.numero_termo = p.numero_termo
-                    )"""
-                elif v == 'nao_preenchido':
-                    query += """ AND NOT EXISTS (
-                        SELECT 1 FROM public.parcerias_enderecos pe
-                        WHERE pe.numero_termo = p.numero_termo
-                    )"""
-
-        # Filtro de status baseado em datas (múltiplos status)
-        if filtro_status:
-            condicoes_status = []
-            
-            for status in filtro_status:
-                if status == 'vigente':
-                    condicoes_status.append("""(p.inicio <= CURRENT_DATE AND p.final >= CURRENT_DATE
-                        AND NOT EXISTS (
-                            SELECT 1 FROM public.parcerias_infos_adicionais pia
-                            WHERE pia.numero_termo = p.numero_termo
-                              AND pia.parceria_data_suspensao IS NOT NULL
-                              AND (pia.parceria_data_retomada IS NULL OR pia.parceria_data_retomada > CURRENT_DATE)
-                        ))""")
-                elif status == 'encerrado':
-                    condicoes_status.append("(p.final < CURRENT_DATE)")
-                elif status == 'nao_iniciado':
-                    condicoes_status.append("(p.inicio > CURRENT_DATE)")
-                elif status == 'suspenso':
-                    condicoes_status.append("""EXISTS (
-                        SELECT 1 FROM public.parcerias_infos_adicionais pia
-                        WHERE pia.numero_termo = p.numero_termo
-                          AND pia.parceria_data_suspensao IS NOT NULL
-                          AND (pia.parceria_data_retomada IS NULL OR pia.parceria_data_retomada > CURRENT_DATE)
-                    )""")
-                elif status == 'rescindido':
-                    condicoes_status.append("(1=0)")
-            
-            if condicoes_status:
-                query += " AND (" + " OR ".join(condicoes_status) + ")"
-        
-        query += " ORDER BY p.numero_termo"
-        
-        cur.execute(query, params)
-        parcerias = cur.fetchall()
-        cur.close()
-        
-        # Criar arquivo CSV em memória com BOM UTF-8 para corrigir encoding
-        output = StringIO()
-        output.write('\ufeff')  # BOM UTF-8
-        writer = csv.writer(output, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+        # Cursor no servidor: linhas chegam em lotes enquanto o CSV é enviado
+        consulta = exportacao.consultar(query, params)
         
         # Verificar se coluna de endereço foi solicitada
         incluir_endereco = request.args.get('incluir_endereco', 'false') == 'true'
@@ -1966,10 +1533,7 @@ def exportar_csv():
             'Transição'
         ])
         
-        writer.writerow(cabecalho)
-        
-        # Escrever dados
-        for parceria in parcerias:
+        def _linha(parceria):
             total_previsto = float(parceria['total_previsto'] or 0)
             
             linha = [
@@ -2018,10 +1582,9 @@ def exportar_csv():
                 'Sim' if parceria['transicao'] else 'Não'
             ])
             
-            writer.writerow(linha)
+            return linha
         
         # Preparar resposta
-        output.seek(0)
         data_atual = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         # Verificar se há filtros aplicados para incluir no nome do arquivo
@@ -2034,17 +1597,12 @@ def exportar_csv():
         else:
             filename = f'parcerias_completo_{data_atual}.csv'
         
-        # Log para debug
-        print(f"[EXPORTAR CSV] Total de registros exportados: {len(parcerias)}")
+        # Log para debug (total de linhas é registrado ao fim do envio)
         print(f"[EXPORTAR CSV] Filtros aplicados: {tem_filtros}")
         
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename={filename}',
-                'Content-Type': 'text/csv; charset=utf-8'
-            }
+        return exportacao.resposta_csv(
+            filename, cabecalho, (_linha(p) for p in consulta), consulta,
+            quoting=csv.QUOTE_MINIMAL
         )
         
     except Exception as e:
@@ -2590,7 +2148,6 @@ def buscar_oscs():
         termo_busca = request.args.get('q', '').strip()
         cnpj_busca = request.args.get('cnpj', '').strip()
         dias_recentes = request.args.get('dias_recentes', 0, type=int)
-        osc_pattern = f'%{termo_busca}%' if termo_busca else '%'
         cnpj_pattern = f'%{cnpj_busca}%' if cnpj_busca else '%'
         dias_cond = f"AND cc.data_mais_recente >= NOW() - INTERVAL '{dias_recentes} days'" if dias_recentes > 0 else ""
 
@@ -2598,6 +2155,14 @@ def buscar_oscs():
             return jsonify({'error': 'Informe pelo menos um critério de busca'}), 400
 
         cur = get_cursor()
+
+        # Nome: substring sem acento ou nome parecido (índices trigram, core/busca)
+        if termo_busca:
+            osc_filtro, osc_params = busca.filtro('osc', termo_busca)
+            ordem_sql, ordem_params = busca.ordem('MAX(c.osc)', termo_busca)
+        else:
+            osc_filtro, osc_params = 'TRUE', []
+            ordem_sql, ordem_params = 'MAX(c.osc)', []
         
         # Buscar OSCs que contenham o termo (CTE para deduplicar + filtrar #N/D)
         query = f"""
@@ -2615,19 +2180,19 @@ def buscar_oscs():
             combined AS (
                 SELECT osc, numero_termo, NULL::integer as id_cents, NULL::integer as id_celeb, cnpj, 'parcerias' as fonte
                 FROM public.Parcerias
-                WHERE osc IS NOT NULL AND TRIM(osc) NOT IN ('', '#N/D') AND osc ILIKE %s
+                WHERE osc IS NOT NULL AND TRIM(osc) NOT IN ('', '#N/D') AND {osc_filtro}
                 
                 UNION ALL
                 
                 SELECT osc, NULL as numero_termo, id as id_cents, NULL::integer as id_celeb, osc_cnpj as cnpj, 'cents' as fonte
                 FROM celebracao.gestao_cents
-                WHERE osc IS NOT NULL AND TRIM(osc) NOT IN ('', '#N/D') AND osc ILIKE %s
+                WHERE osc IS NOT NULL AND TRIM(osc) NOT IN ('', '#N/D') AND {osc_filtro}
                 
                 UNION ALL
                 
                 SELECT osc, NULL as numero_termo, NULL::integer as id_cents, id as id_celeb, cnpj, 'celebracao' as fonte
                 FROM celebracao.celebracao_parcerias
-                WHERE osc IS NOT NULL AND TRIM(osc) NOT IN ('', '#N/D') AND osc ILIKE %s
+                WHERE osc IS NOT NULL AND TRIM(osc) NOT IN ('', '#N/D') AND {osc_filtro}
             )
             SELECT
                 MAX(c.osc) as osc,
@@ -2640,11 +2205,11 @@ def buscar_oscs():
             WHERE COALESCE(cc.cnpj, '') ILIKE %s
             {dias_cond}
             GROUP BY COALESCE(cc.cnpj, c.osc)
-            ORDER BY MAX(c.osc)
+            ORDER BY {ordem_sql}
             LIMIT 100
         """
 
-        cur.execute(query, (osc_pattern, osc_pattern, osc_pattern, cnpj_pattern))
+        cur.execute(query, osc_params * 3 + [cnpj_pattern] + ordem_params)
         oscs = cur.fetchall()
         cur.close()
 
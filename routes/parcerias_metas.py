@@ -13,6 +13,7 @@ from flask import (
 from db import get_cursor, get_db
 from utils import login_required
 from decorators import requires_access, requires_write_access
+from core import busca
 
 parcerias_metas_bp = Blueprint(
     'parcerias_metas', __name__, url_prefix='/parcerias-metas'
@@ -602,42 +603,37 @@ def api_meio_usos(meio_id):
 
 # ── Similaridade ─────────────────────────────────────────────────────────────
 
-@parcerias_metas_bp.route("/api/indicadores/similares", methods=["GET"])
-@login_required
-@requires_access('parcerias_metas')
-def api_indicador_similares():
+def _similares(fonte):
+    """
+    Itens parecidos com ?q= (sem acento/caixa, tolerando erro de digitação),
+    do mais para o menos similar. ?excluir=<id> omite o próprio item (fusão).
+    """
     texto = (request.args.get('q') or '').strip()
     if not texto:
         return jsonify([])
+    excluir = request.args.get('excluir', type=int)
     cur = get_cursor()
-    cur.execute("""
-        SELECT id, indicador
-        FROM categoricas.c_dgp_indicadores
-        WHERE indicador ILIKE %s
-          AND LOWER(indicador) != LOWER(%s)
-        ORDER BY indicador
-        LIMIT 10
-    """, (f"%{texto}%", texto))
-    return jsonify([dict(r) for r in cur.fetchall()])
+    linhas = busca.buscar(
+        cur, fonte, texto,
+        limite=max(1, min(request.args.get('limite', 10, type=int), 50)),
+        excluir_ids=[excluir] if excluir else (),
+        excluir_igual=not excluir,
+    )
+    return jsonify([dict(r) for r in linhas])
+
+
+@parcerias_metas_bp.route("/api/indicadores/similares", methods=["GET"])
+@login_required
+@requires_access('parcerias_metas')
+def api_indicador_similares():
+    return _similares('indicadores')
 
 
 @parcerias_metas_bp.route("/api/meios-afericao/similares", methods=["GET"])
 @login_required
 @requires_access('parcerias_metas')
 def api_meio_similares():
-    texto = (request.args.get('q') or '').strip()
-    if not texto:
-        return jsonify([])
-    cur = get_cursor()
-    cur.execute("""
-        SELECT id, meios_afericao
-        FROM categoricas.c_dgp_meios_afericao
-        WHERE meios_afericao ILIKE %s
-          AND LOWER(meios_afericao) != LOWER(%s)
-        ORDER BY meios_afericao
-        LIMIT 10
-    """, (f"%{texto}%", texto))
-    return jsonify([dict(r) for r in cur.fetchall()])
+    return _similares('meios_afericao')
 
 
 # ── Excluir órfãos em lote ────────────────────────────────────────────────────
@@ -9,6 +9,7 @@ from db import get_cursor, get_db, execute_query
 from functools import wraps
 from decorators import requires_access, requires_write_access
 from datetime import timedelta, date, datetime
+from core import calendario
 
 bp = Blueprint('parcerias_notificacoes', __name__, url_prefix='/parcerias_notificacoes')
 
@@ -713,7 +714,8 @@ def api_calcular_prazo():
         else:
             data_base = datetime.strptime(data_base_str, '%Y-%m-%d')
         
-        data_prazo = data_base + timedelta(days=prazo_dias)
+        # Prazo que vence em fim de semana ou feriado passa para o próximo dia útil
+        data_prazo = calendario.proximo_dia_util(data_base + timedelta(days=prazo_dias), cur=cur)
         prazo_final = data_prazo.strftime('%d/%m/%Y')
         prazo_info = f"{prazo_final} ({prazo_dias} dias)"
         
@@ -4,6 +4,7 @@ from functools import wraps
 from decorators import requires_access
 from datetime import datetime
 from db import get_cursor, execute_query
+from core import busca
 import sys
 import os
 
@@ -122,8 +123,20 @@ def obter_proximo_numero():
 @pesquisa_parcerias_bp.route('/api/oscs')
 @agente_dac_required
 def listar_oscs():
-    """Retorna lista única de OSCs da tabela public.parcerias (apenas termos celebrados)"""
+    """
+    Retorna lista única de OSCs da tabela public.parcerias (apenas termos celebrados)
+
+    Com ?q= devolve só as mais parecidas, do índice em memória (core/busca).
+    """
     try:
+        termo = request.args.get('q', '').strip()
+        if termo:
+            limite = max(1, min(request.args.get('limite', 20, type=int), 100))
+            return jsonify({
+                'sucesso': True,
+                'oscs': [item['osc'] for item in busca.indice('oscs').buscar(termo, limite)]
+            })
+
         query = """
             SELECT DISTINCT osc
             FROM public.parcerias
@@ -184,29 +197,16 @@ def buscar_cnpj(nome_osc):
 
         print(f"⚠️ [BACKEND DEBUG] Match exato não encontrado. Buscando variações...")
 
-        # Se não encontrou, buscar variações similares
-        query_similar = """
-            SELECT cnpj, osc,
-                   LENGTH(osc) as tamanho,
-                   ENCODE(osc::bytea, 'hex') as hex
-            FROM public.parcerias
-            WHERE LOWER(TRIM(osc)) LIKE LOWER(%s)
-            LIMIT 5
-        """
-
-        cur.execute(query_similar, (f'%{nome_osc}%',))
-        similares = cur.fetchall()
-
-        if len(similares) > 0:
-            print(f"📋 [BACKEND DEBUG] Encontradas {len(similares)} OSCs similares:")
-            for s in similares:
-                print(f"   - '{s['osc']}' (len={s['tamanho']}, hex={s['hex'][:50]}...)")
+        # Se não encontrou, buscar a OSC mais parecida (sem acento/caixa, trigramas)
+        similar = busca.melhor(cur, 'oscs', nome_osc, colunas=('cnpj',))
 
+        if similar:
+            print(f"📋 [BACKEND DEBUG] OSC similar: '{similar['osc']}' (similaridade={similar['similaridade']})")
             cur.close()
             return jsonify({
                 'sucesso': True,
-                'cnpj': similares[0]['cnpj'],
-                'aviso': f"Match aproximado: '{similares[0]['osc']}'"
+                'cnpj': similar['cnpj'],
+                'aviso': f"Match aproximado: '{similar['osc']}'"
             })
 
         print(f"❌ [BACKEND DEBUG] Nenhuma OSC similar encontrada")
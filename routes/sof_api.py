@@ -6,11 +6,8 @@ Consulta contratos e empenhos da Prefeitura de São Paulo
 
 from flask import Blueprint, render_template, request, jsonify, session
 from utils import login_required
-from config import SOF_API_USERNAME, SOF_API_PASSWORD, SOF_AUTH_BASE64
-from decorators import registrar_erro
-import requests
-from datetime import datetime, timedelta
-from functools import lru_cache
+from config import SOF_API_USERNAME, SOF_API_PASSWORD
+from core.sof_cliente import cliente_sof, ErroSOF
 import time
 
 sof_api_bp = Blueprint('sof_api', __name__, url_prefix='/gestao_orcamentaria/sof-api')
@@ -19,15 +16,19 @@ sof_api_bp = Blueprint('sof_api', __name__, url_prefix='/gestao_orcamentaria/sof
 # CONFIGURAÇÕES DA API SOF
 # ============================================================================
 
-# URLs da API
-SOF_TOKEN_URL = "https://gateway.apilib.prefeitura.sp.gov.br/token"
-SOF_BASE_URL = "https://gateway.apilib.prefeitura.sp.gov.br/sf/sof/v4"
+# Sessão, token, novas tentativas, cache e fan-out ficam no cliente compartilhado
+# (core/sof_cliente.py); as funções abaixo mantêm o formato de retorno antigo.
+SOF_TOKEN_URL = cliente_sof.token_url
+SOF_BASE_URL = cliente_sof.base_url
+
+
+def _erro(e):
+    return {
+        'erro': True,
+        'mensagem': str(e),
+        'detalhes': e.detalhes if isinstance(e, ErroSOF) else None,
+    }
 
-# Cache do token (em memória) - evita requisições desnecessárias
-_token_cache = {
-    'token': None,
-    'expira_em': None
-}
 
 # ============================================================================
 # FUNÇÕES DE AUTENTICAÇÃO
@@ -35,77 +36,13 @@ _token_cache = {
 
 def obter_token_sof():
     """
-    Obtém token de acesso à API do SOF.
-    Usa cache para evitar requisições desnecessárias (token dura ~1 hora).
-    
+    Obtém token de acesso à API do SOF (em cache até perto de expirar).
+
     Returns:
         str: Token de acesso (Bearer token)
         None: Se falhar autenticação
     """
-    global _token_cache
-    
-    # Verificar se token em cache ainda é válido
-    agora = datetime.now()
-    if _token_cache['token'] and _token_cache['expira_em']:
-        if agora < _token_cache['expira_em']:
-            print(f"[SOF_API] Usando token em cache (expira em {(_token_cache['expira_em'] - agora).seconds}s)")
-            return _token_cache['token']
-    
-    print("[SOF_API] Token expirado ou inexistente. Solicitando novo token...")
-    
-    try:
-        headers = {
-            "Authorization": f"Basic {SOF_AUTH_BASE64}",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        
-        # API SOF usa APENAS grant_type=client_credentials
-        data = {
-            "grant_type": "client_credentials"
-        }
-        
-        print(f"[SOF_API] Autenticando com grant_type=client_credentials")
-        
-        response = requests.post(
-            SOF_TOKEN_URL, 
-            headers=headers, 
-            data=data,
-            timeout=10,
-            verify=True
-        )
-        
-        if response.status_code == 200:
-            token_data = response.json()
-            access_token = token_data.get('access_token')
-            expires_in = token_data.get('expires_in', 3600)  # Default 1 hora
-            
-            # Salvar no cache (com margem de 5 minutos antes da expiração)
-            _token_cache['token'] = access_token
-            _token_cache['expira_em'] = agora + timedelta(seconds=expires_in - 300)
-            
-            print(f"[SOF_API] Token obtido com sucesso! Expira em {expires_in}s")
-            return access_token
-        else:
-            print(f"[SOF_API] ERRO ao obter token: {response.status_code} - {response.text}")
-            registrar_erro(
-                tipo_erro='api_externa',
-                api_nome='SOF',
-                api_endpoint=SOF_TOKEN_URL,
-                status_codigo=response.status_code,
-                mensagem=f'Falha ao obter token: HTTP {response.status_code}',
-                detalhes={'resposta': response.text[:500]},
-            )
-            return None
-            
-    except Exception as e:
-        print(f"[SOF_API] EXCEÇÃO ao obter token: {type(e).__name__} - {str(e)}")
-        registrar_erro(
-            tipo_erro='api_externa',
-            api_nome='SOF',
-            api_endpoint=SOF_TOKEN_URL,
-            mensagem=f'Exceção ao obter token: {type(e).__name__}: {str(e)}',
-        )
-        return None
+    return cliente_sof.token()
 
 
 # ============================================================================
@@ -125,102 +62,27 @@ def consultar_contratos_sof(filtros):
             - numProcesso: Número do processo
             - numPagina: Número da página (paginação)
             - codOrgao: Código do órgão (default: '34' - SMDHC)
+            anoContrato, numProcesso e codContrato aceitam lista (ou 'a,b'):
+            uma consulta por combinação, em paralelo.
     
     Returns:
-        dict: Dados retornados pela API ou None em caso de erro
+        dict: Dados retornados pela API ou {'erro': True, ...}
     """
-    token = obter_token_sof()
-    
-    if not token:
+    campos = ('anoContrato', 'codContrato', 'numCpfCnpj', 'codEmpresa',
+              'numProcesso', 'numPagina', 'codOrgao')
+    params = {k: filtros.get(k) for k in campos if filtros.get(k)}
+    if 'anoContrato' not in params:
         return {
             'erro': True,
-            'mensagem': 'Falha ao obter token de autenticação'
+            'mensagem': 'Parâmetro anoContrato é obrigatório'
         }
-    
     try:
-        # Preparar parâmetros da query
-        params = {}
-        
-        # Filtros obrigatórios
-        if 'anoContrato' in filtros and filtros['anoContrato']:
-            params['anoContrato'] = filtros['anoContrato']
-        else:
-            return {
-                'erro': True,
-                'mensagem': 'Parâmetro anoContrato é obrigatório'
-            }
-        
-        # Filtros opcionais
-        if 'codContrato' in filtros and filtros['codContrato']:
-            params['codContrato'] = filtros['codContrato']
-        
-        if 'numCpfCnpj' in filtros and filtros['numCpfCnpj']:
-            params['numCpfCnpj'] = filtros['numCpfCnpj']
-        
-        if 'codEmpresa' in filtros and filtros['codEmpresa']:
-            params['codEmpresa'] = filtros['codEmpresa']
-        
-        if 'numProcesso' in filtros and filtros['numProcesso']:
-            params['numProcesso'] = filtros['numProcesso']
-        
-        if 'numPagina' in filtros and filtros['numPagina']:
-            params['numPagina'] = filtros['numPagina']
-        
-        if 'codOrgao' in filtros and filtros['codOrgao']:
-            params['codOrgao'] = filtros['codOrgao']
-        
-        # Fazer requisição à API
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json"
-        }
-        
-        url = f"{SOF_BASE_URL}/contratos"
-        
-        print(f"[SOF_API] Consultando contratos: {url}")
-        print(f"[SOF_API] Parâmetros: {params}")
-        
-        response = requests.get(
-            url,
-            headers=headers,
-            params=params,
-            timeout=30,
-            verify=True
-        )
-        
-        if response.status_code == 200:
-            dados = response.json()
-            print(f"[SOF_API] Consulta bem-sucedida! {len(dados.get('lstContratos', []))} contratos retornados")
-            return dados
-        else:
-            print(f"[SOF_API] ERRO na consulta: {response.status_code} - {response.text}")
-            registrar_erro(
-                tipo_erro='api_externa',
-                api_nome='SOF',
-                api_endpoint=url,
-                status_codigo=response.status_code,
-                mensagem=f'Erro na consulta de contratos: HTTP {response.status_code}',
-                detalhes={'resposta': response.text[:500], 'params': params},
-            )
-            return {
-                'erro': True,
-                'mensagem': f'Erro na API: {response.status_code}',
-                'detalhes': response.text
-            }
-    
+        dados = cliente_sof.contratos(params)
     except Exception as e:
-        print(f"[SOF_API] EXCEÇÃO na consulta: {type(e).__name__} - {str(e)}")
-        registrar_erro(
-            tipo_erro='api_externa',
-            api_nome='SOF',
-            api_endpoint=f"{SOF_BASE_URL}/contratos",
-            mensagem=f'Exceção na consulta de contratos: {type(e).__name__}: {str(e)}',
-        )
-        return {
-            'erro': True,
-            'mensagem': f'Exceção: {type(e).__name__}',
-            'detalhes': str(e)
-        }
+        print(f"[SOF_API] Falha na consulta de contratos: {type(e).__name__} - {e}")
+        return _erro(e)
+    print(f"[SOF_API] Consulta bem-sucedida! {len(dados.get('lstContratos', []))} contratos retornados")
+    return dados
 
 
 def consultar_empenhos_sof(filtros):
@@ -249,78 +111,19 @@ def consultar_empenhos_sof(filtros):
             - codElemento: Código do elemento de despesa
             - codFonteRecurso: Código da fonte de recurso
             - numPagina: Número da página (paginação)
+            anoEmpenho, mesEmpenho, codContrato e numCpfCnpj aceitam lista
+            (ou 'a,b'): uma consulta por combinação, em paralelo.
     
     Returns:
         dict: Resposta da API com lstEmpenhos ou erro
     """
     try:
-        # Obter token de acesso
-        token = obter_token_sof()
-        if not token:
-            return {
-                'erro': True,
-                'mensagem': 'Não foi possível obter token de autenticação'
-            }
-        
-        # Montar URL
-        url = f"{SOF_BASE_URL}/empenhos"
-        
-        # Montar parâmetros (remover None e strings vazias)
-        params = {
-            k: v for k, v in filtros.items() 
-            if v is not None and v != ''
-        }
-        
-        print(f"[SOF_API] Consultando empenhos: {url}")
-        print(f"[SOF_API] Parâmetros: {params}")
-        
-        # Fazer requisição
-        headers = {
-            "Authorization": f"Bearer {token}"
-        }
-        
-        response = requests.get(
-            url,
-            params=params,
-            headers=headers,
-            timeout=30
-        )
-        
-        print(f"[SOF_API] Status: {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"[SOF_API] Empenhos obtidos: {len(data.get('lstEmpenhos', []))}")
-            return data
-        else:
-            print(f"[SOF_API] ERRO na consulta: {response.status_code} - {response.text}")
-            registrar_erro(
-                tipo_erro='api_externa',
-                api_nome='SOF',
-                api_endpoint=url,
-                status_codigo=response.status_code,
-                mensagem=f'Erro na consulta de empenhos: HTTP {response.status_code}',
-                detalhes={'resposta': response.text[:500], 'params': params},
-            )
-            return {
-                'erro': True,
-                'mensagem': f'Erro na API: {response.status_code}',
-                'detalhes': response.text
-            }
-    
+        dados = cliente_sof.empenhos(filtros)
     except Exception as e:
-        print(f"[SOF_API] EXCEÇÃO na consulta de empenhos: {type(e).__name__} - {str(e)}")
-        registrar_erro(
-            tipo_erro='api_externa',
-            api_nome='SOF',
-            api_endpoint=f"{SOF_BASE_URL}/empenhos",
-            mensagem=f'Exceção na consulta de empenhos: {type(e).__name__}: {str(e)}',
-        )
-        return {
-            'erro': True,
-            'mensagem': f'Exceção: {type(e).__name__}',
-            'detalhes': str(e)
-        }
+        print(f"[SOF_API] Falha na consulta de empenhos: {type(e).__name__} - {e}")
+        return _erro(e)
+    print(f"[SOF_API] Empenhos obtidos: {len(dados.get('lstEmpenhos', []))}")
+    return dados
 
 
 # ============================================================================
@@ -27,6 +27,7 @@ load_dotenv(ROOT / '.env')
 import psycopg2
 import psycopg2.extras
 from utils_storage import upload_file
+from core import empenhos_saldos, parcerias_resumo
 
 BUCKET_FOLDER = 'arquivo_empenhos'
 ANO_CORTE = 2026
@@ -110,8 +111,13 @@ def main():
                     cur.execute("""
                         DELETE FROM gestao_financeira.back_empenhos
                         WHERE ano_eph = %s
+                        RETURNING cod_pcss_norm
                     """, (ano,))
+                    processos = {row[0] for row in cur.fetchall() if row[0]}
                     deleted = cur.rowcount
+                    # Mantém back_empenhos_saldos e parcerias_resumo coerentes com as linhas removidas
+                    empenhos_saldos.atualizar_saldos(cur, processos)
+                    parcerias_resumo.marcar_por_processos(cur, processos)
                 conn.commit()
                 total_deletado += deleted
                 print(f'[{ano}] {deleted} linhas deletadas e commit feito.')
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Recarga completa de public.parcerias_resumo (read model da listagem de parcerias).
+
+As alterações do dia a dia são aplicadas de forma incremental (triggers +
+core.parcerias_resumo.sincronizar). Esta recarga cobre o que não passa por
+trigger — cargas em back_empenhos fora da tela de importação e mudanças feitas
+direto no banco. Agendar diariamente (cron / Agendador de Tarefas).
+
+Uso:
+  python scripts/atualizar_parcerias_resumo.py
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dotenv import load_dotenv
+load_dotenv(ROOT / '.env')
+
+import psycopg2
+from core import parcerias_resumo
+
+
+def main():
+    conn = psycopg2.connect(
+        host=os.environ['DB_HOST'],
+        port=int(os.environ.get('DB_PORT', 5432)),
+        dbname=os.environ['DB_DATABASE'],
+        user=os.environ['DB_USER'],
+        password=os.environ['DB_PASSWORD'],
+        sslmode=os.environ.get('DB_SSLMODE', 'require'),
+    )
+    conn.autocommit = False
+
+    try:
+        t0 = time.time()
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = 0")
+            if parcerias_resumo.garantir_estrutura(cur):
+                print('Tabela parcerias_resumo criada.')
+            total = parcerias_resumo.atualizar(cur)
+        conn.commit()
+        print(f'{total} termos recalculados em {time.time() - t0:.1f}s.')
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+-- Colunas normalizadas e saldos materializados de empenhos.
+-- Equivale ao DDL guard de core/empenhos_saldos.garantir_estrutura (executado
+-- na primeira importação de empenhos). Pré-requisito de
+-- scripts/arquivar_empenhos_historico.py.
+
+BEGIN;
+
+ALTER TABLE gestao_financeira.back_empenhos
+    ADD COLUMN IF NOT EXISTS val_tot_eph_num      NUMERIC(15,2),
+    ADD COLUMN IF NOT EXISTS val_tot_canc_eph_num NUMERIC(15,2),
+    ADD COLUMN IF NOT EXISTS val_tot_lqdc_eph_num NUMERIC(15,2),
+    ADD COLUMN IF NOT EXISTS val_tot_pago_eph_num NUMERIC(15,2),
+    ADD COLUMN IF NOT EXISTS cod_pcss_norm        VARCHAR(30);
+
+-- Backfill: mesmo critério de core.empenhos_saldos.backfill_colunas_normalizadas
+-- (= valor_sof_decimal: '1.234,56', '1234,56' e '1234.56'; NULL se não for número)
+UPDATE gestao_financeira.back_empenhos
+SET val_tot_eph_num = CASE WHEN (CASE WHEN STRPOS(BTRIM(val_tot_eph), ',') > 0 AND STRPOS(BTRIM(val_tot_eph), '.') > 0
+                  THEN REPLACE(REPLACE(BTRIM(val_tot_eph), '.', ''), ',', '.')
+                  ELSE REPLACE(BTRIM(val_tot_eph), ',', '.') END) ~ '^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)$'
+        THEN (CASE WHEN STRPOS(BTRIM(val_tot_eph), ',') > 0 AND STRPOS(BTRIM(val_tot_eph), '.') > 0
+                  THEN REPLACE(REPLACE(BTRIM(val_tot_eph), '.', ''), ',', '.')
+                  ELSE REPLACE(BTRIM(val_tot_eph), ',', '.') END)::numeric END,
+    val_tot_canc_eph_num = CASE WHEN (CASE WHEN STRPOS(BTRIM(val_tot_canc_eph), ',') > 0 AND STRPOS(BTRIM(val_tot_canc_eph), '.') > 0
+                  THEN REPLACE(REPLACE(BTRIM(val_tot_canc_eph), '.', ''), ',', '.')
+                  ELSE REPLACE(BTRIM(val_tot_canc_eph), ',', '.') END) ~ '^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)$'
+        THEN (CASE WHEN STRPOS(BTRIM(val_tot_canc_eph), ',') > 0 AND STRPOS(BTRIM(val_tot_canc_eph), '.') > 0
+                  THEN REPLACE(REPLACE(BTRIM(val_tot_canc_eph), '.', ''), ',', '.')
+                  ELSE REPLACE(BTRIM(val_tot_canc_eph), ',', '.') END)::numeric END,
+    val_tot_lqdc_eph_num = CASE WHEN (CASE WHEN STRPOS(BTRIM(val_tot_lqdc_eph), ',') > 0 AND STRPOS(BTRIM(val_tot_lqdc_eph), '.') > 0
+                  THEN REPLACE(REPLACE(BTRIM(val_tot_lqdc_eph), '.', ''), ',', '.')
+                  ELSE REPLACE(BTRIM(val_tot_lqdc_eph), ',', '.') END) ~ '^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)$'
+        THEN (CASE WHEN STRPOS(BTRIM(val_tot_lqdc_eph), ',') > 0 AND STRPOS(BTRIM(val_tot_lqdc_eph), '.') > 0
+                  THEN REPLACE(REPLACE(BTRIM(val_tot_lqdc_eph), '.', ''), ',', '.')
+                  ELSE REPLACE(BTRIM(val_tot_lqdc_eph), ',', '.') END)::numeric END,
+    val_tot_pago_eph_num = CASE WHEN (CASE WHEN STRPOS(BTRIM(val_tot_pago_eph), ',') > 0 AND STRPOS(BTRIM(val_tot_pago_eph), '.') > 0
+                  THEN REPLACE(REPLACE(BTRIM(val_tot_pago_eph), '.', ''), ',', '.')
+                  ELSE REPLACE(BTRIM(val_tot_pago_eph), ',', '.') END) ~ '^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)$'
+        THEN (CASE WHEN STRPOS(BTRIM(val_tot_pago_eph), ',') > 0 AND STRPOS(BTRIM(val_tot_pago_eph), '.') > 0
+                  THEN REPLACE(REPLACE(BTRIM(val_tot_pago_eph), '.', ''), ',', '.')
+                  ELSE REPLACE(BTRIM(val_tot_pago_eph), ',', '.') END)::numeric END,
+    cod_pcss_norm = NULLIF(REGEXP_REPLACE(cod_nro_pcss_sof, '[-./[:space:]]', '', 'g'), '');
+
+ALTER TABLE public.parcerias
+    ADD COLUMN IF NOT EXISTS sei_celeb_norm VARCHAR(30)
+    GENERATED ALWAYS AS (
+        NULLIF(REGEXP_REPLACE(sei_celeb, '[-./[:space:]]', '', 'g'), '')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_parcerias_sei_celeb_norm
+    ON public.parcerias (sei_celeb_norm);
+
+CREATE INDEX IF NOT EXISTS idx_back_empenhos_pcss_norm
+    ON gestao_financeira.back_empenhos (cod_pcss_norm, dt_eph);
+
+CREATE TABLE IF NOT EXISTS gestao_financeira.back_empenhos_saldos (
+    cod_sof            VARCHAR(30) NOT NULL,
+    ano                INTEGER     NOT NULL,
+    elemento           INTEGER     NOT NULL,
+    val_tot_eph        NUMERIC(15,2) NOT NULL DEFAULT 0,
+    val_tot_canc_eph   NUMERIC(15,2) NOT NULL DEFAULT 0,
+    val_tot_lqdc_eph   NUMERIC(15,2) NOT NULL DEFAULT 0,
+    val_tot_pago_eph   NUMERIC(15,2) NOT NULL DEFAULT 0,
+    disponivel         NUMERIC(15,2) NOT NULL DEFAULT 0,
+    qtd_empenhos       INTEGER     NOT NULL DEFAULT 0,
+    atualizado_em      TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (cod_sof, ano, elemento)
+);
+
+-- Carga completa (as importações seguintes recalculam só os processos tocados)
+DELETE FROM gestao_financeira.back_empenhos_saldos;
+INSERT INTO gestao_financeira.back_empenhos_saldos (
+    cod_sof, ano, elemento,
+    val_tot_eph, val_tot_canc_eph, val_tot_lqdc_eph, val_tot_pago_eph,
+    disponivel, qtd_empenhos, atualizado_em
+)
+SELECT
+    cod_pcss_norm,
+    EXTRACT(YEAR FROM dt_eph)::integer,
+    cod_item_desp_sof,
+    COALESCE(SUM(val_tot_eph_num), 0),
+    COALESCE(SUM(val_tot_canc_eph_num), 0),
+    COALESCE(SUM(val_tot_lqdc_eph_num), 0),
+    COALESCE(SUM(val_tot_pago_eph_num), 0),
+    COALESCE(SUM(val_tot_eph_num), 0)
+      - COALESCE(SUM(val_tot_canc_eph_num), 0)
+      - COALESCE(SUM(val_tot_pago_eph_num), 0),
+    COUNT(*),
+    NOW()
+FROM gestao_financeira.back_empenhos
+WHERE cod_pcss_norm IS NOT NULL
+  AND dt_eph IS NOT NULL
+  AND cod_item_desp_sof IS NOT NULL
+GROUP BY cod_pcss_norm, EXTRACT(YEAR FROM dt_eph), cod_item_desp_sof;
+
+COMMIT;
+
+ANALYZE gestao_financeira.back_empenhos;
+ANALYZE gestao_financeira.back_empenhos_saldos;
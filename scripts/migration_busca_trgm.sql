@@ -0,0 +1,31 @@
+-- Busca aproximada (core/busca.py): pg_trgm + unaccent e índices GIN trigram
+-- O app cria a mesma estrutura na primeira busca (busca.garantir_estrutura);
+-- este script permite aplicá-la antes, fora do horário de uso.
+-- Em instalações com as extensões no schema `extensions` (Supabase), trocar
+-- public.unaccent por extensions.unaccent na função abaixo.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+CREATE OR REPLACE FUNCTION public.busca_normalizar(texto text)
+RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+AS $$
+    SELECT btrim(regexp_replace(
+        lower(public.unaccent('public.unaccent'::regdictionary, texto)),
+        '\s+', ' ', 'g'
+    ))
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_busca_trgm_parcerias_osc
+    ON public.parcerias USING gin (public.busca_normalizar(osc) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_busca_trgm_gestao_cents_osc
+    ON celebracao.gestao_cents USING gin (public.busca_normalizar(osc) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_busca_trgm_celebracao_parcerias_osc
+    ON celebracao.celebracao_parcerias USING gin (public.busca_normalizar(osc) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_busca_trgm_parcerias_numero_termo
+    ON public.parcerias USING gin (public.busca_normalizar(numero_termo) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_busca_trgm_c_dgp_indicadores_indicador
+    ON categoricas.c_dgp_indicadores USING gin (public.busca_normalizar(indicador) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_busca_trgm_c_dgp_meios_afericao_meios_afericao
+    ON categoricas.c_dgp_meios_afericao USING gin (public.busca_normalizar(meios_afericao) gin_trgm_ops);
@@ -0,0 +1,11 @@
+-- Cache de texto extraído por página de PDF (core/cache_paginas.py).
+-- Chave: SHA-256 do conteúdo da página + método ('pdfplumber', 'tesseract@<dpi>').
+-- Criada também sob demanda pelo módulo.
+
+CREATE TABLE IF NOT EXISTS public.cache_extracao_paginas (
+    hash_pagina  CHAR(64)    NOT NULL,
+    metodo       VARCHAR(30) NOT NULL,
+    texto        TEXT        NOT NULL,
+    criado_em    TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (hash_pagina, metodo)
+);
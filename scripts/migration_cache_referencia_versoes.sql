@@ -0,0 +1,9 @@
+-- Versões das tabelas de referência em cache (core/referencia.py).
+-- Cada invalidação incrementa a versão; os workers comparam periodicamente
+-- e descartam as listas dependentes. Criada também sob demanda pelo módulo.
+
+CREATE TABLE IF NOT EXISTS public.cache_referencia_versoes (
+    tabela        VARCHAR(120) PRIMARY KEY,
+    versao        BIGINT NOT NULL DEFAULT 1,
+    atualizado_em TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+);
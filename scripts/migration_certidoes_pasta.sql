@@ -0,0 +1,10 @@
+-- Chave normalizada da pasta da OSC em public.certidoes (core/certidoes_unificadas.py).
+-- Primeiro segmento de certidao_path com barras invertidas convertidas.
+-- Criada também sob demanda pelo módulo.
+
+ALTER TABLE public.certidoes
+    ADD COLUMN IF NOT EXISTS certidao_pasta TEXT
+    GENERATED ALWAYS AS (split_part(REPLACE(certidao_path, chr(92), '/'), '/', 1)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_certidoes_pasta
+    ON public.certidoes (certidao_pasta);
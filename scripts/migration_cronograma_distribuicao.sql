@@ -0,0 +1,66 @@
+-- Distribuição mensal materializada do cronograma (core/cronograma_distribuicao.py).
+-- Equivale ao DDL guard de core.cronograma_distribuicao.garantir_estrutura
+-- (executado no primeiro acesso aos painéis de gestao_orcamentaria, que também
+-- faz a carga inicial). Recarga completa agendada:
+-- scripts/atualizar_cronograma_distribuicao.py
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS gestao_financeira.cronograma_distribuicao (
+    ano          SMALLINT         NOT NULL,
+    serie        VARCHAR(30)      NOT NULL,
+    numero_termo VARCHAR(100)     NOT NULL,
+    parcela      TEXT             NOT NULL DEFAULT '',
+    mes          SMALLINT         NOT NULL,
+    valor        DOUBLE PRECISION NOT NULL DEFAULT 0,
+    destacado    BOOLEAN          NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (ano, serie, numero_termo, parcela, mes)
+);
+
+CREATE INDEX IF NOT EXISTS idx_cronograma_distribuicao_termo
+    ON gestao_financeira.cronograma_distribuicao (numero_termo);
+
+CREATE TABLE IF NOT EXISTS gestao_financeira.cronograma_distribuicao_pendentes (
+    numero_termo VARCHAR(100) PRIMARY KEY,
+    marcado_em   TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION gestao_financeira.fn_cronograma_distribuicao_marcar()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW.numero_termo IS NOT NULL THEN
+            INSERT INTO gestao_financeira.cronograma_distribuicao_pendentes (numero_termo)
+            VALUES (NEW.numero_termo)
+            ON CONFLICT (numero_termo) DO NOTHING;
+        END IF;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD.numero_termo IS NOT NULL THEN
+            INSERT INTO gestao_financeira.cronograma_distribuicao_pendentes (numero_termo)
+            VALUES (OLD.numero_termo)
+            ON CONFLICT (numero_termo) DO NOTHING;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_cronograma_distribuicao_marcar
+AFTER INSERT OR UPDATE OR DELETE ON gestao_financeira.ultra_liquidacoes
+FOR EACH ROW EXECUTE FUNCTION gestao_financeira.fn_cronograma_distribuicao_marcar();
+
+CREATE OR REPLACE TRIGGER trg_cronograma_distribuicao_marcar
+AFTER INSERT OR UPDATE OR DELETE ON gestao_financeira.ultra_liquidacoes_cronograma
+FOR EACH ROW EXECUTE FUNCTION gestao_financeira.fn_cronograma_distribuicao_marcar();
+
+-- Carga inicial: marcar todos os termos; o primeiro acesso aos painéis recalcula
+INSERT INTO gestao_financeira.cronograma_distribuicao_pendentes (numero_termo)
+SELECT DISTINCT numero_termo FROM gestao_financeira.ultra_liquidacoes WHERE numero_termo IS NOT NULL
+UNION
+SELECT DISTINCT numero_termo FROM gestao_financeira.ultra_liquidacoes_cronograma WHERE numero_termo IS NOT NULL
+ON CONFLICT (numero_termo) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,30 @@
+-- Memória da ingestão de nomeações do Diário Oficial (core/diario_oficial.py)
+-- O app cria as mesmas tabelas na primeira busca (IngestaoDO.garantir_estrutura);
+-- este script permite aplicá-las antes.
+
+-- Listagem da pesquisa do D.O. com os validadores HTTP (requisição condicional)
+CREATE TABLE IF NOT EXISTS gestao_pessoas.do_listagem (
+    termo          TEXT PRIMARY KEY,
+    etag           TEXT,
+    last_modified  TEXT,
+    documentos     JSONB NOT NULL DEFAULT '[]'::jsonb,
+    verificado_em  TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Títulos de Nomeação já baixados e parseados (não são baixados de novo
+-- enquanto versao_parser >= diario_oficial.VERSAO_PARSER)
+CREATE TABLE IF NOT EXISTS gestao_pessoas.do_documentos (
+    numero           TEXT PRIMARY KEY,
+    url              TEXT,
+    tipo             TEXT,
+    data_publicacao  DATE,
+    versao_parser    SMALLINT NOT NULL,
+    nomeacoes        JSONB NOT NULL DEFAULT '[]'::jsonb,
+    processado_em    TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_do_documentos_data_publicacao
+    ON gestao_pessoas.do_documentos (data_publicacao);
+
+-- Forçar nova leitura de tudo (ex.: após corrigir o parser sem subir a versão):
+-- TRUNCATE gestao_pessoas.do_documentos;
@@ -0,0 +1,99 @@
+-- Read model da listagem/exportação de parcerias (core/parcerias_resumo.py).
+-- Cria a fila public.parcerias_resumo_pendentes, as funções e os triggers que
+-- marcam termos alterados nas tabelas de origem.
+-- A tabela public.parcerias_resumo (colunas derivadas do SELECT em
+-- core.parcerias_resumo._SELECT_RESUMO), seus índices e a carga inicial são
+-- feitos pelo DDL guard core.parcerias_resumo.garantir_estrutura — depois desta
+-- migração, executar:
+--   python scripts/atualizar_parcerias_resumo.py
+-- (também agendado diariamente como recarga completa). Sem isso, o primeiro
+-- acesso à listagem de parcerias cria e carrega a tabela.
+-- Requer scripts/migration_back_empenhos_saldos.sql (sei_celeb_norm / cod_pcss_norm).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.parcerias_resumo_pendentes (
+    numero_termo VARCHAR(100) PRIMARY KEY,
+    marcado_em   TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION public.fn_parcerias_resumo_marcar()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW.numero_termo IS NOT NULL THEN
+            INSERT INTO public.parcerias_resumo_pendentes (numero_termo)
+            VALUES (NEW.numero_termo)
+            ON CONFLICT (numero_termo) DO NOTHING;
+        END IF;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD.numero_termo IS NOT NULL THEN
+            INSERT INTO public.parcerias_resumo_pendentes (numero_termo)
+            VALUES (OLD.numero_termo)
+            ON CONFLICT (numero_termo) DO NOTHING;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.fn_parcerias_resumo_marcar_gestora()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    nomes TEXT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        nomes := ARRAY[NEW.nome_pg::text];
+    ELSIF TG_OP = 'DELETE' THEN
+        nomes := ARRAY[OLD.nome_pg::text];
+    ELSE
+        nomes := ARRAY[NEW.nome_pg::text, OLD.nome_pg::text];
+    END IF;
+    INSERT INTO public.parcerias_resumo_pendentes (numero_termo)
+    SELECT DISTINCT pg.numero_termo
+    FROM public.parcerias_pg pg
+    WHERE pg.nome_pg::text = ANY(nomes)
+      AND pg.numero_termo IS NOT NULL
+    ON CONFLICT (numero_termo) DO NOTHING;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+AFTER INSERT OR UPDATE OR DELETE ON public.parcerias
+FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar();
+
+CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+AFTER INSERT OR UPDATE OR DELETE ON public.parcerias_pg
+FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar();
+
+CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+AFTER INSERT OR UPDATE OR DELETE ON public.parcerias_sei
+FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar();
+
+CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+AFTER INSERT OR UPDATE OR DELETE ON public.parcerias_enderecos
+FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar();
+
+CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+AFTER INSERT OR UPDATE OR DELETE ON public.parcerias_infos_adicionais
+FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar();
+
+CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+AFTER INSERT OR UPDATE OR DELETE ON gestao_financeira.ultra_liquidacoes
+FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar();
+
+CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+AFTER INSERT OR UPDATE OR DELETE ON gestao_financeira.ultra_liquidacoes_cronograma
+FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar();
+
+CREATE OR REPLACE TRIGGER trg_parcerias_resumo_marcar
+AFTER INSERT OR UPDATE OR DELETE ON categoricas.c_geral_pessoa_gestora
+FOR EACH ROW EXECUTE FUNCTION public.fn_parcerias_resumo_marcar_gestora();
+
+COMMIT;
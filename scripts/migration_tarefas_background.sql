@@ -0,0 +1,28 @@
+-- Tarefas em background (core/jobs.py).
+-- Equivale ao DDL guard executado na primeira tarefa criada após o deploy.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.tarefas_background (
+    id              VARCHAR(36) PRIMARY KEY,
+    tipo            VARCHAR(60) NOT NULL,
+    status          VARCHAR(20) NOT NULL DEFAULT 'queued',
+    pct             INTEGER     NOT NULL DEFAULT 0,
+    label           TEXT,
+    resultado       JSONB,
+    erro            TEXT,
+    usuario         VARCHAR(255),
+    chave_exclusiva VARCHAR(120),
+    worker          VARCHAR(60),
+    criada_em       TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    iniciada_em     TIMESTAMP WITHOUT TIME ZONE,
+    atualizada_em   TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    concluida_em    TIMESTAMP WITHOUT TIME ZONE
+);
+
+-- No máximo uma tarefa ativa por chave (ex.: 'sincronizar_empenhos', 'importar_sof')
+CREATE UNIQUE INDEX IF NOT EXISTS uq_tarefas_background_exclusiva_ativa
+    ON public.tarefas_background (chave_exclusiva)
+    WHERE chave_exclusiva IS NOT NULL AND status IN ('queued', 'running');
+
+COMMIT;
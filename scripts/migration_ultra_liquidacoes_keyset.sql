@@ -0,0 +1,63 @@
+-- Índices da listagem paginada de parcelas
+-- (routes/gestao_financeira_ultra_liquidacoes.py, api_listar_parcelas).
+-- Equivale ao DDL guard _garantir_indices_ordenacao (executado na primeira
+-- listagem); este script permite criá-los antes, fora do horário de uso.
+-- As expressões precisam ser idênticas às chaves de _SQL_CHAVES / _SQL_SECAO
+-- para que o planner use o índice na ordenação e no cursor (keyset):
+--   idx_ultra_liquidacoes_ordem_ano_corrente → faixa 0 (vigência no ano corrente)
+--   idx_ultra_liquidacoes_ordem_demais       → faixa 1 (demais anos)
+
+CREATE INDEX IF NOT EXISTS idx_ultra_liquidacoes_ordem_ano_corrente
+    ON gestao_financeira.ultra_liquidacoes (
+        (CASE
+                WHEN POSITION('nao pago' IN LOWER(parcela_status)) > 0
+                  OR POSITION('não pago' IN LOWER(parcela_status)) > 0 THEN 'nao_pago'
+                WHEN parcela_status = 'Encaminhado para Pagamento' THEN 'encaminhado'
+                WHEN LOWER(parcela_status) = 'pago' THEN 'pago'
+            END),
+        (EXTRACT(YEAR FROM vigencia_inicial)),
+        (CASE
+                WHEN parcela_status IN ('Não Pago', 'Nao Pago', 'Encaminhado para Pagamento')
+                     AND (COALESCE(valor_elemento_53_23, 0) + COALESCE(valor_elemento_53_24, 0) != COALESCE(valor_previsto, 0))
+                THEN 0
+                ELSE 1
+            END),
+        (CASE
+                WHEN parcela_status IN ('Não Pago', 'Nao Pago')
+                     AND (parcela_status_secundario IS NULL OR parcela_status_secundario = '-' OR parcela_status_secundario = '')
+                THEN 0
+                ELSE 1
+            END),
+        (COALESCE(
+                CASE WHEN LOWER(parcela_status) = 'pago' THEN DATE '9999-12-31' - data_pagamento END,
+                2147483647
+            )),
+        (COALESCE(vigencia_inicial, DATE '9999-12-31')),
+        (COALESCE(numero_termo, '')),
+        id
+    );
+
+CREATE INDEX IF NOT EXISTS idx_ultra_liquidacoes_ordem_demais
+    ON gestao_financeira.ultra_liquidacoes (
+        (CASE
+                WHEN POSITION('nao pago' IN LOWER(parcela_status)) > 0
+                  OR POSITION('não pago' IN LOWER(parcela_status)) > 0 THEN 'nao_pago'
+                WHEN parcela_status = 'Encaminhado para Pagamento' THEN 'encaminhado'
+                WHEN LOWER(parcela_status) = 'pago' THEN 'pago'
+            END),
+        (CASE
+                WHEN parcela_status IN ('Não Pago', 'Nao Pago', 'Encaminhado para Pagamento')
+                     AND (COALESCE(valor_elemento_53_23, 0) + COALESCE(valor_elemento_53_24, 0) != COALESCE(valor_previsto, 0))
+                THEN 0
+                ELSE 1
+            END),
+        (COALESCE(
+                CASE WHEN LOWER(parcela_status) = 'pago' THEN DATE '9999-12-31' - data_pagamento END,
+                2147483647
+            )),
+        (COALESCE(vigencia_inicial, DATE '9999-12-31')),
+        (COALESCE(numero_termo, '')),
+        id
+    );
+
+ANALYZE gestao_financeira.ultra_liquidacoes;
@@ -0,0 +1,13 @@
+"""
+Configuração comum dos testes (pytest.ini → testpaths = testes).
+
+Os testes rodam sem banco e sem rede: backend de disco local do storage,
+HTML salvo em testes/fixtures e servidores HTTP locais (stubs).
+"""
+
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
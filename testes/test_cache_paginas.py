@@ -0,0 +1,95 @@
+"""
+core/cache_paginas.hash_pagina: páginas com o mesmo stream de conteúdo mas
+fontes diferentes não podem compartilhar a chave do cache.
+"""
+
+import io
+
+import pdfplumber
+
+from core import cache_paginas
+
+
+CONTEUDO = b'BT /F1 12 Tf 72 720 Td (ABC) Tj ET'
+
+
+def _cmap(destino):
+    return (
+        b'/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n'
+        b'1 begincodespacerange <00> <FF> endcodespacerange\n'
+        b'1 beginbfrange <41> <43> <' + destino + b'> endbfrange\n'
+        b'endcmap CMapName currentdict /CMap defineresource pop end end'
+    )
+
+
+def _montar_pdf(paginas):
+    """PDF mínimo; cada página é (encoding, bytes do ToUnicode ou None)."""
+    objetos = []
+
+    def novo(corpo):
+        objetos.append(corpo)
+        return len(objetos)
+
+    def stream(dados):
+        return b'<< /Length %d >>\nstream\n%s\nendstream' % (len(dados), dados)
+
+    catalogo = novo(None)
+    arvore = novo(None)
+    kids = []
+    for encoding, to_unicode in paginas:
+        conteudo = novo(stream(CONTEUDO))
+        fonte = b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /' + encoding
+        if to_unicode is not None:
+            fonte += b' /ToUnicode %d 0 R' % novo(stream(to_unicode))
+        fonte_id = novo(fonte + b' >>')
+        kids.append(novo(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] '
+            b'/Contents %d 0 R /Resources << /Font << /F1 %d 0 R >> >> >>'
+            % (arvore, conteudo, fonte_id)
+        ))
+    objetos[catalogo - 1] = b'<< /Type /Catalog /Pages %d 0 R >>' % arvore
+    objetos[arvore - 1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % k for k in kids), len(kids))
+
+    saida = io.BytesIO()
+    saida.write(b'%PDF-1.4\n')
+    offsets = []
+    for i, corpo in enumerate(objetos, start=1):
+        offsets.append(saida.tell())
+        saida.write(b'%d 0 obj\n%s\nendobj\n' % (i, corpo))
+    inicio_xref = saida.tell()
+    saida.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1))
+    for off in offsets:
+        saida.write(b'%010d 00000 n \n' % off)
+    saida.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                % (len(objetos) + 1, catalogo, inicio_xref))
+    saida.seek(0)
+    return saida
+
+
+def _hashes(paginas):
+    with pdfplumber.open(_montar_pdf(paginas)) as pdf:
+        return cache_paginas.hashes_documento(pdf)
+
+
+def test_mesma_pagina_mesmo_hash():
+    a, b = _hashes([(b'WinAnsiEncoding', None), (b'WinAnsiEncoding', None)])
+    assert a == b
+
+
+def test_encoding_diferente_muda_hash():
+    a, b = _hashes([(b'WinAnsiEncoding', None), (b'MacRomanEncoding', None)])
+    assert a != b
+
+
+def test_to_unicode_diferente_muda_hash():
+    a, b = _hashes([
+        (b'WinAnsiEncoding', _cmap(b'0041')),
+        (b'WinAnsiEncoding', _cmap(b'0058')),
+    ])
+    assert a != b
+
+
+def test_hash_estavel_entre_arquivos():
+    paginas = [(b'WinAnsiEncoding', _cmap(b'0041'))]
+    assert _hashes(paginas) == _hashes(paginas)
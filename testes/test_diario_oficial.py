@@ -0,0 +1,397 @@
+"""
+core.diario_oficial sobre HTML salvo (testes/fixtures/diario_oficial).
+
+Sem rede: ClienteDO recebe uma sessão falsa que devolve requests.Response
+montadas com os fixtures. Sem banco: buscar(None, ...) ou uma fábrica de
+conexões em memória que também confere que nenhuma conexão fica aberta
+durante os acessos ao D.O.
+"""
+
+import contextlib
+import os
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from core import diario_oficial as do
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'diario_oficial')
+
+URL_DOC = do.DO_BASE_URL + 'md_epubli_visualizar.php?id={}&dosp=1'
+
+
+def _fixture(nome):
+    with open(os.path.join(FIXTURES, nome), encoding='utf-8') as fh:
+        return fh.read()
+
+
+def _resposta(corpo, status=200, headers=None, url=''):
+    resposta = requests.Response()
+    resposta.status_code = status
+    resposta._content = corpo
+    resposta.headers = CaseInsensitiveDict(headers or {})
+    resposta.encoding = requests.utils.get_encoding_from_headers(resposta.headers)
+    resposta.url = url
+    return resposta
+
+
+class SessaoFixtures:
+    """
+    Serve listagem.html na URL de pesquisa e documento_<n>.html na URL de
+    cada documento (id=1280001 → documento_128000001.html).
+
+    Args:
+        codificacao: codificação dos bytes enviados
+        content_type: Content-Type declarado (pode mentir o charset)
+        etag: validador da listagem; If-None-Match igual → 304
+        falhar: números de documento cujo GET dá erro de conexão
+        ao_chamar: callback(url) antes de cada resposta
+    """
+
+    def __init__(self, codificacao='utf-8', content_type='text/html; charset=UTF-8',
+                 etag='"v1"', falhar=(), ao_chamar=None):
+        self.codificacao = codificacao
+        self.content_type = content_type
+        self.etag = etag
+        self.falhar = set(falhar)
+        self.ao_chamar = ao_chamar
+        self.chamadas = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        headers = dict(headers or {})
+        self.chamadas.append((url, headers))
+        if self.ao_chamar:
+            self.ao_chamar(url)
+
+        if url == do.DO_SEARCH_URL:
+            if self.etag and headers.get('If-None-Match') == self.etag:
+                return _resposta(b'', 304, url=url)
+            return _resposta(_fixture('listagem.html').encode(self.codificacao),
+                             headers={'Content-Type': self.content_type, 'ETag': self.etag}, url=url)
+
+        id_doc = url.split('id=', 1)[1].split('&', 1)[0]         # 1280001 → 128000001
+        numero = id_doc[:3] + id_doc[3:].zfill(6)
+        if numero in self.falhar:
+            raise requests.ConnectionError(f'falha simulada em {numero}')
+        try:
+            corpo = _fixture(f'documento_{numero}.html')
+        except FileNotFoundError:
+            return _resposta(b'', 404, url=url)
+        return _resposta(corpo.encode(self.codificacao),
+                         headers={'Content-Type': self.content_type}, url=url)
+
+    def urls(self):
+        return [url for url, _ in self.chamadas]
+
+
+def _ingestao(sessao):
+    return do.IngestaoDO(do.ClienteDO(sessao=sessao))
+
+
+@pytest.fixture(params=['html.parser', 'lxml'])
+def parser(request, monkeypatch):
+    """Os resultados têm de ser os mesmos com os dois parsers do bs4."""
+    if request.param == 'lxml':
+        pytest.importorskip('lxml')
+    monkeypatch.setattr(do, 'PARSER_HTML', request.param)
+    return request.param
+
+
+NOMEACOES_128000001 = [
+    {
+        'cda': 3,
+        'numero_vaga': 21989,
+        'nome_servidor': 'ANA BEATRIZ CONCEIÇÃO',
+        'numero_rf': 8123456,
+        'data_publicacao': '10/01/2025',
+        'unidade': '',
+        'numero_documento': 128000001,
+        'observacoes': '',
+    },
+    {
+        # Nomeação quebrada em duas linhas (<br>) no meio do parágrafo
+        'cda': 5,
+        'numero_vaga': 22001,
+        'nome_servidor': 'JOSÉ ANTÔNIO ÁVILA',
+        'numero_rf': 8234561,
+        'data_publicacao': '10/01/2025',
+        'unidade': '',
+        'numero_documento': 128000001,
+        'observacoes': '',
+    },
+    {
+        'cda': 2,
+        'numero_vaga': 22010,
+        'nome_servidor': 'ÍRIS MÜLLER DE SÁ',
+        'numero_rf': None,
+        'data_publicacao': '10/01/2025',
+        'unidade': '',
+        'numero_documento': 128000001,
+        'observacoes': '',
+    },
+]
+
+
+# ── Parsing ──────────────────────────────────────────────────────────────────
+
+def test_parse_listagem(parser):
+    documentos = do.parse_listagem(_fixture('listagem.html'))
+
+    # Despacho e publicação sem data ficam de fora; URLs relativas viram absolutas
+    assert documentos == [
+        {'url': URL_DOC.format(1280001), 'numero': '128000001',
+         'data': '10/01/2025', 'tipo': 'Título de Nomeação'},
+        {'url': URL_DOC.format(1280002), 'numero': '128000002',
+         'data': '15/01/2025', 'tipo': 'Título de Nomeação'},
+        {'url': URL_DOC.format(1280003), 'numero': '128000003',
+         'data': '20/02/2025', 'tipo': 'Título de Nomeação'},
+    ]
+
+
+def test_parse_documento(parser):
+    nomeacoes = do.parse_documento(_fixture('documento_128000001.html'), '128000001')
+
+    assert nomeacoes == NOMEACOES_128000001
+
+
+def test_parse_documento_com_nomear_a_senhora(parser):
+    nomeacoes = do.parse_documento(_fixture('documento_128000002.html'), '128000002')
+
+    assert [(n['nome_servidor'], n['numero_rf'], n['cda'], n['numero_vaga'], n['data_publicacao'])
+            for n in nomeacoes] == [('MARIA DAS GRAÇAS SOUZA', 76543210, 1, 21500, '15/01/2025')]
+
+
+def test_parse_documento_numero_pelo_titulo(parser):
+    nomeacoes = do.parse_documento(_fixture('documento_128000003.html'))
+
+    assert [(n['nome_servidor'], n['numero_documento']) for n in nomeacoes] == [
+        ('PEDRO HENRIQUE LIMA', 128000003)
+    ]
+
+
+# ── Busca sem banco ──────────────────────────────────────────────────────────
+
+def test_buscar_sem_banco(parser):
+    sessao = SessaoFixtures()
+
+    resultado = _ingestao(sessao).buscar(None, '01/01/2025', '31/01/2025')
+
+    assert resultado['erro'] is None
+    assert [d['numero'] for d in resultado['documentos']] == ['128000001', '128000002']
+    assert [(n['nome_servidor'], n['_doc_numero'], n['_doc_url']) for n in resultado['nomeacoes']] == [
+        ('ANA BEATRIZ CONCEIÇÃO', '128000001', URL_DOC.format(1280001)),
+        ('JOSÉ ANTÔNIO ÁVILA', '128000001', URL_DOC.format(1280001)),
+        ('ÍRIS MÜLLER DE SÁ', '128000001', URL_DOC.format(1280001)),
+        ('MARIA DAS GRAÇAS SOUZA', '128000002', URL_DOC.format(1280002)),
+    ]
+    assert sorted(sessao.urls()) == sorted([
+        do.DO_SEARCH_URL, URL_DOC.format(1280001), URL_DOC.format(1280002),
+    ])
+
+
+def test_buscar_periodo_sem_documentos():
+    resultado = _ingestao(SessaoFixtures()).buscar(None, '01/03/2025', '31/03/2025')
+
+    assert resultado == {'documentos': [], 'nomeacoes': [], 'erro': None}
+
+
+def test_buscar_datas_invalidas():
+    sessao = SessaoFixtures()
+
+    resultado = _ingestao(sessao).buscar(None, '2025-01-01', '31/01/2025')
+
+    assert resultado['erro'] == 'Datas inválidas.'
+    assert sessao.chamadas == []
+
+
+def test_documento_com_falha_fica_de_fora():
+    resultado = _ingestao(SessaoFixtures(falhar={'128000002'})).buscar(None, '01/01/2025', '31/01/2025')
+
+    assert resultado['erro'] is None
+    assert len(resultado['documentos']) == 2
+    assert {n['_doc_numero'] for n in resultado['nomeacoes']} == {'128000001'}
+
+
+def test_listagem_indisponivel_sem_memoria():
+    class SessaoFora:
+        def get(self, *args, **kwargs):
+            raise requests.ConnectionError('sem rota')
+
+    resultado = _ingestao(SessaoFora()).buscar(None, '01/01/2025', '31/01/2025')
+
+    assert resultado['documentos'] == []
+    assert resultado['erro'].startswith('Erro ao acessar o D.O.')
+
+
+# ── Codificação ──────────────────────────────────────────────────────────────
+
+def test_charset_declarado_errado_documento_em_cp1252(parser):
+    """Content-Type diz UTF-8, bytes em Windows-1252: vale a detecção pelo conteúdo."""
+    sessao = SessaoFixtures(codificacao='cp1252', content_type='text/html; charset=utf-8')
+
+    resultado = _ingestao(sessao).buscar(None, '01/01/2025', '10/01/2025')
+
+    assert [n['nome_servidor'] for n in resultado['nomeacoes']] == [
+        'ANA BEATRIZ CONCEIÇÃO', 'JOSÉ ANTÔNIO ÁVILA', 'ÍRIS MÜLLER DE SÁ',
+    ]
+
+
+def test_charset_declarado_errado_utf8_como_latin1(parser):
+    """Content-Type diz ISO-8859-1, bytes em UTF-8: 'Título de Nomeação' continua reconhecido."""
+    sessao = SessaoFixtures(content_type='text/html; charset=ISO-8859-1')
+
+    resultado = _ingestao(sessao).buscar(None, '01/01/2025', '31/01/2025')
+
+    assert [d['numero'] for d in resultado['documentos']] == ['128000001', '128000002']
+    assert resultado['nomeacoes'][0]['nome_servidor'] == 'ANA BEATRIZ CONCEIÇÃO'
+
+
+def test_texto_resposta_sem_charset_declarado():
+    html = _fixture('documento_128000002.html')
+
+    assert do.texto_resposta(_resposta(html.encode('utf-8'), headers={'Content-Type': 'text/html'})) == html
+    assert do.texto_resposta(_resposta(html.encode('cp1252'), headers={'Content-Type': 'text/html'})) == html
+
+
+# ── Memória no banco (fábrica de conexões em memória) ────────────────────────
+
+class BancoMemoria:
+    """
+    Fábrica de conexões no formato de db.pooled_connection, com as duas
+    tabelas da ingestão em dicts. Só o que diario_oficial executa é tratado.
+    """
+
+    def __init__(self, falhar_commits=0):
+        self.listagem = None            # {etag, last_modified, documentos, idade}
+        self.documentos = {}            # numero → linha
+        self.abertas = 0
+        self.ddl = 0
+        self.commits = 0
+        self.falhar_commits = falhar_commits
+
+    @contextlib.contextmanager
+    def __call__(self):
+        self.abertas += 1
+        try:
+            yield _ConexaoMemoria(self)
+        finally:
+            self.abertas -= 1
+
+
+class _ConexaoMemoria:
+
+    def __init__(self, banco):
+        self.banco = banco
+
+    @contextlib.contextmanager
+    def cursor(self, cursor_factory=None):
+        yield _CursorMemoria(self.banco)
+
+    def commit(self):
+        if self.banco.falhar_commits:
+            self.banco.falhar_commits -= 1
+            raise RuntimeError('commit falhou')
+        self.banco.commits += 1
+
+
+class _CursorMemoria:
+
+    def __init__(self, banco):
+        self.banco = banco
+        self._linhas = []
+
+    def execute(self, sql, params=None):
+        if sql.strip().startswith('CREATE'):
+            self.banco.ddl += 1
+        elif 'INSERT INTO gestao_pessoas.do_listagem' in sql:
+            _, etag, last_modified, documentos = params
+            self.banco.listagem = {'etag': etag, 'last_modified': last_modified,
+                                   'documentos': documentos.adapted, 'idade': 0}
+        elif 'FROM gestao_pessoas.do_listagem' in sql:
+            self._linhas = [dict(self.banco.listagem)] if self.banco.listagem else []
+        elif 'FROM gestao_pessoas.do_documentos' in sql:
+            numeros, versao = params
+            self._linhas = [
+                {'numero': n, 'nomeacoes': linha['nomeacoes']}
+                for n, linha in self.banco.documentos.items()
+                if n in numeros and linha['versao_parser'] >= versao
+            ]
+        else:
+            raise AssertionError(f'SQL inesperado: {sql}')
+
+    def fetchone(self):
+        return self._linhas[0] if self._linhas else None
+
+    def fetchall(self):
+        return self._linhas
+
+
+@pytest.fixture
+def banco(monkeypatch):
+    banco = BancoMemoria()
+
+    def _execute_values(cur, sql, linhas, page_size=None):
+        for numero, url, tipo, data, versao, nomeacoes in linhas:
+            cur.banco.documentos[numero] = {'url': url, 'data_publicacao': data,
+                                            'versao_parser': versao, 'nomeacoes': nomeacoes.adapted}
+
+    monkeypatch.setattr(do, 'execute_values', _execute_values)
+    return banco
+
+
+def test_memoria_evita_downloads_repetidos(banco):
+    sessao = SessaoFixtures(ao_chamar=lambda url: _sem_conexao_aberta(banco))
+    ingestao = _ingestao(sessao)
+
+    janeiro = ingestao.buscar(banco, '01/01/2025', '31/01/2025')
+    assert sorted(banco.documentos) == ['128000001', '128000002']
+    assert banco.listagem['etag'] == '"v1"'
+
+    # Listagem fresca no banco: só o documento novo do período é baixado
+    sessao.chamadas.clear()
+    bimestre = ingestao.buscar(banco, '01/01/2025', '28/02/2025')
+    assert sessao.urls() == [URL_DOC.format(1280003)]
+    assert bimestre['nomeacoes'][:4] == janeiro['nomeacoes']
+    assert bimestre['nomeacoes'][4]['nome_servidor'] == 'PEDRO HENRIQUE LIMA'
+
+    # Listagem vencida: requisição condicional; 304 reaproveita a gravada
+    banco.listagem['idade'] = do.FRESCOR_LISTAGEM + 1
+    sessao.chamadas.clear()
+    de_novo = ingestao.buscar(banco, '01/01/2025', '28/02/2025')
+    assert [(url, headers.get('If-None-Match')) for url, headers in sessao.chamadas] == [
+        (do.DO_SEARCH_URL, '"v1"')
+    ]
+    assert de_novo == bimestre
+
+
+def test_versao_do_parser_antiga_e_relida(banco):
+    ingestao = _ingestao(SessaoFixtures())
+    ingestao.buscar(banco, '01/01/2025', '15/01/2025')
+    banco.documentos['128000001']['versao_parser'] = do.VERSAO_PARSER - 1
+
+    sessao = SessaoFixtures()
+    _ingestao(sessao).buscar(banco, '01/01/2025', '15/01/2025')
+
+    assert URL_DOC.format(1280001) in sessao.urls()
+    assert URL_DOC.format(1280002) not in sessao.urls()
+    assert banco.documentos['128000001']['versao_parser'] == do.VERSAO_PARSER
+
+
+def test_estrutura_so_marcada_apos_commit(banco):
+    banco.falhar_commits = 1
+    ingestao = _ingestao(SessaoFixtures())
+
+    # Commit do DDL falha: a busca segue sem memória nessa etapa...
+    resultado = ingestao.buscar(banco, '01/01/2025', '31/01/2025')
+    assert resultado['erro'] is None
+    assert len(resultado['nomeacoes']) == 4
+
+    # ...e a estrutura é garantida de novo na etapa seguinte
+    assert banco.ddl > 3
+    assert ingestao._estrutura_ok
+
+
+def _sem_conexao_aberta(banco):
+    assert banco.abertas == 0, 'conexão com o banco aberta durante acesso ao D.O.'
@@ -0,0 +1,193 @@
+"""
+core.sof_cliente contra um servidor SOF local (http.server numa thread).
+
+O stub responde /token e /v4/<recurso>; cada teste programa falhas e
+atrasos e confere as chamadas que chegaram ao servidor.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+from core import sof_cliente
+from core.sof_cliente import ClienteSOF, ErroSOF
+
+
+class StubSOF:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens_emitidos = 0
+        self.atraso_token = 0.0
+        self.consultas = []         # (recurso, params, token)
+        self.falhas = []            # status a devolver antes do 200, em ordem
+        self.tokens_revogados = set()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                time.sleep(stub.atraso_token)
+                with stub.lock:
+                    stub.tokens_emitidos += 1
+                    token = f'tok{stub.tokens_emitidos}'
+                self._json(200, {'access_token': token, 'expires_in': 3600})
+
+            def do_GET(self):
+                partes = urlsplit(self.path)
+                recurso = partes.path.rsplit('/', 1)[-1]
+                params = dict(parse_qsl(partes.query))
+                token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+                with stub.lock:
+                    stub.consultas.append((recurso, params, token))
+                    falha = stub.falhas.pop(0) if stub.falhas else None
+                    revogado = token in stub.tokens_revogados
+                if revogado:
+                    return self._json(401, {'erro': 'token revogado'})
+                if falha:
+                    return self._json(falha, {'erro': 'indisponível'})
+                chave = 'lstContratos' if recurso == 'contratos' else 'lstEmpenhos'
+                self._json(200, {chave: [params], 'metaDados': {'qtd': 1}})
+
+            def _json(self, status, corpo):
+                dados = json.dumps(corpo).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.servidor.server_port}'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def encerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # Erros são registrados no banco (decorators.registrar_erro); aqui, não
+    monkeypatch.setattr(sof_cliente, '_registrar', lambda *a, **k: None)
+    servidor = StubSOF()
+    yield servidor
+    servidor.encerrar()
+
+
+def _cliente(stub, **kwargs):
+    kwargs.setdefault('backoff_base', 0.01)
+    return ClienteSOF(token_url=f'{stub.url}/token', base_url=f'{stub.url}/v4',
+                      auth_base64='dGVzdGU6dGVzdGU=', **kwargs)
+
+
+def test_nova_tentativa_em_5xx(stub):
+    stub.falhas = [503, 502]
+    cliente = _cliente(stub)
+
+    dados = cliente.consultar('contratos', {'anoContrato': 2024})
+
+    assert dados['lstContratos'] == [{'anoContrato': '2024'}]
+    assert len(stub.consultas) == 3
+
+
+def test_5xx_persistente_vira_erro(stub):
+    stub.falhas = [500, 500, 500]
+    cliente = _cliente(stub, max_tentativas=3)
+
+    with pytest.raises(ErroSOF) as exc:
+        cliente.consultar('contratos', {'anoContrato': 2024})
+
+    assert exc.value.status == 500
+    assert len(stub.consultas) == 3
+
+
+def test_token_renovado_uma_vez_com_chamadas_concorrentes(stub):
+    stub.atraso_token = 0.2
+    cliente = _cliente(stub)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(
+            lambda ano: cliente.consultar('empenhos', {'anoEmpenho': ano}, usar_cache=False),
+            range(2016, 2024),
+        ))
+
+    assert stub.tokens_emitidos == 1
+    assert {token for _, _, token in stub.consultas} == {'tok1'}
+
+
+def test_401_renova_token_e_repete(stub):
+    cliente = _cliente(stub)
+    cliente.consultar('contratos', {'anoContrato': 2023})
+    stub.tokens_revogados.add('tok1')
+
+    dados = cliente.consultar('contratos', {'anoContrato': 2024})
+
+    assert dados['lstContratos'] == [{'anoContrato': '2024'}]
+    assert stub.tokens_emitidos == 2
+    assert [token for _, _, token in stub.consultas[-2:]] == ['tok1', 'tok2']
+
+
+def test_cache_por_filtros_normalizados(stub):
+    cliente = _cliente(stub, ttl_respostas=0.3)
+
+    cliente.consultar('contratos', {'anoContrato': 2024, 'codOrgao': '34'})
+    # Mesma consulta: ordem diferente, inteiro vs texto, filtros vazios
+    cliente.consultar('contratos', {'codOrgao': 34, 'anoContrato': '2024 ', 'numProcesso': ''})
+    assert len(stub.consultas) == 1
+    assert cliente.estatisticas()['acertos'] == 1
+
+    cliente.consultar('contratos', {'anoContrato': 2024, 'codOrgao': '35'})
+    assert len(stub.consultas) == 2
+
+    time.sleep(0.35)
+    cliente.consultar('contratos', {'anoContrato': 2024, 'codOrgao': '34'})
+    assert len(stub.consultas) == 3
+
+
+def test_cache_devolve_copia(stub):
+    cliente = _cliente(stub)
+    dados = cliente.consultar('contratos', {'anoContrato': 2024})
+    dados['lstContratos'].clear()
+
+    assert cliente.consultar('contratos', {'anoContrato': 2024})['lstContratos']
+
+
+def test_fanout_por_ano(stub):
+    cliente = _cliente(stub)
+
+    dados = cliente.contratos({'anoContrato': [2022, 2023, 2024], 'codOrgao': '34'})
+
+    anos = sorted(params['anoContrato'] for _, params, _ in stub.consultas)
+    assert anos == ['2022', '2023', '2024']
+    assert all(params['codOrgao'] == '34' for _, params, _ in stub.consultas)
+    assert [c['anoContrato'] for c in dados['lstContratos']] == ['2022', '2023', '2024']
+    assert [c['filtros']['anoContrato'] for c in dados['metaDados']['consultas']] == [
+        '2022', '2023', '2024'
+    ]
+
+
+def test_fanout_com_valores_separados_por_virgula(stub):
+    cliente = _cliente(stub)
+
+    dados = cliente.empenhos({'anoEmpenho': '2023,2024', 'mesEmpenho': 12})
+
+    assert len(stub.consultas) == 2
+    assert len(dados['lstEmpenhos']) == 2
+
+
+def test_fanout_acima_do_limite(stub):
+    cliente = _cliente(stub)
+
+    with pytest.raises(ErroSOF):
+        cliente.empenhos({'anoEmpenho': list(range(2000, 2031)), 'mesEmpenho': [1, 2, 3]})
+    assert stub.consultas == []
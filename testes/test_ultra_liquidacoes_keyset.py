@@ -0,0 +1,59 @@
+"""
+Listagem de parcelas (api_listar_parcelas): cursor por faixa e índices de
+ordenação — as expressões do código e da migração precisam ser idênticas.
+"""
+
+import base64
+import datetime
+import json
+import os
+import re
+
+from routes import gestao_financeira_ultra_liquidacoes as ul
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _normalizar(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def test_migracao_tem_os_mesmos_indices_do_codigo():
+    with open(os.path.join(RAIZ, 'scripts', 'migration_ultra_liquidacoes_keyset.sql'), encoding='utf-8') as f:
+        migracao = _normalizar(f.read())
+    for ddl in ul._sql_indices_ordenacao():
+        assert _normalizar(ddl) in migracao
+
+
+def test_indices_usam_as_expressoes_das_chaves():
+    ano_corrente, demais = (_normalizar(d) for d in ul._sql_indices_ordenacao())
+    for faixa, ddl in ((0, ano_corrente), (1, demais)):
+        for chave in ul._CHAVES_FAIXA[faixa]:
+            if chave != 'id':
+                assert _normalizar(ul._SQL_CHAVES[chave].format(t='')) in ddl
+    assert _normalizar(ul._SQL_ANO_VIGENCIA.format(t='')) in ano_corrente
+    assert _normalizar(ul._SQL_ANO_VIGENCIA.format(t='')) not in demais
+
+
+def _linha():
+    return {
+        '_k_pendencia': 1, '_k_secundario': 0, '_k_pagamento': 2147483647,
+        '_k_vigencia': datetime.date(2025, 3, 1), '_k_termo': 'TFM/001/2025', 'id': 42,
+    }
+
+
+def test_cursor_ida_e_volta():
+    assert ul._decodificar_cursor(ul._codificar_cursor(0, _linha())) == (
+        0, [1, 0, 2147483647, '2025-03-01', 'TFM/001/2025', 42])
+    # Fora do ano corrente o status secundário não faz parte da chave
+    assert ul._decodificar_cursor(ul._codificar_cursor(1, _linha())) == (
+        1, [1, 2147483647, '2025-03-01', 'TFM/001/2025', 42])
+
+
+def test_cursor_invalido():
+    assert ul._decodificar_cursor('nao-e-base64!') is None
+    # Faixa inexistente ou número de chaves que não é o da faixa
+    for valores in ([], [2, 1], [1, 1, 2], {'faixa': 0}):
+        token = base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+        assert ul._decodificar_cursor(token) is None
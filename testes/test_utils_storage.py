@@ -0,0 +1,141 @@
+"""
+utils_storage no backend de disco local: cache de listagens e de downloads.
+
+"Outro worker" é simulado gravando direto no disco, sem passar por
+upload_file (que só invalida o cache do processo que fez o upload).
+"""
+
+import os
+
+import pytest
+
+import utils_storage as storage
+
+
+@pytest.fixture(autouse=True)
+def storage_local(tmp_path, monkeypatch):
+    monkeypatch.setenv('USE_SUPABASE_STORAGE', 'False')
+    monkeypatch.setattr(storage, '_BASE_DIR', str(tmp_path / 'base'))
+    monkeypatch.setattr(storage, 'BLOB_CACHE_DIR', str(tmp_path / 'cache'))
+    storage.invalidate_cache()
+    yield tmp_path / 'base' / 'modelos'
+    storage.invalidate_cache()
+
+
+def _gravar_por_fora(raiz, storage_path, dados):
+    caminho = raiz.joinpath(*storage_path.split('/'))
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    caminho.write_bytes(dados)
+    # Garante mtime diferente mesmo em sistemas de arquivos de baixa resolução
+    st = os.stat(caminho)
+    os.utime(caminho, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def test_upload_download_e_listagem():
+    storage.upload_file('Certidoes/OSC/a.pdf', b'v1')
+
+    assert storage.download_file('Certidoes/OSC/a.pdf') == b'v1'
+    assert storage.list_files('Certidoes/OSC') == ['a.pdf']
+    assert storage.list_folders('Certidoes') == ['OSC']
+
+
+def test_download_repetido_sai_do_cache():
+    storage.upload_file('Modelos/m.docx', b'conteudo')
+    storage.download_file('Modelos/m.docx')
+    hits = storage.cache_stats()['blob_hits']
+
+    assert storage.download_file('Modelos/m.docx') == b'conteudo'
+    assert storage.cache_stats()['blob_hits'] == hits + 1
+
+
+def test_regravacao_por_outro_worker_nao_serve_bytes_antigos(storage_local):
+    storage.upload_file('Certidoes/OSC/a.pdf', b'v2x')
+    assert storage.download_file('Certidoes/OSC/a.pdf') == b'v2x'
+    storage.list_files('Certidoes/OSC')     # listagem em cache neste processo
+
+    _gravar_por_fora(storage_local, 'Certidoes/OSC/a.pdf', b'v3yy')
+
+    assert storage.download_file('Certidoes/OSC/a.pdf') == b'v3yy'
+
+
+def test_regravacao_com_mesmo_tamanho(storage_local):
+    storage.upload_file('Certidoes/OSC/a.pdf', b'aaaa')
+    storage.download_file('Certidoes/OSC/a.pdf')
+
+    _gravar_por_fora(storage_local, 'Certidoes/OSC/a.pdf', b'bbbb')
+
+    assert storage.download_file('Certidoes/OSC/a.pdf') == b'bbbb'
+
+
+def test_file_versions_ve_regravacao_de_outro_worker(storage_local):
+    storage.upload_file('Certidoes/OSC/a.pdf', b'v1')
+    antes = storage.file_versions('Certidoes/OSC')
+
+    _gravar_por_fora(storage_local, 'Certidoes/OSC/a.pdf', b'v2-maior')
+
+    depois = storage.file_versions('Certidoes/OSC')
+    assert antes['a.pdf'] != depois['a.pdf']
+
+
+def test_arquivo_ausente():
+    with pytest.raises(FileNotFoundError):
+        storage.download_file('Certidoes/OSC/nao_existe.pdf')
+
+
+def test_download_files_em_lote():
+    storage.upload_file('Certidoes/OSC/a.pdf', b'A')
+    storage.upload_file('Certidoes/OSC/b.pdf', b'B')
+
+    assert storage.download_files(['Certidoes/OSC/a.pdf', 'Certidoes/OSC/b.pdf']) == {
+        'Certidoes/OSC/a.pdf': b'A',
+        'Certidoes/OSC/b.pdf': b'B',
+    }
+    with pytest.raises(FileNotFoundError) as exc:
+        storage.download_files(['Certidoes/OSC/a.pdf', 'Certidoes/OSC/c.pdf'])
+    assert exc.value.filename == 'Certidoes/OSC/c.pdf'
+
+
+def test_delete_file_remove_e_invalida():
+    storage.upload_file('Manuais/1/x.pdf', b'x')
+    storage.download_file('Manuais/1/x.pdf')
+
+    storage.delete_file('Manuais/1/x.pdf')
+
+    assert storage.list_files('Manuais/1') == []
+    with pytest.raises(FileNotFoundError):
+        storage.download_file('Manuais/1/x.pdf')
+
+
+def test_versao_no_supabase_vem_do_head(monkeypatch):
+    """Backend Supabase: versão = ETag do HEAD no objeto (stub HTTP local)."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    etags = {'/storage/v1/object/documentos/Certidoes/OSC/a.pdf': '"e1"'}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            etag = etags.get(self.path)
+            self.send_response(200 if etag else 404)
+            if etag:
+                self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.setenv('USE_SUPABASE_STORAGE', 'True')
+        monkeypatch.setenv('SUPABASE_URL', f'http://127.0.0.1:{servidor.server_port}')
+        monkeypatch.setenv('SUPABASE_SERVICE_KEY', 'chave')
+
+        assert storage._current_version('Certidoes/OSC/a.pdf') == '"e1"'
+        etags['/storage/v1/object/documentos/Certidoes/OSC/a.pdf'] = '"e2"'
+        assert storage._current_version('Certidoes/OSC/a.pdf') == '"e2"'
+        assert storage._current_version('Certidoes/OSC/b.pdf') is None
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
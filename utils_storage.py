@@ -11,17 +11,42 @@ Mapeamento de paths (local ↔ Supabase):
   modelos/Certidoes/<osc>/<file>  ↔  Certidoes/<osc>/<file>
   modelos/Manuais/<id>/<file>     ↔  Manuais/<id>/<file>
   modelos/<arquivo>               ↔  Modelos/<arquivo>
+
+Cache (vale para os dois backends):
+  - Listagens de prefixo em memória por STORAGE_LIST_TTL s; upload_file,
+    delete_file e ensure_folder invalidam o prefixo e seus ancestrais.
+    Outros workers enxergam a mudança ao fim do TTL
+  - Downloads em cache LRU no disco (STORAGE_CACHE_DIR, teto
+    STORAGE_CACHE_MAX_MB), validado a cada leitura pela versão atual do
+    arquivo — HEAD (ETag/Last-Modified) no Supabase, stat (mtime+tamanho) no
+    disco local —, não pela listagem em memória: um upload feito por outro
+    worker nunca é servido com os bytes antigos
+  - file_versions() também consulta o backend na hora (chave do PDF
+    unificado de certidões)
+  - Um único httpx.Client (keep-alive) por processo para o client Supabase e
+    os fallbacks HTTP; clients S3/R2 reaproveitados via s3_client()
 """
 
+import hashlib
 import os
 import socket
 import subprocess
 import tempfile
+import threading
+import time
 from urllib.parse import quote
 
 _BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 BUCKET = 'documentos'
 _client = None
+_client_pid = None
+
+LIST_TTL = float(os.environ.get('STORAGE_LIST_TTL', '30'))
+BLOB_CACHE_DIR = os.environ.get('STORAGE_CACHE_DIR') or os.path.join(
+    tempfile.gettempdir(), 'utils_storage_cache'
+)
+BLOB_CACHE_MAX_BYTES = int(os.environ.get('STORAGE_CACHE_MAX_MB', '512')) * 1024 * 1024
+HTTP_MAX_CONNECTIONS = 32
 
 
 def _use_supabase() -> bool:
@@ -29,19 +54,76 @@ def _use_supabase() -> bool:
 
 
 def _get_client():
-    global _client
-    if _client is None:
-        from supabase import create_client
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        from supabase import ClientOptions, create_client
         url = os.environ.get('SUPABASE_URL', '').rstrip('/')
         key = os.environ.get('SUPABASE_SERVICE_KEY', '')
         if not url or not key:
             raise RuntimeError(
                 'SUPABASE_URL e SUPABASE_SERVICE_KEY devem estar definidos no .env'
             )
-        _client = create_client(url, key)
+        _client = create_client(url, key, options=ClientOptions(httpx_client=http_client()))
+        _client_pid = os.getpid()
     return _client
 
 
+# ─────────────────────────────────────────────────────────────
+# Sessões HTTP compartilhadas
+# ─────────────────────────────────────────────────────────────
+
+_http_lock = threading.Lock()
+_http = None
+_http_pid = None
+_s3_clients = {}
+
+
+def http_client():
+    """
+    httpx.Client do processo (pool de conexões keep-alive).
+
+    Recriado após fork (gunicorn): sockets do processo pai não são reusados.
+    """
+    global _http, _http_pid
+    with _http_lock:
+        if _http is None or _http_pid != os.getpid():
+            import httpx
+            _http = httpx.Client(
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                ),
+            )
+            _http_pid = os.getpid()
+        return _http
+
+
+def s3_client(endpoint_url, access_key_id, secret_access_key):
+    """
+    Client boto3 (S3/Cloudflare R2) reaproveitado por credencial.
+
+    Clients boto3 são thread-safe e mantêm o pool de conexões do urllib3;
+    criar um por requisição refazia o handshake TLS a cada chamada.
+    """
+    chave = (os.getpid(), endpoint_url, access_key_id, secret_access_key)
+    with _http_lock:
+        client = _s3_clients.get(chave)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+            client = boto3.client(
+                's3',
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key_id,
+                aws_secret_access_key=secret_access_key,
+                config=Config(signature_version='s3v4', max_pool_connections=HTTP_MAX_CONNECTIONS),
+                region_name='auto',
+            )
+            _s3_clients[chave] = client
+        return client
+
+
 def _get_supabase_credentials():
     url = os.environ.get('SUPABASE_URL', '').rstrip('/')
     key = os.environ.get('SUPABASE_SERVICE_KEY', '')
@@ -60,8 +142,6 @@ def _upload_via_http(storage_path: str, file_data, content_type: str) -> None:
     intermitente na resolução/conexão de upload; este caminho usa o endpoint
     REST do Storage com upsert explícito.
     """
-    import httpx
-
     url, key = _get_supabase_credentials()
     encoded_path = quote(storage_path, safe='/')
     endpoint = f'{url}/storage/v1/object/{BUCKET}/{encoded_path}'
@@ -71,7 +151,7 @@ def _upload_via_http(storage_path: str, file_data, content_type: str) -> None:
         'x-upsert': 'true',
         'Content-Type': content_type,
     }
-    response = httpx.post(endpoint, headers=headers, content=file_data, timeout=60.0)
+    response = http_client().post(endpoint, headers=headers, content=file_data, timeout=60.0)
     response.raise_for_status()
 
 
@@ -163,6 +243,200 @@ def _list_all_supabase_items(prefix: str, page_size: int = 1000) -> list:
     return items
 
 
+# ─────────────────────────────────────────────────────────────
+# Cache de listagens
+# ─────────────────────────────────────────────────────────────
+
+_listings_lock = threading.Lock()
+_listings = {}          # prefixo → (expira_em, [{'name', 'is_file', 'version'}])
+_stats = {'list_hits': 0, 'list_misses': 0, 'blob_hits': 0, 'blob_misses': 0}
+
+
+def _fetch_entries(prefix: str) -> list:
+    if _use_supabase():
+        entries = []
+        for item in _list_all_supabase_items(prefix) or []:
+            metadata = item.get('metadata') or {}
+            entries.append({
+                'name': item['name'],
+                # Arquivos têm 'id' != None; pastas têm id == None
+                'is_file': item.get('id') is not None,
+                'version': str(
+                    metadata.get('eTag') or item.get('updated_at') or metadata.get('lastModified') or ''
+                ),
+            })
+        return entries
+
+    local = _local_path(prefix)
+    if not os.path.isdir(local):
+        return []
+    entries = []
+    with os.scandir(local) as it:
+        for entry in it:
+            if entry.is_file():
+                st = entry.stat()
+                entries.append({'name': entry.name, 'is_file': True,
+                                'version': f'{st.st_mtime_ns}-{st.st_size}'})
+            elif entry.is_dir():
+                entries.append({'name': entry.name, 'is_file': False, 'version': ''})
+    return entries
+
+
+def _list_entries(prefix: str) -> list:
+    """Itens do prefixo (cache de LIST_TTL s). Erros do backend propagam e não são cacheados."""
+    agora = time.monotonic()
+    with _listings_lock:
+        item = _listings.get(prefix)
+        if item and item[0] > agora:
+            _stats['list_hits'] += 1
+            return item[1]
+        _stats['list_misses'] += 1
+    entries = _fetch_entries(prefix)
+    with _listings_lock:
+        _listings[prefix] = (agora + LIST_TTL, entries)
+    return entries
+
+
+def _listing_cached(prefix: str) -> bool:
+    with _listings_lock:
+        item = _listings.get(prefix)
+        return bool(item and item[0] > time.monotonic())
+
+
+def _invalidate_listing(storage_path: str) -> None:
+    # O próprio prefixo e todos os ancestrais: criar arquivo pode criar pasta
+    parts = _normalize(storage_path).rstrip('/').split('/')
+    prefixes = {'/'.join(parts[:i]) for i in range(len(parts) + 1)}
+    with _listings_lock:
+        for prefix in prefixes:
+            _listings.pop(prefix, None)
+
+
+def _current_version(storage_path: str):
+    """
+    Versão atual do arquivo no backend (None se não existir ou não der para
+    saber — nesse caso o download não usa o cache).
+    """
+    if not _use_supabase():
+        try:
+            st = os.stat(_local_path(storage_path))
+        except OSError:
+            return None
+        return f'{st.st_mtime_ns}-{st.st_size}'
+
+    try:
+        url, key = _get_supabase_credentials()
+        response = http_client().head(
+            f'{url}/storage/v1/object/{BUCKET}/{quote(storage_path, safe="/")}',
+            headers={'Authorization': f'Bearer {key}', 'apikey': key},
+            timeout=10.0,
+        )
+    except Exception:
+        return None
+    if response.status_code != 200:
+        return None
+    return response.headers.get('etag') or response.headers.get('last-modified') or None
+
+
+# ─────────────────────────────────────────────────────────────
+# Cache de arquivos (LRU em disco)
+# ─────────────────────────────────────────────────────────────
+
+_blob_lock = threading.Lock()
+
+
+def _blob_key(storage_path: str) -> str:
+    backend = 'supabase' if _use_supabase() else 'local'
+    return hashlib.sha256(f'{backend}:{storage_path}'.encode()).hexdigest()[:40]
+
+
+def _blob_file(storage_path: str, version: str) -> str:
+    sufixo = hashlib.sha256(version.encode()).hexdigest()[:16]
+    return os.path.join(BLOB_CACHE_DIR, f'{_blob_key(storage_path)}-{sufixo}.bin')
+
+
+def _read_cached_blob(storage_path: str, version: str):
+    caminho = _blob_file(storage_path, version)
+    try:
+        with open(caminho, 'rb') as fh:
+            data = fh.read()
+        os.utime(caminho)   # LRU por mtime
+        return data
+    except OSError:
+        return None
+
+
+def _drop_blobs(storage_path: str) -> None:
+    prefixo = _blob_key(storage_path) + '-'
+    try:
+        nomes = os.listdir(BLOB_CACHE_DIR)
+    except OSError:
+        return
+    for nome in nomes:
+        if nome.startswith(prefixo):
+            try:
+                os.unlink(os.path.join(BLOB_CACHE_DIR, nome))
+            except OSError:
+                pass
+
+
+def _evict_blobs() -> None:
+    arquivos, total = [], 0
+    with os.scandir(BLOB_CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith('.bin'):
+                st = entry.stat()
+                arquivos.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+    if total <= BLOB_CACHE_MAX_BYTES:
+        return
+    # Remove os menos usados até 90% do teto (evita podar a cada gravação)
+    alvo = BLOB_CACHE_MAX_BYTES * 0.9
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= alvo:
+            break
+        try:
+            os.unlink(caminho)
+            total -= tamanho
+        except OSError:
+            pass
+
+
+def _store_blob(storage_path: str, version: str, data: bytes) -> None:
+    if len(data) > BLOB_CACHE_MAX_BYTES:
+        return
+    try:
+        with _blob_lock:
+            os.makedirs(BLOB_CACHE_DIR, exist_ok=True)
+            _drop_blobs(storage_path)
+            fd, tmp = tempfile.mkstemp(dir=BLOB_CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp, _blob_file(storage_path, version))
+            _evict_blobs()
+    except OSError as exc:
+        print(f'[AVISO] cache de storage falhou para {storage_path!r}: {exc}')
+
+
+def invalidate_cache(storage_path: str = None) -> None:
+    """
+    Descarta listagens e arquivos em cache de `storage_path` (e ancestrais),
+    ou todas as listagens se None.
+    """
+    if storage_path is None:
+        with _listings_lock:
+            _listings.clear()
+        return
+    storage_path = _normalize(storage_path)
+    _invalidate_listing(storage_path)
+    _drop_blobs(storage_path)
+
+
+def cache_stats() -> dict:
+    with _listings_lock:
+        return dict(_stats, listings=len(_listings))
+
+
 # ─────────────────────────────────────────────────────────────
 # API pública
 # ─────────────────────────────────────────────────────────────
@@ -203,6 +477,8 @@ def upload_file(storage_path: str, file_data, content_type: str = 'application/o
         with open(local, 'wb') as fh:
             fh.write(file_data)
 
+    invalidate_cache(storage_path)
+
 
 def download_file(storage_path: str) -> bytes:
     """
@@ -210,9 +486,27 @@ def download_file(storage_path: str) -> bytes:
 
     storage_path: ex: 'Certidoes/OSC/file.pdf'
     Lança FileNotFoundError se o arquivo não existir.
+
+    Servido do cache em disco quando a versão atual do arquivo (HEAD/stat)
+    é a mesma da cópia em cache.
     """
     storage_path = _normalize(storage_path)
 
+    version = _current_version(storage_path)
+    if version:
+        data = _read_cached_blob(storage_path, version)
+        if data is not None:
+            _stats['blob_hits'] += 1
+            return data
+    _stats['blob_misses'] += 1
+
+    data = _download_uncached(storage_path)
+    if version:
+        _store_blob(storage_path, version, data)
+    return data
+
+
+def _download_uncached(storage_path: str) -> bytes:
     if _use_supabase():
         client = _get_client()
         try:
@@ -237,22 +531,10 @@ def list_files(prefix: str) -> list:
     Retorna lista de nomes (sem o prefixo).
     """
     prefix = _normalize(prefix)
-
-    if _use_supabase():
-        try:
-            items = _list_all_supabase_items(prefix)
-            # Arquivos têm 'id' != None; pastas têm id == None
-            return [item['name'] for item in (items or []) if item.get('id') is not None]
-        except Exception:
-            return []
-    else:
-        local = _local_path(prefix)
-        if not os.path.isdir(local):
-            return []
-        return [
-            f for f in os.listdir(local)
-            if os.path.isfile(os.path.join(local, f))
-        ]
+    try:
+        return [e['name'] for e in _list_entries(prefix) if e['is_file']]
+    except Exception:
+        return []
 
 
 def list_folders(prefix: str) -> list:
@@ -263,22 +545,10 @@ def list_folders(prefix: str) -> list:
     Retorna lista de nomes de pasta.
     """
     prefix = _normalize(prefix)
-
-    if _use_supabase():
-        try:
-            items = _list_all_supabase_items(prefix)
-            # Pastas têm id == None
-            return [item['name'] for item in (items or []) if item.get('id') is None]
-        except Exception:
-            return []
-    else:
-        local = _local_path(prefix)
-        if not os.path.isdir(local):
-            return []
-        return [
-            d for d in os.listdir(local)
-            if os.path.isdir(os.path.join(local, d))
-        ]
+    try:
+        return [e['name'] for e in _list_entries(prefix) if not e['is_file']]
+    except Exception:
+        return []
 
 
 def folder_exists(prefix: str) -> bool:
@@ -318,14 +588,15 @@ def ensure_folder(prefix: str) -> None:
         upload_file(f'{prefix}/.keep', b'keep', 'text/plain')
     else:
         os.makedirs(_local_path(prefix), exist_ok=True)
+        _invalidate_listing(prefix)
 
 
 def list_files_by_folder(prefix: str) -> dict:
     """
     Retorna {nome_pasta: [arquivos]} para todos os subdiretórios de prefix.
 
-    Na versão Supabase dispara todas as requisições em paralelo (ThreadPoolExecutor)
-    em vez de sequencialmente, reduzindo latência de 100 × RTT para ~1 × RTT.
+    Na versão Supabase dispara em paralelo (ThreadPoolExecutor) só as
+    listagens que não estão no cache; as demais saem da memória.
     prefix: ex: 'Certidoes'
     """
     from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -335,21 +606,62 @@ def list_files_by_folder(prefix: str) -> dict:
     if not folders:
         return {}
 
-    result = {}
-    if _use_supabase():
-        def _fetch(folder_name):
-            return folder_name, list_files(f'{prefix}/{folder_name}')
-
-        with ThreadPoolExecutor(max_workers=30) as executor:
-            futures = {executor.submit(_fetch, f): f for f in folders}
+    pending = [f for f in folders if not _listing_cached(f'{prefix}/{f}')]
+    if _use_supabase() and len(pending) > 1:
+        with ThreadPoolExecutor(max_workers=min(30, len(pending))) as executor:
+            futures = [executor.submit(list_files, f'{prefix}/{f}') for f in pending]
             for future in as_completed(futures):
-                folder_name, files = future.result()
-                result[folder_name] = files
-    else:
-        for folder in folders:
-            result[folder] = list_files(f'{prefix}/{folder}')
+                future.result()
 
-    return result
+    return {folder: list_files(f'{prefix}/{folder}') for folder in folders}
+
+
+def file_versions(prefix: str) -> dict:
+    """
+    Retorna {nome_arquivo: versão} dos arquivos de um prefixo.
+
+    A versão muda sempre que o arquivo é regravado (eTag/updated_at no
+    Supabase, mtime+tamanho no disco) — serve como chave de cache sem baixar.
+    Lista o backend na hora (e renova o cache de listagem): a listagem em
+    memória pode não ter visto uploads de outros workers.
+    prefix: ex: 'Certidoes/OSC'
+    """
+    prefix = _normalize(prefix)
+    try:
+        entries = _fetch_entries(prefix)
+    except Exception:
+        return {}
+    with _listings_lock:
+        _listings[prefix] = (time.monotonic() + LIST_TTL, entries)
+    return {e['name']: e['version'] for e in entries if e['is_file']}
+
+
+def download_files(storage_paths, max_workers: int = 8) -> dict:
+    """
+    Baixa vários arquivos em paralelo e retorna {storage_path: bytes}.
+
+    As chaves são os caminhos como recebidos. Lança FileNotFoundError (com o
+    caminho em `filename`) se algum arquivo não existir.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    storage_paths = list(dict.fromkeys(storage_paths))
+    if not storage_paths:
+        return {}
+
+    # Disco local: leitura já é rápida, threads não compensam
+    workers = min(max_workers, len(storage_paths)) if _use_supabase() else 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {p: executor.submit(download_file, p) for p in storage_paths}
+        result = {}
+        for path, future in futures.items():
+            try:
+                result[path] = future.result()
+            except FileNotFoundError as exc:
+                for pending in futures.values():
+                    pending.cancel()
+                raise FileNotFoundError(2, str(exc), path) from exc
+        return result
 
 
 def delete_file(storage_path: str) -> None:
@@ -373,3 +685,5 @@ def delete_file(storage_path: str) -> None:
                 os.remove(local)
         except Exception as exc:
             print(f'[AVISO] delete_file local falhou para {local!r}: {exc}')
+
+    invalidate_cache(storage_path)